@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""A class for periodically saving and restoring the progress of long-running normalizations."""
+
+import os
+import sys
+import time
+
+import numpy
+import h5py
+
+
+class Checkpoint(object):
+
+    """
+    This class saves the state of a normalization to an h5dict so that an interrupted run can be resumed.
+
+    Values are recorded with :func:`update` and written to disk whenever the checkpoint interval has passed or a write is forced, such as when a chromosome is completed. Only the process with rank zero writes the file, while all processes read it when resuming. Files are written under a temporary name and then renamed so that an interruption during writing never leaves a partial checkpoint.
+
+    :param filename: The file name of the checkpoint h5dict. If 'None', nothing is saved or restored.
+    :type filename: str.
+    :param settings: A string describing the normalization call. A checkpoint is only resumed if it was created with the same settings.
+    :type settings: str.
+    :param rank: The rank of this process.
+    :type rank: int.
+    :param interval: The minimum number of seconds between periodic writes.
+    :type interval: int.
+    :param resume: Specifies whether to load the state saved in an existing checkpoint file.
+    :type resume: bool.
+    :param silent: Indicates whether to print information about checkpoint loading.
+    :type silent: bool.
+    :returns: :class:`Checkpoint` class object.
+
+    :attributes: * **state** (*dict.*) - A dictionary of the values loaded from the checkpoint file, empty if not resuming.
+    """
+
+    def __init__(self, filename, settings, rank=0, interval=600, resume=False, silent=False):
+        """Create a Checkpoint object."""
+        self.filename = filename
+        self.settings = settings
+        self.rank = rank
+        self.interval = interval
+        self.values = {}
+        self.state = {}
+        self.last_write = time.time()
+        if filename is None or not resume:
+            return None
+        if not os.path.exists(filename):
+            if not silent:
+                print >> sys.stderr, ("\r%s\rNo checkpoint file found, starting normalization from the beginning.\n") %\
+                                     (' ' * 80),
+            return None
+        infile = h5py.File(filename, 'r')
+        if infile.attrs['settings'] != settings:
+            infile.close()
+            raise ValueError("Checkpoint %s was created with different normalization settings." % filename)
+        for key in infile.keys():
+            self.state[key] = infile[key][...]
+        for key in infile.attrs.keys():
+            if key != 'settings':
+                self.state[key] = infile.attrs[key]
+        infile.close()
+        self.values.update(self.state)
+        if not silent:
+            print >> sys.stderr, ("\r%s\rResuming normalization from checkpoint %s.\n") % (' ' * 80, filename),
+        return None
+
+    def get(self, key, default=None):
+        """Return a value loaded from the checkpoint file or 'default' if it was not saved."""
+        return self.state.get(key, default)
+
+    def update(self, force=False, **values):
+        """Record values, writing the checkpoint if 'force' is 'True' or the checkpoint interval has passed."""
+        if self.filename is None:
+            return None
+        self.values.update(values)
+        if force or time.time() - self.last_write >= self.interval:
+            self.write()
+        return None
+
+    def write(self):
+        """Write all recorded values to the checkpoint file."""
+        self.last_write = time.time()
+        if self.filename is None or self.rank != 0:
+            return None
+        temp_fname = "%s.tmp" % self.filename
+        output = h5py.File(temp_fname, 'w')
+        output.attrs['settings'] = self.settings
+        for key, value in self.values.iteritems():
+            if value is None:
+                continue
+            elif isinstance(value, numpy.ndarray):
+                output.create_dataset(key, data=value)
+            else:
+                output.attrs[key] = value
+        output.close()
+        os.rename(temp_fname, self.filename)
+        return None
+
+    def remove(self):
+        """Delete the checkpoint file once the normalization has finished."""
+        if self.filename is not None and self.rank == 0 and os.path.exists(self.filename):
+            os.remove(self.filename)
+        return None
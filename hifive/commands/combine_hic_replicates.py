@@ -6,6 +6,8 @@ import os
 import numpy
 import h5py
 
+from ..hic_data import _DataFile, _order_trans_data
+
 
 def run(args):
     in_fname1 = args.replicate1
@@ -13,9 +15,9 @@ def run(args):
     out_fname = args.output
     silent = args.silent
     history = ""
-    infile1 = h5py.File(in_fname1, 'r')
+    infile1 = _DataFile(in_fname1, 'r')
     history += infile1['/'].attrs['history']
-    infile2 = h5py.File(in_fname2, 'r')
+    infile2 = _DataFile(in_fname2, 'r')
     history += infile2['/'].attrs['history']
     fendfilename = infile1['/'].attrs['fendfilename']
     if fendfilename[:2] == './':
@@ -30,6 +32,7 @@ def run(args):
                                               os.path.dirname(out_fname)), os.path.basename(fendfilename))
     fends = h5py.File(fendfilename, 'r')
     num_fends = fends['fends'].shape[0]
+    chr_indices = fends['chr_indices'][...]
     fends.close()
     data1 = infile1['cis_data'][...]
     data2 = infile2['cis_data'][...]
@@ -89,63 +92,24 @@ def run(args):
         print >> sys.stderr, ("\r%s\r%i out of %i cis fends validated\n") % (" " * 80, valid, count),
     del cis_data
     del cindices
-    data1 = infile1['trans_data'][...]
-    data2 = infile2['trans_data'][...]
-    indices1 = infile1['trans_indices'][...]
-    indices2 = infile2['trans_indices'][...]
-    tindices = numpy.zeros(indices1.shape[0], dtype=numpy.int64)
-    fend2 = numpy.zeros(data1.shape[0] + data2.shape[0], dtype=numpy.int32)
-    pos = 0
-    for i in range(num_fends):
-        if not silent:
-            print >> sys.stderr, ("\rTrans phase 1, %08i of %08i") % (i, num_fends),
-        f1 = indices1[i + 1] - indices1[i]
-        f2 = indices2[i + 1] - indices2[i]
-        if f1 > 0 and f2 > 0:
-            temp = numpy.unique(numpy.hstack((data1[indices1[i]:indices1[i + 1], 1],
-                                              data2[indices2[i]:indices2[i + 1], 1])))
-            fend2[pos:(pos + temp.shape[0])] = temp
-            pos += temp.shape[0]
-        elif f1 > 0:
-            fend2[pos:(pos + f1)] = data1[indices1[i]:indices1[i + 1], 1]
-            pos += f1
-        elif f2 > 0:
-            fend2[pos:(pos + f2)] = data2[indices2[i]:indices2[i + 1], 1]
-            pos += f2
-        tindices[i + 1] = pos
-    trans_data = numpy.zeros((tindices[-1], 3), dtype=numpy.int32)
-    trans_data[:, 1] = fend2[:tindices[-1]]
-    del fend2
-    for i in range(num_fends):
-        if not silent:
-            print >> sys.stderr, ("\rTrans phase 2, %08i of %08i") % (i, num_fends),
-        trans_data[tindices[i]:tindices[i + 1], 0] = i
-        f1 = indices1[i + 1] - indices1[i]
-        f2 = indices2[i + 1] - indices2[i]
-        if f1 > 0:
-            pos = numpy.searchsorted(trans_data[tindices[i]:tindices[i + 1], 1], data1[indices1[i]:indices1[i + 1], 1])
-            if pos.shape[0] > 0: 
-                trans_data[pos + tindices[i], 2] += data1[indices1[i]:indices1[i + 1], 2]
-        if f2 > 0:
-            pos = numpy.searchsorted(trans_data[tindices[i]:tindices[i + 1], 1], data2[indices2[i]:indices2[i + 1], 1])
-            if pos.shape[0] > 0: 
-                trans_data[pos + tindices[i], 2] += data2[indices2[i]:indices2[i + 1], 2]
-    del data1
-    del data2
-    del indices1
-    del indices2
+    if not silent:
+        print >> sys.stderr, ("\r%s\rCombining trans data...") % (" " * 80),
+    # sum counts of fend pairs shared between replicates, then order rows by chromosome pair
+    trans_data = numpy.vstack((infile1['trans_data'][...], infile2['trans_data'][...]))
+    keys, inverse = numpy.unique(trans_data[:, 0].astype(numpy.int64) * num_fends + trans_data[:, 1],
+                                 return_inverse=True)
+    counts = numpy.bincount(inverse, weights=trans_data[:, 2], minlength=keys.shape[0])
+    del inverse
+    trans_data = numpy.zeros((keys.shape[0], 3), dtype=numpy.int32)
+    trans_data[:, 0] = keys / num_fends
+    trans_data[:, 1] = keys % num_fends
+    trans_data[:, 2] = numpy.round(counts).astype(numpy.int32)
+    del keys
+    del counts
+    trans_data, tindices = _order_trans_data(trans_data, chr_indices)
     output.create_dataset(name='trans_data', data=trans_data)
-    output.create_dataset(name='trans_indices', data=tindices)
+    output.create_dataset(name='trans_chrom_indices', data=tindices)
     output.attrs['history'] = history
-    count = 0
-    valid = 0
-    for i in range(tindices.shape[0] - 1):
-        if tindices[i + 1] > tindices[i]:
-            count += 1
-            if trans_data[tindices[i], 0] == trans_data[tindices[i + 1] - 1, 0]:
-                valid += 1
-    if not silent:
-        print >> sys.stderr, ("\r%s\r%i out of %i trans fends validate\n") % (" " * 80, valid, count),
     del trans_data
     del tindices
     output.close()
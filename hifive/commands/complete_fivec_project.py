@@ -48,7 +48,7 @@ def run(args):
     del frags
     data = FiveCData(data_fname, 'w', silent=args.silent)
     if not args.bam is None:
-        data.load_data_from_bam(frag_fname, args.bam)
+        data.load_data_from_bam(frag_fname, args.bam, args.processes)
     else:
         data.load_data_from_counts(frag_fname, args.count)
     data.save()
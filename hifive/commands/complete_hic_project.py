@@ -79,40 +79,55 @@ def run(args):
         del fends
         data = HiCData(data_fname, 'w', silent=args.silent)
         if not args.bam is None: 
-            data.load_data_from_bam(fend_fname, args.bam, args.insert, args.skipdups)
+            data.load_data_from_bam(fend_fname, args.bam, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                    args.processes)
         elif not args.raw is None: 
-            data.load_data_from_raw(fend_fname, args.raw, args.insert, args.skipdups)
+            data.load_data_from_raw(fend_fname, args.raw, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                    args.processes)
+        elif not args.pairs is None:
+            data.load_data_from_pairs(fend_fname, args.pairs, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                      args.processes)
         elif not args.mat is None: 
             data.load_data_from_mat(fend_fname, args.mat, args.insert)
         elif not args.matrix is None:
             data.load_binned_data_from_matrices(fend_fname, args.matrix, format=None)
-        data.save()
+        data.save(compression=args.compression, compact=args.compact)
         del data
         for i in range(1, num_procs):
             comm.send(1, dest=i, tag=11)
     else:
         comm.recv(source=0, tag=11)
-    hic = HiC(project_fname, 'w', silent=args.silent)
+    hic = HiC(project_fname, 'w', silent=args.silent, num_workers=args.workers,
+              num_threads=args.threads)
     hic.load_data(data_fname)
     hic.filter_fends(mininteractions=args.minint, mindistance=args.mindist, maxdistance=args.maxdist)
     hic.find_distance_parameters(minsize=args.minbin, numbins=args.numbins)
     precorrect = False
+    if args.algorithm == 'binning' or args.checkpoint is None:
+        binning_checkpoint = args.checkpoint
+    else:
+        binning_checkpoint = "%s.binning" % args.checkpoint
     if args.algorithm in ['binning', 'binning-express', 'binning-probability']:
         hic.find_binning_fend_corrections(mindistance=args.mindist, maxdistance=args.maxdist, parameters=parameters,
                                              chroms=chroms, num_bins=modelbins, model=model, usereads=args.binreads,
                                              learning_threshold=args.threshold, max_iterations=args.biniter,
-                                             pseudocounts=args.pseudo)
+                                             pseudocounts=args.pseudo, checkpoint=binning_checkpoint,
+                                             checkpoint_interval=args.checkpoint_interval, resume=args.resume)
         precorrect = True
     if args.algorithm in ['probability', 'binning-probability']:
         hic.find_probability_fend_corrections(mindistance=args.mindist, maxdistance=args.maxdist,
                                               minchange=args.change, max_iterations=args.probiter,
                                               learningstep=args.step, chroms=chroms,
-                                              precalculate=args.precalc, precorrect=precorrect)
+                                              precalculate=args.precalc, precorrect=precorrect,
+                                              solver=args.solver, implicit_zeros=args.implicit,
+                                              checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+                                              resume=args.resume)
     elif args.algorithm in ['express', 'binning-express']:
         hic.find_express_fend_corrections(iterations=args.expiter, mindistance=args.mindist,
                                           maxdistance=args.maxdist, remove_distance=args.nodist,
                                           usereads=args.expreads, mininteractions=args.minint,
                                           chroms=chroms, minchange=args.change, precorrect=precorrect,
-                                          binary=args.binary, kr=args.kr)
+                                          binary=args.binary, kr=args.kr, checkpoint=args.checkpoint,
+                                          checkpoint_interval=args.checkpoint_interval, resume=args.resume)
     if rank == 0:
-        hic.save()
+        hic.save(compression=args.compression)
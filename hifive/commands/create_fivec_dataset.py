@@ -8,5 +8,5 @@ def run(args):
     if args.bam is None:
         data.load_data_from_counts(args.fragment, args.count)
     else:
-        data.load_data_from_bam(args.fragment, args.bam)
+        data.load_data_from_bam(args.fragment, args.bam, args.processes)
     data.save()
@@ -1,16 +1,26 @@
 #!/usr/bin/env python
 
+import os
+
 from ..hic_data import HiCData
 
 
 def run(args):
-    data = HiCData(args.output, 'w', silent=args.silent)
+    if args.append and os.path.exists(args.output):
+        data = HiCData(args.output, 'a', silent=args.silent)
+    else:
+        data = HiCData(args.output, 'w', silent=args.silent)
     if not args.bam is None: 
-        data.load_data_from_bam(args.fend, args.bam, args.insert, args.skipdups)
+        data.load_data_from_bam(args.fend, args.bam, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                args.processes)
     elif not args.raw is None: 
-        data.load_data_from_raw(args.fend, args.raw, args.insert, args.skipdups)
+        data.load_data_from_raw(args.fend, args.raw, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                args.processes)
+    elif not args.pairs is None:
+        data.load_data_from_pairs(args.fend, args.pairs, args.insert, args.skipdups, args.maxmem, args.tempdir,
+                                  args.processes)
     elif not args.mat is None: 
         data.load_data_from_mat(args.fend, args.mat)
     elif not args.matrix is None:
         data.load_binned_data_from_matrices(args.fend, args.matrix, format=None)
-    data.save()
+    data.save(compression=args.compression, compact=args.compact)
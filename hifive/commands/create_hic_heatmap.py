@@ -36,7 +36,7 @@ def run(args):
         chroms = args.chroms.split(',')
         if len(chroms) == 1 and chroms[0] == '':
             chroms = []
-    hic = HiC(args.project, 'r', silent=args.silent)
+    hic = HiC(args.project, 'r', silent=args.silent, num_workers=args.workers, lazy=True)
     hic.write_heatmap(args.output, binsize=args.binsize, includetrans=args.trans,
                       datatype=args.datatype, chroms=chroms, dynamically_binned=args.dynamic,
                       expansion_binsize=args.expbinsize, minobservations=args.minobs,
@@ -20,7 +20,7 @@ def run(args):
         rank = 0
         num_procs = 1
     if rank == 0:
-        hic = HiC(args.output, 'w', silent=args.silent)
+        hic = HiC(args.output, 'w', silent=args.silent, num_workers=args.workers)
         hic.load_data(args.data)
         hic.filter_fends(mininteractions=args.minint, mindistance=args.mindist, maxdistance=args.maxdist)
         hic.save()
@@ -28,7 +28,7 @@ def run(args):
             comm.send(1, dest=i, tag=11)
     else:
         comm.recv(source=0, tag=11)
-        hic = HiC(args.output, 'r', silent=True)
+        hic = HiC(args.output, 'r', silent=True, num_workers=args.workers)
     hic.find_distance_parameters(minsize=args.minbin, numbins=args.numbins)
     if rank == 0:
         hic.save()
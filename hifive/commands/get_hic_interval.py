@@ -18,7 +18,7 @@ from ..plotting import plot_full_array, plot_diagonal_from_upper_array, plot_key
 def run(args):
     if not args.image is None and args.pdf and "pyx" not in sys.modules.keys():
         parser.error("-p/--pdf requires the package 'pyx'")
-    hic = HiC(args.project, 'r', silent=args.silent)
+    hic = HiC(args.project, 'r', silent=args.silent, lazy=True)
     if 'binned' in hic.fends['/'].attrs and hic.fends['/'].attrs['binned'] is not None:
         binned = True
         chr_indices = 'bin_indices'
@@ -40,25 +40,35 @@ def run(args):
             if rank == 0:
                 print sys.stderr, ("-v/--model, -n/--modelbins, and -u/--parameter-types must be equal lengths.")
             return 1
-    hic = HiC(args.project, 'r', silent=args.silent)
+    hic = HiC(args.project, 'r', silent=args.silent, num_workers=args.workers,
+              num_threads=args.threads)
     precorrect = False
+    if args.algorithm == 'binning' or args.checkpoint is None:
+        binning_checkpoint = args.checkpoint
+    else:
+        binning_checkpoint = "%s.binning" % args.checkpoint
     if args.algorithm in ['binning', 'binning-express', 'binning-probability']:
         hic.find_binning_fend_corrections(mindistance=args.mindist, maxdistance=args.maxdist,
                                           chroms=chroms, num_bins=modelbins, model=model, parameters=parameters,
                                           usereads=args.binreads, learning_threshold=args.threshold,
-                                          max_iterations=args.biniter, pseudocounts=args.pseudo)
+                                          max_iterations=args.biniter, pseudocounts=args.pseudo,
+                                          checkpoint=binning_checkpoint, checkpoint_interval=args.checkpoint_interval,
+                                          resume=args.resume)
         precorrect = True
     if args.algorithm in ['probability', 'binning-probability']:
         hic.find_probability_fend_corrections(mindistance=args.mindist, maxdistance=args.maxdist,
                                               minchange=args.change, max_iterations=args.probiter,
                                               learningstep=args.step, chroms=chroms,
                                               precalculate=args.precalc, precorrect=precorrect,
-                                              model=args.probmodel)
+                                              model=args.probmodel, solver=args.solver,
+                                              implicit_zeros=args.implicit, checkpoint=args.checkpoint,
+                                              checkpoint_interval=args.checkpoint_interval, resume=args.resume)
     elif args.algorithm in ['express', 'binning-express']:
         hic.find_express_fend_corrections(iterations=args.expiter, mindistance=args.mindist,
                                           maxdistance=args.maxdist, remove_distance=args.nodist,
                                           usereads=args.expreads, mininteractions=args.minint,
                                           chroms=chroms, minchange=args.change, precorrect=precorrect,
-                                          binary=args.binary, kr=args.kr)
+                                          binary=args.binary, kr=args.kr, checkpoint=args.checkpoint,
+                                          checkpoint_interval=args.checkpoint_interval, resume=args.resume)
     if rank == 0:
         hic.save(args.output)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+
+"""A thin layer over MPI collective operations for sharing values between processes during parallel analysis."""
+
+import sys
+import copy
+import threading
+
+import numpy
+try:
+    from mpi4py import MPI
+except:
+    pass
+
+
+class Communicator(object):
+
+    """
+    This class performs collective communication between all processes of an MPI job.
+
+    Array operations use buffer-based MPI calls and act in place on contiguous numpy arrays, while scalar and general object operations use pickle-based calls. If no communicator is given or only one process is running, every operation leaves its input unchanged.
+
+    :param comm: A link to the MPI.COMM_WORLD class from the mpi4py package or 'None'.
+    :type comm: class
+    :returns: :class:`Communicator` class object.
+    """
+
+    def __init__(self, comm=None):
+        """Create a Communicator object."""
+        self.comm = comm
+        if comm is None:
+            self.rank = 0
+            self.num_procs = 1
+        else:
+            self.rank = comm.Get_rank()
+            self.num_procs = comm.Get_size()
+        return None
+
+    def sum(self, value):
+        """Return the sum of a scalar value across all processes."""
+        if self.num_procs == 1:
+            return value
+        return self.comm.allreduce(value, op=MPI.SUM)
+
+    def max(self, value):
+        """Return the maximum of a scalar value across all processes."""
+        if self.num_procs == 1:
+            return value
+        return self.comm.allreduce(value, op=MPI.MAX)
+
+    def bcast(self, value, root=0):
+        """Return the value held by process 'root' on all processes."""
+        if self.num_procs == 1:
+            return value
+        return self.comm.bcast(value, root=root)
+
+    def gather(self, value, root=0):
+        """Return a list of values from all processes, ordered by rank, on process 'root' and None elsewhere."""
+        if self.num_procs == 1:
+            return [value]
+        return self.comm.gather(value, root=root)
+
+    def Sum(self, array, root=None):
+        """
+        Sum an array across processes in place.
+
+        If 'root' is None, all processes receive the sum. Otherwise only process 'root' does and the arrays of other processes are left unchanged.
+        """
+        if self.num_procs == 1:
+            return array
+        if root is None:
+            self.comm.Allreduce(MPI.IN_PLACE, array, op=MPI.SUM)
+        elif self.rank == root:
+            self.comm.Reduce(MPI.IN_PLACE, array, op=MPI.SUM, root=root)
+        else:
+            self.comm.Reduce(array, None, op=MPI.SUM, root=root)
+        return array
+
+    def Bcast(self, array, root=0):
+        """Overwrite an array in place on all processes with the values from process 'root'."""
+        if self.num_procs == 1:
+            return array
+        self.comm.Bcast(array, root=root)
+        return array
+
+    def Allgather(self, array, ranges):
+        """
+        Share row blocks of an array in place, where process i holds valid rows ranges[i] through ranges[i + 1].
+
+        :param array: A contiguous numpy array with rows partitioned between processes.
+        :type array: numpy array
+        :param ranges: An array of size num_procs + 1 containing the first row of each process's block.
+        :type ranges: numpy array
+        """
+        if self.num_procs == 1:
+            return array
+        row_size = array.size / max(1, array.shape[0])
+        counts = ((ranges[1:] - ranges[:-1]) * row_size).astype(numpy.int64)
+        displacements = (ranges[:-1] * row_size).astype(numpy.int64)
+        self.comm.Allgatherv(MPI.IN_PLACE, [array, (counts, displacements)])
+        return array
+
+
+class ThreadCommunicator(Communicator):
+
+    """
+    This class performs the same collective operations as :class:`Communicator` between worker threads of a single process.
+
+    Each operation waits for all workers, then combines the values deposited by each worker in rank order so that every worker receives an identical result.
+
+    :param rank: The index of this worker.
+    :type rank: int.
+    :param group: The :class:`_ThreadGroup` shared by all workers.
+    :type group: class
+    :returns: :class:`ThreadCommunicator` class object.
+    """
+
+    def __init__(self, rank, group):
+        """Create a ThreadCommunicator object."""
+        self.comm = None
+        self.rank = rank
+        self.num_procs = group.size
+        self.group = group
+        return None
+
+    def _exchange(self, value):
+        """Return the values deposited by all workers, waiting until each worker has read them before returning."""
+        self.group.values[self.rank] = value
+        self.group.wait()
+        values = list(self.group.values)
+        self.group.wait()
+        return values
+
+    def sum(self, value):
+        """Return the sum of a scalar value across all workers."""
+        values = self._exchange(value)
+        total = values[0]
+        for i in range(1, self.num_procs):
+            total += values[i]
+        return total
+
+    def max(self, value):
+        """Return the maximum of a scalar value across all workers."""
+        return max(self._exchange(value))
+
+    def bcast(self, value, root=0):
+        """Return the value held by worker 'root' on all workers."""
+        return self._exchange(value)[root]
+
+    def gather(self, value, root=0):
+        """Return a list of values from all workers, ordered by rank, on worker 'root' and None elsewhere."""
+        values = self._exchange(value)
+        if self.rank == root:
+            return values
+        return None
+
+    def Sum(self, array, root=None):
+        """Sum an array across workers in place, on all workers if 'root' is None or only on worker 'root'."""
+        self.group.values[self.rank] = array
+        self.group.wait()
+        if root is None or self.rank == root:
+            total = numpy.copy(self.group.values[0])
+            for i in range(1, self.num_procs):
+                total += self.group.values[i]
+        self.group.wait()
+        if root is None or self.rank == root:
+            array[...] = total
+        return array
+
+    def Bcast(self, array, root=0):
+        """Overwrite an array in place on all workers with the values from worker 'root'."""
+        self.group.values[self.rank] = array
+        self.group.wait()
+        if self.rank != root:
+            array[...] = self.group.values[root]
+        self.group.wait()
+        return array
+
+    def Allgather(self, array, ranges):
+        """Share row blocks of an array in place, where worker i holds valid rows ranges[i] through ranges[i + 1]."""
+        self.group.values[self.rank] = array
+        self.group.wait()
+        for i in range(self.num_procs):
+            if i != self.rank:
+                array[ranges[i]:ranges[i + 1]] = self.group.values[i][ranges[i]:ranges[i + 1]]
+        self.group.wait()
+        return array
+
+
+class _WorkerFailure(Exception):
+
+    """Raised in waiting workers when another worker has failed."""
+
+    pass
+
+
+class _ThreadGroup(object):
+
+    """Hold values exchanged between worker threads and a reusable barrier that fails all workers if one of them fails."""
+
+    def __init__(self, size):
+        self.size = size
+        self.values = [None] * size
+        self.condition = threading.Condition()
+        self.count = 0
+        self.generation = 0
+        self.failed = False
+        return None
+
+    def wait(self):
+        self.condition.acquire()
+        try:
+            if self.failed:
+                raise _WorkerFailure()
+            generation = self.generation
+            self.count += 1
+            if self.count == self.size:
+                self.count = 0
+                self.generation += 1
+                self.condition.notify_all()
+            else:
+                while generation == self.generation and not self.failed:
+                    self.condition.wait()
+                if self.failed:
+                    raise _WorkerFailure()
+        finally:
+            self.condition.release()
+        return None
+
+    def fail(self):
+        self.condition.acquire()
+        self.failed = True
+        self.condition.notify_all()
+        self.condition.release()
+        return None
+
+
+def run_workers(obj, method, args, kwargs, num_workers):
+    """
+    Run an MPI-compatible method of an analysis object across local worker threads.
+
+    Each worker runs the method on its own copy of the object, with its own copies of all array attributes, a rank and a :class:`ThreadCommunicator`, exactly as separate MPI processes would. Compiled routines release the GIL, so workers run concurrently. Once all workers finish, the attributes of worker zero are copied back to the original object.
+
+    :param obj: The object whose method is being run. Its 'rank', 'num_procs', 'collective' and 'silent' attributes are set for each worker.
+    :type obj: class
+    :param method: The unbound method to run.
+    :type method: function
+    :param args: Positional arguments to pass to the method.
+    :type args: tuple
+    :param kwargs: Keyword arguments to pass to the method.
+    :type kwargs: dict.
+    :param num_workers: The number of worker threads to run.
+    :type num_workers: int.
+    :returns: The value returned by worker zero.
+    """
+    group = _ThreadGroup(num_workers)
+    workers = []
+    results = [None] * num_workers
+    errors = []
+    for rank in range(num_workers):
+        worker = copy.copy(obj)
+        for key, value in worker.__dict__.items():
+            if isinstance(value, numpy.ndarray):
+                worker.__dict__[key] = numpy.copy(value)
+        worker.rank = rank
+        worker.num_procs = num_workers
+        worker.num_workers = 1
+        worker.collective = ThreadCommunicator(rank, group)
+        if rank > 0:
+            worker.silent = True
+        workers.append(worker)
+
+    def run(rank):
+        try:
+            results[rank] = method(workers[rank], *args, **kwargs)
+        except _WorkerFailure:
+            pass
+        except:
+            errors.append(sys.exc_info())
+            group.fail()
+        return None
+
+    threads = [threading.Thread(target=run, args=(rank,)) for rank in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    for key, value in workers[0].__dict__.items():
+        if key not in ['rank', 'num_procs', 'num_workers', 'collective', 'silent']:
+            obj.__dict__[key] = value
+    return results[0]
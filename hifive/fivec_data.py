@@ -12,6 +12,8 @@ try:
 except:
     pass
 
+import hic_data
+
 
 
 class FiveCData(object):
@@ -197,7 +199,7 @@ class FiveCData(object):
         self.history += "Success\n"
         return None
 
-    def load_data_from_bam(self, fragfilename, filelist):
+    def load_data_from_bam(self, fragfilename, filelist, processes=1):
         """
         Read interaction counts from pairs of BAM files and place in h5dict.
 
@@ -205,6 +207,8 @@ class FiveCData(object):
         :type fragfilename: str.
         :param filelist: A list containing lists of paired read end files.
         :type filelist: list
+        :param processes: The number of processes to use for reading BAM files. Indexed files are split into shards of reference sequences that are read in parallel. Otherwise, any processes beyond one per file are used for decompression.
+        :type processes: int.
         :returns: None
 
         :Attributes: * **fragfilename** (*str.*) - A string containing the relative path of the fragment file.
@@ -216,7 +220,7 @@ class FiveCData(object):
 
         When data is loaded the 'history' attribute is updated to include the history of the Fragment file that becomes associated with it.
         """
-        self.history += "FiveCData.load_data_from_counts(fragfilename='%s', filelist=%s) - " % (fragfilename, str(filelist))
+        self.history += "FiveCData.load_data_from_bam(fragfilename='%s', filelist=%s, processes=%i) - " % (fragfilename, str(filelist), processes)
         if 'pysam' not in sys.modules.keys():
             if not self.silent:
                 print >> sys.stderr, ("The pysam module must be installed to use this function.")
@@ -237,8 +241,8 @@ class FiveCData(object):
             chr2int[j] = i
         # create fragment name dictionary
         names = {}
-        for i in range(self.frags['fragments'].shape[0]):
-            names[self.frags['fragments']['name'][i]] = i
+        for i, name in enumerate(self.frags['fragments']['name'][...]):
+            names[name] = i
         # load data from all files, skipping if either fragment not not in the fragment file.
         if isinstance(filelist[0], str):
             filelist = [[filelist[0], filelist[1]]]
@@ -260,64 +264,55 @@ class FiveCData(object):
             if not present:
                 if not self.silent:
                     print >> sys.stderr, ("No data for one or both ends could be located. Skipping this run.\n")
-            reads = 0
-            unpaired = {}
-            # load first half of paired ends
-            if not self.silent:
-                print >> sys.stderr, ("Loading data from %s...") % (filepair[0].split('/')[-1]),
-            input = pysam.Samfile(filepair[0], 'rb')
-            for read in input.fetch(until_eof=True):
-                # Only consider reads with an alignment
-                if read.is_unmapped:
-                    continue
-                # if mapping name not in fragment names, skip
-                seq_name = input.getrname(read.tid)
-                if seq_name not in names:
-                    continue
-                # skip multiply-aligned reads
-                for tag in read.tags:
-                    if tag[0] == 'XS':
-                        break
-                else:
-                    unpaired[read.qname] = names[seq_name]
-            input.close()
-            if not self.silent:
-                print >> sys.stderr, ("Done\n"),
-            # load second half of paired ends
+                continue
             if not self.silent:
-                print >> sys.stderr, ("Loading data from %s...") % (filepair[1].split('/')[-1]),
-            input = pysam.Samfile(filepair[1], 'rb')
-            for read in input.fetch(until_eof=True):
-                # Only consinder reads whose paired end was valid
-                if read.qname not in unpaired:
-                    continue
-                # Only consider reads with an alignment
-                if read.is_unmapped:
-                    continue
-                # if mapping name not in fragment names, skip
-                seq_name = input.getrname(read.tid)
-                if seq_name not in names:
-                    continue
-                # skip multiply-aligned reads
-                for tag in read.tags:
-                    if tag[0] == 'XS':
-                        break
-                else:
-                    # if both ends map to the same orientation, skip
-                    if strands[unpaired[read.qname]] != strands[names[seq_name]]:
-                        pair = (min(unpaired[read.qname], names[seq_name]),
-                                max(unpaired[read.qname], names[seq_name]))
-                        if pair not in data:
-                            data[pair] = 0
-                        data[pair] += 1
-                        reads += 1
-                    del unpaired[read.qname]
-            input.close()
+                print >> sys.stderr, ("Loading data from %s and %s...") % (filepair[0].split('/')[-1],
+                                                                           filepair[1].split('/')[-1]),
+            ends1, ends2 = hic_data._load_bam_ends(filepair, processes, multimapped=True)
+            # find the fragment index for each mapped read, skipping multiply-aligned reads
+            frags1 = self._find_bam_fragments(ends1[0], names)[ends1[2]]
+            frags2 = self._find_bam_fragments(ends2[0], names)[ends2[2]]
+            frags1[ends1[4]] = -1
+            frags2[ends2[4]] = -1
+            # keep the last valid alignment of each read name from the first file
+            valid = numpy.where(frags1 >= 0)[0]
+            names1 = ends1[1][valid]
+            frags1 = frags1[valid]
+            order = numpy.argsort(names1, kind='mergesort')
+            names1 = names1[order]
+            last = numpy.r_[numpy.where(names1[1:] != names1[:-1])[0], names1.shape[0] - 1]
+            names1 = names1[last]
+            frags1 = frags1[order[last]]
+            # pair each read name with the first valid alignment of its mate in the second file
+            valid = numpy.where(frags2 >= 0)[0]
+            names2 = ends2[1][valid]
+            frags2 = frags2[valid]
+            del ends1, ends2, order, last, valid
+            indices = numpy.minimum(numpy.searchsorted(names1, names2), max(0, names1.shape[0] - 1))
+            if names1.shape[0] > 0:
+                matched = numpy.where(names1[indices] == names2)[0]
+            else:
+                matched = numpy.zeros(0, dtype=numpy.int64)
+            indices = indices[matched]
+            first = numpy.unique(indices, return_index=True)[1]
+            indices = indices[first]
+            frags2 = frags2[matched[first]]
+            frags1 = frags1[indices]
+            del names1, names2, matched, first, indices
+            # if both ends map to the same orientation, skip
+            valid = numpy.where(strands[frags1] != strands[frags2])[0]
+            keys = (numpy.minimum(frags1[valid], frags2[valid]).astype(numpy.int64) << 32) + numpy.maximum(
+                    frags1[valid], frags2[valid])
+            keys, counts = numpy.unique(keys, return_counts=True)
+            for i in range(keys.shape[0]):
+                pair = (int(keys[i] >> 32), int(keys[i] & 4294967295))
+                data[pair] = data.get(pair, 0) + int(counts[i])
+            reads = valid.shape[0]
             if not self.silent:
                 print >> sys.stderr, ("Done\n"),
             if not self.silent:
                 print >> sys.stderr, ("Read %i validly_mapped read paired.\n") % (reads),
-            total_reads += reads           
+            total_reads += reads
         if len(data) == 0:
             if not self.silent:
                 print >> sys.stderr, ("No valid data was loaded.\n"),
@@ -330,6 +325,14 @@ class FiveCData(object):
         self.history += 'Success\n'
         return None
 
+    def _find_bam_fragments(self, references, names):
+        """Return an array of fragment indices for BAM reference sequences, -1 for those not in the fragment file."""
+        frags = numpy.zeros(len(references), dtype=numpy.int64) - 1
+        for i, name in enumerate(references):
+            if name in names:
+                frags[i] = names[name]
+        return frags
+
     def _parse_fragment_pairs(self, frag_pairs):
         """Separate frag pairs into cis (within region) and trans (between region) interactions and write to h5dict with index arrays."""
         if not self.silent:
@@ -5,11 +5,13 @@
 import os
 import sys
 import struct
+import functools
 
 import numpy
 import h5py
 from scipy.stats import poisson, nbinom
 from scipy.optimize import fmin_l_bfgs_b as bfgs
+from scipy import sparse
 try:
     from mpi4py import MPI
 except:
@@ -19,13 +21,63 @@ try:
 except:
     pass
 
+import communication
 import hic_binning
+from checkpoint import Checkpoint
+import hic_data
 import libraries._hic_binning as _binning
 import libraries._hic_distance as _distance
 import libraries._hic_interactions as _interactions
 import libraries._hic_optimize as _optimize
 import plotting
 
+# number of lookup table cells evenly dividing each power-of-two distance range for unbinned projects
+_DISTANCE_TABLE_CELLS = 512
+
+
+class _Converged(Exception):
+
+    """Raised from an optimization callback to stop once the convergence criterion is met."""
+
+    pass
+
+
+def _implicit_zero_cost(cost_function, zero_args, zero_settings):
+    """Add the cost of unobserved fend pairs, found without storing them, to a compiled cost function."""
+    def implicit_cost(*args):
+        # args end with corrections, log_corrections and num_threads
+        return cost_function(*args) + _optimize.calculate_implicit_zero_cost(*(zero_args + [args[-3]] +
+                                                                                zero_settings + [args[-1]]))
+    return implicit_cost
+
+
+def _implicit_zero_gradients(gradient_function, zero_args, zero_settings):
+    """Add the gradients of unobserved fend pairs, found without storing them, to a compiled gradient function."""
+    def implicit_gradients(*args):
+        # args end with corrections, inv_corrections, gradients and num_threads
+        gradient_function(*args)
+        _optimize.calculate_implicit_zero_gradients(*(zero_args + [args[-4], args[-2]] + zero_settings + [args[-1]]))
+        return None
+    return implicit_gradients
+
+
+def _local_workers(method):
+    """Run an MPI-compatible method across 'num_workers' local threads when not running under MPI."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.num_procs > 1 or self.num_workers <= 1:
+            return method(self, *args, **kwargs)
+        # each worker needs its own copy of every project array, so read any not yet loaded
+        for key in self._lazy.keys():
+            getattr(self, key)
+        return communication.run_workers(self, method, args, kwargs, self.num_workers)
+    return wrapper
+
+
+# fend and data index tables held in memory once read, shared by HiC methods and hic_binning/hic_domains
+_FEND_TABLES = ['fends', 'bins', 'chr_indices', 'bin_indices', 'chromosomes']
+_INDEX_TABLES = ['cis_indices', 'trans_chrom_indices']
+
 
 class HiC(object):
 
@@ -45,6 +97,12 @@ class HiC(object):
     :type mode: str.
     :param silent: Indicates whether to print information about function execution for this object.
     :type silent: bool.
+    :param num_workers: The number of local threads to divide the work of MPI-compatible methods between when not running under MPI. Each thread acts as a separate MPI process would.
+    :type num_workers: int.
+    :param num_threads: The number of OpenMP threads used by the compiled optimization routines of the probability and express normalization methods.
+    :type num_threads: int.
+    :param lazy: If 'True', arrays saved in the h5dict are not read when the object is created but on their first access, and the associated :class:`HiCData <hifive.hic_data.HiCData>` and :class:`Fend <hifive.fend.Fend>` h5dicts are not opened until they are needed. Arrays stored contiguously and uncompressed are memory-mapped copy-on-write rather than read into memory.
+    :type lazy: bool.
     :returns: :class:`HiC <hifive.hic.HiC>` class object.
 
     :attributes: * **file** (*str.*) - A string containing the name of the file passed during object creation for saving the object to.
@@ -54,12 +112,17 @@ class HiC(object):
                  * **comm** (*class*) - A link to the MPI.COMM_WORLD class from the mpi4py package. If this package isn't present, this is set to 'None'.
                  * **rank** (*int.*) - The rank integer of this process, if running with mpi, otherwise set to zero.
                  * **num_procs** (*int.*) - The number of processes being executed in parallel. If mpi4py package is not present, this is set to one.
+                 * **num_workers** (*int.*) - The number of local threads used by MPI-compatible methods when not running with mpi.
+                 * **num_threads** (*int.*) - The number of threads used by compiled optimization routines within each process or local worker.
+                 * **collective** (*class*) - A :class:`Communicator <hifive.communication.Communicator>` used to share values between processes with MPI collective operations.
 
     In addition, many other attributes are initialized to the 'None' state.
     """
 
-    def __init__(self, filename, mode='r', silent=False):
+    def __init__(self, filename, mode='r', silent=False, num_workers=1, num_threads=1, lazy=False):
         """Create a HiC object."""
+        self._lazy = {}
+        self._distance_tables = {}
         self.file = os.path.abspath(filename)
         self.filetype = 'hic_project'
         if 'mpi4py' in sys.modules.keys():
@@ -70,6 +133,9 @@ class HiC(object):
             self.comm = None
             self.rank = 0
             self.num_procs = 1
+        self.collective = communication.Communicator(self.comm)
+        self.num_workers = num_workers
+        self.num_threads = num_threads
         if self.rank == 0:
             self.silent = silent
         else:
@@ -87,13 +153,25 @@ class HiC(object):
         self.normalization = 'none'
         self.history = ''
         if mode != 'w':
-            self.load()
+            self.load(lazy=lazy)
         return None
 
+    def __getattr__(self, name):
+        """Materialize lazily-loaded attributes on first access."""
+        lazy = self.__dict__.get('_lazy', {})
+        if name not in lazy:
+            raise AttributeError("'HiC' object has no attribute '%s'" % name)
+        value = lazy[name]()
+        del lazy[name]
+        self.__dict__[name] = value
+        return value
+
     def __getitem__(self, key):
         """Dictionary-like lookup."""
         if key in self.__dict__:
             return self.__dict__[key]
+        elif key in self._lazy:
+            return getattr(self, key)
         else:
             return None
 
@@ -129,7 +207,7 @@ class HiC(object):
             return None
         self.datafilename = "%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(filename)),
                                        os.path.dirname(self.file)), os.path.basename(filename))
-        self.data = h5py.File(filename, 'r')
+        self.data = hic_data._DataFile(filename, 'r', cached=_INDEX_TABLES)
         self.history = self.data['/'].attrs['history'] + self.history
         fendfilename = self.data['/'].attrs['fendfilename']
         if fendfilename[:2] == './':
@@ -145,7 +223,7 @@ class HiC(object):
                 print >> sys.stderr, ("Could not find %s.\n") % (fendfilename),
             self.history += "Error: '%s' not found\n" % fendfilename
             return None
-        self.fends = h5py.File(fendfilename, 'r')
+        self.fends = hic_data._DataFile(fendfilename, 'r', cached=_FEND_TABLES)
         if 'binned' in self.fends['/'].attrs:
             self.binned = self.fends['/'].attrs['binned']
         # create dictionary for converting chromosome names to indices
@@ -160,12 +238,14 @@ class HiC(object):
         self.history += "Succcess\n"
         return None
 
-    def save(self, out_fname=None):
+    def save(self, out_fname=None, compression=None):
         """
         Save analysis parameters to h5dict.
 
         :param filename: Specifies the file name of the :class:`HiC <hifive.hic.HiC>` object to save this analysis to.
         :type filename: str.
+        :param compression: The compression filter to store arrays with, either 'gzip', 'lzf', or 'blosc', with byte shuffling. 'blosc' requires the :mod:`hdf5plugin` module and falls back to 'gzip' if it is not installed. If None, arrays are stored uncompressed and contiguous.
+        :type compression: str.
         :returns: None
         """
         self.history.replace("'None'", "None")
@@ -198,9 +278,17 @@ class HiC(object):
                 datafilename = self.datafilename
             if 'fendfilename' in self.__dict__:
                 fendfilename = self.fendfilename
+        # read any arrays not yet accessed and detach memory-mapped arrays before the file is overwritten
+        for key in self._lazy.keys():
+            if key not in ['data', 'fends', 'chr2int']:
+                getattr(self, key)
+        for key in self.__dict__.keys():
+            if isinstance(self.__dict__[key], numpy.memmap):
+                self.__dict__[key] = numpy.array(self.__dict__[key])
         datafile = h5py.File(out_fname, 'w')
         for key in self.__dict__.keys():
-            if key in ['data', 'fends', 'file', 'chr2int', 'comm', 'rank', 'num_procs', 'silent']:
+            if key in ['data', 'fends', 'file', 'chr2int', 'comm', 'collective', 'rank', 'num_procs', 'num_workers',
+                       'num_threads', 'silent', '_lazy']:
                 continue
             elif self[key] is None:
                 continue
@@ -209,20 +297,23 @@ class HiC(object):
             elif key == 'datafilename':
                 datafile.attrs[key] = datafilename
             elif isinstance(self[key], numpy.ndarray):
-                datafile.create_dataset(key, data=self[key])
+                datafile.create_dataset(key, data=self[key], **hic_data._dataset_options(self[key], compression))
             elif not isinstance(self[key], dict):
                 datafile.attrs[key] = self[key]
         datafile.close()
         return None
 
-    def load(self):
+    def load(self, lazy=False):
         """
         Load analysis parameters from h5dict specified at object creation and open h5dicts for associated :class:`HiCData <hifive.hic_data.HiCData>` and :class:`Fend <hifive.fend.Fend>` objects.
 
         Any call of this function will overwrite current object data with values from the last :func:`save` call.
 
+        :param lazy: If 'True', arrays are read (or memory-mapped if stored contiguously and uncompressed) on first access and the data and fend h5dicts are opened when first needed.
+        :type lazy: bool.
         :returns: None
         """
+        self._lazy = {}
         # set parameters to init state
         self.binning_corrections = None
         self.binning_correction_indices = None
@@ -239,9 +330,14 @@ class HiC(object):
         # load data hdf5 dict 
         datafile = h5py.File(self.file, 'r')
         for key in datafile.keys():
-            self[key] = numpy.copy(datafile[key])
+            if lazy:
+                self.__dict__.pop(key, None)
+                self._lazy[key] = self._array_loader(key)
+            else:
+                self[key] = numpy.copy(datafile[key])
         for key in datafile['/'].attrs.keys():
             self[key] = datafile['/'].attrs[key]
+        datafile.close()
         # ensure data h5dict exists
         if 'datafilename' in self.__dict__:
             datafilename = self.datafilename
@@ -253,8 +349,10 @@ class HiC(object):
             if not os.path.exists(datafilename):
                 if not self.silent:
                     print >> sys.stderr, ("Could not find %s. No data loaded.\n") % (datafilename),
+            elif lazy:
+                self._lazy['data'] = lambda: hic_data._DataFile(datafilename, 'r', cached=_INDEX_TABLES)
             else:
-                self.data = h5py.File(datafilename, 'r')
+                self.data = hic_data._DataFile(datafilename, 'r', cached=_INDEX_TABLES)
         # ensure fend h5dict exists
         if 'fendfilename' in self.__dict__:
             fendfilename = self.fendfilename
@@ -266,17 +364,60 @@ class HiC(object):
             if not os.path.exists(fendfilename):
                 if not self.silent:
                     print >> sys.stderr, ("Could not find %s. No fends loaded.\n") % (fendfilename),
+            elif lazy:
+                self._lazy['fends'] = lambda: hic_data._DataFile(fendfilename, 'r', cached=_FEND_TABLES)
+                self._lazy['chr2int'] = self._find_chr2int
+                if self.binned is None:
+                    del self.binned
+                    self._lazy['binned'] = self._find_binned
             else:
-                self.fends = h5py.File(fendfilename, 'r')
+                self.fends = hic_data._DataFile(fendfilename, 'r', cached=_FEND_TABLES)
                 if 'binned' in self.fends['/'].attrs:
                     self.binned = self.fends['/'].attrs['binned']
         # create dictionary for converting chromosome names to indices
-        self.chr2int = {}
-        for i, chrom in enumerate(self.fends['chromosomes']):
-            self.chr2int[chrom] = i
-        datafile.close()
+        if not lazy:
+            self.chr2int = self._find_chr2int()
+        return None
+
+    def _array_loader(self, key):
+        """Return a function reading array 'key' from the h5dict, memory-mapping it if possible."""
+        def load_array():
+            datafile = h5py.File(self.file, 'r')
+            dataset = datafile[key]
+            offset = dataset.id.get_offset()
+            if (dataset.chunks is None and dataset.compression is None and offset is not None and
+                    dataset.size > 0):
+                value = numpy.memmap(self.file, dtype=dataset.dtype, mode='c', offset=offset, shape=dataset.shape)
+            else:
+                value = numpy.copy(dataset)
+            datafile.close()
+            return value
+        return load_array
+
+    def _find_binned(self):
+        """Read the binning state from the fend h5dict."""
+        if 'binned' in self.fends['/'].attrs:
+            return self.fends['/'].attrs['binned']
         return None
 
+    def _find_chr2int(self):
+        """Create dictionary for converting chromosome names to indices."""
+        chr2int = {}
+        for i, chrom in enumerate(self.fends['chromosomes']):
+            chr2int[chrom] = i
+        return chr2int
+
+    def _find_trans_chrom_indices(self):
+        """Return the first trans data row of each chromosome pair, ordering data from older files in memory."""
+        if 'trans_chrom_indices' not in self.data:
+            if not self.silent and self.rank == 0:
+                print >> sys.stderr, ("Trans data in %s are not indexed by chromosome pair and are ordered in memory each time the file is opened. Loading and saving the file with HiCData stores the ordered data.\n") % (self.data.file.filename),
+            if self.binned is None:
+                self.data.index_trans_data(self.fends['chr_indices'][...])
+            else:
+                self.data.index_trans_data(self.fends['bin_indices'][...])
+        return self.data['trans_chrom_indices'][...]
+
     def reset_filter(self):
         """
         Return all fends to a valid filter state.
@@ -292,7 +433,7 @@ class HiC(object):
         """
         Iterate over the dataset and remove fends that do not have 'minobservations' within 'maxdistance' of themselves using only unfiltered fends.
 
-        In order to create a set of fends that all have the necessary number of interactions, after each round of filtering, fend interactions are retallied using only interactions that have unfiltered fends at both ends.
+        In order to create a set of fends that all have the necessary number of interactions, fend interactions are tallied using only interactions that have unfiltered fends at both ends. Each time a fend is removed, only the tallies of its interaction partners are reduced, so all fends are filtered with a fixed number of passes over the data.
 
         :param mininteractions: The required number of interactions for keeping a fend in analysis.
         :type mininteractions: int.
@@ -319,8 +460,6 @@ class HiC(object):
             maxdistance = 0
         self.maxdistance = maxdistance
         original_count = numpy.sum(self.filter)
-        previous_valid = original_count + 1
-        current_valid = original_count
         coverage = numpy.zeros(self.filter.shape[0], dtype=numpy.int32)
         # determine maximum ranges of valid interactions for each fend
         if usereads != 'trans':
@@ -358,23 +497,52 @@ class HiC(object):
             indices = self.data['cis_indices'][...]
         if usereads != 'cis':
             transdata = self.data['trans_data'][...][:, :2]
-        # repeat until all remaining fends have mininteraction valid interactions
-        while current_valid < previous_valid:
-            previous_valid = current_valid
+        # find initial coverage
+        if usereads != 'trans':
+            _interactions.find_fend_coverage(data,
+                                             indices,
+                                             self.filter,
+                                             min_fend,
+                                             max_fend,
+                                             coverage,
+                                             mininteractions)
+        if usereads != 'cis':
+            coverage += numpy.bincount(transdata.ravel(), minlength=coverage.shape[0])
+        self.filter[:] = coverage >= mininteractions
+        current_valid = numpy.sum(self.filter)
+        # find coverage and interaction partners among remaining fends, then remove fends until all remaining fends
+        # have mininteraction valid interactions, updating only the partners of each removed fend
+        if current_valid < original_count:
             coverage.fill(0)
-            if usereads != 'trans':
-                _interactions.find_fend_coverage(data,
-                                                 indices,
-                                                 self.filter,
-                                                 min_fend,
-                                                 max_fend,
-                                                 coverage,
-                                                 mininteractions)
-            if usereads != 'cis':
-                coverage += numpy.bincount(transdata.ravel(), minlength=coverage.shape[0])
-            self.filter[:] = coverage >= mininteractions
-            if usereads != 'cis':
-                transdata = transdata[numpy.where(self.filter[transdata[:, 0]] * self.filter[transdata[:, 1]])[0], :]
+            positions = numpy.zeros(self.filter.shape[0], dtype=numpy.int64)
+            neighbors = numpy.zeros(0, dtype=numpy.int32)
+            for fill in [False, True]:
+                if usereads != 'trans':
+                    _interactions.find_cis_fend_neighbors(data,
+                                                          indices,
+                                                          self.filter,
+                                                          min_fend,
+                                                          max_fend,
+                                                          positions,
+                                                          neighbors,
+                                                          coverage)
+                if usereads != 'cis':
+                    _interactions.find_trans_fend_neighbors(transdata,
+                                                            self.filter,
+                                                            positions,
+                                                            neighbors,
+                                                            coverage)
+                if not fill:
+                    neighbor_indices = numpy.r_[0, numpy.cumsum(positions)].astype(numpy.int64)
+                    positions = neighbor_indices[:-1].copy()
+                    neighbors = numpy.zeros(neighbor_indices[-1], dtype=numpy.int32)
+                    if neighbors.shape[0] == 0:
+                        break
+            _interactions.filter_fend_neighbors(neighbor_indices,
+                                                neighbors,
+                                                self.filter,
+                                                coverage,
+                                                mininteractions)
             current_valid = numpy.sum(self.filter)
         if not self.silent:
             if self.binned is None:
@@ -384,6 +552,7 @@ class HiC(object):
         self.history += "Success\n"
         return None
 
+    @_local_workers
     def find_distance_parameters(self, numbins=90, minsize=200, maxsize=0, corrected=False):
         """
         Count reads and possible interactions from valid fend pairs in each distance bin to find mean bin signals. This function is MPI compatible.
@@ -497,49 +666,33 @@ class HiC(object):
                                                  node_start,
                                                  node_stop,
                                                  int(self.binned is not None))
-        if self.rank == 0:
-            # exchange arrays
+        if not self.silent:
+            print >> sys.stderr, ('\r%s\rCalculating distance function...') % (' ' * 80),
+        # sum arrays across all nodes
+        self.collective.Sum(bin_size)
+        self.collective.Sum(count_sum)
+        self.collective.Sum(logdistance_sum)
+        valid = numpy.where(count_sum > 0)[0]
+        if valid.shape[0] < 3:
             if not self.silent:
-                print >> sys.stderr, ('\r%s\rCalculating distance function...') % (' ' * 80),
-            for i in range(1, self.num_procs):
-                bin_size += self.comm.recv(source=i, tag=11)
-                count_sum += self.comm.recv(source=i, tag=11)
-                logdistance_sum += self.comm.recv(source=i, tag=11)
-            valid = numpy.where(count_sum > 0)[0]
-            if valid.shape[0] < 3:
-                if not self.silent:
-                    print >> sys.stderr, ('\r%s\rInsufficient data to construct a distance function\n') % (' ' * 80),
-                for i in range(1, self.num_procs):
-                    self.comm.send(None, dest=i, tag=11)
-                return None
-            count_means = numpy.log(count_sum[valid].astype(numpy.float64) / bin_size[valid, 1])
-            binary_means = numpy.log(bin_size[valid, 0].astype(numpy.float64) / bin_size[valid, 1])
-            distance_means = logdistance_sum[valid] / bin_size[valid, 1]
-            # find distance line parameters, cutoffs, slopes and intercepts
-            distance_parameters = numpy.zeros((valid.shape[0] - 1, 3), dtype=numpy.float32)
-            distance_parameters[:-1, 0] = distance_means[1:-1]
-            distance_parameters[-1, 0] = numpy.inf
-            distance_parameters[:, 1] = ((count_means[1:] - count_means[:-1]) /
-                                         (distance_means[1:] - distance_means[:-1]))
-            distance_parameters[:, 2] = (count_means[1:] - distance_parameters[:, 1] * distance_means[1:])
-            bin_distance_parameters = numpy.zeros((valid.shape[0] - 1, 3), dtype=numpy.float32)
-            bin_distance_parameters[:-1, 0] = distance_means[1:-1]
-            bin_distance_parameters[-1, 0] = numpy.inf
-            bin_distance_parameters[:, 1] = ((binary_means[1:] - binary_means[:-1]) /
-                                         (distance_means[1:] - distance_means[:-1]))
-            bin_distance_parameters[:, 2] = (binary_means[1:] - bin_distance_parameters[:, 1] * distance_means[1:])
-            # distribute distance parameters to all nodes
-            for i in range(1, self.num_procs):
-                self.comm.send(distance_parameters, dest=i, tag=11)
-                self.comm.send(bin_distance_parameters, dest=i, tag=11)
-        else:
-            self.comm.send(bin_size, dest=0, tag=11)
-            self.comm.send(count_sum, dest=0, tag=11)
-            self.comm.send(logdistance_sum, dest=0, tag=11)
-            distance_parameters = self.comm.recv(source=0, tag=11)
-            if distance_parameters is None:
-                return None
-            bin_distance_parameters = self.comm.recv(source=0, tag=11)
+                print >> sys.stderr, ('\r%s\rInsufficient data to construct a distance function\n') % (' ' * 80),
+            return None
+        count_means = numpy.log(count_sum[valid].astype(numpy.float64) / bin_size[valid, 1])
+        binary_means = numpy.log(bin_size[valid, 0].astype(numpy.float64) / bin_size[valid, 1])
+        distance_means = logdistance_sum[valid] / bin_size[valid, 1]
+        # find distance line parameters, cutoffs, slopes and intercepts
+        distance_parameters = numpy.zeros((valid.shape[0] - 1, 3), dtype=numpy.float32)
+        distance_parameters[:-1, 0] = distance_means[1:-1]
+        distance_parameters[-1, 0] = numpy.inf
+        distance_parameters[:, 1] = ((count_means[1:] - count_means[:-1]) /
+                                     (distance_means[1:] - distance_means[:-1]))
+        distance_parameters[:, 2] = (count_means[1:] - distance_parameters[:, 1] * distance_means[1:])
+        bin_distance_parameters = numpy.zeros((valid.shape[0] - 1, 3), dtype=numpy.float32)
+        bin_distance_parameters[:-1, 0] = distance_means[1:-1]
+        bin_distance_parameters[-1, 0] = numpy.inf
+        bin_distance_parameters[:, 1] = ((binary_means[1:] - binary_means[:-1]) /
+                                     (distance_means[1:] - distance_means[:-1]))
+        bin_distance_parameters[:, 2] = (binary_means[1:] - bin_distance_parameters[:, 1] * distance_means[1:])
         self.distance_parameters = distance_parameters
         self.bin_distance_parameters = bin_distance_parameters
         if self.chromosome_means is None:
@@ -549,11 +702,53 @@ class HiC(object):
         self.history += "Success\n"
         return None
 
+    def find_distance_table(self, binary=False):
+        """
+        Return a lookup table of distance-dependent means for the current distance function.
+
+        Tables are built once for each set of distance parameters and shared by all expected-value and implicit correction routines, so those routines don't need to find the logarithm, distance function segment, and exponential for every fend pair. For binned projects, the table holds the mean for each multiple of the bin size. Otherwise each power-of-two distance range is divided into evenly spaced cells, each holding the mean at its starting distance and the binomial series coefficients for that cell's distance function segment, so a mean is found by scaling the cell's starting mean by the series for the relative step past the cell start raised to the segment's power. Cells spanning a segment boundary are left unfilled and their means are found directly from the distance function. Chromosome means are not included.
+
+        :param binary: If 'True', the table is built from 'bin_distance_parameters' rather than 'distance_parameters'.
+        :type binary: bool.
+        :returns: A tuple containing a 3D numpy array of type float64 with the lookup table, or None if the distance function has not been found, and the distance between table rows for binned projects or zero.
+        """
+        if binary:
+            parameters = self.bin_distance_parameters
+        else:
+            parameters = self.distance_parameters
+        if self.binned is None:
+            binsize = 0
+        else:
+            binsize = int(self.binned)
+        if parameters is None:
+            return None, binsize
+        parameters = numpy.ascontiguousarray(parameters, dtype=numpy.float32)
+        key = (binsize, parameters.tostring())
+        if key not in self._distance_tables:
+            if self.binned is None:
+                chr_indices = self.fends['chr_indices'][...]
+                mids = self.fends['fends']['mid'][...]
+            else:
+                chr_indices = self.fends['bin_indices'][...]
+                mids = self.fends['bins']['mid'][...]
+            valid = numpy.where(chr_indices[1:] > chr_indices[:-1])[0]
+            max_distance = max(1, numpy.amax(mids[chr_indices[valid + 1] - 1] - mids[chr_indices[valid]]))
+            if binsize > 0:
+                table = numpy.zeros((max_distance / binsize + 1, 1, 1), dtype=numpy.float64)
+            else:
+                table = numpy.zeros((int(max_distance).bit_length(), _DISTANCE_TABLE_CELLS, 8), dtype=numpy.float64)
+            _distance.find_distance_table(parameters, table, binsize)
+            self._distance_tables[key] = table
+        return self._distance_tables[key], binsize
+
+    @_local_workers
     def find_probability_fend_corrections(self, mindistance=0, maxdistance=0, minchange=0.0001,
                                           max_iterations=1000, learningstep=0.5, chroms=[], precalculate=True,
-                                          precorrect=False, model='binomial'):
+                                          precorrect=False, model='binomial', solver='gradient',
+                                          implicit_zeros=False, checkpoint=None, checkpoint_interval=600,
+                                          resume=False):
         """
-        Using gradient descent, learn correction values for each valid fend based on a binomial or Poisson distribution of observations. This function is MPI compatible.
+        Using gradient descent or L-BFGS, learn correction values for each valid fend based on a binomial or Poisson distribution of observations. This function is MPI compatible.
 
         :param mindistance: The minimum inter-fend distance to be included in modeling.
         :type mindistance: int.
@@ -573,13 +768,24 @@ class HiC(object):
         :type precorrect: bool.
         :param model: Which probability model to use, either 'poisson' or 'binomial'. If 'poisson' is chosen, read counts are used. If 'binomial' is chosen, reads are converted to a 0/1 indicator of observed/unobserved status.
         :type model: str.
+        :param solver: Which optimization approach to use, either 'gradient' or 'lbfgs'. If 'gradient' is chosen, corrections are learned by gradient descent with backtracking. If 'lbfgs' is chosen, log-transformed corrections are learned with the bounded quasi-Newton L-BFGS-B algorithm, typically needing far fewer passes over the data. 'learningstep' is ignored for 'lbfgs'.
+        :type solver: str.
+        :param implicit_zeros: If 'True', fend pairs without observed reads are not stored. Their contributions are instead calculated from the fend ranges and distance function as needed, so memory scales with the number of observed pairs rather than all possible pairs at the cost of recalculating distance means during each pass.
+        :type implicit_zeros: bool.
+        :param checkpoint: The file name of an h5dict in which to periodically save learning progress, including finished chromosomes and the current corrections, iteration and cost. The file is removed once learning finishes. If 'None', no checkpoint is saved.
+        :type checkpoint: str.
+        :param checkpoint_interval: The minimum number of seconds between checkpoint saves. The checkpoint is also saved each time a chromosome is finished.
+        :type checkpoint_interval: int.
+        :param resume: If 'True' and 'checkpoint' exists, skip finished chromosomes and continue learning from the saved corrections. The checkpoint must have been created with the same settings.
+        :type resume: bool.
         :returns: None
 
         :Attributes: * **corrections** (*ndarray*) - A numpy array of type float32 and length equal to the number of fends. All invalid fends have an associated correction value of zero.
 
         The 'normalization' attribute is updated to 'probability' or 'binning-probability', depending on if the 'precorrect' option is selected. In addition, the 'chromosome_means' attribute is updated such that the mean correction (sum of all valid chromosomal correction value pairs) is adjusted to zero and the corresponding chromosome mean is adjusted the same amount but the opposite sign. 
         """
-        self.history += "HiC.find_probability_fend_corrections(mindistance=%i, maxdistance=%s, minchange=%f, max_iterations=%i, learningstep=%f, chroms=%s, precalculate=%s, precorrect=%s, model=%s) - " % (mindistance, str(maxdistance), minchange, max_iterations, learningstep, str(chroms), precalculate, precorrect, model)
+        settings = "find_probability_fend_corrections(mindistance=%i, maxdistance=%s, minchange=%f, max_iterations=%i, learningstep=%f, chroms=%s, precalculate=%s, precorrect=%s, model=%s, solver=%s, implicit_zeros=%s" % (mindistance, str(maxdistance), minchange, max_iterations, learningstep, str(chroms), precalculate, precorrect, model, solver, implicit_zeros)
+        self.history += "HiC.%s, checkpoint=%s, checkpoint_interval=%i, resume=%s) - " % (settings, str(checkpoint), checkpoint_interval, resume)
         if precorrect and self.binning_corrections is None:
             if not self.silent:
                 print >> sys.stderr, ("Precorrection can only be used in project has previously run 'find_binning_fend_corrections'.\n"),
@@ -597,6 +803,12 @@ class HiC(object):
                 print >> sys.stderr, ("The model parameter must be either 'poisson' or 'binomial'.\n")
             self.history += "Error: 'find_distance_parameters()' not run yet\n"
             return None
+        # make sure solver parameter has an appropriate value
+        if solver not in ['gradient', 'lbfgs']:
+            if not self.silent:
+                print >> sys.stderr, ("The solver parameter must be either 'gradient' or 'lbfgs'.\n")
+            self.history += "Error: incorrect solver\n"
+            return None
         if self.corrections is None:
             if self.binned is None:
                 self.corrections = numpy.ones(self.fends['fends'].shape[0], dtype=numpy.float32)
@@ -620,7 +832,17 @@ class HiC(object):
             self.chromosome_means = numpy.zeros(chr_indices.shape[0] - 1, dtype=numpy.float32)
         if maxdistance == 0 or maxdistance is None:
             maxdistance = 1999999999
-        for chrom in chroms:
+        progress = self._open_checkpoint(checkpoint, settings, checkpoint_interval, resume)
+        if progress is None:
+            return None
+        # restore corrections and chromosome means of finished chromosomes
+        if progress.get('completed', 0) > 0:
+            self.corrections[:] = progress.get('corrections')
+            self.chromosome_means[:] = progress.get('chromosome_means')
+        progress.update(corrections=self.corrections, chromosome_means=self.chromosome_means)
+        for h, chrom in enumerate(chroms):
+            if h < progress.get('completed', 0):
+                continue
             chrint = self.chr2int[chrom]
             if not self.silent:
                 print >> sys.stderr, ("\r%s\rFinding fend correction arrays for chromosome %s...") %\
@@ -650,14 +872,7 @@ class HiC(object):
                                            node_ranges[self.rank + 1],
                                            start_fend,
                                            int(self.binned is not None))
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    fend_ranges[node_ranges[i]:node_ranges[i + 1], :] = self.comm.recv(source=i, tag=11)
-                for i in range(1, self.num_procs):
-                    self.comm.Send(fend_ranges, dest=i, tag=13)
-            else:
-                self.comm.send(fend_ranges[node_ranges[self.rank]:node_ranges[self.rank + 1], :], dest=0, tag=11)
-                self.comm.Recv(fend_ranges, source=0, tag=13)
+            self.collective.Allgather(fend_ranges, node_ranges)
             # find range of fends for each node, creating as even spacing as possible
             total_pairs = numpy.sum(fend_ranges[:, 0])
             node_ranges = numpy.round(numpy.linspace(0, total_pairs, self.num_procs + 1)).astype(numpy.int64)
@@ -698,30 +913,48 @@ class HiC(object):
                                                     interactions)
             del temp_data
             # allocate zero index arrays and fill and find number of interactions
-            zero_indices0 = numpy.zeros(num_pairs - nonzero_pairs, dtype=numpy.int32)
-            zero_indices1 = numpy.zeros(num_pairs - nonzero_pairs, dtype=numpy.int32)
-            _interactions.find_zero_node_indices(rev_mapping,
-                                                 fend_ranges,
-                                                 nonzero_indices0,
-                                                 nonzero_indices1,
-                                                 zero_indices0,
-                                                 zero_indices1,
-                                                 interactions,
-                                                 start,
-                                                 stop,
-                                                 start_fend,
-                                                 int(self.binned is not None))
+            if implicit_zeros:
+                zero_indices0 = numpy.zeros(0, dtype=numpy.int32)
+                zero_indices1 = numpy.zeros(0, dtype=numpy.int32)
+                _interactions.find_zero_node_indices(rev_mapping,
+                                                     fend_ranges,
+                                                     nonzero_indices0,
+                                                     nonzero_indices1,
+                                                     None,
+                                                     None,
+                                                     interactions,
+                                                     start,
+                                                     stop,
+                                                     start_fend,
+                                                     int(self.binned is not None))
+            else:
+                zero_indices0 = numpy.zeros(num_pairs - nonzero_pairs, dtype=numpy.int32)
+                zero_indices1 = numpy.zeros(num_pairs - nonzero_pairs, dtype=numpy.int32)
+                _interactions.find_zero_node_indices(rev_mapping,
+                                                     fend_ranges,
+                                                     nonzero_indices0,
+                                                     nonzero_indices1,
+                                                     zero_indices0,
+                                                     zero_indices1,
+                                                     interactions,
+                                                     start,
+                                                     stop,
+                                                     start_fend,
+                                                     int(self.binned is not None))
             # find priors based on distance depedence function
             nonzero_means = numpy.zeros(nonzero_indices0.shape[0], dtype=numpy.float32)
             if model == 'binomial':
                 distance_parameters = self.bin_distance_parameters
             else:
                 distance_parameters = self.distance_parameters
+            distance_table, table_binsize = self.find_distance_table(model == 'binomial')
             _distance.find_remapped_distance_means(nonzero_indices0,
                                                    nonzero_indices1,
                                                    mids,
                                                    nonzero_means,
                                                    distance_parameters,
+                                                   distance_table,
+                                                   table_binsize,
                                                    0.0)
             zero_means = numpy.zeros(zero_indices0.shape[0], dtype=numpy.float32)
             _distance.find_remapped_distance_means(zero_indices0,
@@ -729,14 +962,10 @@ class HiC(object):
                                                    mids,
                                                    zero_means,
                                                    distance_parameters,
+                                                   distance_table,
+                                                   table_binsize,
                                                    0.0)
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    interactions += self.comm.recv(source=i, tag=11)
-                temp = numpy.zeros(rev_mapping.shape[0], dtype=numpy.float64)
-            else:
-                self.comm.send(interactions, dest=0, tag=11)
-                temp = None
+            self.collective.Sum(interactions)
             # if precorrecting using binning correction values, find correction matrices and adjust distance means
             if precorrect:
                 if not self.silent:
@@ -754,32 +983,41 @@ class HiC(object):
                                                              self.binning_corrections,
                                                              self.binning_num_bins,
                                                              self.binning_fend_indices[rev_mapping + start_fend, :])
+            # arguments for finding unobserved pair contributions as needed
+            if implicit_zeros:
+                nonzero_starts = numpy.searchsorted(nonzero_indices0,
+                                                    numpy.arange(start, stop + 1)).astype(numpy.int64)
+                if precorrect:
+                    binning_corrections = self.binning_corrections
+                    binning_indices = self.binning_fend_indices[rev_mapping + start_fend, :]
+                else:
+                    binning_corrections = None
+                    binning_indices = None
+                zero_args = [rev_mapping, fend_ranges, nonzero_indices1, nonzero_starts, mids, distance_parameters,
+                             distance_table, table_binsize, binning_corrections, binning_indices]
+                zero_settings = [start, stop, start_fend, int(self.binned is not None), int(model == 'binomial')]
 
-            # if precalculating, find approximate corrections
-            if precalculate:
+            # if resuming, continue from the saved corrections, otherwise if precalculating, find approximate corrections
+            iteration = 0
+            if progress.get('chrom', -1) == h:
+                corrections = progress.get('iterate')
+                iteration = progress.get('iteration')
+            elif precalculate:
                 if not self.silent:
                     print >> sys.stderr, ("\r%s\rPrecalculating corrections for chromosome %s...") %\
                         (' ' * 80, chrom),
                 expected = numpy.zeros(rev_mapping.shape[0], dtype=numpy.float64)
                 observed = numpy.zeros(rev_mapping.shape[0], dtype=numpy.float64)
                 _interactions.sum_weighted_indices(nonzero_indices0, nonzero_indices1, nonzero_means, None, expected)
-                _interactions.sum_weighted_indices(zero_indices0, zero_indices1, zero_means, None, expected)
-                _interactions.sum_weighted_indices(nonzero_indices0, nonzero_indices1, None, counts, observed)
-                corrections = numpy.zeros(rev_mapping.shape[0], dtype=numpy.float32)
-                if self.rank == 0:
-                    temp1 = numpy.empty(expected.shape, dtype=expected.dtype)
-                    for i in range(1, self.num_procs):
-                        self.comm.Recv(temp1, source=i, tag=13)
-                        expected += temp1
-                        self.comm.Recv(temp1, source=i, tag=13)
-                        observed += temp1
-                    corrections[:] = numpy.minimum(100.0, numpy.maximum(0.01, observed / expected))
-                    for i in range(1, self.num_procs):
-                        self.comm.Send(corrections, dest=i, tag=13)
+                if implicit_zeros:
+                    _optimize.calculate_implicit_zero_gradients(*(zero_args + [None, expected] + zero_settings +
+                                                                  [self.num_threads]))
                 else:
-                    self.comm.Send(expected, dest=0, tag=13)
-                    self.comm.Send(observed, dest=0, tag=13)
-                    self.comm.Recv(corrections, source=0, tag=13)
+                    _interactions.sum_weighted_indices(zero_indices0, zero_indices1, zero_means, None, expected)
+                _interactions.sum_weighted_indices(nonzero_indices0, nonzero_indices1, None, counts, observed)
+                self.collective.Sum(expected)
+                self.collective.Sum(observed)
+                corrections = numpy.minimum(100.0, numpy.maximum(0.01, observed / expected)).astype(numpy.float32)
             else:
                 corrections = self.corrections[numpy.where(mapping >= 0)[0] + start_fend]
             new_corrections = numpy.copy(corrections)
@@ -796,6 +1034,9 @@ class HiC(object):
             else:
                 cost_function = _optimize.calculate_poisson_cost
                 gradient_function = _optimize.calculate_poisson_gradients
+            if implicit_zeros:
+                cost_function = _implicit_zero_cost(cost_function, zero_args, zero_settings)
+                gradient_function = _implicit_zero_gradients(gradient_function, zero_args, zero_settings)
             start_cost = cost_function(counts,
                                        zero_indices0,
                                        zero_indices1,
@@ -804,16 +1045,20 @@ class HiC(object):
                                        nonzero_means,
                                        zero_means,
                                        corrections,
-                                       log_corrections)
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    start_cost += self.comm.recv(source=i, tag=11)
-            else:
-                self.comm.send(start_cost, dest=0, tag=11)
+                                       log_corrections,
+                                       self.num_threads)
+            start_cost = self.collective.sum(start_cost)
             previous_cost = start_cost
             change = 0.0
-            cont = True
-            iteration = 0
+            cont = solver == 'gradient'
+            if solver == 'lbfgs':
+                corrections, cost, iteration = self._learn_lbfgs_corrections(cost_function, gradient_function,
+                                                                             counts, zero_indices0, zero_indices1,
+                                                                             nonzero_indices0, nonzero_indices1,
+                                                                             nonzero_means, zero_means, corrections,
+                                                                             interactions, minchange,
+                                                                             max_iterations, progress, h,
+                                                                             iteration)
             while cont:
                 gradients.fill(0.0)
                 inv_corrections = (1.0 / corrections).astype(numpy.float32)
@@ -826,24 +1071,19 @@ class HiC(object):
                                   zero_means,
                                   corrections,
                                   inv_corrections,
-                                  gradients)
-                self._exchange_gradients(gradients, temp)
-                if self.rank == 0:
-                    gradients /= interactions
-                    gradient_norm = numpy.sum(gradients ** 2.0)
+                                  gradients,
+                                  self.num_threads)
+                self.collective.Sum(gradients)
+                gradients /= interactions
+                gradient_norm = numpy.sum(gradients ** 2.0)
                 # find best step size
                 armijo = numpy.inf
                 t = 1.0
                 n = 0
                 while armijo > 0.0 and n < 10:
-                    # if using multiple cores, pass gradients to root
-                    if self.rank == 0:
-                        new_corrections = numpy.minimum(100.0, numpy.maximum(0.01,
-                                                        corrections - t * gradients)).astype(numpy.float32)
-                        for i in range(1, self.num_procs):
-                            self.comm.Send(new_corrections, dest=i, tag=13)
-                    else:
-                        self.comm.Recv(new_corrections, source=0, tag=13)
+                    # all nodes hold the summed gradients, so each finds the same new corrections
+                    new_corrections = numpy.minimum(100.0, numpy.maximum(0.01,
+                                                    corrections - t * gradients)).astype(numpy.float32)
                     log_corrections[:] = numpy.log(new_corrections)
                     cost = cost_function(counts,
                                          zero_indices0,
@@ -853,41 +1093,32 @@ class HiC(object):
                                          nonzero_means,
                                          zero_means,
                                          new_corrections,
-                                         log_corrections)
-                    if self.rank == 0:
-                        for i in range(1, self.num_procs):
-                            cost += self.comm.recv(source=i, tag=11)
-                        if numpy.isnan(cost):
-                            cost = numpy.inf
-                            armijo = numpy.inf
-                        else:
-                            armijo = cost - previous_cost + t * gradient_norm
-                        for i in range(1, self.num_procs):
-                            self.comm.send(armijo, dest=i, tag=11)
-                        if not self.silent:
-                            print >> sys.stderr, ("\r%s iteration:%i cost:%f change:%f armijo: %f %s") %\
-                                                 ('Learning corrections...', iteration, previous_cost,
-                                                  change, armijo, ' ' * 20),
+                                         log_corrections,
+                                         self.num_threads)
+                    cost = self.collective.sum(cost)
+                    if numpy.isnan(cost):
+                        cost = numpy.inf
+                        armijo = numpy.inf
                     else:
-                        self.comm.send(cost, dest=0, tag=11)
-                        armijo = self.comm.recv(source=0, tag=11)
+                        armijo = cost - previous_cost + t * gradient_norm
+                    if not self.silent:
+                        print >> sys.stderr, ("\r%s iteration:%i cost:%f change:%f armijo: %f %s") %\
+                                             ('Learning corrections...', iteration, previous_cost,
+                                              change, armijo, ' ' * 20),
                     t *= learningstep
                     n += 1
                 previous_cost = cost
                 corrections = new_corrections
                 # find change
-                if self.rank == 0:
-                    change = numpy.amax(numpy.abs(gradients / corrections))
-                    for i in range(1, self.num_procs):
-                        self.comm.send(change, dest=i, tag=11)
-                else:
-                    change = self.comm.recv(source=0, tag=11)
+                change = numpy.amax(numpy.abs(gradients / corrections))
                 if not self.silent:
                     print >> sys.stderr, ("\r%s iteration:%i cost:%f change:%f %s") %\
                                          ('Learning corrections...', iteration, cost, change, ' ' * 40),
                 iteration += 1
                 if iteration >= max_iterations or change <= minchange:
                     cont = False
+                else:
+                    progress.update(chrom=h, iterate=corrections, iteration=iteration, cost=previous_cost)
             # calculate chromosome mean
             chrom_mean = numpy.sum(corrections)
             chrom_mean = chrom_mean ** 2.0 - numpy.sum(corrections ** 2.0)
@@ -902,17 +1133,16 @@ class HiC(object):
                                  nonzero_means,
                                  zero_means,
                                  corrections,
-                                 log_corrections)
+                                 log_corrections,
+                                 self.num_threads)
             self.corrections[rev_mapping + start_fend] = corrections / (chrom_mean ** 0.5)
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    cost += self.comm.recv(source=i, tag=11)
-                if not self.silent:
-                    print >> sys.stderr, ("\r%s\rLearning corrections... chromosome %s  Initial Cost:%f  Final Cost:%f  Done\n") % \
-                        (' ' * 80, chrom, start_cost, cost),
-            else:
-                self.comm.send(cost, dest=0, tag=11)
+            cost = self.collective.sum(cost)
+            if not self.silent:
+                print >> sys.stderr, ("\r%s\rLearning corrections... chromosome %s  Initial Cost:%f  Final Cost:%f  Done\n") % \
+                    (' ' * 80, chrom, start_cost, cost),
             del counts, nonzero_indices0, nonzero_indices1, nonzero_means, zero_indices0, zero_indices1, zero_means
+            progress.update(force=True, completed=h + 1, chrom=-1, iterate=None)
+        progress.remove()
         if not self.silent:
             print >> sys.stderr, ("\rLearning corrections... Done%s\n") % (' ' * 80),
         if precorrect:
@@ -922,18 +1152,86 @@ class HiC(object):
         self.history += "Success\n"
         return None
 
-    def _exchange_gradients(self, gradients, temp):
-        if self.rank == 0:
-            for i in range(1, self.num_procs):
-                self.comm.Recv(temp, source=i, tag=13)
-                gradients += temp
-        else:
-            self.comm.Send(gradients, dest=0, tag=13)
-        return None
+    def _learn_lbfgs_corrections(self, cost_function, gradient_function, counts, zero_indices0, zero_indices1,
+                                 nonzero_indices0, nonzero_indices1, nonzero_means, zero_means, corrections,
+                                 interactions, minchange, max_iterations, progress, chrom_index, iteration=0):
+        """Learn log-transformed corrections for one chromosome using L-BFGS-B with the compiled cost and gradient functions, starting at 'iteration' and saving each accepted iterate to the checkpoint 'progress'."""
+        log_corrections = numpy.zeros(corrections.shape[0], dtype=numpy.float32)
+        gradients = numpy.zeros(corrections.shape[0], dtype=numpy.float64)
+        state = {'cost': numpy.inf, 'change': numpy.inf, 'iteration': iteration}
+
+        def lbfgs_cost(x):
+            new_corrections = numpy.exp(x).astype(numpy.float32)
+            log_corrections[:] = x
+            cost = cost_function(counts,
+                                 zero_indices0,
+                                 zero_indices1,
+                                 nonzero_indices0,
+                                 nonzero_indices1,
+                                 nonzero_means,
+                                 zero_means,
+                                 new_corrections,
+                                 log_corrections,
+                                 self.num_threads)
+            cost = self.collective.sum(cost)
+            gradients.fill(0.0)
+            gradient_function(counts,
+                              zero_indices0,
+                              zero_indices1,
+                              nonzero_indices0,
+                              nonzero_indices1,
+                              nonzero_means,
+                              zero_means,
+                              new_corrections,
+                              (1.0 / new_corrections).astype(numpy.float32),
+                              gradients,
+                              self.num_threads)
+            self.collective.Sum(gradients)
+            state['cost'] = cost
+            # use the same change measure as gradient descent
+            state['change'] = numpy.amax(numpy.abs(gradients / interactions / new_corrections))
+            # convert gradients to log-space
+            return cost, gradients * new_corrections
+
+        def lbfgs_iteration(x):
+            # the accepted point of each iteration is the last one evaluated
+            state['iteration'] += 1
+            if not self.silent:
+                print >> sys.stderr, ("\r%s iteration:%i cost:%f change:%f %s") %\
+                                     ('Learning corrections...', state['iteration'], state['cost'],
+                                      state['change'], ' ' * 40),
+            if state['change'] <= minchange:
+                state['x'] = numpy.copy(x)
+                raise _Converged()
+            if state['iteration'] < max_iterations:
+                progress.update(chrom=chrom_index, iterate=numpy.exp(x).astype(numpy.float32),
+                                iteration=state['iteration'], cost=state['cost'])
+            return None
+
+        x0 = numpy.log(corrections).astype(numpy.float64)
+        bounds = [(numpy.log(0.01), numpy.log(100.0))] * x0.shape[0]
+        try:
+            x = bfgs(func=lbfgs_cost, x0=x0, bounds=bounds, pgtol=0.0, maxiter=max(1, max_iterations - iteration),
+                     callback=lbfgs_iteration)[0]
+        except _Converged:
+            x = state['x']
+        corrections = numpy.minimum(100.0, numpy.maximum(0.01, numpy.exp(x))).astype(numpy.float32)
+        return corrections, state['cost'], state['iteration']
+
+    def _open_checkpoint(self, filename, settings, interval, resume):
+        """Return a :class:`Checkpoint <hifive.checkpoint.Checkpoint>` for a normalization, or None if an existing checkpoint was created with different settings."""
+        try:
+            return Checkpoint(filename, settings, self.rank, interval, resume, self.silent)
+        except ValueError:
+            if not self.silent:
+                print >> sys.stderr, ("Checkpoint %s was created with different normalization settings.\n") % filename,
+            self.history += "Error: checkpoint settings don't match\n"
+            return None
 
+    @_local_workers
     def find_express_fend_corrections(self, iterations=100, mindistance=0, maxdistance=0, remove_distance=True, 
                                       usereads='cis', mininteractions=0, minchange=0.0001, chroms=[], precorrect=False,
-                                      binary=False, kr=False):
+                                      binary=False, kr=False, checkpoint=None, checkpoint_interval=600, resume=False):
         """
         Using iterative matrix-balancing approximation, learn correction values for each valid fend. This function is MPI compatible.
 
@@ -959,13 +1257,20 @@ class HiC(object):
         :type binary: bool.
         :param kr: Use the Knight Ruiz matrix balancing algorithm instead of weighted matrix balancing. This option ignores 'iterations'.
         :type kr: bool.
+        :param checkpoint: The file name of an h5dict in which to periodically save learning progress, including the current corrections and iteration and, for the Knight Ruiz algorithm, finished chromosomes. The file is removed once learning finishes. If 'None', no checkpoint is saved.
+        :type checkpoint: str.
+        :param checkpoint_interval: The minimum number of seconds between checkpoint saves.
+        :type checkpoint_interval: int.
+        :param resume: If 'True' and 'checkpoint' exists, continue learning from the saved corrections. The checkpoint must have been created with the same settings.
+        :type resume: bool.
         :returns: None
 
         :Attributes: * **corrections** (*ndarray*) - A numpy array of type float32 and length equal to the number of fends. All invalid fends have an associated correction value of zero.
 
         The 'normalization' attribute is updated to 'express' or 'binning-express', depending on if the 'precorrect' option is selected. In addition, the 'chromosome_means' attribute is updated such that the mean correction (sum of all valid chromosomal correction value pairs) is adjusted to zero and the corresponding chromosome mean is adjusted the same amount but the opposite sign. 
         """
-        self.history += "HiC.find_express_fend_corrections(iterations=%i, mindistance=%i, maxdistance=%s, remove_distance=%s, usereads='%s', mininteractions=%i, minchange=%f, chroms=%s, precorrect=%s, binary=%s, kr=%s) - " % (iterations, mindistance, str(maxdistance), remove_distance, usereads, mininteractions, minchange, str(chroms), precorrect, binary, kr)
+        settings = "find_express_fend_corrections(iterations=%i, mindistance=%i, maxdistance=%s, remove_distance=%s, usereads='%s', mininteractions=%i, minchange=%f, chroms=%s, precorrect=%s, binary=%s, kr=%s" % (iterations, mindistance, str(maxdistance), remove_distance, usereads, mininteractions, minchange, str(chroms), precorrect, binary, kr)
+        self.history += "HiC.%s, checkpoint=%s, checkpoint_interval=%i, resume=%s) - " % (settings, str(checkpoint), checkpoint_interval, resume)
         if mininteractions is None:
             if 'mininteractions' in self.__dict__.keys():
                 mininteractions = self.mininteractions
@@ -996,10 +1301,13 @@ class HiC(object):
             return None
         if self.corrections is None:
             self.corrections = numpy.ones(self.filter.shape[0], dtype=numpy.float32)
+        progress = self._open_checkpoint(checkpoint, settings, checkpoint_interval, resume)
+        if progress is None:
+            return None
         if kr:
             self._find_kr_corrections(mindistance, maxdistance, remove_distance, 
                                       usereads, mininteractions, minchange, chroms, precorrect,
-                                      binary)
+                                      binary, progress)
             return None
         # create needed arrays
         if self.binned is None:
@@ -1035,15 +1343,7 @@ class HiC(object):
             data = self.data['cis_data'][cis_ranges[self.rank]:cis_ranges[self.rank + 1], :]
             distances = mids[data[:, 1]] - mids[data[:, 0]]
             if maxdistance == 0 or maxdistance is None:
-                maxdistance = numpy.amax(distances) + 1
-                if self.rank == 0:
-                    for i in range(1, self.num_procs):
-                        maxdistance = max(maxdistance, self.comm.recv(source=i, tag=11))
-                    for i in range(1, self.num_procs):
-                        self.comm.send(maxdistance, dest=i, tag=11)
-                else:
-                    self.comm.send(maxdistance, dest=0, tag=11)
-                    maxdistance = self.comm.recv(source=0, tag=11)
+                maxdistance = self.collective.max(numpy.amax(distances) + 1)
             valid = numpy.where(filt[data[:, 0]] * filt[data[:, 1]] *
                                 (distances >= mindistance) * (distances < maxdistance))[0]
             data = data[valid, :]
@@ -1069,15 +1369,8 @@ class HiC(object):
         if not data is None:
             observed_interactions += numpy.bincount(data[:, 0], minlength=filt.shape[0])
             observed_interactions += numpy.bincount(data[:, 1], minlength=filt.shape[0])
-        if self.rank == 0:
-            for i in range(1, self.num_procs):
-                observed_interactions += self.comm.recv(source=i, tag=11)
-            minobs = numpy.amin(observed_interactions[numpy.where(filt)])
-            for i in range(1, self.num_procs):
-                self.comm.send(minobs, dest=i, tag=11)
-        else:
-            self.comm.send(observed_interactions, dest=0, tag=11)
-            minobs = self.comm.recv(source=0, tag=11)
+        self.collective.Sum(observed_interactions)
+        minobs = numpy.amin(observed_interactions[numpy.where(filt)])
         if minobs < mininteractions:
             if not self.silent:
                 print >> sys.stderr, ("\nInsufficient interactions for one or more fends.\n"),
@@ -1085,16 +1378,14 @@ class HiC(object):
                 print >> sys.stderr, ("or expanding distance range.\n"),
             self.history += "Error: Too few interactions for given settings\n"
             return None
+        chrints = None
         if self.rank == 0:
             chrints = [self.chr2int[chrom] for chrom in chroms]
             chrints = numpy.array(chrints, dtype=numpy.int32)
             numpy.random.shuffle(chrints)
-            chrint_ranges = numpy.round(numpy.linspace(0, chrints.shape[0], self.num_procs + 1)).astype(numpy.int32)
-            for i in range(1, self.num_procs):
-                self.comm.send(chrints[chrint_ranges[i]:chrint_ranges[i + 1]], dest=i, tag=11)
-            chrints = chrints[:chrint_ranges[1]]
-        else:
-            chrints = self.comm.recv(source=0, tag=11)
+        chrints = self.collective.bcast(chrints)
+        chrint_ranges = numpy.round(numpy.linspace(0, chrints.shape[0], self.num_procs + 1)).astype(numpy.int32)
+        chrints = chrints[chrint_ranges[self.rank]:chrint_ranges[self.rank + 1]]
         interactions = numpy.zeros(filt.shape[0], dtype=numpy.int64)
         _interactions.find_distancebound_possible_interactions(interactions,
                                                                chr_indices,
@@ -1105,14 +1396,7 @@ class HiC(object):
                                                                mindistance,
                                                                maxdistance,
                                                                int(self.binned is not None))
-        if self.rank == 0:
-            for i in range(1, self.num_procs):
-                interactions += self.comm.recv(source=i, tag=11)
-            for i in range(1, self.num_procs):
-                self.comm.Send(interactions, dest=i, tag=13)
-        else:
-            self.comm.send(interactions, dest=0, tag=11)
-            self.comm.Recv(interactions, source=0, tag=13)
+        self.collective.Sum(interactions)
         # precalculate interaction distance means for all included interactions
         if not remove_distance or data is None:
             distance_means = None
@@ -1131,15 +1415,7 @@ class HiC(object):
                     datasum = data.shape[0] + trans_data.shape[0]
                 else:
                     datasum = numpy.sum(data[:, 2]) + numpy.sum(trans_data[:, 2])
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    datasum += self.comm.recv(source=i, tag=11)
-                temp_mu = (2.0 * datasum) / numpy.sum(interactions)
-                for i in range(1, self.num_procs):
-                    self.comm.send(temp_mu, dest=i, tag=11)
-            else:
-                self.comm.send(datasum, dest=0, tag=11)
-                temp_mu = self.comm.recv(source=0, tag=11)
+            temp_mu = (2.0 * self.collective.sum(datasum)) / numpy.sum(interactions)
             if trans_data is None:
                 trans_mu = 1.0
                 mu = temp_mu
@@ -1153,6 +1429,7 @@ class HiC(object):
             if not self.silent:
                 print >> sys.stderr, ("\r%s\rPrecalculating distances...") % (' ' * 80),
             mu = 1.0
+            distance_table, table_binsize = self.find_distance_table(binary)
             if self.binned is None:
                 all_chrints = self.fends['fends']['chr'][data[:, 0]]
             else:
@@ -1169,6 +1446,8 @@ class HiC(object):
                                                                mids,
                                                                distance_means[chrint_indices[i]:chrint_indices[i + 1]],
                                                                self.bin_distance_parameters,
+                                                               distance_table,
+                                                               table_binsize,
                                                                self.chromosome_means[i])
                     else:
                         _distance.find_remapped_distance_means(data[chrint_indices[i]:chrint_indices[i + 1], 0],
@@ -1176,6 +1455,8 @@ class HiC(object):
                                                                mids,
                                                                distance_means[chrint_indices[i]:chrint_indices[i + 1]],
                                                                self.distance_parameters,
+                                                               distance_table,
+                                                               table_binsize,
                                                                self.chromosome_means[i])
             if not trans_data is None:
                 total_possible = numpy.sum(filt).astype(numpy.int64) ** 2
@@ -1183,19 +1464,11 @@ class HiC(object):
                     start = chr_indices[i]
                     stop = chr_indices[i + 1]
                     total_possible -= numpy.sum(filt[start:stop].astype(numpy.int64)) ** 2
-                if self.rank == 0:
-                    if binary:
-                        trans_sum = trans_data.shape[0]
-                    else:
-                        trans_sum = numpy.sum(trans_data[:, 2])
-                    for i in range(1, self.num_procs):
-                        trans_sum += self.comm.recv(source=i, tag=11)
-                    for i in range(1, self.num_procs):
-                        self.comm.send(trans_sum, dest=i, tag=11)
+                if binary:
+                    trans_sum = trans_data.shape[0]
                 else:
-                    self.comm.send(numpy.sum(trans_data[:, 2]), dest=0, tag=11)
-                    trans_sum = self.comm.recv(source=0, tag=11)
-                trans_mu = (2.0 * trans_sum) / total_possible
+                    trans_sum = numpy.sum(trans_data[:, 2])
+                trans_mu = (2.0 * self.collective.sum(trans_sum)) / total_possible
             else:
                 trans_mu = 1.0
         if precorrect:
@@ -1220,13 +1493,14 @@ class HiC(object):
                                                              self.binning_fend_indices)
         if not self.silent and self.rank == 0:
             print >> sys.stderr, ("\r%s\rFinding fend corrections...") % (' ' * 80),
-        # calculate corrections
+        # calculate corrections, continuing from the saved corrections if resuming
         fend_means = numpy.zeros(filt.shape[0], dtype=numpy.float64)
-        if self.rank == 0:
-            temp = numpy.zeros(filt.shape[0], dtype=numpy.float64)
         corrections = numpy.copy(self.corrections)
         cont = True
         iteration = 0
+        if progress.get('iterate') is not None:
+            corrections[:] = progress.get('iterate')
+            iteration = progress.get('iteration')
         change = numpy.zeros(1, dtype=numpy.float64)
         valid = numpy.where(filt)[0]
         mu = 1.0
@@ -1240,28 +1514,22 @@ class HiC(object):
                                       corrections,
                                       mu,
                                       trans_mu,
-                                      int(binary))
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    self.comm.Recv(temp, source=i, tag=13)
-                    fend_means += temp
-                cost = _optimize.update_express_corrections(filt,
-                                                            interactions,
-                                                            fend_means,
-                                                            corrections,
-                                                            change)
-                if iteration >= iterations or change[0] < minchange:
-                    cont = False
-                if not self.silent:
-                    print >> sys.stderr, ("\r%s\rFinding fend corrections  Iteration: %i  Cost: %f  Change: %f") % (' ' * 80,
-                                          iteration, cost, change),
-                for i in range(1, self.num_procs):
-                    self.comm.Send(corrections, dest=i, tag=13)
-                    self.comm.send(cont, dest=i, tag=11)
+                                      int(binary),
+                                      self.num_threads)
+            # all nodes hold the summed fend means, so each makes the same correction update
+            self.collective.Sum(fend_means)
+            cost = _optimize.update_express_corrections(filt,
+                                                        interactions,
+                                                        fend_means,
+                                                        corrections,
+                                                        change)
+            if iteration >= iterations or change[0] < minchange:
+                cont = False
             else:
-                self.comm.Send(fend_means, dest=0, tag=13)
-                self.comm.Recv(corrections, source=0, tag=13)
-                cont = self.comm.recv(source=0, tag=11)
+                progress.update(iterate=corrections, iteration=iteration, cost=cost)
+            if not self.silent:
+                print >> sys.stderr, ("\r%s\rFinding fend corrections  Iteration: %i  Cost: %f  Change: %f") % (' ' * 80,
+                                      iteration, cost, change),
         # calculate chromosome mean
         if self.chromosome_means is None:
             self.chromosome_means = numpy.zeros(chr_indices.shape[0] - 1, dtype=numpy.float32)
@@ -1277,6 +1545,7 @@ class HiC(object):
                 self.chromosome_means[chrint] += numpy.log(chrom_mean)
             corrections[valid] /= chrom_mean ** 0.5
         self.corrections = corrections
+        progress.remove()
         if not self.silent and self.rank == 0:
             print >> sys.stderr, ("\r%s\rCompleted learning express corrections. Final cost: %f\n") % (' ' * 80, cost),
         if precorrect:
@@ -1288,7 +1557,7 @@ class HiC(object):
 
     def _find_kr_corrections(self, mindistance=0, maxdistance=0, remove_distance=True, 
                              usereads='cis', mininteractions=0, minchange=0.0001, chroms=[], precorrect=False,
-                             binary=False):
+                             binary=False, progress=None):
         if (chroms is None or
                 (isinstance(chroms, list) and
                 (len(chroms) == 0 or
@@ -1309,7 +1578,15 @@ class HiC(object):
                 if chrom not in chroms:
                     filt[chr_indices[i]:chr_indices[i + 1]] = 0
             chroms = ['all']
-        for chrom in chroms:
+        if progress is None:
+            progress = Checkpoint(None, None)
+        # restore corrections of finished chromosomes
+        if progress.get('completed', 0) > 0:
+            self.corrections[:] = progress.get('corrections')
+        progress.update(corrections=self.corrections)
+        for h, chrom in enumerate(chroms):
+            if h < progress.get('completed', 0):
+                continue
             if chrom == 'all':
                 startfend = 0
                 stopfend = chr_indices[-1]
@@ -1352,7 +1629,7 @@ class HiC(object):
             if rev_mapping.shape[0] < 2:
                 if not self.silent:
                     print >> sys.stderr, ("\nInsufficient valid fends for this chromosome. Skipping.\n"),
-                    continue
+                continue
             mapping = numpy.zeros(chrfilt.shape[0], dtype=numpy.int32) - 1
             mapping[rev_mapping] = numpy.arange(rev_mapping.shape[0])
             if not data is None:
@@ -1373,15 +1650,8 @@ class HiC(object):
             if not data is None:
                 observed_interactions += numpy.bincount(data[:, 0], minlength=rev_mapping.shape[0])
                 observed_interactions += numpy.bincount(data[:, 1], minlength=rev_mapping.shape[0])
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    observed_interactions += self.comm.recv(source=i, tag=11)
-                minobs = numpy.amin(observed_interactions)
-                for i in range(1, self.num_procs):
-                    self.comm.send(minobs, dest=i, tag=11)
-            else:
-                self.comm.send(observed_interactions, dest=0, tag=11)
-                minobs = self.comm.recv(source=0, tag=11)
+            self.collective.Sum(observed_interactions)
+            minobs = numpy.amin(observed_interactions)
             if minobs < mininteractions:
                 if not self.silent:
                     print >> sys.stderr, ("\nInsufficient interactions for one or more fends.\n"),
@@ -1409,20 +1679,24 @@ class HiC(object):
             if remove_distance:
                 if not self.silent:
                     print >> sys.stderr, ("\r%s\rPrecalculating distances...") % (' ' * 80),
+                distance_table, table_binsize = self.find_distance_table(binary)
                 if usereads != 'cis':
-                    trans_mean = numpy.sum(trans_counts).astype(numpy.float64)
+                    trans_mean = 2.0 * self.collective.sum(numpy.sum(trans_counts))
                     interactions = rev_mapping.shape[0] ** 2
                     if self.binned is None:
                         all_chrints = self.fends['fends']['chr'][rev_mapping]
                     else:
                         all_chrints = self.fends['bins']['chr'][rev_mapping]
                     interactions -= numpy.sum(numpy.bincount(all_chrints,
-                                     minlength=chr_indices.shape[0]) ** 2)
+                                     minlength=chr_indices.shape[0]).astype(numpy.int64) ** 2)
                     trans_mean /= interactions
-                    trans_means = numpy.empty(trans_data.shape[0], dtype=numpy.float32).fill(trans_mean)
+                    trans_means = numpy.empty(trans_data.shape[0], dtype=numpy.float32)
+                    trans_means.fill(trans_mean)
                     if not data is None:
+                        # cis data are sorted by first fend, so each chromosome's interactions are contiguous
                         distance_means = numpy.zeros(data.shape[0], dtype=numpy.float32)
-                        indices = numpy.r_[0, numpy.bincount(all_chrints)]
+                        indices = numpy.r_[0, numpy.bincount(all_chrints[data[:, 0]],
+                                                             minlength=chr_indices.shape[0] - 1)]
                         for i in range(1, indices.shape[0]):
                             indices[i] += indices[i - 1]
                         for i in range(indices.shape[0] - 1):
@@ -1433,6 +1707,8 @@ class HiC(object):
                                                                            mids,
                                                                            distance_means[indices[i]:indices[i + 1]],
                                                                            self.bin_distance_parameters,
+                                                                           distance_table,
+                                                                           table_binsize,
                                                                            self.chromosome_means[i])
                                 else:
                                     _distance.find_remapped_distance_means(data[indices[i]:indices[i + 1], 0],
@@ -1440,6 +1716,8 @@ class HiC(object):
                                                                            mids,
                                                                            distance_means[indices[i]:indices[i + 1]],
                                                                            self.distance_parameters,
+                                                                           distance_table,
+                                                                           table_binsize,
                                                                            self.chromosome_means[i])
                 else:
                     distance_means = numpy.zeros(data.shape[0], dtype=numpy.float32)
@@ -1450,6 +1728,8 @@ class HiC(object):
                                                                mids,
                                                                distance_means,
                                                                self.bin_distance_parameters,
+                                                               distance_table,
+                                                               table_binsize,
                                                                self.chromosome_means[chrint])
                     else:
                         _distance.find_remapped_distance_means(data[:, 0],
@@ -1457,6 +1737,8 @@ class HiC(object):
                                                                mids,
                                                                distance_means,
                                                                self.distance_parameters,
+                                                               distance_table,
+                                                               table_binsize,
                                                                self.chromosome_means[chrint])
             if precorrect:
                 if not self.silent:
@@ -1485,61 +1767,63 @@ class HiC(object):
                 trans_counts /= trans_means
             if not self.silent and self.rank == 0:
                 print >> sys.stderr, ("\r%s\rFinding fend corrections...") % (' ' * 80),
-            # calculate corrections
-            if self.rank == 0:
-                temp = numpy.zeros((rev_mapping.shape[0], 1), dtype=numpy.float64)
-            corrections = numpy.ones((rev_mapping.shape[0], 1), dtype=numpy.float64)
+            # assemble this process's share of the symmetric matrix of observed over expected values
+            num_valid = rev_mapping.shape[0]
+            rows = []
+            cols = []
+            values = []
+            for temp_data, temp_counts in [(data, counts), (trans_data, trans_counts)]:
+                if not temp_data is None:
+                    rows += [temp_data[:, 0], temp_data[:, 1]]
+                    cols += [temp_data[:, 1], temp_data[:, 0]]
+                    values += [temp_counts, temp_counts]
+            matrix = sparse.csr_matrix((numpy.concatenate(values), (numpy.concatenate(rows), numpy.concatenate(cols))),
+                                       shape=(num_valid, num_valid))
+            del rows, cols, values
+            indptr = matrix.indptr.astype(numpy.int64)
+            indices = matrix.indices.astype(numpy.int32)
+            product = numpy.zeros(num_valid, dtype=numpy.float64)
+
+            def balance_product(x, vector):
+                # find x * (matrix * vector), summed across processes
+                _optimize.calculate_sparse_product(indptr, indices, matrix.data, vector, product, self.num_threads)
+                self.collective.Sum(product)
+                return x * product
+
+            # calculate corrections, continuing from the saved corrections if resuming
+            corrections = numpy.ones(num_valid, dtype=numpy.float64)
+            i = MVP = 0
+            if progress.get('chrom', -1) == h:
+                corrections[:] = progress.get('iterate')
+                i = progress.get('iteration')
             g = 0.9
             eta = etamax = 0.1
             stop_tol = minchange * 0.5
             rt = minchange ** 2.0
             delta = 0.1
             Delta = 3
-            v = numpy.zeros((corrections.shape[0], 1), dtype=numpy.float64)
-            w = numpy.zeros((corrections.shape[0], 1), dtype=numpy.float64)
-            _optimize.calculate_v(data, trans_data, counts, trans_counts, corrections, v)
-            if self.rank == 0:
-                for i in range(1, self.num_procs):
-                    self.Recv(temp, source=i, tag=13)
-                    v += temp
-                for i in range(1, self.num_procs):
-                    self.Send(v, dest=i, tag=13)
-            else:
-                self.Send(v, dest=0, tag=13)
-                self.Recv(v, source=0, tag=13)
+            v = balance_product(corrections, corrections)
             rk = 1.0 - v
-            rho_km1 = numpy.dot(rk.T, rk)[0, 0]
+            rho_km1 = numpy.dot(rk, rk)
             rho_km2 = rho_km1
             rold = rout = rho_km1
-            i = MVP = 0
             while rout > rt:
                 i += 1
                 k = 0
-                y = numpy.ones((rev_mapping.shape[0], 1), dtype=numpy.float64)
+                y = numpy.ones(num_valid, dtype=numpy.float64)
                 innertol = max(eta ** 2.0 * rout, rt)
                 while rho_km1 > innertol:
                     k += 1
                     if k == 1:
                         Z = rk / v
                         p = numpy.copy(Z)
-                        rho_km1 = numpy.dot(rk.T, Z)
+                        rho_km1 = numpy.dot(rk, Z)
                     else:
                         beta = rho_km1 / rho_km2
                         p = Z + beta * p
                     # Update search direction efficiently
-                    w.fill(0.0)
-                    _optimize.calculate_w(data, trans_data, counts, trans_counts, corrections, p, w)
-                    if self.rank == 0:
-                        for j in range(1, self.num_procs):
-                            self.Recv(temp, source=j, tag=13)
-                            w += temp
-                        for j in range(1, self.num_procs):
-                            self.Send(w, dest=j, tag=13)
-                    else:
-                        self.Send(w, dest=0, tag=13)
-                        self.Recv(w, source=0, tag=13)
-                    w += v * p
-                    alpha = rho_km1 / numpy.dot(p.T, w)[0, 0]
+                    w = balance_product(corrections, corrections * p) + v * p
+                    alpha = rho_km1 / numpy.dot(p, w)
                     ap = alpha * p
                     # Test distance to boundary of cone
                     ynew = y + ap
@@ -1555,25 +1839,15 @@ class HiC(object):
                         gamma = numpy.amin((Delta - y[ind]) / ap[ind])
                         y += gamma * ap
                         break
-                    y = numpy.copy(ynew)
+                    y = ynew
                     rk -= alpha * w
                     rho_km2 = rho_km1
                     Z = rk / v
-                    rho_km1 = numpy.dot(rk.T, Z)[0, 0]
+                    rho_km1 = numpy.dot(rk, Z)
                 corrections *= y
-                v.fill(0.0)
-                _optimize.calculate_v(data, trans_data, counts, trans_counts, corrections, v)
-                if self.rank == 0:
-                    for j in range(1, self.num_procs):
-                        self.Recv(temp, source=j, tag=13)
-                        v += temp
-                    for j in range(1, self.num_procs):
-                        self.Send(v, dest=j, tag=13)
-                else:
-                    self.Send(v, dest=0, tag=13)
-                    self.Recv(v, source=0, tag=13)
+                v = balance_product(corrections, corrections)
                 rk = 1.0 - v
-                rho_km1 = numpy.dot(rk.T, rk)[0, 0]
+                rho_km1 = numpy.dot(rk, rk)
                 rout = rho_km1
                 MVP += k + 1
                 # Update inner iteration stopping criterion
@@ -1586,10 +1860,15 @@ class HiC(object):
                     eta = max(eta, g * eta_o ** 2.0)
                 eta = max(min(eta, etamax), stop_tol / res_norm)
                 if not self.silent and self.rank == 0:
-                    print >> sys.stderr, ("\r%s\rIteration %i Residual: %e") % (" " * 80, i, rout),
+                    print >> sys.stderr, ("\r%s\rFinding fend corrections... Chrom: %s  Iteration: %i  Residual: %e  Products: %i") %\
+                                         (' ' * 80, chrom, i, rout, MVP),
+                if rout > rt:
+                    progress.update(chrom=h, iterate=corrections, iteration=i, cost=rout)
             if not self.silent and self.rank == 0:
-                print >> sys.stderr, ("\r%s\rFinding fend corrections... Chrom: %s Done\n") % (' ' * 80, chrom),
+                print >> sys.stderr, ("\r%s\rFinding fend corrections... Chrom: %s  Iterations: %i  Residual: %e  Done\n") %\
+                                     (' ' * 80, chrom, i, rout),
             self.corrections[rev_mapping + startfend] = 1.0 / corrections
+            progress.update(force=True, completed=h + 1, chrom=-1, iterate=None)
         # calculate chromosome mean
         if self.chromosome_means is None:
             self.chromosome_means = numpy.zeros(chr_indices.shape[0] - 1, dtype=numpy.float32)
@@ -1604,6 +1883,7 @@ class HiC(object):
             if remove_distance:
                 self.chromosome_means[chrint] += numpy.log(chrom_mean)
             self.corrections[valid] /= chrom_mean ** 0.5
+        progress.remove()
         if not self.silent and self.rank == 0:
             print >> sys.stderr, ("\r%s\rCompleted learning express corrections.\n") % (' ' * 80),
         if precorrect:
@@ -1613,9 +1893,11 @@ class HiC(object):
         self.history += "Succcess\n"
         return None
 
+    @_local_workers
     def find_binning_fend_corrections(self, mindistance=0, maxdistance=0, chroms=[], num_bins=[20, 20, 20],
                                       parameters=['even', 'even', 'even-const'], model=['gc', 'len', 'distance'],
-                                      learning_threshold=1.0, max_iterations=10, usereads='cis', pseudocounts=0):
+                                      learning_threshold=1.0, max_iterations=10, usereads='cis', pseudocounts=0,
+                                      checkpoint=None, checkpoint_interval=600, resume=False):
         """
         Using a multivariate binning model, learn correction values for combinations of model parameter bins. This function is MPI compatible.
 
@@ -1641,6 +1923,12 @@ class HiC(object):
         :type usereads: str.
         :param pseudocounts: The number of pseudo-counts to add to each bin prior to seeding and learning normalization values.
         :type pseudocounts: int.
+        :param checkpoint: The file name of an h5dict in which to periodically save learning progress, including the current correction values, iteration and log-likelihood. The file is removed once learning finishes. If 'None', no checkpoint is saved.
+        :type checkpoint: str.
+        :param checkpoint_interval: The minimum number of seconds between checkpoint saves.
+        :type checkpoint_interval: int.
+        :param resume: If 'True' and 'checkpoint' exists, continue learning from the saved correction values. The checkpoint must have been created with the same settings.
+        :type resume: bool.
         :returns: None
  
         :Attributes: * **model_parameters** (*ndarray*) - A numpy array of strings containing model parameter names. If distance was included in the 'model' option, it is not included in this array since it is only for learning values, not for subsequent corretion.
@@ -1651,7 +1939,8 @@ class HiC(object):
         
         The 'normalization' attribute is updated to 'binning'.
         """
-        self.history += "HiC.find_binning_fend_corrections(max_iterations=%i, mindistance=%i, maxdistance=%s, usereads='%s', chroms=%s num_bins=%s, parameters=%s, model=%s, learning_threshold=%f, pseudocounts=%s) - " % (max_iterations, mindistance, str(maxdistance), usereads, str(chroms), num_bins, parameters, model, learning_threshold, str(pseudocounts))
+        settings = "find_binning_fend_corrections(max_iterations=%i, mindistance=%i, maxdistance=%s, usereads='%s', chroms=%s num_bins=%s, parameters=%s, model=%s, learning_threshold=%f, pseudocounts=%s" % (max_iterations, mindistance, str(maxdistance), usereads, str(chroms), num_bins, parameters, model, learning_threshold, str(pseudocounts))
+        self.history += "HiC.%s, checkpoint=%s, checkpoint_interval=%i, resume=%s) - " % (settings, str(checkpoint), checkpoint_interval, resume)
         for parameter in model:
             if not parameter in ['len', 'distance'] and parameter not in self.fends['fends'].dtype.names:
                 if not self.silent:
@@ -1685,6 +1974,9 @@ class HiC(object):
                 print >> sys.stderr, ("'usereads' does not have a valid value.\n"),
             self.history += "Error: '%s' not a valid value for 'usereads'\n" % usereads
             return None
+        progress = self._open_checkpoint(checkpoint, settings, checkpoint_interval, resume)
+        if progress is None:
+            return None
         if (chroms is None or
                 (isinstance(chroms, list) and
                 (len(chroms) == 0 or
@@ -1779,9 +2071,9 @@ class HiC(object):
             distance_div = 0
             distance_bins = 0
         bin_counts = numpy.zeros((total_bins, 2), dtype=numpy.int64)
-        temp_counts = None
-        if self.rank == 0:
-            temp_counts = numpy.copy(bin_counts)
+        if usereads in ['trans', 'all']:
+            trans_chrom_indices = self._find_trans_chrom_indices()
+            num_chroms = chr_indices.shape[0] - 1
         for h, chrom in enumerate(chroms):
             if not self.silent:
                 print >> sys.stderr, ("\r%s\rFinding bin counts... chr%s") % (' ' * 80, chrom),
@@ -1845,8 +2137,8 @@ class HiC(object):
                                                   maxfend)
             if usereads in ['trans', 'all']:
                 # Find number of observations in each bin
-                start_index = self.data['trans_indices'][chr_indices[chrint]]
-                stop_index = self.data['trans_indices'][chr_indices[chrint + 1]]
+                start_index = trans_chrom_indices[chrint * num_chroms]
+                stop_index = trans_chrom_indices[(chrint + 1) * num_chroms]
                 if start_index < stop_index:
                     node_ranges = numpy.round(numpy.linspace(start_index, stop_index,
                                               self.num_procs + 1)).astype(numpy.int64)
@@ -1884,15 +2176,7 @@ class HiC(object):
         self.binning_fend_indices = all_indices
         self.binning_correction_indices = correction_indices
         # Exchange bin_counts
-        if self.rank == 0:
-            for i in range(1, self.num_procs):
-                self.comm.Recv(temp_counts, source=i, tag=13)
-                bin_counts += temp_counts
-            for i in range(1, self.num_procs):
-                self.comm.Send(bin_counts, dest=i, tag=13)
-        else:
-            self.comm.Send(bin_counts, dest=0, tag=13)
-            self.comm.Recv(bin_counts, source=0, tag=13)
+        self.collective.Sum(bin_counts)
         # if using pseudo counts, find how many should be added
         # when bin1 != bin2, the number should be doubled to represent both combinations
         if not pseudocounts is None and pseudocounts > 0:
@@ -1973,6 +2257,12 @@ class HiC(object):
         iteration = 0
         delta = numpy.inf
         pgtol = 1e-8
+        # if resuming, continue from the saved correction values
+        if progress.get('iterate') is not None:
+            all_corrections = progress.get('iterate')
+            iteration = progress.get('iteration')
+            ll = progress.get('cost')
+            delta = progress.get('change')
 
         old_settings = numpy.seterr(invalid='ignore', divide='ignore')
         while iteration < max_iterations and delta >= learning_threshold:
@@ -2001,21 +2291,9 @@ class HiC(object):
                     x, f, d = bfgs(func=temp_ll, x0=x0, fprime=temp_ll_grad, pgtol=pgtol,
                                    args=(temp_bin_counts, temp_sum_log, temp_prod, prior, log_prior, log_2, min_p))
                     new_corrections[correction_indices[h] + i] = x[0]
-                if self.rank == 0:
-                    for i in range(1, self.num_procs):
-                        if node_ranges[i + 1] > node_ranges[i]:
-                            self.comm.Recv(new_corrections[(node_ranges[i] + correction_indices[h]):(
-                                           node_ranges[i + 1] + correction_indices[h])], source=i, tag=13)
-                else:
-                    if node_ranges[self.rank + 1] > node_ranges[self.rank]:
-                        self.comm.Send(new_corrections[(node_ranges[self.rank] + correction_indices[h]):(
-                                       node_ranges[self.rank + 1] + correction_indices[h])], dest=0, tag=13)
-            if self.rank == 0:
-                all_corrections = new_corrections
-                for i in range(1, self.num_procs):
-                    self.comm.Send(all_corrections, dest=i, tag=13)
-            else:
-                self.comm.Recv(all_corrections, source=0, tag=13)
+                self.collective.Allgather(new_corrections[correction_indices[h]:correction_indices[h + 1]],
+                                          node_ranges)
+            all_corrections = new_corrections
             iteration += 1
             new_ll = find_ll(all_indices, all_corrections, correction_indices, distance_corrections,
                              distance_indices, bin_counts, prior, min_p)
@@ -2026,7 +2304,10 @@ class HiC(object):
             if delta < 0.0:
                 delta = numpy.inf
             ll = new_ll
+            if iteration < max_iterations and delta >= learning_threshold:
+                progress.update(iterate=all_corrections, iteration=iteration, cost=ll, change=delta)
         numpy.seterr(**old_settings)
+        progress.remove()
         if not self.silent:
             print >> sys.stderr, ("\r%s\rLearning binning corrections... Final ll:%f\n") % (' ' * 80, ll),
         self.normalization = 'binning'
@@ -2056,20 +2337,25 @@ class HiC(object):
                 valid2 = numpy.sum(self.filter[chr_indices[j]:chr_indices[j + 1]])
                 possible[pos] = valid1 * valid2
                 pos += 1
-        trans_data = self.data['trans_data'][...]
-        valid = numpy.where(self.filter[trans_data[:, 0]] * self.filter[trans_data[:, 1]])[0]
-        trans_data = trans_data[valid, :]
-        del valid
-        chrom = self.fends['fends']['chr'][trans_data[:, 0]]
-        indices = chrom * (num_chroms - 1) - (chrom * (chrom + 1) / 2) - 1
-        indices += self.fends['fends']['chr'][trans_data[:, 1]]
-        del chrom
-        if self.corrections is None:
-            counts = trans_data[:, 2]
-        else:
-            counts = trans_data[:, 2] / (self.corrections[trans_data[:, 0]] * self.corrections[trans_data[:, 1]])
-        del trans_data
-        actual = numpy.bincount(indices, weights=counts, minlength=possible.shape[0])
+        # sum each chromosome pair's block of trans data so only one pair is held in memory at a time
+        trans_chrom_indices = self._find_trans_chrom_indices()
+        actual = numpy.zeros(possible.shape[0], dtype=numpy.float64)
+        pos = 0
+        for i in range(num_chroms - 1):
+            for j in range(i + 1, num_chroms):
+                start_index = trans_chrom_indices[i * num_chroms + j]
+                stop_index = trans_chrom_indices[i * num_chroms + j + 1]
+                if start_index < stop_index:
+                    trans_data = self.data['trans_data'][start_index:stop_index, :]
+                    valid = numpy.where(self.filter[trans_data[:, 0]] * self.filter[trans_data[:, 1]])[0]
+                    trans_data = trans_data[valid, :]
+                    if self.corrections is None:
+                        counts = trans_data[:, 2]
+                    else:
+                        counts = trans_data[:, 2] / (self.corrections[trans_data[:, 0]] *
+                                                     self.corrections[trans_data[:, 1]])
+                    actual[pos] = numpy.sum(counts)
+                pos += 1
         self.trans_means = actual / numpy.maximum(1.0, possible.astype(numpy.float32))
         if not self.silent:
             print >> sys.stderr, ('Done\n'),
@@ -2372,6 +2658,7 @@ class HiC(object):
             img.save(image_file, format='png')
         return data
 
+    @_local_workers
     def write_heatmap(self, filename, binsize, includetrans=True, datatype='enrichment', chroms=[], 
                       dynamically_binned=False, minobservations=0, searchdistance=0, expansion_binsize=0,
                       removefailed=False, format='hdf5'):
@@ -2433,6 +2720,7 @@ class HiC(object):
                                        silent=self.silent, history=history, format=format)
         return None
 
+    @_local_workers
     def write_multiresolution_heatmap(self, filename, datatype='fend', maxbinsize=1280000, minbinsize=5000,
                                       trans_maxbinsize=None, trans_minbinsize=None, minobservations=5,
                                       chroms=None, includetrans=True, midbinsize=40000):
@@ -2615,15 +2903,12 @@ class HiC(object):
                               stop=stop1, start2=start2, stop2=stop2, minbinsize=minbin, maxbinsize=maxbin,
                               minobservations=minobservations, datatype=datatype, midbinsize=midbinsize, silent=False)
         # pass all results to the root node for writing to file
-        if self.rank == 0:
-            for i in range(1, self.num_procs):
-                for j in range(node_ranges[i], node_ranges[i + 1]):
-                    results[all_needed[j]] = self.comm.recv(source=i, tag=11)
-        else:
-            for i in range(node_ranges[self.rank], node_ranges[self.rank + 1]):
-                self.comm.send(results[all_needed[i]], dest=0, tag=11)
-                del results[all_needed[i]]
+        node_results = self.collective.gather(results)
+        if self.rank > 0:
             return None
+        for i in range(1, self.num_procs):
+            results.update(node_results[i])
+        del node_results
         # calculate header size
         magic_number_size = 4 # 8 4-bit hexadecimals = 4 bytes
         name_sizes = numpy.zeros(n_chroms, dtype=numpy.int32)
@@ -2730,6 +3015,7 @@ class HiC(object):
             print >> sys.stderr, ("Done\n"),
         return None
 
+    @_local_workers
     def calculate_quality(self, filename, resolution=1000000, coverage=[1.0, 0.5, 0.25, 0.12, 0.06],
                           noise=[1.0, 0.75, 0.5, 0.25, 0.0], chroms=[]):
         """
@@ -2983,9 +3269,8 @@ class HiC(object):
                                                             samples[where, 1]) - numpy.mean(samples[where, 0]))
 
         # compile and write results
+        self.collective.Sum(results, root=0)
         if self.rank == 0:
-            for i in range(1, self.num_procs):
-                results += self.comm.recv(source=i, tag=11)
             mean_results = numpy.mean(results, axis=0)
             X = numpy.zeros(mean_results.shape, dtype=numpy.float64)
             for i in range(len(coverage)):
@@ -3015,9 +3300,8 @@ class HiC(object):
             output.close()
             if not self.silent and self.rank == 0:
                 print >> sys.stderr, ("\r%s\r") % (' ' * 80),
-        else:
-            self.comm.send(results, dest=0, tag=11)
 
+    @_local_workers
     def calculate_replicate_quality(self, hic2, filename, resolution=1000000, chroms=[]):
         """
         Write individual chromosome and overall quality metrics comparing two HiC datasets (presumably replicates) to a text file.
@@ -3178,9 +3462,8 @@ class HiC(object):
             probs1, valid1 = get_probs(expected1, counts1)
             probs2, valid2 = get_probs(expected2, counts2)
             results[chroms.index(chrom)] = get_quality(probs1, valid1, probs2, valid2)
+        self.collective.Sum(results, root=0)
         if self.rank == 0:
-            for i in range(1, self.num_procs):
-                results += self.comm.recv(source=i, tag=11)
             valid = numpy.where(results > -numpy.inf)[0]
             chroms = list(numpy.array(chroms)[valid])
             results = results[valid]
@@ -3193,6 +3476,4 @@ class HiC(object):
                 temp.append(str(results[k]))
             print >> output, '\t'.join(temp)
             output.close()
-        else:
-            self.comm.send(results, dest=0, tag=11)
 
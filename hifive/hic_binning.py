@@ -16,6 +16,7 @@ API Documentation
 
 import os
 import sys
+import math
 import subprocess
 
 import numpy
@@ -205,6 +206,8 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
             binbounds[:, 1] = numpy.arange(1, num_bins + 1) * binsize + start
     # if correction is requested, determine the appropriate type
     distance_parameters = None
+    distance_table = None
+    table_binsize = 0
     chrom_mean = 0.0
     corrections = None
     correction_sums = None
@@ -243,6 +246,7 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
     # if accounting for distance, get distance parameters
     if datatype in ['distance', 'enrichment', 'expected']:
         distance_parameters = hic.distance_parameters
+        distance_table, table_binsize = hic.find_distance_table()
         chrom_mean = hic.chromosome_means[chrint]
     # If proportional binning is requested
     ranges = None
@@ -273,16 +277,26 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
         data_array = numpy.zeros((num_bins * (num_bins - 1 + 2 * int(includediagonal)) / 2, 2), dtype=numpy.float32)
     if maxdistance == 0:
         maxdistance = stop - start + 1
+    # if each valid project bin falls in its own array bin and array bins are evenly spaced, expected values
+    # are the product of bin corrections and a distance mean for each diagonal
+    separable = False
+    if binned and correction_sums is None and valid.shape[0] > 0:
+        offsets = mids[valid] - mapping[valid].astype(numpy.int64) * hic.binned
+        separable = numpy.all(offsets == offsets[0])
     # Fill in data values
     if arraytype == 'compact':
-        if binned:
+        if separable:
+            _find_separable_cis_expected(hic, mapping, valid, corrections, distance_table, chrom_mean, data_array,
+                                         maxdistance)
+        elif binned:
             _hic_binning.find_binned_cis_compact_expected(mapping, corrections, mids, distance_parameters,
-                                                          data_array, correction_sums, chrom_mean, startfend, 
-                                                          maxdistance)
+                                                          distance_table, table_binsize, data_array,
+                                                          correction_sums, chrom_mean, startfend, maxdistance)
         else:
             _hic_binning.find_cis_compact_expected(mapping, corrections, binning_corrections,
                                                    binning_num_bins, fend_indices, mids, distance_parameters,
-                                                   data_array, correction_sums, ranges, overlap,
+                                                   distance_table, table_binsize, data_array, correction_sums,
+                                                   ranges, overlap,
                                                    chrom_mean, startfend, maxdistance, int(includediagonal))
         if datatype != 'expected':
             _hic_binning.find_cis_compact_observed(data, data_indices, mapping, mids, data_array,
@@ -294,19 +308,23 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
                 correction_sums = numpy.bincount(mapping[valid], minlength=num_bins).astype(numpy.float32)
             corrections.fill(0)
             corrections[valid] = 1.0
-            _hic_binning.find_cis_compact_expected(mapping, corrections, None, None, None, mids, None,
+            _hic_binning.find_cis_compact_expected(mapping, corrections, None, None, None, mids, None, None, 0,
                                                    data_array, correction_sums, ranges, overlap,
                                                    chrom_mean, startfend, maxdistance, int(includediagonal))
             data_array = data_array[:, :, ::-1]
     else:
-        if binned:
+        if separable:
+            _find_separable_cis_expected(hic, mapping, valid, corrections, distance_table, chrom_mean, data_array,
+                                         maxdistance)
+        elif binned:
             _hic_binning.find_binned_cis_upper_expected(mapping, corrections, mids, distance_parameters,
-                                                        data_array, correction_sums, chrom_mean, startfend, 
-                                                        maxdistance)
+                                                        distance_table, table_binsize, data_array,
+                                                        correction_sums, chrom_mean, startfend, maxdistance)
         else:
             _hic_binning.find_cis_upper_expected(mapping, corrections, binning_corrections,
                                                  binning_num_bins, fend_indices, mids, distance_parameters,
-                                                 data_array, correction_sums, ranges, overlap,
+                                                 distance_table, table_binsize, data_array, correction_sums,
+                                                 ranges, overlap,
                                                  chrom_mean, startfend, maxdistance, int(includediagonal))
         if datatype != 'expected':
             _hic_binning.find_cis_upper_observed(data, data_indices, mapping, mids, data_array,
@@ -318,7 +336,7 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
                 correction_sums = numpy.bincount(mapping[valid], minlength=num_bins).astype(numpy.float64)
             corrections.fill(0)
             corrections[valid] = 1.0
-            _hic_binning.find_cis_upper_expected(mapping, corrections, None, None, None, mids, None,
+            _hic_binning.find_cis_upper_expected(mapping, corrections, None, None, None, mids, None, None, 0,
                                                  data_array, correction_sums, ranges, overlap,
                                                  chrom_mean, startfend, maxdistance, int(includediagonal))
             data_array = data_array[:, ::-1]
@@ -350,6 +368,49 @@ def find_cis_signal(hic, chrom, binsize=10000, binbounds=None, start=None, stop=
             print >> sys.stderr, ("Done\n"),
         return data_array
 
+def _find_separable_cis_expected(hic, mapping, valid, corrections, distance_table, chrom_mean, data_array,
+                                 maxdistance):
+    num_bins = data_array.shape[0]
+    if data_array.ndim == 2:
+        num_bins = int(numpy.round(-0.5 + (num_bins * 2 + 0.25) ** 0.5))
+    bin_corrections = numpy.zeros(num_bins, dtype=numpy.float32)
+    if corrections is None:
+        bin_corrections[mapping[valid]] = 1.0
+    else:
+        bin_corrections[mapping[valid]] = corrections[valid]
+    band = min(num_bins, maxdistance / hic.binned + 1)
+    if data_array.ndim == 3:
+        band = min(band, data_array.shape[1])
+    if distance_table is None:
+        distance_means = numpy.ones(band, dtype=numpy.float64)
+    else:
+        distance_means = distance_table[:band, 0, 0] * math.exp(chrom_mean)
+    # fill the band from the products of corrections, scaled by each diagonal's distance mean, a row at a
+    # time for wide bands and a diagonal at a time for narrow ones to limit the number of python-level loops
+    bin_starts = numpy.arange(num_bins, dtype=numpy.int64)
+    bin_starts = bin_starts * num_bins - bin_starts * (bin_starts - 1) / 2
+    if band * 16 >= num_bins:
+        for i in range(num_bins):
+            n = min(band, num_bins - i)
+            values = (bin_corrections[i] * bin_corrections[i:(i + n)]).astype(numpy.float64) * distance_means[:n]
+            if data_array.ndim == 3:
+                data_array[i, :n, 1] = values
+            else:
+                data_array[bin_starts[i]:(bin_starts[i] + n), 1] = values
+    else:
+        for i in range(band):
+            values = ((bin_corrections[:(num_bins - i)] * bin_corrections[i:]).astype(numpy.float64) *
+                      distance_means[i])
+            if data_array.ndim == 3:
+                data_array[:(num_bins - i), i, 1] = values
+            else:
+                data_array[bin_starts[:(num_bins - i)] + i, 1] = values
+    if data_array.ndim == 3:
+        data_array[:, 0, 1] /= 2.0
+    else:
+        data_array[bin_starts, 1] /= 2.0
+    return None
+
 def _compact_to_upper(array, binned=False):
     n, m = array.shape[0], array.shape[1]
     if binned:
@@ -387,6 +448,20 @@ def _upper_to_compact(array, maxbins=0, binned=False):
             pos += n - i - 1
     return new_array
 
+def _find_trans_block_range(hic, chrint1, chrint2, startfend, stopfend):
+    # rows within a chromosome pair's block are ordered by the lower chromosome's fend, so trim the block to the
+    # requested fends of that chromosome
+    num_chroms = hic.fends['chromosomes'].shape[0]
+    trans_chrom_indices = hic._find_trans_chrom_indices()
+    block = min(chrint1, chrint2) * num_chroms + max(chrint1, chrint2)
+    start_index = trans_chrom_indices[block]
+    stop_index = trans_chrom_indices[block + 1]
+    if start_index < stop_index:
+        bounds = numpy.searchsorted(hic.data['trans_data'][start_index:stop_index, 0], [startfend, stopfend])
+        start_index, stop_index = start_index + bounds[0], start_index + bounds[1]
+    return start_index, stop_index
+
+
 def _find_fend_from_coord(hic, chrint, coord):
     """Find the next fend after the coordinate on chromosome 'chrint'."""
     if hic.binned is not None:
@@ -819,17 +894,20 @@ def find_cis_subregion_signal(hic, chrom, binsize=10000, binbounds1=None, binbou
         fend_indices = None
     # if accounting for distance, get distance parameters
     distance_parameters = None
+    distance_table = None
+    table_binsize = 0
     chrom_mean = 0.0
     if datatype in ['distance', 'enrichment', 'expected']:
         distance_parameters = hic.distance_parameters
+        distance_table, table_binsize = hic.find_distance_table()
         chrom_mean = hic.chromosome_means[chrint]
     # Create data array
     data_array = numpy.zeros((num_bins1, num_bins2, 2), dtype=numpy.float32)
     # Fill in data values
     _hic_binning.find_cis_subregion_expected(mapping1, mapping2, corrections1, corrections2, binning_corrections,
                                              binning_num_bins, fend_indices, data_array, correction_sums1,
-                                             correction_sums2, mids1, mids2, distance_parameters, chrom_mean,
-                                             startfend1, startfend2)
+                                             correction_sums2, mids1, mids2, distance_parameters, distance_table,
+                                             table_binsize, chrom_mean, startfend1, startfend2)
     if datatype != 'expected':
         _hic_binning.find_cis_subregion_observed(mapping1, mapping2, data, data_indices, data_array, startfend1,
                                                  startfend2)
@@ -844,7 +922,7 @@ def find_cis_subregion_signal(hic, chrom, binsize=10000, binbounds1=None, binbou
         correction_sums2 = None
         _hic_binning.find_cis_subregion_expected(mapping1, mapping2, corrections1, corrections2, None, None, None,
                                                  data_array, correction_sums1, correction_sums2, mids1, mids2, None,
-                                                 0.0, startfend1, startfend2)
+                                                 None, 0, 0.0, startfend1, startfend2)
         temp = numpy.copy(data_array[:, :, 0])
         data_array[:, :, 0] = data_array[:, :, 1]
         data_array[:, :, 1] = temp
@@ -1014,23 +1092,17 @@ def find_trans_signal(hic, chrom1, chrom2, binsize=10000, binbounds1=None, binbo
         print >> sys.stderr, ("Finding %s array for %s:%i-%i by %s:%i-%i...") % (datatype,  chrom1,
                                                                                  start1, stop1, chrom2, start2,
                                                                                  stop2),
-    # If datatype is not 'expected', pull the needed slice of data
+    # If datatype is not 'expected', pull the needed slice of the chromosome pair's block of data
     if datatype != 'expected':
         if chrint1 < chrint2:
-            start_index = hic.data['trans_indices'][startfend1]
-            stop_index = hic.data['trans_indices'][stopfend1]
+            start_index, stop_index = _find_trans_block_range(hic, chrint1, chrint2, startfend1, stopfend1)
         else:
-            start_index = hic.data['trans_indices'][startfend2]
-            stop_index = hic.data['trans_indices'][stopfend2]
+            start_index, stop_index = _find_trans_block_range(hic, chrint1, chrint2, startfend2, stopfend2)
         if start_index == stop_index:
             if not silent:
                 print >> sys.stderr, ("Insufficient data\n"),
             return None
-        if chrint1 < chrint2:
-            data_indices = hic.data['trans_indices'][startfend1:(stopfend1 + 1)]
-        else:
-            data_indices = hic.data['trans_indices'][startfend2:(stopfend2 + 1)]
-        data_indices -= data_indices[0]
+        data_indices = None
         data = hic.data['trans_data'][start_index:stop_index, :]
         if chrint1 < chrint2:
             data[:, 0] -= startfend1
@@ -1097,11 +1169,21 @@ def find_trans_signal(hic, chrom1, chrom2, binsize=10000, binbounds1=None, binbo
     else:
         corrections1 = None
         corrections2 = None
-    if ((hic.normalization in ['express', 'probability'] and
-            datatype == 'fend') or datatype == 'raw'):
+    if (hic.normalization in ['binning', 'binning-express', 'binning-probability'] and
+            datatype not in ['raw', 'distance']):
+        binning_corrections = hic.binning_corrections
+        binning_num_bins = hic.binning_num_bins
+        fend_indices = hic.binning_fend_indices
+    else:
+        binning_corrections = None
+        binning_num_bins = None
+        fend_indices = None
+    # without binning corrections, trans expected values are the trans mean times the product of per-bin
+    # correction sums, so only binning-corrected values need to be found from each fend pair
+    if binning_corrections is None:
         correction_sums1 = numpy.zeros(num_bins1, dtype=numpy.float64)
         correction_sums2 = numpy.zeros(num_bins2, dtype=numpy.float64)
-        if datatype == 'fend':
+        if datatype != 'raw' and corrections1 is not None:
             correction_sums1[:] = numpy.bincount(mapping1[valid1], weights=corrections1[valid1], minlength=num_bins1)
             correction_sums2[:] = numpy.bincount(mapping2[valid2], weights=corrections2[valid2], minlength=num_bins2)
         else:
@@ -1110,15 +1192,6 @@ def find_trans_signal(hic, chrom1, chrom2, binsize=10000, binbounds1=None, binbo
     else:
         correction_sums1 = None
         correction_sums2 = None
-    if (hic.normalization in ['binning', 'binning-express', 'binning-probability'] and
-            datatype not in ['raw', 'distance']):
-        binning_corrections = hic.binning_corrections
-        binning_num_bins = hic.binning_num_bins
-        fend_indices = hic.binning_fend_indices
-    else:
-        binning_corrections = None
-        binning_num_bins = None
-        fend_indices = None
     if datatype in ['distance', 'enrichment', 'expected']:
         if 'trans_means' not in hic.__dict__.keys():
             hic.find_trans_means()
@@ -1443,15 +1516,9 @@ def write_heatmap_dict(hic, filename, binsize, includetrans=True, datatype='enri
     :type format: str.
     :returns: None
     """
-    # check if MPI is available
-    if 'mpi4py' in sys.modules.keys():
-        comm = MPI.COMM_WORLD
-        rank = comm.Get_rank()
-        num_procs = comm.Get_size()
-    else:
-        comm = None
-        rank = 0
-        num_procs = 1
+    # work is divided between MPI processes or local workers as set up by the HiC object
+    rank = hic.rank
+    num_procs = hic.num_procs
     if ('silent' in kwargs and kwargs['silent']) or rank > 0:
         silent = True
     else:
@@ -1493,15 +1560,11 @@ def write_heatmap_dict(hic, filename, binsize, includetrans=True, datatype='enri
             for i in range(len(chroms)-1):
                 for j in range(i + 1, len(chroms)):
                     needed.append((chroms[i],chroms[j]))
-        if num_procs == 1:
-            node_needed = needed
-        else:
-            node_ranges = numpy.round(numpy.linspace(0, len(needed), num_procs + 1)).astype(numpy.int32)
-            for i in range(1, num_procs):
-                comm.send(needed[node_ranges[i]:node_ranges[i + 1]], dest=i, tag=11)
-            node_needed = needed[node_ranges[0]:node_ranges[1]]
     else:
-        node_needed = comm.recv(source=0, tag=11)
+        needed = None
+    needed = hic.collective.bcast(needed)
+    node_ranges = numpy.round(numpy.linspace(0, len(needed), num_procs + 1)).astype(numpy.int32)
+    node_needed = needed[node_ranges[rank]:node_ranges[rank + 1]]
     heatmaps = {}
     # Find heatmaps
     for chrom in node_needed:
@@ -1548,17 +1611,12 @@ def write_heatmap_dict(hic, filename, binsize, includetrans=True, datatype='enri
         if heatmaps[chrom] is None or heatmaps[chrom][0].shape[0] == 0:
             del heatmaps[chrom]
     # Collect heatmaps at node 0 and write to h5dict
-    if rank == 0:
-        if num_procs > 1:
-            for i in range(1, num_procs):
-                if node_ranges[i + 1] - node_ranges[i] > 0:
-                    temp = comm.recv(source=i, tag=11)
-                    heatmaps.update(temp)
-            del temp
-    else:
-        if len(heatmaps) > 0:
-            comm.send(heatmaps, dest=0, tag=11)
+    node_heatmaps = hic.collective.gather(heatmaps)
+    if rank > 0:
         return None
+    for i in range(1, num_procs):
+        heatmaps.update(node_heatmaps[i])
+    del node_heatmaps
     if format == 'hdf5':
         output = h5py.File(filename, 'w')
         output.attrs['resolution'] = binsize
@@ -1773,9 +1831,12 @@ def find_multiresolution_heatmap(hic, chrom, start, stop, chrom2=None, start2=No
         fend_indices = None
     if datatype in ['distance', 'enrichment']:
         distance_parameters = hic.distance_parameters
+        distance_table, table_binsize = hic.find_distance_table()
         chrom_mean = hic.chromosome_means[chrint]
     else:
         distance_parameters = None
+        distance_table = None
+        table_binsize = 0
         chrom_mean = 0.0
     if trans:
         m = span2 / midbinsize
@@ -1811,11 +1872,9 @@ def find_multiresolution_heatmap(hic, chrom, start, stop, chrom2=None, start2=No
             chrom_mean = hic.trans_means[index]
         # pull relevant trans observations and remap
         if chrint2 < chrint:
-            start_index = hic.data['trans_indices'][startfend2]
-            stop_index = hic.data['trans_indices'][stopfend2]
+            start_index, stop_index = _find_trans_block_range(hic, chrint, chrint2, startfend2, stopfend2)
             data = hic.data['trans_data'][start_index:stop_index, :]
-            data_indices = hic.data['trans_indices'][startfend2:(stopfend2 + 1)]
-            data_indices -= data_indices[0]
+            data_indices = numpy.searchsorted(data[:, 0], numpy.arange(startfend2, stopfend2 + 1)).astype(numpy.int64)
             num_data = _hic_binning.remap_mrh_data(
                         data,
                         data_indices,
@@ -1828,11 +1887,9 @@ def find_multiresolution_heatmap(hic, chrom, start, stop, chrom2=None, start2=No
                         1)
             data[:num_data, :] = data[numpy.lexsort((data[:num_data, 1], data[:num_data, 0])), :]
         else:
-            start_index = hic.data['trans_indices'][startfend]
-            stop_index = hic.data['trans_indices'][stopfend]
+            start_index, stop_index = _find_trans_block_range(hic, chrint, chrint2, startfend, stopfend)
             data = hic.data['trans_data'][start_index:stop_index, :]
-            data_indices = hic.data['trans_indices'][startfend:(stopfend + 1)]
-            data_indices -= data_indices[0]
+            data_indices = numpy.searchsorted(data[:, 0], numpy.arange(startfend, stopfend + 1)).astype(numpy.int64)
             num_data = _hic_binning.remap_mrh_data(
                         data,
                         data_indices,
@@ -1908,6 +1965,8 @@ def find_multiresolution_heatmap(hic, chrom, start, stop, chrom2=None, start2=No
             binning_corrections,
             fend_indices,
             distance_parameters,
+            distance_table,
+            table_binsize,
             chrom_mean,
             dt_int)
     # find features for largest binned data array
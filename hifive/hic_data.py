@@ -4,6 +4,11 @@
 
 import os
 import sys
+import gzip
+import time
+import tempfile
+import itertools
+import multiprocessing
 
 import numpy
 import h5py
@@ -11,6 +16,14 @@ try:
     import pysam
 except:
     pass
+try:
+    import pypairix
+except:
+    pass
+try:
+    import hdf5plugin
+except:
+    pass
 
 
 class HiCData(object):
@@ -26,7 +39,7 @@ class HiCData(object):
     
     :param filename: The file name of the h5dict. This should end with the suffix '.hdf5'
     :type filename: str.
-    :param mode: The mode to open the h5dict with. This should be 'w' for creating or overwriting an h5dict with name given in filename.
+    :param mode: The mode to open the h5dict with. This should be 'w' for creating or overwriting an h5dict with name given in filename, or 'a' for adding reads to an existing h5dict. Reads loaded from raw, BAM, or pairs files into an existing h5dict are merged with its data.
     :type mode: str.
     :param silent: Indicates whether to print information about function execution for this object.
     :type silent: bool.
@@ -72,17 +85,25 @@ class HiCData(object):
         self.__dict__[key] = value
         return None
 
-    def save(self):
+    def save(self, compression=None, chunk_rows=None, compact=False):
         """
         Save analysis parameters to h5dict.
 
+        :param compression: The compression filter to store arrays with, either 'gzip', 'lzf', or 'blosc', with byte shuffling. 'blosc' requires the :mod:`hdf5plugin` module and falls back to 'gzip' if it is not installed. If None, arrays are stored uncompressed and contiguous.
+        :type compression: str.
+        :param chunk_rows: The number of rows per chunk for 'cis_data' and 'trans_data'. If None and compression is requested, chunks are sized so that reading a chromosome's or chromosome pair's slice of data only decompresses a small margin of rows outside of it.
+        :type chunk_rows: int.
+        :param compact: If True, 'cis_data' is stored without its first column, which is implied by 'cis_indices', and the first column of 'trans_data' is delta-encoded within each chromosome pair block given by 'trans_chrom_indices'. Second fend indices are delta-encoded within each first fend's interactions and stored with counts in the smallest sufficient unsigned integer types. Arrays not ordered by their first column (within each chromosome pair for 'trans_data') are stored normally. :class:`HiC <hifive.hic.HiC>` objects expand compact arrays as slices are read.
+        :type compact: bool.
         :returns: None
         """
         self.history.replace("'None'", "None")
         datafile = h5py.File(self.file, 'w')
         chroms = self.fends['chromosomes'][...]
+        if chunk_rows is None and compression is not None:
+            chunk_rows = self._find_chunk_rows()
         for key in self.__dict__.keys():
-            if key in ['file', 'chr2int', 'fends', 'silent', 'cuts']:
+            if key in ['file', 'chr2int', 'chr_codes', 'fends', 'silent', 'cuts']:
                 continue
             elif key == 'stats':
                 stats = []
@@ -92,18 +113,57 @@ class HiCData(object):
                 datafile.create_dataset(name='stats', data=stats)
             elif self[key] is None:
                 continue
+            elif key in ['cis_data', 'trans_data']:
+                name = key.split('_')[0]
+                encoded = None
+                if compact and name == 'cis':
+                    encoded = _encode_compact_data(self[key], self['cis_indices'])
+                    suffixes = ['partner_deltas', 'counts']
+                elif compact:
+                    encoded = _encode_compact_trans_data(self[key], self['trans_chrom_indices'])
+                    suffixes = ['fend_deltas', 'block_fends', 'partner_deltas', 'counts']
+                if encoded is None:
+                    datafile.create_dataset(key, data=self[key], **_dataset_options(self[key], compression,
+                                                                                     chunk_rows))
+                else:
+                    for suffix, array in zip(suffixes, encoded):
+                        datafile.create_dataset("%s_%s" % (name, suffix), data=array,
+                                                **_dataset_options(array, compression, chunk_rows))
             elif isinstance(self[key], numpy.ndarray):
-                datafile.create_dataset(key, data=self[key])
+                datafile.create_dataset(key, data=self[key], **_dataset_options(self[key], compression))
             elif isinstance(self[key], list):
                 if isinstance(self[key][0], numpy.ndarray):
                     for i in range(len(self[key])):
-                        datafile.create_dataset("%s.%s" % (key, chroms[i]), data=self[key][i])
+                        datafile.create_dataset("%s.%s" % (key, chroms[i]), data=self[key][i],
+                                                **_dataset_options(self[key][i], compression))
             elif not isinstance(self[key], dict):
                 datafile.attrs[key] = self[key]
 
         datafile.close()
         return None
 
+    def _find_chunk_rows(self):
+        """Return a number of data rows per chunk scaled to the sizes of per-chromosome and chromosome pair slices."""
+        if 'binned' in self.fends['/'].attrs and self.fends['/'].attrs['binned'] is not None:
+            chr_indices = self.fends['bin_indices'][...]
+        else:
+            chr_indices = self.fends['chr_indices'][...]
+        sizes = []
+        if self['cis_indices'] is not None:
+            indices = self['cis_indices']
+            sizes.append(indices[numpy.minimum(chr_indices[1:], indices.shape[0] - 1)] -
+                         indices[numpy.minimum(chr_indices[:-1], indices.shape[0] - 1)])
+        if self['trans_chrom_indices'] is not None:
+            sizes.append(self['trans_chrom_indices'][1:] - self['trans_chrom_indices'][:-1])
+        if len(sizes) == 0:
+            return None
+        sizes = numpy.hstack(sizes)
+        sizes = sizes[numpy.where(sizes > 0)[0]]
+        if sizes.shape[0] == 0:
+            return None
+        # partial chunks at either end of a slice add at most a quarter of the median slice size
+        return int(min(65536, max(4096, numpy.median(sizes) / 8)))
+
     def load(self):
         """
         Load data from h5dict specified at object creation.
@@ -118,8 +178,15 @@ class HiCData(object):
                 stats = datafile[key][...]
                 for i in range(stats.shape[0]):
                     self.stats[stats['name'][i]] = stats['count'][i]
+            elif key in ['cis_partner_deltas', 'cis_counts', 'trans_fend_deltas', 'trans_block_fends',
+                         'trans_partner_deltas', 'trans_counts']:
+                continue
             else:
                 self[key] = numpy.copy(datafile[key])
+        # expand compactly-stored data
+        for name in ['cis', 'trans']:
+            if '%s_partner_deltas' % name in datafile:
+                self['%s_data' % name] = _open_compact_data(datafile, name)[...]
         for key in datafile['/'].attrs.keys():
             self[key] = datafile['/'].attrs[key]
         # ensure fend h5dict exists
@@ -139,6 +206,11 @@ class HiCData(object):
                 self.chr2int = {}
                 for i, chrom in enumerate(self.fends['chromosomes']):
                     self.chr2int[chrom] = i
+                # order trans data from files saved without chromosome pair indices
+                if self['trans_data'] is not None and self['trans_chrom_indices'] is None:
+                    self.trans_data, self.trans_chrom_indices = _order_trans_data(self.trans_data,
+                                                                                  self._find_chr_indices())
+                    self.trans_indices = None
         datafile.close()
         return None
 
@@ -152,7 +224,140 @@ class HiCData(object):
                 self.fends['fends']['stop'][chr_indices[i + 1] - 1]])
         return None
 
-    def load_data_from_raw(self, fendfilename, filelist, maxinsert, skip_duplicate_filtering=False):
+    def _read_raw_blocks(self, input, blocksize=67108864, start=0, stop=None):
+        """Yield blocks of complete lines from an open raw read file, optionally only lines beginning in a byte range."""
+        if start > 0:
+            # skip the line containing the byte before start, which belongs to the previous range
+            input.seek(start - 1)
+            input.readline()
+        position = input.tell()
+        remainder = ''
+        while stop is None or position < stop:
+            if stop is None:
+                block = input.read(blocksize)
+            else:
+                block = input.read(min(blocksize, stop - position))
+            if len(block) == 0:
+                break
+            position += len(block)
+            last = block.rfind('\n') + 1
+            if last == 0:
+                remainder += block
+                continue
+            yield remainder + block[:last]
+            remainder = block[last:]
+        if stop is not None and len(remainder) > 0:
+            # finish the last line beginning within the range
+            remainder += input.readline()
+            if remainder[-1] == '\n':
+                remainder = remainder[:-1]
+        if len(remainder) > 0:
+            yield remainder + '\n'
+
+    def _parse_raw_block(self, block, columns=(0, 1, 2, 3, 4, 5), width=6, one_based=False):
+        """Return chromosome pair indices and packed, ordered coordinate keys for a block of raw read lines.
+
+        'columns' gives the positions of the chromosome, coordinate, and strand of the first and then second read end
+        within lines of 'width' tab-separated fields. If 'one_based' is True, coordinates are 1-based 5' read end
+        positions and are converted to the 0-based convention used for BAM files.
+        """
+        num_lines = block.count('\n')
+        fields = block.replace('\n', '\t').split('\t')
+        if len(fields) != num_lines * width + 1:
+            # lines with an unexpected number of columns need to be split individually
+            fields = []
+            for line in block.split('\n')[:-1]:
+                fields.extend((line.split('\t') + [''] * width)[:width])
+            fields.append('')
+        # map chromosome names through a code table, adding any names not in the fend file
+        chroms1 = fields[columns[0]:-1:width]
+        chroms2 = fields[columns[3]:-1:width]
+        for name in set(chroms1).union(chroms2).difference(self.chr_codes):
+            self.chr_codes[name] = -1
+        codes = numpy.empty((num_lines, 2), dtype=numpy.int64)
+        codes[:, 0] = map(self.chr_codes.__getitem__, chroms1)
+        codes[:, 1] = map(self.chr_codes.__getitem__, chroms2)
+        del chroms1, chroms2
+        valid = numpy.where((codes[:, 0] >= 0) & (codes[:, 1] >= 0))[0]
+        self.stats['chr_not_in_fends'] += num_lines - valid.shape[0]
+        if valid.shape[0] == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+        starts = numpy.empty((valid.shape[0], 2), dtype=numpy.int64)
+        for i, (column, strand_column) in enumerate([columns[1:3], columns[4:6]]):
+            values = numpy.fromstring(' '.join(fields[column:-1:width]), dtype=numpy.int64, sep=' ')
+            if values.shape[0] == num_lines:
+                starts[:, i] = values[valid]
+            else:
+                # unparseable coordinates are only an error for lines with valid chromosomes
+                starts[:, i] = [int(fields[j * width + column]) for j in valid]
+            strands = ''.join(fields[strand_column:-1:width])
+            if len(strands) == num_lines:
+                strands = numpy.fromstring(strands, dtype='S1')
+            else:
+                strands = numpy.array(fields[strand_column:-1:width])
+            reverse = numpy.where(strands[valid] == '-')[0]
+            if one_based:
+                starts[:, i] -= 1
+                starts[reverse, i] += 1
+            starts[reverse, i] *= -1
+        codes = codes[valid, :]
+        del valid, values, strands, reverse, fields
+        return self._pack_read_ends(codes, starts)
+
+    def _pack_read_ends(self, codes, starts):
+        """Return chromosome pair indices and packed keys for read ends, ordering ends within each read."""
+        # order ends so the lower chromosome, or upstream coordinate for cis reads, comes first
+        swap = numpy.where((codes[:, 1] < codes[:, 0]) | ((codes[:, 0] == codes[:, 1]) &
+                           (numpy.abs(starts[:, 0]) > numpy.abs(starts[:, 1]))))[0]
+        codes[swap, :] = codes[swap, ::-1]
+        starts[swap, :] = starts[swap, ::-1]
+        pairs = codes[:, 1] * (codes[:, 1] + 1) / 2 + codes[:, 0]
+        return pairs, self._pack_read_keys(starts[:, 0], starts[:, 1])
+
+    def _pack_read_keys(self, start1, start2):
+        """Pack signed coordinate pairs into int64 keys that sort by start1 and then start2."""
+        return (start1.astype(numpy.int64) << 32) + (start2.astype(numpy.int64) + 2147483648)
+
+    def _unpack_read_keys(self, keys):
+        """Return the signed coordinate pairs encoded in packed int64 keys."""
+        return (keys >> 32), (keys & 4294967295) - 2147483648
+
+    def _split_read_keys(self, pairs, keys, counts=None):
+        """Arrange sorted read keys into per-chromosome pair arrays of coordinates (and counts if given)."""
+        num_chroms = len(self.chr2int)
+        bounds = numpy.searchsorted(pairs, numpy.arange(num_chroms * (num_chroms + 1) / 2 + 1))
+        if counts is None:
+            width = 2
+        else:
+            width = 3
+        data = []
+        for i in range(num_chroms):
+            data.append([])
+            for j in range(i + 1):
+                index = i * (i + 1) / 2 + j
+                temp = numpy.empty((bounds[index + 1] - bounds[index], width), dtype=numpy.int32)
+                temp[:, 0], temp[:, 1] = self._unpack_read_keys(keys[bounds[index]:bounds[index + 1]])
+                if counts is not None:
+                    temp[:, 2] = counts[bounds[index]:bounds[index + 1]]
+                data[i].append(temp)
+        return data
+
+    def _map_read_keys(self, pairs, keys, counts, fend_pairs, skip_duplicate_filtering):
+        """Map a set of unique reads to fend or bin pairs."""
+        if pairs.shape[0] == 0:
+            return None
+        if skip_duplicate_filtering:
+            data = self._split_read_keys(pairs, keys, counts)
+        else:
+            data = self._split_read_keys(pairs, keys)
+        if self.re:
+            self._find_fend_pairs(data, fend_pairs, skip_duplicate_filtering)
+        else:
+            self._find_bin_pairs(data, fend_pairs, skip_duplicate_filtering)
+        return None
+
+    def load_data_from_raw(self, fendfilename, filelist, maxinsert, skip_duplicate_filtering=False, max_memory=None,
+                          temp_dir=None, processes=1):
         """
         Read interaction counts from a text file(s) and place in h5dict.
 
@@ -170,19 +375,27 @@ class HiCData(object):
         :type maxinsert: int.
         :param skip_duplicate_filtering: Do not remove PCR duplicates. This allows much lower memoer requirements since files can be processed in chunks.
         :type skip_duplicate_filtering: bool.
+        :param max_memory: The approximate amount of memory, in megabytes, to use for holding reads during PCR duplicate filtering. If specified, sorted runs of unique reads are written to temporary files and merged once each file (or file pair) is loaded, so memory use does not grow with library size. If None, all unique reads are held in memory.
+        :type max_memory: int.
+        :param temp_dir: The directory in which to write temporary files when 'max_memory' is specified. If None, the system default temporary directory is used.
+        :type temp_dir: str.
+        :param processes: The number of processes to use for loading files. Each file (or file pair) is loaded and filtered for PCR duplicates independently in its own process and the results are merged. If there are more processes than raw text files and 'max_memory' is None, files are also split into byte ranges that are parsed in parallel. If 'max_memory' is specified, it is divided between processes.
+        :type processes: int.
         :returns: None
 
         :Attributes: * **fendfilename** (*str.*) - A string containing the relative path of the fend file.
                      * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend, the second column contains the idnex of the downstream fend, and the third column contains the number of reads observed for that fend pair.
                      * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'cis_data'. For example, all of the downstream cis interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
                      * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chroosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream fend, and the third column contains the number of reads observed for that fend pair.
-                     * **trans_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'trans_data'. For example, all of the downstream trans interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :].
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by fend pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
                      * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved fend attributes can be accessed through this class attribute.
                      * **maxinsert** (*int.*) - An interger denoting the maximum included distance sum between both read ends and their downstream RE site.
 
         When data is loaded the 'history' attribute is updated to include the history of the fend file that becomes associated with it.
+
+        If the object already contains data, new reads are merged into it, summing counts for shared fend pairs, and read statistics are added to the existing statistics. The same fend file and maxinsert must be used. PCR duplicates are filtered within each file (or file pair), so appending files gives the same counts as loading them together, except that valid pair counts for binned RE data are summed across appended files.
         """
-        self.history += "HiCData.load_data_from_raw(fendfilename='%s', filelist=%s, maxinsert=%i, skip_duplicate_filtering=%s) - " % (fendfilename, str(filelist), maxinsert, str(skip_duplicate_filtering))
+        self.history += "HiCData.load_data_from_raw(fendfilename='%s', filelist=%s, maxinsert=%i, skip_duplicate_filtering=%s, max_memory=%s, temp_dir=%s, processes=%i) - " % (fendfilename, str(filelist), maxinsert, str(skip_duplicate_filtering), str(max_memory), str(temp_dir), processes)
         # determine if fend file exists and if so, load it
         if not os.path.exists(fendfilename):
             if not self.silent:
@@ -190,6 +403,9 @@ class HiCData(object):
                 ("The fend file %s was not found. No data was loaded.\n") % (fendfilename),
             self.history += "Error: '%s' not found\n" % fendfilename
             return None
+        if not self._check_appended_data(fendfilename, maxinsert):
+            return None
+        previous = self._stash_data()
         self.fendfilename = "%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(fendfilename)),
                                        os.path.dirname(self.file)), os.path.basename(fendfilename))
         self.maxinsert = maxinsert
@@ -202,11 +418,13 @@ class HiCData(object):
             self.re = True
         else:
             self.re = False
-        self.history = self.fends['/'].attrs['history'] + self.history
+        if previous is None:
+            self.history = self.fends['/'].attrs['history'] + self.history
         self.chr2int = {}
         chroms = self.fends['chromosomes'][...]
         for i, j in enumerate(chroms):
             self.chr2int[j] = i
+        self.chr_codes = dict(self.chr2int)
         self.insert_distribution = numpy.zeros((182, 2), dtype=numpy.int32)
         self.insert_distribution[1:, 1] = numpy.round(numpy.exp(numpy.linspace(3.8, 12.8, 181))).astype(numpy.int32)
         # load data from all files, skipping if chromosome not in the fend file.
@@ -217,104 +435,23 @@ class HiCData(object):
             raw_filelist.append("%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(filename)),
                                            os.path.dirname(self.file)), os.path.basename(filename)))
         self.raw_filelist = ",".join(raw_filelist)
-        fend_pairs = []
-        for i in range(len(chroms)):
-            fend_pairs.append([])
-            for j in range(i + 1):
-                fend_pairs[i].append({})
-        total_reads = 0
+        fend_pairs = self._empty_fend_pairs(len(chroms))
+        present = []
         for fname in filelist:
-            data = []
-            for i in range(len(chroms)):
-                data.append([])
-                for j in range(i + 1):
-                    data[i].append({})
             if not os.path.exists(fname):
                 if not self.silent:
                     print >> sys.stderr, ("The file %s was not found...skipped.\n") % (fname.split('/')[-1]),
                 self.history += "'%s' not found, " % fname
                 continue
-            if not self.silent:
-                print >> sys.stderr, ("Loading data from %s...") % (fname.split('/')[-1]),
-            a = 0
-            input = open(fname, 'r', 1)
-            new_reads = 0
-            for line in input:
-                temp = line.strip('\n').split('\t')
-                if temp[0] not in self.chr2int or temp[3] not in self.chr2int:
-                    self.stats['chr_not_in_fends'] += 1
-                    continue
-                chrint1 = self.chr2int[temp[0]]
-                chrint2 = self.chr2int[temp[3]]
-                start1 = int(temp[1])
-                start2 = int(temp[4])
-                if temp[2] == '-':
-                    start1 = -start1
-                if temp[5] == '-':
-                    start2 = -start2
-                if chrint1 == chrint2:
-                    if abs(start1) > abs(start2):
-                        start1, start2 = start2, start1
-                elif chrint2 < chrint1:
-                    chrint1, chrint2, start1, start2 = chrint2, chrint1, start2, start1
-                key = (start1, start2)
-                if key not in data[chrint2][chrint1]:
-                    if skip_duplicate_filtering:
-                        data[chrint2][chrint1][key] = 1
-                    else:
-                        data[chrint2][chrint1][key] = None
-                else:
-                    if skip_duplicate_filtering:
-                        data[chrint2][chrint1][key] += 1
-                    else:
-                        self.stats['pcr_duplicates'] += 1
-                a += 1
-                if skip_duplicate_filtering and a >= 10000000:
-                    for i in range(len(data)):
-                        for j in range(len(data[i])):
-                            temp = numpy.zeros((len(data[i][j]), 3), dtype=numpy.int32)
-                            k = 0
-                            for key, count in data[i][j].iteritems():
-                                temp[k, :] = (key[0], key[1], count)
-                                self.stats['pcr_duplicates'] += count - 1
-                                k += 1
-                            data[i][j] = temp
-                            new_reads += numpy.sum(data[i][j][:, 2])
-                    if self.re:
-                        self._find_fend_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    else:
-                        self._find_bin_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    if not self.silent:
-                        print >> sys.stderr, ("\r%s\rLoading data from %s...") % (' '*50, fname.split('/')[-1]),
-                    for i in range(len(data)):
-                        for j in range(len(data[i])):
-                            data[i][j] = {}
-                    a = 0
-            input.close()
-            if not skip_duplicate_filtering or a > 0:
-                for i in range(len(data)):
-                    for j in range(len(data[i])):
-                        if skip_duplicate_filtering:
-                            temp = numpy.zeros((len(data[i][j]), 3), dtype=numpy.int32)
-                            k = 0
-                            for key, count in data[i][j].iteritems():
-                                temp[k, :] = (key[0], key[1], count)
-                                self.stats['pcr_duplicates'] += count - 1
-                                k += 1
-                            data[i][j] = temp
-                            new_reads += numpy.sum(data[i][j][:, 2])
-                        else:
-                            data[i][j] = numpy.array(data[i][j].keys(), dtype=numpy.int32)
-                            new_reads += data[i][j].shape[0]
-                # map data to fends, filtering as needed
-                if new_reads > 0 and (a > 0 or not skip_duplicate_filtering):
-                    if self.re:
-                        self._find_fend_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    else:
-                        self._find_bin_pairs(data, fend_pairs, skip_duplicate_filtering)
-            total_reads += new_reads
-            if not self.silent:
-                print >> sys.stderr, ("\r%s\r%i validly-mapped reads pairs loaded.\n") % (' ' * 50, new_reads),
+            present.append(fname)
+        if processes > 1 and len(present) > 0:
+            total_reads = self._load_files_in_parallel(present, fend_pairs, skip_duplicate_filtering, max_memory,
+                                                       temp_dir, processes)
+        else:
+            total_reads = 0
+            for fname in present:
+                total_reads += self._load_raw_file(fname, fend_pairs, skip_duplicate_filtering, max_memory,
+                                                   temp_dir)
         if skip_duplicate_filtering:
             self.stats['total_reads'] = total_reads + self.stats['chr_not_in_fends']
         else:
@@ -324,11 +461,13 @@ class HiCData(object):
         total_fend_pairs = 0
         for i in range(len(fend_pairs)):
             for j in range(len(fend_pairs[i])):
-                total_fend_pairs += len(fend_pairs[i][j])
+                total_fend_pairs += fend_pairs[i][j][0].shape[0]
         if total_fend_pairs == 0:
             if not self.silent:
                 print >> sys.stderr, ("No valid data was loaded.\n"),
             self.history += "Error: no valid data loaded\n"
+            if previous is not None:
+                self._merge_previous_data(previous)
             return None
         if not self.silent:
             print >> sys.stderr, ("%i total validly-mapped read pairs loaded. %i valid fend pairs\n") %\
@@ -338,10 +477,13 @@ class HiCData(object):
             self._parse_binned_fend_pairs(fend_pairs)
         else:
             self._parse_fend_pairs(fend_pairs)
+        if previous is not None:
+            self._merge_previous_data(previous)
         self.history += 'Success\n'
         return None
 
-    def load_data_from_bam(self, fendfilename, filelist, maxinsert, skip_duplicate_filtering=False):
+    def load_data_from_bam(self, fendfilename, filelist, maxinsert, skip_duplicate_filtering=False, max_memory=None,
+                          temp_dir=None, processes=1):
         """
         Read interaction counts from pairs of BAM-formatted alignment file(s) and place in h5dict.
 
@@ -353,19 +495,27 @@ class HiCData(object):
         :type maxinsert: int.
         :param skip_duplicate_filtering: Do not remove PCR duplicates. This allows much lower memoer requirements since files can be processed in chunks.
         :type skip_duplicate_filtering: bool.
+        :param max_memory: The approximate amount of memory, in megabytes, to use for holding reads during PCR duplicate filtering. If specified, sorted runs of unique reads are written to temporary files and merged once each file (or file pair) is loaded, so memory use does not grow with library size. If None, all unique reads are held in memory.
+        :type max_memory: int.
+        :param temp_dir: The directory in which to write temporary files when 'max_memory' is specified. If None, the system default temporary directory is used.
+        :type temp_dir: str.
+        :param processes: The number of processes to use for loading files. Indexed BAM files are split into shards of reference sequences that are read in parallel, and mates are then paired by sorting read names. Otherwise, any processes beyond one per file are used for BAM decompression.
+        :type processes: int.
         :returns: None
 
         :Attributes: * **fendfilename** (*str.*) - A string containing the relative path of the fend file.
                      * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend, the second column contains the idnex of the downstream fend, and the third column contains the number of reads observed for that fend pair.
                      * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'cis_data'. For example, all of the downstream cis interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
                      * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chroosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream fend, and the third column contains the number of reads observed for that fend pair.
-                     * **trans_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'trans_data'. For example, all of the downstream trans interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :].
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by fend pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
                      * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved fend attributes can be accessed through this class attribute.
                      * **maxinsert** (*int.*) - An interger denoting the maximum included distance sum between both read ends and their downstream RE site.
 
         When data is loaded the 'history' attribute is updated to include the history of the fend file that becomes associated with it.
+
+        If the object already contains data, reads from the new BAM file pairs are merged into it as described for :func:`load_data_from_raw`, with PCR duplicates filtered within each pair of BAM files.
         """
-        self.history += "HiCData.load_data_from_bam(fendfilename='%s', filelist=%s, maxinsert=%i, skip_duplicate_filtering=%s) - " % (fendfilename, str(filelist), maxinsert, str(skip_duplicate_filtering))
+        self.history += "HiCData.load_data_from_bam(fendfilename='%s', filelist=%s, maxinsert=%i, skip_duplicate_filtering=%s, max_memory=%s, temp_dir=%s, processes=%i) - " % (fendfilename, str(filelist), maxinsert, str(skip_duplicate_filtering), str(max_memory), str(temp_dir), processes)
         if 'pysam' not in sys.modules.keys():
             if not self.silent:
                 print >> sys.stderr, ("The pysam module must be installed to use this function.")
@@ -377,6 +527,9 @@ class HiCData(object):
                 print >> sys.stderr, ("The fend file %s was not found. No data was loaded.\n") % (fendfilename),
             self.history += "Error: '%s' not found\n" % fendfilename
             return None
+        if not self._check_appended_data(fendfilename, maxinsert):
+            return None
+        previous = self._stash_data()
         self.fendfilename = "%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(fendfilename)),
                                        os.path.dirname(self.file)), os.path.basename(fendfilename))
         self.maxinsert = maxinsert
@@ -389,7 +542,8 @@ class HiCData(object):
             self.re = True
         else:
             self.re = False
-        self.history = self.fends['/'].attrs['history'] + self.history
+        if previous is None:
+            self.history = self.fends['/'].attrs['history'] + self.history
         self.chr2int = {}
         chroms = self.fends['chromosomes'][...]
         for i, j in enumerate(chroms):
@@ -406,12 +560,8 @@ class HiCData(object):
             bam_filelist.append("%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(filenames[1])),
                                            os.path.dirname(self.file)), os.path.basename(filenames[1])))
         self.bam_filelist = ",".join(bam_filelist)
-        total_reads = 0
-        fend_pairs = []
-        for i in range(len(chroms)):
-            fend_pairs.append([])
-            for j in range(i + 1):
-                fend_pairs[i].append({})
+        fend_pairs = self._empty_fend_pairs(len(chroms))
+        present_pairs = []
         for filepair in filelist:
             # determine which files have both mapped ends present
             present = True
@@ -429,128 +579,11 @@ class HiCData(object):
                 if not self.silent:
                     print >> sys.stderr, ("No data for one or both ends could be located. Skipping this run.\n")
                 continue
-            unpaired = {}
-            # load first half of paired ends
-            if not self.silent:
-                print >> sys.stderr, ("Loading data from %s...") % (filepair[0].split('/')[-1]),
-            input = pysam.Samfile(filepair[0], 'rb')
-            idx2int = {}
-            for i in range(len(input.header['SQ'])):
-                chrom = input.header['SQ'][i]['SN']
-                if chrom in self.chr2int:
-                    idx2int[i] = self.chr2int[chrom]
-            for read in input.fetch(until_eof=True):
-                # Only consider reads with an alignment
-                if read.is_unmapped:
-                    continue
-                # if chromosome not in chr2int, skip
-                if read.tid not in idx2int:
-                    self.stats['chr_not_in_fends'] += 1
-                    continue
-                if read.is_reverse:
-                    end = -(read.pos + len(read.seq))
-                else:
-                    end = read.pos
-                unpaired[read.qname] = (idx2int[read.tid], end)
-            input.close()
-            if not self.silent:
-                print >> sys.stderr, ("Done\n"),
-            # load second half of paired ends
-            if not self.silent:
-                print >> sys.stderr, ("Loading data from %s...") % (filepair[1].split('/')[-1]),
-            data = []
-            for i in range(len(chroms)):
-                data.append([])
-                for j in range(i + 1):
-                    data[i].append({})
-            input = pysam.Samfile(filepair[1], 'rb')
-            idx2int = {}
-            for i in range(len(input.header['SQ'])):
-                chrom = input.header['SQ'][i]['SN']
-                if chrom in self.chr2int:
-                    idx2int[i] = self.chr2int[chrom]
-            a = 0
-            new_reads = 0
-            for read in input.fetch(until_eof=True):
-                # Only consider reads with an alignment
-                if read.is_unmapped:
-                    continue
-                if read.qname not in unpaired:
-                    continue
-                # if chromosome not in chr2int, skip
-                if read.tid not in idx2int:
-                    self.stats['chr_not_in_fends'] += 1
-                    continue
-                if read.is_reverse:
-                    start2 = -(read.pos + len(read.seq))
-                else:
-                    start2 = read.pos
-                chr1, start1 = unpaired[read.qname]
-                chr2 = idx2int[read.tid]
-                if chr1 == chr2:
-                    if abs(start1) > abs(start2):
-                        start1, start2 = start2, start1
-                elif chr2 < chr1:
-                    chr1, chr2, start1, start2 = chr2, chr1, start2, start1
-                key = (start1, start2)
-                if key not in data[chr2][chr1]:
-                    if skip_duplicate_filtering:
-                        data[chr2][chr1][key] = 1
-                    else:
-                        data[chr2][chr1][key] = None
-                else:
-                    if skip_duplicate_filtering:
-                        data[chr2][chr1][key] += 1
-                    else:
-                        self.stats['pcr_duplicates'] += 1
-                a += 1
-                if skip_duplicate_filtering and a >= 10000000:
-                    for i in range(len(data)):
-                        for j in range(len(data[i])):
-                            temp = numpy.zeros((len(data[i][j]),3), dtype=numpy.int32)
-                            k = 0
-                            for key, count in data[i][j].iteritems():
-                                temp[k, :] = (key[0], key[1], count)
-                                self.stats['pcr_duplicates'] += count - 1
-                                k += 1
-                            data[i][j] = temp
-                            new_reads += numpy.sum(data[i][j][:, 2])
-                    if self.re:
-                        self._find_fend_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    else:
-                        self._find_bin_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    if not self.silent:
-                        print >> sys.stderr, ("\r%s\rLoading data from %s...") % (' '*50, filepair[1].split('/')[-1]),
-                    for i in range(len(data)):
-                        for j in range(len(data[i])):
-                            data[i][j] = {}
-                    a = 0
-            input.close()
-            del unpaired
-            if a > 0 or not skip_duplicate_filtering:
-                for i in range(len(data)):
-                    for j in range(len(data[i])):
-                        if skip_duplicate_filtering:
-                                temp = numpy.zeros((len(data[i][j]),3), dtype=numpy.int32)
-                                k = 0
-                                for key, count in data[i][j].iteritems():
-                                    temp[k, :] = (key[0], key[1], count)
-                                    self.stats['pcr_duplicates'] += count - 1
-                                    k += 1
-                                data[i][j] = temp
-                                new_reads += numpy.sum(data[i][j][:, 2])
-                        else:
-                            data[i][j] = numpy.array(data[i][j].keys(), dtype=numpy.int32)
-                            new_reads += data[i][j].shape[0]
-                if new_reads > 0 and (a > 0 or not skip_duplicate_filtering):
-                    if self.re:
-                        self._find_fend_pairs(data, fend_pairs, skip_duplicate_filtering)
-                    else:
-                        self._find_bin_pairs(data, fend_pairs, skip_duplicate_filtering)
-            if not self.silent:
-                print >> sys.stderr, ("\r%s\rRead %i validly-mapped read pairs.\n") % (' ' * 50, new_reads),
-            total_reads += new_reads
-            del data
+            present_pairs.append(filepair)
+        total_reads = 0
+        for filepair in present_pairs:
+            total_reads += self._load_bam_files(filepair, fend_pairs, skip_duplicate_filtering, max_memory,
+                                                temp_dir, processes)
         if skip_duplicate_filtering:
             self.stats['total_reads'] = total_reads + self.stats['chr_not_in_fends']
         else:
@@ -560,11 +593,13 @@ class HiCData(object):
         total_fend_pairs = 0
         for i in range(len(fend_pairs)):
             for j in range(len(fend_pairs[i])):
-                total_fend_pairs += len(fend_pairs[i][j])
+                total_fend_pairs += fend_pairs[i][j][0].shape[0]
         if total_fend_pairs == 0:
             if not self.silent:
                 print >> sys.stderr, ("No valid data was loaded.\n"),
             self.history += "Error: no valid data loaded\n"
+            if previous is not None:
+                self._merge_previous_data(previous)
             return None
         if not self.silent:
             print >> sys.stderr, ("%i total validly-mapped read pairs loaded. %i valid fend pairs\n") %\
@@ -573,9 +608,574 @@ class HiCData(object):
             self._parse_binned_fend_pairs(fend_pairs)
         else:
             self._parse_fend_pairs(fend_pairs)
+        if previous is not None:
+            self._merge_previous_data(previous)
         self.history += "Success\n"
         return None
 
+    def load_data_from_pairs(self, fendfilename, filelist, maxinsert, skip_duplicate_filtering=False, max_memory=None,
+                             temp_dir=None, processes=1):
+        """
+        Read interaction counts from 4DN-formatted pairs file(s) and place in h5dict.
+
+        Files may be gzip- or bgzip-compressed. Positions are read from the 'chr1', 'pos1', 'chr2', 'pos2', 'strand1', and 'strand2' columns named in the '#columns:' header line, or from columns two through seven if no such line is present, and are treated as 1-based 5' read end positions. If a pairix index (a file with the same name plus the suffix '.px2') exists and the :mod:`pypairix` module is installed, each chromosome pair block is read from the index separately. Otherwise, files whose header reports them as sorted by chromosome pair ('#sorted: chr1-chr2-...') are streamed one chromosome pair block at a time, so only one block of reads is held in memory. Reads from unsorted files are filtered for PCR duplicates across the whole file, as with :func:`load_data_from_raw`.
+
+        :param fendfilename: This specifies the file name of the :class:`Fend` object to associate with the dataset.
+        :type fendfilename: str.
+        :param filelist: A list containing all of the file names of pairs files to be included in the dataset. If only one file is needed, this may be passed as a string.
+        :type filelist: list
+        :param maxinsert: A cutoff for filtering paired end reads whose total distance to their respective restriction sites exceeds this value. If data was produced without a restriction enzyme (fend object has no fend data, only bin data), this integer specifies the maximum intra-chromosomal insert size that strandedness is considered for filtering. Fragments below the maxinsert size are only kept if they occur on the same orientation strand. This filtering is skipped is maxinsert is None.
+        :type maxinsert: int.
+        :param skip_duplicate_filtering: Do not remove PCR duplicates. This allows much lower memoer requirements since files can be processed in chunks.
+        :type skip_duplicate_filtering: bool.
+        :param max_memory: The approximate amount of memory, in megabytes, to use for holding reads during PCR duplicate filtering. If specified, sorted runs of unique reads are written to temporary files and merged once each block (or unsorted file) is loaded. If None, all unique reads of a block (or unsorted file) are held in memory.
+        :type max_memory: int.
+        :param temp_dir: The directory in which to write temporary files when 'max_memory' is specified. If None, the system default temporary directory is used.
+        :type temp_dir: str.
+        :param processes: The number of processes to use for loading files. Chromosome pair blocks from pairix-indexed files are each loaded in a separate process. Otherwise, blocks of lines are parsed in parallel while reads are filtered and mapped in the calling process. If 'max_memory' is specified, it is divided between processes.
+        :type processes: int.
+        :returns: None
+
+        :Attributes: * **fendfilename** (*str.*) - A string containing the relative path of the fend file.
+                     * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend, the second column contains the idnex of the downstream fend, and the third column contains the number of reads observed for that fend pair.
+                     * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'cis_data'. For example, all of the downstream cis interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
+                     * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chroosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream fend, and the third column contains the number of reads observed for that fend pair.
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by fend pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
+                     * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved fend attributes can be accessed through this class attribute.
+                     * **maxinsert** (*int.*) - An interger denoting the maximum included distance sum between both read ends and their downstream RE site.
+
+        When data is loaded the 'history' attribute is updated to include the history of the fend file that becomes associated with it.
+
+        If the object already contains data, reads from the new pairs files are merged into it as described for :func:`load_data_from_raw`. PCR duplicates are filtered within each chromosome pair block of a sorted or indexed file, or within each unsorted file.
+        """
+        self.history += "HiCData.load_data_from_pairs(fendfilename='%s', filelist=%s, maxinsert=%i, skip_duplicate_filtering=%s, max_memory=%s, temp_dir=%s, processes=%i) - " % (fendfilename, str(filelist), maxinsert, str(skip_duplicate_filtering), str(max_memory), str(temp_dir), processes)
+        # determine if fend file exists and if so, load it
+        if not os.path.exists(fendfilename):
+            if not self.silent:
+                print >> sys.stderr, \
+                ("The fend file %s was not found. No data was loaded.\n") % (fendfilename),
+            self.history += "Error: '%s' not found\n" % fendfilename
+            return None
+        if not self._check_appended_data(fendfilename, maxinsert):
+            return None
+        previous = self._stash_data()
+        self.fendfilename = "%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(fendfilename)),
+                                       os.path.dirname(self.file)), os.path.basename(fendfilename))
+        self.maxinsert = maxinsert
+        self.fends = h5py.File(fendfilename, 'r')
+        if 'binned' in self.fends['/'].attrs and self.fends['/'].attrs['binned'] is not None:
+            self.binned = True
+        else:
+            self.binned = False
+        if 'fends' in self.fends and self.fends['fends'] is not None:
+            self.re = True
+        else:
+            self.re = False
+        if previous is None:
+            self.history = self.fends['/'].attrs['history'] + self.history
+        self.chr2int = {}
+        chroms = self.fends['chromosomes'][...]
+        for i, j in enumerate(chroms):
+            self.chr2int[j] = i
+        self.chr_codes = dict(self.chr2int)
+        self.insert_distribution = numpy.zeros((182, 2), dtype=numpy.int32)
+        self.insert_distribution[1:, 1] = numpy.round(numpy.exp(numpy.linspace(3.8, 12.8, 181))).astype(numpy.int32)
+        # load data from all files, skipping if chromosome not in the fend file.
+        if isinstance(filelist, str):
+            filelist = [filelist]
+        pairs_filelist = []
+        for filename in filelist:
+            pairs_filelist.append("%s/%s" % (os.path.relpath(os.path.dirname(os.path.abspath(filename)),
+                                             os.path.dirname(self.file)), os.path.basename(filename)))
+        self.pairs_filelist = ",".join(pairs_filelist)
+        fend_pairs = self._empty_fend_pairs(len(chroms))
+        total_reads = 0
+        for fname in filelist:
+            if not os.path.exists(fname):
+                if not self.silent:
+                    print >> sys.stderr, ("The file %s was not found...skipped.\n") % (fname.split('/')[-1]),
+                self.history += "'%s' not found, " % fname
+                continue
+            total_reads += self._load_pairs_file(fname, fend_pairs, skip_duplicate_filtering, max_memory, temp_dir,
+                                                 processes)
+        if skip_duplicate_filtering:
+            self.stats['total_reads'] = total_reads + self.stats['chr_not_in_fends']
+        else:
+            self.stats['total_reads'] = total_reads + self.stats['chr_not_in_fends'] + self.stats['pcr_duplicates']
+        if self.re:
+            self._clean_fend_pairs(fend_pairs)
+        total_fend_pairs = 0
+        for i in range(len(fend_pairs)):
+            for j in range(len(fend_pairs[i])):
+                total_fend_pairs += fend_pairs[i][j][0].shape[0]
+        if total_fend_pairs == 0:
+            if not self.silent:
+                print >> sys.stderr, ("No valid data was loaded.\n"),
+            self.history += "Error: no valid data loaded\n"
+            if previous is not None:
+                self._merge_previous_data(previous)
+            return None
+        if not self.silent:
+            print >> sys.stderr, ("%i total validly-mapped read pairs loaded. %i valid fend pairs\n") %\
+                             (total_reads, total_fend_pairs),
+        # write fend pairs to h5dict
+        if self.re and self.binned:
+            self._parse_binned_fend_pairs(fend_pairs)
+        else:
+            self._parse_fend_pairs(fend_pairs)
+        if previous is not None:
+            self._merge_previous_data(previous)
+        self.history += 'Success\n'
+        return None
+
+    def _open_pairs_file(self, fname):
+        """Open a pairs file, returning the file, its read end column layout and sorting, and its first data line."""
+        if open(fname, 'rb').read(2) == '\x1f\x8b':
+            input = gzip.open(fname, 'rb')
+        else:
+            input = open(fname, 'r')
+        names = ['readID', 'chr1', 'pos1', 'chr2', 'pos2', 'strand1', 'strand2']
+        sorting = 'none'
+        line = input.readline()
+        while line.startswith('#'):
+            if line.startswith('#columns:'):
+                names = line.split(':', 1)[1].split()
+            elif line.startswith('#sorted:'):
+                sorting = line.split(':', 1)[1].strip()
+            line = input.readline()
+        if len(line) > 0 and line[-1] != '\n':
+            line += '\n'
+        columns = tuple([names.index(name) for name in ['chr1', 'pos1', 'strand1', 'chr2', 'pos2', 'strand2']])
+        return input, columns, len(names), sorting, line
+
+    def _load_pairs_file(self, fname, fend_pairs, skip_duplicate_filtering=False, max_memory=None, temp_dir=None,
+                         processes=1):
+        """Load reads from a pairs file one chromosome pair block at a time, returning the number of valid reads."""
+        if not self.silent:
+            print >> sys.stderr, ("Loading data from %s...") % (fname.split('/')[-1]),
+        input, columns, width, sorting, line = self._open_pairs_file(fname)
+        if os.path.exists("%s.px2" % fname) and 'pypairix' in sys.modules:
+            input.close()
+            blocks = pypairix.open(fname).get_blocknames()
+            new_reads = 0
+            if processes > 1 and len(blocks) > 1:
+                settings = self._worker_settings(skip_duplicate_filtering, max_memory, temp_dir, processes)
+                tasks = [(('pairs_block', fname, block, columns, width), settings) for block in blocks]
+                pool = multiprocessing.Pool(processes)
+                try:
+                    for task, result in pool.imap_unordered(_load_reads_worker, tasks):
+                        self._merge_worker_stats(result)
+                        self._merge_fend_pairs(fend_pairs, result['fend_pairs'])
+                        new_reads += result['reads']
+                    pool.close()
+                except:
+                    pool.terminate()
+                    raise
+                finally:
+                    pool.join()
+            else:
+                for block in blocks:
+                    new_reads += self._load_pairs_block(fname, block, columns, width, fend_pairs,
+                                                        skip_duplicate_filtering, max_memory, temp_dir)
+        else:
+            new_reads = self._stream_pairs_file(input, columns, width, sorting.startswith('chr1-chr2'), line,
+                                                fend_pairs, skip_duplicate_filtering, max_memory, temp_dir,
+                                                processes)
+            input.close()
+        if not self.silent:
+            print >> sys.stderr, ("\r%s\r%i validly-mapped reads pairs loaded.\n") % (' ' * 50, new_reads),
+        return new_reads
+
+    def _load_pairs_block(self, fname, block, columns, width, fend_pairs, skip_duplicate_filtering=False,
+                          max_memory=None, temp_dir=None):
+        """Load the reads of one chromosome pair block from a pairix-indexed file, returning the number of valid reads."""
+        buffer = _ReadBuffer(len(self.chr2int) * (len(self.chr2int) + 1) / 2, skip_duplicate_filtering, max_memory,
+                             temp_dir)
+        lines = []
+        for row in pypairix.open(fname).querys2D(block):
+            lines.append('\t'.join(row))
+            # parse lines in sets of one million
+            if len(lines) >= 1000000:
+                pairs, keys = self._parse_raw_block('\n'.join(lines) + '\n', columns, width, True)
+                lines = []
+                for pairs, keys, counts in buffer.add(pairs, keys):
+                    self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        if len(lines) > 0:
+            pairs, keys = self._parse_raw_block('\n'.join(lines) + '\n', columns, width, True)
+            for pairs, keys, counts in buffer.add(pairs, keys):
+                self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        del lines
+        for pairs, keys, counts in buffer.finish():
+            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        self.stats['pcr_duplicates'] += buffer.duplicates
+        return buffer.reads
+
+    def _stream_pairs_file(self, input, columns, width, block_sorted, line, fend_pairs, skip_duplicate_filtering,
+                           max_memory, temp_dir, processes):
+        """Parse and map the reads from an open pairs file, finishing each chromosome pair block as it ends."""
+        num_pairs = len(self.chr2int) * (len(self.chr2int) + 1) / 2
+        if processes > 1:
+            settings = self._worker_settings(skip_duplicate_filtering, max_memory, temp_dir, processes)
+            pool = multiprocessing.Pool(processes)
+        blocks = self._read_raw_blocks(input, blocksize=16777216)
+        if len(line) > 0:
+            blocks = itertools.chain([line], blocks)
+        buffer = _ReadBuffer(num_pairs, skip_duplicate_filtering, max_memory, temp_dir)
+        new_reads = 0
+        current = None
+        finished = set()
+        try:
+            while True:
+                # parse sets of line blocks, in parallel if possible
+                parsed = []
+                if processes > 1:
+                    tasks = [(('pairs_text', block, columns, width), settings)
+                             for block in itertools.islice(blocks, processes)]
+                    for task, result in pool.map(_load_reads_worker, tasks):
+                        self._merge_worker_stats(result)
+                        parsed.append((result['pairs'], result['keys']))
+                else:
+                    for block in itertools.islice(blocks, 1):
+                        parsed.append(self._parse_raw_block(block, columns, width, True))
+                if len(parsed) == 0:
+                    break
+                for pairs, keys in parsed:
+                    if not block_sorted:
+                        for pairs, keys, counts in buffer.add(pairs, keys):
+                            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+                        continue
+                    # split reads into runs from the same chromosome pair
+                    bounds = numpy.r_[0, numpy.where(pairs[1:] != pairs[:-1])[0] + 1, pairs.shape[0]]
+                    for i in range(bounds.shape[0] - 1):
+                        if bounds[i + 1] == bounds[i]:
+                            continue
+                        if pairs[bounds[i]] != current:
+                            # a chromosome pair block is complete once reads from another pair are seen
+                            new_reads += self._finish_pairs_block(buffer, fend_pairs, skip_duplicate_filtering)
+                            current = pairs[bounds[i]]
+                            if current in finished and not self.silent and not skip_duplicate_filtering:
+                                print >> sys.stderr, ("Reads are not sorted by chromosome pair. Duplicates in separate blocks will not be removed.\n"),
+                            finished.add(current)
+                        for pairs2, keys2, counts in buffer.add(pairs[bounds[i]:bounds[i + 1]],
+                                                                keys[bounds[i]:bounds[i + 1]]):
+                            self._map_read_keys(pairs2, keys2, counts, fend_pairs, skip_duplicate_filtering)
+            new_reads += self._finish_pairs_block(buffer, fend_pairs, skip_duplicate_filtering)
+            if processes > 1:
+                pool.close()
+        except:
+            if processes > 1:
+                pool.terminate()
+            raise
+        finally:
+            if processes > 1:
+                pool.join()
+        return new_reads
+
+    def _finish_pairs_block(self, buffer, fend_pairs, skip_duplicate_filtering):
+        """Map all reads remaining in a read buffer and reset it for the next block, returning the number of reads."""
+        for pairs, keys, counts in buffer.finish():
+            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        self.stats['pcr_duplicates'] += buffer.duplicates
+        reads = buffer.reads
+        buffer.duplicates = 0
+        buffer.reads = 0
+        return reads
+
+    def _load_raw_file(self, fname, fend_pairs, skip_duplicate_filtering=False, max_memory=None, temp_dir=None):
+        """Load reads from a raw text file and map them to fend pairs, returning the number of valid reads."""
+        if not self.silent:
+            print >> sys.stderr, ("Loading data from %s...") % (fname.split('/')[-1]),
+        start_time = time.time()
+        line_count = 0
+        num_pairs = len(self.chr2int) * (len(self.chr2int) + 1) / 2
+        buffer = _ReadBuffer(num_pairs, skip_duplicate_filtering, max_memory, temp_dir)
+        input = open(fname, 'r')
+        for block in self._read_raw_blocks(input):
+            line_count += block.count('\n')
+            pairs, keys = self._parse_raw_block(block)
+            for pairs, keys, counts in buffer.add(pairs, keys):
+                self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+                if not self.silent:
+                    print >> sys.stderr, ("\r%s\rLoading data from %s...") % (' '*50, fname.split('/')[-1]),
+        input.close()
+        # map data to fends, filtering as needed
+        for pairs, keys, counts in buffer.finish():
+            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        self.stats['pcr_duplicates'] += buffer.duplicates
+        new_reads = buffer.reads
+        if not self.silent:
+            print >> sys.stderr, ("\r%s\r%i validly-mapped reads pairs loaded (%i reads/s).\n") % (' ' * 50,
+                new_reads, line_count / max(time.time() - start_time, 1e-6)),
+        return new_reads
+
+    def _load_bam_files(self, filepair, fend_pairs, skip_duplicate_filtering=False, max_memory=None, temp_dir=None,
+                        processes=1):
+        """Load reads from a pair of BAM files and map them to fend pairs, returning the number of valid reads."""
+        if not self.silent:
+            print >> sys.stderr, ("Loading data from %s and %s...") % (filepair[0].split('/')[-1],
+                                                                       filepair[1].split('/')[-1]),
+        ends1, ends2 = _load_bam_ends(filepair, processes)
+        # find the chromosome index for each reference sequence of each file
+        chroms1 = self._find_bam_chroms(ends1[0])[ends1[2]]
+        chroms2 = self._find_bam_chroms(ends2[0])[ends2[2]]
+        # keep the last alignment of each read name from the first file, as with a name lookup table
+        valid = numpy.where(chroms1 >= 0)[0]
+        self.stats['chr_not_in_fends'] += chroms1.shape[0] - valid.shape[0]
+        names1 = ends1[1][valid]
+        starts1 = ends1[3][valid]
+        chroms1 = chroms1[valid]
+        order = numpy.argsort(names1, kind='mergesort')
+        names1 = names1[order]
+        last = numpy.r_[numpy.where(names1[1:] != names1[:-1])[0], names1.shape[0] - 1]
+        order = order[last]
+        names1 = names1[last]
+        del valid, last
+        # pair each second-end alignment with its mate
+        indices = numpy.minimum(numpy.searchsorted(names1, ends2[1]), max(0, names1.shape[0] - 1))
+        if names1.shape[0] > 0:
+            matched = names1[indices] == ends2[1]
+        else:
+            matched = numpy.zeros(ends2[1].shape[0], dtype=numpy.bool)
+        valid = numpy.where(matched & (chroms2 >= 0))[0]
+        self.stats['chr_not_in_fends'] += numpy.sum(matched) - valid.shape[0]
+        del names1, matched
+        indices = order[indices[valid]]
+        codes = numpy.empty((valid.shape[0], 2), dtype=numpy.int64)
+        codes[:, 0] = chroms1[indices]
+        codes[:, 1] = chroms2[valid]
+        starts = numpy.empty((valid.shape[0], 2), dtype=numpy.int64)
+        starts[:, 0] = starts1[indices]
+        starts[:, 1] = ends2[3][valid]
+        del ends1, ends2, chroms1, chroms2, starts1, order, indices, valid
+        pairs, keys = self._pack_read_ends(codes, starts)
+        del codes, starts
+        num_pairs = len(self.chr2int) * (len(self.chr2int) + 1) / 2
+        buffer = _ReadBuffer(num_pairs, skip_duplicate_filtering, max_memory, temp_dir)
+        for pairs, keys, counts in buffer.add(pairs, keys):
+            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        for pairs, keys, counts in buffer.finish():
+            self._map_read_keys(pairs, keys, counts, fend_pairs, skip_duplicate_filtering)
+        self.stats['pcr_duplicates'] += buffer.duplicates
+        new_reads = buffer.reads
+        if not self.silent:
+            print >> sys.stderr, ("\r%s\rRead %i validly-mapped read pairs.\n") % (' ' * 50, new_reads),
+        return new_reads
+
+    def _find_bam_chroms(self, references):
+        """Return an array of chromosome indices for BAM reference sequences, -1 for those not in the fend file."""
+        chroms = numpy.zeros(len(references), dtype=numpy.int64) - 1
+        for i, name in enumerate(references):
+            if name in self.chr2int:
+                chroms[i] = self.chr2int[name]
+        return chroms
+
+    def _read_raw_range(self, fname, start, stop):
+        """Return unique reads from lines of a raw text file starting within a byte range, counting duplicates."""
+        buffer = _ReadBuffer(len(self.chr2int) * (len(self.chr2int) + 1) / 2)
+        input = open(fname, 'r')
+        for block in self._read_raw_blocks(input, start=start, stop=stop):
+            pairs, keys = self._parse_raw_block(block)
+            for result in buffer.add(pairs, keys):
+                pass
+        input.close()
+        pairs = numpy.zeros(0, dtype=numpy.int64)
+        keys = numpy.zeros(0, dtype=numpy.int64)
+        for pairs, keys, counts in buffer.finish():
+            pass
+        self.stats['pcr_duplicates'] += buffer.duplicates
+        return pairs, keys
+
+    def _worker_settings(self, skip_duplicate_filtering, max_memory, temp_dir, processes):
+        """Return the settings worker processes need to parse and map reads like this object."""
+        settings = {
+            'file': self.file,
+            'fendfilename': self.fends.filename,
+            'maxinsert': self.maxinsert,
+            'binned': self.binned,
+            're': self.re,
+            'chr2int': self.chr2int,
+            'insert_bins': self.insert_distribution[:, 1],
+            'skip_duplicate_filtering': skip_duplicate_filtering,
+            'max_memory': max_memory,
+            'temp_dir': temp_dir,
+        }
+        if max_memory is not None:
+            settings['max_memory'] = max_memory / float(processes)
+        return settings
+
+    def _merge_worker_stats(self, result):
+        """Add the read statistics and insert size distribution from a worker process result."""
+        for key in result['stats']:
+            self.stats[key] += result['stats'][key]
+        self.insert_distribution[:, 0] += result['insert_distribution']
+        for key in ['non_cis_invalid_insert', 'different_fragment_invalid_insert']:
+            if key in result:
+                self[key] = self.__dict__.get(key, 0) + result[key]
+        return None
+
+    def _merge_fend_pairs(self, fend_pairs, new_fend_pairs):
+        """Add the counts from one set of fend pair accumulators into another."""
+        for i in range(len(fend_pairs)):
+            for j in range(len(fend_pairs[i])):
+                fends1, fends2, counts = self._unpack_fend_pairs(new_fend_pairs[i][j])
+                self._add_fend_pairs(fend_pairs[i][j], fends1, fends2, counts)
+        return None
+
+    def _check_appended_data(self, fendfilename, maxinsert):
+        """Return whether reads can be appended to any existing data using the given fend file and insert cutoff."""
+        if self['cis_data'] is None and self['trans_data'] is None:
+            return True
+        if ('fends' in self.__dict__ and
+                os.path.abspath(self.fends.filename) == os.path.abspath(fendfilename) and self['maxinsert'] == maxinsert):
+            return True
+        if not self.silent:
+            print >> sys.stderr, ("Appended reads must use the same fend file and maxinsert as the existing data. No data was loaded.\n"),
+        self.history += "Error: fend file or maxinsert differs from existing data\n"
+        return False
+
+    def _stash_data(self):
+        """Remove any existing data and statistics from the object so new reads can be loaded, returning them."""
+        if self['cis_data'] is None and self['trans_data'] is None:
+            return None
+        previous = {'stats': dict(self.stats)}
+        for key in ['cis_data', 'trans_data', 'insert_distribution', 'raw_filelist', 'bam_filelist',
+                    'pairs_filelist']:
+            previous[key] = self[key]
+        for key in ['cis_data', 'cis_indices', 'cis_interaction_distribution', 'trans_data', 'trans_chrom_indices',
+                    'trans_interaction_distribution', 'raw_filelist', 'bam_filelist', 'pairs_filelist']:
+            self[key] = None
+        # reset counts in place so statistics are saved in the same order as for a newly created file
+        for key in self.stats:
+            self.stats[key] = 0
+        return previous
+
+    def _merge_previous_data(self, previous):
+        """Merge data and statistics removed by :func:`_stash_data` with newly loaded data."""
+        for key in previous['stats']:
+            self.stats[key] += previous['stats'][key]
+        if previous['insert_distribution'] is None:
+            pass
+        elif self.insert_distribution.shape == previous['insert_distribution'].shape:
+            self.insert_distribution[:, 0] += previous['insert_distribution'][:, 0]
+        elif not self.silent:
+            print >> sys.stderr, ("Insert size bins differ from existing data. Only the new insert distribution was kept.\n"),
+        if not self.silent:
+            print >> sys.stderr, ("Merging with existing data..."),
+        for key in ['raw_filelist', 'bam_filelist', 'pairs_filelist']:
+            filelist = [x for x in [previous[key], self[key]] if x is not None]
+            if len(filelist) > 0:
+                self[key] = ",".join(filelist)
+        self.cis_data = self._merge_data(previous['cis_data'], self.cis_data)
+        self.trans_data = self._merge_data(previous['trans_data'], self.trans_data, True)
+        if self.binned and not self.re:
+            num_fends = self.fends['bin_indices'][-1]
+        else:
+            num_fends = self.fends['chr_indices'][-1]
+        if not (self.re and self.binned):
+            # binned RE data only counts fend pairs within each set of reads
+            for name, data in [['valid_cis_pairs', self.cis_data], ['valid_trans_pairs', self.trans_data]]:
+                if data is not None:
+                    self.stats[name] = data.shape[0]
+                else:
+                    self.stats[name] = 0
+        cis_reads, trans_reads = self._index_data(num_fends)
+        if not self.silent:
+            print >> sys.stderr, ("Done  %i cis reads, %i trans reads\n") % (cis_reads, trans_reads),
+        return None
+
+    def _merge_data(self, data1, data2, blocked=False):
+        """Merge two sorted data arrays, summing the counts of shared pairs.
+
+        Arrays are ordered by first and then second index, or, if 'blocked' is True, by chromosome pair and then
+        first and second index, as for trans data. New rows are placed with a binary search and inserted in a
+        single pass, so existing data is not resorted.
+        """
+        if data1 is None:
+            return data2
+        if data2 is None:
+            return data1
+        keys1 = (data1[:, 0].astype(numpy.int64) << 32) + data1[:, 1]
+        keys2 = (data2[:, 0].astype(numpy.int64) << 32) + data2[:, 1]
+        if blocked:
+            chr_indices = self._find_chr_indices()
+            num_chroms = chr_indices.shape[0] - 1
+            bounds = []
+            for data in [data1, data2]:
+                blocks = ((numpy.searchsorted(chr_indices, data[:, 0], side='right') - 1) * num_chroms +
+                          numpy.searchsorted(chr_indices, data[:, 1], side='right') - 1)
+                bounds.append(numpy.searchsorted(blocks, numpy.arange(num_chroms ** 2 + 1)))
+            positions = numpy.zeros(keys2.shape[0], dtype=numpy.int64)
+            for i in numpy.where(bounds[1][1:] > bounds[1][:-1])[0]:
+                positions[bounds[1][i]:bounds[1][i + 1]] = bounds[0][i] + numpy.searchsorted(
+                    keys1[bounds[0][i]:bounds[0][i + 1]], keys2[bounds[1][i]:bounds[1][i + 1]])
+        else:
+            positions = numpy.searchsorted(keys1, keys2)
+        shared = numpy.where(positions < keys1.shape[0])[0]
+        shared = shared[numpy.where(keys1[positions[shared]] == keys2[shared])[0]]
+        data = numpy.copy(data1)
+        data[positions[shared], 2] += data2[shared, 2]
+        new = numpy.ones(keys2.shape[0], dtype=numpy.bool)
+        new[shared] = False
+        new = numpy.where(new)[0]
+        return numpy.insert(data, positions[new], data2[new, :], axis=0)
+
+    def _load_files_in_parallel(self, filelist, fend_pairs, skip_duplicate_filtering, max_memory, temp_dir, processes):
+        """Load reads from several raw text files in worker processes, merging fend pairs and statistics.
+
+        Each file is deduplicated independently, as in serial loading. When there are more processes than files and
+        reads are held in memory, files are also split into byte ranges whose unique reads are combined and
+        deduplicated in this process before mapping.
+        """
+        settings = self._worker_settings(skip_duplicate_filtering, max_memory, temp_dir, processes)
+        tasks = []
+        ranges = {}
+        for index, fname in enumerate(filelist):
+            if not skip_duplicate_filtering and max_memory is None and len(filelist) < processes:
+                # split files into roughly equal byte ranges so all processes are used
+                size = os.path.getsize(fname)
+                num_ranges = min(max(1, size / 1048576), (processes - 1) / len(filelist) + 1)
+                bounds = numpy.round(numpy.linspace(0, size, num_ranges + 1)).astype(numpy.int64)
+                ranges[index] = [num_ranges, []]
+                for i in range(num_ranges):
+                    tasks.append(('range', fname, bounds[i], bounds[i + 1], index))
+            else:
+                tasks.append(('raw', fname))
+        if not self.silent:
+            print >> sys.stderr, ("Loading data from %i files using %i processes...") % (len(filelist), processes),
+        total_reads = 0
+        pool = multiprocessing.Pool(processes)
+        try:
+            for task, result in pool.imap_unordered(_load_reads_worker, [(task, settings) for task in tasks]):
+                self._merge_worker_stats(result)
+                if task[0] == 'range':
+                    num_ranges, parts = ranges[task[4]]
+                    parts.append((result['pairs'], result['keys']))
+                    if len(parts) < num_ranges:
+                        continue
+                    # remove duplicates spanning byte ranges and map the file's reads here
+                    pairs = numpy.hstack([x[0] for x in parts])
+                    keys = numpy.hstack([x[1] for x in parts])
+                    del ranges[task[4]], parts
+                    pairs, keys, counts = _unique_read_keys(pairs, keys)
+                    self.stats['pcr_duplicates'] += numpy.sum(counts) - counts.shape[0]
+                    self._map_read_keys(pairs, keys, counts, fend_pairs, False)
+                    new_reads = pairs.shape[0]
+                    del pairs, keys, counts
+                else:
+                    self._merge_fend_pairs(fend_pairs, result['fend_pairs'])
+                    new_reads = result['reads']
+                total_reads += new_reads
+                if not self.silent:
+                    print >> sys.stderr, ("\r%s\r%i validly-mapped read pairs loaded from %s.\n") % (' ' * 50,
+                        new_reads, str(task[1]).split('/')[-1]),
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return total_reads
+
     def load_data_from_mat(self, fendfilename, filename):
         """
         Read interaction counts from a :mod:`HiCPipe`-compatible 'mat' text file and place in h5dict.
@@ -590,7 +1190,7 @@ class HiCData(object):
                      * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend, the second column contains the idnex of the downstream fend, and the third column contains the number of reads observed for that fend pair.
                      * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'cis_data'. For example, all of the downstream cis interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
                      * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chroosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream fend, and the third column contains the number of reads observed for that fend pair.
-                     * **trans_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'trans_data'. For example, all of the downstream trans interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :].
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by fend pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
                      * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved fend attributes can be accessed through this class attribute.
 
         When data is loaded the 'history' attribute is updated to include the history of the fend file that becomes associated with it.
@@ -657,12 +1257,15 @@ class HiCData(object):
             else:
                 fend_pairs[chr1][chr2][(fend2 - chr_indices[chr2], fend1 - chr_indices[chr1])] = count
         input.close()
+        for i in range(len(fend_pairs)):
+            for j in range(len(fend_pairs[i])):
+                fend_pairs[i][j] = self._dict_to_fend_pairs(fend_pairs[i][j])
         self.stats['total_reads'] = total_reads
         self._clean_fend_pairs(fend_pairs)
         total_fend_pairs = 0
         for i in range(len(fend_pairs)):
             for j in range(len(fend_pairs[i])):
-                total_fend_pairs += len(fend_pairs[i][j])
+                total_fend_pairs += fend_pairs[i][j][0].shape[0]
         if total_fend_pairs == 0:
             if not self.silent:
                 print >> sys.stderr, ("No valid data was loaded.\n"),
@@ -690,7 +1293,7 @@ class HiCData(object):
                      * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend, the second column contains the idnex of the downstream fend, and the third column contains the number of reads observed for that fend pair.
                      * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'cis_data'. For example, all of the downstream cis interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
                      * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chroosomal fend pairings observed in the data. The first column contains the fend index (from the 'fends' array in the fend object) of the upstream fend (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream fend, and the third column contains the number of reads observed for that fend pair.
-                     * **trans_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of fends + 1. Each position contains the first entry for the correspondingly-indexed fend in the first column of 'trans_data'. For example, all of the downstream trans interactions for the fend at index 5 in the fend object 'fends' array are in cis_data[cis_indices[5]:cis_indices[6], :].
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by fend pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
                      * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved fend attributes can be accessed through this class attribute.
 
         Data in a binned 'mat' format should include three tab-separaterd columns: bin1, bin2, and count. The bin values should correspond to the bin indices in the fend object.
@@ -731,11 +1334,14 @@ class HiCData(object):
             else:
                 bin_pairs[chr1][chr2][(bin2 - chr_indices[chr2], bin1 - chr_indices[chr1])] = count
         input.close()
+        for i in range(len(bin_pairs)):
+            for j in range(len(bin_pairs[i])):
+                bin_pairs[i][j] = self._dict_to_fend_pairs(bin_pairs[i][j])
         self.stats['total_reads'] = total_reads
         total_bin_pairs = 0
         for i in range(len(bin_pairs)):
             for j in range(len(bin_pairs[i])):
-                total_bin_pairs += len(bin_pairs[i][j])
+                total_bin_pairs += bin_pairs[i][j][0].shape[0]
         if total_bin_pairs == 0:
             if not self.silent:
                 print >> sys.stderr, ("No valid data was loaded.\n"),
@@ -766,7 +1372,7 @@ class HiCData(object):
                      * **cis_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero intra-chromosomal bin pairings observed in the data. The first column contains the bin index (from the 'bins' array in the fend object) of the upstream bin, the second column contains the index of the downstream bin, and the third column contains the number of reads observed for that bin pair.
                      * **cis_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of bins + 1. Each position contains the first entry for the correspondingly-indexed bin in the first column of 'cis_data'. For example, all of the downstream cis interactions for the bin at index 5 in the fend object 'bins' array are in cis_data[cis_indices[5]:cis_indices[6], :]. 
                      * **trans_data** (*ndarray*) - A numpy array of type int32 and shape N x 3 where N is the number of valid non-zero inter-chromosomal bin pairings observed in the data. The first column contains the bin index (from the 'bins' array in the fend object) of the upstream bin (upstream also refers to the lower indexed chromosome in this context), the second column contains the index of the downstream bin, and the third column contains the number of reads observed for that bin pair.
-                     * **trans_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of bins + 1. Each position contains the first entry for the correspondingly-indexed bin in the first column of 'trans_data'. For example, all of the downstream trans interactions for the bin at index 5 in the fend object 'bins' array are in trans_data[trans_indices[5]:trans_indices[6], :].
+                     * **trans_chrom_indices** (*ndarray*) - A numpy array of type int64 and a length of the number of chromosomes squared + 1. 'trans_data' is ordered by chromosome pair and then by bin pair, and each position contains the first entry for the chromosome pair with index chrom1 * number of chromosomes + chrom2. For example, all of the trans interactions between chromosomes 0 and 2 of a genome with 3 chromosomes are in trans_data[trans_chrom_indices[2]:trans_chrom_indices[3], :].
                      * **fends** (*ndarray*) - A filestream to the hdf5 fend file such that all saved bin attributes can be accessed through this class attribute.
 
         When data is loaded the 'history' attribute is updated to include the history of the fend file that becomes associated with it.
@@ -848,21 +1454,13 @@ class HiCData(object):
             self.trans_data = None
         # create data indices
         if self.cis_data is not None:
-            cis_indices = numpy.r_[0, numpy.bincount(self.cis_data[:, 0],
-                                   minlength=self.fends['bins'].shape[0])].astype(numpy.int64)
-            for i in range(1, cis_indices.shape[0]):
-                cis_indices[i] += cis_indices[i - 1]
-            self.cis_indices = cis_indices
+            self.cis_indices = self._find_data_indices(self.cis_data, self.fends['bins'].shape[0])
         else:
             self.cis_indices = None
         if self.trans_data is not None:
-            trans_indices = numpy.r_[0, numpy.bincount(self.trans_data[:, 0],
-                                     minlength=self.fends['bins'].shape[0])].astype(numpy.int64)
-            for i in range(1, trans_indices.shape[0]):
-                trans_indices[i] += trans_indices[i - 1]
-            self.trans_indices = trans_indices
+            self.trans_data, self.trans_chrom_indices = _order_trans_data(self.trans_data, bin_indices)
         else:
-            self.trans_indices = None
+            self.trans_chrom_indices = None
         # create interaction partner profiles for quality reporting
         cis_reads = 0
         trans_reads = 0
@@ -1106,6 +1704,57 @@ class HiCData(object):
             print >> sys.stderr, ("\r%s\r") % (' '*80),
         return cis_counts, trans_counts
 
+    def _empty_fend_pairs(self, num_chroms):
+        """Return per-chromosome pair accumulators of sorted packed fend pair keys and counts."""
+        fend_pairs = []
+        for i in range(num_chroms):
+            fend_pairs.append([])
+            for j in range(i + 1):
+                fend_pairs[i].append([numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)])
+        return fend_pairs
+
+    def _add_fend_pairs(self, fend_pairs, fends1, fends2, counts=None):
+        """Merge fend pair observations into a sorted accumulator of packed fend pair keys and counts."""
+        if fends1.shape[0] == 0:
+            return None
+        keys = (fends1.astype(numpy.int64) << 32) + fends2
+        order = numpy.argsort(keys)
+        keys = keys[order]
+        starts = numpy.r_[0, numpy.where(keys[1:] != keys[:-1])[0] + 1]
+        if counts is None:
+            counts = numpy.diff(numpy.r_[starts, keys.shape[0]])
+        else:
+            counts = numpy.add.reduceat(counts[order].astype(numpy.int64), starts)
+        keys = keys[starts]
+        del order, starts
+        if fend_pairs[0].shape[0] == 0:
+            fend_pairs[0] = keys
+            fend_pairs[1] = counts
+            return None
+        # merge new keys into the sorted accumulator in linear time
+        indices = numpy.searchsorted(fend_pairs[0], keys)
+        found = indices < fend_pairs[0].shape[0]
+        found[found] = fend_pairs[0][indices[found]] == keys[found]
+        fend_pairs[1][indices[found]] += counts[found]
+        new = numpy.where(numpy.logical_not(found))[0]
+        if new.shape[0] > 0:
+            fend_pairs[0] = numpy.insert(fend_pairs[0], indices[new], keys[new])
+            fend_pairs[1] = numpy.insert(fend_pairs[1], indices[new], counts[new])
+        return None
+
+    def _unpack_fend_pairs(self, fend_pairs):
+        """Return the first fends, second fends, and counts held in a fend pair accumulator."""
+        return fend_pairs[0] >> 32, fend_pairs[0] & 4294967295, fend_pairs[1]
+
+    def _dict_to_fend_pairs(self, pairs):
+        """Convert a dictionary of fend pair counts to a sorted fend pair accumulator."""
+        fend_pairs = [numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)]
+        if len(pairs) > 0:
+            fends = numpy.array(pairs.keys(), dtype=numpy.int64)
+            self._add_fend_pairs(fend_pairs, fends[:, 0], fends[:, 1],
+                                 numpy.array(pairs.values(), dtype=numpy.int64))
+        return fend_pairs
+
     def _find_fend_pairs(self, data, fend_pairs, skip_duplicate_filtering=False):
         """Return array with lower fend, upper fend, and count for pair."""
         chroms = self.fends['chromosomes'][...]
@@ -1186,18 +1835,11 @@ class HiCData(object):
                 mapped_fends[valid, :2] = mapped_fends[valid, :2] * 2 - 1 + signs[valid, :2]
                 if not self.silent:
                     print >> sys.stderr, ("\r%s\rCounting fend pairs...") % (' ' * 50),
-                for k in valid:
-                    key = (mapped_fends[k, 0], mapped_fends[k, 1])
-                    if key not in fend_pairs[i][j]:
-                        if skip_duplicate_filtering:
-                            fend_pairs[i][j][key] = data[i][j][k, 2]
-                        else:
-                            fend_pairs[i][j][key] = 1
-                    else:
-                        if skip_duplicate_filtering:
-                            fend_pairs[i][j][key] += data[i][j][k, 2]
-                        else:
-                            fend_pairs[i][j][key] += 1
+                if skip_duplicate_filtering:
+                    self._add_fend_pairs(fend_pairs[i][j], mapped_fends[valid, 0], mapped_fends[valid, 1],
+                                         data[i][j][valid, 2])
+                else:
+                    self._add_fend_pairs(fend_pairs[i][j], mapped_fends[valid, 0], mapped_fends[valid, 1])
         if not self.silent and not skip_duplicate_filtering:
             print >> sys.stderr, ("Done\n"),
         return None
@@ -1250,73 +1892,29 @@ class HiCData(object):
                 # convert to bin paired
                 if not self.silent:
                     print >> sys.stderr, ("\r%s\rCounting bin pairs...") % (' ' * 50),
-                for k in valid:
-                    key = (mapped_bins[k, 0], mapped_bins[k, 1])
-                    if key not in bin_pairs[i][j]:
-                        if skip_duplicate_filtering:
-                            bin_pairs[i][j][key] = data[i][j][k, 2]
-                        else:
-                            bin_pairs[i][j][key] = 1
-                    else:
-                        if skip_duplicate_filtering:
-                            bin_pairs[i][j][key] += data[i][j][k, 2]
-                        else:
-                            bin_pairs[i][j][key] += 1
+                if skip_duplicate_filtering:
+                    self._add_fend_pairs(bin_pairs[i][j], mapped_bins[valid, 0], mapped_bins[valid, 1],
+                                         data[i][j][valid, 2])
+                else:
+                    self._add_fend_pairs(bin_pairs[i][j], mapped_bins[valid, 0], mapped_bins[valid, 1])
         if not self.silent and not skip_duplicate_filtering:
             print >> sys.stderr, ("Done\n"),
         return None
 
     def _clean_fend_pairs(self, fend_pairs):
-        chr_indices = self.fends['chr_indices'][...]
         # remove fend pairs from same fend or opposite strand adjacents
         for i in range(len(fend_pairs)):
-            for j in range(0, chr_indices[i + 1] - chr_indices[i] - 2, 2):
-                # same fend
-                name = (j, j)
-                if name in fend_pairs[i][i]:
-                    self.stats['same_fragment'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-                name = (j + 1, j + 1)
-                if name in fend_pairs[i][i]:
-                    self.stats['same_fragment'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-                # same fend
-                name = (j, j + 1)
-                if name in fend_pairs[i][i]:
-                    self.stats['same_fragment'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-                # same fend
-                name = (j + 1, j)
-                if name in fend_pairs[i][i]:
-                    self.stats['same_fragment'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-                # adjacent fends, opposite strands
-                name = (j, j + 3)
-                if name in fend_pairs[i][i]:
-                    self.stats['failed_cut'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-                name = (j + 1, j + 2)
-                if name in fend_pairs[i][i]:
-                    self.stats['failed_cut'] += fend_pairs[i][i][name]
-                    del fend_pairs[i][i][name]
-            j = chr_indices[i + 1] - chr_indices[i] - 2
-            # same fend
-            name = (j, j)
-            if name in fend_pairs[i][i]:
-                self.stats['same_fragment'] += fend_pairs[i][i][name]
-                del fend_pairs[i][i][name]
-            name = (j + 1, j + 1)
-            if name in fend_pairs[i][i]:
-                self.stats['same_fragment'] += fend_pairs[i][i][name]
-                del fend_pairs[i][i][name]
-            name = (j, j + 1)
-            if name in fend_pairs[i][i]:
-                self.stats['same_fragment'] += fend_pairs[i][i][name]
-                del fend_pairs[i][i][name]
-            name = (j + 1, j)
-            if name in fend_pairs[i][i]:
-                self.stats['same_fragment'] += fend_pairs[i][i][name]
-                del fend_pairs[i][i][name]
+            if fend_pairs[i][i][0].shape[0] == 0:
+                continue
+            fends1, fends2, counts = self._unpack_fend_pairs(fend_pairs[i][i])
+            # same fragment
+            same = (fends1 / 2) == (fends2 / 2)
+            # adjacent fends, opposite strands
+            failed = (((fends1 % 2) == 0) & (fends2 == fends1 + 3)) | (((fends1 % 2) == 1) & (fends2 == fends1 + 1))
+            self.stats['same_fragment'] += numpy.sum(counts[same])
+            self.stats['failed_cut'] += numpy.sum(counts[failed])
+            keep = numpy.where(numpy.logical_not(same | failed))[0]
+            fend_pairs[i][i] = [fend_pairs[i][i][0][keep], counts[keep]]
         return None
 
     def _parse_fend_pairs(self, fend_pairs):
@@ -1330,88 +1928,99 @@ class HiCData(object):
         # determine number of cis pairs
         cis_count = 0
         for i in range(len(fend_pairs)):
-            cis_count += len(fend_pairs[i][i])
+            cis_count += fend_pairs[i][i][0].shape[0]
         self.stats['valid_cis_pairs'] = cis_count
         # create cis array
         self.cis_data = numpy.empty((cis_count, 3), dtype=numpy.int32)
         pos = 0
-        # fill in each chromosome's cis interactions
+        # fill in each chromosome's cis interactions, already sorted by fend pair
         for i in range(len(fend_pairs)):
-            if len(fend_pairs[i][i]) == 0:
+            n = fend_pairs[i][i][0].shape[0]
+            if n == 0:
                 continue
-            chr_start = pos
-            for key, count in fend_pairs[i][i].iteritems():
-                self.cis_data[pos, :2] = key
-                self.cis_data[pos, 2] = count
-                pos += 1
+            fends1, fends2, counts = self._unpack_fend_pairs(fend_pairs[i][i])
+            self.cis_data[pos:(pos + n), 0] = fends1 + chr_indices[i]
+            self.cis_data[pos:(pos + n), 1] = fends2 + chr_indices[i]
+            self.cis_data[pos:(pos + n), 2] = counts
+            pos += n
             fend_pairs[i][i] = None
-            # sort interactions
-            order = numpy.lexsort((self.cis_data[chr_start:pos, 1], self.cis_data[chr_start:pos, 0]))
-            self.cis_data[chr_start:pos, :] = self.cis_data[order + chr_start, :]
-            self.cis_data[chr_start:pos, :2] += chr_indices[i]
-            del order
+            del fends1, fends2, counts
         self.stats['valid_cis_reads'] += numpy.sum(self.cis_data[:, 2])
         # determine number of trans pairs
         trans_count = 0
         for i in range(len(fend_pairs)):
             for j in range(i + 1, len(fend_pairs)):
-                trans_count += len(fend_pairs[j][i])
+                trans_count += fend_pairs[j][i][0].shape[0]
         self.stats['valid_trans_pairs'] = trans_count
         # create trans array
         self.trans_data = numpy.empty((trans_count, 3), dtype=numpy.int32)
         pos = 0
-        # fill in each chromosome's trans interactions
+        # fill in each chromosome pair's trans interactions, already sorted by fend pair
         for i in range(len(fend_pairs) - 1):
-            chr1_start = pos
             for j in range(i + 1, len(fend_pairs)):
-                if len(fend_pairs[j][i]) == 0:
+                n = fend_pairs[j][i][0].shape[0]
+                if n == 0:
                     continue
-                chr2_start = pos
-                for key, count in fend_pairs[j][i].iteritems():
-                    self.trans_data[pos, :2] = key
-                    self.trans_data[pos, 2] = count
-                    pos += 1
+                fends1, fends2, counts = self._unpack_fend_pairs(fend_pairs[j][i])
+                self.trans_data[pos:(pos + n), 0] = fends1 + chr_indices[i]
+                self.trans_data[pos:(pos + n), 1] = fends2 + chr_indices[j]
+                self.trans_data[pos:(pos + n), 2] = counts
+                pos += n
                 fend_pairs[j][i] = None
-                self.trans_data[chr2_start:pos, 0] += chr_indices[i]
-                self.trans_data[chr2_start:pos, 1] += chr_indices[j]
-            # sort interactions
-            order = numpy.lexsort((self.trans_data[chr1_start:pos, 1], self.trans_data[chr1_start:pos, 0]))
-            self.trans_data[chr1_start:pos, :] = self.trans_data[order + chr1_start, :]
-            del order
+                del fends1, fends2, counts
         self.stats['valid_trans_reads'] += numpy.sum(self.trans_data[:, 2])
-        # create data indices
-        if self.cis_data.shape[0] > 0:
-            cis_indices = numpy.r_[0, numpy.bincount(self.cis_data[:, 0],
-                                   minlength=chr_indices[-1])].astype(numpy.int64)
-            for i in range(1, cis_indices.shape[0]):
-                cis_indices[i] += cis_indices[i - 1]
-            self.cis_indices = cis_indices
-        else:
+        # create data indices and interaction partner profiles
+        if self.cis_data.shape[0] == 0:
             self.cis_data = None
-        if self.trans_data.shape[0] > 0:
-            trans_indices = numpy.r_[0, numpy.bincount(self.trans_data[:, 0],
-                                     minlength=chr_indices[-1])].astype(numpy.int64)
-            for i in range(1, trans_indices.shape[0]):
-                trans_indices[i] += trans_indices[i - 1]
-            self.trans_indices = trans_indices
-        else:
+        if self.trans_data.shape[0] == 0:
             self.trans_data = None
-        # create interaction partner profiles for quality reporting
+        cis_reads, trans_reads = self._index_data(chr_indices[-1])
+        if not self.silent:
+            print >> sys.stderr, ("Done  %i cis reads, %i trans reads\n") % (cis_reads, trans_reads),
+        return None
+
+    def _fend_pairs_to_bin_pairs(self, fend_pairs, mapping1, mapping2, offset1, offset2):
+        """Return an array of first bins, second bins, and summed counts for a fend pair accumulator."""
+        bin_pairs = [numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)]
+        fends1, fends2, counts = self._unpack_fend_pairs(fend_pairs)
+        self._add_fend_pairs(bin_pairs, mapping1[fends1], mapping2[fends2], counts)
+        del fends1, fends2, counts
+        data = numpy.empty((bin_pairs[0].shape[0], 3), dtype=numpy.int32)
+        bins1, bins2, data[:, 2] = self._unpack_fend_pairs(bin_pairs)
+        data[:, 0] = bins1 + offset1
+        data[:, 1] = bins2 + offset2
+        return data
+
+    def _index_data(self, num_fends):
+        """Find data indices and interaction partner profiles, returning the numbers of cis and trans reads."""
         cis_reads = 0
         trans_reads = 0
         if self.cis_data is not None:
-            fend_profiles = numpy.bincount(self.cis_data[:, 0], minlength=chr_indices[-1])
-            fend_profiles += numpy.bincount(self.cis_data[:, 1], minlength=chr_indices[-1])
+            self.cis_indices = self._find_data_indices(self.cis_data, num_fends)
+            # create interaction partner profiles for quality reporting
+            fend_profiles = numpy.bincount(self.cis_data[:, 0], minlength=num_fends)
+            fend_profiles += numpy.bincount(self.cis_data[:, 1], minlength=num_fends)
             self.cis_interaction_distribution = numpy.bincount(fend_profiles)
             cis_reads = numpy.sum(self.cis_data[:, 2])
         if self.trans_data is not None:
-            fend_profiles = numpy.bincount(self.trans_data[:, 0], minlength=chr_indices[-1])
-            fend_profiles += numpy.bincount(self.trans_data[:, 1], minlength=chr_indices[-1])
+            self.trans_data, self.trans_chrom_indices = _order_trans_data(self.trans_data, self._find_chr_indices())
+            fend_profiles = numpy.bincount(self.trans_data[:, 0], minlength=num_fends)
+            fend_profiles += numpy.bincount(self.trans_data[:, 1], minlength=num_fends)
             self.trans_interaction_distribution = numpy.bincount(fend_profiles)
             trans_reads = numpy.sum(self.trans_data[:, 2])
-        if not self.silent:
-            print >> sys.stderr, ("Done  %i cis reads, %i trans reads\n") % (cis_reads, trans_reads),
-        return None
+        return cis_reads, trans_reads
+
+    def _find_chr_indices(self):
+        """Return the first fend (or bin, for binned data) of each chromosome."""
+        if self['binned']:
+            return self.fends['bin_indices'][...]
+        return self.fends['chr_indices'][...]
+
+    def _find_data_indices(self, data, num_fends):
+        """Return the first row of each fend (or bin) in a data array ordered by its first column."""
+        indices = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+        indices[1:] = numpy.cumsum(numpy.bincount(data[:, 0], minlength=num_fends))
+        return indices
 
     def _parse_binned_fend_pairs(self, fend_pairs):
         """Separate fend pairs into cis and trans interactions index."""
@@ -1421,115 +2030,45 @@ class HiCData(object):
         # determine number of cis pairs
         cis_count = 0
         for i in range(len(fend_pairs)):
-            cis_count += len(fend_pairs[i][i])
+            cis_count += fend_pairs[i][i][0].shape[0]
         self.stats['valid_cis_pairs'] = cis_count
-        # determine number of bin pairs present
-        cis_count = 0
+        # sum fend pair counts into bin pairs, ordered by first and then second bin
         bin_indices = self.fends['bin_indices'][...]
         bins = self.fends['bins'][...]
         binsize = self.fends['/'].attrs['binned']
-        indices = []
+        mappings = []
         for i in range(len(fend_pairs)):
-            mapping = (self.fends['fends']['mid'][chr_indices[i]:chr_indices[i + 1]] -
-                       bins['start'][bin_indices[i]]) / binsize
-            n = bin_indices[i + 1] - bin_indices[i]
-            data = numpy.zeros(n * (n + 1) / 2, dtype=numpy.int32)
-            for key, count in fend_pairs[i][i].iteritems():
-                bin1 = mapping[key[0]]
-                bin2 = mapping[key[1]]
-                index = bin1 * (n - 1) - (bin1 * (bin1 - 1) / 2) + bin2
-                data[index] += count
-            indices.append(numpy.where(data > 0)[0])
-            cis_count += indices[-1].shape[0]
-            fend_pairs[i][i] = data[indices[-1]]
-        # create cis array
-        self.cis_data = numpy.empty((cis_count, 3), dtype=numpy.int32)
-        pos = 0
-        # fill in each chromosome's cis interactions
+            mappings.append((self.fends['fends']['mid'][chr_indices[i]:chr_indices[i + 1]] -
+                             bins['start'][bin_indices[i]]) / binsize)
+        cis_data = []
         for i in range(len(fend_pairs)):
-            if indices[i].shape[0] == 0:
-                continue
-            n = bin_indices[i + 1] - bin_indices[i]
-            triu_indices = numpy.triu_indices(n, 0)
-            self.cis_data[pos:(pos + indices[i].shape[0]), 0] = triu_indices[0][indices[i]] + bin_indices[i]
-            self.cis_data[pos:(pos + indices[i].shape[0]), 1] = triu_indices[1][indices[i]] + bin_indices[i]
-            self.cis_data[pos:(pos + indices[i].shape[0]), 2] = fend_pairs[i][i]
-            pos += indices[i].shape[0]
-            indices[i] = None
+            cis_data.append(self._fend_pairs_to_bin_pairs(fend_pairs[i][i], mappings[i], mappings[i],
+                                                          bin_indices[i], bin_indices[i]))
             fend_pairs[i][i] = None
+        self.cis_data = numpy.vstack(cis_data)
+        del cis_data
         self.stats['valid_cis_reads'] += numpy.sum(self.cis_data[:, 2])
         # determine number of trans pairs
         trans_count = 0
         for i in range(len(fend_pairs)):
             for j in range(i + 1, len(fend_pairs)):
-                trans_count += len(fend_pairs[j][i])
-        self.stats['valid_trans_pairs'] = trans_count        
-        # determine number of bin pairs present
-        trans_count = 0
-        indices = []
-        for i in range(len(fend_pairs)):
-            indices.append([])
-        for i in range(len(fend_pairs)):
-            mapping1 = (self.fends['fends']['mid'][chr_indices[i]:chr_indices[i + 1]] -
-                        bins['start'][bin_indices[i]]) / binsize
-            n = bin_indices[i + 1] - bin_indices[i]
-            for j in range(i + 1, len(fend_pairs)):
-                mapping2 = (self.fends['fends']['mid'][chr_indices[j]:chr_indices[j + 1]] -
-                            bins['start'][bin_indices[j]]) / binsize
-                m = bin_indices[j + 1] - bin_indices[j]
-                data = numpy.zeros((n, m), dtype=numpy.int32)
-                for key, count in fend_pairs[j][i].iteritems():
-                    bin1 = mapping1[key[0]]
-                    bin2 = mapping2[key[1]]
-                    data[bin1, bin2] += count
-                indices[j].append(numpy.where(data > 0))
-                trans_count += indices[j][-1][0].shape[0]
-                fend_pairs[j][i] = data[indices[j][i]]
-        # create trans array
-        self.trans_data = numpy.empty((trans_count, 3), dtype=numpy.int32)
-        pos = 0
-        # fill in each chromosome's cis interactions
+                trans_count += fend_pairs[j][i][0].shape[0]
+        self.stats['valid_trans_pairs'] = trans_count
+        trans_data = [numpy.zeros((0, 3), dtype=numpy.int32)]
         for i in range(len(fend_pairs)):
             for j in range(i + 1, len(fend_pairs)):
-                if indices[j][i][0].shape[0] == 0:
-                    continue
-                self.trans_data[pos:(pos + indices[j][i][0].shape[0]), 0] = indices[j][i][0] + bin_indices[i]
-                self.trans_data[pos:(pos + indices[j][i][0].shape[0]), 1] = indices[j][i][1] + bin_indices[j]
-                self.trans_data[pos:(pos + indices[j][i][0].shape[0]), 2] = fend_pairs[j][i]
-                pos += indices[j][i][0].shape[0]
-                indices[j][i] = None
+                trans_data.append(self._fend_pairs_to_bin_pairs(fend_pairs[j][i], mappings[i], mappings[j],
+                                                                bin_indices[i], bin_indices[j]))
                 fend_pairs[j][i] = None
+        self.trans_data = numpy.vstack(trans_data)
+        del trans_data
         self.stats['valid_trans_reads'] += numpy.sum(self.trans_data[:, 2])
-        # create data indices
-        if self.cis_data.shape[0] > 0:
-            cis_indices = numpy.r_[0, numpy.bincount(self.cis_data[:, 0],
-                                   minlength=self.fends['fends'].shape[0])].astype(numpy.int64)
-            for i in range(1, cis_indices.shape[0]):
-                cis_indices[i] += cis_indices[i - 1]
-            self.cis_indices = cis_indices
-        else:
+        # create data indices and interaction partner profiles
+        if self.cis_data.shape[0] == 0:
             self.cis_data = None
-        if self.trans_data.shape[0] > 0:
-            trans_indices = numpy.r_[0, numpy.bincount(self.trans_data[:, 0],
-                                     minlength=self.fends['fends'].shape[0])].astype(numpy.int64)
-            for i in range(1, trans_indices.shape[0]):
-                trans_indices[i] += trans_indices[i - 1]
-            self.trans_indices = trans_indices
-        else:
+        if self.trans_data.shape[0] == 0:
             self.trans_data = None
-        # create interaction partner profiles for quality reporting
-        cis_reads = 0
-        trans_reads = 0
-        if self.cis_data is not None:
-            fend_profiles = numpy.bincount(self.cis_data[:, 0], minlength=chr_indices[-1])
-            fend_profiles += numpy.bincount(self.cis_data[:, 1], minlength=chr_indices[-1])
-            self.cis_interaction_distribution = numpy.bincount(fend_profiles)
-            cis_reads = numpy.sum(self.cis_data[:, 2])
-        if self.trans_data is not None:
-            fend_profiles = numpy.bincount(self.trans_data[:, 0], minlength=chr_indices[-1])
-            fend_profiles += numpy.bincount(self.trans_data[:, 1], minlength=chr_indices[-1])
-            self.trans_interaction_distribution = numpy.bincount(fend_profiles)
-            trans_reads = numpy.sum(self.trans_data[:, 2])
+        cis_reads, trans_reads = self._index_data(self.fends['fends'].shape[0])
         if not self.silent:
             print >> sys.stderr, ("Done  %i cis reads, %i trans reads\n") % (cis_reads, trans_reads),
         return None
@@ -1547,13 +2086,655 @@ class HiCData(object):
         output = open(outfilename, 'w')
         if not self.silent:
             print >> output, "fend1\tfend2\tcount"
+        # trans interactions are ordered by chromosome pair, so order them by first fend for writing
+        order = numpy.argsort(self.trans_data[:, 0], kind='mergesort')
+        trans_data = self.trans_data[order, :]
+        trans_indices = self._find_data_indices(trans_data, self.cis_indices.shape[0] - 1)
+        del order
         for i in range(self.cis_indices.shape[0] - 1):
             for j in range(self.cis_indices[i], self.cis_indices[i + 1]):
                 # One is added to indices so numbering starts from one.
                 print >> output, "%i\t%i\t%i" % (i + 1, self.cis_data[j, 1] + 1, self.cis_data[j, 2])
-            for j in range(self.trans_indices[i], self.trans_indices[i + 1]):
-                print >> output, "%i\t%i\t%i" % (i + 1, self.trans_data[j, 1] + 1, self.trans_data[j, 2])
+            for j in range(trans_indices[i], trans_indices[i + 1]):
+                print >> output, "%i\t%i\t%i" % (i + 1, trans_data[j, 1] + 1, trans_data[j, 2])
         output.close()
         if not self.silent:
             print >> sys.stderr, ("Done\n"),
         return None
+
+
+def _dataset_options(data, compression=None, chunk_rows=None):
+    """Return h5py dataset creation keywords for storing an array with the given compression and chunk rows."""
+    if (compression is None and chunk_rows is None) or data.ndim == 0 or data.shape[0] == 0:
+        return {}
+    options = {}
+    if chunk_rows is None:
+        options['chunks'] = True
+    else:
+        options['chunks'] = (min(chunk_rows, data.shape[0]),) + data.shape[1:]
+    if compression == 'blosc' and 'hdf5plugin' in sys.modules:
+        options.update(hdf5plugin.Blosc(cname='lz4', clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    elif compression is not None:
+        if compression == 'blosc':
+            compression = 'gzip'
+        options['compression'] = compression
+        options['shuffle'] = True
+    return options
+
+
+def _encode_compact_data(data, indices):
+    """Return second index deltas and counts for a data array, or None if it is not ordered by its first column."""
+    if indices is None or data.shape[0] == 0 or indices[-1] != data.shape[0]:
+        return None
+    if numpy.any(data[1:, 0] < data[:-1, 0]):
+        return None
+    # the first partner of each fend is stored relative to the fend, later partners relative to the previous one
+    deltas = numpy.empty(data.shape[0], dtype=numpy.int64)
+    deltas[0] = data[0, 1] - data[0, 0]
+    deltas[1:] = data[1:, 1] - data[:-1, 1]
+    starts = numpy.where(data[1:, 0] != data[:-1, 0])[0] + 1
+    deltas[starts] = data[starts, 1] - data[starts, 0]
+    if numpy.amin(deltas) < 0 or numpy.amin(data[:, 2]) < 0:
+        return None
+    return (deltas.astype(_smallest_uint(numpy.amax(deltas))),
+            data[:, 2].astype(_smallest_uint(numpy.amax(data[:, 2]))))
+
+
+def _encode_compact_trans_data(data, indices):
+    """Return first index deltas, block first indices, second index deltas, and counts for trans data, or None."""
+    if indices is None or data.shape[0] == 0 or indices[-1] != data.shape[0]:
+        return None
+    # each block's first fend is stored separately and later fends relative to the previous row
+    blocks = numpy.where(indices[1:] > indices[:-1])[0]
+    starts = indices[blocks]
+    block_fends = numpy.zeros(indices.shape[0] - 1, dtype=numpy.int32)
+    block_fends[blocks] = data[starts, 0]
+    fend_deltas = numpy.empty(data.shape[0], dtype=numpy.int64)
+    fend_deltas[0] = 0
+    fend_deltas[1:] = data[1:, 0] - data[:-1, 0]
+    fend_deltas[starts] = 0
+    if numpy.amin(fend_deltas) < 0:
+        return None
+    # partners are encoded as for cis data, restarting at each block
+    deltas = numpy.empty(data.shape[0], dtype=numpy.int64)
+    deltas[0] = data[0, 1] - data[0, 0]
+    deltas[1:] = data[1:, 1] - data[:-1, 1]
+    runs = numpy.r_[starts, numpy.where(fend_deltas != 0)[0]]
+    deltas[runs] = data[runs, 1] - data[runs, 0]
+    if numpy.amin(deltas) < 0 or numpy.amin(data[:, 2]) < 0:
+        return None
+    return (fend_deltas.astype(_smallest_uint(numpy.amax(fend_deltas))), block_fends,
+            deltas.astype(_smallest_uint(numpy.amax(deltas))),
+            data[:, 2].astype(_smallest_uint(numpy.amax(data[:, 2]))))
+
+
+def _open_compact_data(datafile, name):
+    """Return a reader for compactly-stored 'cis_data' or 'trans_data' in an open h5dict."""
+    if '%s_fend_deltas' % name in datafile:
+        return _CompactTransData(datafile['%s_fend_deltas' % name], datafile['%s_block_fends' % name][...],
+                                 datafile['%s_partner_deltas' % name], datafile['%s_counts' % name],
+                                 datafile['%s_chrom_indices' % name][...])
+    return _CompactData(datafile['%s_partner_deltas' % name], datafile['%s_counts' % name],
+                        datafile['%s_indices' % name][...])
+
+
+def _order_trans_data(data, chr_indices):
+    """Return trans data ordered by chromosome pair and then fend pair, and the first row of each chromosome pair.
+
+    The rows for chromosomes i and j are data[indices[i * N + j]:indices[i * N + j + 1], :], where N is the number
+    of chromosomes. Data already in this order, as built by :class:`HiCData`, are returned unchanged.
+    """
+    num_chroms = chr_indices.shape[0] - 1
+    blocks = ((numpy.searchsorted(chr_indices, data[:, 0], side='right') - 1).astype(numpy.int64) * num_chroms +
+              numpy.searchsorted(chr_indices, data[:, 1], side='right') - 1)
+    if numpy.any(blocks[1:] < blocks[:-1]):
+        order = numpy.lexsort((data[:, 1], data[:, 0], blocks))
+        data = data[order, :]
+        blocks = blocks[order]
+        del order
+    indices = numpy.searchsorted(blocks, numpy.arange(num_chroms ** 2 + 1)).astype(numpy.int64)
+    return data, indices
+
+
+def _smallest_uint(value):
+    """Return the smallest unsigned integer type that can hold a value."""
+    for dtype in [numpy.uint8, numpy.uint16, numpy.uint32]:
+        if value <= numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.uint64
+
+
+class _CompactData(object):
+
+    """Present compactly-stored interactions as an N x 3 array of first indices, second indices, and counts.
+
+    Only the rows requested by indexing are read and expanded, so slices cost memory in proportion to their size.
+    """
+
+    def __init__(self, deltas, counts, indices):
+        self.deltas = deltas
+        self.counts = counts
+        self.indices = indices
+        self.shape = (counts.shape[0], 3)
+        self.dtype = numpy.dtype(numpy.int32)
+        self.ndim = 2
+        return None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows = key[0]
+        if rows is Ellipsis:
+            data = self._expand(0, self.shape[0])
+        elif isinstance(rows, slice):
+            start, stop, step = rows.indices(self.shape[0])
+            if step == 1:
+                data = self._expand(start, max(start, stop))
+            else:
+                data = self._expand(0, self.shape[0])[rows, :]
+        elif numpy.ndim(rows) > 0:
+            rows = numpy.asarray(rows)
+            if rows.dtype == numpy.bool_:
+                if rows.shape != (self.shape[0],):
+                    raise IndexError("boolean index of shape %s does not match axis 0 with size %i" %
+                                     (str(rows.shape), self.shape[0]))
+                rows = numpy.where(rows)[0]
+            elif rows.dtype.kind not in ['i', 'u'] and rows.shape[0] > 0:
+                raise IndexError("arrays used as indices must be of integer or boolean type")
+            rows = rows.astype(numpy.int64)
+            rows[rows < 0] += self.shape[0]
+            if rows.shape[0] == 0:
+                data = self._expand(0, 0)
+            else:
+                start = numpy.amin(rows)
+                stop = numpy.amax(rows) + 1
+                if start < 0 or stop > self.shape[0]:
+                    raise IndexError("index is out of bounds for axis 0 with size %i" % self.shape[0])
+                # only the range covering the requested rows is expanded
+                data = self._expand(start, stop)[rows - start, :]
+        else:
+            row = int(rows)
+            if row < 0:
+                row += self.shape[0]
+            if row < 0 or row >= self.shape[0]:
+                raise IndexError("index %i is out of bounds for axis 0 with size %i" % (rows, self.shape[0]))
+            data = self._expand(row, row + 1)[0, :]
+            return data[key[1:]]
+        return data[(slice(None),) + key[1:]]
+
+    def _expand(self, start, stop):
+        """Return the rows from start to stop as an N x 3 array."""
+        data = numpy.empty((stop - start, 3), dtype=numpy.int32)
+        if stop <= start:
+            return data
+        # partner deltas accumulate from the first row of the fend containing start
+        first = self.indices[numpy.searchsorted(self.indices, start, side='right') - 1]
+        fends = numpy.searchsorted(self.indices, numpy.arange(first, stop), side='right') - 1
+        sums = numpy.r_[0, numpy.cumsum(self.deltas[first:stop].astype(numpy.int64))]
+        partners = fends + sums[1:] - sums[self.indices[fends] - first]
+        data[:, 0] = fends[(start - first):]
+        data[:, 1] = partners[(start - first):]
+        data[:, 2] = self.counts[start:stop]
+        return data
+
+
+class _CompactTransData(_CompactData):
+
+    """Present compactly-stored trans interactions, ordered by chromosome pair, as an N x 3 array.
+
+    First indices are delta-encoded within each chromosome pair block, so rows are expanded from the start of their
+    block.
+    """
+
+    def __init__(self, fend_deltas, block_fends, deltas, counts, indices):
+        _CompactData.__init__(self, deltas, counts, indices)
+        self.fend_deltas = fend_deltas
+        self.block_fends = block_fends
+        return None
+
+    def _expand(self, start, stop):
+        """Return the rows from start to stop as an N x 3 array."""
+        data = numpy.empty((stop - start, 3), dtype=numpy.int32)
+        if stop <= start:
+            return data
+        first = self.indices[numpy.searchsorted(self.indices, start, side='right') - 1]
+        rows = numpy.arange(first, stop)
+        blocks = numpy.searchsorted(self.indices, rows, side='right') - 1
+        fend_deltas = self.fend_deltas[first:stop].astype(numpy.int64)
+        sums = numpy.r_[0, numpy.cumsum(fend_deltas)]
+        fends = self.block_fends[blocks] + sums[1:] - sums[self.indices[blocks] - first]
+        # partner deltas accumulate from the first row of each fend within a block
+        run_starts = numpy.where((fend_deltas != 0) | (rows == self.indices[blocks]), rows, first)
+        run_starts = numpy.maximum.accumulate(run_starts)
+        sums = numpy.r_[0, numpy.cumsum(self.deltas[first:stop].astype(numpy.int64))]
+        partners = fends + sums[1:] - sums[run_starts - first]
+        data[:, 0] = fends[(start - first):]
+        data[:, 1] = partners[(start - first):]
+        data[:, 2] = self.counts[start:stop]
+        return data
+
+
+class _CachedArray(object):
+
+    """Hold an h5dict dataset in memory, returning fresh arrays on indexing as reading the dataset would.
+
+    Fields of compound datasets are kept as contiguous columns the first time they are requested.
+    """
+
+    def __init__(self, dataset):
+        self.array = dataset[...]
+        self.columns = {}
+        self.shape = self.array.shape
+        self.dtype = self.array.dtype
+        self.ndim = self.array.ndim
+        return None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        return iter(self.array.copy())
+
+    def __array__(self, dtype=None):
+        return numpy.array(self.array, dtype=dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            if key not in self.columns:
+                self.columns[key] = numpy.ascontiguousarray(self.array[key])
+            return numpy.copy(self.columns[key])
+        value = self.array[key]
+        if isinstance(value, numpy.ndarray):
+            value = value.copy()
+        return value
+
+
+class _DataFile(object):
+
+    """Wrap an open HiCData h5dict, presenting compactly-stored 'cis_data' and 'trans_data' as :class:`_CompactData`.
+
+    Datasets named in 'cached' are read once on first access and then served from memory as :class:`_CachedArray`.
+    Files saved without 'trans_chrom_indices' can have their trans data ordered by chromosome pair in memory with
+    :meth:`index_trans_data`.
+    """
+
+    def __init__(self, filename, mode='r', cached=None):
+        self.file = h5py.File(filename, mode)
+        self.views = {}
+        if cached is None:
+            self.cached = []
+        else:
+            self.cached = cached
+        return None
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['file'], name)
+
+    def __contains__(self, key):
+        return key in self.file or key in self.views or self._is_compact(key)
+
+    def __getitem__(self, key):
+        if key in self.views:
+            return self.views[key]
+        if key in self.cached and key in self.file:
+            if key not in self.views:
+                self.views[key] = _CachedArray(self.file[key])
+            return self.views[key]
+        if not self._is_compact(key):
+            return self.file[key]
+        if key not in self.views:
+            self.views[key] = _open_compact_data(self.file, key.split('_')[0])
+        return self.views[key]
+
+    def keys(self):
+        keys = list(self.file.keys())
+        for key in ['cis_data', 'trans_data']:
+            if self._is_compact(key):
+                keys.append(key)
+        if 'trans_chrom_indices' in self.views and 'trans_chrom_indices' not in keys:
+            keys.append('trans_chrom_indices')
+        return keys
+
+    def index_trans_data(self, chr_indices):
+        """Order trans data by chromosome pair in memory if the file was saved without 'trans_chrom_indices'."""
+        if 'trans_chrom_indices' in self or 'trans_data' not in self:
+            return None
+        data, indices = _order_trans_data(self['trans_data'][...], chr_indices)
+        self.views['trans_data'] = _CachedArray(data)
+        self.views['trans_chrom_indices'] = _CachedArray(indices)
+        return None
+
+    def _is_compact(self, key):
+        return (key in ['cis_data', 'trans_data'] and key not in self.file and
+                "%s_partner_deltas" % key.split('_')[0] in self.file)
+
+
+class _ReadBuffer(object):
+
+    """Collect reads as chromosome pair indices and packed coordinate keys, collapsing PCR duplicates by sorting.
+
+    Unless a memory limit is given, all unique reads are held in memory. With a limit, sorted runs of unique keys
+    are written to temporary files whenever the buffer fills and are k-way merged when the buffer is finished, so
+    memory use is bounded by the limit rather than the library size.
+    """
+
+    def __init__(self, num_pairs, skip_duplicate_filtering=False, max_memory=None, temp_dir=None):
+        self.num_pairs = num_pairs
+        self.skip_duplicate_filtering = skip_duplicate_filtering
+        self.temp_dir = temp_dir
+        if max_memory is None:
+            self.max_reads = None
+        else:
+            # each buffered read needs about 40 bytes while sorting
+            self.max_reads = max(1, int(max_memory * 1048576 / 40))
+        self.pairs = []
+        self.keys = []
+        self.buffered = 0
+        self.compacted = 0
+        self.runs = []
+        self.duplicates = 0
+        self.reads = 0
+        return None
+
+    def add(self, pairs, keys):
+        """Add reads to the buffer, yielding sets of reads that are ready for mapping."""
+        if pairs.shape[0] == 0:
+            return
+        self.pairs.append(pairs)
+        self.keys.append(keys)
+        self.buffered += pairs.shape[0]
+        if self.skip_duplicate_filtering:
+            # map reads in sets of 10 million to keep memory usage bounded
+            while self.buffered >= 10000000:
+                pairs = numpy.hstack(self.pairs)
+                keys = numpy.hstack(self.keys)
+                self.pairs = [pairs[10000000:]]
+                self.keys = [keys[10000000:]]
+                self.buffered -= 10000000
+                yield self._count(pairs[:10000000], keys[:10000000])
+        elif self.max_reads is not None and self.buffered >= self.max_reads:
+            self._compact()
+            self._write_run()
+        elif self.max_reads is None and self.buffered >= max(2 * self.compacted, 10000000):
+            # periodically collapse duplicates so memory scales with unique reads
+            self._compact()
+        return
+
+    def finish(self):
+        """Yield all remaining reads, merging any runs written to disk."""
+        if self.buffered > 0:
+            if self.skip_duplicate_filtering:
+                yield self._count(numpy.hstack(self.pairs), numpy.hstack(self.keys))
+            else:
+                self._compact()
+                if len(self.runs) == 0:
+                    self.reads += self.buffered
+                    yield self.pairs[0], self.keys[0], numpy.ones(self.buffered, dtype=numpy.int64)
+                else:
+                    self._write_run()
+        self.pairs = []
+        self.keys = []
+        self.buffered = 0
+        if len(self.runs) > 0:
+            try:
+                for pairs, keys, counts in self._merge_runs():
+                    yield pairs, keys, counts
+            finally:
+                for fname, run_pairs, run_bounds in self.runs:
+                    if os.path.exists(fname):
+                        os.remove(fname)
+                self.runs = []
+        return
+
+    def _count(self, pairs, keys):
+        """Return unique reads and counts for a set of reads whose duplicates are not filtered."""
+        pairs, keys, counts = _unique_read_keys(pairs, keys)
+        self.duplicates += numpy.sum(counts) - counts.shape[0]
+        self.reads += numpy.sum(counts)
+        return pairs, keys, counts
+
+    def _compact(self):
+        pairs, keys, counts = _unique_read_keys(numpy.hstack(self.pairs), numpy.hstack(self.keys))
+        self.duplicates += self.buffered - pairs.shape[0]
+        self.pairs = [pairs]
+        self.keys = [keys]
+        self.buffered = self.compacted = pairs.shape[0]
+        return None
+
+    def _write_run(self):
+        """Write the compacted buffer to a temporary file as a sorted run of packed keys."""
+        pairs = self.pairs[0]
+        run_pairs = numpy.r_[0, numpy.where(pairs[1:] != pairs[:-1])[0] + 1]
+        run_bounds = numpy.r_[run_pairs, pairs.shape[0]].astype(numpy.int64)
+        run_pairs = pairs[run_pairs]
+        handle, fname = tempfile.mkstemp(suffix='.npy', prefix='hifive_reads_', dir=self.temp_dir)
+        os.close(handle)
+        numpy.save(fname, self.keys[0])
+        self.runs.append((fname, run_pairs, run_bounds))
+        self.pairs = []
+        self.keys = []
+        self.buffered = self.compacted = 0
+        return None
+
+    def _merge_runs(self):
+        """K-way merge sorted runs one chromosome pair at a time, yielding unique reads in bounded batches."""
+        runs = []
+        for fname, run_pairs, run_bounds in self.runs:
+            runs.append((numpy.load(fname, mmap_mode='r'), run_pairs, run_bounds))
+        if self.max_reads is None:
+            max_reads = 10000000
+        else:
+            max_reads = self.max_reads
+        block_size = max(1024, max_reads / (len(runs) + 1))
+        all_pairs = numpy.unique(numpy.hstack([run[1] for run in runs]))
+        batch_pairs = []
+        batch_keys = []
+        batch_size = 0
+        for pair in all_pairs:
+            positions = []
+            stops = []
+            for keys, run_pairs, run_bounds in runs:
+                index = numpy.searchsorted(run_pairs, pair)
+                if index < run_pairs.shape[0] and run_pairs[index] == pair:
+                    positions.append(run_bounds[index])
+                    stops.append(run_bounds[index + 1])
+                else:
+                    positions.append(0)
+                    stops.append(0)
+            while True:
+                blocks = []
+                bound = None
+                for i, run in enumerate(runs):
+                    if positions[i] >= stops[i]:
+                        blocks.append(None)
+                        continue
+                    blocks.append(numpy.array(run[0][positions[i]:min(stops[i], positions[i] + block_size)]))
+                    # keys beyond a partially-read block can only be merged once all smaller keys are loaded
+                    if positions[i] + blocks[i].shape[0] < stops[i]:
+                        if bound is None:
+                            bound = blocks[i][-1]
+                        else:
+                            bound = min(bound, blocks[i][-1])
+                merged = []
+                for i, block in enumerate(blocks):
+                    if block is None:
+                        continue
+                    if bound is not None:
+                        block = block[:numpy.searchsorted(block, bound, side='right')]
+                    positions[i] += block.shape[0]
+                    merged.append(block)
+                if len(merged) == 0:
+                    break
+                merged = numpy.hstack(merged)
+                keys = numpy.unique(merged)
+                self.duplicates += merged.shape[0] - keys.shape[0]
+                self.reads += keys.shape[0]
+                del merged
+                batch_pairs.append(numpy.zeros(keys.shape[0], dtype=numpy.int64) + pair)
+                batch_keys.append(keys)
+                batch_size += keys.shape[0]
+                if batch_size >= max_reads:
+                    yield (numpy.hstack(batch_pairs), numpy.hstack(batch_keys),
+                           numpy.ones(batch_size, dtype=numpy.int64))
+                    batch_pairs = []
+                    batch_keys = []
+                    batch_size = 0
+        if batch_size > 0:
+            yield numpy.hstack(batch_pairs), numpy.hstack(batch_keys), numpy.ones(batch_size, dtype=numpy.int64)
+        return
+
+
+def _load_reads_worker(args):
+    """Load reads for a single parallel loading task, returning its reads or fend pairs and statistics."""
+    task, settings = args
+    data = HiCData(settings['file'], 'w', silent=True)
+    data.fends = h5py.File(settings['fendfilename'], 'r')
+    data.maxinsert = settings['maxinsert']
+    data.binned = settings['binned']
+    data.re = settings['re']
+    data.chr2int = dict(settings['chr2int'])
+    data.chr_codes = dict(data.chr2int)
+    data.insert_distribution = numpy.zeros((settings['insert_bins'].shape[0], 2), dtype=numpy.int32)
+    data.insert_distribution[:, 1] = settings['insert_bins']
+    result = {}
+    if task[0] == 'range':
+        result['pairs'], result['keys'] = data._read_raw_range(task[1], task[2], task[3])
+    elif task[0] == 'pairs_text':
+        result['pairs'], result['keys'] = data._parse_raw_block(task[1], task[2], task[3], True)
+    elif task[0] == 'pairs_block':
+        fend_pairs = data._empty_fend_pairs(len(data.chr2int))
+        result['reads'] = data._load_pairs_block(task[1], task[2], task[3], task[4], fend_pairs,
+                                                 settings['skip_duplicate_filtering'], settings['max_memory'],
+                                                 settings['temp_dir'])
+        result['fend_pairs'] = fend_pairs
+    else:
+        fend_pairs = data._empty_fend_pairs(len(data.chr2int))
+        result['reads'] = data._load_raw_file(task[1], fend_pairs, settings['skip_duplicate_filtering'],
+                                              settings['max_memory'], settings['temp_dir'])
+        result['fend_pairs'] = fend_pairs
+    data.fends.close()
+    result['stats'] = data.stats
+    result['insert_distribution'] = data.insert_distribution[:, 0]
+    for key in ['non_cis_invalid_insert', 'different_fragment_invalid_insert']:
+        if key in data.__dict__:
+            result[key] = data[key]
+    return task, result
+
+
+def _load_bam_ends(filenames, processes=1, multimapped=False):
+    """Return the reference names and mapped read ends of each BAM file, reading indexed files in parallel shards.
+
+    For each file a tuple of reference names and arrays of read names, reference indices, signed 5' coordinates
+    (negative for reverse strand reads) and, if 'multimapped' is True, flags for reads with an 'XS' tag is returned.
+    Reads are in the same order as in the file.
+    """
+    indices = []
+    shards = []
+    for i, fname in enumerate(filenames):
+        for shard in _find_bam_shards(fname, processes):
+            indices.append(i)
+            shards.append((fname, shard))
+    # let files that can't be sharded use spare processes for BGZF decompression
+    threads = max(1, processes / len(shards))
+    tasks = [(fname, shard, threads, multimapped) for fname, shard in shards]
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            results = pool.map(_read_bam_ends, tasks)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        results = map(_read_bam_ends, tasks)
+    ends = []
+    for i in range(len(filenames)):
+        parts = [results[j] for j in range(len(tasks)) if indices[j] == i]
+        ends.append((parts[0][0],) + tuple([numpy.concatenate([part[j] for part in parts]) for j in range(1, 5)]))
+    return ends
+
+
+def _find_bam_shards(fname, num_shards):
+    """Split the reference sequences of an indexed BAM file into shards of about equal length."""
+    input = pysam.AlignmentFile(fname, 'rb')
+    if num_shards < 2 or not input.has_index():
+        input.close()
+        return [None]
+    references = input.references
+    lengths = input.lengths
+    input.close()
+    size = max(1, sum(lengths) / num_shards)
+    shards = [[]]
+    shard_size = 0
+    for name, length in zip(references, lengths):
+        for start in range(0, length, size):
+            stop = min(length, start + size)
+            if shard_size >= size:
+                shards.append([])
+                shard_size = 0
+            shards[-1].append((name, start, stop))
+            shard_size += stop - start
+    return shards
+
+
+def _read_bam_ends(args):
+    """Return the reference names and arrays describing the mapped reads in a BAM file or set of regions."""
+    fname, regions, threads, multimapped = args
+    input = pysam.AlignmentFile(fname, 'rb', threads=threads)
+    references = input.references
+    if regions is None:
+        iterators = [(input.fetch(until_eof=True), None)]
+    else:
+        iterators = [(input.fetch(name, start, stop), start) for name, start, stop in regions]
+    names = []
+    tids = []
+    starts = []
+    multi = []
+    chunks = [[numpy.zeros(0, dtype='S1'), numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.int64),
+               numpy.zeros(0, dtype=numpy.bool)]]
+    for reads, region_start in iterators:
+        for read in reads:
+            # Only consider reads with an alignment
+            if read.is_unmapped:
+                continue
+            # reads overlapping the start of a region belong to the previous region
+            if region_start is not None and read.reference_start < region_start:
+                continue
+            names.append(read.query_name)
+            tids.append(read.reference_id)
+            if read.is_reverse:
+                starts.append(-(read.reference_start + read.query_length))
+            else:
+                starts.append(read.reference_start)
+            if multimapped:
+                multi.append(read.has_tag('XS'))
+            # convert reads to arrays in sets of one million
+            if len(names) >= 1000000:
+                chunks.append([numpy.array(names), numpy.array(tids, dtype=numpy.int32),
+                               numpy.array(starts, dtype=numpy.int64), numpy.array(multi, dtype=numpy.bool)])
+                names, tids, starts, multi = [], [], [], []
+    input.close()
+    if len(names) > 0:
+        chunks.append([numpy.array(names), numpy.array(tids, dtype=numpy.int32),
+                       numpy.array(starts, dtype=numpy.int64), numpy.array(multi, dtype=numpy.bool)])
+    return (references,) + tuple([numpy.concatenate([chunk[i] for chunk in chunks]) for i in range(4)])
+
+
+def _unique_read_keys(pairs, keys):
+    """Return sorted unique chromosome pair/read keys and the number of times each occurs."""
+    if pairs.shape[0] == 0:
+        return pairs, keys, numpy.zeros(0, dtype=numpy.int64)
+    # sorting on keys and then stably on pairs is much faster than lexsort
+    order = numpy.argsort(keys)
+    order = order[numpy.argsort(pairs[order], kind='mergesort')]
+    pairs = pairs[order]
+    keys = keys[order]
+    del order
+    starts = numpy.r_[0, numpy.where((pairs[1:] != pairs[:-1]) | (keys[1:] != keys[:-1]))[0] + 1]
+    counts = numpy.diff(numpy.r_[starts, pairs.shape[0]])
+    return pairs[starts], keys[starts], counts
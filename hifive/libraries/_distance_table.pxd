@@ -0,0 +1,78 @@
+"""Inline lookups of distance-dependent means from tables built by
+:func:`find_distance_table`, shared by the hic expected-value and
+optimization functions.
+"""
+
+cimport numpy as np
+from libc.string cimport memcpy
+
+cdef extern from "math.h":
+    double exp(double x) nogil
+    double log(double x) nogil
+
+
+cdef struct DistanceTable:
+    np.float64_t* values
+    np.float32_t* parameters
+    long long int num_rows
+    long long int num_columns
+    long long int binsize
+    double inverse_binsize
+    int cell_bits
+
+
+cdef inline DistanceTable get_distance_table(np.ndarray parameters, np.ndarray table, long long int binsize):
+    # collect the pointers and sizes needed for lookups, with a table of None meaning that all means
+    # are found from the distance function
+    cdef DistanceTable lookup
+    lookup.values = NULL
+    lookup.parameters = NULL
+    lookup.num_rows = 0
+    lookup.num_columns = 0
+    lookup.binsize = binsize
+    lookup.inverse_binsize = 0.0
+    lookup.cell_bits = 0
+    if binsize > 0:
+        lookup.inverse_binsize = 1.0 / binsize
+    if not parameters is None:
+        lookup.parameters = <np.float32_t*> parameters.data
+    if not table is None:
+        lookup.values = <np.float64_t*> table.data
+        lookup.num_rows = table.shape[0]
+        lookup.num_columns = table.shape[2]
+        while (1 << lookup.cell_bits) < table.shape[1]:
+            lookup.cell_bits += 1
+    return lookup
+
+
+cdef inline double find_distance_mean(DistanceTable* lookup, long long int distance) nogil:
+    # binned tables hold the mean for each multiple of the bin size. Otherwise cells evenly divide each
+    # power-of-two distance range and are found from the exponent and leading fraction bits of the
+    # distance. Each cell holds its starting mean, the inverse of its starting distance in cell widths
+    # and the series coefficients for scaling that mean by its line segment's power of distance
+    cdef long long int index, k
+    cdef unsigned long long int bits
+    cdef double value, step, step2, step4
+    cdef np.float64_t* cell
+    if lookup.num_rows > 0:
+        if lookup.binsize > 0:
+            index = <long long int>(distance * lookup.inverse_binsize + 0.5)
+            if distance >= 0 and index * lookup.binsize == distance and index < lookup.num_rows:
+                return lookup.values[index * lookup.num_columns]
+        elif distance > 0:
+            value = <double>distance
+            memcpy(&bits, &value, sizeof(double))
+            index = <long long int>(bits >> (52 - lookup.cell_bits)) - (1023LL << lookup.cell_bits)
+            if index < (lookup.num_rows << lookup.cell_bits):
+                cell = lookup.values + index * lookup.num_columns
+                if cell[1] == cell[1]:
+                    step = <double>(bits & ((1ULL << (52 - lookup.cell_bits)) - 1)) * cell[1]
+                    step2 = step * step
+                    step4 = step2 * step2
+                    return cell[0] * ((1.0 + cell[2] * step) + step2 * (cell[3] + cell[4] * step) +
+                                      step4 * (cell[5] + cell[6] * step + cell[7] * step2))
+    value = log(<double>max(1, distance))
+    k = 0
+    while value > lookup.parameters[k * 3]:
+        k += 1
+    return exp(value * lookup.parameters[k * 3 + 1] + lookup.parameters[k * 3 + 2])
@@ -7,6 +7,7 @@ functions necessary for supporting hic analysis using HiFive.
 import cython
 cimport numpy as np
 import numpy
+from _distance_table cimport DistanceTable, get_distance_table, find_distance_mean
 
 ctypedef np.float32_t DTYPE_t
 ctypedef np.float64_t DTYPE_64_t
@@ -29,6 +30,7 @@ cdef extern from "math.h":
     double ceil(double x) nogil
 
 
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -165,7 +167,9 @@ def find_cis_compact_expected(
         np.ndarray[DTYPE_int_t, ndim=1] binning_num_bins,
         np.ndarray[DTYPE_int_t, ndim=3] fend_indices,
         np.ndarray[DTYPE_int_t, ndim=1] mids,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         np.ndarray[DTYPE_t, ndim=3] signal not None,
         np.ndarray[DTYPE_t, ndim=1] correction_sums,
         np.ndarray[DTYPE_int_t, ndim=2] ranges,
@@ -176,7 +180,7 @@ def find_cis_compact_expected(
         int diag):
     cdef long long int fend1, fend2, afend1, afend2, j, k, map1, map2, index, num_parameters, num_bins, max_bin
     cdef long long int start1, start2, stop1, stop2, l, m
-    cdef double distance, value
+    cdef double value
     cdef long long int num_fends = mapping.shape[0]
     if not fend_indices is None:
         num_parameters = fend_indices.shape[1]
@@ -185,13 +189,14 @@ def find_cis_compact_expected(
     if not correction_sums is None:
         num_bins = correction_sums.shape[0]
         max_bin = signal.shape[1]
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if correction_sums is None or not ranges is None:
             for fend1 in range(num_fends - 2):
                 map1 = mapping[fend1]
                 if map1 == -1:
                     continue
-                k = 0
                 # find opposite strand adjacents, skipping same fragment and same strand adjacents
                 fend2 = fend1 + 2
                 map2 = mapping[fend2]
@@ -212,10 +217,7 @@ def find_cis_compact_expected(
                                 value *= binning_corrections[fend_indices[afend2, j, 1] + fend_indices[afend1, j, 0]]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(mids[fend2] - mids[fend1]))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     if ranges is None:
                         signal[map1, map2 - map1 - 1 + diag, 1] += value
                     else:
@@ -262,10 +264,7 @@ def find_cis_compact_expected(
                                 value *= binning_corrections[fend_indices[afend2, j, 1] + fend_indices[afend1, j, 0]]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(mids[fend2] - mids[fend1]))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     if ranges is None:
                         signal[map1, map2 - map1 - 1 + diag, 1] += value
                     else:
@@ -328,7 +327,9 @@ def find_cis_upper_expected(
         np.ndarray[DTYPE_int_t, ndim=1] binning_num_bins,
         np.ndarray[DTYPE_int_t, ndim=3] fend_indices,
         np.ndarray[DTYPE_int_t, ndim=1] mids,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         np.ndarray[DTYPE_t, ndim=2] signal not None,
         np.ndarray[DTYPE_t, ndim=1] correction_sums,
         np.ndarray[DTYPE_int_t, ndim=2] ranges,
@@ -339,7 +340,7 @@ def find_cis_upper_expected(
         int diag):
     cdef long long int fend1, fend2, afend1, afend2, j, k, index, map1, map2, index2, num_parameters
     cdef long long int start1, start2, stop1, stop2, l, m, index1
-    cdef double distance, value
+    cdef double value
     cdef long long int num_fends = mapping.shape[0]
     cdef int diag2 = diag * 2
     cdef long long int num_bins = int(0.5 + pow(0.25 + 2 * signal.shape[0], 0.5)) - diag
@@ -347,13 +348,14 @@ def find_cis_upper_expected(
         num_parameters = fend_indices.shape[1]
     else:
         num_parameters = 0
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if correction_sums is None or not ranges is None:
             for fend1 in range(num_fends - 2):
                 map1 = mapping[fend1]
                 if map1 == -1:
                     continue
-                k = 0
                 index = map1 * (num_bins - 1) - map1 * (map1 + 1 - diag2) / 2 - 1 + diag
                 # find opposite strand adjacents, skipping same fragment and same strand adjacents
                 fend2 = fend1 + 2
@@ -375,10 +377,7 @@ def find_cis_upper_expected(
                                 value *= binning_corrections[fend_indices[afend2, j, 1] + fend_indices[afend1, j, 0]]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(mids[fend2] - mids[fend1]))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     if ranges is None:
                         signal[index + map2, 1] += value
                     else:
@@ -428,10 +427,7 @@ def find_cis_upper_expected(
                                 value *= binning_corrections[fend_indices[afend2, j, 1] + fend_indices[afend1, j, 0]]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(mids[fend2] - mids[fend1]))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     if ranges is None:
                         signal[index + map2, 1] += value
                     else:
@@ -498,24 +494,27 @@ def find_binned_cis_compact_expected(
         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
         np.ndarray[DTYPE_t, ndim=1] corrections,
         np.ndarray[DTYPE_int_t, ndim=1] mids,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         np.ndarray[DTYPE_t, ndim=3] signal not None,
         np.ndarray[DTYPE_t, ndim=1] correction_sums,
         double chrom_mean,
         int startfend,
         int maxdistance):
     cdef long long int fend1, fend2, j, k, map1, map2, num_bins, max_bin
-    cdef double distance, value
+    cdef double value
     cdef long long int num_fends = mapping.shape[0]
     num_bins = signal.shape[0]
     max_bin = signal.shape[1]
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if correction_sums is None:
             for fend1 in range(num_fends):
                 map1 = mapping[fend1]
                 if map1 == -1:
                     continue
-                k = 0
                 for fend2 in range(fend1, num_fends):
                     map2 = mapping[fend2]
                     if map2 == -1 or mids[fend2] - mids[fend1] > maxdistance:
@@ -527,10 +526,7 @@ def find_binned_cis_compact_expected(
                         value *= corrections[fend1] * corrections[fend2]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(max(1, mids[fend2] - mids[fend1])))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     signal[map1, map2 - map1, 1] += value
                 signal[map1, 0, 1] /= 2
         else:
@@ -548,16 +544,20 @@ def find_binned_cis_upper_expected(
         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
         np.ndarray[DTYPE_t, ndim=1] corrections,
         np.ndarray[DTYPE_int_t, ndim=1] mids,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         np.ndarray[DTYPE_t, ndim=2] signal not None,
         np.ndarray[DTYPE_t, ndim=1] correction_sums,
         double chrom_mean,
         int startfend,
         int maxdistance):
     cdef long long int fend1, fend2, j, k, map1, map2, index, num_bins, max_bin
-    cdef double distance, value
+    cdef double value
     cdef long long int num_fends = mapping.shape[0]
     num_bins = int(-0.5 + pow(0.25 + 2 * signal.shape[0], 0.5))
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if correction_sums is None:
             for fend1 in range(num_fends):
@@ -565,7 +565,6 @@ def find_binned_cis_upper_expected(
                 if map1 == -1:
                     continue
                 index = map1 * (num_bins - 1) - map1 * (map1 - 1) / 2
-                k = 0
                 for fend2 in range(fend1, num_fends):
                     map2 = mapping[fend2]
                     if map2 == -1 or mids[fend2] - mids[fend1] > maxdistance:
@@ -577,10 +576,7 @@ def find_binned_cis_upper_expected(
                         value *= corrections[fend1] * corrections[fend2]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = log(<double>(max(1, mids[fend2] - mids[fend1])))
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, mids[fend2] - mids[fend1]) * scale
                     signal[index + map2, 1] += value
             for j in range(num_bins):
                 signal[j * num_bins - j * (j - 1) / 2, 1] /= 2.0
@@ -652,13 +648,15 @@ def find_cis_subregion_expected(
         np.ndarray[DTYPE_64_t, ndim=1] correction_sums2,
         np.ndarray[DTYPE_int_t, ndim=1] mids1,
         np.ndarray[DTYPE_int_t, ndim=1] mids2,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         double chrom_mean,
         int startfend1,
         int startfend2):
     cdef long long int fend1, fend2, afend1, afend2, i, j, k, map1, map2, index, num_parameters, num_bins1, num_bins2
     cdef long long int start1, start2, stop1, stop2, l, m
-    cdef double distance, value
+    cdef double value
     cdef long long int num_fends1 = mapping1.shape[0]
     cdef long long int num_fends2 = mapping2.shape[0]
     if not fend_indices is None:
@@ -668,6 +666,8 @@ def find_cis_subregion_expected(
     if not correction_sums1 is None:
         num_bins1 = correction_sums1.shape[0]
         num_bins2 = correction_sums2.shape[0]
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if correction_sums1 is None:
             for fend1 in range(num_fends1):
@@ -697,15 +697,8 @@ def find_cis_subregion_expected(
                                 value *= binning_corrections[fend_indices[afend2, j, 1] + fend_indices[afend1, j, 0]]
                     # if finding distance, enrichment, or expected, correct for distance
                     if not parameters is None:
-                        distance = mids2[fend2] - mids1[fend1]
-                        if distance > 0:
-                            distance = log(<double>distance)
-                        else:
-                            distance = log(<double>(-distance))
-                        k = 0
-                        while distance > parameters[k, 0]:
-                            k += 1
-                        value *= exp(distance * parameters[k, 1] + parameters[k, 2] + chrom_mean)
+                        value *= find_distance_mean(&lookup, max(mids2[fend2] - mids1[fend1],
+                                                                 mids1[fend1] - mids2[fend2])) * scale
                     signal[map1, map2, 1] += value
         else:
             for i in range(num_bins1):
@@ -1951,16 +1944,20 @@ def find_mrh_cis_expected(
         np.ndarray[DTYPE_t, ndim=1] correction_sums,
         np.ndarray[DTYPE_t, ndim=1] binning_corrections,
         np.ndarray[DTYPE_int_t, ndim=3] fend_indices,
-        np.ndarray[DTYPE_t, ndim=2] distance_parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] distance_parameters,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         double chrom_mean,
         int dt_int):
-    cdef long long int i, j, k, l, bin1, bin2, num, num_parameters, map1, map2
-    cdef double value, corr, distance
+    cdef long long int i, j, k, bin1, bin2, num, num_parameters, map1, map2
+    cdef double value, corr
     cdef long long int n = expected.shape[0]
     cdef long long int valid_fends = binmapping.shape[0]
     cdef long long int num_fends = mapping.shape[0]
     if not fend_indices is None:
         num_parameters = fend_indices.shape[1]
+    cdef DistanceTable lookup = get_distance_table(distance_parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
         if dt_int == 0:
             # if raw data is requested, only determine the number of valid fends per bin
@@ -2014,7 +2011,6 @@ def find_mrh_cis_expected(
             for i in range(valid_fends - 1):
                 bin1 = binmapping[i]
                 num = fend_nums[i]
-                l = 0
                 for j in range(i + 1, min(valid_fends, i + 4)):
                     if fend_nums[i + 1] - num == 1:
                         continue
@@ -2023,10 +2019,7 @@ def find_mrh_cis_expected(
                     if dt_int < 2:
                         value = 1.0
                     else:                            
-                        distance = log(<double>(mids[j] - mids[i]))
-                        while distance > distance_parameters[l, 0]:
-                            l += 1
-                        value = exp(distance * distance_parameters[l, 1] + distance_parameters[l, 2] + chrom_mean)
+                        value = find_distance_mean(&lookup, mids[j] - mids[i]) * scale
                     if not corrections is None:
                         value *= corrections[i] * corrections[j]
                     if not fend_indices is None:
@@ -2040,10 +2033,7 @@ def find_mrh_cis_expected(
                     if dt_int < 2:
                         value = 1.0
                     else:                            
-                        distance = log(<double>(mids[j] - mids[i]))
-                        while distance > distance_parameters[l, 0]:
-                            l += 1
-                        value = exp(distance * distance_parameters[l, 1] + distance_parameters[l, 2] + chrom_mean)
+                        value = find_distance_mean(&lookup, mids[j] - mids[i]) * scale
                     if not corrections is None:
                         value *= corrections[i] * corrections[j]
                     if not fend_indices is None:
@@ -8,6 +8,7 @@ HiFive.
 import cython
 cimport numpy as np
 import numpy
+from _distance_table cimport DistanceTable, get_distance_table, find_distance_mean
 
 ctypedef np.float32_t DTYPE_t
 ctypedef np.float64_t DTYPE_64_t
@@ -16,6 +17,7 @@ ctypedef np.int64_t DTYPE_int64_t
 ctypedef np.uint32_t DTYPE_uint_t
 ctypedef np.int8_t DTYPE_int8_t
 cdef double Inf = numpy.inf
+cdef double NaN = numpy.nan
 
 cdef extern from "math.h":
     double exp(double x) nogil
@@ -29,6 +31,82 @@ cdef extern from "math.h":
     double ceil(double x) nogil
 
 
+
+# possible pairs spanning less than this relative change in distance are summed as one group
+cdef double GROUP_SPAN = 0.03
+# groups with no more than this many pairs have their log-distances summed individually
+cdef long long int GROUP_MIN = 32
+
+
+cdef inline double pair_log_distance(DTYPE_int_t* mids, long long int fend1, long long int fend2, int binned) nogil:
+    if binned == 0:
+        return log(<double>(mids[fend2] - mids[fend1]))
+    return log(<double>(max(1, mids[fend2] - mids[fend1])))
+
+
+cdef inline long long int find_bin_end(DTYPE_int_t* mids, long long int fend1, long long int lower,
+                                       long long int upper, double cutoff, int binned) nogil:
+    # find the first fend in [lower, upper) whose log-distance from fend1 exceeds cutoff
+    cdef long long int middle
+    while lower < upper:
+        middle = (lower + upper) / 2
+        if pair_log_distance(mids, fend1, middle, binned) > cutoff:
+            upper = middle
+        else:
+            lower = middle + 1
+    return lower
+
+
+cdef inline long long int find_first_above(DTYPE_int_t* mids, long long int lower, long long int upper,
+                                           long long int value) nogil:
+    # find the first fend in [lower, upper) whose midpoint exceeds value
+    cdef long long int middle
+    while lower < upper:
+        middle = (lower + upper) / 2
+        if mids[middle] > value:
+            upper = middle
+        else:
+            lower = middle + 1
+    return lower
+
+
+cdef inline void add_range_distance_sums(DTYPE_int_t* mids, DTYPE_int64_t* mid_sums, DTYPE_64_t* square_sums,
+                                         DTYPE_t* cutoffs, long long int num_bins, long long int fend1,
+                                         long long int lower, long long int upper, DTYPE_int64_t* bin_size,
+                                         DTYPE_64_t* logdistance_sum, int binned) nogil:
+    # add possible pairs between fend1 and fends in [lower, upper) to their distance bins
+    cdef long long int i, j, stop, group_stop, num_pairs
+    cdef double log_dist, mean, variance, group_sum
+    j = 0
+    while lower < upper:
+        log_dist = pair_log_distance(mids, fend1, lower, binned)
+        while log_dist > cutoffs[j]:
+            j += 1
+        if j == num_bins - 1:
+            stop = upper
+        else:
+            stop = find_bin_end(mids, fend1, lower + 1, upper, cutoffs[j], binned)
+        bin_size[j * 2 + 1] += stop - lower
+        # sum log-distances over groups of pairs with similar distances
+        while lower < stop:
+            group_stop = find_first_above(mids, lower + 1, stop, mids[fend1] + <long long int>(
+                                          max(1, mids[lower] - mids[fend1]) * (1.0 + GROUP_SPAN)))
+            num_pairs = group_stop - lower
+            if num_pairs <= GROUP_MIN:
+                group_sum = 0.0
+                for i in range(lower, group_stop):
+                    group_sum += pair_log_distance(mids, fend1, i, binned)
+            else:
+                # expand log-distance to second order around the group mean distance
+                mean = <double>(mid_sums[group_stop] - mid_sums[lower]) / num_pairs - (mids[fend1] - mids[0])
+                variance = (square_sums[group_stop] - square_sums[lower] -
+                            pow(<double>(mid_sums[group_stop] - mid_sums[lower]), 2.0) / num_pairs)
+                group_sum = num_pairs * log(mean) - max(0.0, variance) / (2.0 * mean * mean)
+            logdistance_sum[j] += group_sum
+            lower = group_stop
+    return
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -39,9 +117,9 @@ def find_distance_bin_sums(
         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
         np.ndarray[DTYPE_64_t, ndim=1] counts not None,
         np.ndarray[DTYPE_int_t, ndim=2] indices not None,
-        np.ndarray[DTYPE_int64_t, ndim=2] bin_size not None,
+        np.ndarray[DTYPE_int64_t, ndim=2, mode='c'] bin_size not None,
         np.ndarray[DTYPE_64_t, ndim=1] count_sum not None,
-        np.ndarray[DTYPE_64_t, ndim=1] logdistance_sum not None,
+        np.ndarray[DTYPE_64_t, ndim=1, mode='c'] logdistance_sum not None,
         int start,
         int stop,
         int binned):
@@ -49,6 +127,16 @@ def find_distance_bin_sums(
     cdef double log_dist
     cdef long long int num_data = indices.shape[0]
     cdef long long int num_fends = rev_mapping.shape[0]
+    cdef long long int num_bins = cutoffs.shape[0]
+    cutoffs = numpy.ascontiguousarray(cutoffs)
+    mids = numpy.ascontiguousarray(mids)
+    # prefix sums of midpoints and squared midpoints, relative to the first fend, for summing groups of pairs
+    cdef np.ndarray[DTYPE_int64_t, ndim=1] mid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+    cdef np.ndarray[DTYPE_64_t, ndim=1] square_sums = numpy.zeros(num_fends + 1, dtype=numpy.float64)
+    if num_fends > 0:
+        mid_sums[1:] = numpy.cumsum(mids[:num_fends].astype(numpy.int64) - mids[0])
+        square_sums[1:] = numpy.cumsum((mids[:num_fends].astype(numpy.float64) - mids[0]) ** 2.0)
+    cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
     with nogil:
         previous_fend = -1
         j = 0
@@ -65,6 +153,7 @@ def find_distance_bin_sums(
                 j += 1
             count_sum[j] += counts[i]
             bin_size[j, 0] += 1
+        # possible pairs are counted by finding the range of fends in each distance bin rather than visiting each pair
         for fend1 in range(start, stop):
             j = 0
             if binned == 0:
@@ -81,19 +170,15 @@ def find_distance_bin_sums(
                         j += 1
                     bin_size[j, 1] += 1
                     logdistance_sum[j] += log_dist
-                for fend2 in range(min(fend1 + 4, num_fends), num_fends):
-                    log_dist = log(<double>(mids[fend2] - mids[fend1]))
-                    while log_dist > cutoffs[j]:
-                        j += 1
-                    bin_size[j, 1] += 1
-                    logdistance_sum[j] += log_dist
+                add_range_distance_sums(mids_ptr, <DTYPE_int64_t*> mid_sums.data, <DTYPE_64_t*> square_sums.data,
+                                        <DTYPE_t*> cutoffs.data, num_bins, fend1, min(fend1 + 4, num_fends),
+                                        num_fends, <DTYPE_int64_t*> bin_size.data,
+                                        <DTYPE_64_t*> logdistance_sum.data, binned)
             else:
-                for fend2 in range(fend1, num_fends):
-                    log_dist = log(<double>(max(1, mids[fend2] - mids[fend1])))
-                    while log_dist > cutoffs[j]:
-                        j += 1
-                    bin_size[j, 1] += 1
-                    logdistance_sum[j] += log_dist
+                add_range_distance_sums(mids_ptr, <DTYPE_int64_t*> mid_sums.data, <DTYPE_64_t*> square_sums.data,
+                                        <DTYPE_t*> cutoffs.data, num_bins, fend1, fend1, num_fends,
+                                        <DTYPE_int64_t*> bin_size.data, <DTYPE_64_t*> logdistance_sum.data,
+                                        binned)
     return None
 
 
@@ -170,21 +255,63 @@ def find_remapped_distance_means(
         np.ndarray[DTYPE_int_t, ndim=1] indices1,
         np.ndarray[DTYPE_int_t, ndim=1] mids,
         np.ndarray[DTYPE_t, ndim=1] means,
-        np.ndarray[DTYPE_t, ndim=2] parameters,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters not None,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
         float chrom_mean):
-    cdef long long int i, j, index0, previous_index
-    cdef double frac, distance
+    cdef long long int i
     cdef long long int num_pairs = indices0.shape[0]
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    cdef double scale = exp(<double>chrom_mean)
     with nogil:
-        previous_index = -1
-        j = 0
         for i in range(num_pairs):
-            index0 = indices0[i]
-            distance = log(<double>(max(1, mids[indices1[i]] - mids[index0])))
-            if index0 != previous_index:
-                previous_index = index0
-                j = 0
-            while distance > parameters[j, 0]:
-                j += 1
-            means[i] = exp(parameters[j, 1] * distance + parameters[j, 2] + chrom_mean)
+            means[i] = find_distance_mean(&lookup, mids[indices1[i]] - mids[indices0[i]]) * scale
+    return None
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def find_distance_table(
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters not None,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] table not None,
+        int binsize):
+    # fill a lookup table of distance-dependent means for find_distance_mean, either for every multiple
+    # of binsize or for a power-of-two number of cells evenly dividing each power-of-two distance range.
+    # Cells spanning a segment boundary are marked with NaN so those means are found from the distance
+    # function. Within a cell, the mean is the starting mean times (1 + step) ** slope, which is
+    # expanded in a binomial series
+    cdef long long int i, j, k, n, next_k
+    cdef double log_distance, next_log_distance, coefficient
+    cdef long long int num_rows = table.shape[0]
+    cdef long long int num_cells = table.shape[1]
+    cdef long long int num_terms = table.shape[2] - 2
+    cdef long long int num_parameters = parameters.shape[0]
+    cdef DistanceTable lookup = get_distance_table(parameters, None, 0)
+    cdef double fraction_scale = pow(2.0, 52 - <int>(log(num_cells) / log(2.0) + 0.5))
+    with nogil:
+        if binsize > 0:
+            for i in range(num_rows):
+                table[i, 0, 0] = find_distance_mean(&lookup, i * binsize)
+        else:
+            k = 0
+            for i in range(num_rows):
+                for j in range(num_cells):
+                    log_distance = log(pow(2.0, i) * (1.0 + j / <double>num_cells))
+                    next_log_distance = log(pow(2.0, i) * (1.0 + (j + 1) / <double>num_cells))
+                    while k < num_parameters - 1 and log_distance > parameters[k, 0]:
+                        k += 1
+                    next_k = k
+                    while next_k < num_parameters - 1 and next_log_distance > parameters[next_k, 0]:
+                        next_k += 1
+                    table[i, j, 0] = exp(log_distance * parameters[k, 1] + parameters[k, 2])
+                    if next_k != k:
+                        table[i, j, 1] = NaN
+                        continue
+                    # convert the fraction bits of a distance into its relative step from the cell start
+                    table[i, j, 1] = 1.0 / ((num_cells + j) * fraction_scale)
+                    coefficient = 1.0
+                    for n in range(num_terms):
+                        coefficient *= (parameters[k, 1] - n) / (n + 1)
+                        table[i, j, n + 2] = coefficient
     return None
@@ -0,0 +1,16380 @@
+/* Generated by Cython 0.29.37 */
+
+#ifndef PY_SSIZE_T_CLEAN
+#define PY_SSIZE_T_CLEAN
+#endif /* PY_SSIZE_T_CLEAN */
+#include "Python.h"
+#ifndef Py_PYTHON_H
+    #error Python headers needed to compile C extensions, please install development version of Python.
+#elif PY_VERSION_HEX < 0x02060000 || (0x03000000 <= PY_VERSION_HEX && PY_VERSION_HEX < 0x03030000)
+    #error Cython requires Python 2.6+ or Python 3.3+.
+#else
+#define CYTHON_ABI "0_29_37"
+#define CYTHON_HEX_VERSION 0x001D25F0
+#define CYTHON_FUTURE_DIVISION 0
+#include <stddef.h>
+#ifndef offsetof
+  #define offsetof(type, member) ( (size_t) & ((type*)0) -> member )
+#endif
+#if !defined(WIN32) && !defined(MS_WINDOWS)
+  #ifndef __stdcall
+    #define __stdcall
+  #endif
+  #ifndef __cdecl
+    #define __cdecl
+  #endif
+  #ifndef __fastcall
+    #define __fastcall
+  #endif
+#endif
+#ifndef DL_IMPORT
+  #define DL_IMPORT(t) t
+#endif
+#ifndef DL_EXPORT
+  #define DL_EXPORT(t) t
+#endif
+#define __PYX_COMMA ,
+#ifndef HAVE_LONG_LONG
+  #if PY_VERSION_HEX >= 0x02070000
+    #define HAVE_LONG_LONG
+  #endif
+#endif
+#ifndef PY_LONG_LONG
+  #define PY_LONG_LONG LONG_LONG
+#endif
+#ifndef Py_HUGE_VAL
+  #define Py_HUGE_VAL HUGE_VAL
+#endif
+#ifdef PYPY_VERSION
+  #define CYTHON_COMPILING_IN_PYPY 1
+  #define CYTHON_COMPILING_IN_PYSTON 0
+  #define CYTHON_COMPILING_IN_CPYTHON 0
+  #define CYTHON_COMPILING_IN_NOGIL 0
+  #undef CYTHON_USE_TYPE_SLOTS
+  #define CYTHON_USE_TYPE_SLOTS 0
+  #undef CYTHON_USE_PYTYPE_LOOKUP
+  #define CYTHON_USE_PYTYPE_LOOKUP 0
+  #if PY_VERSION_HEX < 0x03050000
+    #undef CYTHON_USE_ASYNC_SLOTS
+    #define CYTHON_USE_ASYNC_SLOTS 0
+  #elif !defined(CYTHON_USE_ASYNC_SLOTS)
+    #define CYTHON_USE_ASYNC_SLOTS 1
+  #endif
+  #undef CYTHON_USE_PYLIST_INTERNALS
+  #define CYTHON_USE_PYLIST_INTERNALS 0
+  #undef CYTHON_USE_UNICODE_INTERNALS
+  #define CYTHON_USE_UNICODE_INTERNALS 0
+  #undef CYTHON_USE_UNICODE_WRITER
+  #define CYTHON_USE_UNICODE_WRITER 0
+  #undef CYTHON_USE_PYLONG_INTERNALS
+  #define CYTHON_USE_PYLONG_INTERNALS 0
+  #undef CYTHON_AVOID_BORROWED_REFS
+  #define CYTHON_AVOID_BORROWED_REFS 1
+  #undef CYTHON_ASSUME_SAFE_MACROS
+  #define CYTHON_ASSUME_SAFE_MACROS 0
+  #undef CYTHON_UNPACK_METHODS
+  #define CYTHON_UNPACK_METHODS 0
+  #undef CYTHON_FAST_THREAD_STATE
+  #define CYTHON_FAST_THREAD_STATE 0
+  #undef CYTHON_FAST_PYCALL
+  #define CYTHON_FAST_PYCALL 0
+  #if PY_VERSION_HEX < 0x03090000
+    #undef CYTHON_PEP489_MULTI_PHASE_INIT
+    #define CYTHON_PEP489_MULTI_PHASE_INIT 0
+  #elif !defined(CYTHON_PEP489_MULTI_PHASE_INIT)
+    #define CYTHON_PEP489_MULTI_PHASE_INIT 1
+  #endif
+  #undef CYTHON_USE_TP_FINALIZE
+  #define CYTHON_USE_TP_FINALIZE (PY_VERSION_HEX >= 0x030400a1 && PYPY_VERSION_NUM >= 0x07030C00)
+  #undef CYTHON_USE_DICT_VERSIONS
+  #define CYTHON_USE_DICT_VERSIONS 0
+  #undef CYTHON_USE_EXC_INFO_STACK
+  #define CYTHON_USE_EXC_INFO_STACK 0
+  #ifndef CYTHON_UPDATE_DESCRIPTOR_DOC
+    #define CYTHON_UPDATE_DESCRIPTOR_DOC 0
+  #endif
+#elif defined(PYSTON_VERSION)
+  #define CYTHON_COMPILING_IN_PYPY 0
+  #define CYTHON_COMPILING_IN_PYSTON 1
+  #define CYTHON_COMPILING_IN_CPYTHON 0
+  #define CYTHON_COMPILING_IN_NOGIL 0
+  #ifndef CYTHON_USE_TYPE_SLOTS
+    #define CYTHON_USE_TYPE_SLOTS 1
+  #endif
+  #undef CYTHON_USE_PYTYPE_LOOKUP
+  #define CYTHON_USE_PYTYPE_LOOKUP 0
+  #undef CYTHON_USE_ASYNC_SLOTS
+  #define CYTHON_USE_ASYNC_SLOTS 0
+  #undef CYTHON_USE_PYLIST_INTERNALS
+  #define CYTHON_USE_PYLIST_INTERNALS 0
+  #ifndef CYTHON_USE_UNICODE_INTERNALS
+    #define CYTHON_USE_UNICODE_INTERNALS 1
+  #endif
+  #undef CYTHON_USE_UNICODE_WRITER
+  #define CYTHON_USE_UNICODE_WRITER 0
+  #undef CYTHON_USE_PYLONG_INTERNALS
+  #define CYTHON_USE_PYLONG_INTERNALS 0
+  #ifndef CYTHON_AVOID_BORROWED_REFS
+    #define CYTHON_AVOID_BORROWED_REFS 0
+  #endif
+  #ifndef CYTHON_ASSUME_SAFE_MACROS
+    #define CYTHON_ASSUME_SAFE_MACROS 1
+  #endif
+  #ifndef CYTHON_UNPACK_METHODS
+    #define CYTHON_UNPACK_METHODS 1
+  #endif
+  #undef CYTHON_FAST_THREAD_STATE
+  #define CYTHON_FAST_THREAD_STATE 0
+  #undef CYTHON_FAST_PYCALL
+  #define CYTHON_FAST_PYCALL 0
+  #undef CYTHON_PEP489_MULTI_PHASE_INIT
+  #define CYTHON_PEP489_MULTI_PHASE_INIT 0
+  #undef CYTHON_USE_TP_FINALIZE
+  #define CYTHON_USE_TP_FINALIZE 0
+  #undef CYTHON_USE_DICT_VERSIONS
+  #define CYTHON_USE_DICT_VERSIONS 0
+  #undef CYTHON_USE_EXC_INFO_STACK
+  #define CYTHON_USE_EXC_INFO_STACK 0
+  #ifndef CYTHON_UPDATE_DESCRIPTOR_DOC
+    #define CYTHON_UPDATE_DESCRIPTOR_DOC 0
+  #endif
+#elif defined(PY_NOGIL)
+  #define CYTHON_COMPILING_IN_PYPY 0
+  #define CYTHON_COMPILING_IN_PYSTON 0
+  #define CYTHON_COMPILING_IN_CPYTHON 0
+  #define CYTHON_COMPILING_IN_NOGIL 1
+  #ifndef CYTHON_USE_TYPE_SLOTS
+    #define CYTHON_USE_TYPE_SLOTS 1
+  #endif
+  #undef CYTHON_USE_PYTYPE_LOOKUP
+  #define CYTHON_USE_PYTYPE_LOOKUP 0
+  #ifndef CYTHON_USE_ASYNC_SLOTS
+    #define CYTHON_USE_ASYNC_SLOTS 1
+  #endif
+  #undef CYTHON_USE_PYLIST_INTERNALS
+  #define CYTHON_USE_PYLIST_INTERNALS 0
+  #ifndef CYTHON_USE_UNICODE_INTERNALS
+    #define CYTHON_USE_UNICODE_INTERNALS 1
+  #endif
+  #undef CYTHON_USE_UNICODE_WRITER
+  #define CYTHON_USE_UNICODE_WRITER 0
+  #undef CYTHON_USE_PYLONG_INTERNALS
+  #define CYTHON_USE_PYLONG_INTERNALS 0
+  #ifndef CYTHON_AVOID_BORROWED_REFS
+    #define CYTHON_AVOID_BORROWED_REFS 0
+  #endif
+  #ifndef CYTHON_ASSUME_SAFE_MACROS
+    #define CYTHON_ASSUME_SAFE_MACROS 1
+  #endif
+  #ifndef CYTHON_UNPACK_METHODS
+    #define CYTHON_UNPACK_METHODS 1
+  #endif
+  #undef CYTHON_FAST_THREAD_STATE
+  #define CYTHON_FAST_THREAD_STATE 0
+  #undef CYTHON_FAST_PYCALL
+  #define CYTHON_FAST_PYCALL 0
+  #ifndef CYTHON_PEP489_MULTI_PHASE_INIT
+    #define CYTHON_PEP489_MULTI_PHASE_INIT 1
+  #endif
+  #ifndef CYTHON_USE_TP_FINALIZE
+    #define CYTHON_USE_TP_FINALIZE 1
+  #endif
+  #undef CYTHON_USE_DICT_VERSIONS
+  #define CYTHON_USE_DICT_VERSIONS 0
+  #undef CYTHON_USE_EXC_INFO_STACK
+  #define CYTHON_USE_EXC_INFO_STACK 0
+#else
+  #define CYTHON_COMPILING_IN_PYPY 0
+  #define CYTHON_COMPILING_IN_PYSTON 0
+  #define CYTHON_COMPILING_IN_CPYTHON 1
+  #define CYTHON_COMPILING_IN_NOGIL 0
+  #ifndef CYTHON_USE_TYPE_SLOTS
+    #define CYTHON_USE_TYPE_SLOTS 1
+  #endif
+  #if PY_VERSION_HEX < 0x02070000
+    #undef CYTHON_USE_PYTYPE_LOOKUP
+    #define CYTHON_USE_PYTYPE_LOOKUP 0
+  #elif !defined(CYTHON_USE_PYTYPE_LOOKUP)
+    #define CYTHON_USE_PYTYPE_LOOKUP 1
+  #endif
+  #if PY_MAJOR_VERSION < 3
+    #undef CYTHON_USE_ASYNC_SLOTS
+    #define CYTHON_USE_ASYNC_SLOTS 0
+  #elif !defined(CYTHON_USE_ASYNC_SLOTS)
+    #define CYTHON_USE_ASYNC_SLOTS 1
+  #endif
+  #if PY_VERSION_HEX < 0x02070000
+    #undef CYTHON_USE_PYLONG_INTERNALS
+    #define CYTHON_USE_PYLONG_INTERNALS 0
+  #elif !defined(CYTHON_USE_PYLONG_INTERNALS)
+    #define CYTHON_USE_PYLONG_INTERNALS (PY_VERSION_HEX < 0x030C00A5)
+  #endif
+  #ifndef CYTHON_USE_PYLIST_INTERNALS
+    #define CYTHON_USE_PYLIST_INTERNALS 1
+  #endif
+  #ifndef CYTHON_USE_UNICODE_INTERNALS
+    #define CYTHON_USE_UNICODE_INTERNALS 1
+  #endif
+  #if PY_VERSION_HEX < 0x030300F0 || PY_VERSION_HEX >= 0x030B00A2
+    #undef CYTHON_USE_UNICODE_WRITER
+    #define CYTHON_USE_UNICODE_WRITER 0
+  #elif !defined(CYTHON_USE_UNICODE_WRITER)
+    #define CYTHON_USE_UNICODE_WRITER 1
+  #endif
+  #ifndef CYTHON_AVOID_BORROWED_REFS
+    #define CYTHON_AVOID_BORROWED_REFS 0
+  #endif
+  #ifndef CYTHON_ASSUME_SAFE_MACROS
+    #define CYTHON_ASSUME_SAFE_MACROS 1
+  #endif
+  #ifndef CYTHON_UNPACK_METHODS
+    #define CYTHON_UNPACK_METHODS 1
+  #endif
+  #if PY_VERSION_HEX >= 0x030B00A4
+    #undef CYTHON_FAST_THREAD_STATE
+    #define CYTHON_FAST_THREAD_STATE 0
+  #elif !defined(CYTHON_FAST_THREAD_STATE)
+    #define CYTHON_FAST_THREAD_STATE 1
+  #endif
+  #ifndef CYTHON_FAST_PYCALL
+    #define CYTHON_FAST_PYCALL (PY_VERSION_HEX < 0x030A0000)
+  #endif
+  #ifndef CYTHON_PEP489_MULTI_PHASE_INIT
+    #define CYTHON_PEP489_MULTI_PHASE_INIT (PY_VERSION_HEX >= 0x03050000)
+  #endif
+  #ifndef CYTHON_USE_TP_FINALIZE
+    #define CYTHON_USE_TP_FINALIZE (PY_VERSION_HEX >= 0x030400a1)
+  #endif
+  #ifndef CYTHON_USE_DICT_VERSIONS
+    #define CYTHON_USE_DICT_VERSIONS ((PY_VERSION_HEX >= 0x030600B1) && (PY_VERSION_HEX < 0x030C00A5))
+  #endif
+  #if PY_VERSION_HEX >= 0x030B00A4
+    #undef CYTHON_USE_EXC_INFO_STACK
+    #define CYTHON_USE_EXC_INFO_STACK 0
+  #elif !defined(CYTHON_USE_EXC_INFO_STACK)
+    #define CYTHON_USE_EXC_INFO_STACK (PY_VERSION_HEX >= 0x030700A3)
+  #endif
+  #ifndef CYTHON_UPDATE_DESCRIPTOR_DOC
+    #define CYTHON_UPDATE_DESCRIPTOR_DOC 1
+  #endif
+#endif
+#if !defined(CYTHON_FAST_PYCCALL)
+#define CYTHON_FAST_PYCCALL  (CYTHON_FAST_PYCALL && PY_VERSION_HEX >= 0x030600B1)
+#endif
+#if CYTHON_USE_PYLONG_INTERNALS
+  #if PY_MAJOR_VERSION < 3
+    #include "longintrepr.h"
+  #endif
+  #undef SHIFT
+  #undef BASE
+  #undef MASK
+  #ifdef SIZEOF_VOID_P
+    enum { __pyx_check_sizeof_voidp = 1 / (int)(SIZEOF_VOID_P == sizeof(void*)) };
+  #endif
+#endif
+#ifndef __has_attribute
+  #define __has_attribute(x) 0
+#endif
+#ifndef __has_cpp_attribute
+  #define __has_cpp_attribute(x) 0
+#endif
+#ifndef CYTHON_RESTRICT
+  #if defined(__GNUC__)
+    #define CYTHON_RESTRICT __restrict__
+  #elif defined(_MSC_VER) && _MSC_VER >= 1400
+    #define CYTHON_RESTRICT __restrict
+  #elif defined (__STDC_VERSION__) && __STDC_VERSION__ >= 199901L
+    #define CYTHON_RESTRICT restrict
+  #else
+    #define CYTHON_RESTRICT
+  #endif
+#endif
+#ifndef CYTHON_UNUSED
+# if defined(__GNUC__)
+#   if !(defined(__cplusplus)) || (__GNUC__ > 3 || (__GNUC__ == 3 && __GNUC_MINOR__ >= 4))
+#     define CYTHON_UNUSED __attribute__ ((__unused__))
+#   else
+#     define CYTHON_UNUSED
+#   endif
+# elif defined(__ICC) || (defined(__INTEL_COMPILER) && !defined(_MSC_VER))
+#   define CYTHON_UNUSED __attribute__ ((__unused__))
+# else
+#   define CYTHON_UNUSED
+# endif
+#endif
+#ifndef CYTHON_MAYBE_UNUSED_VAR
+#  if defined(__cplusplus)
+     template<class T> void CYTHON_MAYBE_UNUSED_VAR( const T& ) { }
+#  else
+#    define CYTHON_MAYBE_UNUSED_VAR(x) (void)(x)
+#  endif
+#endif
+#ifndef CYTHON_NCP_UNUSED
+# if CYTHON_COMPILING_IN_CPYTHON
+#  define CYTHON_NCP_UNUSED
+# else
+#  define CYTHON_NCP_UNUSED CYTHON_UNUSED
+# endif
+#endif
+#define __Pyx_void_to_None(void_result) ((void)(void_result), Py_INCREF(Py_None), Py_None)
+#ifdef _MSC_VER
+    #ifndef _MSC_STDINT_H_
+        #if _MSC_VER < 1300
+           typedef unsigned char     uint8_t;
+           typedef unsigned int      uint32_t;
+        #else
+           typedef unsigned __int8   uint8_t;
+           typedef unsigned __int32  uint32_t;
+        #endif
+    #endif
+#else
+   #include <stdint.h>
+#endif
+#ifndef CYTHON_FALLTHROUGH
+  #if defined(__cplusplus) && __cplusplus >= 201103L
+    #if __has_cpp_attribute(fallthrough)
+      #define CYTHON_FALLTHROUGH [[fallthrough]]
+    #elif __has_cpp_attribute(clang::fallthrough)
+      #define CYTHON_FALLTHROUGH [[clang::fallthrough]]
+    #elif __has_cpp_attribute(gnu::fallthrough)
+      #define CYTHON_FALLTHROUGH [[gnu::fallthrough]]
+    #endif
+  #endif
+  #ifndef CYTHON_FALLTHROUGH
+    #if __has_attribute(fallthrough)
+      #define CYTHON_FALLTHROUGH __attribute__((fallthrough))
+    #else
+      #define CYTHON_FALLTHROUGH
+    #endif
+  #endif
+  #if defined(__clang__ ) && defined(__apple_build_version__)
+    #if __apple_build_version__ < 7000000
+      #undef  CYTHON_FALLTHROUGH
+      #define CYTHON_FALLTHROUGH
+    #endif
+  #endif
+#endif
+
+#ifndef __cplusplus
+  #error "Cython files generated with the C++ option must be compiled with a C++ compiler."
+#endif
+#ifndef CYTHON_INLINE
+  #if defined(__clang__)
+    #define CYTHON_INLINE __inline__ __attribute__ ((__unused__))
+  #else
+    #define CYTHON_INLINE inline
+  #endif
+#endif
+template<typename T>
+void __Pyx_call_destructor(T& x) {
+    x.~T();
+}
+template<typename T>
+class __Pyx_FakeReference {
+  public:
+    __Pyx_FakeReference() : ptr(NULL) { }
+    __Pyx_FakeReference(const T& ref) : ptr(const_cast<T*>(&ref)) { }
+    T *operator->() { return ptr; }
+    T *operator&() { return ptr; }
+    operator T&() { return *ptr; }
+    template<typename U> bool operator ==(U other) { return *ptr == other; }
+    template<typename U> bool operator !=(U other) { return *ptr != other; }
+  private:
+    T *ptr;
+};
+
+#define __PYX_BUILD_PY_SSIZE_T "n"
+#define CYTHON_FORMAT_SSIZE_T "z"
+#if PY_MAJOR_VERSION < 3
+  #define __Pyx_BUILTIN_MODULE_NAME "__builtin__"
+  #define __Pyx_PyCode_New(a, k, l, s, f, code, c, n, v, fv, cell, fn, name, fline, lnos)\
+          PyCode_New(a+k, l, s, f, code, c, n, v, fv, cell, fn, name, fline, lnos)
+  #define __Pyx_DefaultClassType PyClass_Type
+#else
+  #define __Pyx_BUILTIN_MODULE_NAME "builtins"
+  #define __Pyx_DefaultClassType PyType_Type
+#if PY_VERSION_HEX >= 0x030B00A1
+    static CYTHON_INLINE PyCodeObject* __Pyx_PyCode_New(int a, int k, int l, int s, int f,
+                                                    PyObject *code, PyObject *c, PyObject* n, PyObject *v,
+                                                    PyObject *fv, PyObject *cell, PyObject* fn,
+                                                    PyObject *name, int fline, PyObject *lnos) {
+        PyObject *kwds=NULL, *argcount=NULL, *posonlyargcount=NULL, *kwonlyargcount=NULL;
+        PyObject *nlocals=NULL, *stacksize=NULL, *flags=NULL, *replace=NULL, *call_result=NULL, *empty=NULL;
+        const char *fn_cstr=NULL;
+        const char *name_cstr=NULL;
+        PyCodeObject* co=NULL;
+        PyObject *type, *value, *traceback;
+        PyErr_Fetch(&type, &value, &traceback);
+        if (!(kwds=PyDict_New())) goto end;
+        if (!(argcount=PyLong_FromLong(a))) goto end;
+        if (PyDict_SetItemString(kwds, "co_argcount", argcount) != 0) goto end;
+        if (!(posonlyargcount=PyLong_FromLong(0))) goto end;
+        if (PyDict_SetItemString(kwds, "co_posonlyargcount", posonlyargcount) != 0) goto end;
+        if (!(kwonlyargcount=PyLong_FromLong(k))) goto end;
+        if (PyDict_SetItemString(kwds, "co_kwonlyargcount", kwonlyargcount) != 0) goto end;
+        if (!(nlocals=PyLong_FromLong(l))) goto end;
+        if (PyDict_SetItemString(kwds, "co_nlocals", nlocals) != 0) goto end;
+        if (!(stacksize=PyLong_FromLong(s))) goto end;
+        if (PyDict_SetItemString(kwds, "co_stacksize", stacksize) != 0) goto end;
+        if (!(flags=PyLong_FromLong(f))) goto end;
+        if (PyDict_SetItemString(kwds, "co_flags", flags) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_code", code) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_consts", c) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_names", n) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_varnames", v) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_freevars", fv) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_cellvars", cell) != 0) goto end;
+        if (PyDict_SetItemString(kwds, "co_linetable", lnos) != 0) goto end;
+        if (!(fn_cstr=PyUnicode_AsUTF8AndSize(fn, NULL))) goto end;
+        if (!(name_cstr=PyUnicode_AsUTF8AndSize(name, NULL))) goto end;
+        if (!(co = PyCode_NewEmpty(fn_cstr, name_cstr, fline))) goto end;
+        if (!(replace = PyObject_GetAttrString((PyObject*)co, "replace"))) goto cleanup_code_too;
+        if (!(empty = PyTuple_New(0))) goto cleanup_code_too; // unfortunately __pyx_empty_tuple isn't available here
+        if (!(call_result = PyObject_Call(replace, empty, kwds))) goto cleanup_code_too;
+        Py_XDECREF((PyObject*)co);
+        co = (PyCodeObject*)call_result;
+        call_result = NULL;
+        if (0) {
+            cleanup_code_too:
+            Py_XDECREF((PyObject*)co);
+            co = NULL;
+        }
+        end:
+        Py_XDECREF(kwds);
+        Py_XDECREF(argcount);
+        Py_XDECREF(posonlyargcount);
+        Py_XDECREF(kwonlyargcount);
+        Py_XDECREF(nlocals);
+        Py_XDECREF(stacksize);
+        Py_XDECREF(replace);
+        Py_XDECREF(call_result);
+        Py_XDECREF(empty);
+        if (type) {
+            PyErr_Restore(type, value, traceback);
+        }
+        return co;
+    }
+#else
+  #define __Pyx_PyCode_New(a, k, l, s, f, code, c, n, v, fv, cell, fn, name, fline, lnos)\
+          PyCode_New(a, k, l, s, f, code, c, n, v, fv, cell, fn, name, fline, lnos)
+#endif
+  #define __Pyx_DefaultClassType PyType_Type
+#endif
+#if PY_VERSION_HEX >= 0x030900F0 && !CYTHON_COMPILING_IN_PYPY
+  #define __Pyx_PyObject_GC_IsFinalized(o) PyObject_GC_IsFinalized(o)
+#else
+  #define __Pyx_PyObject_GC_IsFinalized(o) _PyGC_FINALIZED(o)
+#endif
+#ifndef Py_TPFLAGS_CHECKTYPES
+  #define Py_TPFLAGS_CHECKTYPES 0
+#endif
+#ifndef Py_TPFLAGS_HAVE_INDEX
+  #define Py_TPFLAGS_HAVE_INDEX 0
+#endif
+#ifndef Py_TPFLAGS_HAVE_NEWBUFFER
+  #define Py_TPFLAGS_HAVE_NEWBUFFER 0
+#endif
+#ifndef Py_TPFLAGS_HAVE_FINALIZE
+  #define Py_TPFLAGS_HAVE_FINALIZE 0
+#endif
+#ifndef METH_STACKLESS
+  #define METH_STACKLESS 0
+#endif
+#if PY_VERSION_HEX <= 0x030700A3 || !defined(METH_FASTCALL)
+  #ifndef METH_FASTCALL
+     #define METH_FASTCALL 0x80
+  #endif
+  typedef PyObject *(*__Pyx_PyCFunctionFast) (PyObject *self, PyObject *const *args, Py_ssize_t nargs);
+  typedef PyObject *(*__Pyx_PyCFunctionFastWithKeywords) (PyObject *self, PyObject *const *args,
+                                                          Py_ssize_t nargs, PyObject *kwnames);
+#else
+  #define __Pyx_PyCFunctionFast _PyCFunctionFast
+  #define __Pyx_PyCFunctionFastWithKeywords _PyCFunctionFastWithKeywords
+#endif
+#if CYTHON_FAST_PYCCALL
+#define __Pyx_PyFastCFunction_Check(func)\
+    ((PyCFunction_Check(func) && (METH_FASTCALL == (PyCFunction_GET_FLAGS(func) & ~(METH_CLASS | METH_STATIC | METH_COEXIST | METH_KEYWORDS | METH_STACKLESS)))))
+#else
+#define __Pyx_PyFastCFunction_Check(func) 0
+#endif
+#if CYTHON_COMPILING_IN_PYPY && !defined(PyObject_Malloc)
+  #define PyObject_Malloc(s)   PyMem_Malloc(s)
+  #define PyObject_Free(p)     PyMem_Free(p)
+  #define PyObject_Realloc(p)  PyMem_Realloc(p)
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX < 0x030400A1
+  #define PyMem_RawMalloc(n)           PyMem_Malloc(n)
+  #define PyMem_RawRealloc(p, n)       PyMem_Realloc(p, n)
+  #define PyMem_RawFree(p)             PyMem_Free(p)
+#endif
+#if CYTHON_COMPILING_IN_PYSTON
+  #define __Pyx_PyCode_HasFreeVars(co)  PyCode_HasFreeVars(co)
+  #define __Pyx_PyFrame_SetLineNumber(frame, lineno) PyFrame_SetLineNumber(frame, lineno)
+#else
+  #define __Pyx_PyCode_HasFreeVars(co)  (PyCode_GetNumFree(co) > 0)
+  #define __Pyx_PyFrame_SetLineNumber(frame, lineno)  (frame)->f_lineno = (lineno)
+#endif
+#if !CYTHON_FAST_THREAD_STATE || PY_VERSION_HEX < 0x02070000
+  #define __Pyx_PyThreadState_Current PyThreadState_GET()
+#elif PY_VERSION_HEX >= 0x03060000
+  #define __Pyx_PyThreadState_Current _PyThreadState_UncheckedGet()
+#elif PY_VERSION_HEX >= 0x03000000
+  #define __Pyx_PyThreadState_Current PyThreadState_GET()
+#else
+  #define __Pyx_PyThreadState_Current _PyThreadState_Current
+#endif
+#if PY_VERSION_HEX < 0x030700A2 && !defined(PyThread_tss_create) && !defined(Py_tss_NEEDS_INIT)
+#include "pythread.h"
+#define Py_tss_NEEDS_INIT 0
+typedef int Py_tss_t;
+static CYTHON_INLINE int PyThread_tss_create(Py_tss_t *key) {
+  *key = PyThread_create_key();
+  return 0;
+}
+static CYTHON_INLINE Py_tss_t * PyThread_tss_alloc(void) {
+  Py_tss_t *key = (Py_tss_t *)PyObject_Malloc(sizeof(Py_tss_t));
+  *key = Py_tss_NEEDS_INIT;
+  return key;
+}
+static CYTHON_INLINE void PyThread_tss_free(Py_tss_t *key) {
+  PyObject_Free(key);
+}
+static CYTHON_INLINE int PyThread_tss_is_created(Py_tss_t *key) {
+  return *key != Py_tss_NEEDS_INIT;
+}
+static CYTHON_INLINE void PyThread_tss_delete(Py_tss_t *key) {
+  PyThread_delete_key(*key);
+  *key = Py_tss_NEEDS_INIT;
+}
+static CYTHON_INLINE int PyThread_tss_set(Py_tss_t *key, void *value) {
+  return PyThread_set_key_value(*key, value);
+}
+static CYTHON_INLINE void * PyThread_tss_get(Py_tss_t *key) {
+  return PyThread_get_key_value(*key);
+}
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON || defined(_PyDict_NewPresized)
+#define __Pyx_PyDict_NewPresized(n)  ((n <= 8) ? PyDict_New() : _PyDict_NewPresized(n))
+#else
+#define __Pyx_PyDict_NewPresized(n)  PyDict_New()
+#endif
+#if PY_MAJOR_VERSION >= 3 || CYTHON_FUTURE_DIVISION
+  #define __Pyx_PyNumber_Divide(x,y)         PyNumber_TrueDivide(x,y)
+  #define __Pyx_PyNumber_InPlaceDivide(x,y)  PyNumber_InPlaceTrueDivide(x,y)
+#else
+  #define __Pyx_PyNumber_Divide(x,y)         PyNumber_Divide(x,y)
+  #define __Pyx_PyNumber_InPlaceDivide(x,y)  PyNumber_InPlaceDivide(x,y)
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX >= 0x030500A1 && CYTHON_USE_UNICODE_INTERNALS
+#define __Pyx_PyDict_GetItemStr(dict, name)  _PyDict_GetItem_KnownHash(dict, name, ((PyASCIIObject *) name)->hash)
+#else
+#define __Pyx_PyDict_GetItemStr(dict, name)  PyDict_GetItem(dict, name)
+#endif
+#if PY_VERSION_HEX > 0x03030000 && defined(PyUnicode_KIND)
+  #define CYTHON_PEP393_ENABLED 1
+  #if PY_VERSION_HEX >= 0x030C0000
+    #define __Pyx_PyUnicode_READY(op)       (0)
+  #else
+    #define __Pyx_PyUnicode_READY(op)       (likely(PyUnicode_IS_READY(op)) ?\
+                                                0 : _PyUnicode_Ready((PyObject *)(op)))
+  #endif
+  #define __Pyx_PyUnicode_GET_LENGTH(u)   PyUnicode_GET_LENGTH(u)
+  #define __Pyx_PyUnicode_READ_CHAR(u, i) PyUnicode_READ_CHAR(u, i)
+  #define __Pyx_PyUnicode_MAX_CHAR_VALUE(u)   PyUnicode_MAX_CHAR_VALUE(u)
+  #define __Pyx_PyUnicode_KIND(u)         PyUnicode_KIND(u)
+  #define __Pyx_PyUnicode_DATA(u)         PyUnicode_DATA(u)
+  #define __Pyx_PyUnicode_READ(k, d, i)   PyUnicode_READ(k, d, i)
+  #define __Pyx_PyUnicode_WRITE(k, d, i, ch)  PyUnicode_WRITE(k, d, i, ch)
+  #if PY_VERSION_HEX >= 0x030C0000
+    #define __Pyx_PyUnicode_IS_TRUE(u)      (0 != PyUnicode_GET_LENGTH(u))
+  #else
+    #if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX >= 0x03090000
+    #define __Pyx_PyUnicode_IS_TRUE(u)      (0 != (likely(PyUnicode_IS_READY(u)) ? PyUnicode_GET_LENGTH(u) : ((PyCompactUnicodeObject *)(u))->wstr_length))
+    #else
+    #define __Pyx_PyUnicode_IS_TRUE(u)      (0 != (likely(PyUnicode_IS_READY(u)) ? PyUnicode_GET_LENGTH(u) : PyUnicode_GET_SIZE(u)))
+    #endif
+  #endif
+#else
+  #define CYTHON_PEP393_ENABLED 0
+  #define PyUnicode_1BYTE_KIND  1
+  #define PyUnicode_2BYTE_KIND  2
+  #define PyUnicode_4BYTE_KIND  4
+  #define __Pyx_PyUnicode_READY(op)       (0)
+  #define __Pyx_PyUnicode_GET_LENGTH(u)   PyUnicode_GET_SIZE(u)
+  #define __Pyx_PyUnicode_READ_CHAR(u, i) ((Py_UCS4)(PyUnicode_AS_UNICODE(u)[i]))
+  #define __Pyx_PyUnicode_MAX_CHAR_VALUE(u)   ((sizeof(Py_UNICODE) == 2) ? 65535 : 1114111)
+  #define __Pyx_PyUnicode_KIND(u)         (sizeof(Py_UNICODE))
+  #define __Pyx_PyUnicode_DATA(u)         ((void*)PyUnicode_AS_UNICODE(u))
+  #define __Pyx_PyUnicode_READ(k, d, i)   ((void)(k), (Py_UCS4)(((Py_UNICODE*)d)[i]))
+  #define __Pyx_PyUnicode_WRITE(k, d, i, ch)  (((void)(k)), ((Py_UNICODE*)d)[i] = ch)
+  #define __Pyx_PyUnicode_IS_TRUE(u)      (0 != PyUnicode_GET_SIZE(u))
+#endif
+#if CYTHON_COMPILING_IN_PYPY
+  #define __Pyx_PyUnicode_Concat(a, b)      PyNumber_Add(a, b)
+  #define __Pyx_PyUnicode_ConcatSafe(a, b)  PyNumber_Add(a, b)
+#else
+  #define __Pyx_PyUnicode_Concat(a, b)      PyUnicode_Concat(a, b)
+  #define __Pyx_PyUnicode_ConcatSafe(a, b)  ((unlikely((a) == Py_None) || unlikely((b) == Py_None)) ?\
+      PyNumber_Add(a, b) : __Pyx_PyUnicode_Concat(a, b))
+#endif
+#if CYTHON_COMPILING_IN_PYPY && !defined(PyUnicode_Contains)
+  #define PyUnicode_Contains(u, s)  PySequence_Contains(u, s)
+#endif
+#if CYTHON_COMPILING_IN_PYPY && !defined(PyByteArray_Check)
+  #define PyByteArray_Check(obj)  PyObject_TypeCheck(obj, &PyByteArray_Type)
+#endif
+#if CYTHON_COMPILING_IN_PYPY && !defined(PyObject_Format)
+  #define PyObject_Format(obj, fmt)  PyObject_CallMethod(obj, "__format__", "O", fmt)
+#endif
+#define __Pyx_PyString_FormatSafe(a, b)   ((unlikely((a) == Py_None || (PyString_Check(b) && !PyString_CheckExact(b)))) ? PyNumber_Remainder(a, b) : __Pyx_PyString_Format(a, b))
+#define __Pyx_PyUnicode_FormatSafe(a, b)  ((unlikely((a) == Py_None || (PyUnicode_Check(b) && !PyUnicode_CheckExact(b)))) ? PyNumber_Remainder(a, b) : PyUnicode_Format(a, b))
+#if PY_MAJOR_VERSION >= 3
+  #define __Pyx_PyString_Format(a, b)  PyUnicode_Format(a, b)
+#else
+  #define __Pyx_PyString_Format(a, b)  PyString_Format(a, b)
+#endif
+#if PY_MAJOR_VERSION < 3 && !defined(PyObject_ASCII)
+  #define PyObject_ASCII(o)            PyObject_Repr(o)
+#endif
+#if PY_MAJOR_VERSION >= 3
+  #define PyBaseString_Type            PyUnicode_Type
+  #define PyStringObject               PyUnicodeObject
+  #define PyString_Type                PyUnicode_Type
+  #define PyString_Check               PyUnicode_Check
+  #define PyString_CheckExact          PyUnicode_CheckExact
+#ifndef PyObject_Unicode
+  #define PyObject_Unicode             PyObject_Str
+#endif
+#endif
+#if PY_MAJOR_VERSION >= 3
+  #define __Pyx_PyBaseString_Check(obj) PyUnicode_Check(obj)
+  #define __Pyx_PyBaseString_CheckExact(obj) PyUnicode_CheckExact(obj)
+#else
+  #define __Pyx_PyBaseString_Check(obj) (PyString_Check(obj) || PyUnicode_Check(obj))
+  #define __Pyx_PyBaseString_CheckExact(obj) (PyString_CheckExact(obj) || PyUnicode_CheckExact(obj))
+#endif
+#ifndef PySet_CheckExact
+  #define PySet_CheckExact(obj)        (Py_TYPE(obj) == &PySet_Type)
+#endif
+#if PY_VERSION_HEX >= 0x030900A4
+  #define __Pyx_SET_REFCNT(obj, refcnt) Py_SET_REFCNT(obj, refcnt)
+  #define __Pyx_SET_SIZE(obj, size) Py_SET_SIZE(obj, size)
+#else
+  #define __Pyx_SET_REFCNT(obj, refcnt) Py_REFCNT(obj) = (refcnt)
+  #define __Pyx_SET_SIZE(obj, size) Py_SIZE(obj) = (size)
+#endif
+#if CYTHON_ASSUME_SAFE_MACROS
+  #define __Pyx_PySequence_SIZE(seq)  Py_SIZE(seq)
+#else
+  #define __Pyx_PySequence_SIZE(seq)  PySequence_Size(seq)
+#endif
+#if PY_MAJOR_VERSION >= 3
+  #define PyIntObject                  PyLongObject
+  #define PyInt_Type                   PyLong_Type
+  #define PyInt_Check(op)              PyLong_Check(op)
+  #define PyInt_CheckExact(op)         PyLong_CheckExact(op)
+  #define PyInt_FromString             PyLong_FromString
+  #define PyInt_FromUnicode            PyLong_FromUnicode
+  #define PyInt_FromLong               PyLong_FromLong
+  #define PyInt_FromSize_t             PyLong_FromSize_t
+  #define PyInt_FromSsize_t            PyLong_FromSsize_t
+  #define PyInt_AsLong                 PyLong_AsLong
+  #define PyInt_AS_LONG                PyLong_AS_LONG
+  #define PyInt_AsSsize_t              PyLong_AsSsize_t
+  #define PyInt_AsUnsignedLongMask     PyLong_AsUnsignedLongMask
+  #define PyInt_AsUnsignedLongLongMask PyLong_AsUnsignedLongLongMask
+  #define PyNumber_Int                 PyNumber_Long
+#endif
+#if PY_MAJOR_VERSION >= 3
+  #define PyBoolObject                 PyLongObject
+#endif
+#if PY_MAJOR_VERSION >= 3 && CYTHON_COMPILING_IN_PYPY
+  #ifndef PyUnicode_InternFromString
+    #define PyUnicode_InternFromString(s) PyUnicode_FromString(s)
+  #endif
+#endif
+#if PY_VERSION_HEX < 0x030200A4
+  typedef long Py_hash_t;
+  #define __Pyx_PyInt_FromHash_t PyInt_FromLong
+  #define __Pyx_PyInt_AsHash_t   __Pyx_PyIndex_AsHash_t
+#else
+  #define __Pyx_PyInt_FromHash_t PyInt_FromSsize_t
+  #define __Pyx_PyInt_AsHash_t   __Pyx_PyIndex_AsSsize_t
+#endif
+#if PY_MAJOR_VERSION >= 3
+  #define __Pyx_PyMethod_New(func, self, klass) ((self) ? ((void)(klass), PyMethod_New(func, self)) : __Pyx_NewRef(func))
+#else
+  #define __Pyx_PyMethod_New(func, self, klass) PyMethod_New(func, self, klass)
+#endif
+#if CYTHON_USE_ASYNC_SLOTS
+  #if PY_VERSION_HEX >= 0x030500B1
+    #define __Pyx_PyAsyncMethodsStruct PyAsyncMethods
+    #define __Pyx_PyType_AsAsync(obj) (Py_TYPE(obj)->tp_as_async)
+  #else
+    #define __Pyx_PyType_AsAsync(obj) ((__Pyx_PyAsyncMethodsStruct*) (Py_TYPE(obj)->tp_reserved))
+  #endif
+#else
+  #define __Pyx_PyType_AsAsync(obj) NULL
+#endif
+#ifndef __Pyx_PyAsyncMethodsStruct
+    typedef struct {
+        unaryfunc am_await;
+        unaryfunc am_aiter;
+        unaryfunc am_anext;
+    } __Pyx_PyAsyncMethodsStruct;
+#endif
+
+#if defined(_WIN32) || defined(WIN32) || defined(MS_WINDOWS)
+  #if !defined(_USE_MATH_DEFINES)
+    #define _USE_MATH_DEFINES
+  #endif
+#endif
+#include <math.h>
+#ifdef NAN
+#define __PYX_NAN() ((float) NAN)
+#else
+static CYTHON_INLINE float __PYX_NAN() {
+  float value;
+  memset(&value, 0xFF, sizeof(value));
+  return value;
+}
+#endif
+#if defined(__CYGWIN__) && defined(_LDBL_EQ_DBL)
+#define __Pyx_truncl trunc
+#else
+#define __Pyx_truncl truncl
+#endif
+
+#define __PYX_MARK_ERR_POS(f_index, lineno) \
+    { __pyx_filename = __pyx_f[f_index]; (void)__pyx_filename; __pyx_lineno = lineno; (void)__pyx_lineno; __pyx_clineno = __LINE__; (void)__pyx_clineno; }
+#define __PYX_ERR(f_index, lineno, Ln_error) \
+    { __PYX_MARK_ERR_POS(f_index, lineno) goto Ln_error; }
+
+#ifndef __PYX_EXTERN_C
+  #ifdef __cplusplus
+    #define __PYX_EXTERN_C extern "C"
+  #else
+    #define __PYX_EXTERN_C extern
+  #endif
+#endif
+
+#define __PYX_HAVE__hifive__libraries___hic_interactions
+#define __PYX_HAVE_API__hifive__libraries___hic_interactions
+/* Early includes */
+#include <string.h>
+#include <stdio.h>
+#include "numpy/arrayobject.h"
+#include "numpy/ufuncobject.h"
+#include "math.h"
+#ifdef _OPENMP
+#include <omp.h>
+#endif /* _OPENMP */
+
+#if defined(PYREX_WITHOUT_ASSERTIONS) && !defined(CYTHON_WITHOUT_ASSERTIONS)
+#define CYTHON_WITHOUT_ASSERTIONS
+#endif
+
+typedef struct {PyObject **p; const char *s; const Py_ssize_t n; const char* encoding;
+                const char is_unicode; const char is_str; const char intern; } __Pyx_StringTabEntry;
+
+#define __PYX_DEFAULT_STRING_ENCODING_IS_ASCII 0
+#define __PYX_DEFAULT_STRING_ENCODING_IS_UTF8 0
+#define __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT (PY_MAJOR_VERSION >= 3 && __PYX_DEFAULT_STRING_ENCODING_IS_UTF8)
+#define __PYX_DEFAULT_STRING_ENCODING ""
+#define __Pyx_PyObject_FromString __Pyx_PyBytes_FromString
+#define __Pyx_PyObject_FromStringAndSize __Pyx_PyBytes_FromStringAndSize
+#define __Pyx_uchar_cast(c) ((unsigned char)c)
+#define __Pyx_long_cast(x) ((long)x)
+#define __Pyx_fits_Py_ssize_t(v, type, is_signed)  (\
+    (sizeof(type) < sizeof(Py_ssize_t))  ||\
+    (sizeof(type) > sizeof(Py_ssize_t) &&\
+          likely(v < (type)PY_SSIZE_T_MAX ||\
+                 v == (type)PY_SSIZE_T_MAX)  &&\
+          (!is_signed || likely(v > (type)PY_SSIZE_T_MIN ||\
+                                v == (type)PY_SSIZE_T_MIN)))  ||\
+    (sizeof(type) == sizeof(Py_ssize_t) &&\
+          (is_signed || likely(v < (type)PY_SSIZE_T_MAX ||\
+                               v == (type)PY_SSIZE_T_MAX)))  )
+static CYTHON_INLINE int __Pyx_is_valid_index(Py_ssize_t i, Py_ssize_t limit) {
+    return (size_t) i < (size_t) limit;
+}
+#if defined (__cplusplus) && __cplusplus >= 201103L
+    #include <cstdlib>
+    #define __Pyx_sst_abs(value) std::abs(value)
+#elif SIZEOF_INT >= SIZEOF_SIZE_T
+    #define __Pyx_sst_abs(value) abs(value)
+#elif SIZEOF_LONG >= SIZEOF_SIZE_T
+    #define __Pyx_sst_abs(value) labs(value)
+#elif defined (_MSC_VER)
+    #define __Pyx_sst_abs(value) ((Py_ssize_t)_abs64(value))
+#elif defined (__STDC_VERSION__) && __STDC_VERSION__ >= 199901L
+    #define __Pyx_sst_abs(value) llabs(value)
+#elif defined (__GNUC__)
+    #define __Pyx_sst_abs(value) __builtin_llabs(value)
+#else
+    #define __Pyx_sst_abs(value) ((value<0) ? -value : value)
+#endif
+static CYTHON_INLINE const char* __Pyx_PyObject_AsString(PyObject*);
+static CYTHON_INLINE const char* __Pyx_PyObject_AsStringAndSize(PyObject*, Py_ssize_t* length);
+#define __Pyx_PyByteArray_FromString(s) PyByteArray_FromStringAndSize((const char*)s, strlen((const char*)s))
+#define __Pyx_PyByteArray_FromStringAndSize(s, l) PyByteArray_FromStringAndSize((const char*)s, l)
+#define __Pyx_PyBytes_FromString        PyBytes_FromString
+#define __Pyx_PyBytes_FromStringAndSize PyBytes_FromStringAndSize
+static CYTHON_INLINE PyObject* __Pyx_PyUnicode_FromString(const char*);
+#if PY_MAJOR_VERSION < 3
+    #define __Pyx_PyStr_FromString        __Pyx_PyBytes_FromString
+    #define __Pyx_PyStr_FromStringAndSize __Pyx_PyBytes_FromStringAndSize
+#else
+    #define __Pyx_PyStr_FromString        __Pyx_PyUnicode_FromString
+    #define __Pyx_PyStr_FromStringAndSize __Pyx_PyUnicode_FromStringAndSize
+#endif
+#define __Pyx_PyBytes_AsWritableString(s)     ((char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyBytes_AsWritableSString(s)    ((signed char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyBytes_AsWritableUString(s)    ((unsigned char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyBytes_AsString(s)     ((const char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyBytes_AsSString(s)    ((const signed char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyBytes_AsUString(s)    ((const unsigned char*) PyBytes_AS_STRING(s))
+#define __Pyx_PyObject_AsWritableString(s)    ((char*) __Pyx_PyObject_AsString(s))
+#define __Pyx_PyObject_AsWritableSString(s)    ((signed char*) __Pyx_PyObject_AsString(s))
+#define __Pyx_PyObject_AsWritableUString(s)    ((unsigned char*) __Pyx_PyObject_AsString(s))
+#define __Pyx_PyObject_AsSString(s)    ((const signed char*) __Pyx_PyObject_AsString(s))
+#define __Pyx_PyObject_AsUString(s)    ((const unsigned char*) __Pyx_PyObject_AsString(s))
+#define __Pyx_PyObject_FromCString(s)  __Pyx_PyObject_FromString((const char*)s)
+#define __Pyx_PyBytes_FromCString(s)   __Pyx_PyBytes_FromString((const char*)s)
+#define __Pyx_PyByteArray_FromCString(s)   __Pyx_PyByteArray_FromString((const char*)s)
+#define __Pyx_PyStr_FromCString(s)     __Pyx_PyStr_FromString((const char*)s)
+#define __Pyx_PyUnicode_FromCString(s) __Pyx_PyUnicode_FromString((const char*)s)
+static CYTHON_INLINE size_t __Pyx_Py_UNICODE_strlen(const Py_UNICODE *u) {
+    const Py_UNICODE *u_end = u;
+    while (*u_end++) ;
+    return (size_t)(u_end - u - 1);
+}
+#define __Pyx_PyUnicode_FromUnicode(u)       PyUnicode_FromUnicode(u, __Pyx_Py_UNICODE_strlen(u))
+#define __Pyx_PyUnicode_FromUnicodeAndLength PyUnicode_FromUnicode
+#define __Pyx_PyUnicode_AsUnicode            PyUnicode_AsUnicode
+#define __Pyx_NewRef(obj) (Py_INCREF(obj), obj)
+#define __Pyx_Owned_Py_None(b) __Pyx_NewRef(Py_None)
+static CYTHON_INLINE PyObject * __Pyx_PyBool_FromLong(long b);
+static CYTHON_INLINE int __Pyx_PyObject_IsTrue(PyObject*);
+static CYTHON_INLINE int __Pyx_PyObject_IsTrueAndDecref(PyObject*);
+static CYTHON_INLINE PyObject* __Pyx_PyNumber_IntOrLong(PyObject* x);
+#define __Pyx_PySequence_Tuple(obj)\
+    (likely(PyTuple_CheckExact(obj)) ? __Pyx_NewRef(obj) : PySequence_Tuple(obj))
+static CYTHON_INLINE Py_ssize_t __Pyx_PyIndex_AsSsize_t(PyObject*);
+static CYTHON_INLINE PyObject * __Pyx_PyInt_FromSize_t(size_t);
+static CYTHON_INLINE Py_hash_t __Pyx_PyIndex_AsHash_t(PyObject*);
+#if CYTHON_ASSUME_SAFE_MACROS
+#define __pyx_PyFloat_AsDouble(x) (PyFloat_CheckExact(x) ? PyFloat_AS_DOUBLE(x) : PyFloat_AsDouble(x))
+#else
+#define __pyx_PyFloat_AsDouble(x) PyFloat_AsDouble(x)
+#endif
+#define __pyx_PyFloat_AsFloat(x) ((float) __pyx_PyFloat_AsDouble(x))
+#if PY_MAJOR_VERSION >= 3
+#define __Pyx_PyNumber_Int(x) (PyLong_CheckExact(x) ? __Pyx_NewRef(x) : PyNumber_Long(x))
+#else
+#define __Pyx_PyNumber_Int(x) (PyInt_CheckExact(x) ? __Pyx_NewRef(x) : PyNumber_Int(x))
+#endif
+#define __Pyx_PyNumber_Float(x) (PyFloat_CheckExact(x) ? __Pyx_NewRef(x) : PyNumber_Float(x))
+#if PY_MAJOR_VERSION < 3 && __PYX_DEFAULT_STRING_ENCODING_IS_ASCII
+static int __Pyx_sys_getdefaultencoding_not_ascii;
+static int __Pyx_init_sys_getdefaultencoding_params(void) {
+    PyObject* sys;
+    PyObject* default_encoding = NULL;
+    PyObject* ascii_chars_u = NULL;
+    PyObject* ascii_chars_b = NULL;
+    const char* default_encoding_c;
+    sys = PyImport_ImportModule("sys");
+    if (!sys) goto bad;
+    default_encoding = PyObject_CallMethod(sys, (char*) "getdefaultencoding", NULL);
+    Py_DECREF(sys);
+    if (!default_encoding) goto bad;
+    default_encoding_c = PyBytes_AsString(default_encoding);
+    if (!default_encoding_c) goto bad;
+    if (strcmp(default_encoding_c, "ascii") == 0) {
+        __Pyx_sys_getdefaultencoding_not_ascii = 0;
+    } else {
+        char ascii_chars[128];
+        int c;
+        for (c = 0; c < 128; c++) {
+            ascii_chars[c] = c;
+        }
+        __Pyx_sys_getdefaultencoding_not_ascii = 1;
+        ascii_chars_u = PyUnicode_DecodeASCII(ascii_chars, 128, NULL);
+        if (!ascii_chars_u) goto bad;
+        ascii_chars_b = PyUnicode_AsEncodedString(ascii_chars_u, default_encoding_c, NULL);
+        if (!ascii_chars_b || !PyBytes_Check(ascii_chars_b) || memcmp(ascii_chars, PyBytes_AS_STRING(ascii_chars_b), 128) != 0) {
+            PyErr_Format(
+                PyExc_ValueError,
+                "This module compiled with c_string_encoding=ascii, but default encoding '%.200s' is not a superset of ascii.",
+                default_encoding_c);
+            goto bad;
+        }
+        Py_DECREF(ascii_chars_u);
+        Py_DECREF(ascii_chars_b);
+    }
+    Py_DECREF(default_encoding);
+    return 0;
+bad:
+    Py_XDECREF(default_encoding);
+    Py_XDECREF(ascii_chars_u);
+    Py_XDECREF(ascii_chars_b);
+    return -1;
+}
+#endif
+#if __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT && PY_MAJOR_VERSION >= 3
+#define __Pyx_PyUnicode_FromStringAndSize(c_str, size) PyUnicode_DecodeUTF8(c_str, size, NULL)
+#else
+#define __Pyx_PyUnicode_FromStringAndSize(c_str, size) PyUnicode_Decode(c_str, size, __PYX_DEFAULT_STRING_ENCODING, NULL)
+#if __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT
+static char* __PYX_DEFAULT_STRING_ENCODING;
+static int __Pyx_init_sys_getdefaultencoding_params(void) {
+    PyObject* sys;
+    PyObject* default_encoding = NULL;
+    char* default_encoding_c;
+    sys = PyImport_ImportModule("sys");
+    if (!sys) goto bad;
+    default_encoding = PyObject_CallMethod(sys, (char*) (const char*) "getdefaultencoding", NULL);
+    Py_DECREF(sys);
+    if (!default_encoding) goto bad;
+    default_encoding_c = PyBytes_AsString(default_encoding);
+    if (!default_encoding_c) goto bad;
+    __PYX_DEFAULT_STRING_ENCODING = (char*) malloc(strlen(default_encoding_c) + 1);
+    if (!__PYX_DEFAULT_STRING_ENCODING) goto bad;
+    strcpy(__PYX_DEFAULT_STRING_ENCODING, default_encoding_c);
+    Py_DECREF(default_encoding);
+    return 0;
+bad:
+    Py_XDECREF(default_encoding);
+    return -1;
+}
+#endif
+#endif
+
+
+/* Test for GCC > 2.95 */
+#if defined(__GNUC__)     && (__GNUC__ > 2 || (__GNUC__ == 2 && (__GNUC_MINOR__ > 95)))
+  #define likely(x)   __builtin_expect(!!(x), 1)
+  #define unlikely(x) __builtin_expect(!!(x), 0)
+#else /* !__GNUC__ or GCC < 2.95 */
+  #define likely(x)   (x)
+  #define unlikely(x) (x)
+#endif /* __GNUC__ */
+static CYTHON_INLINE void __Pyx_pretend_to_initialize(void* ptr) { (void)ptr; }
+
+static PyObject *__pyx_m = NULL;
+static PyObject *__pyx_d;
+static PyObject *__pyx_b;
+static PyObject *__pyx_cython_runtime = NULL;
+static PyObject *__pyx_empty_tuple;
+static PyObject *__pyx_empty_bytes;
+static PyObject *__pyx_empty_unicode;
+static int __pyx_lineno;
+static int __pyx_clineno = 0;
+static const char * __pyx_cfilenm= __FILE__;
+static const char *__pyx_filename;
+
+/* Header.proto */
+#if !defined(CYTHON_CCOMPLEX)
+  #if defined(__cplusplus)
+    #define CYTHON_CCOMPLEX 1
+  #elif (defined(_Complex_I) && !defined(_MSC_VER))
+    #define CYTHON_CCOMPLEX 1
+  #else
+    #define CYTHON_CCOMPLEX 0
+  #endif
+#endif
+#if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    #include <complex>
+  #else
+    #include <complex.h>
+  #endif
+#endif
+#if CYTHON_CCOMPLEX && !defined(__cplusplus) && defined(__sun__) && defined(__GNUC__)
+  #undef _Complex_I
+  #define _Complex_I 1.0fj
+#endif
+
+
+static const char *__pyx_f[] = {
+  "hifive/libraries/_hic_interactions.pyx",
+  "__init__.pxd",
+  "type.pxd",
+};
+/* BufferFormatStructs.proto */
+#define IS_UNSIGNED(type) (((type) -1) > 0)
+struct __Pyx_StructField_;
+#define __PYX_BUF_FLAGS_PACKED_STRUCT (1 << 0)
+typedef struct {
+  const char* name;
+  struct __Pyx_StructField_* fields;
+  size_t size;
+  size_t arraysize[8];
+  int ndim;
+  char typegroup;
+  char is_unsigned;
+  int flags;
+} __Pyx_TypeInfo;
+typedef struct __Pyx_StructField_ {
+  __Pyx_TypeInfo* type;
+  const char* name;
+  size_t offset;
+} __Pyx_StructField;
+typedef struct {
+  __Pyx_StructField* field;
+  size_t parent_offset;
+} __Pyx_BufFmt_StackElem;
+typedef struct {
+  __Pyx_StructField root;
+  __Pyx_BufFmt_StackElem* head;
+  size_t fmt_offset;
+  size_t new_count, enc_count;
+  size_t struct_alignment;
+  int is_complex;
+  char enc_type;
+  char new_packmode;
+  char enc_packmode;
+  char is_valid_array;
+} __Pyx_BufFmt_Context;
+
+/* NoFastGil.proto */
+#define __Pyx_PyGILState_Ensure PyGILState_Ensure
+#define __Pyx_PyGILState_Release PyGILState_Release
+#define __Pyx_FastGIL_Remember()
+#define __Pyx_FastGIL_Forget()
+#define __Pyx_FastGilFuncInit()
+
+/* ForceInitThreads.proto */
+#ifndef __PYX_FORCE_INIT_THREADS
+  #define __PYX_FORCE_INIT_THREADS 0
+#endif
+
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":775
+ * # in Cython to enable them only on the right systems.
+ * 
+ * ctypedef npy_int8       int8_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_int16      int16_t
+ * ctypedef npy_int32      int32_t
+ */
+typedef npy_int8 __pyx_t_5numpy_int8_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":776
+ * 
+ * ctypedef npy_int8       int8_t
+ * ctypedef npy_int16      int16_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_int32      int32_t
+ * ctypedef npy_int64      int64_t
+ */
+typedef npy_int16 __pyx_t_5numpy_int16_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":777
+ * ctypedef npy_int8       int8_t
+ * ctypedef npy_int16      int16_t
+ * ctypedef npy_int32      int32_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_int64      int64_t
+ * #ctypedef npy_int96      int96_t
+ */
+typedef npy_int32 __pyx_t_5numpy_int32_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":778
+ * ctypedef npy_int16      int16_t
+ * ctypedef npy_int32      int32_t
+ * ctypedef npy_int64      int64_t             # <<<<<<<<<<<<<<
+ * #ctypedef npy_int96      int96_t
+ * #ctypedef npy_int128     int128_t
+ */
+typedef npy_int64 __pyx_t_5numpy_int64_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":782
+ * #ctypedef npy_int128     int128_t
+ * 
+ * ctypedef npy_uint8      uint8_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_uint16     uint16_t
+ * ctypedef npy_uint32     uint32_t
+ */
+typedef npy_uint8 __pyx_t_5numpy_uint8_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":783
+ * 
+ * ctypedef npy_uint8      uint8_t
+ * ctypedef npy_uint16     uint16_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_uint32     uint32_t
+ * ctypedef npy_uint64     uint64_t
+ */
+typedef npy_uint16 __pyx_t_5numpy_uint16_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":784
+ * ctypedef npy_uint8      uint8_t
+ * ctypedef npy_uint16     uint16_t
+ * ctypedef npy_uint32     uint32_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_uint64     uint64_t
+ * #ctypedef npy_uint96     uint96_t
+ */
+typedef npy_uint32 __pyx_t_5numpy_uint32_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":785
+ * ctypedef npy_uint16     uint16_t
+ * ctypedef npy_uint32     uint32_t
+ * ctypedef npy_uint64     uint64_t             # <<<<<<<<<<<<<<
+ * #ctypedef npy_uint96     uint96_t
+ * #ctypedef npy_uint128    uint128_t
+ */
+typedef npy_uint64 __pyx_t_5numpy_uint64_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":789
+ * #ctypedef npy_uint128    uint128_t
+ * 
+ * ctypedef npy_float32    float32_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_float64    float64_t
+ * #ctypedef npy_float80    float80_t
+ */
+typedef npy_float32 __pyx_t_5numpy_float32_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":790
+ * 
+ * ctypedef npy_float32    float32_t
+ * ctypedef npy_float64    float64_t             # <<<<<<<<<<<<<<
+ * #ctypedef npy_float80    float80_t
+ * #ctypedef npy_float128   float128_t
+ */
+typedef npy_float64 __pyx_t_5numpy_float64_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":799
+ * # The int types are mapped a bit surprising --
+ * # numpy.int corresponds to 'l' and numpy.long to 'q'
+ * ctypedef npy_long       int_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_longlong   long_t
+ * ctypedef npy_longlong   longlong_t
+ */
+typedef npy_long __pyx_t_5numpy_int_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":800
+ * # numpy.int corresponds to 'l' and numpy.long to 'q'
+ * ctypedef npy_long       int_t
+ * ctypedef npy_longlong   long_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_longlong   longlong_t
+ * 
+ */
+typedef npy_longlong __pyx_t_5numpy_long_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":801
+ * ctypedef npy_long       int_t
+ * ctypedef npy_longlong   long_t
+ * ctypedef npy_longlong   longlong_t             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef npy_ulong      uint_t
+ */
+typedef npy_longlong __pyx_t_5numpy_longlong_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":803
+ * ctypedef npy_longlong   longlong_t
+ * 
+ * ctypedef npy_ulong      uint_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_ulonglong  ulong_t
+ * ctypedef npy_ulonglong  ulonglong_t
+ */
+typedef npy_ulong __pyx_t_5numpy_uint_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":804
+ * 
+ * ctypedef npy_ulong      uint_t
+ * ctypedef npy_ulonglong  ulong_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_ulonglong  ulonglong_t
+ * 
+ */
+typedef npy_ulonglong __pyx_t_5numpy_ulong_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":805
+ * ctypedef npy_ulong      uint_t
+ * ctypedef npy_ulonglong  ulong_t
+ * ctypedef npy_ulonglong  ulonglong_t             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef npy_intp       intp_t
+ */
+typedef npy_ulonglong __pyx_t_5numpy_ulonglong_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":807
+ * ctypedef npy_ulonglong  ulonglong_t
+ * 
+ * ctypedef npy_intp       intp_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_uintp      uintp_t
+ * 
+ */
+typedef npy_intp __pyx_t_5numpy_intp_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":808
+ * 
+ * ctypedef npy_intp       intp_t
+ * ctypedef npy_uintp      uintp_t             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef npy_double     float_t
+ */
+typedef npy_uintp __pyx_t_5numpy_uintp_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":810
+ * ctypedef npy_uintp      uintp_t
+ * 
+ * ctypedef npy_double     float_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_double     double_t
+ * ctypedef npy_longdouble longdouble_t
+ */
+typedef npy_double __pyx_t_5numpy_float_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":811
+ * 
+ * ctypedef npy_double     float_t
+ * ctypedef npy_double     double_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_longdouble longdouble_t
+ * 
+ */
+typedef npy_double __pyx_t_5numpy_double_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":812
+ * ctypedef npy_double     float_t
+ * ctypedef npy_double     double_t
+ * ctypedef npy_longdouble longdouble_t             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef npy_cfloat      cfloat_t
+ */
+typedef npy_longdouble __pyx_t_5numpy_longdouble_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":11
+ * import numpy
+ * 
+ * ctypedef np.float32_t DTYPE_t             # <<<<<<<<<<<<<<
+ * ctypedef np.float64_t DTYPE_64_t
+ * ctypedef np.int32_t DTYPE_int_t
+ */
+typedef __pyx_t_5numpy_float32_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":12
+ * 
+ * ctypedef np.float32_t DTYPE_t
+ * ctypedef np.float64_t DTYPE_64_t             # <<<<<<<<<<<<<<
+ * ctypedef np.int32_t DTYPE_int_t
+ * ctypedef np.int64_t DTYPE_int64_t
+ */
+typedef __pyx_t_5numpy_float64_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":13
+ * ctypedef np.float32_t DTYPE_t
+ * ctypedef np.float64_t DTYPE_64_t
+ * ctypedef np.int32_t DTYPE_int_t             # <<<<<<<<<<<<<<
+ * ctypedef np.int64_t DTYPE_int64_t
+ * ctypedef np.uint32_t DTYPE_uint_t
+ */
+typedef __pyx_t_5numpy_int32_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":14
+ * ctypedef np.float64_t DTYPE_64_t
+ * ctypedef np.int32_t DTYPE_int_t
+ * ctypedef np.int64_t DTYPE_int64_t             # <<<<<<<<<<<<<<
+ * ctypedef np.uint32_t DTYPE_uint_t
+ * ctypedef np.int8_t DTYPE_int8_t
+ */
+typedef __pyx_t_5numpy_int64_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":15
+ * ctypedef np.int32_t DTYPE_int_t
+ * ctypedef np.int64_t DTYPE_int64_t
+ * ctypedef np.uint32_t DTYPE_uint_t             # <<<<<<<<<<<<<<
+ * ctypedef np.int8_t DTYPE_int8_t
+ * cdef double Inf = numpy.inf
+ */
+typedef __pyx_t_5numpy_uint32_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_uint_t;
+
+/* "hifive/libraries/_hic_interactions.pyx":16
+ * ctypedef np.int64_t DTYPE_int64_t
+ * ctypedef np.uint32_t DTYPE_uint_t
+ * ctypedef np.int8_t DTYPE_int8_t             # <<<<<<<<<<<<<<
+ * cdef double Inf = numpy.inf
+ * 
+ */
+typedef __pyx_t_5numpy_int8_t __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int8_t;
+/* Declarations.proto */
+#if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    typedef ::std::complex< float > __pyx_t_float_complex;
+  #else
+    typedef float _Complex __pyx_t_float_complex;
+  #endif
+#else
+    typedef struct { float real, imag; } __pyx_t_float_complex;
+#endif
+static CYTHON_INLINE __pyx_t_float_complex __pyx_t_float_complex_from_parts(float, float);
+
+/* Declarations.proto */
+#if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    typedef ::std::complex< double > __pyx_t_double_complex;
+  #else
+    typedef double _Complex __pyx_t_double_complex;
+  #endif
+#else
+    typedef struct { double real, imag; } __pyx_t_double_complex;
+#endif
+static CYTHON_INLINE __pyx_t_double_complex __pyx_t_double_complex_from_parts(double, double);
+
+
+/*--- Type declarations ---*/
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":814
+ * ctypedef npy_longdouble longdouble_t
+ * 
+ * ctypedef npy_cfloat      cfloat_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_cdouble     cdouble_t
+ * ctypedef npy_clongdouble clongdouble_t
+ */
+typedef npy_cfloat __pyx_t_5numpy_cfloat_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":815
+ * 
+ * ctypedef npy_cfloat      cfloat_t
+ * ctypedef npy_cdouble     cdouble_t             # <<<<<<<<<<<<<<
+ * ctypedef npy_clongdouble clongdouble_t
+ * 
+ */
+typedef npy_cdouble __pyx_t_5numpy_cdouble_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":816
+ * ctypedef npy_cfloat      cfloat_t
+ * ctypedef npy_cdouble     cdouble_t
+ * ctypedef npy_clongdouble clongdouble_t             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef npy_cdouble     complex_t
+ */
+typedef npy_clongdouble __pyx_t_5numpy_clongdouble_t;
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":818
+ * ctypedef npy_clongdouble clongdouble_t
+ * 
+ * ctypedef npy_cdouble     complex_t             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object PyArray_MultiIterNew1(a):
+ */
+typedef npy_cdouble __pyx_t_5numpy_complex_t;
+
+/* --- Runtime support code (head) --- */
+/* Refnanny.proto */
+#ifndef CYTHON_REFNANNY
+  #define CYTHON_REFNANNY 0
+#endif
+#if CYTHON_REFNANNY
+  typedef struct {
+    void (*INCREF)(void*, PyObject*, int);
+    void (*DECREF)(void*, PyObject*, int);
+    void (*GOTREF)(void*, PyObject*, int);
+    void (*GIVEREF)(void*, PyObject*, int);
+    void* (*SetupContext)(const char*, int, const char*);
+    void (*FinishContext)(void**);
+  } __Pyx_RefNannyAPIStruct;
+  static __Pyx_RefNannyAPIStruct *__Pyx_RefNanny = NULL;
+  static __Pyx_RefNannyAPIStruct *__Pyx_RefNannyImportAPI(const char *modname);
+  #define __Pyx_RefNannyDeclarations void *__pyx_refnanny = NULL;
+#ifdef WITH_THREAD
+  #define __Pyx_RefNannySetupContext(name, acquire_gil)\
+          if (acquire_gil) {\
+              PyGILState_STATE __pyx_gilstate_save = PyGILState_Ensure();\
+              __pyx_refnanny = __Pyx_RefNanny->SetupContext((name), __LINE__, __FILE__);\
+              PyGILState_Release(__pyx_gilstate_save);\
+          } else {\
+              __pyx_refnanny = __Pyx_RefNanny->SetupContext((name), __LINE__, __FILE__);\
+          }
+#else
+  #define __Pyx_RefNannySetupContext(name, acquire_gil)\
+          __pyx_refnanny = __Pyx_RefNanny->SetupContext((name), __LINE__, __FILE__)
+#endif
+  #define __Pyx_RefNannyFinishContext()\
+          __Pyx_RefNanny->FinishContext(&__pyx_refnanny)
+  #define __Pyx_INCREF(r)  __Pyx_RefNanny->INCREF(__pyx_refnanny, (PyObject *)(r), __LINE__)
+  #define __Pyx_DECREF(r)  __Pyx_RefNanny->DECREF(__pyx_refnanny, (PyObject *)(r), __LINE__)
+  #define __Pyx_GOTREF(r)  __Pyx_RefNanny->GOTREF(__pyx_refnanny, (PyObject *)(r), __LINE__)
+  #define __Pyx_GIVEREF(r) __Pyx_RefNanny->GIVEREF(__pyx_refnanny, (PyObject *)(r), __LINE__)
+  #define __Pyx_XINCREF(r)  do { if((r) != NULL) {__Pyx_INCREF(r); }} while(0)
+  #define __Pyx_XDECREF(r)  do { if((r) != NULL) {__Pyx_DECREF(r); }} while(0)
+  #define __Pyx_XGOTREF(r)  do { if((r) != NULL) {__Pyx_GOTREF(r); }} while(0)
+  #define __Pyx_XGIVEREF(r) do { if((r) != NULL) {__Pyx_GIVEREF(r);}} while(0)
+#else
+  #define __Pyx_RefNannyDeclarations
+  #define __Pyx_RefNannySetupContext(name, acquire_gil)
+  #define __Pyx_RefNannyFinishContext()
+  #define __Pyx_INCREF(r) Py_INCREF(r)
+  #define __Pyx_DECREF(r) Py_DECREF(r)
+  #define __Pyx_GOTREF(r)
+  #define __Pyx_GIVEREF(r)
+  #define __Pyx_XINCREF(r) Py_XINCREF(r)
+  #define __Pyx_XDECREF(r) Py_XDECREF(r)
+  #define __Pyx_XGOTREF(r)
+  #define __Pyx_XGIVEREF(r)
+#endif
+#define __Pyx_XDECREF_SET(r, v) do {\
+        PyObject *tmp = (PyObject *) r;\
+        r = v; __Pyx_XDECREF(tmp);\
+    } while (0)
+#define __Pyx_DECREF_SET(r, v) do {\
+        PyObject *tmp = (PyObject *) r;\
+        r = v; __Pyx_DECREF(tmp);\
+    } while (0)
+#define __Pyx_CLEAR(r)    do { PyObject* tmp = ((PyObject*)(r)); r = NULL; __Pyx_DECREF(tmp);} while(0)
+#define __Pyx_XCLEAR(r)   do { if((r) != NULL) {PyObject* tmp = ((PyObject*)(r)); r = NULL; __Pyx_DECREF(tmp);}} while(0)
+
+/* PyObjectGetAttrStr.proto */
+#if CYTHON_USE_TYPE_SLOTS
+static CYTHON_INLINE PyObject* __Pyx_PyObject_GetAttrStr(PyObject* obj, PyObject* attr_name);
+#else
+#define __Pyx_PyObject_GetAttrStr(o,n) PyObject_GetAttr(o,n)
+#endif
+
+/* GetBuiltinName.proto */
+static PyObject *__Pyx_GetBuiltinName(PyObject *name);
+
+/* RaiseArgTupleInvalid.proto */
+static void __Pyx_RaiseArgtupleInvalid(const char* func_name, int exact,
+    Py_ssize_t num_min, Py_ssize_t num_max, Py_ssize_t num_found);
+
+/* RaiseDoubleKeywords.proto */
+static void __Pyx_RaiseDoubleKeywordsError(const char* func_name, PyObject* kw_name);
+
+/* ParseKeywords.proto */
+static int __Pyx_ParseOptionalKeywords(PyObject *kwds, PyObject **argnames[],\
+    PyObject *kwds2, PyObject *values[], Py_ssize_t num_pos_args,\
+    const char* function_name);
+
+/* ArgTypeTest.proto */
+#define __Pyx_ArgTypeTest(obj, type, none_allowed, name, exact)\
+    ((likely((Py_TYPE(obj) == type) | (none_allowed && (obj == Py_None)))) ? 1 :\
+        __Pyx__ArgTypeTest(obj, type, name, exact))
+static int __Pyx__ArgTypeTest(PyObject *obj, PyTypeObject *type, const char *name, int exact);
+
+/* IsLittleEndian.proto */
+static CYTHON_INLINE int __Pyx_Is_Little_Endian(void);
+
+/* BufferFormatCheck.proto */
+static const char* __Pyx_BufFmt_CheckString(__Pyx_BufFmt_Context* ctx, const char* ts);
+static void __Pyx_BufFmt_Init(__Pyx_BufFmt_Context* ctx,
+                              __Pyx_BufFmt_StackElem* stack,
+                              __Pyx_TypeInfo* type);
+
+/* BufferGetAndValidate.proto */
+#define __Pyx_GetBufferAndValidate(buf, obj, dtype, flags, nd, cast, stack)\
+    ((obj == Py_None || obj == NULL) ?\
+    (__Pyx_ZeroBuffer(buf), 0) :\
+    __Pyx__GetBufferAndValidate(buf, obj, dtype, flags, nd, cast, stack))
+static int  __Pyx__GetBufferAndValidate(Py_buffer* buf, PyObject* obj,
+    __Pyx_TypeInfo* dtype, int flags, int nd, int cast, __Pyx_BufFmt_StackElem* stack);
+static void __Pyx_ZeroBuffer(Py_buffer* buf);
+static CYTHON_INLINE void __Pyx_SafeReleaseBuffer(Py_buffer* info);
+static Py_ssize_t __Pyx_minusones[] = { -1, -1, -1, -1, -1, -1, -1, -1 };
+static Py_ssize_t __Pyx_zeros[] = { 0, 0, 0, 0, 0, 0, 0, 0 };
+
+#define __Pyx_BufPtrStrided2d(type, buf, i0, s0, i1, s1) (type)((char*)buf + i0 * s0 + i1 * s1)
+/* PyThreadStateGet.proto */
+#if CYTHON_FAST_THREAD_STATE
+#define __Pyx_PyThreadState_declare  PyThreadState *__pyx_tstate;
+#define __Pyx_PyThreadState_assign  __pyx_tstate = __Pyx_PyThreadState_Current;
+#define __Pyx_PyErr_Occurred()  __pyx_tstate->curexc_type
+#else
+#define __Pyx_PyThreadState_declare
+#define __Pyx_PyThreadState_assign
+#define __Pyx_PyErr_Occurred()  PyErr_Occurred()
+#endif
+
+/* PyErrFetchRestore.proto */
+#if CYTHON_FAST_THREAD_STATE
+#define __Pyx_PyErr_Clear() __Pyx_ErrRestore(NULL, NULL, NULL)
+#define __Pyx_ErrRestoreWithState(type, value, tb)  __Pyx_ErrRestoreInState(PyThreadState_GET(), type, value, tb)
+#define __Pyx_ErrFetchWithState(type, value, tb)    __Pyx_ErrFetchInState(PyThreadState_GET(), type, value, tb)
+#define __Pyx_ErrRestore(type, value, tb)  __Pyx_ErrRestoreInState(__pyx_tstate, type, value, tb)
+#define __Pyx_ErrFetch(type, value, tb)    __Pyx_ErrFetchInState(__pyx_tstate, type, value, tb)
+static CYTHON_INLINE void __Pyx_ErrRestoreInState(PyThreadState *tstate, PyObject *type, PyObject *value, PyObject *tb);
+static CYTHON_INLINE void __Pyx_ErrFetchInState(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb);
+#if CYTHON_COMPILING_IN_CPYTHON
+#define __Pyx_PyErr_SetNone(exc) (Py_INCREF(exc), __Pyx_ErrRestore((exc), NULL, NULL))
+#else
+#define __Pyx_PyErr_SetNone(exc) PyErr_SetNone(exc)
+#endif
+#else
+#define __Pyx_PyErr_Clear() PyErr_Clear()
+#define __Pyx_PyErr_SetNone(exc) PyErr_SetNone(exc)
+#define __Pyx_ErrRestoreWithState(type, value, tb)  PyErr_Restore(type, value, tb)
+#define __Pyx_ErrFetchWithState(type, value, tb)  PyErr_Fetch(type, value, tb)
+#define __Pyx_ErrRestoreInState(tstate, type, value, tb)  PyErr_Restore(type, value, tb)
+#define __Pyx_ErrFetchInState(tstate, type, value, tb)  PyErr_Fetch(type, value, tb)
+#define __Pyx_ErrRestore(type, value, tb)  PyErr_Restore(type, value, tb)
+#define __Pyx_ErrFetch(type, value, tb)  PyErr_Fetch(type, value, tb)
+#endif
+
+#define __Pyx_BufPtrStrided1d(type, buf, i0, s0) (type)((char*)buf + i0 * s0)
+/* PyDictVersioning.proto */
+#if CYTHON_USE_DICT_VERSIONS && CYTHON_USE_TYPE_SLOTS
+#define __PYX_DICT_VERSION_INIT  ((PY_UINT64_T) -1)
+#define __PYX_GET_DICT_VERSION(dict)  (((PyDictObject*)(dict))->ma_version_tag)
+#define __PYX_UPDATE_DICT_CACHE(dict, value, cache_var, version_var)\
+    (version_var) = __PYX_GET_DICT_VERSION(dict);\
+    (cache_var) = (value);
+#define __PYX_PY_DICT_LOOKUP_IF_MODIFIED(VAR, DICT, LOOKUP) {\
+    static PY_UINT64_T __pyx_dict_version = 0;\
+    static PyObject *__pyx_dict_cached_value = NULL;\
+    if (likely(__PYX_GET_DICT_VERSION(DICT) == __pyx_dict_version)) {\
+        (VAR) = __pyx_dict_cached_value;\
+    } else {\
+        (VAR) = __pyx_dict_cached_value = (LOOKUP);\
+        __pyx_dict_version = __PYX_GET_DICT_VERSION(DICT);\
+    }\
+}
+static CYTHON_INLINE PY_UINT64_T __Pyx_get_tp_dict_version(PyObject *obj);
+static CYTHON_INLINE PY_UINT64_T __Pyx_get_object_dict_version(PyObject *obj);
+static CYTHON_INLINE int __Pyx_object_dict_version_matches(PyObject* obj, PY_UINT64_T tp_dict_version, PY_UINT64_T obj_dict_version);
+#else
+#define __PYX_GET_DICT_VERSION(dict)  (0)
+#define __PYX_UPDATE_DICT_CACHE(dict, value, cache_var, version_var)
+#define __PYX_PY_DICT_LOOKUP_IF_MODIFIED(VAR, DICT, LOOKUP)  (VAR) = (LOOKUP);
+#endif
+
+/* GetModuleGlobalName.proto */
+#if CYTHON_USE_DICT_VERSIONS
+#define __Pyx_GetModuleGlobalName(var, name)  do {\
+    static PY_UINT64_T __pyx_dict_version = 0;\
+    static PyObject *__pyx_dict_cached_value = NULL;\
+    (var) = (likely(__pyx_dict_version == __PYX_GET_DICT_VERSION(__pyx_d))) ?\
+        (likely(__pyx_dict_cached_value) ? __Pyx_NewRef(__pyx_dict_cached_value) : __Pyx_GetBuiltinName(name)) :\
+        __Pyx__GetModuleGlobalName(name, &__pyx_dict_version, &__pyx_dict_cached_value);\
+} while(0)
+#define __Pyx_GetModuleGlobalNameUncached(var, name)  do {\
+    PY_UINT64_T __pyx_dict_version;\
+    PyObject *__pyx_dict_cached_value;\
+    (var) = __Pyx__GetModuleGlobalName(name, &__pyx_dict_version, &__pyx_dict_cached_value);\
+} while(0)
+static PyObject *__Pyx__GetModuleGlobalName(PyObject *name, PY_UINT64_T *dict_version, PyObject **dict_cached_value);
+#else
+#define __Pyx_GetModuleGlobalName(var, name)  (var) = __Pyx__GetModuleGlobalName(name)
+#define __Pyx_GetModuleGlobalNameUncached(var, name)  (var) = __Pyx__GetModuleGlobalName(name)
+static CYTHON_INLINE PyObject *__Pyx__GetModuleGlobalName(PyObject *name);
+#endif
+
+/* PyObjectCall.proto */
+#if CYTHON_COMPILING_IN_CPYTHON
+static CYTHON_INLINE PyObject* __Pyx_PyObject_Call(PyObject *func, PyObject *arg, PyObject *kw);
+#else
+#define __Pyx_PyObject_Call(func, arg, kw) PyObject_Call(func, arg, kw)
+#endif
+
+/* ExtTypeTest.proto */
+static CYTHON_INLINE int __Pyx_TypeTest(PyObject *obj, PyTypeObject *type);
+
+/* DivInt[PY_LONG_LONG].proto */
+static CYTHON_INLINE PY_LONG_LONG __Pyx_div_PY_LONG_LONG(PY_LONG_LONG, PY_LONG_LONG);
+
+/* PyCFunctionFastCall.proto */
+#if CYTHON_FAST_PYCCALL
+static CYTHON_INLINE PyObject *__Pyx_PyCFunction_FastCall(PyObject *func, PyObject **args, Py_ssize_t nargs);
+#else
+#define __Pyx_PyCFunction_FastCall(func, args, nargs)  (assert(0), NULL)
+#endif
+
+/* PyFunctionFastCall.proto */
+#if CYTHON_FAST_PYCALL
+#define __Pyx_PyFunction_FastCall(func, args, nargs)\
+    __Pyx_PyFunction_FastCallDict((func), (args), (nargs), NULL)
+#if 1 || PY_VERSION_HEX < 0x030600B1
+static PyObject *__Pyx_PyFunction_FastCallDict(PyObject *func, PyObject **args, Py_ssize_t nargs, PyObject *kwargs);
+#else
+#define __Pyx_PyFunction_FastCallDict(func, args, nargs, kwargs) _PyFunction_FastCallDict(func, args, nargs, kwargs)
+#endif
+#define __Pyx_BUILD_ASSERT_EXPR(cond)\
+    (sizeof(char [1 - 2*!(cond)]) - 1)
+#ifndef Py_MEMBER_SIZE
+#define Py_MEMBER_SIZE(type, member) sizeof(((type *)0)->member)
+#endif
+#if CYTHON_FAST_PYCALL
+  static size_t __pyx_pyframe_localsplus_offset = 0;
+  #include "frameobject.h"
+#if PY_VERSION_HEX >= 0x030b00a6
+  #ifndef Py_BUILD_CORE
+    #define Py_BUILD_CORE 1
+  #endif
+  #include "internal/pycore_frame.h"
+#endif
+  #define __Pxy_PyFrame_Initialize_Offsets()\
+    ((void)__Pyx_BUILD_ASSERT_EXPR(sizeof(PyFrameObject) == offsetof(PyFrameObject, f_localsplus) + Py_MEMBER_SIZE(PyFrameObject, f_localsplus)),\
+     (void)(__pyx_pyframe_localsplus_offset = ((size_t)PyFrame_Type.tp_basicsize) - Py_MEMBER_SIZE(PyFrameObject, f_localsplus)))
+  #define __Pyx_PyFrame_GetLocalsplus(frame)\
+    (assert(__pyx_pyframe_localsplus_offset), (PyObject **)(((char *)(frame)) + __pyx_pyframe_localsplus_offset))
+#endif // CYTHON_FAST_PYCALL
+#endif
+
+/* PyObjectCall2Args.proto */
+static CYTHON_UNUSED PyObject* __Pyx_PyObject_Call2Args(PyObject* function, PyObject* arg1, PyObject* arg2);
+
+/* PyObjectCallMethO.proto */
+#if CYTHON_COMPILING_IN_CPYTHON
+static CYTHON_INLINE PyObject* __Pyx_PyObject_CallMethO(PyObject *func, PyObject *arg);
+#endif
+
+/* PyObjectCallOneArg.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyObject_CallOneArg(PyObject *func, PyObject *arg);
+
+/* BufferFallbackError.proto */
+static void __Pyx_RaiseBufferFallbackError(void);
+
+/* RaiseException.proto */
+static void __Pyx_Raise(PyObject *type, PyObject *value, PyObject *tb, PyObject *cause);
+
+/* DictGetItem.proto */
+#if PY_MAJOR_VERSION >= 3 && !CYTHON_COMPILING_IN_PYPY
+static PyObject *__Pyx_PyDict_GetItem(PyObject *d, PyObject* key);
+#define __Pyx_PyObject_Dict_GetItem(obj, name)\
+    (likely(PyDict_CheckExact(obj)) ?\
+     __Pyx_PyDict_GetItem(obj, name) : PyObject_GetItem(obj, name))
+#else
+#define __Pyx_PyDict_GetItem(d, key) PyObject_GetItem(d, key)
+#define __Pyx_PyObject_Dict_GetItem(obj, name)  PyObject_GetItem(obj, name)
+#endif
+
+/* RaiseTooManyValuesToUnpack.proto */
+static CYTHON_INLINE void __Pyx_RaiseTooManyValuesError(Py_ssize_t expected);
+
+/* RaiseNeedMoreValuesToUnpack.proto */
+static CYTHON_INLINE void __Pyx_RaiseNeedMoreValuesError(Py_ssize_t index);
+
+/* RaiseNoneIterError.proto */
+static CYTHON_INLINE void __Pyx_RaiseNoneNotIterableError(void);
+
+/* GetTopmostException.proto */
+#if CYTHON_USE_EXC_INFO_STACK
+static _PyErr_StackItem * __Pyx_PyErr_GetTopmostException(PyThreadState *tstate);
+#endif
+
+/* SaveResetException.proto */
+#if CYTHON_FAST_THREAD_STATE
+#define __Pyx_ExceptionSave(type, value, tb)  __Pyx__ExceptionSave(__pyx_tstate, type, value, tb)
+static CYTHON_INLINE void __Pyx__ExceptionSave(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb);
+#define __Pyx_ExceptionReset(type, value, tb)  __Pyx__ExceptionReset(__pyx_tstate, type, value, tb)
+static CYTHON_INLINE void __Pyx__ExceptionReset(PyThreadState *tstate, PyObject *type, PyObject *value, PyObject *tb);
+#else
+#define __Pyx_ExceptionSave(type, value, tb)   PyErr_GetExcInfo(type, value, tb)
+#define __Pyx_ExceptionReset(type, value, tb)  PyErr_SetExcInfo(type, value, tb)
+#endif
+
+/* PyErrExceptionMatches.proto */
+#if CYTHON_FAST_THREAD_STATE
+#define __Pyx_PyErr_ExceptionMatches(err) __Pyx_PyErr_ExceptionMatchesInState(__pyx_tstate, err)
+static CYTHON_INLINE int __Pyx_PyErr_ExceptionMatchesInState(PyThreadState* tstate, PyObject* err);
+#else
+#define __Pyx_PyErr_ExceptionMatches(err)  PyErr_ExceptionMatches(err)
+#endif
+
+/* GetException.proto */
+#if CYTHON_FAST_THREAD_STATE
+#define __Pyx_GetException(type, value, tb)  __Pyx__GetException(__pyx_tstate, type, value, tb)
+static int __Pyx__GetException(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb);
+#else
+static int __Pyx_GetException(PyObject **type, PyObject **value, PyObject **tb);
+#endif
+
+/* TypeImport.proto */
+#ifndef __PYX_HAVE_RT_ImportType_proto_0_29_37
+#define __PYX_HAVE_RT_ImportType_proto_0_29_37
+#if __STDC_VERSION__ >= 201112L
+#include <stdalign.h>
+#endif
+#if __STDC_VERSION__ >= 201112L || __cplusplus >= 201103L
+#define __PYX_GET_STRUCT_ALIGNMENT_0_29_37(s) alignof(s)
+#else
+#define __PYX_GET_STRUCT_ALIGNMENT_0_29_37(s) sizeof(void*)
+#endif
+enum __Pyx_ImportType_CheckSize_0_29_37 {
+   __Pyx_ImportType_CheckSize_Error_0_29_37 = 0,
+   __Pyx_ImportType_CheckSize_Warn_0_29_37 = 1,
+   __Pyx_ImportType_CheckSize_Ignore_0_29_37 = 2
+};
+static PyTypeObject *__Pyx_ImportType_0_29_37(PyObject* module, const char *module_name, const char *class_name, size_t size, size_t alignment, enum __Pyx_ImportType_CheckSize_0_29_37 check_size);
+#endif
+
+/* Import.proto */
+static PyObject *__Pyx_Import(PyObject *name, PyObject *from_list, int level);
+
+/* CLineInTraceback.proto */
+#ifdef CYTHON_CLINE_IN_TRACEBACK
+#define __Pyx_CLineForTraceback(tstate, c_line)  (((CYTHON_CLINE_IN_TRACEBACK)) ? c_line : 0)
+#else
+static int __Pyx_CLineForTraceback(PyThreadState *tstate, int c_line);
+#endif
+
+/* CodeObjectCache.proto */
+typedef struct {
+    PyCodeObject* code_object;
+    int code_line;
+} __Pyx_CodeObjectCacheEntry;
+struct __Pyx_CodeObjectCache {
+    int count;
+    int max_count;
+    __Pyx_CodeObjectCacheEntry* entries;
+};
+static struct __Pyx_CodeObjectCache __pyx_code_cache = {0,0,NULL};
+static int __pyx_bisect_code_objects(__Pyx_CodeObjectCacheEntry* entries, int count, int code_line);
+static PyCodeObject *__pyx_find_code_object(int code_line);
+static void __pyx_insert_code_object(int code_line, PyCodeObject* code_object);
+
+/* AddTraceback.proto */
+static void __Pyx_AddTraceback(const char *funcname, int c_line,
+                               int py_line, const char *filename);
+
+/* BufferStructDeclare.proto */
+typedef struct {
+  Py_ssize_t shape, strides, suboffsets;
+} __Pyx_Buf_DimInfo;
+typedef struct {
+  size_t refcount;
+  Py_buffer pybuffer;
+} __Pyx_Buffer;
+typedef struct {
+  __Pyx_Buffer *rcbuffer;
+  char *data;
+  __Pyx_Buf_DimInfo diminfo[8];
+} __Pyx_LocalBuf_ND;
+
+#if PY_MAJOR_VERSION < 3
+    static int __Pyx_GetBuffer(PyObject *obj, Py_buffer *view, int flags);
+    static void __Pyx_ReleaseBuffer(Py_buffer *view);
+#else
+    #define __Pyx_GetBuffer PyObject_GetBuffer
+    #define __Pyx_ReleaseBuffer PyBuffer_Release
+#endif
+
+
+/* GCCDiagnostics.proto */
+#if defined(__GNUC__) && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 6))
+#define __Pyx_HAS_GCC_DIAGNOSTIC
+#endif
+
+/* RealImag.proto */
+#if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    #define __Pyx_CREAL(z) ((z).real())
+    #define __Pyx_CIMAG(z) ((z).imag())
+  #else
+    #define __Pyx_CREAL(z) (__real__(z))
+    #define __Pyx_CIMAG(z) (__imag__(z))
+  #endif
+#else
+    #define __Pyx_CREAL(z) ((z).real)
+    #define __Pyx_CIMAG(z) ((z).imag)
+#endif
+#if defined(__cplusplus) && CYTHON_CCOMPLEX\
+        && (defined(_WIN32) || defined(__clang__) || (defined(__GNUC__) && (__GNUC__ >= 5 || __GNUC__ == 4 && __GNUC_MINOR__ >= 4 )) || __cplusplus >= 201103)
+    #define __Pyx_SET_CREAL(z,x) ((z).real(x))
+    #define __Pyx_SET_CIMAG(z,y) ((z).imag(y))
+#else
+    #define __Pyx_SET_CREAL(z,x) __Pyx_CREAL(z) = (x)
+    #define __Pyx_SET_CIMAG(z,y) __Pyx_CIMAG(z) = (y)
+#endif
+
+/* Arithmetic.proto */
+#if CYTHON_CCOMPLEX
+    #define __Pyx_c_eq_float(a, b)   ((a)==(b))
+    #define __Pyx_c_sum_float(a, b)  ((a)+(b))
+    #define __Pyx_c_diff_float(a, b) ((a)-(b))
+    #define __Pyx_c_prod_float(a, b) ((a)*(b))
+    #define __Pyx_c_quot_float(a, b) ((a)/(b))
+    #define __Pyx_c_neg_float(a)     (-(a))
+  #ifdef __cplusplus
+    #define __Pyx_c_is_zero_float(z) ((z)==(float)0)
+    #define __Pyx_c_conj_float(z)    (::std::conj(z))
+    #if 1
+        #define __Pyx_c_abs_float(z)     (::std::abs(z))
+        #define __Pyx_c_pow_float(a, b)  (::std::pow(a, b))
+    #endif
+  #else
+    #define __Pyx_c_is_zero_float(z) ((z)==0)
+    #define __Pyx_c_conj_float(z)    (conjf(z))
+    #if 1
+        #define __Pyx_c_abs_float(z)     (cabsf(z))
+        #define __Pyx_c_pow_float(a, b)  (cpowf(a, b))
+    #endif
+ #endif
+#else
+    static CYTHON_INLINE int __Pyx_c_eq_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_sum_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_diff_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_prod_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_quot_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_neg_float(__pyx_t_float_complex);
+    static CYTHON_INLINE int __Pyx_c_is_zero_float(__pyx_t_float_complex);
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_conj_float(__pyx_t_float_complex);
+    #if 1
+        static CYTHON_INLINE float __Pyx_c_abs_float(__pyx_t_float_complex);
+        static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_pow_float(__pyx_t_float_complex, __pyx_t_float_complex);
+    #endif
+#endif
+
+/* Arithmetic.proto */
+#if CYTHON_CCOMPLEX
+    #define __Pyx_c_eq_double(a, b)   ((a)==(b))
+    #define __Pyx_c_sum_double(a, b)  ((a)+(b))
+    #define __Pyx_c_diff_double(a, b) ((a)-(b))
+    #define __Pyx_c_prod_double(a, b) ((a)*(b))
+    #define __Pyx_c_quot_double(a, b) ((a)/(b))
+    #define __Pyx_c_neg_double(a)     (-(a))
+  #ifdef __cplusplus
+    #define __Pyx_c_is_zero_double(z) ((z)==(double)0)
+    #define __Pyx_c_conj_double(z)    (::std::conj(z))
+    #if 1
+        #define __Pyx_c_abs_double(z)     (::std::abs(z))
+        #define __Pyx_c_pow_double(a, b)  (::std::pow(a, b))
+    #endif
+  #else
+    #define __Pyx_c_is_zero_double(z) ((z)==0)
+    #define __Pyx_c_conj_double(z)    (conj(z))
+    #if 1
+        #define __Pyx_c_abs_double(z)     (cabs(z))
+        #define __Pyx_c_pow_double(a, b)  (cpow(a, b))
+    #endif
+ #endif
+#else
+    static CYTHON_INLINE int __Pyx_c_eq_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_sum_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_diff_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_prod_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_quot_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_neg_double(__pyx_t_double_complex);
+    static CYTHON_INLINE int __Pyx_c_is_zero_double(__pyx_t_double_complex);
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_conj_double(__pyx_t_double_complex);
+    #if 1
+        static CYTHON_INLINE double __Pyx_c_abs_double(__pyx_t_double_complex);
+        static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_pow_double(__pyx_t_double_complex, __pyx_t_double_complex);
+    #endif
+#endif
+
+/* CIntFromPy.proto */
+static CYTHON_INLINE int __Pyx_PyInt_As_int(PyObject *);
+
+/* CIntFromPy.proto */
+static CYTHON_INLINE PY_LONG_LONG __Pyx_PyInt_As_PY_LONG_LONG(PyObject *);
+
+/* CIntToPy.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyInt_From_int(int value);
+
+/* CIntToPy.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyInt_From_PY_LONG_LONG(PY_LONG_LONG value);
+
+/* CIntToPy.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyInt_From_npy_int64(npy_int64 value);
+
+/* CIntToPy.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyInt_From_enum__NPY_TYPES(enum NPY_TYPES value);
+
+/* CIntToPy.proto */
+static CYTHON_INLINE PyObject* __Pyx_PyInt_From_long(long value);
+
+/* CIntFromPy.proto */
+static CYTHON_INLINE long __Pyx_PyInt_As_long(PyObject *);
+
+/* FastTypeChecks.proto */
+#if CYTHON_COMPILING_IN_CPYTHON
+#define __Pyx_TypeCheck(obj, type) __Pyx_IsSubtype(Py_TYPE(obj), (PyTypeObject *)type)
+static CYTHON_INLINE int __Pyx_IsSubtype(PyTypeObject *a, PyTypeObject *b);
+static CYTHON_INLINE int __Pyx_PyErr_GivenExceptionMatches(PyObject *err, PyObject *type);
+static CYTHON_INLINE int __Pyx_PyErr_GivenExceptionMatches2(PyObject *err, PyObject *type1, PyObject *type2);
+#else
+#define __Pyx_TypeCheck(obj, type) PyObject_TypeCheck(obj, (PyTypeObject *)type)
+#define __Pyx_PyErr_GivenExceptionMatches(err, type) PyErr_GivenExceptionMatches(err, type)
+#define __Pyx_PyErr_GivenExceptionMatches2(err, type1, type2) (PyErr_GivenExceptionMatches(err, type1) || PyErr_GivenExceptionMatches(err, type2))
+#endif
+#define __Pyx_PyException_Check(obj) __Pyx_TypeCheck(obj, PyExc_Exception)
+
+/* CheckBinaryVersion.proto */
+static int __Pyx_check_binary_version(void);
+
+/* InitStrings.proto */
+static int __Pyx_InitStrings(__Pyx_StringTabEntry *t);
+
+
+/* Module declarations from 'cython' */
+
+/* Module declarations from 'cpython.buffer' */
+
+/* Module declarations from 'libc.string' */
+
+/* Module declarations from 'libc.stdio' */
+
+/* Module declarations from '__builtin__' */
+
+/* Module declarations from 'cpython.type' */
+static PyTypeObject *__pyx_ptype_7cpython_4type_type = 0;
+
+/* Module declarations from 'cpython' */
+
+/* Module declarations from 'cpython.object' */
+
+/* Module declarations from 'cpython.ref' */
+
+/* Module declarations from 'cpython.mem' */
+
+/* Module declarations from 'numpy' */
+
+/* Module declarations from 'numpy' */
+static PyTypeObject *__pyx_ptype_5numpy_dtype = 0;
+static PyTypeObject *__pyx_ptype_5numpy_flatiter = 0;
+static PyTypeObject *__pyx_ptype_5numpy_broadcast = 0;
+static PyTypeObject *__pyx_ptype_5numpy_ndarray = 0;
+static PyTypeObject *__pyx_ptype_5numpy_ufunc = 0;
+static CYTHON_INLINE char *__pyx_f_5numpy__util_dtypestring(PyArray_Descr *, char *, char *, int *); /*proto*/
+
+/* Module declarations from 'hifive.libraries._hic_interactions' */
+static double __pyx_v_6hifive_9libraries_17_hic_interactions_Inf;
+static CYTHON_INLINE PY_LONG_LONG __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, PY_LONG_LONG, PY_LONG_LONG, PY_LONG_LONG); /*proto*/
+static __Pyx_TypeInfo __Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t = { "DTYPE_int_t", NULL, sizeof(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t), { 0 }, 0, IS_UNSIGNED(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t) ? 'U' : 'I', IS_UNSIGNED(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t), 0 };
+static __Pyx_TypeInfo __Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t = { "DTYPE_int64_t", NULL, sizeof(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t), { 0 }, 0, IS_UNSIGNED(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t) ? 'U' : 'I', IS_UNSIGNED(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t), 0 };
+static __Pyx_TypeInfo __Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t = { "DTYPE_t", NULL, sizeof(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t), { 0 }, 0, 'R', 0, 0 };
+static __Pyx_TypeInfo __Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t = { "DTYPE_64_t", NULL, sizeof(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t), { 0 }, 0, 'R', 0, 0 };
+#define __Pyx_MODULE_NAME "hifive.libraries._hic_interactions"
+extern int __pyx_module_is_main_hifive__libraries___hic_interactions;
+int __pyx_module_is_main_hifive__libraries___hic_interactions = 0;
+
+/* Implementation of 'hifive.libraries._hic_interactions' */
+static PyObject *__pyx_builtin_range;
+static PyObject *__pyx_builtin_ValueError;
+static PyObject *__pyx_builtin_RuntimeError;
+static PyObject *__pyx_builtin_ImportError;
+static const char __pyx_k_h[] = "h";
+static const char __pyx_k_i[] = "i";
+static const char __pyx_k_j[] = "j";
+static const char __pyx_k_k[] = "k";
+static const char __pyx_k_m1[] = "m1";
+static const char __pyx_k_m2[] = "m2";
+static const char __pyx_k_inf[] = "inf";
+static const char __pyx_k_pos[] = "pos";
+static const char __pyx_k_data[] = "data";
+static const char __pyx_k_fill[] = "fill";
+static const char __pyx_k_main[] = "__main__";
+static const char __pyx_k_mids[] = "mids";
+static const char __pyx_k_name[] = "__name__";
+static const char __pyx_k_stop[] = "stop";
+static const char __pyx_k_sums[] = "sums";
+static const char __pyx_k_test[] = "__test__";
+static const char __pyx_k_zpos[] = "zpos";
+static const char __pyx_k_count[] = "count";
+static const char __pyx_k_dtype[] = "dtype";
+static const char __pyx_k_fend1[] = "fend1";
+static const char __pyx_k_fend2[] = "fend2";
+static const char __pyx_k_int32[] = "int32";
+static const char __pyx_k_int64[] = "int64";
+static const char __pyx_k_numpy[] = "numpy";
+static const char __pyx_k_nzpos[] = "nzpos";
+static const char __pyx_k_range[] = "range";
+static const char __pyx_k_start[] = "start";
+static const char __pyx_k_total[] = "total";
+static const char __pyx_k_valid[] = "valid";
+static const char __pyx_k_zeros[] = "zeros";
+static const char __pyx_k_binned[] = "binned";
+static const char __pyx_k_counts[] = "counts";
+static const char __pyx_k_cumsum[] = "cumsum";
+static const char __pyx_k_filter[] = "filter";
+static const char __pyx_k_import[] = "__import__";
+static const char __pyx_k_maxbin[] = "maxbin";
+static const char __pyx_k_num_nz[] = "num_nz";
+static const char __pyx_k_ranges[] = "ranges";
+static const char __pyx_k_chr_max[] = "chr_max";
+static const char __pyx_k_chrints[] = "chrints";
+static const char __pyx_k_mapping[] = "mapping";
+static const char __pyx_k_removed[] = "removed";
+static const char __pyx_k_weights[] = "weights";
+static const char __pyx_k_coverage[] = "coverage";
+static const char __pyx_k_indices0[] = "indices0";
+static const char __pyx_k_indices1[] = "indices1";
+static const char __pyx_k_max_fend[] = "max_fend";
+static const char __pyx_k_mids_ptr[] = "mids_ptr";
+static const char __pyx_k_min_fend[] = "min_fend";
+static const char __pyx_k_num_bins[] = "num_bins";
+static const char __pyx_k_num_data[] = "num_data";
+static const char __pyx_k_all_total[] = "all_total";
+static const char __pyx_k_binbounds[] = "binbounds";
+static const char __pyx_k_chr_total[] = "chr_total";
+static const char __pyx_k_neighbors[] = "neighbors";
+static const char __pyx_k_num_fends[] = "num_fends";
+static const char __pyx_k_positions[] = "positions";
+static const char __pyx_k_startfend[] = "startfend";
+static const char __pyx_k_stop_fend[] = "stop_fend";
+static const char __pyx_k_zindices0[] = "zindices0";
+static const char __pyx_k_zindices1[] = "zindices1";
+static const char __pyx_k_ValueError[] = "ValueError";
+static const char __pyx_k_num_chroms[] = "num_chroms";
+static const char __pyx_k_nzindices0[] = "nzindices0";
+static const char __pyx_k_nzindices1[] = "nzindices1";
+static const char __pyx_k_start_fend[] = "start_fend";
+static const char __pyx_k_valid_sums[] = "valid_sums";
+static const char __pyx_k_ImportError[] = "ImportError";
+static const char __pyx_k_chr_indices[] = "chr_indices";
+static const char __pyx_k_chromosomes[] = "chromosomes";
+static const char __pyx_k_int_weights[] = "int_weights";
+static const char __pyx_k_maxdistance[] = "maxdistance";
+static const char __pyx_k_mincoverage[] = "mincoverage";
+static const char __pyx_k_mindistance[] = "mindistance";
+static const char __pyx_k_num_indices[] = "num_indices";
+static const char __pyx_k_num_removed[] = "num_removed";
+static const char __pyx_k_total_fends[] = "total_fends";
+static const char __pyx_k_useread_int[] = "useread_int";
+static const char __pyx_k_RuntimeError[] = "RuntimeError";
+static const char __pyx_k_data_indices[] = "data_indices";
+static const char __pyx_k_find_max_bin[] = "find_max_bin";
+static const char __pyx_k_interactions[] = "interactions";
+static const char __pyx_k_find_max_fend[] = "find_max_fend";
+static const char __pyx_k_find_min_fend[] = "find_min_fend";
+static const char __pyx_k_max_num_fends[] = "max_num_fends";
+static const char __pyx_k_find_fend_ranges[] = "find_fend_ranges";
+static const char __pyx_k_neighbor_indices[] = "neighbor_indices";
+static const char __pyx_k_ascontiguousarray[] = "ascontiguousarray";
+static const char __pyx_k_cline_in_traceback[] = "cline_in_traceback";
+static const char __pyx_k_find_fend_coverage[] = "find_fend_coverage";
+static const char __pyx_k_sum_weighted_indices[] = "sum_weighted_indices";
+static const char __pyx_k_filter_fend_neighbors[] = "filter_fend_neighbors";
+static const char __pyx_k_find_nonzeros_in_range[] = "find_nonzeros_in_range";
+static const char __pyx_k_find_zero_node_indices[] = "find_zero_node_indices";
+static const char __pyx_k_find_cis_fend_neighbors[] = "find_cis_fend_neighbors";
+static const char __pyx_k_find_nonzero_node_indices[] = "find_nonzero_node_indices";
+static const char __pyx_k_find_trans_fend_neighbors[] = "find_trans_fend_neighbors";
+static const char __pyx_k_ndarray_is_not_C_contiguous[] = "ndarray is not C contiguous";
+static const char __pyx_k_numpy_core_multiarray_failed_to[] = "numpy.core.multiarray failed to import";
+static const char __pyx_k_unknown_dtype_code_in_numpy_pxd[] = "unknown dtype code in numpy.pxd (%d)";
+static const char __pyx_k_Format_string_allocated_too_shor[] = "Format string allocated too short, see comment in numpy.pxd";
+static const char __pyx_k_Non_native_byte_order_not_suppor[] = "Non-native byte order not supported";
+static const char __pyx_k_These_functions_provide_increase[] = "These functions provide increased speed in handling functions dealing with finding valid\ninteractions and interaction ranges necessary for supporting hic analysis using HiFive.\n";
+static const char __pyx_k_find_distancebound_possible_inte[] = "find_distancebound_possible_interactions";
+static const char __pyx_k_hifive_libraries__hic_interactio[] = "hifive/libraries/_hic_interactions.pyx";
+static const char __pyx_k_ndarray_is_not_Fortran_contiguou[] = "ndarray is not Fortran contiguous";
+static const char __pyx_k_numpy_core_umath_failed_to_impor[] = "numpy.core.umath failed to import";
+static const char __pyx_k_Format_string_allocated_too_shor_2[] = "Format string allocated too short.";
+static const char __pyx_k_hifive_libraries__hic_interactio_2[] = "hifive.libraries._hic_interactions";
+static PyObject *__pyx_kp_u_Format_string_allocated_too_shor;
+static PyObject *__pyx_kp_u_Format_string_allocated_too_shor_2;
+static PyObject *__pyx_n_s_ImportError;
+static PyObject *__pyx_kp_u_Non_native_byte_order_not_suppor;
+static PyObject *__pyx_n_s_RuntimeError;
+static PyObject *__pyx_n_s_ValueError;
+static PyObject *__pyx_n_s_all_total;
+static PyObject *__pyx_n_s_ascontiguousarray;
+static PyObject *__pyx_n_s_binbounds;
+static PyObject *__pyx_n_s_binned;
+static PyObject *__pyx_n_s_chr_indices;
+static PyObject *__pyx_n_s_chr_max;
+static PyObject *__pyx_n_s_chr_total;
+static PyObject *__pyx_n_s_chrints;
+static PyObject *__pyx_n_s_chromosomes;
+static PyObject *__pyx_n_s_cline_in_traceback;
+static PyObject *__pyx_n_s_count;
+static PyObject *__pyx_n_s_counts;
+static PyObject *__pyx_n_s_coverage;
+static PyObject *__pyx_n_s_cumsum;
+static PyObject *__pyx_n_s_data;
+static PyObject *__pyx_n_s_data_indices;
+static PyObject *__pyx_n_s_dtype;
+static PyObject *__pyx_n_s_fend1;
+static PyObject *__pyx_n_s_fend2;
+static PyObject *__pyx_n_s_fill;
+static PyObject *__pyx_n_s_filter;
+static PyObject *__pyx_n_s_filter_fend_neighbors;
+static PyObject *__pyx_n_s_find_cis_fend_neighbors;
+static PyObject *__pyx_n_s_find_distancebound_possible_inte;
+static PyObject *__pyx_n_s_find_fend_coverage;
+static PyObject *__pyx_n_s_find_fend_ranges;
+static PyObject *__pyx_n_s_find_max_bin;
+static PyObject *__pyx_n_s_find_max_fend;
+static PyObject *__pyx_n_s_find_min_fend;
+static PyObject *__pyx_n_s_find_nonzero_node_indices;
+static PyObject *__pyx_n_s_find_nonzeros_in_range;
+static PyObject *__pyx_n_s_find_trans_fend_neighbors;
+static PyObject *__pyx_n_s_find_zero_node_indices;
+static PyObject *__pyx_n_s_h;
+static PyObject *__pyx_kp_s_hifive_libraries__hic_interactio;
+static PyObject *__pyx_n_s_hifive_libraries__hic_interactio_2;
+static PyObject *__pyx_n_s_i;
+static PyObject *__pyx_n_s_import;
+static PyObject *__pyx_n_s_indices0;
+static PyObject *__pyx_n_s_indices1;
+static PyObject *__pyx_n_s_inf;
+static PyObject *__pyx_n_s_int32;
+static PyObject *__pyx_n_s_int64;
+static PyObject *__pyx_n_s_int_weights;
+static PyObject *__pyx_n_s_interactions;
+static PyObject *__pyx_n_s_j;
+static PyObject *__pyx_n_s_k;
+static PyObject *__pyx_n_s_m1;
+static PyObject *__pyx_n_s_m2;
+static PyObject *__pyx_n_s_main;
+static PyObject *__pyx_n_s_mapping;
+static PyObject *__pyx_n_s_max_fend;
+static PyObject *__pyx_n_s_max_num_fends;
+static PyObject *__pyx_n_s_maxbin;
+static PyObject *__pyx_n_s_maxdistance;
+static PyObject *__pyx_n_s_mids;
+static PyObject *__pyx_n_s_mids_ptr;
+static PyObject *__pyx_n_s_min_fend;
+static PyObject *__pyx_n_s_mincoverage;
+static PyObject *__pyx_n_s_mindistance;
+static PyObject *__pyx_n_s_name;
+static PyObject *__pyx_kp_u_ndarray_is_not_C_contiguous;
+static PyObject *__pyx_kp_u_ndarray_is_not_Fortran_contiguou;
+static PyObject *__pyx_n_s_neighbor_indices;
+static PyObject *__pyx_n_s_neighbors;
+static PyObject *__pyx_n_s_num_bins;
+static PyObject *__pyx_n_s_num_chroms;
+static PyObject *__pyx_n_s_num_data;
+static PyObject *__pyx_n_s_num_fends;
+static PyObject *__pyx_n_s_num_indices;
+static PyObject *__pyx_n_s_num_nz;
+static PyObject *__pyx_n_s_num_removed;
+static PyObject *__pyx_n_s_numpy;
+static PyObject *__pyx_kp_s_numpy_core_multiarray_failed_to;
+static PyObject *__pyx_kp_s_numpy_core_umath_failed_to_impor;
+static PyObject *__pyx_n_s_nzindices0;
+static PyObject *__pyx_n_s_nzindices1;
+static PyObject *__pyx_n_s_nzpos;
+static PyObject *__pyx_n_s_pos;
+static PyObject *__pyx_n_s_positions;
+static PyObject *__pyx_n_s_range;
+static PyObject *__pyx_n_s_ranges;
+static PyObject *__pyx_n_s_removed;
+static PyObject *__pyx_n_s_start;
+static PyObject *__pyx_n_s_start_fend;
+static PyObject *__pyx_n_s_startfend;
+static PyObject *__pyx_n_s_stop;
+static PyObject *__pyx_n_s_stop_fend;
+static PyObject *__pyx_n_s_sum_weighted_indices;
+static PyObject *__pyx_n_s_sums;
+static PyObject *__pyx_n_s_test;
+static PyObject *__pyx_n_s_total;
+static PyObject *__pyx_n_s_total_fends;
+static PyObject *__pyx_kp_u_unknown_dtype_code_in_numpy_pxd;
+static PyObject *__pyx_n_s_useread_int;
+static PyObject *__pyx_n_s_valid;
+static PyObject *__pyx_n_s_valid_sums;
+static PyObject *__pyx_n_s_weights;
+static PyObject *__pyx_n_s_zeros;
+static PyObject *__pyx_n_s_zindices0;
+static PyObject *__pyx_n_s_zindices1;
+static PyObject *__pyx_n_s_zpos;
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_find_max_bin(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_binbounds, int __pyx_v_maxdistance); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_2find_max_fend(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_chromosomes, PyArrayObject *__pyx_v_chr_indices, int __pyx_v_start, int __pyx_v_maxdistance); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_4find_min_fend(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_chromosomes, PyArrayObject *__pyx_v_chr_indices, int __pyx_v_mindistance, int __pyx_v_binned); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_6find_fend_coverage(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_data_indices, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_coverage, CYTHON_UNUSED int __pyx_v_mincoverage); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_8find_cis_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_data_indices, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_positions, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_coverage); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_10find_trans_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_positions, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_coverage); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_12filter_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_neighbor_indices, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_coverage, int __pyx_v_mincoverage); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_14find_fend_ranges(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_mapping, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_ranges, int __pyx_v_mindistance, int __pyx_v_maxdistance, PY_LONG_LONG __pyx_v_start, PY_LONG_LONG __pyx_v_stop, int __pyx_v_startfend, int __pyx_v_binned); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_16find_nonzeros_in_range(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_data); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_18find_nonzero_node_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_indices0, PyArrayObject *__pyx_v_indices1, PyArrayObject *__pyx_v_counts, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_interactions); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_20find_zero_node_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_mapping, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_nzindices0, PyArrayObject *__pyx_v_nzindices1, PyArrayObject *__pyx_v_zindices0, PyArrayObject *__pyx_v_zindices1, PyArrayObject *__pyx_v_interactions, PY_LONG_LONG __pyx_v_start, PY_LONG_LONG __pyx_v_stop, int __pyx_v_startfend, int __pyx_v_binned); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_22find_distancebound_possible_interactions(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_interactions, PyArrayObject *__pyx_v_chr_indices, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_chrints, int __pyx_v_useread_int, int __pyx_v_mindistance, int __pyx_v_maxdistance, int __pyx_v_binned); /* proto */
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_24sum_weighted_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_indices0, PyArrayObject *__pyx_v_indices1, PyArrayObject *__pyx_v_weights, PyArrayObject *__pyx_v_int_weights, PyArrayObject *__pyx_v_sums); /* proto */
+static int __pyx_pf_5numpy_7ndarray___getbuffer__(PyArrayObject *__pyx_v_self, Py_buffer *__pyx_v_info, int __pyx_v_flags); /* proto */
+static void __pyx_pf_5numpy_7ndarray_2__releasebuffer__(PyArrayObject *__pyx_v_self, Py_buffer *__pyx_v_info); /* proto */
+static PyObject *__pyx_int_1;
+static PyObject *__pyx_slice_;
+static PyObject *__pyx_tuple__2;
+static PyObject *__pyx_tuple__3;
+static PyObject *__pyx_tuple__4;
+static PyObject *__pyx_tuple__5;
+static PyObject *__pyx_tuple__6;
+static PyObject *__pyx_tuple__7;
+static PyObject *__pyx_tuple__8;
+static PyObject *__pyx_tuple__9;
+static PyObject *__pyx_tuple__11;
+static PyObject *__pyx_tuple__13;
+static PyObject *__pyx_tuple__15;
+static PyObject *__pyx_tuple__17;
+static PyObject *__pyx_tuple__19;
+static PyObject *__pyx_tuple__21;
+static PyObject *__pyx_tuple__23;
+static PyObject *__pyx_tuple__25;
+static PyObject *__pyx_tuple__27;
+static PyObject *__pyx_tuple__29;
+static PyObject *__pyx_tuple__31;
+static PyObject *__pyx_tuple__33;
+static PyObject *__pyx_codeobj__10;
+static PyObject *__pyx_codeobj__12;
+static PyObject *__pyx_codeobj__14;
+static PyObject *__pyx_codeobj__16;
+static PyObject *__pyx_codeobj__18;
+static PyObject *__pyx_codeobj__20;
+static PyObject *__pyx_codeobj__22;
+static PyObject *__pyx_codeobj__24;
+static PyObject *__pyx_codeobj__26;
+static PyObject *__pyx_codeobj__28;
+static PyObject *__pyx_codeobj__30;
+static PyObject *__pyx_codeobj__32;
+static PyObject *__pyx_codeobj__34;
+/* Late includes */
+
+/* "hifive/libraries/_hic_interactions.pyx":34
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_bin(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] binbounds not None,
+ *         int maxdistance):
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_1find_max_bin(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_1find_max_bin = {"find_max_bin", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_1find_max_bin, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_1find_max_bin(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_binbounds = 0;
+  int __pyx_v_maxdistance;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_max_bin (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_binbounds,&__pyx_n_s_maxdistance,0};
+    PyObject* values[2] = {0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_binbounds)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_maxdistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_bin", 1, 2, 2, 1); __PYX_ERR(0, 34, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_max_bin") < 0)) __PYX_ERR(0, 34, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 2) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+    }
+    __pyx_v_binbounds = ((PyArrayObject *)values[0]);
+    __pyx_v_maxdistance = __Pyx_PyInt_As_int(values[1]); if (unlikely((__pyx_v_maxdistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 36, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_max_bin", 1, 2, 2, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 34, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_max_bin", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_binbounds), __pyx_ptype_5numpy_ndarray, 0, "binbounds", 0))) __PYX_ERR(0, 35, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_find_max_bin(__pyx_self, __pyx_v_binbounds, __pyx_v_maxdistance);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_find_max_bin(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_binbounds, int __pyx_v_maxdistance) {
+  int __pyx_v_i;
+  int __pyx_v_j;
+  int __pyx_v_maxbin;
+  int __pyx_v_start;
+  int __pyx_v_num_bins;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_binbounds;
+  __Pyx_Buffer __pyx_pybuffer_binbounds;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  int __pyx_t_2;
+  int __pyx_t_3;
+  Py_ssize_t __pyx_t_4;
+  Py_ssize_t __pyx_t_5;
+  int __pyx_t_6;
+  int __pyx_t_7;
+  long __pyx_t_8;
+  int __pyx_t_9;
+  long __pyx_t_10;
+  PyObject *__pyx_t_11 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_max_bin", 0);
+  __pyx_pybuffer_binbounds.pybuffer.buf = NULL;
+  __pyx_pybuffer_binbounds.refcount = 0;
+  __pyx_pybuffernd_binbounds.data = NULL;
+  __pyx_pybuffernd_binbounds.rcbuffer = &__pyx_pybuffer_binbounds;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_binbounds.rcbuffer->pybuffer, (PyObject*)__pyx_v_binbounds, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 34, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_binbounds.diminfo[0].strides = __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_binbounds.diminfo[0].shape = __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_binbounds.diminfo[1].strides = __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_binbounds.diminfo[1].shape = __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.shape[1];
+
+  /* "hifive/libraries/_hic_interactions.pyx":38
+ *         int maxdistance):
+ *     cdef int i, j, maxbin, start
+ *     cdef int num_bins = binbounds.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         maxbin = 0
+ */
+  __pyx_v_num_bins = (__pyx_v_binbounds->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":39
+ *     cdef int i, j, maxbin, start
+ *     cdef int num_bins = binbounds.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         maxbin = 0
+ *         for i in range(num_bins):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":40
+ *     cdef int num_bins = binbounds.shape[0]
+ *     with nogil:
+ *         maxbin = 0             # <<<<<<<<<<<<<<
+ *         for i in range(num_bins):
+ *             start = binbounds[i, 1] - 1
+ */
+        __pyx_v_maxbin = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":41
+ *     with nogil:
+ *         maxbin = 0
+ *         for i in range(num_bins):             # <<<<<<<<<<<<<<
+ *             start = binbounds[i, 1] - 1
+ *             j = i + 1
+ */
+        __pyx_t_1 = __pyx_v_num_bins;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":42
+ *         maxbin = 0
+ *         for i in range(num_bins):
+ *             start = binbounds[i, 1] - 1             # <<<<<<<<<<<<<<
+ *             j = i + 1
+ *             while j < num_bins and binbounds[j, 0] - start < maxdistance:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = 1;
+          __pyx_v_start = ((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_binbounds.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_binbounds.diminfo[1].strides)) - 1);
+
+          /* "hifive/libraries/_hic_interactions.pyx":43
+ *         for i in range(num_bins):
+ *             start = binbounds[i, 1] - 1
+ *             j = i + 1             # <<<<<<<<<<<<<<
+ *             while j < num_bins and binbounds[j, 0] - start < maxdistance:
+ *                 j += 1
+ */
+          __pyx_v_j = (__pyx_v_i + 1);
+
+          /* "hifive/libraries/_hic_interactions.pyx":44
+ *             start = binbounds[i, 1] - 1
+ *             j = i + 1
+ *             while j < num_bins and binbounds[j, 0] - start < maxdistance:             # <<<<<<<<<<<<<<
+ *                 j += 1
+ *             maxbin = max(maxbin, j - i - 1)
+ */
+          while (1) {
+            __pyx_t_7 = ((__pyx_v_j < __pyx_v_num_bins) != 0);
+            if (__pyx_t_7) {
+            } else {
+              __pyx_t_6 = __pyx_t_7;
+              goto __pyx_L10_bool_binop_done;
+            }
+            __pyx_t_5 = __pyx_v_j;
+            __pyx_t_4 = 0;
+            __pyx_t_7 = ((((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_binbounds.rcbuffer->pybuffer.buf, __pyx_t_5, __pyx_pybuffernd_binbounds.diminfo[0].strides, __pyx_t_4, __pyx_pybuffernd_binbounds.diminfo[1].strides)) - __pyx_v_start) < __pyx_v_maxdistance) != 0);
+            __pyx_t_6 = __pyx_t_7;
+            __pyx_L10_bool_binop_done:;
+            if (!__pyx_t_6) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":45
+ *             j = i + 1
+ *             while j < num_bins and binbounds[j, 0] - start < maxdistance:
+ *                 j += 1             # <<<<<<<<<<<<<<
+ *             maxbin = max(maxbin, j - i - 1)
+ *     return maxbin
+ */
+            __pyx_v_j = (__pyx_v_j + 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":46
+ *             while j < num_bins and binbounds[j, 0] - start < maxdistance:
+ *                 j += 1
+ *             maxbin = max(maxbin, j - i - 1)             # <<<<<<<<<<<<<<
+ *     return maxbin
+ * 
+ */
+          __pyx_t_8 = ((__pyx_v_j - __pyx_v_i) - 1);
+          __pyx_t_9 = __pyx_v_maxbin;
+          if (((__pyx_t_8 > __pyx_t_9) != 0)) {
+            __pyx_t_10 = __pyx_t_8;
+          } else {
+            __pyx_t_10 = __pyx_t_9;
+          }
+          __pyx_v_maxbin = __pyx_t_10;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":39
+ *     cdef int i, j, maxbin, start
+ *     cdef int num_bins = binbounds.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         maxbin = 0
+ *         for i in range(num_bins):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":47
+ *                 j += 1
+ *             maxbin = max(maxbin, j - i - 1)
+ *     return maxbin             # <<<<<<<<<<<<<<
+ * 
+ * @cython.boundscheck(False)
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_11 = __Pyx_PyInt_From_int(__pyx_v_maxbin); if (unlikely(!__pyx_t_11)) __PYX_ERR(0, 47, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_11);
+  __pyx_r = __pyx_t_11;
+  __pyx_t_11 = 0;
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":34
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_bin(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] binbounds not None,
+ *         int maxdistance):
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_11);
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_binbounds.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_max_bin", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_binbounds.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":52
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] max_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_3find_max_fend(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_3find_max_fend = {"find_max_fend", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_3find_max_fend, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_3find_max_fend(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_max_fend = 0;
+  PyArrayObject *__pyx_v_mids = 0;
+  PyArrayObject *__pyx_v_chromosomes = 0;
+  PyArrayObject *__pyx_v_chr_indices = 0;
+  int __pyx_v_start;
+  int __pyx_v_maxdistance;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_max_fend (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_max_fend,&__pyx_n_s_mids,&__pyx_n_s_chromosomes,&__pyx_n_s_chr_indices,&__pyx_n_s_start,&__pyx_n_s_maxdistance,0};
+    PyObject* values[6] = {0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_max_fend)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mids)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, 1); __PYX_ERR(0, 52, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chromosomes)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, 2); __PYX_ERR(0, 52, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chr_indices)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, 3); __PYX_ERR(0, 52, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_start)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, 4); __PYX_ERR(0, 52, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_maxdistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, 5); __PYX_ERR(0, 52, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_max_fend") < 0)) __PYX_ERR(0, 52, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 6) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+    }
+    __pyx_v_max_fend = ((PyArrayObject *)values[0]);
+    __pyx_v_mids = ((PyArrayObject *)values[1]);
+    __pyx_v_chromosomes = ((PyArrayObject *)values[2]);
+    __pyx_v_chr_indices = ((PyArrayObject *)values[3]);
+    __pyx_v_start = __Pyx_PyInt_As_int(values[4]); if (unlikely((__pyx_v_start == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 57, __pyx_L3_error)
+    __pyx_v_maxdistance = __Pyx_PyInt_As_int(values[5]); if (unlikely((__pyx_v_maxdistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 58, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_max_fend", 1, 6, 6, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 52, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_max_fend", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_max_fend), __pyx_ptype_5numpy_ndarray, 0, "max_fend", 0))) __PYX_ERR(0, 53, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mids), __pyx_ptype_5numpy_ndarray, 0, "mids", 0))) __PYX_ERR(0, 54, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chromosomes), __pyx_ptype_5numpy_ndarray, 0, "chromosomes", 0))) __PYX_ERR(0, 55, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chr_indices), __pyx_ptype_5numpy_ndarray, 0, "chr_indices", 0))) __PYX_ERR(0, 56, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_2find_max_fend(__pyx_self, __pyx_v_max_fend, __pyx_v_mids, __pyx_v_chromosomes, __pyx_v_chr_indices, __pyx_v_start, __pyx_v_maxdistance);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_2find_max_fend(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_chromosomes, PyArrayObject *__pyx_v_chr_indices, int __pyx_v_start, int __pyx_v_maxdistance) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_chr_max;
+  PY_LONG_LONG __pyx_v_num_fends;
+  PY_LONG_LONG __pyx_v_max_num_fends;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chr_indices;
+  __Pyx_Buffer __pyx_pybuffer_chr_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chromosomes;
+  __Pyx_Buffer __pyx_pybuffer_chromosomes;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_max_fend;
+  __Pyx_Buffer __pyx_pybuffer_max_fend;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mids;
+  __Pyx_Buffer __pyx_pybuffer_mids;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  Py_ssize_t __pyx_t_5;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t __pyx_t_6;
+  PY_LONG_LONG __pyx_t_7;
+  int __pyx_t_8;
+  int __pyx_t_9;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_max_fend", 0);
+  __pyx_pybuffer_max_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_max_fend.refcount = 0;
+  __pyx_pybuffernd_max_fend.data = NULL;
+  __pyx_pybuffernd_max_fend.rcbuffer = &__pyx_pybuffer_max_fend;
+  __pyx_pybuffer_mids.pybuffer.buf = NULL;
+  __pyx_pybuffer_mids.refcount = 0;
+  __pyx_pybuffernd_mids.data = NULL;
+  __pyx_pybuffernd_mids.rcbuffer = &__pyx_pybuffer_mids;
+  __pyx_pybuffer_chromosomes.pybuffer.buf = NULL;
+  __pyx_pybuffer_chromosomes.refcount = 0;
+  __pyx_pybuffernd_chromosomes.data = NULL;
+  __pyx_pybuffernd_chromosomes.rcbuffer = &__pyx_pybuffer_chromosomes;
+  __pyx_pybuffer_chr_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_chr_indices.refcount = 0;
+  __pyx_pybuffernd_chr_indices.data = NULL;
+  __pyx_pybuffernd_chr_indices.rcbuffer = &__pyx_pybuffer_chr_indices;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_max_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 52, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_max_fend.diminfo[0].strides = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_max_fend.diminfo[0].shape = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_v_mids, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 52, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mids.diminfo[0].strides = __pyx_pybuffernd_mids.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mids.diminfo[0].shape = __pyx_pybuffernd_mids.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer, (PyObject*)__pyx_v_chromosomes, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 52, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chromosomes.diminfo[0].strides = __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chromosomes.diminfo[0].shape = __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_chr_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 52, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chr_indices.diminfo[0].strides = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chr_indices.diminfo[0].shape = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":60
+ *         int maxdistance):
+ *     cdef long long int h, i, j, chr_max
+ *     cdef long long int num_fends = max_fend.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:
+ */
+  __pyx_v_num_fends = (__pyx_v_max_fend->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":61
+ *     cdef long long int h, i, j, chr_max
+ *     cdef long long int num_fends = max_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         j = 1
+ */
+  __pyx_v_max_num_fends = (__pyx_v_mids->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":62
+ *     cdef long long int num_fends = max_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         j = 1
+ *         for i in range(num_fends):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":63
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:
+ *         j = 1             # <<<<<<<<<<<<<<
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)
+ */
+        __pyx_v_j = 1;
+
+        /* "hifive/libraries/_hic_interactions.pyx":64
+ *     with nogil:
+ *         j = 1
+ *         for i in range(num_fends):             # <<<<<<<<<<<<<<
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)
+ *             if maxdistance == 0:
+ */
+        __pyx_t_1 = __pyx_v_num_fends;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":65
+ *         j = 1
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)             # <<<<<<<<<<<<<<
+ *             if maxdistance == 0:
+ *                 max_fend[i] = chr_max
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_chromosomes.diminfo[0].strides)) + 1);
+          __pyx_t_6 = ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.buf, __pyx_t_5, __pyx_pybuffernd_chr_indices.diminfo[0].strides)) - __pyx_v_start);
+          __pyx_t_4 = __pyx_v_max_num_fends;
+          if (((__pyx_t_6 < __pyx_t_4) != 0)) {
+            __pyx_t_7 = __pyx_t_6;
+          } else {
+            __pyx_t_7 = __pyx_t_4;
+          }
+          __pyx_v_chr_max = __pyx_t_7;
+
+          /* "hifive/libraries/_hic_interactions.pyx":66
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)
+ *             if maxdistance == 0:             # <<<<<<<<<<<<<<
+ *                 max_fend[i] = chr_max
+ *             else:
+ */
+          __pyx_t_8 = ((__pyx_v_maxdistance == 0) != 0);
+          if (__pyx_t_8) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":67
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)
+ *             if maxdistance == 0:
+ *                 max_fend[i] = chr_max             # <<<<<<<<<<<<<<
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < maxdistance:
+ */
+            __pyx_t_7 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_max_fend.diminfo[0].strides) = __pyx_v_chr_max;
+
+            /* "hifive/libraries/_hic_interactions.pyx":66
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1] - start)
+ *             if maxdistance == 0:             # <<<<<<<<<<<<<<
+ *                 max_fend[i] = chr_max
+ *             else:
+ */
+            goto __pyx_L8;
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":69
+ *                 max_fend[i] = chr_max
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < maxdistance:             # <<<<<<<<<<<<<<
+ *                     j += 1
+ *                 max_fend[i] = j
+ */
+          /*else*/ {
+            while (1) {
+              __pyx_t_9 = ((__pyx_v_j < __pyx_v_chr_max) != 0);
+              if (__pyx_t_9) {
+              } else {
+                __pyx_t_8 = __pyx_t_9;
+                goto __pyx_L11_bool_binop_done;
+              }
+              __pyx_t_7 = __pyx_v_j;
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_9 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_maxdistance) != 0);
+              __pyx_t_8 = __pyx_t_9;
+              __pyx_L11_bool_binop_done:;
+              if (!__pyx_t_8) break;
+
+              /* "hifive/libraries/_hic_interactions.pyx":70
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < maxdistance:
+ *                     j += 1             # <<<<<<<<<<<<<<
+ *                 max_fend[i] = j
+ *     return None
+ */
+              __pyx_v_j = (__pyx_v_j + 1);
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":71
+ *                 while j < chr_max and mids[j] - mids[i] < maxdistance:
+ *                     j += 1
+ *                 max_fend[i] = j             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_t_4 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_max_fend.diminfo[0].strides) = __pyx_v_j;
+          }
+          __pyx_L8:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":62
+ *     cdef long long int num_fends = max_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         j = 1
+ *         for i in range(num_fends):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":72
+ *                     j += 1
+ *                 max_fend[i] = j
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * @cython.boundscheck(False)
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":52
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] max_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_max_fend", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":77
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_min_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] min_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_5find_min_fend(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_5find_min_fend = {"find_min_fend", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_5find_min_fend, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_5find_min_fend(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_min_fend = 0;
+  PyArrayObject *__pyx_v_mids = 0;
+  PyArrayObject *__pyx_v_chromosomes = 0;
+  PyArrayObject *__pyx_v_chr_indices = 0;
+  int __pyx_v_mindistance;
+  int __pyx_v_binned;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_min_fend (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_min_fend,&__pyx_n_s_mids,&__pyx_n_s_chromosomes,&__pyx_n_s_chr_indices,&__pyx_n_s_mindistance,&__pyx_n_s_binned,0};
+    PyObject* values[6] = {0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_min_fend)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mids)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, 1); __PYX_ERR(0, 77, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chromosomes)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, 2); __PYX_ERR(0, 77, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chr_indices)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, 3); __PYX_ERR(0, 77, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mindistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, 4); __PYX_ERR(0, 77, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_binned)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, 5); __PYX_ERR(0, 77, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_min_fend") < 0)) __PYX_ERR(0, 77, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 6) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+    }
+    __pyx_v_min_fend = ((PyArrayObject *)values[0]);
+    __pyx_v_mids = ((PyArrayObject *)values[1]);
+    __pyx_v_chromosomes = ((PyArrayObject *)values[2]);
+    __pyx_v_chr_indices = ((PyArrayObject *)values[3]);
+    __pyx_v_mindistance = __Pyx_PyInt_As_int(values[4]); if (unlikely((__pyx_v_mindistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 82, __pyx_L3_error)
+    __pyx_v_binned = __Pyx_PyInt_As_int(values[5]); if (unlikely((__pyx_v_binned == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 83, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_min_fend", 1, 6, 6, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 77, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_min_fend", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_min_fend), __pyx_ptype_5numpy_ndarray, 0, "min_fend", 0))) __PYX_ERR(0, 78, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mids), __pyx_ptype_5numpy_ndarray, 0, "mids", 0))) __PYX_ERR(0, 79, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chromosomes), __pyx_ptype_5numpy_ndarray, 0, "chromosomes", 0))) __PYX_ERR(0, 80, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chr_indices), __pyx_ptype_5numpy_ndarray, 0, "chr_indices", 0))) __PYX_ERR(0, 81, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_4find_min_fend(__pyx_self, __pyx_v_min_fend, __pyx_v_mids, __pyx_v_chromosomes, __pyx_v_chr_indices, __pyx_v_mindistance, __pyx_v_binned);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_4find_min_fend(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_chromosomes, PyArrayObject *__pyx_v_chr_indices, int __pyx_v_mindistance, int __pyx_v_binned) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_chr_max;
+  PY_LONG_LONG __pyx_v_num_fends;
+  PY_LONG_LONG __pyx_v_max_num_fends;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chr_indices;
+  __Pyx_Buffer __pyx_pybuffer_chr_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chromosomes;
+  __Pyx_Buffer __pyx_pybuffer_chromosomes;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mids;
+  __Pyx_Buffer __pyx_pybuffer_mids;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_min_fend;
+  __Pyx_Buffer __pyx_pybuffer_min_fend;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  PY_LONG_LONG __pyx_t_5;
+  Py_ssize_t __pyx_t_6;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t __pyx_t_7;
+  PY_LONG_LONG __pyx_t_8;
+  PY_LONG_LONG __pyx_t_9;
+  int __pyx_t_10;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_min_fend", 0);
+  __pyx_pybuffer_min_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_min_fend.refcount = 0;
+  __pyx_pybuffernd_min_fend.data = NULL;
+  __pyx_pybuffernd_min_fend.rcbuffer = &__pyx_pybuffer_min_fend;
+  __pyx_pybuffer_mids.pybuffer.buf = NULL;
+  __pyx_pybuffer_mids.refcount = 0;
+  __pyx_pybuffernd_mids.data = NULL;
+  __pyx_pybuffernd_mids.rcbuffer = &__pyx_pybuffer_mids;
+  __pyx_pybuffer_chromosomes.pybuffer.buf = NULL;
+  __pyx_pybuffer_chromosomes.refcount = 0;
+  __pyx_pybuffernd_chromosomes.data = NULL;
+  __pyx_pybuffernd_chromosomes.rcbuffer = &__pyx_pybuffer_chromosomes;
+  __pyx_pybuffer_chr_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_chr_indices.refcount = 0;
+  __pyx_pybuffernd_chr_indices.data = NULL;
+  __pyx_pybuffernd_chr_indices.rcbuffer = &__pyx_pybuffer_chr_indices;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_min_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 77, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_min_fend.diminfo[0].strides = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_min_fend.diminfo[0].shape = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_v_mids, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 77, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mids.diminfo[0].strides = __pyx_pybuffernd_mids.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mids.diminfo[0].shape = __pyx_pybuffernd_mids.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer, (PyObject*)__pyx_v_chromosomes, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 77, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chromosomes.diminfo[0].strides = __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chromosomes.diminfo[0].shape = __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_chr_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 77, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chr_indices.diminfo[0].strides = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chr_indices.diminfo[0].shape = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":85
+ *         int binned):
+ *     cdef long long int h, i, j, chr_max
+ *     cdef long long int num_fends = min_fend.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:
+ */
+  __pyx_v_num_fends = (__pyx_v_min_fend->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":86
+ *     cdef long long int h, i, j, chr_max
+ *     cdef long long int num_fends = min_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         if binned == 1:
+ */
+  __pyx_v_max_num_fends = (__pyx_v_mids->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":87
+ *     cdef long long int num_fends = min_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         if binned == 1:
+ *             j = 0
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":88
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:
+ *         if binned == 1:             # <<<<<<<<<<<<<<
+ *             j = 0
+ *         else:
+ */
+        __pyx_t_1 = ((__pyx_v_binned == 1) != 0);
+        if (__pyx_t_1) {
+
+          /* "hifive/libraries/_hic_interactions.pyx":89
+ *     with nogil:
+ *         if binned == 1:
+ *             j = 0             # <<<<<<<<<<<<<<
+ *         else:
+ *             j = 2
+ */
+          __pyx_v_j = 0;
+
+          /* "hifive/libraries/_hic_interactions.pyx":88
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:
+ *         if binned == 1:             # <<<<<<<<<<<<<<
+ *             j = 0
+ *         else:
+ */
+          goto __pyx_L6;
+        }
+
+        /* "hifive/libraries/_hic_interactions.pyx":91
+ *             j = 0
+ *         else:
+ *             j = 2             # <<<<<<<<<<<<<<
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ */
+        /*else*/ {
+          __pyx_v_j = 2;
+        }
+        __pyx_L6:;
+
+        /* "hifive/libraries/_hic_interactions.pyx":92
+ *         else:
+ *             j = 2
+ *         for i in range(num_fends):             # <<<<<<<<<<<<<<
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ *             if mindistance == 0:
+ */
+        __pyx_t_2 = __pyx_v_num_fends;
+        __pyx_t_3 = __pyx_t_2;
+        for (__pyx_t_4 = 0; __pyx_t_4 < __pyx_t_3; __pyx_t_4+=1) {
+          __pyx_v_i = __pyx_t_4;
+
+          /* "hifive/libraries/_hic_interactions.pyx":93
+ *             j = 2
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])             # <<<<<<<<<<<<<<
+ *             if mindistance == 0:
+ *                 if binned == 1:
+ */
+          __pyx_t_5 = __pyx_v_i;
+          __pyx_t_6 = ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chromosomes.rcbuffer->pybuffer.buf, __pyx_t_5, __pyx_pybuffernd_chromosomes.diminfo[0].strides)) + 1);
+          __pyx_t_7 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_chr_indices.diminfo[0].strides));
+          __pyx_t_5 = __pyx_v_max_num_fends;
+          if (((__pyx_t_7 < __pyx_t_5) != 0)) {
+            __pyx_t_8 = __pyx_t_7;
+          } else {
+            __pyx_t_8 = __pyx_t_5;
+          }
+          __pyx_v_chr_max = __pyx_t_8;
+
+          /* "hifive/libraries/_hic_interactions.pyx":94
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ *             if mindistance == 0:             # <<<<<<<<<<<<<<
+ *                 if binned == 1:
+ *                     min_fend[i] = min(i, chr_max)
+ */
+          __pyx_t_1 = ((__pyx_v_mindistance == 0) != 0);
+          if (__pyx_t_1) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":95
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ *             if mindistance == 0:
+ *                 if binned == 1:             # <<<<<<<<<<<<<<
+ *                     min_fend[i] = min(i, chr_max)
+ *                 else:
+ */
+            __pyx_t_1 = ((__pyx_v_binned == 1) != 0);
+            if (__pyx_t_1) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":96
+ *             if mindistance == 0:
+ *                 if binned == 1:
+ *                     min_fend[i] = min(i, chr_max)             # <<<<<<<<<<<<<<
+ *                 else:
+ *                     min_fend[i] = min(i + 2, chr_max)
+ */
+              __pyx_t_8 = __pyx_v_chr_max;
+              __pyx_t_5 = __pyx_v_i;
+              if (((__pyx_t_8 < __pyx_t_5) != 0)) {
+                __pyx_t_9 = __pyx_t_8;
+              } else {
+                __pyx_t_9 = __pyx_t_5;
+              }
+              __pyx_t_8 = __pyx_v_i;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_min_fend.diminfo[0].strides) = __pyx_t_9;
+
+              /* "hifive/libraries/_hic_interactions.pyx":95
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ *             if mindistance == 0:
+ *                 if binned == 1:             # <<<<<<<<<<<<<<
+ *                     min_fend[i] = min(i, chr_max)
+ *                 else:
+ */
+              goto __pyx_L10;
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":98
+ *                     min_fend[i] = min(i, chr_max)
+ *                 else:
+ *                     min_fend[i] = min(i + 2, chr_max)             # <<<<<<<<<<<<<<
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < mindistance:
+ */
+            /*else*/ {
+              __pyx_t_9 = __pyx_v_chr_max;
+              __pyx_t_8 = (__pyx_v_i + 2);
+              if (((__pyx_t_9 < __pyx_t_8) != 0)) {
+                __pyx_t_5 = __pyx_t_9;
+              } else {
+                __pyx_t_5 = __pyx_t_8;
+              }
+              __pyx_t_9 = __pyx_v_i;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_min_fend.diminfo[0].strides) = __pyx_t_5;
+            }
+            __pyx_L10:;
+
+            /* "hifive/libraries/_hic_interactions.pyx":94
+ *         for i in range(num_fends):
+ *             chr_max = min(max_num_fends, chr_indices[chromosomes[i] + 1])
+ *             if mindistance == 0:             # <<<<<<<<<<<<<<
+ *                 if binned == 1:
+ *                     min_fend[i] = min(i, chr_max)
+ */
+            goto __pyx_L9;
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":100
+ *                     min_fend[i] = min(i + 2, chr_max)
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < mindistance:             # <<<<<<<<<<<<<<
+ *                     j += 1
+ *                 min_fend[i] = j
+ */
+          /*else*/ {
+            while (1) {
+              __pyx_t_10 = ((__pyx_v_j < __pyx_v_chr_max) != 0);
+              if (__pyx_t_10) {
+              } else {
+                __pyx_t_1 = __pyx_t_10;
+                goto __pyx_L13_bool_binop_done;
+              }
+              __pyx_t_5 = __pyx_v_j;
+              __pyx_t_9 = __pyx_v_i;
+              __pyx_t_10 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_5, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_mindistance) != 0);
+              __pyx_t_1 = __pyx_t_10;
+              __pyx_L13_bool_binop_done:;
+              if (!__pyx_t_1) break;
+
+              /* "hifive/libraries/_hic_interactions.pyx":101
+ *             else:
+ *                 while j < chr_max and mids[j] - mids[i] < mindistance:
+ *                     j += 1             # <<<<<<<<<<<<<<
+ *                 min_fend[i] = j
+ *     return None
+ */
+              __pyx_v_j = (__pyx_v_j + 1);
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":102
+ *                 while j < chr_max and mids[j] - mids[i] < mindistance:
+ *                     j += 1
+ *                 min_fend[i] = j             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_t_9 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_min_fend.diminfo[0].strides) = __pyx_v_j;
+          }
+          __pyx_L9:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":87
+ *     cdef long long int num_fends = min_fend.shape[0]
+ *     cdef long long int max_num_fends = mids.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         if binned == 1:
+ *             j = 0
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":103
+ *                     j += 1
+ *                 min_fend[i] = j
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * @cython.boundscheck(False)
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":77
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_min_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] min_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_min_fend", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chromosomes.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":108
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_coverage(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_7find_fend_coverage(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_7find_fend_coverage = {"find_fend_coverage", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_7find_fend_coverage, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_7find_fend_coverage(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_data = 0;
+  PyArrayObject *__pyx_v_data_indices = 0;
+  PyArrayObject *__pyx_v_filter = 0;
+  PyArrayObject *__pyx_v_min_fend = 0;
+  PyArrayObject *__pyx_v_max_fend = 0;
+  PyArrayObject *__pyx_v_coverage = 0;
+  CYTHON_UNUSED int __pyx_v_mincoverage;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_fend_coverage (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_data,&__pyx_n_s_data_indices,&__pyx_n_s_filter,&__pyx_n_s_min_fend,&__pyx_n_s_max_fend,&__pyx_n_s_coverage,&__pyx_n_s_mincoverage,0};
+    PyObject* values[7] = {0,0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  7: values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+        CYTHON_FALLTHROUGH;
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data_indices)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 1); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_filter)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 2); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_min_fend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 3); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_max_fend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 4); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_coverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 5); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  6:
+        if (likely((values[6] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mincoverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, 6); __PYX_ERR(0, 108, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_fend_coverage") < 0)) __PYX_ERR(0, 108, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 7) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+      values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+    }
+    __pyx_v_data = ((PyArrayObject *)values[0]);
+    __pyx_v_data_indices = ((PyArrayObject *)values[1]);
+    __pyx_v_filter = ((PyArrayObject *)values[2]);
+    __pyx_v_min_fend = ((PyArrayObject *)values[3]);
+    __pyx_v_max_fend = ((PyArrayObject *)values[4]);
+    __pyx_v_coverage = ((PyArrayObject *)values[5]);
+    __pyx_v_mincoverage = __Pyx_PyInt_As_int(values[6]); if (unlikely((__pyx_v_mincoverage == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 115, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_fend_coverage", 1, 7, 7, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 108, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_fend_coverage", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data), __pyx_ptype_5numpy_ndarray, 0, "data", 0))) __PYX_ERR(0, 109, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data_indices), __pyx_ptype_5numpy_ndarray, 0, "data_indices", 0))) __PYX_ERR(0, 110, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_filter), __pyx_ptype_5numpy_ndarray, 0, "filter", 0))) __PYX_ERR(0, 111, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_min_fend), __pyx_ptype_5numpy_ndarray, 0, "min_fend", 0))) __PYX_ERR(0, 112, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_max_fend), __pyx_ptype_5numpy_ndarray, 0, "max_fend", 0))) __PYX_ERR(0, 113, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_coverage), __pyx_ptype_5numpy_ndarray, 0, "coverage", 0))) __PYX_ERR(0, 114, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_6find_fend_coverage(__pyx_self, __pyx_v_data, __pyx_v_data_indices, __pyx_v_filter, __pyx_v_min_fend, __pyx_v_max_fend, __pyx_v_coverage, __pyx_v_mincoverage);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_6find_fend_coverage(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_data_indices, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_coverage, CYTHON_UNUSED int __pyx_v_mincoverage) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_fend1;
+  CYTHON_UNUSED PY_LONG_LONG __pyx_v_valid;
+  PY_LONG_LONG __pyx_v_num_fends;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_coverage;
+  __Pyx_Buffer __pyx_pybuffer_coverage;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data;
+  __Pyx_Buffer __pyx_pybuffer_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data_indices;
+  __Pyx_Buffer __pyx_pybuffer_data_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_filter;
+  __Pyx_Buffer __pyx_pybuffer_filter;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_max_fend;
+  __Pyx_Buffer __pyx_pybuffer_max_fend;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_min_fend;
+  __Pyx_Buffer __pyx_pybuffer_min_fend;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  int __pyx_t_5;
+  int __pyx_t_6;
+  Py_ssize_t __pyx_t_7;
+  PY_LONG_LONG __pyx_t_8;
+  Py_ssize_t __pyx_t_9;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_fend_coverage", 0);
+  __pyx_pybuffer_data.pybuffer.buf = NULL;
+  __pyx_pybuffer_data.refcount = 0;
+  __pyx_pybuffernd_data.data = NULL;
+  __pyx_pybuffernd_data.rcbuffer = &__pyx_pybuffer_data;
+  __pyx_pybuffer_data_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_data_indices.refcount = 0;
+  __pyx_pybuffernd_data_indices.data = NULL;
+  __pyx_pybuffernd_data_indices.rcbuffer = &__pyx_pybuffer_data_indices;
+  __pyx_pybuffer_filter.pybuffer.buf = NULL;
+  __pyx_pybuffer_filter.refcount = 0;
+  __pyx_pybuffernd_filter.data = NULL;
+  __pyx_pybuffernd_filter.rcbuffer = &__pyx_pybuffer_filter;
+  __pyx_pybuffer_min_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_min_fend.refcount = 0;
+  __pyx_pybuffernd_min_fend.data = NULL;
+  __pyx_pybuffernd_min_fend.rcbuffer = &__pyx_pybuffer_min_fend;
+  __pyx_pybuffer_max_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_max_fend.refcount = 0;
+  __pyx_pybuffernd_max_fend.data = NULL;
+  __pyx_pybuffernd_max_fend.rcbuffer = &__pyx_pybuffer_max_fend;
+  __pyx_pybuffer_coverage.pybuffer.buf = NULL;
+  __pyx_pybuffer_coverage.refcount = 0;
+  __pyx_pybuffernd_coverage.data = NULL;
+  __pyx_pybuffernd_coverage.rcbuffer = &__pyx_pybuffer_coverage;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data.rcbuffer->pybuffer, (PyObject*)__pyx_v_data, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data.diminfo[0].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data.diminfo[0].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_data.diminfo[1].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_data.diminfo[1].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_data_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data_indices.diminfo[0].strides = __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data_indices.diminfo[0].shape = __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_filter.rcbuffer->pybuffer, (PyObject*)__pyx_v_filter, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_filter.diminfo[0].strides = __pyx_pybuffernd_filter.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_filter.diminfo[0].shape = __pyx_pybuffernd_filter.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_min_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_min_fend.diminfo[0].strides = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_min_fend.diminfo[0].shape = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_max_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_max_fend.diminfo[0].strides = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_max_fend.diminfo[0].shape = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer, (PyObject*)__pyx_v_coverage, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 108, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_coverage.diminfo[0].strides = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_coverage.diminfo[0].shape = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":117
+ *         int mincoverage):
+ *     cdef long long int i, fend1, valid
+ *     cdef long long int num_fends = filter.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         valid = 0
+ */
+  __pyx_v_num_fends = (__pyx_v_filter->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":118
+ *     cdef long long int i, fend1, valid
+ *     cdef long long int num_fends = filter.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         valid = 0
+ *         for fend1 in range(num_fends):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":119
+ *     cdef long long int num_fends = filter.shape[0]
+ *     with nogil:
+ *         valid = 0             # <<<<<<<<<<<<<<
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:
+ */
+        __pyx_v_valid = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":120
+ *     with nogil:
+ *         valid = 0
+ *         for fend1 in range(num_fends):             # <<<<<<<<<<<<<<
+ *             if filter[fend1] == 0:
+ *                 continue
+ */
+        __pyx_t_1 = __pyx_v_num_fends;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_fend1 = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":121
+ *         valid = 0
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             i = data_indices[fend1]
+ */
+          __pyx_t_4 = __pyx_v_fend1;
+          __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+          if (__pyx_t_5) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":122
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:
+ *                 continue             # <<<<<<<<<<<<<<
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ */
+            goto __pyx_L6_continue;
+
+            /* "hifive/libraries/_hic_interactions.pyx":121
+ *         valid = 0
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             i = data_indices[fend1]
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":123
+ *             if filter[fend1] == 0:
+ *                 continue
+ *             i = data_indices[fend1]             # <<<<<<<<<<<<<<
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1
+ */
+          __pyx_t_4 = __pyx_v_fend1;
+          __pyx_v_i = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data_indices.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":124
+ *                 continue
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:             # <<<<<<<<<<<<<<
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ */
+          while (1) {
+            __pyx_t_4 = (__pyx_v_fend1 + 1);
+            __pyx_t_6 = ((__pyx_v_i < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data_indices.diminfo[0].strides))) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L11_bool_binop_done;
+            }
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_8 = __pyx_v_fend1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_min_fend.diminfo[0].strides))) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L11_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":125
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1             # <<<<<<<<<<<<<<
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 if filter[data[i, 1]] == 1:
+ */
+            __pyx_v_i = (__pyx_v_i + 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":126
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:             # <<<<<<<<<<<<<<
+ *                 if filter[data[i, 1]] == 1:
+ *                     coverage[fend1] += 1
+ */
+          while (1) {
+            __pyx_t_8 = (__pyx_v_fend1 + 1);
+            __pyx_t_6 = ((__pyx_v_i < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_data_indices.diminfo[0].strides))) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L15_bool_binop_done;
+            }
+            __pyx_t_8 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_4 = __pyx_v_fend1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_max_fend.diminfo[0].strides))) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L15_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":127
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 if filter[data[i, 1]] == 1:             # <<<<<<<<<<<<<<
+ *                     coverage[fend1] += 1
+ *                     if fend1 != data[i, 1]:
+ */
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides));
+            __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_filter.diminfo[0].strides)) == 1) != 0);
+            if (__pyx_t_5) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":128
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 if filter[data[i, 1]] == 1:
+ *                     coverage[fend1] += 1             # <<<<<<<<<<<<<<
+ *                     if fend1 != data[i, 1]:
+ *                         coverage[data[i, 1]] += 1
+ */
+              __pyx_t_4 = __pyx_v_fend1;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+              /* "hifive/libraries/_hic_interactions.pyx":129
+ *                 if filter[data[i, 1]] == 1:
+ *                     coverage[fend1] += 1
+ *                     if fend1 != data[i, 1]:             # <<<<<<<<<<<<<<
+ *                         coverage[data[i, 1]] += 1
+ *                 i += 1
+ */
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_7 = 1;
+              __pyx_t_5 = ((__pyx_v_fend1 != (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides))) != 0);
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":130
+ *                     coverage[fend1] += 1
+ *                     if fend1 != data[i, 1]:
+ *                         coverage[data[i, 1]] += 1             # <<<<<<<<<<<<<<
+ *                 i += 1
+ *     return None
+ */
+                __pyx_t_4 = __pyx_v_i;
+                __pyx_t_7 = 1;
+                __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides));
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":129
+ *                 if filter[data[i, 1]] == 1:
+ *                     coverage[fend1] += 1
+ *                     if fend1 != data[i, 1]:             # <<<<<<<<<<<<<<
+ *                         coverage[data[i, 1]] += 1
+ *                 i += 1
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":127
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 if filter[data[i, 1]] == 1:             # <<<<<<<<<<<<<<
+ *                     coverage[fend1] += 1
+ *                     if fend1 != data[i, 1]:
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":131
+ *                     if fend1 != data[i, 1]:
+ *                         coverage[data[i, 1]] += 1
+ *                 i += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_v_i = (__pyx_v_i + 1);
+          }
+          __pyx_L6_continue:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":118
+ *     cdef long long int i, fend1, valid
+ *     cdef long long int num_fends = filter.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         valid = 0
+ *         for fend1 in range(num_fends):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":132
+ *                         coverage[data[i, 1]] += 1
+ *                 i += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":108
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_coverage(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_fend_coverage", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":138
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_cis_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_9find_cis_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_9find_cis_fend_neighbors = {"find_cis_fend_neighbors", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_9find_cis_fend_neighbors, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_9find_cis_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_data = 0;
+  PyArrayObject *__pyx_v_data_indices = 0;
+  PyArrayObject *__pyx_v_filter = 0;
+  PyArrayObject *__pyx_v_min_fend = 0;
+  PyArrayObject *__pyx_v_max_fend = 0;
+  PyArrayObject *__pyx_v_positions = 0;
+  PyArrayObject *__pyx_v_neighbors = 0;
+  PyArrayObject *__pyx_v_coverage = 0;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_cis_fend_neighbors (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_data,&__pyx_n_s_data_indices,&__pyx_n_s_filter,&__pyx_n_s_min_fend,&__pyx_n_s_max_fend,&__pyx_n_s_positions,&__pyx_n_s_neighbors,&__pyx_n_s_coverage,0};
+    PyObject* values[8] = {0,0,0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  8: values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+        CYTHON_FALLTHROUGH;
+        case  7: values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+        CYTHON_FALLTHROUGH;
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data_indices)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 1); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_filter)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 2); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_min_fend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 3); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_max_fend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 4); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_positions)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 5); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  6:
+        if (likely((values[6] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_neighbors)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 6); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  7:
+        if (likely((values[7] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_coverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, 7); __PYX_ERR(0, 138, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_cis_fend_neighbors") < 0)) __PYX_ERR(0, 138, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 8) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+      values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+      values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+    }
+    __pyx_v_data = ((PyArrayObject *)values[0]);
+    __pyx_v_data_indices = ((PyArrayObject *)values[1]);
+    __pyx_v_filter = ((PyArrayObject *)values[2]);
+    __pyx_v_min_fend = ((PyArrayObject *)values[3]);
+    __pyx_v_max_fend = ((PyArrayObject *)values[4]);
+    __pyx_v_positions = ((PyArrayObject *)values[5]);
+    __pyx_v_neighbors = ((PyArrayObject *)values[6]);
+    __pyx_v_coverage = ((PyArrayObject *)values[7]);
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_cis_fend_neighbors", 1, 8, 8, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 138, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_cis_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data), __pyx_ptype_5numpy_ndarray, 0, "data", 0))) __PYX_ERR(0, 139, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data_indices), __pyx_ptype_5numpy_ndarray, 0, "data_indices", 0))) __PYX_ERR(0, 140, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_filter), __pyx_ptype_5numpy_ndarray, 0, "filter", 0))) __PYX_ERR(0, 141, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_min_fend), __pyx_ptype_5numpy_ndarray, 0, "min_fend", 0))) __PYX_ERR(0, 142, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_max_fend), __pyx_ptype_5numpy_ndarray, 0, "max_fend", 0))) __PYX_ERR(0, 143, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_positions), __pyx_ptype_5numpy_ndarray, 0, "positions", 0))) __PYX_ERR(0, 144, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_neighbors), __pyx_ptype_5numpy_ndarray, 0, "neighbors", 0))) __PYX_ERR(0, 145, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_coverage), __pyx_ptype_5numpy_ndarray, 0, "coverage", 0))) __PYX_ERR(0, 146, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_8find_cis_fend_neighbors(__pyx_self, __pyx_v_data, __pyx_v_data_indices, __pyx_v_filter, __pyx_v_min_fend, __pyx_v_max_fend, __pyx_v_positions, __pyx_v_neighbors, __pyx_v_coverage);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_8find_cis_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_data_indices, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_min_fend, PyArrayObject *__pyx_v_max_fend, PyArrayObject *__pyx_v_positions, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_coverage) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_fend1;
+  PY_LONG_LONG __pyx_v_fend2;
+  PY_LONG_LONG __pyx_v_num_fends;
+  int __pyx_v_fill;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_coverage;
+  __Pyx_Buffer __pyx_pybuffer_coverage;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data;
+  __Pyx_Buffer __pyx_pybuffer_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data_indices;
+  __Pyx_Buffer __pyx_pybuffer_data_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_filter;
+  __Pyx_Buffer __pyx_pybuffer_filter;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_max_fend;
+  __Pyx_Buffer __pyx_pybuffer_max_fend;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_min_fend;
+  __Pyx_Buffer __pyx_pybuffer_min_fend;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_neighbors;
+  __Pyx_Buffer __pyx_pybuffer_neighbors;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_positions;
+  __Pyx_Buffer __pyx_pybuffer_positions;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  int __pyx_t_5;
+  int __pyx_t_6;
+  Py_ssize_t __pyx_t_7;
+  PY_LONG_LONG __pyx_t_8;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_9;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_cis_fend_neighbors", 0);
+  __pyx_pybuffer_data.pybuffer.buf = NULL;
+  __pyx_pybuffer_data.refcount = 0;
+  __pyx_pybuffernd_data.data = NULL;
+  __pyx_pybuffernd_data.rcbuffer = &__pyx_pybuffer_data;
+  __pyx_pybuffer_data_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_data_indices.refcount = 0;
+  __pyx_pybuffernd_data_indices.data = NULL;
+  __pyx_pybuffernd_data_indices.rcbuffer = &__pyx_pybuffer_data_indices;
+  __pyx_pybuffer_filter.pybuffer.buf = NULL;
+  __pyx_pybuffer_filter.refcount = 0;
+  __pyx_pybuffernd_filter.data = NULL;
+  __pyx_pybuffernd_filter.rcbuffer = &__pyx_pybuffer_filter;
+  __pyx_pybuffer_min_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_min_fend.refcount = 0;
+  __pyx_pybuffernd_min_fend.data = NULL;
+  __pyx_pybuffernd_min_fend.rcbuffer = &__pyx_pybuffer_min_fend;
+  __pyx_pybuffer_max_fend.pybuffer.buf = NULL;
+  __pyx_pybuffer_max_fend.refcount = 0;
+  __pyx_pybuffernd_max_fend.data = NULL;
+  __pyx_pybuffernd_max_fend.rcbuffer = &__pyx_pybuffer_max_fend;
+  __pyx_pybuffer_positions.pybuffer.buf = NULL;
+  __pyx_pybuffer_positions.refcount = 0;
+  __pyx_pybuffernd_positions.data = NULL;
+  __pyx_pybuffernd_positions.rcbuffer = &__pyx_pybuffer_positions;
+  __pyx_pybuffer_neighbors.pybuffer.buf = NULL;
+  __pyx_pybuffer_neighbors.refcount = 0;
+  __pyx_pybuffernd_neighbors.data = NULL;
+  __pyx_pybuffernd_neighbors.rcbuffer = &__pyx_pybuffer_neighbors;
+  __pyx_pybuffer_coverage.pybuffer.buf = NULL;
+  __pyx_pybuffer_coverage.refcount = 0;
+  __pyx_pybuffernd_coverage.data = NULL;
+  __pyx_pybuffernd_coverage.rcbuffer = &__pyx_pybuffer_coverage;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data.rcbuffer->pybuffer, (PyObject*)__pyx_v_data, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data.diminfo[0].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data.diminfo[0].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_data.diminfo[1].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_data.diminfo[1].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_data_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data_indices.diminfo[0].strides = __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data_indices.diminfo[0].shape = __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_filter.rcbuffer->pybuffer, (PyObject*)__pyx_v_filter, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_filter.diminfo[0].strides = __pyx_pybuffernd_filter.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_filter.diminfo[0].shape = __pyx_pybuffernd_filter.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_min_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_min_fend.diminfo[0].strides = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_min_fend.diminfo[0].shape = __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer, (PyObject*)__pyx_v_max_fend, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_max_fend.diminfo[0].strides = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_max_fend.diminfo[0].shape = __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_positions.rcbuffer->pybuffer, (PyObject*)__pyx_v_positions, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_positions.diminfo[0].strides = __pyx_pybuffernd_positions.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_positions.diminfo[0].shape = __pyx_pybuffernd_positions.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer, (PyObject*)__pyx_v_neighbors, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_neighbors.diminfo[0].strides = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_neighbors.diminfo[0].shape = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer, (PyObject*)__pyx_v_coverage, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 138, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_coverage.diminfo[0].strides = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_coverage.diminfo[0].shape = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":148
+ *         np.ndarray[DTYPE_int_t, ndim=1] coverage not None):
+ *     cdef long long int i, fend1, fend2
+ *     cdef long long int num_fends = filter.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:
+ */
+  __pyx_v_num_fends = (__pyx_v_filter->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":149
+ *     cdef long long int i, fend1, fend2
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         for fend1 in range(num_fends):
+ */
+  __pyx_v_fill = ((__pyx_v_neighbors->dimensions[0]) > 0);
+
+  /* "hifive/libraries/_hic_interactions.pyx":150
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":151
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:
+ *         for fend1 in range(num_fends):             # <<<<<<<<<<<<<<
+ *             if filter[fend1] == 0:
+ *                 continue
+ */
+        __pyx_t_1 = __pyx_v_num_fends;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_fend1 = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":152
+ *     with nogil:
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             i = data_indices[fend1]
+ */
+          __pyx_t_4 = __pyx_v_fend1;
+          __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+          if (__pyx_t_5) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":153
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:
+ *                 continue             # <<<<<<<<<<<<<<
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ */
+            goto __pyx_L6_continue;
+
+            /* "hifive/libraries/_hic_interactions.pyx":152
+ *     with nogil:
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             i = data_indices[fend1]
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":154
+ *             if filter[fend1] == 0:
+ *                 continue
+ *             i = data_indices[fend1]             # <<<<<<<<<<<<<<
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1
+ */
+          __pyx_t_4 = __pyx_v_fend1;
+          __pyx_v_i = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data_indices.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":155
+ *                 continue
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:             # <<<<<<<<<<<<<<
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ */
+          while (1) {
+            __pyx_t_4 = (__pyx_v_fend1 + 1);
+            __pyx_t_6 = ((__pyx_v_i < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data_indices.diminfo[0].strides))) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L11_bool_binop_done;
+            }
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_8 = __pyx_v_fend1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_min_fend.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_min_fend.diminfo[0].strides))) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L11_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":156
+ *             i = data_indices[fend1]
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1             # <<<<<<<<<<<<<<
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 fend2 = data[i, 1]
+ */
+            __pyx_v_i = (__pyx_v_i + 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":157
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:             # <<<<<<<<<<<<<<
+ *                 fend2 = data[i, 1]
+ *                 if filter[fend2] == 1:
+ */
+          while (1) {
+            __pyx_t_8 = (__pyx_v_fend1 + 1);
+            __pyx_t_6 = ((__pyx_v_i < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_data_indices.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_data_indices.diminfo[0].strides))) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L15_bool_binop_done;
+            }
+            __pyx_t_8 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_4 = __pyx_v_fend1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_max_fend.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_max_fend.diminfo[0].strides))) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L15_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":158
+ *                 i += 1
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 fend2 = data[i, 1]             # <<<<<<<<<<<<<<
+ *                 if filter[fend2] == 1:
+ *                     if fend1 == fend2:
+ */
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_v_fend2 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_data.diminfo[1].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":159
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 fend2 = data[i, 1]
+ *                 if filter[fend2] == 1:             # <<<<<<<<<<<<<<
+ *                     if fend1 == fend2:
+ *                         if fill == 0:
+ */
+            __pyx_t_4 = __pyx_v_fend2;
+            __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_filter.diminfo[0].strides)) == 1) != 0);
+            if (__pyx_t_5) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":160
+ *                 fend2 = data[i, 1]
+ *                 if filter[fend2] == 1:
+ *                     if fend1 == fend2:             # <<<<<<<<<<<<<<
+ *                         if fill == 0:
+ *                             coverage[fend1] += 1
+ */
+              __pyx_t_5 = ((__pyx_v_fend1 == __pyx_v_fend2) != 0);
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":161
+ *                 if filter[fend2] == 1:
+ *                     if fend1 == fend2:
+ *                         if fill == 0:             # <<<<<<<<<<<<<<
+ *                             coverage[fend1] += 1
+ *                     elif fill == 0:
+ */
+                __pyx_t_5 = ((__pyx_v_fill == 0) != 0);
+                if (__pyx_t_5) {
+
+                  /* "hifive/libraries/_hic_interactions.pyx":162
+ *                     if fend1 == fend2:
+ *                         if fill == 0:
+ *                             coverage[fend1] += 1             # <<<<<<<<<<<<<<
+ *                     elif fill == 0:
+ *                         coverage[fend1] += 1
+ */
+                  __pyx_t_4 = __pyx_v_fend1;
+                  *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+                  /* "hifive/libraries/_hic_interactions.pyx":161
+ *                 if filter[fend2] == 1:
+ *                     if fend1 == fend2:
+ *                         if fill == 0:             # <<<<<<<<<<<<<<
+ *                             coverage[fend1] += 1
+ *                     elif fill == 0:
+ */
+                }
+
+                /* "hifive/libraries/_hic_interactions.pyx":160
+ *                 fend2 = data[i, 1]
+ *                 if filter[fend2] == 1:
+ *                     if fend1 == fend2:             # <<<<<<<<<<<<<<
+ *                         if fill == 0:
+ *                             coverage[fend1] += 1
+ */
+                goto __pyx_L18;
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":163
+ *                         if fill == 0:
+ *                             coverage[fend1] += 1
+ *                     elif fill == 0:             # <<<<<<<<<<<<<<
+ *                         coverage[fend1] += 1
+ *                         coverage[fend2] += 1
+ */
+              __pyx_t_5 = ((__pyx_v_fill == 0) != 0);
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":164
+ *                             coverage[fend1] += 1
+ *                     elif fill == 0:
+ *                         coverage[fend1] += 1             # <<<<<<<<<<<<<<
+ *                         coverage[fend2] += 1
+ *                         positions[fend1] += 1
+ */
+                __pyx_t_4 = __pyx_v_fend1;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":165
+ *                     elif fill == 0:
+ *                         coverage[fend1] += 1
+ *                         coverage[fend2] += 1             # <<<<<<<<<<<<<<
+ *                         positions[fend1] += 1
+ *                         positions[fend2] += 1
+ */
+                __pyx_t_4 = __pyx_v_fend2;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":166
+ *                         coverage[fend1] += 1
+ *                         coverage[fend2] += 1
+ *                         positions[fend1] += 1             # <<<<<<<<<<<<<<
+ *                         positions[fend2] += 1
+ *                     else:
+ */
+                __pyx_t_4 = __pyx_v_fend1;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":167
+ *                         coverage[fend2] += 1
+ *                         positions[fend1] += 1
+ *                         positions[fend2] += 1             # <<<<<<<<<<<<<<
+ *                     else:
+ *                         neighbors[positions[fend1]] = fend2
+ */
+                __pyx_t_4 = __pyx_v_fend2;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":163
+ *                         if fill == 0:
+ *                             coverage[fend1] += 1
+ *                     elif fill == 0:             # <<<<<<<<<<<<<<
+ *                         coverage[fend1] += 1
+ *                         coverage[fend2] += 1
+ */
+                goto __pyx_L18;
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":169
+ *                         positions[fend2] += 1
+ *                     else:
+ *                         neighbors[positions[fend1]] = fend2             # <<<<<<<<<<<<<<
+ *                         positions[fend1] += 1
+ *                         neighbors[positions[fend2]] = fend1
+ */
+              /*else*/ {
+                __pyx_t_4 = __pyx_v_fend1;
+                __pyx_t_9 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides));
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_neighbors.diminfo[0].strides) = __pyx_v_fend2;
+
+                /* "hifive/libraries/_hic_interactions.pyx":170
+ *                     else:
+ *                         neighbors[positions[fend1]] = fend2
+ *                         positions[fend1] += 1             # <<<<<<<<<<<<<<
+ *                         neighbors[positions[fend2]] = fend1
+ *                         positions[fend2] += 1
+ */
+                __pyx_t_4 = __pyx_v_fend1;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":171
+ *                         neighbors[positions[fend1]] = fend2
+ *                         positions[fend1] += 1
+ *                         neighbors[positions[fend2]] = fend1             # <<<<<<<<<<<<<<
+ *                         positions[fend2] += 1
+ *                 i += 1
+ */
+                __pyx_t_4 = __pyx_v_fend2;
+                __pyx_t_9 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides));
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_neighbors.diminfo[0].strides) = __pyx_v_fend1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":172
+ *                         positions[fend1] += 1
+ *                         neighbors[positions[fend2]] = fend1
+ *                         positions[fend2] += 1             # <<<<<<<<<<<<<<
+ *                 i += 1
+ *     return None
+ */
+                __pyx_t_4 = __pyx_v_fend2;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+              }
+              __pyx_L18:;
+
+              /* "hifive/libraries/_hic_interactions.pyx":159
+ *             while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+ *                 fend2 = data[i, 1]
+ *                 if filter[fend2] == 1:             # <<<<<<<<<<<<<<
+ *                     if fend1 == fend2:
+ *                         if fill == 0:
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":173
+ *                         neighbors[positions[fend2]] = fend1
+ *                         positions[fend2] += 1
+ *                 i += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_v_i = (__pyx_v_i + 1);
+          }
+          __pyx_L6_continue:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":150
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for fend1 in range(num_fends):
+ *             if filter[fend1] == 0:
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":174
+ *                         positions[fend2] += 1
+ *                 i += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":138
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_cis_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_positions.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_cis_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_max_fend.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_min_fend.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_positions.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":180
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_trans_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_11find_trans_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_11find_trans_fend_neighbors = {"find_trans_fend_neighbors", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_11find_trans_fend_neighbors, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_11find_trans_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_data = 0;
+  PyArrayObject *__pyx_v_filter = 0;
+  PyArrayObject *__pyx_v_positions = 0;
+  PyArrayObject *__pyx_v_neighbors = 0;
+  PyArrayObject *__pyx_v_coverage = 0;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_trans_fend_neighbors (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_data,&__pyx_n_s_filter,&__pyx_n_s_positions,&__pyx_n_s_neighbors,&__pyx_n_s_coverage,0};
+    PyObject* values[5] = {0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_filter)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_trans_fend_neighbors", 1, 5, 5, 1); __PYX_ERR(0, 180, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_positions)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_trans_fend_neighbors", 1, 5, 5, 2); __PYX_ERR(0, 180, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_neighbors)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_trans_fend_neighbors", 1, 5, 5, 3); __PYX_ERR(0, 180, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_coverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_trans_fend_neighbors", 1, 5, 5, 4); __PYX_ERR(0, 180, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_trans_fend_neighbors") < 0)) __PYX_ERR(0, 180, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 5) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+    }
+    __pyx_v_data = ((PyArrayObject *)values[0]);
+    __pyx_v_filter = ((PyArrayObject *)values[1]);
+    __pyx_v_positions = ((PyArrayObject *)values[2]);
+    __pyx_v_neighbors = ((PyArrayObject *)values[3]);
+    __pyx_v_coverage = ((PyArrayObject *)values[4]);
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_trans_fend_neighbors", 1, 5, 5, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 180, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_trans_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data), __pyx_ptype_5numpy_ndarray, 0, "data", 0))) __PYX_ERR(0, 181, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_filter), __pyx_ptype_5numpy_ndarray, 0, "filter", 0))) __PYX_ERR(0, 182, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_positions), __pyx_ptype_5numpy_ndarray, 0, "positions", 0))) __PYX_ERR(0, 183, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_neighbors), __pyx_ptype_5numpy_ndarray, 0, "neighbors", 0))) __PYX_ERR(0, 184, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_coverage), __pyx_ptype_5numpy_ndarray, 0, "coverage", 0))) __PYX_ERR(0, 185, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_10find_trans_fend_neighbors(__pyx_self, __pyx_v_data, __pyx_v_filter, __pyx_v_positions, __pyx_v_neighbors, __pyx_v_coverage);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_10find_trans_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_positions, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_coverage) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_fend1;
+  PY_LONG_LONG __pyx_v_fend2;
+  PY_LONG_LONG __pyx_v_num_data;
+  int __pyx_v_fill;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_coverage;
+  __Pyx_Buffer __pyx_pybuffer_coverage;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data;
+  __Pyx_Buffer __pyx_pybuffer_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_filter;
+  __Pyx_Buffer __pyx_pybuffer_filter;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_neighbors;
+  __Pyx_Buffer __pyx_pybuffer_neighbors;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_positions;
+  __Pyx_Buffer __pyx_pybuffer_positions;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  Py_ssize_t __pyx_t_5;
+  int __pyx_t_6;
+  int __pyx_t_7;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_8;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_trans_fend_neighbors", 0);
+  __pyx_pybuffer_data.pybuffer.buf = NULL;
+  __pyx_pybuffer_data.refcount = 0;
+  __pyx_pybuffernd_data.data = NULL;
+  __pyx_pybuffernd_data.rcbuffer = &__pyx_pybuffer_data;
+  __pyx_pybuffer_filter.pybuffer.buf = NULL;
+  __pyx_pybuffer_filter.refcount = 0;
+  __pyx_pybuffernd_filter.data = NULL;
+  __pyx_pybuffernd_filter.rcbuffer = &__pyx_pybuffer_filter;
+  __pyx_pybuffer_positions.pybuffer.buf = NULL;
+  __pyx_pybuffer_positions.refcount = 0;
+  __pyx_pybuffernd_positions.data = NULL;
+  __pyx_pybuffernd_positions.rcbuffer = &__pyx_pybuffer_positions;
+  __pyx_pybuffer_neighbors.pybuffer.buf = NULL;
+  __pyx_pybuffer_neighbors.refcount = 0;
+  __pyx_pybuffernd_neighbors.data = NULL;
+  __pyx_pybuffernd_neighbors.rcbuffer = &__pyx_pybuffer_neighbors;
+  __pyx_pybuffer_coverage.pybuffer.buf = NULL;
+  __pyx_pybuffer_coverage.refcount = 0;
+  __pyx_pybuffernd_coverage.data = NULL;
+  __pyx_pybuffernd_coverage.rcbuffer = &__pyx_pybuffer_coverage;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data.rcbuffer->pybuffer, (PyObject*)__pyx_v_data, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 180, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data.diminfo[0].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data.diminfo[0].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_data.diminfo[1].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_data.diminfo[1].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_filter.rcbuffer->pybuffer, (PyObject*)__pyx_v_filter, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 180, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_filter.diminfo[0].strides = __pyx_pybuffernd_filter.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_filter.diminfo[0].shape = __pyx_pybuffernd_filter.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_positions.rcbuffer->pybuffer, (PyObject*)__pyx_v_positions, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 180, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_positions.diminfo[0].strides = __pyx_pybuffernd_positions.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_positions.diminfo[0].shape = __pyx_pybuffernd_positions.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer, (PyObject*)__pyx_v_neighbors, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 180, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_neighbors.diminfo[0].strides = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_neighbors.diminfo[0].shape = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer, (PyObject*)__pyx_v_coverage, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 180, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_coverage.diminfo[0].strides = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_coverage.diminfo[0].shape = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":187
+ *         np.ndarray[DTYPE_int_t, ndim=1] coverage not None):
+ *     cdef long long int i, fend1, fend2
+ *     cdef long long int num_data = data.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:
+ */
+  __pyx_v_num_data = (__pyx_v_data->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":188
+ *     cdef long long int i, fend1, fend2
+ *     cdef long long int num_data = data.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         for i in range(num_data):
+ */
+  __pyx_v_fill = ((__pyx_v_neighbors->dimensions[0]) > 0);
+
+  /* "hifive/libraries/_hic_interactions.pyx":189
+ *     cdef long long int num_data = data.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for i in range(num_data):
+ *             fend1 = data[i, 0]
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":190
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:
+ *         for i in range(num_data):             # <<<<<<<<<<<<<<
+ *             fend1 = data[i, 0]
+ *             fend2 = data[i, 1]
+ */
+        __pyx_t_1 = __pyx_v_num_data;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":191
+ *     with nogil:
+ *         for i in range(num_data):
+ *             fend1 = data[i, 0]             # <<<<<<<<<<<<<<
+ *             fend2 = data[i, 1]
+ *             if filter[fend1] == 0 or filter[fend2] == 0:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = 0;
+          __pyx_v_fend1 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":192
+ *         for i in range(num_data):
+ *             fend1 = data[i, 0]
+ *             fend2 = data[i, 1]             # <<<<<<<<<<<<<<
+ *             if filter[fend1] == 0 or filter[fend2] == 0:
+ *                 continue
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = 1;
+          __pyx_v_fend2 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":193
+ *             fend1 = data[i, 0]
+ *             fend2 = data[i, 1]
+ *             if filter[fend1] == 0 or filter[fend2] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if fill == 0:
+ */
+          __pyx_t_4 = __pyx_v_fend1;
+          __pyx_t_7 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+          if (!__pyx_t_7) {
+          } else {
+            __pyx_t_6 = __pyx_t_7;
+            goto __pyx_L9_bool_binop_done;
+          }
+          __pyx_t_4 = __pyx_v_fend2;
+          __pyx_t_7 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+          __pyx_t_6 = __pyx_t_7;
+          __pyx_L9_bool_binop_done:;
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":194
+ *             fend2 = data[i, 1]
+ *             if filter[fend1] == 0 or filter[fend2] == 0:
+ *                 continue             # <<<<<<<<<<<<<<
+ *             if fill == 0:
+ *                 coverage[fend1] += 1
+ */
+            goto __pyx_L6_continue;
+
+            /* "hifive/libraries/_hic_interactions.pyx":193
+ *             fend1 = data[i, 0]
+ *             fend2 = data[i, 1]
+ *             if filter[fend1] == 0 or filter[fend2] == 0:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if fill == 0:
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":195
+ *             if filter[fend1] == 0 or filter[fend2] == 0:
+ *                 continue
+ *             if fill == 0:             # <<<<<<<<<<<<<<
+ *                 coverage[fend1] += 1
+ *                 coverage[fend2] += 1
+ */
+          __pyx_t_6 = ((__pyx_v_fill == 0) != 0);
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":196
+ *                 continue
+ *             if fill == 0:
+ *                 coverage[fend1] += 1             # <<<<<<<<<<<<<<
+ *                 coverage[fend2] += 1
+ *                 positions[fend1] += 1
+ */
+            __pyx_t_4 = __pyx_v_fend1;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":197
+ *             if fill == 0:
+ *                 coverage[fend1] += 1
+ *                 coverage[fend2] += 1             # <<<<<<<<<<<<<<
+ *                 positions[fend1] += 1
+ *                 positions[fend2] += 1
+ */
+            __pyx_t_4 = __pyx_v_fend2;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_coverage.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":198
+ *                 coverage[fend1] += 1
+ *                 coverage[fend2] += 1
+ *                 positions[fend1] += 1             # <<<<<<<<<<<<<<
+ *                 positions[fend2] += 1
+ *             else:
+ */
+            __pyx_t_4 = __pyx_v_fend1;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":199
+ *                 coverage[fend2] += 1
+ *                 positions[fend1] += 1
+ *                 positions[fend2] += 1             # <<<<<<<<<<<<<<
+ *             else:
+ *                 neighbors[positions[fend1]] = fend2
+ */
+            __pyx_t_4 = __pyx_v_fend2;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":195
+ *             if filter[fend1] == 0 or filter[fend2] == 0:
+ *                 continue
+ *             if fill == 0:             # <<<<<<<<<<<<<<
+ *                 coverage[fend1] += 1
+ *                 coverage[fend2] += 1
+ */
+            goto __pyx_L11;
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":201
+ *                 positions[fend2] += 1
+ *             else:
+ *                 neighbors[positions[fend1]] = fend2             # <<<<<<<<<<<<<<
+ *                 positions[fend1] += 1
+ *                 neighbors[positions[fend2]] = fend1
+ */
+          /*else*/ {
+            __pyx_t_4 = __pyx_v_fend1;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_neighbors.diminfo[0].strides) = __pyx_v_fend2;
+
+            /* "hifive/libraries/_hic_interactions.pyx":202
+ *             else:
+ *                 neighbors[positions[fend1]] = fend2
+ *                 positions[fend1] += 1             # <<<<<<<<<<<<<<
+ *                 neighbors[positions[fend2]] = fend1
+ *                 positions[fend2] += 1
+ */
+            __pyx_t_4 = __pyx_v_fend1;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":203
+ *                 neighbors[positions[fend1]] = fend2
+ *                 positions[fend1] += 1
+ *                 neighbors[positions[fend2]] = fend1             # <<<<<<<<<<<<<<
+ *                 positions[fend2] += 1
+ *     return None
+ */
+            __pyx_t_4 = __pyx_v_fend2;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_neighbors.diminfo[0].strides) = __pyx_v_fend1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":204
+ *                 positions[fend1] += 1
+ *                 neighbors[positions[fend2]] = fend1
+ *                 positions[fend2] += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_t_4 = __pyx_v_fend2;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_positions.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_positions.diminfo[0].strides) += 1;
+          }
+          __pyx_L11:;
+          __pyx_L6_continue:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":189
+ *     cdef long long int num_data = data.shape[0]
+ *     cdef int fill = neighbors.shape[0] > 0
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for i in range(num_data):
+ *             fend1 = data[i, 0]
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":205
+ *                 neighbors[positions[fend2]] = fend1
+ *                 positions[fend2] += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":180
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_trans_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_positions.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_trans_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_positions.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":211
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def filter_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] neighbor_indices not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_13filter_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_13filter_fend_neighbors = {"filter_fend_neighbors", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_13filter_fend_neighbors, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_13filter_fend_neighbors(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_neighbor_indices = 0;
+  PyArrayObject *__pyx_v_neighbors = 0;
+  PyArrayObject *__pyx_v_filter = 0;
+  PyArrayObject *__pyx_v_coverage = 0;
+  int __pyx_v_mincoverage;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("filter_fend_neighbors (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_neighbor_indices,&__pyx_n_s_neighbors,&__pyx_n_s_filter,&__pyx_n_s_coverage,&__pyx_n_s_mincoverage,0};
+    PyObject* values[5] = {0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_neighbor_indices)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_neighbors)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("filter_fend_neighbors", 1, 5, 5, 1); __PYX_ERR(0, 211, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_filter)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("filter_fend_neighbors", 1, 5, 5, 2); __PYX_ERR(0, 211, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_coverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("filter_fend_neighbors", 1, 5, 5, 3); __PYX_ERR(0, 211, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mincoverage)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("filter_fend_neighbors", 1, 5, 5, 4); __PYX_ERR(0, 211, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "filter_fend_neighbors") < 0)) __PYX_ERR(0, 211, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 5) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+    }
+    __pyx_v_neighbor_indices = ((PyArrayObject *)values[0]);
+    __pyx_v_neighbors = ((PyArrayObject *)values[1]);
+    __pyx_v_filter = ((PyArrayObject *)values[2]);
+    __pyx_v_coverage = ((PyArrayObject *)values[3]);
+    __pyx_v_mincoverage = __Pyx_PyInt_As_int(values[4]); if (unlikely((__pyx_v_mincoverage == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 216, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("filter_fend_neighbors", 1, 5, 5, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 211, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.filter_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_neighbor_indices), __pyx_ptype_5numpy_ndarray, 0, "neighbor_indices", 0))) __PYX_ERR(0, 212, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_neighbors), __pyx_ptype_5numpy_ndarray, 0, "neighbors", 0))) __PYX_ERR(0, 213, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_filter), __pyx_ptype_5numpy_ndarray, 0, "filter", 0))) __PYX_ERR(0, 214, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_coverage), __pyx_ptype_5numpy_ndarray, 0, "coverage", 0))) __PYX_ERR(0, 215, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_12filter_fend_neighbors(__pyx_self, __pyx_v_neighbor_indices, __pyx_v_neighbors, __pyx_v_filter, __pyx_v_coverage, __pyx_v_mincoverage);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_12filter_fend_neighbors(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_neighbor_indices, PyArrayObject *__pyx_v_neighbors, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_coverage, int __pyx_v_mincoverage) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_fend1;
+  PY_LONG_LONG __pyx_v_fend2;
+  PY_LONG_LONG __pyx_v_num_removed;
+  PY_LONG_LONG __pyx_v_num_fends;
+  PyArrayObject *__pyx_v_removed = 0;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_coverage;
+  __Pyx_Buffer __pyx_pybuffer_coverage;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_filter;
+  __Pyx_Buffer __pyx_pybuffer_filter;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_neighbor_indices;
+  __Pyx_Buffer __pyx_pybuffer_neighbor_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_neighbors;
+  __Pyx_Buffer __pyx_pybuffer_neighbors;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_removed;
+  __Pyx_Buffer __pyx_pybuffer_removed;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  PyObject *__pyx_t_3 = NULL;
+  PyObject *__pyx_t_4 = NULL;
+  PyObject *__pyx_t_5 = NULL;
+  PyArrayObject *__pyx_t_6 = NULL;
+  PY_LONG_LONG __pyx_t_7;
+  PY_LONG_LONG __pyx_t_8;
+  PY_LONG_LONG __pyx_t_9;
+  int __pyx_t_10;
+  PY_LONG_LONG __pyx_t_11;
+  int __pyx_t_12;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_13;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_14;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("filter_fend_neighbors", 0);
+  __pyx_pybuffer_removed.pybuffer.buf = NULL;
+  __pyx_pybuffer_removed.refcount = 0;
+  __pyx_pybuffernd_removed.data = NULL;
+  __pyx_pybuffernd_removed.rcbuffer = &__pyx_pybuffer_removed;
+  __pyx_pybuffer_neighbor_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_neighbor_indices.refcount = 0;
+  __pyx_pybuffernd_neighbor_indices.data = NULL;
+  __pyx_pybuffernd_neighbor_indices.rcbuffer = &__pyx_pybuffer_neighbor_indices;
+  __pyx_pybuffer_neighbors.pybuffer.buf = NULL;
+  __pyx_pybuffer_neighbors.refcount = 0;
+  __pyx_pybuffernd_neighbors.data = NULL;
+  __pyx_pybuffernd_neighbors.rcbuffer = &__pyx_pybuffer_neighbors;
+  __pyx_pybuffer_filter.pybuffer.buf = NULL;
+  __pyx_pybuffer_filter.refcount = 0;
+  __pyx_pybuffernd_filter.data = NULL;
+  __pyx_pybuffernd_filter.rcbuffer = &__pyx_pybuffer_filter;
+  __pyx_pybuffer_coverage.pybuffer.buf = NULL;
+  __pyx_pybuffer_coverage.refcount = 0;
+  __pyx_pybuffernd_coverage.data = NULL;
+  __pyx_pybuffernd_coverage.rcbuffer = &__pyx_pybuffer_coverage;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_neighbor_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 211, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_neighbor_indices.diminfo[0].strides = __pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_neighbor_indices.diminfo[0].shape = __pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer, (PyObject*)__pyx_v_neighbors, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 211, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_neighbors.diminfo[0].strides = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_neighbors.diminfo[0].shape = __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_filter.rcbuffer->pybuffer, (PyObject*)__pyx_v_filter, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 211, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_filter.diminfo[0].strides = __pyx_pybuffernd_filter.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_filter.diminfo[0].shape = __pyx_pybuffernd_filter.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer, (PyObject*)__pyx_v_coverage, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 211, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_coverage.diminfo[0].strides = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_coverage.diminfo[0].shape = __pyx_pybuffernd_coverage.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":218
+ *         int mincoverage):
+ *     cdef long long int i, j, fend1, fend2, num_removed
+ *     cdef long long int num_fends = filter.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)
+ *     with nogil:
+ */
+  __pyx_v_num_fends = (__pyx_v_filter->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":219
+ *     cdef long long int i, j, fend1, fend2, num_removed
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         num_removed = 0
+ */
+  __Pyx_GetModuleGlobalName(__pyx_t_1, __pyx_n_s_numpy); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_2 = __Pyx_PyObject_GetAttrStr(__pyx_t_1, __pyx_n_s_zeros); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __pyx_t_1 = __Pyx_PyInt_From_PY_LONG_LONG(__pyx_v_num_fends); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_3 = PyTuple_New(1); if (unlikely(!__pyx_t_3)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_3);
+  __Pyx_GIVEREF(__pyx_t_1);
+  PyTuple_SET_ITEM(__pyx_t_3, 0, __pyx_t_1);
+  __pyx_t_1 = 0;
+  __pyx_t_1 = __Pyx_PyDict_NewPresized(1); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __Pyx_GetModuleGlobalName(__pyx_t_4, __pyx_n_s_numpy); if (unlikely(!__pyx_t_4)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_4);
+  __pyx_t_5 = __Pyx_PyObject_GetAttrStr(__pyx_t_4, __pyx_n_s_int32); if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+  if (PyDict_SetItem(__pyx_t_1, __pyx_n_s_dtype, __pyx_t_5) < 0) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_5); __pyx_t_5 = 0;
+  __pyx_t_5 = __Pyx_PyObject_Call(__pyx_t_2, __pyx_t_3, __pyx_t_1); if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 219, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+  __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  if (!(likely(((__pyx_t_5) == Py_None) || likely(__Pyx_TypeTest(__pyx_t_5, __pyx_ptype_5numpy_ndarray))))) __PYX_ERR(0, 219, __pyx_L1_error)
+  __pyx_t_6 = ((PyArrayObject *)__pyx_t_5);
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_removed.rcbuffer->pybuffer, (PyObject*)__pyx_t_6, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) {
+      __pyx_v_removed = ((PyArrayObject *)Py_None); __Pyx_INCREF(Py_None); __pyx_pybuffernd_removed.rcbuffer->pybuffer.buf = NULL;
+      __PYX_ERR(0, 219, __pyx_L1_error)
+    } else {__pyx_pybuffernd_removed.diminfo[0].strides = __pyx_pybuffernd_removed.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_removed.diminfo[0].shape = __pyx_pybuffernd_removed.rcbuffer->pybuffer.shape[0];
+    }
+  }
+  __pyx_t_6 = 0;
+  __pyx_v_removed = ((PyArrayObject *)__pyx_t_5);
+  __pyx_t_5 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":220
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         num_removed = 0
+ *         for i in range(num_fends):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":221
+ *     cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)
+ *     with nogil:
+ *         num_removed = 0             # <<<<<<<<<<<<<<
+ *         for i in range(num_fends):
+ *             if filter[i] == 1 and coverage[i] < mincoverage:
+ */
+        __pyx_v_num_removed = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":222
+ *     with nogil:
+ *         num_removed = 0
+ *         for i in range(num_fends):             # <<<<<<<<<<<<<<
+ *             if filter[i] == 1 and coverage[i] < mincoverage:
+ *                 filter[i] = 0
+ */
+        __pyx_t_7 = __pyx_v_num_fends;
+        __pyx_t_8 = __pyx_t_7;
+        for (__pyx_t_9 = 0; __pyx_t_9 < __pyx_t_8; __pyx_t_9+=1) {
+          __pyx_v_i = __pyx_t_9;
+
+          /* "hifive/libraries/_hic_interactions.pyx":223
+ *         num_removed = 0
+ *         for i in range(num_fends):
+ *             if filter[i] == 1 and coverage[i] < mincoverage:             # <<<<<<<<<<<<<<
+ *                 filter[i] = 0
+ *                 removed[num_removed] = i
+ */
+          __pyx_t_11 = __pyx_v_i;
+          __pyx_t_12 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_filter.diminfo[0].strides)) == 1) != 0);
+          if (__pyx_t_12) {
+          } else {
+            __pyx_t_10 = __pyx_t_12;
+            goto __pyx_L9_bool_binop_done;
+          }
+          __pyx_t_11 = __pyx_v_i;
+          __pyx_t_12 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_coverage.diminfo[0].strides)) < __pyx_v_mincoverage) != 0);
+          __pyx_t_10 = __pyx_t_12;
+          __pyx_L9_bool_binop_done:;
+          if (__pyx_t_10) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":224
+ *         for i in range(num_fends):
+ *             if filter[i] == 1 and coverage[i] < mincoverage:
+ *                 filter[i] = 0             # <<<<<<<<<<<<<<
+ *                 removed[num_removed] = i
+ *                 num_removed += 1
+ */
+            __pyx_t_11 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_filter.diminfo[0].strides) = 0;
+
+            /* "hifive/libraries/_hic_interactions.pyx":225
+ *             if filter[i] == 1 and coverage[i] < mincoverage:
+ *                 filter[i] = 0
+ *                 removed[num_removed] = i             # <<<<<<<<<<<<<<
+ *                 num_removed += 1
+ *         # each removed fend lowers the coverage of its remaining partners, which may remove them in turn
+ */
+            __pyx_t_11 = __pyx_v_num_removed;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_removed.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_removed.diminfo[0].strides) = __pyx_v_i;
+
+            /* "hifive/libraries/_hic_interactions.pyx":226
+ *                 filter[i] = 0
+ *                 removed[num_removed] = i
+ *                 num_removed += 1             # <<<<<<<<<<<<<<
+ *         # each removed fend lowers the coverage of its remaining partners, which may remove them in turn
+ *         while num_removed > 0:
+ */
+            __pyx_v_num_removed = (__pyx_v_num_removed + 1);
+
+            /* "hifive/libraries/_hic_interactions.pyx":223
+ *         num_removed = 0
+ *         for i in range(num_fends):
+ *             if filter[i] == 1 and coverage[i] < mincoverage:             # <<<<<<<<<<<<<<
+ *                 filter[i] = 0
+ *                 removed[num_removed] = i
+ */
+          }
+        }
+
+        /* "hifive/libraries/_hic_interactions.pyx":228
+ *                 num_removed += 1
+ *         # each removed fend lowers the coverage of its remaining partners, which may remove them in turn
+ *         while num_removed > 0:             # <<<<<<<<<<<<<<
+ *             num_removed -= 1
+ *             fend1 = removed[num_removed]
+ */
+        while (1) {
+          __pyx_t_10 = ((__pyx_v_num_removed > 0) != 0);
+          if (!__pyx_t_10) break;
+
+          /* "hifive/libraries/_hic_interactions.pyx":229
+ *         # each removed fend lowers the coverage of its remaining partners, which may remove them in turn
+ *         while num_removed > 0:
+ *             num_removed -= 1             # <<<<<<<<<<<<<<
+ *             fend1 = removed[num_removed]
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+ */
+          __pyx_v_num_removed = (__pyx_v_num_removed - 1);
+
+          /* "hifive/libraries/_hic_interactions.pyx":230
+ *         while num_removed > 0:
+ *             num_removed -= 1
+ *             fend1 = removed[num_removed]             # <<<<<<<<<<<<<<
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+ *                 fend2 = neighbors[j]
+ */
+          __pyx_t_7 = __pyx_v_num_removed;
+          __pyx_v_fend1 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_removed.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_removed.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":231
+ *             num_removed -= 1
+ *             fend1 = removed[num_removed]
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):             # <<<<<<<<<<<<<<
+ *                 fend2 = neighbors[j]
+ *                 if filter[fend2] == 0:
+ */
+          __pyx_t_7 = (__pyx_v_fend1 + 1);
+          __pyx_t_13 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_neighbor_indices.diminfo[0].strides));
+          __pyx_t_7 = __pyx_v_fend1;
+          __pyx_t_14 = __pyx_t_13;
+          for (__pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_neighbor_indices.diminfo[0].strides)); __pyx_t_8 < __pyx_t_14; __pyx_t_8+=1) {
+            __pyx_v_j = __pyx_t_8;
+
+            /* "hifive/libraries/_hic_interactions.pyx":232
+ *             fend1 = removed[num_removed]
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+ *                 fend2 = neighbors[j]             # <<<<<<<<<<<<<<
+ *                 if filter[fend2] == 0:
+ *                     continue
+ */
+            __pyx_t_9 = __pyx_v_j;
+            __pyx_v_fend2 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_neighbors.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_neighbors.diminfo[0].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":233
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+ *                 fend2 = neighbors[j]
+ *                 if filter[fend2] == 0:             # <<<<<<<<<<<<<<
+ *                     continue
+ *                 coverage[fend2] -= 1
+ */
+            __pyx_t_9 = __pyx_v_fend2;
+            __pyx_t_10 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+            if (__pyx_t_10) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":234
+ *                 fend2 = neighbors[j]
+ *                 if filter[fend2] == 0:
+ *                     continue             # <<<<<<<<<<<<<<
+ *                 coverage[fend2] -= 1
+ *                 if coverage[fend2] < mincoverage:
+ */
+              goto __pyx_L13_continue;
+
+              /* "hifive/libraries/_hic_interactions.pyx":233
+ *             for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+ *                 fend2 = neighbors[j]
+ *                 if filter[fend2] == 0:             # <<<<<<<<<<<<<<
+ *                     continue
+ *                 coverage[fend2] -= 1
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":235
+ *                 if filter[fend2] == 0:
+ *                     continue
+ *                 coverage[fend2] -= 1             # <<<<<<<<<<<<<<
+ *                 if coverage[fend2] < mincoverage:
+ *                     filter[fend2] = 0
+ */
+            __pyx_t_9 = __pyx_v_fend2;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_coverage.diminfo[0].strides) -= 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":236
+ *                     continue
+ *                 coverage[fend2] -= 1
+ *                 if coverage[fend2] < mincoverage:             # <<<<<<<<<<<<<<
+ *                     filter[fend2] = 0
+ *                     removed[num_removed] = fend2
+ */
+            __pyx_t_9 = __pyx_v_fend2;
+            __pyx_t_10 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_coverage.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_coverage.diminfo[0].strides)) < __pyx_v_mincoverage) != 0);
+            if (__pyx_t_10) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":237
+ *                 coverage[fend2] -= 1
+ *                 if coverage[fend2] < mincoverage:
+ *                     filter[fend2] = 0             # <<<<<<<<<<<<<<
+ *                     removed[num_removed] = fend2
+ *                     num_removed += 1
+ */
+              __pyx_t_9 = __pyx_v_fend2;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_filter.diminfo[0].strides) = 0;
+
+              /* "hifive/libraries/_hic_interactions.pyx":238
+ *                 if coverage[fend2] < mincoverage:
+ *                     filter[fend2] = 0
+ *                     removed[num_removed] = fend2             # <<<<<<<<<<<<<<
+ *                     num_removed += 1
+ *     return None
+ */
+              __pyx_t_9 = __pyx_v_num_removed;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_removed.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_removed.diminfo[0].strides) = __pyx_v_fend2;
+
+              /* "hifive/libraries/_hic_interactions.pyx":239
+ *                     filter[fend2] = 0
+ *                     removed[num_removed] = fend2
+ *                     num_removed += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+              __pyx_v_num_removed = (__pyx_v_num_removed + 1);
+
+              /* "hifive/libraries/_hic_interactions.pyx":236
+ *                     continue
+ *                 coverage[fend2] -= 1
+ *                 if coverage[fend2] < mincoverage:             # <<<<<<<<<<<<<<
+ *                     filter[fend2] = 0
+ *                     removed[num_removed] = fend2
+ */
+            }
+            __pyx_L13_continue:;
+          }
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":220
+ *     cdef long long int num_fends = filter.shape[0]
+ *     cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         num_removed = 0
+ *         for i in range(num_fends):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":240
+ *                     removed[num_removed] = fend2
+ *                     num_removed += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":211
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def filter_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] neighbor_indices not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_XDECREF(__pyx_t_2);
+  __Pyx_XDECREF(__pyx_t_3);
+  __Pyx_XDECREF(__pyx_t_4);
+  __Pyx_XDECREF(__pyx_t_5);
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_removed.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.filter_fend_neighbors", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_coverage.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbor_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_neighbors.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_removed.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XDECREF((PyObject *)__pyx_v_removed);
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":246
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_ranges(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_15find_fend_ranges(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_15find_fend_ranges = {"find_fend_ranges", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_15find_fend_ranges, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_15find_fend_ranges(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_mapping = 0;
+  PyArrayObject *__pyx_v_mids = 0;
+  PyArrayObject *__pyx_v_ranges = 0;
+  int __pyx_v_mindistance;
+  int __pyx_v_maxdistance;
+  PY_LONG_LONG __pyx_v_start;
+  PY_LONG_LONG __pyx_v_stop;
+  int __pyx_v_startfend;
+  int __pyx_v_binned;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_fend_ranges (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_mapping,&__pyx_n_s_mids,&__pyx_n_s_ranges,&__pyx_n_s_mindistance,&__pyx_n_s_maxdistance,&__pyx_n_s_start,&__pyx_n_s_stop,&__pyx_n_s_startfend,&__pyx_n_s_binned,0};
+    PyObject* values[9] = {0,0,0,0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  9: values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+        CYTHON_FALLTHROUGH;
+        case  8: values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+        CYTHON_FALLTHROUGH;
+        case  7: values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+        CYTHON_FALLTHROUGH;
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mapping)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mids)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 1); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_ranges)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 2); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mindistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 3); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_maxdistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 4); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_start)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 5); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  6:
+        if (likely((values[6] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_stop)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 6); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  7:
+        if (likely((values[7] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_startfend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 7); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  8:
+        if (likely((values[8] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_binned)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, 8); __PYX_ERR(0, 246, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_fend_ranges") < 0)) __PYX_ERR(0, 246, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 9) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+      values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+      values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+      values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+    }
+    __pyx_v_mapping = ((PyArrayObject *)values[0]);
+    __pyx_v_mids = ((PyArrayObject *)values[1]);
+    __pyx_v_ranges = ((PyArrayObject *)values[2]);
+    __pyx_v_mindistance = __Pyx_PyInt_As_int(values[3]); if (unlikely((__pyx_v_mindistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 250, __pyx_L3_error)
+    __pyx_v_maxdistance = __Pyx_PyInt_As_int(values[4]); if (unlikely((__pyx_v_maxdistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 251, __pyx_L3_error)
+    __pyx_v_start = __Pyx_PyInt_As_PY_LONG_LONG(values[5]); if (unlikely((__pyx_v_start == (PY_LONG_LONG)-1) && PyErr_Occurred())) __PYX_ERR(0, 252, __pyx_L3_error)
+    __pyx_v_stop = __Pyx_PyInt_As_PY_LONG_LONG(values[6]); if (unlikely((__pyx_v_stop == (PY_LONG_LONG)-1) && PyErr_Occurred())) __PYX_ERR(0, 253, __pyx_L3_error)
+    __pyx_v_startfend = __Pyx_PyInt_As_int(values[7]); if (unlikely((__pyx_v_startfend == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 254, __pyx_L3_error)
+    __pyx_v_binned = __Pyx_PyInt_As_int(values[8]); if (unlikely((__pyx_v_binned == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 255, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_fend_ranges", 1, 9, 9, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 246, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_fend_ranges", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mapping), __pyx_ptype_5numpy_ndarray, 0, "mapping", 0))) __PYX_ERR(0, 247, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mids), __pyx_ptype_5numpy_ndarray, 0, "mids", 0))) __PYX_ERR(0, 248, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_ranges), __pyx_ptype_5numpy_ndarray, 0, "ranges", 0))) __PYX_ERR(0, 249, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_14find_fend_ranges(__pyx_self, __pyx_v_mapping, __pyx_v_mids, __pyx_v_ranges, __pyx_v_mindistance, __pyx_v_maxdistance, __pyx_v_start, __pyx_v_stop, __pyx_v_startfend, __pyx_v_binned);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_14find_fend_ranges(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_mapping, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_ranges, int __pyx_v_mindistance, int __pyx_v_maxdistance, PY_LONG_LONG __pyx_v_start, PY_LONG_LONG __pyx_v_stop, int __pyx_v_startfend, int __pyx_v_binned) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_pos;
+  PY_LONG_LONG __pyx_v_total;
+  PY_LONG_LONG __pyx_v_total_fends;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mapping;
+  __Pyx_Buffer __pyx_pybuffer_mapping;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mids;
+  __Pyx_Buffer __pyx_pybuffer_mids;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_ranges;
+  __Pyx_Buffer __pyx_pybuffer_ranges;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  int __pyx_t_5;
+  int __pyx_t_6;
+  Py_ssize_t __pyx_t_7;
+  PY_LONG_LONG __pyx_t_8;
+  Py_ssize_t __pyx_t_9;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_10;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_fend_ranges", 0);
+  __pyx_pybuffer_mapping.pybuffer.buf = NULL;
+  __pyx_pybuffer_mapping.refcount = 0;
+  __pyx_pybuffernd_mapping.data = NULL;
+  __pyx_pybuffernd_mapping.rcbuffer = &__pyx_pybuffer_mapping;
+  __pyx_pybuffer_mids.pybuffer.buf = NULL;
+  __pyx_pybuffer_mids.refcount = 0;
+  __pyx_pybuffernd_mids.data = NULL;
+  __pyx_pybuffernd_mids.rcbuffer = &__pyx_pybuffer_mids;
+  __pyx_pybuffer_ranges.pybuffer.buf = NULL;
+  __pyx_pybuffer_ranges.refcount = 0;
+  __pyx_pybuffernd_ranges.data = NULL;
+  __pyx_pybuffernd_ranges.rcbuffer = &__pyx_pybuffer_ranges;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer, (PyObject*)__pyx_v_mapping, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 246, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mapping.diminfo[0].strides = __pyx_pybuffernd_mapping.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mapping.diminfo[0].shape = __pyx_pybuffernd_mapping.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_v_mids, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 246, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mids.diminfo[0].strides = __pyx_pybuffernd_mids.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mids.diminfo[0].shape = __pyx_pybuffernd_mids.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer, (PyObject*)__pyx_v_ranges, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 246, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_ranges.diminfo[0].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_ranges.diminfo[0].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_ranges.diminfo[1].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_ranges.diminfo[1].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[1];
+
+  /* "hifive/libraries/_hic_interactions.pyx":257
+ *         int binned):
+ *     cdef long long int i, j, pos, total
+ *     cdef long long int total_fends = mapping.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         for i in range(start, stop):
+ */
+  __pyx_v_total_fends = (__pyx_v_mapping->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":258
+ *     cdef long long int i, j, pos, total
+ *     cdef long long int total_fends = mapping.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for i in range(start, stop):
+ *             pos = mids[i]
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":259
+ *     cdef long long int total_fends = mapping.shape[0]
+ *     with nogil:
+ *         for i in range(start, stop):             # <<<<<<<<<<<<<<
+ *             pos = mids[i]
+ *             j = i + 1 - binned
+ */
+        __pyx_t_1 = __pyx_v_stop;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = __pyx_v_start; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":260
+ *     with nogil:
+ *         for i in range(start, stop):
+ *             pos = mids[i]             # <<<<<<<<<<<<<<
+ *             j = i + 1 - binned
+ *             while j < total_fends and mids[j] - pos < mindistance:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_v_pos = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mids.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":261
+ *         for i in range(start, stop):
+ *             pos = mids[i]
+ *             j = i + 1 - binned             # <<<<<<<<<<<<<<
+ *             while j < total_fends and mids[j] - pos < mindistance:
+ *                 j += 1
+ */
+          __pyx_v_j = ((__pyx_v_i + 1) - __pyx_v_binned);
+
+          /* "hifive/libraries/_hic_interactions.pyx":262
+ *             pos = mids[i]
+ *             j = i + 1 - binned
+ *             while j < total_fends and mids[j] - pos < mindistance:             # <<<<<<<<<<<<<<
+ *                 j += 1
+ *             ranges[i, 1] = j
+ */
+          while (1) {
+            __pyx_t_6 = ((__pyx_v_j < __pyx_v_total_fends) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L10_bool_binop_done;
+            }
+            __pyx_t_4 = __pyx_v_j;
+            __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mids.diminfo[0].strides)) - __pyx_v_pos) < __pyx_v_mindistance) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L10_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":263
+ *             j = i + 1 - binned
+ *             while j < total_fends and mids[j] - pos < mindistance:
+ *                 j += 1             # <<<<<<<<<<<<<<
+ *             ranges[i, 1] = j
+ *             j = total_fends
+ */
+            __pyx_v_j = (__pyx_v_j + 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":264
+ *             while j < total_fends and mids[j] - pos < mindistance:
+ *                 j += 1
+ *             ranges[i, 1] = j             # <<<<<<<<<<<<<<
+ *             j = total_fends
+ *             while j > ranges[i, 1] and mids[j - 1] - pos > maxdistance:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_7 = 1;
+          *__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides) = __pyx_v_j;
+
+          /* "hifive/libraries/_hic_interactions.pyx":265
+ *                 j += 1
+ *             ranges[i, 1] = j
+ *             j = total_fends             # <<<<<<<<<<<<<<
+ *             while j > ranges[i, 1] and mids[j - 1] - pos > maxdistance:
+ *                 j -= 1
+ */
+          __pyx_v_j = __pyx_v_total_fends;
+
+          /* "hifive/libraries/_hic_interactions.pyx":266
+ *             ranges[i, 1] = j
+ *             j = total_fends
+ *             while j > ranges[i, 1] and mids[j - 1] - pos > maxdistance:             # <<<<<<<<<<<<<<
+ *                 j -= 1
+ *             ranges[i, 2] = j
+ */
+          while (1) {
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_7 = 1;
+            __pyx_t_6 = ((__pyx_v_j > (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides))) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L14_bool_binop_done;
+            }
+            __pyx_t_4 = (__pyx_v_j - 1);
+            __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mids.diminfo[0].strides)) - __pyx_v_pos) > __pyx_v_maxdistance) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L14_bool_binop_done:;
+            if (!__pyx_t_5) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":267
+ *             j = total_fends
+ *             while j > ranges[i, 1] and mids[j - 1] - pos > maxdistance:
+ *                 j -= 1             # <<<<<<<<<<<<<<
+ *             ranges[i, 2] = j
+ *             total = ranges[i, 2] - ranges[i, 1]
+ */
+            __pyx_v_j = (__pyx_v_j - 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":268
+ *             while j > ranges[i, 1] and mids[j - 1] - pos > maxdistance:
+ *                 j -= 1
+ *             ranges[i, 2] = j             # <<<<<<<<<<<<<<
+ *             total = ranges[i, 2] - ranges[i, 1]
+ *             if binned == 0:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_7 = 2;
+          *__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides) = __pyx_v_j;
+
+          /* "hifive/libraries/_hic_interactions.pyx":269
+ *                 j -= 1
+ *             ranges[i, 2] = j
+ *             total = ranges[i, 2] - ranges[i, 1]             # <<<<<<<<<<<<<<
+ *             if binned == 0:
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_7 = 2;
+          __pyx_t_8 = __pyx_v_i;
+          __pyx_t_9 = 1;
+          __pyx_v_total = ((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides)) - (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)));
+
+          /* "hifive/libraries/_hic_interactions.pyx":270
+ *             ranges[i, 2] = j
+ *             total = ranges[i, 2] - ranges[i, 1]
+ *             if binned == 0:             # <<<<<<<<<<<<<<
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ *                     total -= 1
+ */
+          __pyx_t_5 = ((__pyx_v_binned == 0) != 0);
+          if (__pyx_t_5) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":271
+ *             total = ranges[i, 2] - ranges[i, 1]
+ *             if binned == 0:
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:             # <<<<<<<<<<<<<<
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ */
+            __pyx_t_8 = __pyx_v_i;
+            __pyx_t_9 = 1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) < __pyx_v_total_fends) != 0);
+            if (__pyx_t_6) {
+            } else {
+              __pyx_t_5 = __pyx_t_6;
+              goto __pyx_L18_bool_binop_done;
+            }
+            __pyx_t_8 = __pyx_v_i;
+            __pyx_t_9 = 1;
+            __pyx_t_10 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides));
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_10, __pyx_pybuffernd_mapping.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mapping.diminfo[0].strides))) == 1) != 0);
+            __pyx_t_5 = __pyx_t_6;
+            __pyx_L18_bool_binop_done:;
+            if (__pyx_t_5) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":272
+ *             if binned == 0:
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ *                     total -= 1             # <<<<<<<<<<<<<<
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ */
+              __pyx_v_total = (__pyx_v_total - 1);
+
+              /* "hifive/libraries/_hic_interactions.pyx":271
+ *             total = ranges[i, 2] - ranges[i, 1]
+ *             if binned == 0:
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:             # <<<<<<<<<<<<<<
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":273
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:             # <<<<<<<<<<<<<<
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ *                         total -= 1
+ */
+            __pyx_t_4 = __pyx_v_i;
+            __pyx_t_5 = (((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mapping.diminfo[0].strides)) + __pyx_v_startfend) % 2) == 0) != 0);
+            if (__pyx_t_5) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":274
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ */
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) < __pyx_v_total_fends) != 0);
+              if (__pyx_t_6) {
+              } else {
+                __pyx_t_5 = __pyx_t_6;
+                goto __pyx_L22_bool_binop_done;
+              }
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_10 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides));
+              __pyx_t_8 = __pyx_v_i;
+              __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_10, __pyx_pybuffernd_mapping.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_mapping.diminfo[0].strides))) == 3) != 0);
+              __pyx_t_5 = __pyx_t_6;
+              __pyx_L22_bool_binop_done:;
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":275
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ *                         total -= 1             # <<<<<<<<<<<<<<
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ *                         total -= 1
+ */
+                __pyx_v_total = (__pyx_v_total - 1);
+
+                /* "hifive/libraries/_hic_interactions.pyx":274
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":276
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ *                         total -= 1
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:
+ */
+              __pyx_t_8 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_6 = ((((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) + 1) < __pyx_v_total_fends) != 0);
+              if (__pyx_t_6) {
+              } else {
+                __pyx_t_5 = __pyx_t_6;
+                goto __pyx_L25_bool_binop_done;
+              }
+              __pyx_t_8 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_10 = ((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) + 1);
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_10, __pyx_pybuffernd_mapping.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_mapping.diminfo[0].strides))) == 3) != 0);
+              __pyx_t_5 = __pyx_t_6;
+              __pyx_L25_bool_binop_done:;
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":277
+ *                         total -= 1
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ *                         total -= 1             # <<<<<<<<<<<<<<
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:
+ *                         total -= 1
+ */
+                __pyx_v_total = (__pyx_v_total - 1);
+
+                /* "hifive/libraries/_hic_interactions.pyx":276
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ *                         total -= 1
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":278
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ *                         total -= 1
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *             ranges[i, 0] = total
+ */
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_6 = ((((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) + 2) < __pyx_v_total_fends) != 0);
+              if (__pyx_t_6) {
+              } else {
+                __pyx_t_5 = __pyx_t_6;
+                goto __pyx_L28_bool_binop_done;
+              }
+              __pyx_t_4 = __pyx_v_i;
+              __pyx_t_9 = 1;
+              __pyx_t_10 = ((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides)) + 2);
+              __pyx_t_8 = __pyx_v_i;
+              __pyx_t_6 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_10, __pyx_pybuffernd_mapping.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_mapping.diminfo[0].strides))) == 3) != 0);
+              __pyx_t_5 = __pyx_t_6;
+              __pyx_L28_bool_binop_done:;
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":279
+ *                         total -= 1
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:
+ *                         total -= 1             # <<<<<<<<<<<<<<
+ *             ranges[i, 0] = total
+ *     return None
+ */
+                __pyx_v_total = (__pyx_v_total - 1);
+
+                /* "hifive/libraries/_hic_interactions.pyx":278
+ *                     if ranges[i, 1] + 1 < total_fends and mapping[ranges[i, 1] + 1] - mapping[i] == 3:
+ *                         total -= 1
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:             # <<<<<<<<<<<<<<
+ *                         total -= 1
+ *             ranges[i, 0] = total
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":273
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ *                     total -= 1
+ *                 if (mapping[i] + startfend) % 2 == 0:             # <<<<<<<<<<<<<<
+ *                     if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 3:
+ *                         total -= 1
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":270
+ *             ranges[i, 2] = j
+ *             total = ranges[i, 2] - ranges[i, 1]
+ *             if binned == 0:             # <<<<<<<<<<<<<<
+ *                 if ranges[i, 1] < total_fends and mapping[ranges[i, 1]] - mapping[i] == 1:
+ *                     total -= 1
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":280
+ *                     if ranges[i, 1] + 2 < total_fends and mapping[ranges[i, 1] + 2] - mapping[i] == 3:
+ *                         total -= 1
+ *             ranges[i, 0] = total             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+          __pyx_t_8 = __pyx_v_i;
+          __pyx_t_9 = 0;
+          *__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[1].strides) = __pyx_v_total;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":258
+ *     cdef long long int i, j, pos, total
+ *     cdef long long int total_fends = mapping.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         for i in range(start, stop):
+ *             pos = mids[i]
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":281
+ *                         total -= 1
+ *             ranges[i, 0] = total
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":246
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_ranges(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_fend_ranges", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":287
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzeros_in_range(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None):
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_17find_nonzeros_in_range(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_17find_nonzeros_in_range = {"find_nonzeros_in_range", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_17find_nonzeros_in_range, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_17find_nonzeros_in_range(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_ranges = 0;
+  PyArrayObject *__pyx_v_data = 0;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_nonzeros_in_range (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_ranges,&__pyx_n_s_data,0};
+    PyObject* values[2] = {0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_ranges)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzeros_in_range", 1, 2, 2, 1); __PYX_ERR(0, 287, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_nonzeros_in_range") < 0)) __PYX_ERR(0, 287, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 2) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+    }
+    __pyx_v_ranges = ((PyArrayObject *)values[0]);
+    __pyx_v_data = ((PyArrayObject *)values[1]);
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_nonzeros_in_range", 1, 2, 2, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 287, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_nonzeros_in_range", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_ranges), __pyx_ptype_5numpy_ndarray, 0, "ranges", 0))) __PYX_ERR(0, 288, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data), __pyx_ptype_5numpy_ndarray, 0, "data", 0))) __PYX_ERR(0, 289, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_16find_nonzeros_in_range(__pyx_self, __pyx_v_ranges, __pyx_v_data);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_16find_nonzeros_in_range(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_data) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_count;
+  PY_LONG_LONG __pyx_v_num_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data;
+  __Pyx_Buffer __pyx_pybuffer_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_ranges;
+  __Pyx_Buffer __pyx_pybuffer_ranges;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  Py_ssize_t __pyx_t_5;
+  int __pyx_t_6;
+  PY_LONG_LONG __pyx_t_7;
+  Py_ssize_t __pyx_t_8;
+  Py_ssize_t __pyx_t_9;
+  Py_ssize_t __pyx_t_10;
+  int __pyx_t_11;
+  PyObject *__pyx_t_12 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_nonzeros_in_range", 0);
+  __pyx_pybuffer_ranges.pybuffer.buf = NULL;
+  __pyx_pybuffer_ranges.refcount = 0;
+  __pyx_pybuffernd_ranges.data = NULL;
+  __pyx_pybuffernd_ranges.rcbuffer = &__pyx_pybuffer_ranges;
+  __pyx_pybuffer_data.pybuffer.buf = NULL;
+  __pyx_pybuffer_data.refcount = 0;
+  __pyx_pybuffernd_data.data = NULL;
+  __pyx_pybuffernd_data.rcbuffer = &__pyx_pybuffer_data;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer, (PyObject*)__pyx_v_ranges, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 287, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_ranges.diminfo[0].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_ranges.diminfo[0].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_ranges.diminfo[1].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_ranges.diminfo[1].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data.rcbuffer->pybuffer, (PyObject*)__pyx_v_data, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 287, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data.diminfo[0].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data.diminfo[0].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_data.diminfo[1].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_data.diminfo[1].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[1];
+
+  /* "hifive/libraries/_hic_interactions.pyx":291
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None):
+ *     cdef long long int i, count
+ *     cdef long long int num_data = data.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         count = 0
+ */
+  __pyx_v_num_data = (__pyx_v_data->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":292
+ *     cdef long long int i, count
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         count = 0
+ *         for i in range(num_data):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":293
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:
+ *         count = 0             # <<<<<<<<<<<<<<
+ *         for i in range(num_data):
+ *             if data[i, 0] == -1:
+ */
+        __pyx_v_count = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":294
+ *     with nogil:
+ *         count = 0
+ *         for i in range(num_data):             # <<<<<<<<<<<<<<
+ *             if data[i, 0] == -1:
+ *                 continue
+ */
+        __pyx_t_1 = __pyx_v_num_data;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":295
+ *         count = 0
+ *         for i in range(num_data):
+ *             if data[i, 0] == -1:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = 0;
+          __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides)) == -1L) != 0);
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":296
+ *         for i in range(num_data):
+ *             if data[i, 0] == -1:
+ *                 continue             # <<<<<<<<<<<<<<
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:
+ *                 count += 1
+ */
+            goto __pyx_L6_continue;
+
+            /* "hifive/libraries/_hic_interactions.pyx":295
+ *         count = 0
+ *         for i in range(num_data):
+ *             if data[i, 0] == -1:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":297
+ *             if data[i, 0] == -1:
+ *                 continue
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:             # <<<<<<<<<<<<<<
+ *                 count += 1
+ *     return count
+ */
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_5 = 1;
+          __pyx_t_7 = __pyx_v_i;
+          __pyx_t_8 = 0;
+          __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_8, __pyx_pybuffernd_data.diminfo[1].strides));
+          __pyx_t_10 = 1;
+          __pyx_t_11 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides)) >= (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_ranges.diminfo[1].strides))) != 0);
+          if (__pyx_t_11) {
+          } else {
+            __pyx_t_6 = __pyx_t_11;
+            goto __pyx_L10_bool_binop_done;
+          }
+          __pyx_t_7 = __pyx_v_i;
+          __pyx_t_8 = 1;
+          __pyx_t_4 = __pyx_v_i;
+          __pyx_t_10 = 0;
+          __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides));
+          __pyx_t_5 = 2;
+          __pyx_t_11 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_8, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_ranges.diminfo[1].strides))) != 0);
+          __pyx_t_6 = __pyx_t_11;
+          __pyx_L10_bool_binop_done:;
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":298
+ *                 continue
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:
+ *                 count += 1             # <<<<<<<<<<<<<<
+ *     return count
+ * 
+ */
+            __pyx_v_count = (__pyx_v_count + 1);
+
+            /* "hifive/libraries/_hic_interactions.pyx":297
+ *             if data[i, 0] == -1:
+ *                 continue
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:             # <<<<<<<<<<<<<<
+ *                 count += 1
+ *     return count
+ */
+          }
+          __pyx_L6_continue:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":292
+ *     cdef long long int i, count
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         count = 0
+ *         for i in range(num_data):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":299
+ *             if data[i, 1] >= ranges[data[i, 0], 1] and data[i, 1] < ranges[data[i, 0], 2]:
+ *                 count += 1
+ *     return count             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_12 = __Pyx_PyInt_From_PY_LONG_LONG(__pyx_v_count); if (unlikely(!__pyx_t_12)) __PYX_ERR(0, 299, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_12);
+  __pyx_r = __pyx_t_12;
+  __pyx_t_12 = 0;
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":287
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzeros_in_range(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None):
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_12);
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_nonzeros_in_range", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":305
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_19find_nonzero_node_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_19find_nonzero_node_indices = {"find_nonzero_node_indices", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_19find_nonzero_node_indices, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_19find_nonzero_node_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_ranges = 0;
+  PyArrayObject *__pyx_v_indices0 = 0;
+  PyArrayObject *__pyx_v_indices1 = 0;
+  PyArrayObject *__pyx_v_counts = 0;
+  PyArrayObject *__pyx_v_data = 0;
+  PyArrayObject *__pyx_v_interactions = 0;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_nonzero_node_indices (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_ranges,&__pyx_n_s_indices0,&__pyx_n_s_indices1,&__pyx_n_s_counts,&__pyx_n_s_data,&__pyx_n_s_interactions,0};
+    PyObject* values[6] = {0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_ranges)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_indices0)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, 1); __PYX_ERR(0, 305, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_indices1)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, 2); __PYX_ERR(0, 305, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_counts)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, 3); __PYX_ERR(0, 305, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_data)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, 4); __PYX_ERR(0, 305, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_interactions)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, 5); __PYX_ERR(0, 305, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_nonzero_node_indices") < 0)) __PYX_ERR(0, 305, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 6) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+    }
+    __pyx_v_ranges = ((PyArrayObject *)values[0]);
+    __pyx_v_indices0 = ((PyArrayObject *)values[1]);
+    __pyx_v_indices1 = ((PyArrayObject *)values[2]);
+    __pyx_v_counts = ((PyArrayObject *)values[3]);
+    __pyx_v_data = ((PyArrayObject *)values[4]);
+    __pyx_v_interactions = ((PyArrayObject *)values[5]);
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_nonzero_node_indices", 1, 6, 6, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 305, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_nonzero_node_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_ranges), __pyx_ptype_5numpy_ndarray, 1, "ranges", 0))) __PYX_ERR(0, 306, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_indices0), __pyx_ptype_5numpy_ndarray, 1, "indices0", 0))) __PYX_ERR(0, 307, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_indices1), __pyx_ptype_5numpy_ndarray, 1, "indices1", 0))) __PYX_ERR(0, 308, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_counts), __pyx_ptype_5numpy_ndarray, 1, "counts", 0))) __PYX_ERR(0, 309, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_data), __pyx_ptype_5numpy_ndarray, 1, "data", 0))) __PYX_ERR(0, 310, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_interactions), __pyx_ptype_5numpy_ndarray, 1, "interactions", 0))) __PYX_ERR(0, 311, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_18find_nonzero_node_indices(__pyx_self, __pyx_v_ranges, __pyx_v_indices0, __pyx_v_indices1, __pyx_v_counts, __pyx_v_data, __pyx_v_interactions);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_18find_nonzero_node_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_indices0, PyArrayObject *__pyx_v_indices1, PyArrayObject *__pyx_v_counts, PyArrayObject *__pyx_v_data, PyArrayObject *__pyx_v_interactions) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_num_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_counts;
+  __Pyx_Buffer __pyx_pybuffer_counts;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_data;
+  __Pyx_Buffer __pyx_pybuffer_data;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_indices0;
+  __Pyx_Buffer __pyx_pybuffer_indices0;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_indices1;
+  __Pyx_Buffer __pyx_pybuffer_indices1;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_interactions;
+  __Pyx_Buffer __pyx_pybuffer_interactions;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_ranges;
+  __Pyx_Buffer __pyx_pybuffer_ranges;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  Py_ssize_t __pyx_t_5;
+  int __pyx_t_6;
+  PY_LONG_LONG __pyx_t_7;
+  Py_ssize_t __pyx_t_8;
+  Py_ssize_t __pyx_t_9;
+  Py_ssize_t __pyx_t_10;
+  int __pyx_t_11;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_nonzero_node_indices", 0);
+  __pyx_pybuffer_ranges.pybuffer.buf = NULL;
+  __pyx_pybuffer_ranges.refcount = 0;
+  __pyx_pybuffernd_ranges.data = NULL;
+  __pyx_pybuffernd_ranges.rcbuffer = &__pyx_pybuffer_ranges;
+  __pyx_pybuffer_indices0.pybuffer.buf = NULL;
+  __pyx_pybuffer_indices0.refcount = 0;
+  __pyx_pybuffernd_indices0.data = NULL;
+  __pyx_pybuffernd_indices0.rcbuffer = &__pyx_pybuffer_indices0;
+  __pyx_pybuffer_indices1.pybuffer.buf = NULL;
+  __pyx_pybuffer_indices1.refcount = 0;
+  __pyx_pybuffernd_indices1.data = NULL;
+  __pyx_pybuffernd_indices1.rcbuffer = &__pyx_pybuffer_indices1;
+  __pyx_pybuffer_counts.pybuffer.buf = NULL;
+  __pyx_pybuffer_counts.refcount = 0;
+  __pyx_pybuffernd_counts.data = NULL;
+  __pyx_pybuffernd_counts.rcbuffer = &__pyx_pybuffer_counts;
+  __pyx_pybuffer_data.pybuffer.buf = NULL;
+  __pyx_pybuffer_data.refcount = 0;
+  __pyx_pybuffernd_data.data = NULL;
+  __pyx_pybuffernd_data.rcbuffer = &__pyx_pybuffer_data;
+  __pyx_pybuffer_interactions.pybuffer.buf = NULL;
+  __pyx_pybuffer_interactions.refcount = 0;
+  __pyx_pybuffernd_interactions.data = NULL;
+  __pyx_pybuffernd_interactions.rcbuffer = &__pyx_pybuffer_interactions;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer, (PyObject*)__pyx_v_ranges, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_ranges.diminfo[0].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_ranges.diminfo[0].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_ranges.diminfo[1].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_ranges.diminfo[1].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer, (PyObject*)__pyx_v_indices0, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_indices0.diminfo[0].strides = __pyx_pybuffernd_indices0.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_indices0.diminfo[0].shape = __pyx_pybuffernd_indices0.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer, (PyObject*)__pyx_v_indices1, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_indices1.diminfo[0].strides = __pyx_pybuffernd_indices1.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_indices1.diminfo[0].shape = __pyx_pybuffernd_indices1.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_counts.rcbuffer->pybuffer, (PyObject*)__pyx_v_counts, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_counts.diminfo[0].strides = __pyx_pybuffernd_counts.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_counts.diminfo[0].shape = __pyx_pybuffernd_counts.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_data.rcbuffer->pybuffer, (PyObject*)__pyx_v_data, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_data.diminfo[0].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_data.diminfo[0].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_data.diminfo[1].strides = __pyx_pybuffernd_data.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_data.diminfo[1].shape = __pyx_pybuffernd_data.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer, (PyObject*)__pyx_v_interactions, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 305, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_interactions.diminfo[0].strides = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_interactions.diminfo[0].shape = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":313
+ *         np.ndarray[DTYPE_int_t, ndim=1] interactions):
+ *     cdef long long int i, j
+ *     cdef long long int num_data = data.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         i = 0
+ */
+  __pyx_v_num_data = (__pyx_v_data->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":314
+ *     cdef long long int i, j
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         i = 0
+ *         for j in range(num_data):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":315
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:
+ *         i = 0             # <<<<<<<<<<<<<<
+ *         for j in range(num_data):
+ *             if data[j, 0] == -1:
+ */
+        __pyx_v_i = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":316
+ *     with nogil:
+ *         i = 0
+ *         for j in range(num_data):             # <<<<<<<<<<<<<<
+ *             if data[j, 0] == -1:
+ *                 continue
+ */
+        __pyx_t_1 = __pyx_v_num_data;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = 0; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_j = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":317
+ *         i = 0
+ *         for j in range(num_data):
+ *             if data[j, 0] == -1:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:
+ */
+          __pyx_t_4 = __pyx_v_j;
+          __pyx_t_5 = 0;
+          __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides)) == -1L) != 0);
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":318
+ *         for j in range(num_data):
+ *             if data[j, 0] == -1:
+ *                 continue             # <<<<<<<<<<<<<<
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:
+ *                 indices0[i] = data[j, 0]
+ */
+            goto __pyx_L6_continue;
+
+            /* "hifive/libraries/_hic_interactions.pyx":317
+ *         i = 0
+ *         for j in range(num_data):
+ *             if data[j, 0] == -1:             # <<<<<<<<<<<<<<
+ *                 continue
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":319
+ *             if data[j, 0] == -1:
+ *                 continue
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:             # <<<<<<<<<<<<<<
+ *                 indices0[i] = data[j, 0]
+ *                 indices1[i] = data[j, 1]
+ */
+          __pyx_t_4 = __pyx_v_j;
+          __pyx_t_5 = 1;
+          __pyx_t_7 = __pyx_v_j;
+          __pyx_t_8 = 0;
+          __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_8, __pyx_pybuffernd_data.diminfo[1].strides));
+          __pyx_t_10 = 1;
+          __pyx_t_11 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides)) >= (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_ranges.diminfo[1].strides))) != 0);
+          if (__pyx_t_11) {
+          } else {
+            __pyx_t_6 = __pyx_t_11;
+            goto __pyx_L10_bool_binop_done;
+          }
+          __pyx_t_7 = __pyx_v_j;
+          __pyx_t_8 = 1;
+          __pyx_t_4 = __pyx_v_j;
+          __pyx_t_10 = 0;
+          __pyx_t_9 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides));
+          __pyx_t_5 = 2;
+          __pyx_t_11 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_8, __pyx_pybuffernd_data.diminfo[1].strides)) < (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_9, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_ranges.diminfo[1].strides))) != 0);
+          __pyx_t_6 = __pyx_t_11;
+          __pyx_L10_bool_binop_done:;
+          if (__pyx_t_6) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":320
+ *                 continue
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:
+ *                 indices0[i] = data[j, 0]             # <<<<<<<<<<<<<<
+ *                 indices1[i] = data[j, 1]
+ *                 interactions[data[j, 0]] += 1
+ */
+            __pyx_t_4 = __pyx_v_j;
+            __pyx_t_10 = 0;
+            __pyx_t_7 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices0.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices0.diminfo[0].strides) = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":321
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:
+ *                 indices0[i] = data[j, 0]
+ *                 indices1[i] = data[j, 1]             # <<<<<<<<<<<<<<
+ *                 interactions[data[j, 0]] += 1
+ *                 if data[j, 0] != data[j, 1]:
+ */
+            __pyx_t_4 = __pyx_v_j;
+            __pyx_t_10 = 1;
+            __pyx_t_7 = __pyx_v_i;
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices1.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices1.diminfo[0].strides) = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":322
+ *                 indices0[i] = data[j, 0]
+ *                 indices1[i] = data[j, 1]
+ *                 interactions[data[j, 0]] += 1             # <<<<<<<<<<<<<<
+ *                 if data[j, 0] != data[j, 1]:
+ *                     interactions[data[j, 1]] += 1
+ */
+            __pyx_t_4 = __pyx_v_j;
+            __pyx_t_10 = 0;
+            __pyx_t_5 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_5, __pyx_pybuffernd_interactions.diminfo[0].strides) += 1;
+
+            /* "hifive/libraries/_hic_interactions.pyx":323
+ *                 indices1[i] = data[j, 1]
+ *                 interactions[data[j, 0]] += 1
+ *                 if data[j, 0] != data[j, 1]:             # <<<<<<<<<<<<<<
+ *                     interactions[data[j, 1]] += 1
+ *                 if not counts is None:
+ */
+            __pyx_t_4 = __pyx_v_j;
+            __pyx_t_10 = 0;
+            __pyx_t_7 = __pyx_v_j;
+            __pyx_t_5 = 1;
+            __pyx_t_6 = (((*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_10, __pyx_pybuffernd_data.diminfo[1].strides)) != (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides))) != 0);
+            if (__pyx_t_6) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":324
+ *                 interactions[data[j, 0]] += 1
+ *                 if data[j, 0] != data[j, 1]:
+ *                     interactions[data[j, 1]] += 1             # <<<<<<<<<<<<<<
+ *                 if not counts is None:
+ *                     counts[i] = data[j, 2]
+ */
+              __pyx_t_7 = __pyx_v_j;
+              __pyx_t_5 = 1;
+              __pyx_t_10 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides));
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_10, __pyx_pybuffernd_interactions.diminfo[0].strides) += 1;
+
+              /* "hifive/libraries/_hic_interactions.pyx":323
+ *                 indices1[i] = data[j, 1]
+ *                 interactions[data[j, 0]] += 1
+ *                 if data[j, 0] != data[j, 1]:             # <<<<<<<<<<<<<<
+ *                     interactions[data[j, 1]] += 1
+ *                 if not counts is None:
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":325
+ *                 if data[j, 0] != data[j, 1]:
+ *                     interactions[data[j, 1]] += 1
+ *                 if not counts is None:             # <<<<<<<<<<<<<<
+ *                     counts[i] = data[j, 2]
+ *                 i += 1
+ */
+            __pyx_t_6 = (((PyObject *)__pyx_v_counts) != Py_None);
+            __pyx_t_11 = (__pyx_t_6 != 0);
+            if (__pyx_t_11) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":326
+ *                     interactions[data[j, 1]] += 1
+ *                 if not counts is None:
+ *                     counts[i] = data[j, 2]             # <<<<<<<<<<<<<<
+ *                 i += 1
+ *     return None
+ */
+              __pyx_t_7 = __pyx_v_j;
+              __pyx_t_5 = 2;
+              __pyx_t_4 = __pyx_v_i;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_counts.rcbuffer->pybuffer.buf, __pyx_t_4, __pyx_pybuffernd_counts.diminfo[0].strides) = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_data.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_data.diminfo[0].strides, __pyx_t_5, __pyx_pybuffernd_data.diminfo[1].strides));
+
+              /* "hifive/libraries/_hic_interactions.pyx":325
+ *                 if data[j, 0] != data[j, 1]:
+ *                     interactions[data[j, 1]] += 1
+ *                 if not counts is None:             # <<<<<<<<<<<<<<
+ *                     counts[i] = data[j, 2]
+ *                 i += 1
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":327
+ *                 if not counts is None:
+ *                     counts[i] = data[j, 2]
+ *                 i += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_v_i = (__pyx_v_i + 1);
+
+            /* "hifive/libraries/_hic_interactions.pyx":319
+ *             if data[j, 0] == -1:
+ *                 continue
+ *             if data[j, 1] >= ranges[data[j, 0], 1] and data[j, 1] < ranges[data[j, 0], 2]:             # <<<<<<<<<<<<<<
+ *                 indices0[i] = data[j, 0]
+ *                 indices1[i] = data[j, 1]
+ */
+          }
+          __pyx_L6_continue:;
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":314
+ *     cdef long long int i, j
+ *     cdef long long int num_data = data.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         i = 0
+ *         for j in range(num_data):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":328
+ *                     counts[i] = data[j, 2]
+ *                 i += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":305
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_counts.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_nonzero_node_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_counts.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_data.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":334
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_zero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping,
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_21find_zero_node_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_21find_zero_node_indices = {"find_zero_node_indices", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_21find_zero_node_indices, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_21find_zero_node_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_mapping = 0;
+  PyArrayObject *__pyx_v_ranges = 0;
+  PyArrayObject *__pyx_v_nzindices0 = 0;
+  PyArrayObject *__pyx_v_nzindices1 = 0;
+  PyArrayObject *__pyx_v_zindices0 = 0;
+  PyArrayObject *__pyx_v_zindices1 = 0;
+  PyArrayObject *__pyx_v_interactions = 0;
+  PY_LONG_LONG __pyx_v_start;
+  PY_LONG_LONG __pyx_v_stop;
+  int __pyx_v_startfend;
+  int __pyx_v_binned;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_zero_node_indices (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_mapping,&__pyx_n_s_ranges,&__pyx_n_s_nzindices0,&__pyx_n_s_nzindices1,&__pyx_n_s_zindices0,&__pyx_n_s_zindices1,&__pyx_n_s_interactions,&__pyx_n_s_start,&__pyx_n_s_stop,&__pyx_n_s_startfend,&__pyx_n_s_binned,0};
+    PyObject* values[11] = {0,0,0,0,0,0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case 11: values[10] = PyTuple_GET_ITEM(__pyx_args, 10);
+        CYTHON_FALLTHROUGH;
+        case 10: values[9] = PyTuple_GET_ITEM(__pyx_args, 9);
+        CYTHON_FALLTHROUGH;
+        case  9: values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+        CYTHON_FALLTHROUGH;
+        case  8: values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+        CYTHON_FALLTHROUGH;
+        case  7: values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+        CYTHON_FALLTHROUGH;
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mapping)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_ranges)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 1); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_nzindices0)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 2); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_nzindices1)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 3); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_zindices0)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 4); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_zindices1)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 5); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  6:
+        if (likely((values[6] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_interactions)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 6); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  7:
+        if (likely((values[7] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_start)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 7); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  8:
+        if (likely((values[8] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_stop)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 8); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  9:
+        if (likely((values[9] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_startfend)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 9); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case 10:
+        if (likely((values[10] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_binned)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, 10); __PYX_ERR(0, 334, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_zero_node_indices") < 0)) __PYX_ERR(0, 334, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 11) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+      values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+      values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+      values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+      values[9] = PyTuple_GET_ITEM(__pyx_args, 9);
+      values[10] = PyTuple_GET_ITEM(__pyx_args, 10);
+    }
+    __pyx_v_mapping = ((PyArrayObject *)values[0]);
+    __pyx_v_ranges = ((PyArrayObject *)values[1]);
+    __pyx_v_nzindices0 = ((PyArrayObject *)values[2]);
+    __pyx_v_nzindices1 = ((PyArrayObject *)values[3]);
+    __pyx_v_zindices0 = ((PyArrayObject *)values[4]);
+    __pyx_v_zindices1 = ((PyArrayObject *)values[5]);
+    __pyx_v_interactions = ((PyArrayObject *)values[6]);
+    __pyx_v_start = __Pyx_PyInt_As_PY_LONG_LONG(values[7]); if (unlikely((__pyx_v_start == (PY_LONG_LONG)-1) && PyErr_Occurred())) __PYX_ERR(0, 342, __pyx_L3_error)
+    __pyx_v_stop = __Pyx_PyInt_As_PY_LONG_LONG(values[8]); if (unlikely((__pyx_v_stop == (PY_LONG_LONG)-1) && PyErr_Occurred())) __PYX_ERR(0, 343, __pyx_L3_error)
+    __pyx_v_startfend = __Pyx_PyInt_As_int(values[9]); if (unlikely((__pyx_v_startfend == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 344, __pyx_L3_error)
+    __pyx_v_binned = __Pyx_PyInt_As_int(values[10]); if (unlikely((__pyx_v_binned == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 345, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_zero_node_indices", 1, 11, 11, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 334, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_zero_node_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mapping), __pyx_ptype_5numpy_ndarray, 1, "mapping", 0))) __PYX_ERR(0, 335, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_ranges), __pyx_ptype_5numpy_ndarray, 1, "ranges", 0))) __PYX_ERR(0, 336, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_nzindices0), __pyx_ptype_5numpy_ndarray, 1, "nzindices0", 0))) __PYX_ERR(0, 337, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_nzindices1), __pyx_ptype_5numpy_ndarray, 1, "nzindices1", 0))) __PYX_ERR(0, 338, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_zindices0), __pyx_ptype_5numpy_ndarray, 1, "zindices0", 0))) __PYX_ERR(0, 339, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_zindices1), __pyx_ptype_5numpy_ndarray, 1, "zindices1", 0))) __PYX_ERR(0, 340, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_interactions), __pyx_ptype_5numpy_ndarray, 1, "interactions", 0))) __PYX_ERR(0, 341, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_20find_zero_node_indices(__pyx_self, __pyx_v_mapping, __pyx_v_ranges, __pyx_v_nzindices0, __pyx_v_nzindices1, __pyx_v_zindices0, __pyx_v_zindices1, __pyx_v_interactions, __pyx_v_start, __pyx_v_stop, __pyx_v_startfend, __pyx_v_binned);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_20find_zero_node_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_mapping, PyArrayObject *__pyx_v_ranges, PyArrayObject *__pyx_v_nzindices0, PyArrayObject *__pyx_v_nzindices1, PyArrayObject *__pyx_v_zindices0, PyArrayObject *__pyx_v_zindices1, PyArrayObject *__pyx_v_interactions, PY_LONG_LONG __pyx_v_start, PY_LONG_LONG __pyx_v_stop, int __pyx_v_startfend, int __pyx_v_binned) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_m1;
+  PY_LONG_LONG __pyx_v_m2;
+  PY_LONG_LONG __pyx_v_nzpos;
+  PY_LONG_LONG __pyx_v_zpos;
+  PY_LONG_LONG __pyx_v_num_nz;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_interactions;
+  __Pyx_Buffer __pyx_pybuffer_interactions;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mapping;
+  __Pyx_Buffer __pyx_pybuffer_mapping;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_nzindices0;
+  __Pyx_Buffer __pyx_pybuffer_nzindices0;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_nzindices1;
+  __Pyx_Buffer __pyx_pybuffer_nzindices1;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_ranges;
+  __Pyx_Buffer __pyx_pybuffer_ranges;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_zindices0;
+  __Pyx_Buffer __pyx_pybuffer_zindices0;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_zindices1;
+  __Pyx_Buffer __pyx_pybuffer_zindices1;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PY_LONG_LONG __pyx_t_1;
+  PY_LONG_LONG __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  int __pyx_t_4;
+  int __pyx_t_5;
+  PY_LONG_LONG __pyx_t_6;
+  Py_ssize_t __pyx_t_7;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_8;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t __pyx_t_9;
+  PY_LONG_LONG __pyx_t_10;
+  PY_LONG_LONG __pyx_t_11;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_zero_node_indices", 0);
+  __pyx_pybuffer_mapping.pybuffer.buf = NULL;
+  __pyx_pybuffer_mapping.refcount = 0;
+  __pyx_pybuffernd_mapping.data = NULL;
+  __pyx_pybuffernd_mapping.rcbuffer = &__pyx_pybuffer_mapping;
+  __pyx_pybuffer_ranges.pybuffer.buf = NULL;
+  __pyx_pybuffer_ranges.refcount = 0;
+  __pyx_pybuffernd_ranges.data = NULL;
+  __pyx_pybuffernd_ranges.rcbuffer = &__pyx_pybuffer_ranges;
+  __pyx_pybuffer_nzindices0.pybuffer.buf = NULL;
+  __pyx_pybuffer_nzindices0.refcount = 0;
+  __pyx_pybuffernd_nzindices0.data = NULL;
+  __pyx_pybuffernd_nzindices0.rcbuffer = &__pyx_pybuffer_nzindices0;
+  __pyx_pybuffer_nzindices1.pybuffer.buf = NULL;
+  __pyx_pybuffer_nzindices1.refcount = 0;
+  __pyx_pybuffernd_nzindices1.data = NULL;
+  __pyx_pybuffernd_nzindices1.rcbuffer = &__pyx_pybuffer_nzindices1;
+  __pyx_pybuffer_zindices0.pybuffer.buf = NULL;
+  __pyx_pybuffer_zindices0.refcount = 0;
+  __pyx_pybuffernd_zindices0.data = NULL;
+  __pyx_pybuffernd_zindices0.rcbuffer = &__pyx_pybuffer_zindices0;
+  __pyx_pybuffer_zindices1.pybuffer.buf = NULL;
+  __pyx_pybuffer_zindices1.refcount = 0;
+  __pyx_pybuffernd_zindices1.data = NULL;
+  __pyx_pybuffernd_zindices1.rcbuffer = &__pyx_pybuffer_zindices1;
+  __pyx_pybuffer_interactions.pybuffer.buf = NULL;
+  __pyx_pybuffer_interactions.refcount = 0;
+  __pyx_pybuffernd_interactions.data = NULL;
+  __pyx_pybuffernd_interactions.rcbuffer = &__pyx_pybuffer_interactions;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer, (PyObject*)__pyx_v_mapping, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mapping.diminfo[0].strides = __pyx_pybuffernd_mapping.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mapping.diminfo[0].shape = __pyx_pybuffernd_mapping.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer, (PyObject*)__pyx_v_ranges, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 2, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_ranges.diminfo[0].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_ranges.diminfo[0].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[0]; __pyx_pybuffernd_ranges.diminfo[1].strides = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.strides[1]; __pyx_pybuffernd_ranges.diminfo[1].shape = __pyx_pybuffernd_ranges.rcbuffer->pybuffer.shape[1];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_nzindices0.rcbuffer->pybuffer, (PyObject*)__pyx_v_nzindices0, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_nzindices0.diminfo[0].strides = __pyx_pybuffernd_nzindices0.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_nzindices0.diminfo[0].shape = __pyx_pybuffernd_nzindices0.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_nzindices1.rcbuffer->pybuffer, (PyObject*)__pyx_v_nzindices1, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_nzindices1.diminfo[0].strides = __pyx_pybuffernd_nzindices1.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_nzindices1.diminfo[0].shape = __pyx_pybuffernd_nzindices1.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_zindices0.rcbuffer->pybuffer, (PyObject*)__pyx_v_zindices0, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_zindices0.diminfo[0].strides = __pyx_pybuffernd_zindices0.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_zindices0.diminfo[0].shape = __pyx_pybuffernd_zindices0.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_zindices1.rcbuffer->pybuffer, (PyObject*)__pyx_v_zindices1, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_zindices1.diminfo[0].strides = __pyx_pybuffernd_zindices1.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_zindices1.diminfo[0].shape = __pyx_pybuffernd_zindices1.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer, (PyObject*)__pyx_v_interactions, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 334, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_interactions.diminfo[0].strides = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_interactions.diminfo[0].shape = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":347
+ *         int binned):
+ *     cdef long long int i, j, m1, m2, nzpos, zpos
+ *     cdef long long int num_nz = nzindices0.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         nzpos = 0
+ */
+  __pyx_v_num_nz = (__pyx_v_nzindices0->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":348
+ *     cdef long long int i, j, m1, m2, nzpos, zpos
+ *     cdef long long int num_nz = nzindices0.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         nzpos = 0
+ *         zpos = 0
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":349
+ *     cdef long long int num_nz = nzindices0.shape[0]
+ *     with nogil:
+ *         nzpos = 0             # <<<<<<<<<<<<<<
+ *         zpos = 0
+ *         for i in range(start, stop):
+ */
+        __pyx_v_nzpos = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":350
+ *     with nogil:
+ *         nzpos = 0
+ *         zpos = 0             # <<<<<<<<<<<<<<
+ *         for i in range(start, stop):
+ *             while nzpos < num_nz and nzindices0[nzpos] < i:
+ */
+        __pyx_v_zpos = 0;
+
+        /* "hifive/libraries/_hic_interactions.pyx":351
+ *         nzpos = 0
+ *         zpos = 0
+ *         for i in range(start, stop):             # <<<<<<<<<<<<<<
+ *             while nzpos < num_nz and nzindices0[nzpos] < i:
+ *                 nzpos += 1
+ */
+        __pyx_t_1 = __pyx_v_stop;
+        __pyx_t_2 = __pyx_t_1;
+        for (__pyx_t_3 = __pyx_v_start; __pyx_t_3 < __pyx_t_2; __pyx_t_3+=1) {
+          __pyx_v_i = __pyx_t_3;
+
+          /* "hifive/libraries/_hic_interactions.pyx":352
+ *         zpos = 0
+ *         for i in range(start, stop):
+ *             while nzpos < num_nz and nzindices0[nzpos] < i:             # <<<<<<<<<<<<<<
+ *                 nzpos += 1
+ *             for j in range(ranges[i, 1], ranges[i, 2]):
+ */
+          while (1) {
+            __pyx_t_5 = ((__pyx_v_nzpos < __pyx_v_num_nz) != 0);
+            if (__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L10_bool_binop_done;
+            }
+            __pyx_t_6 = __pyx_v_nzpos;
+            __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_nzindices0.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_nzindices0.diminfo[0].strides)) < __pyx_v_i) != 0);
+            __pyx_t_4 = __pyx_t_5;
+            __pyx_L10_bool_binop_done:;
+            if (!__pyx_t_4) break;
+
+            /* "hifive/libraries/_hic_interactions.pyx":353
+ *         for i in range(start, stop):
+ *             while nzpos < num_nz and nzindices0[nzpos] < i:
+ *                 nzpos += 1             # <<<<<<<<<<<<<<
+ *             for j in range(ranges[i, 1], ranges[i, 2]):
+ *                 while nzpos < num_nz and nzindices0[nzpos] == i and nzindices1[nzpos] < j:
+ */
+            __pyx_v_nzpos = (__pyx_v_nzpos + 1);
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":354
+ *             while nzpos < num_nz and nzindices0[nzpos] < i:
+ *                 nzpos += 1
+ *             for j in range(ranges[i, 1], ranges[i, 2]):             # <<<<<<<<<<<<<<
+ *                 while nzpos < num_nz and nzindices0[nzpos] == i and nzindices1[nzpos] < j:
+ *                     nzpos += 1
+ */
+          __pyx_t_6 = __pyx_v_i;
+          __pyx_t_7 = 2;
+          __pyx_t_8 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides));
+          __pyx_t_6 = __pyx_v_i;
+          __pyx_t_7 = 1;
+          __pyx_t_9 = __pyx_t_8;
+          for (__pyx_t_10 = (*__Pyx_BufPtrStrided2d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_ranges.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_ranges.diminfo[0].strides, __pyx_t_7, __pyx_pybuffernd_ranges.diminfo[1].strides)); __pyx_t_10 < __pyx_t_9; __pyx_t_10+=1) {
+            __pyx_v_j = __pyx_t_10;
+
+            /* "hifive/libraries/_hic_interactions.pyx":355
+ *                 nzpos += 1
+ *             for j in range(ranges[i, 1], ranges[i, 2]):
+ *                 while nzpos < num_nz and nzindices0[nzpos] == i and nzindices1[nzpos] < j:             # <<<<<<<<<<<<<<
+ *                     nzpos += 1
+ *                 m1 = mapping[i]
+ */
+            while (1) {
+              __pyx_t_5 = ((__pyx_v_nzpos < __pyx_v_num_nz) != 0);
+              if (__pyx_t_5) {
+              } else {
+                __pyx_t_4 = __pyx_t_5;
+                goto __pyx_L16_bool_binop_done;
+              }
+              __pyx_t_11 = __pyx_v_nzpos;
+              __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_nzindices0.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_nzindices0.diminfo[0].strides)) == __pyx_v_i) != 0);
+              if (__pyx_t_5) {
+              } else {
+                __pyx_t_4 = __pyx_t_5;
+                goto __pyx_L16_bool_binop_done;
+              }
+              __pyx_t_11 = __pyx_v_nzpos;
+              __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_nzindices1.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_nzindices1.diminfo[0].strides)) < __pyx_v_j) != 0);
+              __pyx_t_4 = __pyx_t_5;
+              __pyx_L16_bool_binop_done:;
+              if (!__pyx_t_4) break;
+
+              /* "hifive/libraries/_hic_interactions.pyx":356
+ *             for j in range(ranges[i, 1], ranges[i, 2]):
+ *                 while nzpos < num_nz and nzindices0[nzpos] == i and nzindices1[nzpos] < j:
+ *                     nzpos += 1             # <<<<<<<<<<<<<<
+ *                 m1 = mapping[i]
+ *                 m2 = mapping[j]
+ */
+              __pyx_v_nzpos = (__pyx_v_nzpos + 1);
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":357
+ *                 while nzpos < num_nz and nzindices0[nzpos] == i and nzindices1[nzpos] < j:
+ *                     nzpos += 1
+ *                 m1 = mapping[i]             # <<<<<<<<<<<<<<
+ *                 m2 = mapping[j]
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+ */
+            __pyx_t_11 = __pyx_v_i;
+            __pyx_v_m1 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_mapping.diminfo[0].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":358
+ *                     nzpos += 1
+ *                 m1 = mapping[i]
+ *                 m2 = mapping[j]             # <<<<<<<<<<<<<<
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+ *                     continue
+ */
+            __pyx_t_11 = __pyx_v_j;
+            __pyx_v_m2 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mapping.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_mapping.diminfo[0].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":359
+ *                 m1 = mapping[i]
+ *                 m2 = mapping[j]
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):             # <<<<<<<<<<<<<<
+ *                     continue
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
+ */
+            __pyx_t_5 = ((__pyx_v_binned == 0) != 0);
+            if (__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L20_bool_binop_done;
+            }
+            __pyx_t_5 = (((__pyx_v_m2 - __pyx_v_m1) < 4) != 0);
+            if (__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L20_bool_binop_done;
+            }
+            __pyx_t_5 = (((__pyx_v_m2 - __pyx_v_m1) == 1) != 0);
+            if (!__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L20_bool_binop_done;
+            }
+            __pyx_t_5 = ((((__pyx_v_m1 + __pyx_v_startfend) % 2) == 0) != 0);
+            if (__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L20_bool_binop_done;
+            }
+            __pyx_t_5 = (((__pyx_v_m2 - __pyx_v_m1) == 3) != 0);
+            __pyx_t_4 = __pyx_t_5;
+            __pyx_L20_bool_binop_done:;
+            if (__pyx_t_4) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":360
+ *                 m2 = mapping[j]
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+ *                     continue             # <<<<<<<<<<<<<<
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
+ *                     # without zero index arrays, only count interactions
+ */
+              goto __pyx_L12_continue;
+
+              /* "hifive/libraries/_hic_interactions.pyx":359
+ *                 m1 = mapping[i]
+ *                 m2 = mapping[j]
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):             # <<<<<<<<<<<<<<
+ *                     continue
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
+ */
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":361
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+ *                     continue
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:             # <<<<<<<<<<<<<<
+ *                     # without zero index arrays, only count interactions
+ *                     if not zindices0 is None:
+ */
+            __pyx_t_5 = ((__pyx_v_nzpos == __pyx_v_num_nz) != 0);
+            if (!__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L25_bool_binop_done;
+            }
+            __pyx_t_11 = __pyx_v_nzpos;
+            __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_nzindices1.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_nzindices1.diminfo[0].strides)) != __pyx_v_j) != 0);
+            if (!__pyx_t_5) {
+            } else {
+              __pyx_t_4 = __pyx_t_5;
+              goto __pyx_L25_bool_binop_done;
+            }
+            __pyx_t_11 = __pyx_v_nzpos;
+            __pyx_t_5 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_nzindices0.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_nzindices0.diminfo[0].strides)) != __pyx_v_i) != 0);
+            __pyx_t_4 = __pyx_t_5;
+            __pyx_L25_bool_binop_done:;
+            if (__pyx_t_4) {
+
+              /* "hifive/libraries/_hic_interactions.pyx":363
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
+ *                     # without zero index arrays, only count interactions
+ *                     if not zindices0 is None:             # <<<<<<<<<<<<<<
+ *                         zindices0[zpos] = i
+ *                         zindices1[zpos] = j
+ */
+              __pyx_t_4 = (((PyObject *)__pyx_v_zindices0) != Py_None);
+              __pyx_t_5 = (__pyx_t_4 != 0);
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":364
+ *                     # without zero index arrays, only count interactions
+ *                     if not zindices0 is None:
+ *                         zindices0[zpos] = i             # <<<<<<<<<<<<<<
+ *                         zindices1[zpos] = j
+ *                     interactions[i] += 1
+ */
+                __pyx_t_11 = __pyx_v_zpos;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_zindices0.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_zindices0.diminfo[0].strides) = __pyx_v_i;
+
+                /* "hifive/libraries/_hic_interactions.pyx":365
+ *                     if not zindices0 is None:
+ *                         zindices0[zpos] = i
+ *                         zindices1[zpos] = j             # <<<<<<<<<<<<<<
+ *                     interactions[i] += 1
+ *                     if i != j:
+ */
+                __pyx_t_11 = __pyx_v_zpos;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_zindices1.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_zindices1.diminfo[0].strides) = __pyx_v_j;
+
+                /* "hifive/libraries/_hic_interactions.pyx":363
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
+ *                     # without zero index arrays, only count interactions
+ *                     if not zindices0 is None:             # <<<<<<<<<<<<<<
+ *                         zindices0[zpos] = i
+ *                         zindices1[zpos] = j
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":366
+ *                         zindices0[zpos] = i
+ *                         zindices1[zpos] = j
+ *                     interactions[i] += 1             # <<<<<<<<<<<<<<
+ *                     if i != j:
+ *                         interactions[j] += 1
+ */
+              __pyx_t_11 = __pyx_v_i;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_interactions.diminfo[0].strides) += 1;
+
+              /* "hifive/libraries/_hic_interactions.pyx":367
+ *                         zindices1[zpos] = j
+ *                     interactions[i] += 1
+ *                     if i != j:             # <<<<<<<<<<<<<<
+ *                         interactions[j] += 1
+ *                     zpos += 1
+ */
+              __pyx_t_5 = ((__pyx_v_i != __pyx_v_j) != 0);
+              if (__pyx_t_5) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":368
+ *                     interactions[i] += 1
+ *                     if i != j:
+ *                         interactions[j] += 1             # <<<<<<<<<<<<<<
+ *                     zpos += 1
+ *     return None
+ */
+                __pyx_t_11 = __pyx_v_j;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_11, __pyx_pybuffernd_interactions.diminfo[0].strides) += 1;
+
+                /* "hifive/libraries/_hic_interactions.pyx":367
+ *                         zindices1[zpos] = j
+ *                     interactions[i] += 1
+ *                     if i != j:             # <<<<<<<<<<<<<<
+ *                         interactions[j] += 1
+ *                     zpos += 1
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":369
+ *                     if i != j:
+ *                         interactions[j] += 1
+ *                     zpos += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+              __pyx_v_zpos = (__pyx_v_zpos + 1);
+
+              /* "hifive/libraries/_hic_interactions.pyx":361
+ *                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+ *                     continue
+ *                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:             # <<<<<<<<<<<<<<
+ *                     # without zero index arrays, only count interactions
+ *                     if not zindices0 is None:
+ */
+            }
+            __pyx_L12_continue:;
+          }
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":348
+ *     cdef long long int i, j, m1, m2, nzpos, zpos
+ *     cdef long long int num_nz = nzindices0.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         nzpos = 0
+ *         zpos = 0
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":370
+ *                         interactions[j] += 1
+ *                     zpos += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":334
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_zero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping,
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_nzindices0.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_nzindices1.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_zindices0.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_zindices1.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_zero_node_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mapping.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_nzindices0.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_nzindices1.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_ranges.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_zindices0.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_zindices1.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":373
+ * 
+ * 
+ * cdef inline long long int find_first_above(DTYPE_int_t* mids, long long int lower, long long int upper,             # <<<<<<<<<<<<<<
+ *                                            long long int value) nogil:
+ *     # find the first fend in [lower, upper) whose midpoint exceeds value
+ */
+
+static CYTHON_INLINE PY_LONG_LONG __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *__pyx_v_mids, PY_LONG_LONG __pyx_v_lower, PY_LONG_LONG __pyx_v_upper, PY_LONG_LONG __pyx_v_value) {
+  PY_LONG_LONG __pyx_v_middle;
+  PY_LONG_LONG __pyx_r;
+  int __pyx_t_1;
+
+  /* "hifive/libraries/_hic_interactions.pyx":377
+ *     # find the first fend in [lower, upper) whose midpoint exceeds value
+ *     cdef long long int middle
+ *     while lower < upper:             # <<<<<<<<<<<<<<
+ *         middle = (lower + upper) / 2
+ *         if mids[middle] > value:
+ */
+  while (1) {
+    __pyx_t_1 = ((__pyx_v_lower < __pyx_v_upper) != 0);
+    if (!__pyx_t_1) break;
+
+    /* "hifive/libraries/_hic_interactions.pyx":378
+ *     cdef long long int middle
+ *     while lower < upper:
+ *         middle = (lower + upper) / 2             # <<<<<<<<<<<<<<
+ *         if mids[middle] > value:
+ *             upper = middle
+ */
+    __pyx_v_middle = __Pyx_div_PY_LONG_LONG((__pyx_v_lower + __pyx_v_upper), 2);
+
+    /* "hifive/libraries/_hic_interactions.pyx":379
+ *     while lower < upper:
+ *         middle = (lower + upper) / 2
+ *         if mids[middle] > value:             # <<<<<<<<<<<<<<
+ *             upper = middle
+ *         else:
+ */
+    __pyx_t_1 = (((__pyx_v_mids[__pyx_v_middle]) > __pyx_v_value) != 0);
+    if (__pyx_t_1) {
+
+      /* "hifive/libraries/_hic_interactions.pyx":380
+ *         middle = (lower + upper) / 2
+ *         if mids[middle] > value:
+ *             upper = middle             # <<<<<<<<<<<<<<
+ *         else:
+ *             lower = middle + 1
+ */
+      __pyx_v_upper = __pyx_v_middle;
+
+      /* "hifive/libraries/_hic_interactions.pyx":379
+ *     while lower < upper:
+ *         middle = (lower + upper) / 2
+ *         if mids[middle] > value:             # <<<<<<<<<<<<<<
+ *             upper = middle
+ *         else:
+ */
+      goto __pyx_L5;
+    }
+
+    /* "hifive/libraries/_hic_interactions.pyx":382
+ *             upper = middle
+ *         else:
+ *             lower = middle + 1             # <<<<<<<<<<<<<<
+ *     return lower
+ * 
+ */
+    /*else*/ {
+      __pyx_v_lower = (__pyx_v_middle + 1);
+    }
+    __pyx_L5:;
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":383
+ *         else:
+ *             lower = middle + 1
+ *     return lower             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __pyx_r = __pyx_v_lower;
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":373
+ * 
+ * 
+ * cdef inline long long int find_first_above(DTYPE_int_t* mids, long long int lower, long long int upper,             # <<<<<<<<<<<<<<
+ *                                            long long int value) nogil:
+ *     # find the first fend in [lower, upper) whose midpoint exceeds value
+ */
+
+  /* function exit code */
+  __pyx_L0:;
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":389
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_distancebound_possible_interactions(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] interactions not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] chr_indices not None,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_23find_distancebound_possible_interactions(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_23find_distancebound_possible_interactions = {"find_distancebound_possible_interactions", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_23find_distancebound_possible_interactions, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_23find_distancebound_possible_interactions(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_interactions = 0;
+  PyArrayObject *__pyx_v_chr_indices = 0;
+  PyArrayObject *__pyx_v_mids = 0;
+  PyArrayObject *__pyx_v_filter = 0;
+  PyArrayObject *__pyx_v_chrints = 0;
+  int __pyx_v_useread_int;
+  int __pyx_v_mindistance;
+  int __pyx_v_maxdistance;
+  int __pyx_v_binned;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("find_distancebound_possible_interactions (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_interactions,&__pyx_n_s_chr_indices,&__pyx_n_s_mids,&__pyx_n_s_filter,&__pyx_n_s_chrints,&__pyx_n_s_useread_int,&__pyx_n_s_mindistance,&__pyx_n_s_maxdistance,&__pyx_n_s_binned,0};
+    PyObject* values[9] = {0,0,0,0,0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  9: values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+        CYTHON_FALLTHROUGH;
+        case  8: values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+        CYTHON_FALLTHROUGH;
+        case  7: values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+        CYTHON_FALLTHROUGH;
+        case  6: values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+        CYTHON_FALLTHROUGH;
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_interactions)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chr_indices)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 1); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mids)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 2); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_filter)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 3); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_chrints)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 4); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  5:
+        if (likely((values[5] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_useread_int)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 5); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  6:
+        if (likely((values[6] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_mindistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 6); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  7:
+        if (likely((values[7] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_maxdistance)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 7); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  8:
+        if (likely((values[8] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_binned)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, 8); __PYX_ERR(0, 389, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "find_distancebound_possible_interactions") < 0)) __PYX_ERR(0, 389, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 9) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+      values[5] = PyTuple_GET_ITEM(__pyx_args, 5);
+      values[6] = PyTuple_GET_ITEM(__pyx_args, 6);
+      values[7] = PyTuple_GET_ITEM(__pyx_args, 7);
+      values[8] = PyTuple_GET_ITEM(__pyx_args, 8);
+    }
+    __pyx_v_interactions = ((PyArrayObject *)values[0]);
+    __pyx_v_chr_indices = ((PyArrayObject *)values[1]);
+    __pyx_v_mids = ((PyArrayObject *)values[2]);
+    __pyx_v_filter = ((PyArrayObject *)values[3]);
+    __pyx_v_chrints = ((PyArrayObject *)values[4]);
+    __pyx_v_useread_int = __Pyx_PyInt_As_int(values[5]); if (unlikely((__pyx_v_useread_int == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 395, __pyx_L3_error)
+    __pyx_v_mindistance = __Pyx_PyInt_As_int(values[6]); if (unlikely((__pyx_v_mindistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 396, __pyx_L3_error)
+    __pyx_v_maxdistance = __Pyx_PyInt_As_int(values[7]); if (unlikely((__pyx_v_maxdistance == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 397, __pyx_L3_error)
+    __pyx_v_binned = __Pyx_PyInt_As_int(values[8]); if (unlikely((__pyx_v_binned == (int)-1) && PyErr_Occurred())) __PYX_ERR(0, 398, __pyx_L3_error)
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("find_distancebound_possible_interactions", 1, 9, 9, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 389, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_distancebound_possible_interactions", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_interactions), __pyx_ptype_5numpy_ndarray, 0, "interactions", 0))) __PYX_ERR(0, 390, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chr_indices), __pyx_ptype_5numpy_ndarray, 0, "chr_indices", 0))) __PYX_ERR(0, 391, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_mids), __pyx_ptype_5numpy_ndarray, 0, "mids", 0))) __PYX_ERR(0, 392, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_filter), __pyx_ptype_5numpy_ndarray, 0, "filter", 0))) __PYX_ERR(0, 393, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_chrints), __pyx_ptype_5numpy_ndarray, 0, "chrints", 0))) __PYX_ERR(0, 394, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_22find_distancebound_possible_interactions(__pyx_self, __pyx_v_interactions, __pyx_v_chr_indices, __pyx_v_mids, __pyx_v_filter, __pyx_v_chrints, __pyx_v_useread_int, __pyx_v_mindistance, __pyx_v_maxdistance, __pyx_v_binned);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_22find_distancebound_possible_interactions(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_interactions, PyArrayObject *__pyx_v_chr_indices, PyArrayObject *__pyx_v_mids, PyArrayObject *__pyx_v_filter, PyArrayObject *__pyx_v_chrints, int __pyx_v_useread_int, int __pyx_v_mindistance, int __pyx_v_maxdistance, int __pyx_v_binned) {
+  PY_LONG_LONG __pyx_v_h;
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_j;
+  PY_LONG_LONG __pyx_v_k;
+  PY_LONG_LONG __pyx_v_chr_total;
+  PY_LONG_LONG __pyx_v_all_total;
+  PY_LONG_LONG __pyx_v_total;
+  PY_LONG_LONG __pyx_v_stop;
+  PY_LONG_LONG __pyx_v_start_fend;
+  PY_LONG_LONG __pyx_v_stop_fend;
+  PY_LONG_LONG __pyx_v_num_chroms;
+  PY_LONG_LONG __pyx_v_num_fends;
+  PyArrayObject *__pyx_v_valid_sums = 0;
+  __pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *__pyx_v_mids_ptr;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chr_indices;
+  __Pyx_Buffer __pyx_pybuffer_chr_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_chrints;
+  __Pyx_Buffer __pyx_pybuffer_chrints;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_filter;
+  __Pyx_Buffer __pyx_pybuffer_filter;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_interactions;
+  __Pyx_Buffer __pyx_pybuffer_interactions;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_mids;
+  __Pyx_Buffer __pyx_pybuffer_mids;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_valid_sums;
+  __Pyx_Buffer __pyx_pybuffer_valid_sums;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  PyObject *__pyx_t_3 = NULL;
+  PyObject *__pyx_t_4 = NULL;
+  PyObject *__pyx_t_5 = NULL;
+  PyArrayObject *__pyx_t_6 = NULL;
+  PyArrayObject *__pyx_t_7 = NULL;
+  int __pyx_t_8;
+  PyObject *__pyx_t_9 = NULL;
+  PyObject *__pyx_t_10 = NULL;
+  PyObject *__pyx_t_11 = NULL;
+  PY_LONG_LONG __pyx_t_12;
+  PY_LONG_LONG __pyx_t_13;
+  PY_LONG_LONG __pyx_t_14;
+  PY_LONG_LONG __pyx_t_15;
+  PY_LONG_LONG __pyx_t_16;
+  int __pyx_t_17;
+  PY_LONG_LONG __pyx_t_18;
+  PY_LONG_LONG __pyx_t_19;
+  PY_LONG_LONG __pyx_t_20;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("find_distancebound_possible_interactions", 0);
+  __Pyx_INCREF((PyObject *)__pyx_v_mids);
+  __pyx_pybuffer_valid_sums.pybuffer.buf = NULL;
+  __pyx_pybuffer_valid_sums.refcount = 0;
+  __pyx_pybuffernd_valid_sums.data = NULL;
+  __pyx_pybuffernd_valid_sums.rcbuffer = &__pyx_pybuffer_valid_sums;
+  __pyx_pybuffer_interactions.pybuffer.buf = NULL;
+  __pyx_pybuffer_interactions.refcount = 0;
+  __pyx_pybuffernd_interactions.data = NULL;
+  __pyx_pybuffernd_interactions.rcbuffer = &__pyx_pybuffer_interactions;
+  __pyx_pybuffer_chr_indices.pybuffer.buf = NULL;
+  __pyx_pybuffer_chr_indices.refcount = 0;
+  __pyx_pybuffernd_chr_indices.data = NULL;
+  __pyx_pybuffernd_chr_indices.rcbuffer = &__pyx_pybuffer_chr_indices;
+  __pyx_pybuffer_mids.pybuffer.buf = NULL;
+  __pyx_pybuffer_mids.refcount = 0;
+  __pyx_pybuffernd_mids.data = NULL;
+  __pyx_pybuffernd_mids.rcbuffer = &__pyx_pybuffer_mids;
+  __pyx_pybuffer_filter.pybuffer.buf = NULL;
+  __pyx_pybuffer_filter.refcount = 0;
+  __pyx_pybuffernd_filter.data = NULL;
+  __pyx_pybuffernd_filter.rcbuffer = &__pyx_pybuffer_filter;
+  __pyx_pybuffer_chrints.pybuffer.buf = NULL;
+  __pyx_pybuffer_chrints.refcount = 0;
+  __pyx_pybuffernd_chrints.data = NULL;
+  __pyx_pybuffernd_chrints.rcbuffer = &__pyx_pybuffer_chrints;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer, (PyObject*)__pyx_v_interactions, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 389, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_interactions.diminfo[0].strides = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_interactions.diminfo[0].shape = __pyx_pybuffernd_interactions.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer, (PyObject*)__pyx_v_chr_indices, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 389, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chr_indices.diminfo[0].strides = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chr_indices.diminfo[0].shape = __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_v_mids, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 389, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_mids.diminfo[0].strides = __pyx_pybuffernd_mids.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mids.diminfo[0].shape = __pyx_pybuffernd_mids.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_filter.rcbuffer->pybuffer, (PyObject*)__pyx_v_filter, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 389, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_filter.diminfo[0].strides = __pyx_pybuffernd_filter.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_filter.diminfo[0].shape = __pyx_pybuffernd_filter.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_chrints.rcbuffer->pybuffer, (PyObject*)__pyx_v_chrints, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 389, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_chrints.diminfo[0].strides = __pyx_pybuffernd_chrints.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_chrints.diminfo[0].shape = __pyx_pybuffernd_chrints.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":400
+ *         int binned):
+ *     cdef long long int h, i, j, k, chr_total, all_total, total, stop, start_fend, stop_fend
+ *     cdef long long int num_chroms = chrints.shape[0]             # <<<<<<<<<<<<<<
+ *     cdef long long int num_fends = filter.shape[0]
+ *     # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+ */
+  __pyx_v_num_chroms = (__pyx_v_chrints->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":401
+ *     cdef long long int h, i, j, k, chr_total, all_total, total, stop, start_fend, stop_fend
+ *     cdef long long int num_chroms = chrints.shape[0]
+ *     cdef long long int num_fends = filter.shape[0]             # <<<<<<<<<<<<<<
+ *     # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+ *     cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+ */
+  __pyx_v_num_fends = (__pyx_v_filter->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":403
+ *     cdef long long int num_fends = filter.shape[0]
+ *     # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+ *     cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)             # <<<<<<<<<<<<<<
+ *     valid_sums[1:] = numpy.cumsum(filter)
+ *     mids = numpy.ascontiguousarray(mids)
+ */
+  __Pyx_GetModuleGlobalName(__pyx_t_1, __pyx_n_s_numpy); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_2 = __Pyx_PyObject_GetAttrStr(__pyx_t_1, __pyx_n_s_zeros); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __pyx_t_1 = __Pyx_PyInt_From_PY_LONG_LONG((__pyx_v_num_fends + 1)); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_3 = PyTuple_New(1); if (unlikely(!__pyx_t_3)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_3);
+  __Pyx_GIVEREF(__pyx_t_1);
+  PyTuple_SET_ITEM(__pyx_t_3, 0, __pyx_t_1);
+  __pyx_t_1 = 0;
+  __pyx_t_1 = __Pyx_PyDict_NewPresized(1); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __Pyx_GetModuleGlobalName(__pyx_t_4, __pyx_n_s_numpy); if (unlikely(!__pyx_t_4)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_4);
+  __pyx_t_5 = __Pyx_PyObject_GetAttrStr(__pyx_t_4, __pyx_n_s_int64); if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+  if (PyDict_SetItem(__pyx_t_1, __pyx_n_s_dtype, __pyx_t_5) < 0) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_5); __pyx_t_5 = 0;
+  __pyx_t_5 = __Pyx_PyObject_Call(__pyx_t_2, __pyx_t_3, __pyx_t_1); if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 403, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+  __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  if (!(likely(((__pyx_t_5) == Py_None) || likely(__Pyx_TypeTest(__pyx_t_5, __pyx_ptype_5numpy_ndarray))))) __PYX_ERR(0, 403, __pyx_L1_error)
+  __pyx_t_6 = ((PyArrayObject *)__pyx_t_5);
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_valid_sums.rcbuffer->pybuffer, (PyObject*)__pyx_t_6, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) {
+      __pyx_v_valid_sums = ((PyArrayObject *)Py_None); __Pyx_INCREF(Py_None); __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf = NULL;
+      __PYX_ERR(0, 403, __pyx_L1_error)
+    } else {__pyx_pybuffernd_valid_sums.diminfo[0].strides = __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_valid_sums.diminfo[0].shape = __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.shape[0];
+    }
+  }
+  __pyx_t_6 = 0;
+  __pyx_v_valid_sums = ((PyArrayObject *)__pyx_t_5);
+  __pyx_t_5 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":404
+ *     # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+ *     cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+ *     valid_sums[1:] = numpy.cumsum(filter)             # <<<<<<<<<<<<<<
+ *     mids = numpy.ascontiguousarray(mids)
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ */
+  __Pyx_GetModuleGlobalName(__pyx_t_1, __pyx_n_s_numpy); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 404, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_3 = __Pyx_PyObject_GetAttrStr(__pyx_t_1, __pyx_n_s_cumsum); if (unlikely(!__pyx_t_3)) __PYX_ERR(0, 404, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_3);
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __pyx_t_1 = NULL;
+  if (CYTHON_UNPACK_METHODS && unlikely(PyMethod_Check(__pyx_t_3))) {
+    __pyx_t_1 = PyMethod_GET_SELF(__pyx_t_3);
+    if (likely(__pyx_t_1)) {
+      PyObject* function = PyMethod_GET_FUNCTION(__pyx_t_3);
+      __Pyx_INCREF(__pyx_t_1);
+      __Pyx_INCREF(function);
+      __Pyx_DECREF_SET(__pyx_t_3, function);
+    }
+  }
+  __pyx_t_5 = (__pyx_t_1) ? __Pyx_PyObject_Call2Args(__pyx_t_3, __pyx_t_1, ((PyObject *)__pyx_v_filter)) : __Pyx_PyObject_CallOneArg(__pyx_t_3, ((PyObject *)__pyx_v_filter));
+  __Pyx_XDECREF(__pyx_t_1); __pyx_t_1 = 0;
+  if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 404, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+  if (unlikely(PyObject_SetItem(((PyObject *)__pyx_v_valid_sums), __pyx_slice_, __pyx_t_5) < 0)) __PYX_ERR(0, 404, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_5); __pyx_t_5 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":405
+ *     cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+ *     valid_sums[1:] = numpy.cumsum(filter)
+ *     mids = numpy.ascontiguousarray(mids)             # <<<<<<<<<<<<<<
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ *     with nogil:
+ */
+  __Pyx_GetModuleGlobalName(__pyx_t_3, __pyx_n_s_numpy); if (unlikely(!__pyx_t_3)) __PYX_ERR(0, 405, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_3);
+  __pyx_t_1 = __Pyx_PyObject_GetAttrStr(__pyx_t_3, __pyx_n_s_ascontiguousarray); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 405, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+  __pyx_t_3 = NULL;
+  if (CYTHON_UNPACK_METHODS && unlikely(PyMethod_Check(__pyx_t_1))) {
+    __pyx_t_3 = PyMethod_GET_SELF(__pyx_t_1);
+    if (likely(__pyx_t_3)) {
+      PyObject* function = PyMethod_GET_FUNCTION(__pyx_t_1);
+      __Pyx_INCREF(__pyx_t_3);
+      __Pyx_INCREF(function);
+      __Pyx_DECREF_SET(__pyx_t_1, function);
+    }
+  }
+  __pyx_t_5 = (__pyx_t_3) ? __Pyx_PyObject_Call2Args(__pyx_t_1, __pyx_t_3, ((PyObject *)__pyx_v_mids)) : __Pyx_PyObject_CallOneArg(__pyx_t_1, ((PyObject *)__pyx_v_mids));
+  __Pyx_XDECREF(__pyx_t_3); __pyx_t_3 = 0;
+  if (unlikely(!__pyx_t_5)) __PYX_ERR(0, 405, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_5);
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  if (!(likely(((__pyx_t_5) == Py_None) || likely(__Pyx_TypeTest(__pyx_t_5, __pyx_ptype_5numpy_ndarray))))) __PYX_ERR(0, 405, __pyx_L1_error)
+  __pyx_t_7 = ((PyArrayObject *)__pyx_t_5);
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+    __pyx_t_8 = __Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_t_7, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack);
+    if (unlikely(__pyx_t_8 < 0)) {
+      PyErr_Fetch(&__pyx_t_9, &__pyx_t_10, &__pyx_t_11);
+      if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_mids.rcbuffer->pybuffer, (PyObject*)__pyx_v_mids, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) {
+        Py_XDECREF(__pyx_t_9); Py_XDECREF(__pyx_t_10); Py_XDECREF(__pyx_t_11);
+        __Pyx_RaiseBufferFallbackError();
+      } else {
+        PyErr_Restore(__pyx_t_9, __pyx_t_10, __pyx_t_11);
+      }
+      __pyx_t_9 = __pyx_t_10 = __pyx_t_11 = 0;
+    }
+    __pyx_pybuffernd_mids.diminfo[0].strides = __pyx_pybuffernd_mids.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_mids.diminfo[0].shape = __pyx_pybuffernd_mids.rcbuffer->pybuffer.shape[0];
+    if (unlikely(__pyx_t_8 < 0)) __PYX_ERR(0, 405, __pyx_L1_error)
+  }
+  __pyx_t_7 = 0;
+  __Pyx_DECREF_SET(__pyx_v_mids, ((PyArrayObject *)__pyx_t_5));
+  __pyx_t_5 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":406
+ *     valid_sums[1:] = numpy.cumsum(filter)
+ *     mids = numpy.ascontiguousarray(mids)
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         all_total = valid_sums[num_fends]
+ */
+  __pyx_v_mids_ptr = ((__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *)__pyx_v_mids->data);
+
+  /* "hifive/libraries/_hic_interactions.pyx":407
+ *     mids = numpy.ascontiguousarray(mids)
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         all_total = valid_sums[num_fends]
+ *         for h in range(num_chroms):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":408
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ *     with nogil:
+ *         all_total = valid_sums[num_fends]             # <<<<<<<<<<<<<<
+ *         for h in range(num_chroms):
+ *             i = chrints[h]
+ */
+        __pyx_t_12 = __pyx_v_num_fends;
+        __pyx_v_all_total = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_12, __pyx_pybuffernd_valid_sums.diminfo[0].strides));
+
+        /* "hifive/libraries/_hic_interactions.pyx":409
+ *     with nogil:
+ *         all_total = valid_sums[num_fends]
+ *         for h in range(num_chroms):             # <<<<<<<<<<<<<<
+ *             i = chrints[h]
+ *             start_fend = chr_indices[i]
+ */
+        __pyx_t_12 = __pyx_v_num_chroms;
+        __pyx_t_13 = __pyx_t_12;
+        for (__pyx_t_14 = 0; __pyx_t_14 < __pyx_t_13; __pyx_t_14+=1) {
+          __pyx_v_h = __pyx_t_14;
+
+          /* "hifive/libraries/_hic_interactions.pyx":410
+ *         all_total = valid_sums[num_fends]
+ *         for h in range(num_chroms):
+ *             i = chrints[h]             # <<<<<<<<<<<<<<
+ *             start_fend = chr_indices[i]
+ *             stop_fend = chr_indices[i + 1]
+ */
+          __pyx_t_15 = __pyx_v_h;
+          __pyx_v_i = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chrints.rcbuffer->pybuffer.buf, __pyx_t_15, __pyx_pybuffernd_chrints.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":411
+ *         for h in range(num_chroms):
+ *             i = chrints[h]
+ *             start_fend = chr_indices[i]             # <<<<<<<<<<<<<<
+ *             stop_fend = chr_indices[i + 1]
+ *             # for each chrom, find valid number of fends
+ */
+          __pyx_t_15 = __pyx_v_i;
+          __pyx_v_start_fend = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.buf, __pyx_t_15, __pyx_pybuffernd_chr_indices.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":412
+ *             i = chrints[h]
+ *             start_fend = chr_indices[i]
+ *             stop_fend = chr_indices[i + 1]             # <<<<<<<<<<<<<<
+ *             # for each chrom, find valid number of fends
+ *             chr_total = valid_sums[stop_fend] - valid_sums[start_fend]
+ */
+          __pyx_t_15 = (__pyx_v_i + 1);
+          __pyx_v_stop_fend = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_chr_indices.rcbuffer->pybuffer.buf, __pyx_t_15, __pyx_pybuffernd_chr_indices.diminfo[0].strides));
+
+          /* "hifive/libraries/_hic_interactions.pyx":414
+ *             stop_fend = chr_indices[i + 1]
+ *             # for each chrom, find valid number of fends
+ *             chr_total = valid_sums[stop_fend] - valid_sums[start_fend]             # <<<<<<<<<<<<<<
+ *             # if using trans, for each valid fend add on all possible trans interactions tot total
+ *             if useread_int > 0:
+ */
+          __pyx_t_15 = __pyx_v_stop_fend;
+          __pyx_t_16 = __pyx_v_start_fend;
+          __pyx_v_chr_total = ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_15, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_16, __pyx_pybuffernd_valid_sums.diminfo[0].strides)));
+
+          /* "hifive/libraries/_hic_interactions.pyx":416
+ *             chr_total = valid_sums[stop_fend] - valid_sums[start_fend]
+ *             # if using trans, for each valid fend add on all possible trans interactions tot total
+ *             if useread_int > 0:             # <<<<<<<<<<<<<<
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] > 0:
+ */
+          __pyx_t_17 = ((__pyx_v_useread_int > 0) != 0);
+          if (__pyx_t_17) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":417
+ *             # if using trans, for each valid fend add on all possible trans interactions tot total
+ *             if useread_int > 0:
+ *                 for j in range(start_fend, stop_fend):             # <<<<<<<<<<<<<<
+ *                     if filter[j] > 0:
+ *                         interactions[j] += all_total - chr_total
+ */
+            __pyx_t_16 = __pyx_v_stop_fend;
+            __pyx_t_15 = __pyx_t_16;
+            for (__pyx_t_18 = __pyx_v_start_fend; __pyx_t_18 < __pyx_t_15; __pyx_t_18+=1) {
+              __pyx_v_j = __pyx_t_18;
+
+              /* "hifive/libraries/_hic_interactions.pyx":418
+ *             if useread_int > 0:
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] > 0:             # <<<<<<<<<<<<<<
+ *                         interactions[j] += all_total - chr_total
+ *             # if using cis, find number of interactions within distance range and
+ */
+              __pyx_t_19 = __pyx_v_j;
+              __pyx_t_17 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)) > 0) != 0);
+              if (__pyx_t_17) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":419
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] > 0:
+ *                         interactions[j] += all_total - chr_total             # <<<<<<<<<<<<<<
+ *             # if using cis, find number of interactions within distance range and
+ *             # not adjacent fends or opposite strand adjacent fragment fends
+ */
+                __pyx_t_19 = __pyx_v_j;
+                *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_interactions.diminfo[0].strides) += (__pyx_v_all_total - __pyx_v_chr_total);
+
+                /* "hifive/libraries/_hic_interactions.pyx":418
+ *             if useread_int > 0:
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] > 0:             # <<<<<<<<<<<<<<
+ *                         interactions[j] += all_total - chr_total
+ *             # if using cis, find number of interactions within distance range and
+ */
+              }
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":416
+ *             chr_total = valid_sums[stop_fend] - valid_sums[start_fend]
+ *             # if using trans, for each valid fend add on all possible trans interactions tot total
+ *             if useread_int > 0:             # <<<<<<<<<<<<<<
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] > 0:
+ */
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":422
+ *             # if using cis, find number of interactions within distance range and
+ *             # not adjacent fends or opposite strand adjacent fragment fends
+ *             if useread_int < 2:             # <<<<<<<<<<<<<<
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] == 0:
+ */
+          __pyx_t_17 = ((__pyx_v_useread_int < 2) != 0);
+          if (__pyx_t_17) {
+
+            /* "hifive/libraries/_hic_interactions.pyx":423
+ *             # not adjacent fends or opposite strand adjacent fragment fends
+ *             if useread_int < 2:
+ *                 for j in range(start_fend, stop_fend):             # <<<<<<<<<<<<<<
+ *                     if filter[j] == 0:
+ *                         continue
+ */
+            __pyx_t_16 = __pyx_v_stop_fend;
+            __pyx_t_15 = __pyx_t_16;
+            for (__pyx_t_18 = __pyx_v_start_fend; __pyx_t_18 < __pyx_t_15; __pyx_t_18+=1) {
+              __pyx_v_j = __pyx_t_18;
+
+              /* "hifive/libraries/_hic_interactions.pyx":424
+ *             if useread_int < 2:
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] == 0:             # <<<<<<<<<<<<<<
+ *                         continue
+ *                     if binned == 0:
+ */
+              __pyx_t_19 = __pyx_v_j;
+              __pyx_t_17 = (((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)) == 0) != 0);
+              if (__pyx_t_17) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":425
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] == 0:
+ *                         continue             # <<<<<<<<<<<<<<
+ *                     if binned == 0:
+ *                         total = chr_total - 1
+ */
+                goto __pyx_L13_continue;
+
+                /* "hifive/libraries/_hic_interactions.pyx":424
+ *             if useread_int < 2:
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] == 0:             # <<<<<<<<<<<<<<
+ *                         continue
+ *                     if binned == 0:
+ */
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":426
+ *                     if filter[j] == 0:
+ *                         continue
+ *                     if binned == 0:             # <<<<<<<<<<<<<<
+ *                         total = chr_total - 1
+ *                         if j > start_fend + 4:
+ */
+              __pyx_t_17 = ((__pyx_v_binned == 0) != 0);
+              if (__pyx_t_17) {
+
+                /* "hifive/libraries/_hic_interactions.pyx":427
+ *                         continue
+ *                     if binned == 0:
+ *                         total = chr_total - 1             # <<<<<<<<<<<<<<
+ *                         if j > start_fend + 4:
+ *                             # remove upstream interactions outside of maxdistance
+ */
+                __pyx_v_total = (__pyx_v_chr_total - 1);
+
+                /* "hifive/libraries/_hic_interactions.pyx":428
+ *                     if binned == 0:
+ *                         total = chr_total - 1
+ *                         if j > start_fend + 4:             # <<<<<<<<<<<<<<
+ *                             # remove upstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 - 2
+ */
+                __pyx_t_17 = ((__pyx_v_j > (__pyx_v_start_fend + 4)) != 0);
+                if (__pyx_t_17) {
+
+                  /* "hifive/libraries/_hic_interactions.pyx":430
+ *                         if j > start_fend + 4:
+ *                             # remove upstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 - 2             # <<<<<<<<<<<<<<
+ *                             k = find_first_above(mids_ptr, start_fend, stop, <long long int>mids[j] - maxdistance)
+ *                             total -= valid_sums[k] - valid_sums[start_fend]
+ */
+                  __pyx_v_stop = (((__pyx_v_j / 2) * 2) - 2);
+
+                  /* "hifive/libraries/_hic_interactions.pyx":431
+ *                             # remove upstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 - 2
+ *                             k = find_first_above(mids_ptr, start_fend, stop, <long long int>mids[j] - maxdistance)             # <<<<<<<<<<<<<<
+ *                             total -= valid_sums[k] - valid_sums[start_fend]
+ *                             # remove upstream interactions inside of mindistance
+ */
+                  __pyx_t_19 = __pyx_v_j;
+                  __pyx_v_k = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_start_fend, __pyx_v_stop, (((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) - __pyx_v_maxdistance));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":432
+ *                             stop = (j / 2) * 2 - 2
+ *                             k = find_first_above(mids_ptr, start_fend, stop, <long long int>mids[j] - maxdistance)
+ *                             total -= valid_sums[k] - valid_sums[start_fend]             # <<<<<<<<<<<<<<
+ *                             # remove upstream interactions inside of mindistance
+ *                             stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)
+ */
+                  __pyx_t_19 = __pyx_v_k;
+                  __pyx_t_20 = __pyx_v_start_fend;
+                  __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":434
+ *                             total -= valid_sums[k] - valid_sums[start_fend]
+ *                             # remove upstream interactions inside of mindistance
+ *                             stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)             # <<<<<<<<<<<<<<
+ *                             total -= valid_sums[(j / 2) * 2 - 2] - valid_sums[stop]
+ *                         if j < stop_fend - 4:
+ */
+                  __pyx_t_20 = __pyx_v_j;
+                  __pyx_v_stop = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_k, __pyx_v_stop, (((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) - __pyx_v_mindistance));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":435
+ *                             # remove upstream interactions inside of mindistance
+ *                             stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)
+ *                             total -= valid_sums[(j / 2) * 2 - 2] - valid_sums[stop]             # <<<<<<<<<<<<<<
+ *                         if j < stop_fend - 4:
+ *                             # remove downstream interactions outside of maxdistance
+ */
+                  __pyx_t_20 = (((__pyx_v_j / 2) * 2) - 2);
+                  __pyx_t_19 = __pyx_v_stop;
+                  __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":428
+ *                     if binned == 0:
+ *                         total = chr_total - 1
+ *                         if j > start_fend + 4:             # <<<<<<<<<<<<<<
+ *                             # remove upstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 - 2
+ */
+                }
+
+                /* "hifive/libraries/_hic_interactions.pyx":436
+ *                             stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)
+ *                             total -= valid_sums[(j / 2) * 2 - 2] - valid_sums[stop]
+ *                         if j < stop_fend - 4:             # <<<<<<<<<<<<<<
+ *                             # remove downstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 + 4
+ */
+                __pyx_t_17 = ((__pyx_v_j < (__pyx_v_stop_fend - 4)) != 0);
+                if (__pyx_t_17) {
+
+                  /* "hifive/libraries/_hic_interactions.pyx":438
+ *                         if j < stop_fend - 4:
+ *                             # remove downstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 + 4             # <<<<<<<<<<<<<<
+ *                             k = find_first_above(mids_ptr, stop, stop_fend,
+ *                                                  <long long int>mids[j] + maxdistance - 1)
+ */
+                  __pyx_v_stop = (((__pyx_v_j / 2) * 2) + 4);
+
+                  /* "hifive/libraries/_hic_interactions.pyx":440
+ *                             stop = (j / 2) * 2 + 4
+ *                             k = find_first_above(mids_ptr, stop, stop_fend,
+ *                                                  <long long int>mids[j] + maxdistance - 1)             # <<<<<<<<<<<<<<
+ *                             total -= valid_sums[stop_fend] - valid_sums[k]
+ *                             # remove downstream interactions inside of mindistance
+ */
+                  __pyx_t_19 = __pyx_v_j;
+
+                  /* "hifive/libraries/_hic_interactions.pyx":439
+ *                             # remove downstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 + 4
+ *                             k = find_first_above(mids_ptr, stop, stop_fend,             # <<<<<<<<<<<<<<
+ *                                                  <long long int>mids[j] + maxdistance - 1)
+ *                             total -= valid_sums[stop_fend] - valid_sums[k]
+ */
+                  __pyx_v_k = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_stop, __pyx_v_stop_fend, ((((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) + __pyx_v_maxdistance) - 1));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":441
+ *                             k = find_first_above(mids_ptr, stop, stop_fend,
+ *                                                  <long long int>mids[j] + maxdistance - 1)
+ *                             total -= valid_sums[stop_fend] - valid_sums[k]             # <<<<<<<<<<<<<<
+ *                             # remove downstream interactions inside of mindistance
+ *                             k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)
+ */
+                  __pyx_t_19 = __pyx_v_stop_fend;
+                  __pyx_t_20 = __pyx_v_k;
+                  __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":443
+ *                             total -= valid_sums[stop_fend] - valid_sums[k]
+ *                             # remove downstream interactions inside of mindistance
+ *                             k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)             # <<<<<<<<<<<<<<
+ *                             total -= valid_sums[k] - valid_sums[stop]
+ *                         if j % 2 == 0:
+ */
+                  __pyx_t_20 = __pyx_v_j;
+                  __pyx_v_k = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_stop, __pyx_v_k, ((((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) + __pyx_v_mindistance) - 1));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":444
+ *                             # remove downstream interactions inside of mindistance
+ *                             k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)
+ *                             total -= valid_sums[k] - valid_sums[stop]             # <<<<<<<<<<<<<<
+ *                         if j % 2 == 0:
+ *                             # remove same fragment fend
+ */
+                  __pyx_t_20 = __pyx_v_k;
+                  __pyx_t_19 = __pyx_v_stop;
+                  __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":436
+ *                             stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)
+ *                             total -= valid_sums[(j / 2) * 2 - 2] - valid_sums[stop]
+ *                         if j < stop_fend - 4:             # <<<<<<<<<<<<<<
+ *                             # remove downstream interactions outside of maxdistance
+ *                             stop = (j / 2) * 2 + 4
+ */
+                }
+
+                /* "hifive/libraries/_hic_interactions.pyx":445
+ *                             k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)
+ *                             total -= valid_sums[k] - valid_sums[stop]
+ *                         if j % 2 == 0:             # <<<<<<<<<<<<<<
+ *                             # remove same fragment fend
+ *                             total -= filter[j + 1]
+ */
+                __pyx_t_17 = (((__pyx_v_j % 2) == 0) != 0);
+                if (__pyx_t_17) {
+
+                  /* "hifive/libraries/_hic_interactions.pyx":447
+ *                         if j % 2 == 0:
+ *                             # remove same fragment fend
+ *                             total -= filter[j + 1]             # <<<<<<<<<<<<<<
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend:
+ */
+                  __pyx_t_19 = (__pyx_v_j + 1);
+                  __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":449
+ *                             total -= filter[j + 1]
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j - 1]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ */
+                  __pyx_t_17 = ((__pyx_v_j > __pyx_v_start_fend) != 0);
+                  if (__pyx_t_17) {
+
+                    /* "hifive/libraries/_hic_interactions.pyx":450
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend:
+ *                                 total -= filter[j - 1]             # <<<<<<<<<<<<<<
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ *                                     total -= filter[j - 2]
+ */
+                    __pyx_t_19 = (__pyx_v_j - 1);
+                    __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                    /* "hifive/libraries/_hic_interactions.pyx":451
+ *                             if j > start_fend:
+ *                                 total -= filter[j - 1]
+ *                                 if mids[j] - mids[j - 2] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ */
+                    __pyx_t_19 = __pyx_v_j;
+                    __pyx_t_20 = (__pyx_v_j - 2);
+                    __pyx_t_17 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_mindistance) != 0);
+                    if (__pyx_t_17) {
+
+                      /* "hifive/libraries/_hic_interactions.pyx":452
+ *                                 total -= filter[j - 1]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ *                                     total -= filter[j - 2]             # <<<<<<<<<<<<<<
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:
+ */
+                      __pyx_t_20 = (__pyx_v_j - 2);
+                      __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                      /* "hifive/libraries/_hic_interactions.pyx":451
+ *                             if j > start_fend:
+ *                                 total -= filter[j - 1]
+ *                                 if mids[j] - mids[j - 2] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ */
+                    }
+
+                    /* "hifive/libraries/_hic_interactions.pyx":449
+ *                             total -= filter[j + 1]
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j - 1]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ */
+                  }
+
+                  /* "hifive/libraries/_hic_interactions.pyx":454
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j + 3]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ */
+                  __pyx_t_17 = ((__pyx_v_j < (__pyx_v_stop_fend - 2)) != 0);
+                  if (__pyx_t_17) {
+
+                    /* "hifive/libraries/_hic_interactions.pyx":455
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 3]             # <<<<<<<<<<<<<<
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ *                                     total -= filter[j + 2]
+ */
+                    __pyx_t_20 = (__pyx_v_j + 3);
+                    __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                    /* "hifive/libraries/_hic_interactions.pyx":456
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 3]
+ *                                 if mids[j + 2] - mids[j] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j + 2]
+ *                         else:
+ */
+                    __pyx_t_20 = (__pyx_v_j + 2);
+                    __pyx_t_19 = __pyx_v_j;
+                    __pyx_t_17 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_mindistance) != 0);
+                    if (__pyx_t_17) {
+
+                      /* "hifive/libraries/_hic_interactions.pyx":457
+ *                                 total -= filter[j + 3]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ *                                     total -= filter[j + 2]             # <<<<<<<<<<<<<<
+ *                         else:
+ *                             # remove same fragment fend
+ */
+                      __pyx_t_19 = (__pyx_v_j + 2);
+                      __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                      /* "hifive/libraries/_hic_interactions.pyx":456
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 3]
+ *                                 if mids[j + 2] - mids[j] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j + 2]
+ *                         else:
+ */
+                    }
+
+                    /* "hifive/libraries/_hic_interactions.pyx":454
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j + 3]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ */
+                  }
+
+                  /* "hifive/libraries/_hic_interactions.pyx":445
+ *                             k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)
+ *                             total -= valid_sums[k] - valid_sums[stop]
+ *                         if j % 2 == 0:             # <<<<<<<<<<<<<<
+ *                             # remove same fragment fend
+ *                             total -= filter[j + 1]
+ */
+                  goto __pyx_L19;
+                }
+
+                /* "hifive/libraries/_hic_interactions.pyx":460
+ *                         else:
+ *                             # remove same fragment fend
+ *                             total -= filter[j - 1]             # <<<<<<<<<<<<<<
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend + 2:
+ */
+                /*else*/ {
+                  __pyx_t_19 = (__pyx_v_j - 1);
+                  __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                  /* "hifive/libraries/_hic_interactions.pyx":462
+ *                             total -= filter[j - 1]
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend + 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j - 3]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ */
+                  __pyx_t_17 = ((__pyx_v_j > (__pyx_v_start_fend + 2)) != 0);
+                  if (__pyx_t_17) {
+
+                    /* "hifive/libraries/_hic_interactions.pyx":463
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend + 2:
+ *                                 total -= filter[j - 3]             # <<<<<<<<<<<<<<
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ *                                     total -= filter[j - 2]
+ */
+                    __pyx_t_19 = (__pyx_v_j - 3);
+                    __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                    /* "hifive/libraries/_hic_interactions.pyx":464
+ *                             if j > start_fend + 2:
+ *                                 total -= filter[j - 3]
+ *                                 if mids[j] - mids[j - 2] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ */
+                    __pyx_t_19 = __pyx_v_j;
+                    __pyx_t_20 = (__pyx_v_j - 2);
+                    __pyx_t_17 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_mindistance) != 0);
+                    if (__pyx_t_17) {
+
+                      /* "hifive/libraries/_hic_interactions.pyx":465
+ *                                 total -= filter[j - 3]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ *                                     total -= filter[j - 2]             # <<<<<<<<<<<<<<
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:
+ */
+                      __pyx_t_20 = (__pyx_v_j - 2);
+                      __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                      /* "hifive/libraries/_hic_interactions.pyx":464
+ *                             if j > start_fend + 2:
+ *                                 total -= filter[j - 3]
+ *                                 if mids[j] - mids[j - 2] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ */
+                    }
+
+                    /* "hifive/libraries/_hic_interactions.pyx":462
+ *                             total -= filter[j - 1]
+ *                             # remove previous fragment fends if necessary
+ *                             if j > start_fend + 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j - 3]
+ *                                 if mids[j] - mids[j - 2] < mindistance:
+ */
+                  }
+
+                  /* "hifive/libraries/_hic_interactions.pyx":467
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j + 1]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ */
+                  __pyx_t_17 = ((__pyx_v_j < (__pyx_v_stop_fend - 2)) != 0);
+                  if (__pyx_t_17) {
+
+                    /* "hifive/libraries/_hic_interactions.pyx":468
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 1]             # <<<<<<<<<<<<<<
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ *                                     total -= filter[j + 2]
+ */
+                    __pyx_t_20 = (__pyx_v_j + 1);
+                    __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                    /* "hifive/libraries/_hic_interactions.pyx":469
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 1]
+ *                                 if mids[j + 2] - mids[j] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j + 2]
+ *                     else:
+ */
+                    __pyx_t_20 = (__pyx_v_j + 2);
+                    __pyx_t_19 = __pyx_v_j;
+                    __pyx_t_17 = ((((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) < __pyx_v_mindistance) != 0);
+                    if (__pyx_t_17) {
+
+                      /* "hifive/libraries/_hic_interactions.pyx":470
+ *                                 total -= filter[j + 1]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ *                                     total -= filter[j + 2]             # <<<<<<<<<<<<<<
+ *                     else:
+ *                         total = chr_total
+ */
+                      __pyx_t_19 = (__pyx_v_j + 2);
+                      __pyx_v_total = (__pyx_v_total - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_filter.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_filter.diminfo[0].strides)));
+
+                      /* "hifive/libraries/_hic_interactions.pyx":469
+ *                             if j < stop_fend - 2:
+ *                                 total -= filter[j + 1]
+ *                                 if mids[j + 2] - mids[j] < mindistance:             # <<<<<<<<<<<<<<
+ *                                     total -= filter[j + 2]
+ *                     else:
+ */
+                    }
+
+                    /* "hifive/libraries/_hic_interactions.pyx":467
+ *                                     total -= filter[j - 2]
+ *                             # remove next fragment fends if necessary
+ *                             if j < stop_fend - 2:             # <<<<<<<<<<<<<<
+ *                                 total -= filter[j + 1]
+ *                                 if mids[j + 2] - mids[j] < mindistance:
+ */
+                  }
+                }
+                __pyx_L19:;
+
+                /* "hifive/libraries/_hic_interactions.pyx":426
+ *                     if filter[j] == 0:
+ *                         continue
+ *                     if binned == 0:             # <<<<<<<<<<<<<<
+ *                         total = chr_total - 1
+ *                         if j > start_fend + 4:
+ */
+                goto __pyx_L16;
+              }
+
+              /* "hifive/libraries/_hic_interactions.pyx":472
+ *                                     total -= filter[j + 2]
+ *                     else:
+ *                         total = chr_total             # <<<<<<<<<<<<<<
+ *                         if mindistance > 0:
+ *                             total -= 1
+ */
+              /*else*/ {
+                __pyx_v_total = __pyx_v_chr_total;
+
+                /* "hifive/libraries/_hic_interactions.pyx":473
+ *                     else:
+ *                         total = chr_total
+ *                         if mindistance > 0:             # <<<<<<<<<<<<<<
+ *                             total -= 1
+ *                         # remove upstream interactions outside of maxdistance
+ */
+                __pyx_t_17 = ((__pyx_v_mindistance > 0) != 0);
+                if (__pyx_t_17) {
+
+                  /* "hifive/libraries/_hic_interactions.pyx":474
+ *                         total = chr_total
+ *                         if mindistance > 0:
+ *                             total -= 1             # <<<<<<<<<<<<<<
+ *                         # remove upstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, start_fend, j, <long long int>mids[j] - maxdistance)
+ */
+                  __pyx_v_total = (__pyx_v_total - 1);
+
+                  /* "hifive/libraries/_hic_interactions.pyx":473
+ *                     else:
+ *                         total = chr_total
+ *                         if mindistance > 0:             # <<<<<<<<<<<<<<
+ *                             total -= 1
+ *                         # remove upstream interactions outside of maxdistance
+ */
+                }
+
+                /* "hifive/libraries/_hic_interactions.pyx":476
+ *                             total -= 1
+ *                         # remove upstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, start_fend, j, <long long int>mids[j] - maxdistance)             # <<<<<<<<<<<<<<
+ *                         total -= valid_sums[k] - valid_sums[start_fend]
+ *                         # remove upstream interactions inside of mindistance
+ */
+                __pyx_t_19 = __pyx_v_j;
+                __pyx_v_k = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_start_fend, __pyx_v_j, (((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) - __pyx_v_maxdistance));
+
+                /* "hifive/libraries/_hic_interactions.pyx":477
+ *                         # remove upstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, start_fend, j, <long long int>mids[j] - maxdistance)
+ *                         total -= valid_sums[k] - valid_sums[start_fend]             # <<<<<<<<<<<<<<
+ *                         # remove upstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, k, j, <long long int>mids[j] - mindistance)
+ */
+                __pyx_t_19 = __pyx_v_k;
+                __pyx_t_20 = __pyx_v_start_fend;
+                __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                /* "hifive/libraries/_hic_interactions.pyx":479
+ *                         total -= valid_sums[k] - valid_sums[start_fend]
+ *                         # remove upstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, k, j, <long long int>mids[j] - mindistance)             # <<<<<<<<<<<<<<
+ *                         total -= valid_sums[j] - valid_sums[stop]
+ *                         # remove downstream interactions outside of maxdistance
+ */
+                __pyx_t_20 = __pyx_v_j;
+                __pyx_v_stop = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, __pyx_v_k, __pyx_v_j, (((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) - __pyx_v_mindistance));
+
+                /* "hifive/libraries/_hic_interactions.pyx":480
+ *                         # remove upstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, k, j, <long long int>mids[j] - mindistance)
+ *                         total -= valid_sums[j] - valid_sums[stop]             # <<<<<<<<<<<<<<
+ *                         # remove downstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, j + 1, stop_fend, <long long int>mids[j] + maxdistance - 1)
+ */
+                __pyx_t_20 = __pyx_v_j;
+                __pyx_t_19 = __pyx_v_stop;
+                __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                /* "hifive/libraries/_hic_interactions.pyx":482
+ *                         total -= valid_sums[j] - valid_sums[stop]
+ *                         # remove downstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, j + 1, stop_fend, <long long int>mids[j] + maxdistance - 1)             # <<<<<<<<<<<<<<
+ *                         total -= valid_sums[stop_fend] - valid_sums[k]
+ *                         # remove downstream interactions inside of mindistance
+ */
+                __pyx_t_19 = __pyx_v_j;
+                __pyx_v_k = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, (__pyx_v_j + 1), __pyx_v_stop_fend, ((((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_mids.diminfo[0].strides))) + __pyx_v_maxdistance) - 1));
+
+                /* "hifive/libraries/_hic_interactions.pyx":483
+ *                         # remove downstream interactions outside of maxdistance
+ *                         k = find_first_above(mids_ptr, j + 1, stop_fend, <long long int>mids[j] + maxdistance - 1)
+ *                         total -= valid_sums[stop_fend] - valid_sums[k]             # <<<<<<<<<<<<<<
+ *                         # remove downstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, j + 1, k, <long long int>mids[j] + mindistance - 1)
+ */
+                __pyx_t_19 = __pyx_v_stop_fend;
+                __pyx_t_20 = __pyx_v_k;
+                __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+
+                /* "hifive/libraries/_hic_interactions.pyx":485
+ *                         total -= valid_sums[stop_fend] - valid_sums[k]
+ *                         # remove downstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, j + 1, k, <long long int>mids[j] + mindistance - 1)             # <<<<<<<<<<<<<<
+ *                         total -= valid_sums[stop] - valid_sums[j + 1]
+ *                     interactions[j] += total
+ */
+                __pyx_t_20 = __pyx_v_j;
+                __pyx_v_stop = __pyx_f_6hifive_9libraries_17_hic_interactions_find_first_above(__pyx_v_mids_ptr, (__pyx_v_j + 1), __pyx_v_k, ((((PY_LONG_LONG)(*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_mids.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_mids.diminfo[0].strides))) + __pyx_v_mindistance) - 1));
+
+                /* "hifive/libraries/_hic_interactions.pyx":486
+ *                         # remove downstream interactions inside of mindistance
+ *                         stop = find_first_above(mids_ptr, j + 1, k, <long long int>mids[j] + mindistance - 1)
+ *                         total -= valid_sums[stop] - valid_sums[j + 1]             # <<<<<<<<<<<<<<
+ *                     interactions[j] += total
+ *     return None
+ */
+                __pyx_t_20 = __pyx_v_stop;
+                __pyx_t_19 = (__pyx_v_j + 1);
+                __pyx_v_total = (__pyx_v_total - ((*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_20, __pyx_pybuffernd_valid_sums.diminfo[0].strides)) - (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_valid_sums.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_valid_sums.diminfo[0].strides))));
+              }
+              __pyx_L16:;
+
+              /* "hifive/libraries/_hic_interactions.pyx":487
+ *                         stop = find_first_above(mids_ptr, j + 1, k, <long long int>mids[j] + mindistance - 1)
+ *                         total -= valid_sums[stop] - valid_sums[j + 1]
+ *                     interactions[j] += total             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+              __pyx_t_19 = __pyx_v_j;
+              *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int64_t *, __pyx_pybuffernd_interactions.rcbuffer->pybuffer.buf, __pyx_t_19, __pyx_pybuffernd_interactions.diminfo[0].strides) += __pyx_v_total;
+              __pyx_L13_continue:;
+            }
+
+            /* "hifive/libraries/_hic_interactions.pyx":422
+ *             # if using cis, find number of interactions within distance range and
+ *             # not adjacent fends or opposite strand adjacent fragment fends
+ *             if useread_int < 2:             # <<<<<<<<<<<<<<
+ *                 for j in range(start_fend, stop_fend):
+ *                     if filter[j] == 0:
+ */
+          }
+        }
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":407
+ *     mids = numpy.ascontiguousarray(mids)
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         all_total = valid_sums[num_fends]
+ *         for h in range(num_chroms):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":488
+ *                         total -= valid_sums[stop] - valid_sums[j + 1]
+ *                     interactions[j] += total
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":389
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_distancebound_possible_interactions(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] interactions not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] chr_indices not None,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_XDECREF(__pyx_t_2);
+  __Pyx_XDECREF(__pyx_t_3);
+  __Pyx_XDECREF(__pyx_t_4);
+  __Pyx_XDECREF(__pyx_t_5);
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chrints.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_valid_sums.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.find_distancebound_possible_interactions", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chr_indices.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_chrints.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_filter.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_interactions.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_mids.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_valid_sums.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XDECREF((PyObject *)__pyx_v_valid_sums);
+  __Pyx_XDECREF((PyObject *)__pyx_v_mids);
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "hifive/libraries/_hic_interactions.pyx":494
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def sum_weighted_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices1,
+ */
+
+/* Python wrapper */
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_25sum_weighted_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds); /*proto*/
+static PyMethodDef __pyx_mdef_6hifive_9libraries_17_hic_interactions_25sum_weighted_indices = {"sum_weighted_indices", (PyCFunction)(void*)(PyCFunctionWithKeywords)__pyx_pw_6hifive_9libraries_17_hic_interactions_25sum_weighted_indices, METH_VARARGS|METH_KEYWORDS, 0};
+static PyObject *__pyx_pw_6hifive_9libraries_17_hic_interactions_25sum_weighted_indices(PyObject *__pyx_self, PyObject *__pyx_args, PyObject *__pyx_kwds) {
+  PyArrayObject *__pyx_v_indices0 = 0;
+  PyArrayObject *__pyx_v_indices1 = 0;
+  PyArrayObject *__pyx_v_weights = 0;
+  PyArrayObject *__pyx_v_int_weights = 0;
+  PyArrayObject *__pyx_v_sums = 0;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  PyObject *__pyx_r = 0;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("sum_weighted_indices (wrapper)", 0);
+  {
+    static PyObject **__pyx_pyargnames[] = {&__pyx_n_s_indices0,&__pyx_n_s_indices1,&__pyx_n_s_weights,&__pyx_n_s_int_weights,&__pyx_n_s_sums,0};
+    PyObject* values[5] = {0,0,0,0,0};
+    if (unlikely(__pyx_kwds)) {
+      Py_ssize_t kw_args;
+      const Py_ssize_t pos_args = PyTuple_GET_SIZE(__pyx_args);
+      switch (pos_args) {
+        case  5: values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+        CYTHON_FALLTHROUGH;
+        case  4: values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+        CYTHON_FALLTHROUGH;
+        case  3: values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+        CYTHON_FALLTHROUGH;
+        case  2: values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+        CYTHON_FALLTHROUGH;
+        case  1: values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+        CYTHON_FALLTHROUGH;
+        case  0: break;
+        default: goto __pyx_L5_argtuple_error;
+      }
+      kw_args = PyDict_Size(__pyx_kwds);
+      switch (pos_args) {
+        case  0:
+        if (likely((values[0] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_indices0)) != 0)) kw_args--;
+        else goto __pyx_L5_argtuple_error;
+        CYTHON_FALLTHROUGH;
+        case  1:
+        if (likely((values[1] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_indices1)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("sum_weighted_indices", 1, 5, 5, 1); __PYX_ERR(0, 494, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  2:
+        if (likely((values[2] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_weights)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("sum_weighted_indices", 1, 5, 5, 2); __PYX_ERR(0, 494, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  3:
+        if (likely((values[3] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_int_weights)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("sum_weighted_indices", 1, 5, 5, 3); __PYX_ERR(0, 494, __pyx_L3_error)
+        }
+        CYTHON_FALLTHROUGH;
+        case  4:
+        if (likely((values[4] = __Pyx_PyDict_GetItemStr(__pyx_kwds, __pyx_n_s_sums)) != 0)) kw_args--;
+        else {
+          __Pyx_RaiseArgtupleInvalid("sum_weighted_indices", 1, 5, 5, 4); __PYX_ERR(0, 494, __pyx_L3_error)
+        }
+      }
+      if (unlikely(kw_args > 0)) {
+        if (unlikely(__Pyx_ParseOptionalKeywords(__pyx_kwds, __pyx_pyargnames, 0, values, pos_args, "sum_weighted_indices") < 0)) __PYX_ERR(0, 494, __pyx_L3_error)
+      }
+    } else if (PyTuple_GET_SIZE(__pyx_args) != 5) {
+      goto __pyx_L5_argtuple_error;
+    } else {
+      values[0] = PyTuple_GET_ITEM(__pyx_args, 0);
+      values[1] = PyTuple_GET_ITEM(__pyx_args, 1);
+      values[2] = PyTuple_GET_ITEM(__pyx_args, 2);
+      values[3] = PyTuple_GET_ITEM(__pyx_args, 3);
+      values[4] = PyTuple_GET_ITEM(__pyx_args, 4);
+    }
+    __pyx_v_indices0 = ((PyArrayObject *)values[0]);
+    __pyx_v_indices1 = ((PyArrayObject *)values[1]);
+    __pyx_v_weights = ((PyArrayObject *)values[2]);
+    __pyx_v_int_weights = ((PyArrayObject *)values[3]);
+    __pyx_v_sums = ((PyArrayObject *)values[4]);
+  }
+  goto __pyx_L4_argument_unpacking_done;
+  __pyx_L5_argtuple_error:;
+  __Pyx_RaiseArgtupleInvalid("sum_weighted_indices", 1, 5, 5, PyTuple_GET_SIZE(__pyx_args)); __PYX_ERR(0, 494, __pyx_L3_error)
+  __pyx_L3_error:;
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.sum_weighted_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __Pyx_RefNannyFinishContext();
+  return NULL;
+  __pyx_L4_argument_unpacking_done:;
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_indices0), __pyx_ptype_5numpy_ndarray, 1, "indices0", 0))) __PYX_ERR(0, 495, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_indices1), __pyx_ptype_5numpy_ndarray, 1, "indices1", 0))) __PYX_ERR(0, 496, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_weights), __pyx_ptype_5numpy_ndarray, 1, "weights", 0))) __PYX_ERR(0, 497, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_int_weights), __pyx_ptype_5numpy_ndarray, 1, "int_weights", 0))) __PYX_ERR(0, 498, __pyx_L1_error)
+  if (unlikely(!__Pyx_ArgTypeTest(((PyObject *)__pyx_v_sums), __pyx_ptype_5numpy_ndarray, 1, "sums", 0))) __PYX_ERR(0, 499, __pyx_L1_error)
+  __pyx_r = __pyx_pf_6hifive_9libraries_17_hic_interactions_24sum_weighted_indices(__pyx_self, __pyx_v_indices0, __pyx_v_indices1, __pyx_v_weights, __pyx_v_int_weights, __pyx_v_sums);
+
+  /* function exit code */
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyObject *__pyx_pf_6hifive_9libraries_17_hic_interactions_24sum_weighted_indices(CYTHON_UNUSED PyObject *__pyx_self, PyArrayObject *__pyx_v_indices0, PyArrayObject *__pyx_v_indices1, PyArrayObject *__pyx_v_weights, PyArrayObject *__pyx_v_int_weights, PyArrayObject *__pyx_v_sums) {
+  PY_LONG_LONG __pyx_v_i;
+  PY_LONG_LONG __pyx_v_num_indices;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_indices0;
+  __Pyx_Buffer __pyx_pybuffer_indices0;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_indices1;
+  __Pyx_Buffer __pyx_pybuffer_indices1;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_int_weights;
+  __Pyx_Buffer __pyx_pybuffer_int_weights;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_sums;
+  __Pyx_Buffer __pyx_pybuffer_sums;
+  __Pyx_LocalBuf_ND __pyx_pybuffernd_weights;
+  __Pyx_Buffer __pyx_pybuffer_weights;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  int __pyx_t_2;
+  PY_LONG_LONG __pyx_t_3;
+  PY_LONG_LONG __pyx_t_4;
+  PY_LONG_LONG __pyx_t_5;
+  PY_LONG_LONG __pyx_t_6;
+  PY_LONG_LONG __pyx_t_7;
+  Py_ssize_t __pyx_t_8;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("sum_weighted_indices", 0);
+  __pyx_pybuffer_indices0.pybuffer.buf = NULL;
+  __pyx_pybuffer_indices0.refcount = 0;
+  __pyx_pybuffernd_indices0.data = NULL;
+  __pyx_pybuffernd_indices0.rcbuffer = &__pyx_pybuffer_indices0;
+  __pyx_pybuffer_indices1.pybuffer.buf = NULL;
+  __pyx_pybuffer_indices1.refcount = 0;
+  __pyx_pybuffernd_indices1.data = NULL;
+  __pyx_pybuffernd_indices1.rcbuffer = &__pyx_pybuffer_indices1;
+  __pyx_pybuffer_weights.pybuffer.buf = NULL;
+  __pyx_pybuffer_weights.refcount = 0;
+  __pyx_pybuffernd_weights.data = NULL;
+  __pyx_pybuffernd_weights.rcbuffer = &__pyx_pybuffer_weights;
+  __pyx_pybuffer_int_weights.pybuffer.buf = NULL;
+  __pyx_pybuffer_int_weights.refcount = 0;
+  __pyx_pybuffernd_int_weights.data = NULL;
+  __pyx_pybuffernd_int_weights.rcbuffer = &__pyx_pybuffer_int_weights;
+  __pyx_pybuffer_sums.pybuffer.buf = NULL;
+  __pyx_pybuffer_sums.refcount = 0;
+  __pyx_pybuffernd_sums.data = NULL;
+  __pyx_pybuffernd_sums.rcbuffer = &__pyx_pybuffer_sums;
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer, (PyObject*)__pyx_v_indices0, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 494, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_indices0.diminfo[0].strides = __pyx_pybuffernd_indices0.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_indices0.diminfo[0].shape = __pyx_pybuffernd_indices0.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer, (PyObject*)__pyx_v_indices1, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 494, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_indices1.diminfo[0].strides = __pyx_pybuffernd_indices1.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_indices1.diminfo[0].shape = __pyx_pybuffernd_indices1.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_weights.rcbuffer->pybuffer, (PyObject*)__pyx_v_weights, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 494, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_weights.diminfo[0].strides = __pyx_pybuffernd_weights.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_weights.diminfo[0].shape = __pyx_pybuffernd_weights.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_int_weights.rcbuffer->pybuffer, (PyObject*)__pyx_v_int_weights, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t, PyBUF_FORMAT| PyBUF_STRIDES, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 494, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_int_weights.diminfo[0].strides = __pyx_pybuffernd_int_weights.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_int_weights.diminfo[0].shape = __pyx_pybuffernd_int_weights.rcbuffer->pybuffer.shape[0];
+  {
+    __Pyx_BufFmt_StackElem __pyx_stack[1];
+    if (unlikely(__Pyx_GetBufferAndValidate(&__pyx_pybuffernd_sums.rcbuffer->pybuffer, (PyObject*)__pyx_v_sums, &__Pyx_TypeInfo_nn___pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t, PyBUF_FORMAT| PyBUF_STRIDES| PyBUF_WRITABLE, 1, 0, __pyx_stack) == -1)) __PYX_ERR(0, 494, __pyx_L1_error)
+  }
+  __pyx_pybuffernd_sums.diminfo[0].strides = __pyx_pybuffernd_sums.rcbuffer->pybuffer.strides[0]; __pyx_pybuffernd_sums.diminfo[0].shape = __pyx_pybuffernd_sums.rcbuffer->pybuffer.shape[0];
+
+  /* "hifive/libraries/_hic_interactions.pyx":501
+ *         np.ndarray[DTYPE_64_t, ndim=1] sums):
+ *     cdef long long int i
+ *     cdef long long int num_indices = indices0.shape[0]             # <<<<<<<<<<<<<<
+ *     with nogil:
+ *         if not weights is None:
+ */
+  __pyx_v_num_indices = (__pyx_v_indices0->dimensions[0]);
+
+  /* "hifive/libraries/_hic_interactions.pyx":502
+ *     cdef long long int i
+ *     cdef long long int num_indices = indices0.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         if not weights is None:
+ *             for i in range(num_indices):
+ */
+  {
+      #ifdef WITH_THREAD
+      PyThreadState *_save;
+      Py_UNBLOCK_THREADS
+      __Pyx_FastGIL_Remember();
+      #endif
+      /*try:*/ {
+
+        /* "hifive/libraries/_hic_interactions.pyx":503
+ *     cdef long long int num_indices = indices0.shape[0]
+ *     with nogil:
+ *         if not weights is None:             # <<<<<<<<<<<<<<
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += weights[i]
+ */
+        __pyx_t_1 = (((PyObject *)__pyx_v_weights) != Py_None);
+        __pyx_t_2 = (__pyx_t_1 != 0);
+        if (__pyx_t_2) {
+
+          /* "hifive/libraries/_hic_interactions.pyx":504
+ *     with nogil:
+ *         if not weights is None:
+ *             for i in range(num_indices):             # <<<<<<<<<<<<<<
+ *                 sums[indices0[i]] += weights[i]
+ *                 sums[indices1[i]] += weights[i]
+ */
+          __pyx_t_3 = __pyx_v_num_indices;
+          __pyx_t_4 = __pyx_t_3;
+          for (__pyx_t_5 = 0; __pyx_t_5 < __pyx_t_4; __pyx_t_5+=1) {
+            __pyx_v_i = __pyx_t_5;
+
+            /* "hifive/libraries/_hic_interactions.pyx":505
+ *         if not weights is None:
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += weights[i]             # <<<<<<<<<<<<<<
+ *                 sums[indices1[i]] += weights[i]
+ *         elif not int_weights is None:
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_7 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices0.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices0.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t *, __pyx_pybuffernd_weights.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_weights.diminfo[0].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":506
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += weights[i]
+ *                 sums[indices1[i]] += weights[i]             # <<<<<<<<<<<<<<
+ *         elif not int_weights is None:
+ *             for i in range(num_indices):
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_7 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices1.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices1.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_t *, __pyx_pybuffernd_weights.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_weights.diminfo[0].strides));
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":503
+ *     cdef long long int num_indices = indices0.shape[0]
+ *     with nogil:
+ *         if not weights is None:             # <<<<<<<<<<<<<<
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += weights[i]
+ */
+          goto __pyx_L6;
+        }
+
+        /* "hifive/libraries/_hic_interactions.pyx":507
+ *                 sums[indices0[i]] += weights[i]
+ *                 sums[indices1[i]] += weights[i]
+ *         elif not int_weights is None:             # <<<<<<<<<<<<<<
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += int_weights[i]
+ */
+        __pyx_t_2 = (((PyObject *)__pyx_v_int_weights) != Py_None);
+        __pyx_t_1 = (__pyx_t_2 != 0);
+        if (__pyx_t_1) {
+
+          /* "hifive/libraries/_hic_interactions.pyx":508
+ *                 sums[indices1[i]] += weights[i]
+ *         elif not int_weights is None:
+ *             for i in range(num_indices):             # <<<<<<<<<<<<<<
+ *                 sums[indices0[i]] += int_weights[i]
+ *                 sums[indices1[i]] += int_weights[i]
+ */
+          __pyx_t_3 = __pyx_v_num_indices;
+          __pyx_t_4 = __pyx_t_3;
+          for (__pyx_t_5 = 0; __pyx_t_5 < __pyx_t_4; __pyx_t_5+=1) {
+            __pyx_v_i = __pyx_t_5;
+
+            /* "hifive/libraries/_hic_interactions.pyx":509
+ *         elif not int_weights is None:
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += int_weights[i]             # <<<<<<<<<<<<<<
+ *                 sums[indices1[i]] += int_weights[i]
+ *         else:
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_7 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices0.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices0.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_int_weights.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_int_weights.diminfo[0].strides));
+
+            /* "hifive/libraries/_hic_interactions.pyx":510
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += int_weights[i]
+ *                 sums[indices1[i]] += int_weights[i]             # <<<<<<<<<<<<<<
+ *         else:
+ *             for i in range(num_indices):
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_7 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices1.rcbuffer->pybuffer.buf, __pyx_t_7, __pyx_pybuffernd_indices1.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_int_weights.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_int_weights.diminfo[0].strides));
+          }
+
+          /* "hifive/libraries/_hic_interactions.pyx":507
+ *                 sums[indices0[i]] += weights[i]
+ *                 sums[indices1[i]] += weights[i]
+ *         elif not int_weights is None:             # <<<<<<<<<<<<<<
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += int_weights[i]
+ */
+          goto __pyx_L6;
+        }
+
+        /* "hifive/libraries/_hic_interactions.pyx":512
+ *                 sums[indices1[i]] += int_weights[i]
+ *         else:
+ *             for i in range(num_indices):             # <<<<<<<<<<<<<<
+ *                 sums[indices0[i]] += 1
+ *                 sums[indices1[i]] += 1
+ */
+        /*else*/ {
+          __pyx_t_3 = __pyx_v_num_indices;
+          __pyx_t_4 = __pyx_t_3;
+          for (__pyx_t_5 = 0; __pyx_t_5 < __pyx_t_4; __pyx_t_5+=1) {
+            __pyx_v_i = __pyx_t_5;
+
+            /* "hifive/libraries/_hic_interactions.pyx":513
+ *         else:
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += 1             # <<<<<<<<<<<<<<
+ *                 sums[indices1[i]] += 1
+ *     return None
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices0.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_indices0.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += 1.0;
+
+            /* "hifive/libraries/_hic_interactions.pyx":514
+ *             for i in range(num_indices):
+ *                 sums[indices0[i]] += 1
+ *                 sums[indices1[i]] += 1             # <<<<<<<<<<<<<<
+ *     return None
+ * 
+ */
+            __pyx_t_6 = __pyx_v_i;
+            __pyx_t_8 = (*__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_int_t *, __pyx_pybuffernd_indices1.rcbuffer->pybuffer.buf, __pyx_t_6, __pyx_pybuffernd_indices1.diminfo[0].strides));
+            *__Pyx_BufPtrStrided1d(__pyx_t_6hifive_9libraries_17_hic_interactions_DTYPE_64_t *, __pyx_pybuffernd_sums.rcbuffer->pybuffer.buf, __pyx_t_8, __pyx_pybuffernd_sums.diminfo[0].strides) += 1.0;
+          }
+        }
+        __pyx_L6:;
+      }
+
+      /* "hifive/libraries/_hic_interactions.pyx":502
+ *     cdef long long int i
+ *     cdef long long int num_indices = indices0.shape[0]
+ *     with nogil:             # <<<<<<<<<<<<<<
+ *         if not weights is None:
+ *             for i in range(num_indices):
+ */
+      /*finally:*/ {
+        /*normal exit:*/{
+          #ifdef WITH_THREAD
+          __Pyx_FastGIL_Forget();
+          Py_BLOCK_THREADS
+          #endif
+          goto __pyx_L5;
+        }
+        __pyx_L5:;
+      }
+  }
+
+  /* "hifive/libraries/_hic_interactions.pyx":515
+ *                 sums[indices0[i]] += 1
+ *                 sums[indices1[i]] += 1
+ *     return None             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+  goto __pyx_L0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":494
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def sum_weighted_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices1,
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  { PyObject *__pyx_type, *__pyx_value, *__pyx_tb;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&__pyx_type, &__pyx_value, &__pyx_tb);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_int_weights.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_sums.rcbuffer->pybuffer);
+    __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_weights.rcbuffer->pybuffer);
+  __Pyx_ErrRestore(__pyx_type, __pyx_value, __pyx_tb);}
+  __Pyx_AddTraceback("hifive.libraries._hic_interactions.sum_weighted_indices", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  goto __pyx_L2;
+  __pyx_L0:;
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices0.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_indices1.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_int_weights.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_sums.rcbuffer->pybuffer);
+  __Pyx_SafeReleaseBuffer(&__pyx_pybuffernd_weights.rcbuffer->pybuffer);
+  __pyx_L2:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":258
+ *         # experimental exception made for __getbuffer__ and __releasebuffer__
+ *         # -- the details of this may change.
+ *         def __getbuffer__(ndarray self, Py_buffer* info, int flags):             # <<<<<<<<<<<<<<
+ *             # This implementation of getbuffer is geared towards Cython
+ *             # requirements, and does not yet fulfill the PEP.
+ */
+
+/* Python wrapper */
+static CYTHON_UNUSED int __pyx_pw_5numpy_7ndarray_1__getbuffer__(PyObject *__pyx_v_self, Py_buffer *__pyx_v_info, int __pyx_v_flags); /*proto*/
+static CYTHON_UNUSED int __pyx_pw_5numpy_7ndarray_1__getbuffer__(PyObject *__pyx_v_self, Py_buffer *__pyx_v_info, int __pyx_v_flags) {
+  int __pyx_r;
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__getbuffer__ (wrapper)", 0);
+  __pyx_r = __pyx_pf_5numpy_7ndarray___getbuffer__(((PyArrayObject *)__pyx_v_self), ((Py_buffer *)__pyx_v_info), ((int)__pyx_v_flags));
+
+  /* function exit code */
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static int __pyx_pf_5numpy_7ndarray___getbuffer__(PyArrayObject *__pyx_v_self, Py_buffer *__pyx_v_info, int __pyx_v_flags) {
+  int __pyx_v_i;
+  int __pyx_v_ndim;
+  int __pyx_v_endian_detector;
+  int __pyx_v_little_endian;
+  int __pyx_v_t;
+  char *__pyx_v_f;
+  PyArray_Descr *__pyx_v_descr = 0;
+  int __pyx_v_offset;
+  int __pyx_r;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  int __pyx_t_2;
+  PyObject *__pyx_t_3 = NULL;
+  int __pyx_t_4;
+  int __pyx_t_5;
+  int __pyx_t_6;
+  PyArray_Descr *__pyx_t_7;
+  PyObject *__pyx_t_8 = NULL;
+  char *__pyx_t_9;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  if (__pyx_v_info == NULL) {
+    PyErr_SetString(PyExc_BufferError, "PyObject_GetBuffer: view==NULL argument is obsolete");
+    return -1;
+  }
+  __Pyx_RefNannySetupContext("__getbuffer__", 0);
+  __pyx_v_info->obj = Py_None; __Pyx_INCREF(Py_None);
+  __Pyx_GIVEREF(__pyx_v_info->obj);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":265
+ * 
+ *             cdef int i, ndim
+ *             cdef int endian_detector = 1             # <<<<<<<<<<<<<<
+ *             cdef bint little_endian = ((<char*>&endian_detector)[0] != 0)
+ * 
+ */
+  __pyx_v_endian_detector = 1;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":266
+ *             cdef int i, ndim
+ *             cdef int endian_detector = 1
+ *             cdef bint little_endian = ((<char*>&endian_detector)[0] != 0)             # <<<<<<<<<<<<<<
+ * 
+ *             ndim = PyArray_NDIM(self)
+ */
+  __pyx_v_little_endian = ((((char *)(&__pyx_v_endian_detector))[0]) != 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":268
+ *             cdef bint little_endian = ((<char*>&endian_detector)[0] != 0)
+ * 
+ *             ndim = PyArray_NDIM(self)             # <<<<<<<<<<<<<<
+ * 
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)
+ */
+  __pyx_v_ndim = PyArray_NDIM(__pyx_v_self);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":270
+ *             ndim = PyArray_NDIM(self)
+ * 
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ */
+  __pyx_t_2 = (((__pyx_v_flags & PyBUF_C_CONTIGUOUS) == PyBUF_C_CONTIGUOUS) != 0);
+  if (__pyx_t_2) {
+  } else {
+    __pyx_t_1 = __pyx_t_2;
+    goto __pyx_L4_bool_binop_done;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":271
+ * 
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):             # <<<<<<<<<<<<<<
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ * 
+ */
+  __pyx_t_2 = ((!(PyArray_CHKFLAGS(__pyx_v_self, NPY_ARRAY_C_CONTIGUOUS) != 0)) != 0);
+  __pyx_t_1 = __pyx_t_2;
+  __pyx_L4_bool_binop_done:;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":270
+ *             ndim = PyArray_NDIM(self)
+ * 
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ */
+  if (unlikely(__pyx_t_1)) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":272
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not C contiguous")             # <<<<<<<<<<<<<<
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)
+ */
+    __pyx_t_3 = __Pyx_PyObject_Call(__pyx_builtin_ValueError, __pyx_tuple__2, NULL); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 272, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_3);
+    __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+    __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+    __PYX_ERR(1, 272, __pyx_L1_error)
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":270
+ *             ndim = PyArray_NDIM(self)
+ * 
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":274
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")
+ */
+  __pyx_t_2 = (((__pyx_v_flags & PyBUF_F_CONTIGUOUS) == PyBUF_F_CONTIGUOUS) != 0);
+  if (__pyx_t_2) {
+  } else {
+    __pyx_t_1 = __pyx_t_2;
+    goto __pyx_L7_bool_binop_done;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":275
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):             # <<<<<<<<<<<<<<
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")
+ * 
+ */
+  __pyx_t_2 = ((!(PyArray_CHKFLAGS(__pyx_v_self, NPY_ARRAY_F_CONTIGUOUS) != 0)) != 0);
+  __pyx_t_1 = __pyx_t_2;
+  __pyx_L7_bool_binop_done:;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":274
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")
+ */
+  if (unlikely(__pyx_t_1)) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":276
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")             # <<<<<<<<<<<<<<
+ * 
+ *             info.buf = PyArray_DATA(self)
+ */
+    __pyx_t_3 = __Pyx_PyObject_Call(__pyx_builtin_ValueError, __pyx_tuple__3, NULL); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 276, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_3);
+    __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+    __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+    __PYX_ERR(1, 276, __pyx_L1_error)
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":274
+ *                 raise ValueError(u"ndarray is not C contiguous")
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)             # <<<<<<<<<<<<<<
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":278
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")
+ * 
+ *             info.buf = PyArray_DATA(self)             # <<<<<<<<<<<<<<
+ *             info.ndim = ndim
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ */
+  __pyx_v_info->buf = PyArray_DATA(__pyx_v_self);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":279
+ * 
+ *             info.buf = PyArray_DATA(self)
+ *             info.ndim = ndim             # <<<<<<<<<<<<<<
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ *                 # Allocate new buffer for strides and shape info.
+ */
+  __pyx_v_info->ndim = __pyx_v_ndim;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":280
+ *             info.buf = PyArray_DATA(self)
+ *             info.ndim = ndim
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):             # <<<<<<<<<<<<<<
+ *                 # Allocate new buffer for strides and shape info.
+ *                 # This is allocated as one block, strides first.
+ */
+  __pyx_t_1 = (((sizeof(npy_intp)) != (sizeof(Py_ssize_t))) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":283
+ *                 # Allocate new buffer for strides and shape info.
+ *                 # This is allocated as one block, strides first.
+ *                 info.strides = <Py_ssize_t*>PyObject_Malloc(sizeof(Py_ssize_t) * 2 * <size_t>ndim)             # <<<<<<<<<<<<<<
+ *                 info.shape = info.strides + ndim
+ *                 for i in range(ndim):
+ */
+    __pyx_v_info->strides = ((Py_ssize_t *)PyObject_Malloc((((sizeof(Py_ssize_t)) * 2) * ((size_t)__pyx_v_ndim))));
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":284
+ *                 # This is allocated as one block, strides first.
+ *                 info.strides = <Py_ssize_t*>PyObject_Malloc(sizeof(Py_ssize_t) * 2 * <size_t>ndim)
+ *                 info.shape = info.strides + ndim             # <<<<<<<<<<<<<<
+ *                 for i in range(ndim):
+ *                     info.strides[i] = PyArray_STRIDES(self)[i]
+ */
+    __pyx_v_info->shape = (__pyx_v_info->strides + __pyx_v_ndim);
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":285
+ *                 info.strides = <Py_ssize_t*>PyObject_Malloc(sizeof(Py_ssize_t) * 2 * <size_t>ndim)
+ *                 info.shape = info.strides + ndim
+ *                 for i in range(ndim):             # <<<<<<<<<<<<<<
+ *                     info.strides[i] = PyArray_STRIDES(self)[i]
+ *                     info.shape[i] = PyArray_DIMS(self)[i]
+ */
+    __pyx_t_4 = __pyx_v_ndim;
+    __pyx_t_5 = __pyx_t_4;
+    for (__pyx_t_6 = 0; __pyx_t_6 < __pyx_t_5; __pyx_t_6+=1) {
+      __pyx_v_i = __pyx_t_6;
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":286
+ *                 info.shape = info.strides + ndim
+ *                 for i in range(ndim):
+ *                     info.strides[i] = PyArray_STRIDES(self)[i]             # <<<<<<<<<<<<<<
+ *                     info.shape[i] = PyArray_DIMS(self)[i]
+ *             else:
+ */
+      (__pyx_v_info->strides[__pyx_v_i]) = (PyArray_STRIDES(__pyx_v_self)[__pyx_v_i]);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":287
+ *                 for i in range(ndim):
+ *                     info.strides[i] = PyArray_STRIDES(self)[i]
+ *                     info.shape[i] = PyArray_DIMS(self)[i]             # <<<<<<<<<<<<<<
+ *             else:
+ *                 info.strides = <Py_ssize_t*>PyArray_STRIDES(self)
+ */
+      (__pyx_v_info->shape[__pyx_v_i]) = (PyArray_DIMS(__pyx_v_self)[__pyx_v_i]);
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":280
+ *             info.buf = PyArray_DATA(self)
+ *             info.ndim = ndim
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):             # <<<<<<<<<<<<<<
+ *                 # Allocate new buffer for strides and shape info.
+ *                 # This is allocated as one block, strides first.
+ */
+    goto __pyx_L9;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":289
+ *                     info.shape[i] = PyArray_DIMS(self)[i]
+ *             else:
+ *                 info.strides = <Py_ssize_t*>PyArray_STRIDES(self)             # <<<<<<<<<<<<<<
+ *                 info.shape = <Py_ssize_t*>PyArray_DIMS(self)
+ *             info.suboffsets = NULL
+ */
+  /*else*/ {
+    __pyx_v_info->strides = ((Py_ssize_t *)PyArray_STRIDES(__pyx_v_self));
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":290
+ *             else:
+ *                 info.strides = <Py_ssize_t*>PyArray_STRIDES(self)
+ *                 info.shape = <Py_ssize_t*>PyArray_DIMS(self)             # <<<<<<<<<<<<<<
+ *             info.suboffsets = NULL
+ *             info.itemsize = PyArray_ITEMSIZE(self)
+ */
+    __pyx_v_info->shape = ((Py_ssize_t *)PyArray_DIMS(__pyx_v_self));
+  }
+  __pyx_L9:;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":291
+ *                 info.strides = <Py_ssize_t*>PyArray_STRIDES(self)
+ *                 info.shape = <Py_ssize_t*>PyArray_DIMS(self)
+ *             info.suboffsets = NULL             # <<<<<<<<<<<<<<
+ *             info.itemsize = PyArray_ITEMSIZE(self)
+ *             info.readonly = not PyArray_ISWRITEABLE(self)
+ */
+  __pyx_v_info->suboffsets = NULL;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":292
+ *                 info.shape = <Py_ssize_t*>PyArray_DIMS(self)
+ *             info.suboffsets = NULL
+ *             info.itemsize = PyArray_ITEMSIZE(self)             # <<<<<<<<<<<<<<
+ *             info.readonly = not PyArray_ISWRITEABLE(self)
+ * 
+ */
+  __pyx_v_info->itemsize = PyArray_ITEMSIZE(__pyx_v_self);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":293
+ *             info.suboffsets = NULL
+ *             info.itemsize = PyArray_ITEMSIZE(self)
+ *             info.readonly = not PyArray_ISWRITEABLE(self)             # <<<<<<<<<<<<<<
+ * 
+ *             cdef int t
+ */
+  __pyx_v_info->readonly = (!(PyArray_ISWRITEABLE(__pyx_v_self) != 0));
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":296
+ * 
+ *             cdef int t
+ *             cdef char* f = NULL             # <<<<<<<<<<<<<<
+ *             cdef dtype descr = <dtype>PyArray_DESCR(self)
+ *             cdef int offset
+ */
+  __pyx_v_f = NULL;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":297
+ *             cdef int t
+ *             cdef char* f = NULL
+ *             cdef dtype descr = <dtype>PyArray_DESCR(self)             # <<<<<<<<<<<<<<
+ *             cdef int offset
+ * 
+ */
+  __pyx_t_7 = PyArray_DESCR(__pyx_v_self);
+  __pyx_t_3 = ((PyObject *)__pyx_t_7);
+  __Pyx_INCREF(__pyx_t_3);
+  __pyx_v_descr = ((PyArray_Descr *)__pyx_t_3);
+  __pyx_t_3 = 0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":300
+ *             cdef int offset
+ * 
+ *             info.obj = self             # <<<<<<<<<<<<<<
+ * 
+ *             if not PyDataType_HASFIELDS(descr):
+ */
+  __Pyx_INCREF(((PyObject *)__pyx_v_self));
+  __Pyx_GIVEREF(((PyObject *)__pyx_v_self));
+  __Pyx_GOTREF(__pyx_v_info->obj);
+  __Pyx_DECREF(__pyx_v_info->obj);
+  __pyx_v_info->obj = ((PyObject *)__pyx_v_self);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":302
+ *             info.obj = self
+ * 
+ *             if not PyDataType_HASFIELDS(descr):             # <<<<<<<<<<<<<<
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ */
+  __pyx_t_1 = ((!(PyDataType_HASFIELDS(__pyx_v_descr) != 0)) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":303
+ * 
+ *             if not PyDataType_HASFIELDS(descr):
+ *                 t = descr.type_num             # <<<<<<<<<<<<<<
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ */
+    __pyx_t_4 = __pyx_v_descr->type_num;
+    __pyx_v_t = __pyx_t_4;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":304
+ *             if not PyDataType_HASFIELDS(descr):
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")
+ */
+    __pyx_t_2 = ((__pyx_v_descr->byteorder == '>') != 0);
+    if (!__pyx_t_2) {
+      goto __pyx_L15_next_or;
+    } else {
+    }
+    __pyx_t_2 = (__pyx_v_little_endian != 0);
+    if (!__pyx_t_2) {
+    } else {
+      __pyx_t_1 = __pyx_t_2;
+      goto __pyx_L14_bool_binop_done;
+    }
+    __pyx_L15_next_or:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":305
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ *                     (descr.byteorder == c'<' and not little_endian)):             # <<<<<<<<<<<<<<
+ *                     raise ValueError(u"Non-native byte order not supported")
+ *                 if   t == NPY_BYTE:        f = "b"
+ */
+    __pyx_t_2 = ((__pyx_v_descr->byteorder == '<') != 0);
+    if (__pyx_t_2) {
+    } else {
+      __pyx_t_1 = __pyx_t_2;
+      goto __pyx_L14_bool_binop_done;
+    }
+    __pyx_t_2 = ((!(__pyx_v_little_endian != 0)) != 0);
+    __pyx_t_1 = __pyx_t_2;
+    __pyx_L14_bool_binop_done:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":304
+ *             if not PyDataType_HASFIELDS(descr):
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")
+ */
+    if (unlikely(__pyx_t_1)) {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":306
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")             # <<<<<<<<<<<<<<
+ *                 if   t == NPY_BYTE:        f = "b"
+ *                 elif t == NPY_UBYTE:       f = "B"
+ */
+      __pyx_t_3 = __Pyx_PyObject_Call(__pyx_builtin_ValueError, __pyx_tuple__4, NULL); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 306, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __PYX_ERR(1, 306, __pyx_L1_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":304
+ *             if not PyDataType_HASFIELDS(descr):
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")
+ */
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":307
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")
+ *                 if   t == NPY_BYTE:        f = "b"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_UBYTE:       f = "B"
+ *                 elif t == NPY_SHORT:       f = "h"
+ */
+    switch (__pyx_v_t) {
+      case NPY_BYTE:
+      __pyx_v_f = ((char *)"b");
+      break;
+      case NPY_UBYTE:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":308
+ *                     raise ValueError(u"Non-native byte order not supported")
+ *                 if   t == NPY_BYTE:        f = "b"
+ *                 elif t == NPY_UBYTE:       f = "B"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_SHORT:       f = "h"
+ *                 elif t == NPY_USHORT:      f = "H"
+ */
+      __pyx_v_f = ((char *)"B");
+      break;
+      case NPY_SHORT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":309
+ *                 if   t == NPY_BYTE:        f = "b"
+ *                 elif t == NPY_UBYTE:       f = "B"
+ *                 elif t == NPY_SHORT:       f = "h"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_USHORT:      f = "H"
+ *                 elif t == NPY_INT:         f = "i"
+ */
+      __pyx_v_f = ((char *)"h");
+      break;
+      case NPY_USHORT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":310
+ *                 elif t == NPY_UBYTE:       f = "B"
+ *                 elif t == NPY_SHORT:       f = "h"
+ *                 elif t == NPY_USHORT:      f = "H"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_INT:         f = "i"
+ *                 elif t == NPY_UINT:        f = "I"
+ */
+      __pyx_v_f = ((char *)"H");
+      break;
+      case NPY_INT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":311
+ *                 elif t == NPY_SHORT:       f = "h"
+ *                 elif t == NPY_USHORT:      f = "H"
+ *                 elif t == NPY_INT:         f = "i"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_UINT:        f = "I"
+ *                 elif t == NPY_LONG:        f = "l"
+ */
+      __pyx_v_f = ((char *)"i");
+      break;
+      case NPY_UINT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":312
+ *                 elif t == NPY_USHORT:      f = "H"
+ *                 elif t == NPY_INT:         f = "i"
+ *                 elif t == NPY_UINT:        f = "I"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_LONG:        f = "l"
+ *                 elif t == NPY_ULONG:       f = "L"
+ */
+      __pyx_v_f = ((char *)"I");
+      break;
+      case NPY_LONG:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":313
+ *                 elif t == NPY_INT:         f = "i"
+ *                 elif t == NPY_UINT:        f = "I"
+ *                 elif t == NPY_LONG:        f = "l"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_ULONG:       f = "L"
+ *                 elif t == NPY_LONGLONG:    f = "q"
+ */
+      __pyx_v_f = ((char *)"l");
+      break;
+      case NPY_ULONG:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":314
+ *                 elif t == NPY_UINT:        f = "I"
+ *                 elif t == NPY_LONG:        f = "l"
+ *                 elif t == NPY_ULONG:       f = "L"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_LONGLONG:    f = "q"
+ *                 elif t == NPY_ULONGLONG:   f = "Q"
+ */
+      __pyx_v_f = ((char *)"L");
+      break;
+      case NPY_LONGLONG:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":315
+ *                 elif t == NPY_LONG:        f = "l"
+ *                 elif t == NPY_ULONG:       f = "L"
+ *                 elif t == NPY_LONGLONG:    f = "q"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_ULONGLONG:   f = "Q"
+ *                 elif t == NPY_FLOAT:       f = "f"
+ */
+      __pyx_v_f = ((char *)"q");
+      break;
+      case NPY_ULONGLONG:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":316
+ *                 elif t == NPY_ULONG:       f = "L"
+ *                 elif t == NPY_LONGLONG:    f = "q"
+ *                 elif t == NPY_ULONGLONG:   f = "Q"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_FLOAT:       f = "f"
+ *                 elif t == NPY_DOUBLE:      f = "d"
+ */
+      __pyx_v_f = ((char *)"Q");
+      break;
+      case NPY_FLOAT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":317
+ *                 elif t == NPY_LONGLONG:    f = "q"
+ *                 elif t == NPY_ULONGLONG:   f = "Q"
+ *                 elif t == NPY_FLOAT:       f = "f"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_DOUBLE:      f = "d"
+ *                 elif t == NPY_LONGDOUBLE:  f = "g"
+ */
+      __pyx_v_f = ((char *)"f");
+      break;
+      case NPY_DOUBLE:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":318
+ *                 elif t == NPY_ULONGLONG:   f = "Q"
+ *                 elif t == NPY_FLOAT:       f = "f"
+ *                 elif t == NPY_DOUBLE:      f = "d"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_LONGDOUBLE:  f = "g"
+ *                 elif t == NPY_CFLOAT:      f = "Zf"
+ */
+      __pyx_v_f = ((char *)"d");
+      break;
+      case NPY_LONGDOUBLE:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":319
+ *                 elif t == NPY_FLOAT:       f = "f"
+ *                 elif t == NPY_DOUBLE:      f = "d"
+ *                 elif t == NPY_LONGDOUBLE:  f = "g"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_CFLOAT:      f = "Zf"
+ *                 elif t == NPY_CDOUBLE:     f = "Zd"
+ */
+      __pyx_v_f = ((char *)"g");
+      break;
+      case NPY_CFLOAT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":320
+ *                 elif t == NPY_DOUBLE:      f = "d"
+ *                 elif t == NPY_LONGDOUBLE:  f = "g"
+ *                 elif t == NPY_CFLOAT:      f = "Zf"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_CDOUBLE:     f = "Zd"
+ *                 elif t == NPY_CLONGDOUBLE: f = "Zg"
+ */
+      __pyx_v_f = ((char *)"Zf");
+      break;
+      case NPY_CDOUBLE:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":321
+ *                 elif t == NPY_LONGDOUBLE:  f = "g"
+ *                 elif t == NPY_CFLOAT:      f = "Zf"
+ *                 elif t == NPY_CDOUBLE:     f = "Zd"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_CLONGDOUBLE: f = "Zg"
+ *                 elif t == NPY_OBJECT:      f = "O"
+ */
+      __pyx_v_f = ((char *)"Zd");
+      break;
+      case NPY_CLONGDOUBLE:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":322
+ *                 elif t == NPY_CFLOAT:      f = "Zf"
+ *                 elif t == NPY_CDOUBLE:     f = "Zd"
+ *                 elif t == NPY_CLONGDOUBLE: f = "Zg"             # <<<<<<<<<<<<<<
+ *                 elif t == NPY_OBJECT:      f = "O"
+ *                 else:
+ */
+      __pyx_v_f = ((char *)"Zg");
+      break;
+      case NPY_OBJECT:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":323
+ *                 elif t == NPY_CDOUBLE:     f = "Zd"
+ *                 elif t == NPY_CLONGDOUBLE: f = "Zg"
+ *                 elif t == NPY_OBJECT:      f = "O"             # <<<<<<<<<<<<<<
+ *                 else:
+ *                     raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)
+ */
+      __pyx_v_f = ((char *)"O");
+      break;
+      default:
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":325
+ *                 elif t == NPY_OBJECT:      f = "O"
+ *                 else:
+ *                     raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)             # <<<<<<<<<<<<<<
+ *                 info.format = f
+ *                 return
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_int(__pyx_v_t); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 325, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_8 = PyUnicode_Format(__pyx_kp_u_unknown_dtype_code_in_numpy_pxd, __pyx_t_3); if (unlikely(!__pyx_t_8)) __PYX_ERR(1, 325, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_8);
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_3 = __Pyx_PyObject_CallOneArg(__pyx_builtin_ValueError, __pyx_t_8); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 325, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __Pyx_DECREF(__pyx_t_8); __pyx_t_8 = 0;
+      __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __PYX_ERR(1, 325, __pyx_L1_error)
+      break;
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":326
+ *                 else:
+ *                     raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)
+ *                 info.format = f             # <<<<<<<<<<<<<<
+ *                 return
+ *             else:
+ */
+    __pyx_v_info->format = __pyx_v_f;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":327
+ *                     raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)
+ *                 info.format = f
+ *                 return             # <<<<<<<<<<<<<<
+ *             else:
+ *                 info.format = <char*>PyObject_Malloc(_buffer_format_string_len)
+ */
+    __pyx_r = 0;
+    goto __pyx_L0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":302
+ *             info.obj = self
+ * 
+ *             if not PyDataType_HASFIELDS(descr):             # <<<<<<<<<<<<<<
+ *                 t = descr.type_num
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":329
+ *                 return
+ *             else:
+ *                 info.format = <char*>PyObject_Malloc(_buffer_format_string_len)             # <<<<<<<<<<<<<<
+ *                 info.format[0] = c'^' # Native data types, manual alignment
+ *                 offset = 0
+ */
+  /*else*/ {
+    __pyx_v_info->format = ((char *)PyObject_Malloc(0xFF));
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":330
+ *             else:
+ *                 info.format = <char*>PyObject_Malloc(_buffer_format_string_len)
+ *                 info.format[0] = c'^' # Native data types, manual alignment             # <<<<<<<<<<<<<<
+ *                 offset = 0
+ *                 f = _util_dtypestring(descr, info.format + 1,
+ */
+    (__pyx_v_info->format[0]) = '^';
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":331
+ *                 info.format = <char*>PyObject_Malloc(_buffer_format_string_len)
+ *                 info.format[0] = c'^' # Native data types, manual alignment
+ *                 offset = 0             # <<<<<<<<<<<<<<
+ *                 f = _util_dtypestring(descr, info.format + 1,
+ *                                       info.format + _buffer_format_string_len,
+ */
+    __pyx_v_offset = 0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":332
+ *                 info.format[0] = c'^' # Native data types, manual alignment
+ *                 offset = 0
+ *                 f = _util_dtypestring(descr, info.format + 1,             # <<<<<<<<<<<<<<
+ *                                       info.format + _buffer_format_string_len,
+ *                                       &offset)
+ */
+    __pyx_t_9 = __pyx_f_5numpy__util_dtypestring(__pyx_v_descr, (__pyx_v_info->format + 1), (__pyx_v_info->format + 0xFF), (&__pyx_v_offset)); if (unlikely(__pyx_t_9 == ((char *)NULL))) __PYX_ERR(1, 332, __pyx_L1_error)
+    __pyx_v_f = __pyx_t_9;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":335
+ *                                       info.format + _buffer_format_string_len,
+ *                                       &offset)
+ *                 f[0] = c'\0' # Terminate format string             # <<<<<<<<<<<<<<
+ * 
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):
+ */
+    (__pyx_v_f[0]) = '\x00';
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":258
+ *         # experimental exception made for __getbuffer__ and __releasebuffer__
+ *         # -- the details of this may change.
+ *         def __getbuffer__(ndarray self, Py_buffer* info, int flags):             # <<<<<<<<<<<<<<
+ *             # This implementation of getbuffer is geared towards Cython
+ *             # requirements, and does not yet fulfill the PEP.
+ */
+
+  /* function exit code */
+  __pyx_r = 0;
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_3);
+  __Pyx_XDECREF(__pyx_t_8);
+  __Pyx_AddTraceback("numpy.ndarray.__getbuffer__", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = -1;
+  if (__pyx_v_info->obj != NULL) {
+    __Pyx_GOTREF(__pyx_v_info->obj);
+    __Pyx_DECREF(__pyx_v_info->obj); __pyx_v_info->obj = 0;
+  }
+  goto __pyx_L2;
+  __pyx_L0:;
+  if (__pyx_v_info->obj == Py_None) {
+    __Pyx_GOTREF(__pyx_v_info->obj);
+    __Pyx_DECREF(__pyx_v_info->obj); __pyx_v_info->obj = 0;
+  }
+  __pyx_L2:;
+  __Pyx_XDECREF((PyObject *)__pyx_v_descr);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":337
+ *                 f[0] = c'\0' # Terminate format string
+ * 
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):             # <<<<<<<<<<<<<<
+ *             if PyArray_HASFIELDS(self):
+ *                 PyObject_Free(info.format)
+ */
+
+/* Python wrapper */
+static CYTHON_UNUSED void __pyx_pw_5numpy_7ndarray_3__releasebuffer__(PyObject *__pyx_v_self, Py_buffer *__pyx_v_info); /*proto*/
+static CYTHON_UNUSED void __pyx_pw_5numpy_7ndarray_3__releasebuffer__(PyObject *__pyx_v_self, Py_buffer *__pyx_v_info) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__releasebuffer__ (wrapper)", 0);
+  __pyx_pf_5numpy_7ndarray_2__releasebuffer__(((PyArrayObject *)__pyx_v_self), ((Py_buffer *)__pyx_v_info));
+
+  /* function exit code */
+  __Pyx_RefNannyFinishContext();
+}
+
+static void __pyx_pf_5numpy_7ndarray_2__releasebuffer__(PyArrayObject *__pyx_v_self, Py_buffer *__pyx_v_info) {
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  __Pyx_RefNannySetupContext("__releasebuffer__", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":338
+ * 
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):
+ *             if PyArray_HASFIELDS(self):             # <<<<<<<<<<<<<<
+ *                 PyObject_Free(info.format)
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ */
+  __pyx_t_1 = (PyArray_HASFIELDS(__pyx_v_self) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":339
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):
+ *             if PyArray_HASFIELDS(self):
+ *                 PyObject_Free(info.format)             # <<<<<<<<<<<<<<
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ *                 PyObject_Free(info.strides)
+ */
+    PyObject_Free(__pyx_v_info->format);
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":338
+ * 
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):
+ *             if PyArray_HASFIELDS(self):             # <<<<<<<<<<<<<<
+ *                 PyObject_Free(info.format)
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":340
+ *             if PyArray_HASFIELDS(self):
+ *                 PyObject_Free(info.format)
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):             # <<<<<<<<<<<<<<
+ *                 PyObject_Free(info.strides)
+ *                 # info.shape was stored after info.strides in the same block
+ */
+  __pyx_t_1 = (((sizeof(npy_intp)) != (sizeof(Py_ssize_t))) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":341
+ *                 PyObject_Free(info.format)
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):
+ *                 PyObject_Free(info.strides)             # <<<<<<<<<<<<<<
+ *                 # info.shape was stored after info.strides in the same block
+ * 
+ */
+    PyObject_Free(__pyx_v_info->strides);
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":340
+ *             if PyArray_HASFIELDS(self):
+ *                 PyObject_Free(info.format)
+ *             if sizeof(npy_intp) != sizeof(Py_ssize_t):             # <<<<<<<<<<<<<<
+ *                 PyObject_Free(info.strides)
+ *                 # info.shape was stored after info.strides in the same block
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":337
+ *                 f[0] = c'\0' # Terminate format string
+ * 
+ *         def __releasebuffer__(ndarray self, Py_buffer* info):             # <<<<<<<<<<<<<<
+ *             if PyArray_HASFIELDS(self):
+ *                 PyObject_Free(info.format)
+ */
+
+  /* function exit code */
+  __Pyx_RefNannyFinishContext();
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":820
+ * ctypedef npy_cdouble     complex_t
+ * 
+ * cdef inline object PyArray_MultiIterNew1(a):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(1, <void*>a)
+ * 
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyArray_MultiIterNew1(PyObject *__pyx_v_a) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("PyArray_MultiIterNew1", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":821
+ * 
+ * cdef inline object PyArray_MultiIterNew1(a):
+ *     return PyArray_MultiIterNew(1, <void*>a)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object PyArray_MultiIterNew2(a, b):
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_1 = PyArray_MultiIterNew(1, ((void *)__pyx_v_a)); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 821, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_r = __pyx_t_1;
+  __pyx_t_1 = 0;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":820
+ * ctypedef npy_cdouble     complex_t
+ * 
+ * cdef inline object PyArray_MultiIterNew1(a):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(1, <void*>a)
+ * 
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_AddTraceback("numpy.PyArray_MultiIterNew1", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = 0;
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":823
+ *     return PyArray_MultiIterNew(1, <void*>a)
+ * 
+ * cdef inline object PyArray_MultiIterNew2(a, b):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(2, <void*>a, <void*>b)
+ * 
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyArray_MultiIterNew2(PyObject *__pyx_v_a, PyObject *__pyx_v_b) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("PyArray_MultiIterNew2", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":824
+ * 
+ * cdef inline object PyArray_MultiIterNew2(a, b):
+ *     return PyArray_MultiIterNew(2, <void*>a, <void*>b)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object PyArray_MultiIterNew3(a, b, c):
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_1 = PyArray_MultiIterNew(2, ((void *)__pyx_v_a), ((void *)__pyx_v_b)); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 824, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_r = __pyx_t_1;
+  __pyx_t_1 = 0;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":823
+ *     return PyArray_MultiIterNew(1, <void*>a)
+ * 
+ * cdef inline object PyArray_MultiIterNew2(a, b):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(2, <void*>a, <void*>b)
+ * 
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_AddTraceback("numpy.PyArray_MultiIterNew2", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = 0;
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":826
+ *     return PyArray_MultiIterNew(2, <void*>a, <void*>b)
+ * 
+ * cdef inline object PyArray_MultiIterNew3(a, b, c):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(3, <void*>a, <void*>b, <void*> c)
+ * 
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyArray_MultiIterNew3(PyObject *__pyx_v_a, PyObject *__pyx_v_b, PyObject *__pyx_v_c) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("PyArray_MultiIterNew3", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":827
+ * 
+ * cdef inline object PyArray_MultiIterNew3(a, b, c):
+ *     return PyArray_MultiIterNew(3, <void*>a, <void*>b, <void*> c)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object PyArray_MultiIterNew4(a, b, c, d):
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_1 = PyArray_MultiIterNew(3, ((void *)__pyx_v_a), ((void *)__pyx_v_b), ((void *)__pyx_v_c)); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 827, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_r = __pyx_t_1;
+  __pyx_t_1 = 0;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":826
+ *     return PyArray_MultiIterNew(2, <void*>a, <void*>b)
+ * 
+ * cdef inline object PyArray_MultiIterNew3(a, b, c):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(3, <void*>a, <void*>b, <void*> c)
+ * 
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_AddTraceback("numpy.PyArray_MultiIterNew3", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = 0;
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":829
+ *     return PyArray_MultiIterNew(3, <void*>a, <void*>b, <void*> c)
+ * 
+ * cdef inline object PyArray_MultiIterNew4(a, b, c, d):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(4, <void*>a, <void*>b, <void*>c, <void*> d)
+ * 
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyArray_MultiIterNew4(PyObject *__pyx_v_a, PyObject *__pyx_v_b, PyObject *__pyx_v_c, PyObject *__pyx_v_d) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("PyArray_MultiIterNew4", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":830
+ * 
+ * cdef inline object PyArray_MultiIterNew4(a, b, c, d):
+ *     return PyArray_MultiIterNew(4, <void*>a, <void*>b, <void*>c, <void*> d)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object PyArray_MultiIterNew5(a, b, c, d, e):
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_1 = PyArray_MultiIterNew(4, ((void *)__pyx_v_a), ((void *)__pyx_v_b), ((void *)__pyx_v_c), ((void *)__pyx_v_d)); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 830, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_r = __pyx_t_1;
+  __pyx_t_1 = 0;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":829
+ *     return PyArray_MultiIterNew(3, <void*>a, <void*>b, <void*> c)
+ * 
+ * cdef inline object PyArray_MultiIterNew4(a, b, c, d):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(4, <void*>a, <void*>b, <void*>c, <void*> d)
+ * 
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_AddTraceback("numpy.PyArray_MultiIterNew4", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = 0;
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":832
+ *     return PyArray_MultiIterNew(4, <void*>a, <void*>b, <void*>c, <void*> d)
+ * 
+ * cdef inline object PyArray_MultiIterNew5(a, b, c, d, e):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(5, <void*>a, <void*>b, <void*>c, <void*> d, <void*> e)
+ * 
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyArray_MultiIterNew5(PyObject *__pyx_v_a, PyObject *__pyx_v_b, PyObject *__pyx_v_c, PyObject *__pyx_v_d, PyObject *__pyx_v_e) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("PyArray_MultiIterNew5", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":833
+ * 
+ * cdef inline object PyArray_MultiIterNew5(a, b, c, d, e):
+ *     return PyArray_MultiIterNew(5, <void*>a, <void*>b, <void*>c, <void*> d, <void*> e)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline tuple PyDataType_SHAPE(dtype d):
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __pyx_t_1 = PyArray_MultiIterNew(5, ((void *)__pyx_v_a), ((void *)__pyx_v_b), ((void *)__pyx_v_c), ((void *)__pyx_v_d), ((void *)__pyx_v_e)); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 833, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_r = __pyx_t_1;
+  __pyx_t_1 = 0;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":832
+ *     return PyArray_MultiIterNew(4, <void*>a, <void*>b, <void*>c, <void*> d)
+ * 
+ * cdef inline object PyArray_MultiIterNew5(a, b, c, d, e):             # <<<<<<<<<<<<<<
+ *     return PyArray_MultiIterNew(5, <void*>a, <void*>b, <void*>c, <void*> d, <void*> e)
+ * 
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_AddTraceback("numpy.PyArray_MultiIterNew5", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = 0;
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":835
+ *     return PyArray_MultiIterNew(5, <void*>a, <void*>b, <void*>c, <void*> d, <void*> e)
+ * 
+ * cdef inline tuple PyDataType_SHAPE(dtype d):             # <<<<<<<<<<<<<<
+ *     if PyDataType_HASSUBARRAY(d):
+ *         return <tuple>d.subarray.shape
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_PyDataType_SHAPE(PyArray_Descr *__pyx_v_d) {
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  __Pyx_RefNannySetupContext("PyDataType_SHAPE", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":836
+ * 
+ * cdef inline tuple PyDataType_SHAPE(dtype d):
+ *     if PyDataType_HASSUBARRAY(d):             # <<<<<<<<<<<<<<
+ *         return <tuple>d.subarray.shape
+ *     else:
+ */
+  __pyx_t_1 = (PyDataType_HASSUBARRAY(__pyx_v_d) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":837
+ * cdef inline tuple PyDataType_SHAPE(dtype d):
+ *     if PyDataType_HASSUBARRAY(d):
+ *         return <tuple>d.subarray.shape             # <<<<<<<<<<<<<<
+ *     else:
+ *         return ()
+ */
+    __Pyx_XDECREF(__pyx_r);
+    __Pyx_INCREF(((PyObject*)__pyx_v_d->subarray->shape));
+    __pyx_r = ((PyObject*)__pyx_v_d->subarray->shape);
+    goto __pyx_L0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":836
+ * 
+ * cdef inline tuple PyDataType_SHAPE(dtype d):
+ *     if PyDataType_HASSUBARRAY(d):             # <<<<<<<<<<<<<<
+ *         return <tuple>d.subarray.shape
+ *     else:
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":839
+ *         return <tuple>d.subarray.shape
+ *     else:
+ *         return ()             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline char* _util_dtypestring(dtype descr, char* f, char* end, int* offset) except NULL:
+ */
+  /*else*/ {
+    __Pyx_XDECREF(__pyx_r);
+    __Pyx_INCREF(__pyx_empty_tuple);
+    __pyx_r = __pyx_empty_tuple;
+    goto __pyx_L0;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":835
+ *     return PyArray_MultiIterNew(5, <void*>a, <void*>b, <void*>c, <void*> d, <void*> e)
+ * 
+ * cdef inline tuple PyDataType_SHAPE(dtype d):             # <<<<<<<<<<<<<<
+ *     if PyDataType_HASSUBARRAY(d):
+ *         return <tuple>d.subarray.shape
+ */
+
+  /* function exit code */
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":841
+ *         return ()
+ * 
+ * cdef inline char* _util_dtypestring(dtype descr, char* f, char* end, int* offset) except NULL:             # <<<<<<<<<<<<<<
+ *     # Recursive utility function used in __getbuffer__ to get format
+ *     # string. The new location in the format string is returned.
+ */
+
+static CYTHON_INLINE char *__pyx_f_5numpy__util_dtypestring(PyArray_Descr *__pyx_v_descr, char *__pyx_v_f, char *__pyx_v_end, int *__pyx_v_offset) {
+  PyArray_Descr *__pyx_v_child = 0;
+  int __pyx_v_endian_detector;
+  int __pyx_v_little_endian;
+  PyObject *__pyx_v_fields = 0;
+  PyObject *__pyx_v_childname = NULL;
+  PyObject *__pyx_v_new_offset = NULL;
+  PyObject *__pyx_v_t = NULL;
+  char *__pyx_r;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  Py_ssize_t __pyx_t_2;
+  PyObject *__pyx_t_3 = NULL;
+  PyObject *__pyx_t_4 = NULL;
+  int __pyx_t_5;
+  int __pyx_t_6;
+  int __pyx_t_7;
+  long __pyx_t_8;
+  char *__pyx_t_9;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("_util_dtypestring", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":846
+ * 
+ *     cdef dtype child
+ *     cdef int endian_detector = 1             # <<<<<<<<<<<<<<
+ *     cdef bint little_endian = ((<char*>&endian_detector)[0] != 0)
+ *     cdef tuple fields
+ */
+  __pyx_v_endian_detector = 1;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":847
+ *     cdef dtype child
+ *     cdef int endian_detector = 1
+ *     cdef bint little_endian = ((<char*>&endian_detector)[0] != 0)             # <<<<<<<<<<<<<<
+ *     cdef tuple fields
+ * 
+ */
+  __pyx_v_little_endian = ((((char *)(&__pyx_v_endian_detector))[0]) != 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":850
+ *     cdef tuple fields
+ * 
+ *     for childname in descr.names:             # <<<<<<<<<<<<<<
+ *         fields = descr.fields[childname]
+ *         child, new_offset = fields
+ */
+  if (unlikely(__pyx_v_descr->names == Py_None)) {
+    PyErr_SetString(PyExc_TypeError, "'NoneType' object is not iterable");
+    __PYX_ERR(1, 850, __pyx_L1_error)
+  }
+  __pyx_t_1 = __pyx_v_descr->names; __Pyx_INCREF(__pyx_t_1); __pyx_t_2 = 0;
+  for (;;) {
+    if (__pyx_t_2 >= PyTuple_GET_SIZE(__pyx_t_1)) break;
+    #if CYTHON_ASSUME_SAFE_MACROS && !CYTHON_AVOID_BORROWED_REFS
+    __pyx_t_3 = PyTuple_GET_ITEM(__pyx_t_1, __pyx_t_2); __Pyx_INCREF(__pyx_t_3); __pyx_t_2++; if (unlikely(0 < 0)) __PYX_ERR(1, 850, __pyx_L1_error)
+    #else
+    __pyx_t_3 = PySequence_ITEM(__pyx_t_1, __pyx_t_2); __pyx_t_2++; if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 850, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_3);
+    #endif
+    __Pyx_XDECREF_SET(__pyx_v_childname, __pyx_t_3);
+    __pyx_t_3 = 0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":851
+ * 
+ *     for childname in descr.names:
+ *         fields = descr.fields[childname]             # <<<<<<<<<<<<<<
+ *         child, new_offset = fields
+ * 
+ */
+    if (unlikely(__pyx_v_descr->fields == Py_None)) {
+      PyErr_SetString(PyExc_TypeError, "'NoneType' object is not subscriptable");
+      __PYX_ERR(1, 851, __pyx_L1_error)
+    }
+    __pyx_t_3 = __Pyx_PyDict_GetItem(__pyx_v_descr->fields, __pyx_v_childname); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 851, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_3);
+    if (!(likely(PyTuple_CheckExact(__pyx_t_3))||((__pyx_t_3) == Py_None)||((void)PyErr_Format(PyExc_TypeError, "Expected %.16s, got %.200s", "tuple", Py_TYPE(__pyx_t_3)->tp_name), 0))) __PYX_ERR(1, 851, __pyx_L1_error)
+    __Pyx_XDECREF_SET(__pyx_v_fields, ((PyObject*)__pyx_t_3));
+    __pyx_t_3 = 0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":852
+ *     for childname in descr.names:
+ *         fields = descr.fields[childname]
+ *         child, new_offset = fields             # <<<<<<<<<<<<<<
+ * 
+ *         if (end - f) - <int>(new_offset - offset[0]) < 15:
+ */
+    if (likely(__pyx_v_fields != Py_None)) {
+      PyObject* sequence = __pyx_v_fields;
+      Py_ssize_t size = __Pyx_PySequence_SIZE(sequence);
+      if (unlikely(size != 2)) {
+        if (size > 2) __Pyx_RaiseTooManyValuesError(2);
+        else if (size >= 0) __Pyx_RaiseNeedMoreValuesError(size);
+        __PYX_ERR(1, 852, __pyx_L1_error)
+      }
+      #if CYTHON_ASSUME_SAFE_MACROS && !CYTHON_AVOID_BORROWED_REFS
+      __pyx_t_3 = PyTuple_GET_ITEM(sequence, 0); 
+      __pyx_t_4 = PyTuple_GET_ITEM(sequence, 1); 
+      __Pyx_INCREF(__pyx_t_3);
+      __Pyx_INCREF(__pyx_t_4);
+      #else
+      __pyx_t_3 = PySequence_ITEM(sequence, 0); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 852, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PySequence_ITEM(sequence, 1); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 852, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      #endif
+    } else {
+      __Pyx_RaiseNoneNotIterableError(); __PYX_ERR(1, 852, __pyx_L1_error)
+    }
+    if (!(likely(((__pyx_t_3) == Py_None) || likely(__Pyx_TypeTest(__pyx_t_3, __pyx_ptype_5numpy_dtype))))) __PYX_ERR(1, 852, __pyx_L1_error)
+    __Pyx_XDECREF_SET(__pyx_v_child, ((PyArray_Descr *)__pyx_t_3));
+    __pyx_t_3 = 0;
+    __Pyx_XDECREF_SET(__pyx_v_new_offset, __pyx_t_4);
+    __pyx_t_4 = 0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":854
+ *         child, new_offset = fields
+ * 
+ *         if (end - f) - <int>(new_offset - offset[0]) < 15:             # <<<<<<<<<<<<<<
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")
+ * 
+ */
+    __pyx_t_4 = __Pyx_PyInt_From_int((__pyx_v_offset[0])); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 854, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_4);
+    __pyx_t_3 = PyNumber_Subtract(__pyx_v_new_offset, __pyx_t_4); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 854, __pyx_L1_error)
+    __Pyx_GOTREF(__pyx_t_3);
+    __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+    __pyx_t_5 = __Pyx_PyInt_As_int(__pyx_t_3); if (unlikely((__pyx_t_5 == (int)-1) && PyErr_Occurred())) __PYX_ERR(1, 854, __pyx_L1_error)
+    __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+    __pyx_t_6 = ((((__pyx_v_end - __pyx_v_f) - ((int)__pyx_t_5)) < 15) != 0);
+    if (unlikely(__pyx_t_6)) {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":855
+ * 
+ *         if (end - f) - <int>(new_offset - offset[0]) < 15:
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")             # <<<<<<<<<<<<<<
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or
+ */
+      __pyx_t_3 = __Pyx_PyObject_Call(__pyx_builtin_RuntimeError, __pyx_tuple__5, NULL); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 855, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __PYX_ERR(1, 855, __pyx_L1_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":854
+ *         child, new_offset = fields
+ * 
+ *         if (end - f) - <int>(new_offset - offset[0]) < 15:             # <<<<<<<<<<<<<<
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")
+ * 
+ */
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":857
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *             (child.byteorder == c'<' and not little_endian)):
+ *             raise ValueError(u"Non-native byte order not supported")
+ */
+    __pyx_t_7 = ((__pyx_v_child->byteorder == '>') != 0);
+    if (!__pyx_t_7) {
+      goto __pyx_L8_next_or;
+    } else {
+    }
+    __pyx_t_7 = (__pyx_v_little_endian != 0);
+    if (!__pyx_t_7) {
+    } else {
+      __pyx_t_6 = __pyx_t_7;
+      goto __pyx_L7_bool_binop_done;
+    }
+    __pyx_L8_next_or:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":858
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or
+ *             (child.byteorder == c'<' and not little_endian)):             # <<<<<<<<<<<<<<
+ *             raise ValueError(u"Non-native byte order not supported")
+ *             # One could encode it in the format string and have Cython
+ */
+    __pyx_t_7 = ((__pyx_v_child->byteorder == '<') != 0);
+    if (__pyx_t_7) {
+    } else {
+      __pyx_t_6 = __pyx_t_7;
+      goto __pyx_L7_bool_binop_done;
+    }
+    __pyx_t_7 = ((!(__pyx_v_little_endian != 0)) != 0);
+    __pyx_t_6 = __pyx_t_7;
+    __pyx_L7_bool_binop_done:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":857
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *             (child.byteorder == c'<' and not little_endian)):
+ *             raise ValueError(u"Non-native byte order not supported")
+ */
+    if (unlikely(__pyx_t_6)) {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":859
+ *         if ((child.byteorder == c'>' and little_endian) or
+ *             (child.byteorder == c'<' and not little_endian)):
+ *             raise ValueError(u"Non-native byte order not supported")             # <<<<<<<<<<<<<<
+ *             # One could encode it in the format string and have Cython
+ *             # complain instead, BUT: < and > in format strings also imply
+ */
+      __pyx_t_3 = __Pyx_PyObject_Call(__pyx_builtin_ValueError, __pyx_tuple__4, NULL); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 859, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __Pyx_Raise(__pyx_t_3, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __PYX_ERR(1, 859, __pyx_L1_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":857
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or             # <<<<<<<<<<<<<<
+ *             (child.byteorder == c'<' and not little_endian)):
+ *             raise ValueError(u"Non-native byte order not supported")
+ */
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":869
+ * 
+ *         # Output padding bytes
+ *         while offset[0] < new_offset:             # <<<<<<<<<<<<<<
+ *             f[0] = 120 # "x"; pad byte
+ *             f += 1
+ */
+    while (1) {
+      __pyx_t_3 = __Pyx_PyInt_From_int((__pyx_v_offset[0])); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 869, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_t_3, __pyx_v_new_offset, Py_LT); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 869, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 869, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (!__pyx_t_6) break;
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":870
+ *         # Output padding bytes
+ *         while offset[0] < new_offset:
+ *             f[0] = 120 # "x"; pad byte             # <<<<<<<<<<<<<<
+ *             f += 1
+ *             offset[0] += 1
+ */
+      (__pyx_v_f[0]) = 0x78;
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":871
+ *         while offset[0] < new_offset:
+ *             f[0] = 120 # "x"; pad byte
+ *             f += 1             # <<<<<<<<<<<<<<
+ *             offset[0] += 1
+ * 
+ */
+      __pyx_v_f = (__pyx_v_f + 1);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":872
+ *             f[0] = 120 # "x"; pad byte
+ *             f += 1
+ *             offset[0] += 1             # <<<<<<<<<<<<<<
+ * 
+ *         offset[0] += child.itemsize
+ */
+      __pyx_t_8 = 0;
+      (__pyx_v_offset[__pyx_t_8]) = ((__pyx_v_offset[__pyx_t_8]) + 1);
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":874
+ *             offset[0] += 1
+ * 
+ *         offset[0] += child.itemsize             # <<<<<<<<<<<<<<
+ * 
+ *         if not PyDataType_HASFIELDS(child):
+ */
+    __pyx_t_8 = 0;
+    (__pyx_v_offset[__pyx_t_8]) = ((__pyx_v_offset[__pyx_t_8]) + __pyx_v_child->elsize);
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":876
+ *         offset[0] += child.itemsize
+ * 
+ *         if not PyDataType_HASFIELDS(child):             # <<<<<<<<<<<<<<
+ *             t = child.type_num
+ *             if end - f < 5:
+ */
+    __pyx_t_6 = ((!(PyDataType_HASFIELDS(__pyx_v_child) != 0)) != 0);
+    if (__pyx_t_6) {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":877
+ * 
+ *         if not PyDataType_HASFIELDS(child):
+ *             t = child.type_num             # <<<<<<<<<<<<<<
+ *             if end - f < 5:
+ *                 raise RuntimeError(u"Format string allocated too short.")
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_int(__pyx_v_child->type_num); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 877, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __Pyx_XDECREF_SET(__pyx_v_t, __pyx_t_4);
+      __pyx_t_4 = 0;
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":878
+ *         if not PyDataType_HASFIELDS(child):
+ *             t = child.type_num
+ *             if end - f < 5:             # <<<<<<<<<<<<<<
+ *                 raise RuntimeError(u"Format string allocated too short.")
+ * 
+ */
+      __pyx_t_6 = (((__pyx_v_end - __pyx_v_f) < 5) != 0);
+      if (unlikely(__pyx_t_6)) {
+
+        /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":879
+ *             t = child.type_num
+ *             if end - f < 5:
+ *                 raise RuntimeError(u"Format string allocated too short.")             # <<<<<<<<<<<<<<
+ * 
+ *             # Until ticket #99 is fixed, use integers to avoid warnings
+ */
+        __pyx_t_4 = __Pyx_PyObject_Call(__pyx_builtin_RuntimeError, __pyx_tuple__6, NULL); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 879, __pyx_L1_error)
+        __Pyx_GOTREF(__pyx_t_4);
+        __Pyx_Raise(__pyx_t_4, 0, 0, 0);
+        __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+        __PYX_ERR(1, 879, __pyx_L1_error)
+
+        /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":878
+ *         if not PyDataType_HASFIELDS(child):
+ *             t = child.type_num
+ *             if end - f < 5:             # <<<<<<<<<<<<<<
+ *                 raise RuntimeError(u"Format string allocated too short.")
+ * 
+ */
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":882
+ * 
+ *             # Until ticket #99 is fixed, use integers to avoid warnings
+ *             if   t == NPY_BYTE:        f[0] =  98 #"b"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_UBYTE:       f[0] =  66 #"B"
+ *             elif t == NPY_SHORT:       f[0] = 104 #"h"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_BYTE); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 882, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 882, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 882, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 98;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":883
+ *             # Until ticket #99 is fixed, use integers to avoid warnings
+ *             if   t == NPY_BYTE:        f[0] =  98 #"b"
+ *             elif t == NPY_UBYTE:       f[0] =  66 #"B"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_SHORT:       f[0] = 104 #"h"
+ *             elif t == NPY_USHORT:      f[0] =  72 #"H"
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_UBYTE); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 883, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 883, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 883, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 66;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":884
+ *             if   t == NPY_BYTE:        f[0] =  98 #"b"
+ *             elif t == NPY_UBYTE:       f[0] =  66 #"B"
+ *             elif t == NPY_SHORT:       f[0] = 104 #"h"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_USHORT:      f[0] =  72 #"H"
+ *             elif t == NPY_INT:         f[0] = 105 #"i"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_SHORT); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 884, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 884, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 884, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x68;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":885
+ *             elif t == NPY_UBYTE:       f[0] =  66 #"B"
+ *             elif t == NPY_SHORT:       f[0] = 104 #"h"
+ *             elif t == NPY_USHORT:      f[0] =  72 #"H"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_INT:         f[0] = 105 #"i"
+ *             elif t == NPY_UINT:        f[0] =  73 #"I"
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_USHORT); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 885, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 885, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 885, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 72;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":886
+ *             elif t == NPY_SHORT:       f[0] = 104 #"h"
+ *             elif t == NPY_USHORT:      f[0] =  72 #"H"
+ *             elif t == NPY_INT:         f[0] = 105 #"i"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_UINT:        f[0] =  73 #"I"
+ *             elif t == NPY_LONG:        f[0] = 108 #"l"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_INT); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 886, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 886, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 886, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x69;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":887
+ *             elif t == NPY_USHORT:      f[0] =  72 #"H"
+ *             elif t == NPY_INT:         f[0] = 105 #"i"
+ *             elif t == NPY_UINT:        f[0] =  73 #"I"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_LONG:        f[0] = 108 #"l"
+ *             elif t == NPY_ULONG:       f[0] = 76  #"L"
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_UINT); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 887, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 887, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 887, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 73;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":888
+ *             elif t == NPY_INT:         f[0] = 105 #"i"
+ *             elif t == NPY_UINT:        f[0] =  73 #"I"
+ *             elif t == NPY_LONG:        f[0] = 108 #"l"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_ULONG:       f[0] = 76  #"L"
+ *             elif t == NPY_LONGLONG:    f[0] = 113 #"q"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_LONG); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 888, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 888, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 888, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x6C;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":889
+ *             elif t == NPY_UINT:        f[0] =  73 #"I"
+ *             elif t == NPY_LONG:        f[0] = 108 #"l"
+ *             elif t == NPY_ULONG:       f[0] = 76  #"L"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_LONGLONG:    f[0] = 113 #"q"
+ *             elif t == NPY_ULONGLONG:   f[0] = 81  #"Q"
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_ULONG); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 889, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 889, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 889, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 76;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":890
+ *             elif t == NPY_LONG:        f[0] = 108 #"l"
+ *             elif t == NPY_ULONG:       f[0] = 76  #"L"
+ *             elif t == NPY_LONGLONG:    f[0] = 113 #"q"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_ULONGLONG:   f[0] = 81  #"Q"
+ *             elif t == NPY_FLOAT:       f[0] = 102 #"f"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_LONGLONG); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 890, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 890, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 890, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x71;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":891
+ *             elif t == NPY_ULONG:       f[0] = 76  #"L"
+ *             elif t == NPY_LONGLONG:    f[0] = 113 #"q"
+ *             elif t == NPY_ULONGLONG:   f[0] = 81  #"Q"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_FLOAT:       f[0] = 102 #"f"
+ *             elif t == NPY_DOUBLE:      f[0] = 100 #"d"
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_ULONGLONG); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 891, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 891, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 891, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 81;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":892
+ *             elif t == NPY_LONGLONG:    f[0] = 113 #"q"
+ *             elif t == NPY_ULONGLONG:   f[0] = 81  #"Q"
+ *             elif t == NPY_FLOAT:       f[0] = 102 #"f"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_DOUBLE:      f[0] = 100 #"d"
+ *             elif t == NPY_LONGDOUBLE:  f[0] = 103 #"g"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_FLOAT); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 892, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 892, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 892, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x66;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":893
+ *             elif t == NPY_ULONGLONG:   f[0] = 81  #"Q"
+ *             elif t == NPY_FLOAT:       f[0] = 102 #"f"
+ *             elif t == NPY_DOUBLE:      f[0] = 100 #"d"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_LONGDOUBLE:  f[0] = 103 #"g"
+ *             elif t == NPY_CFLOAT:      f[0] = 90; f[1] = 102; f += 1 # Zf
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_DOUBLE); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 893, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 893, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 893, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x64;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":894
+ *             elif t == NPY_FLOAT:       f[0] = 102 #"f"
+ *             elif t == NPY_DOUBLE:      f[0] = 100 #"d"
+ *             elif t == NPY_LONGDOUBLE:  f[0] = 103 #"g"             # <<<<<<<<<<<<<<
+ *             elif t == NPY_CFLOAT:      f[0] = 90; f[1] = 102; f += 1 # Zf
+ *             elif t == NPY_CDOUBLE:     f[0] = 90; f[1] = 100; f += 1 # Zd
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_LONGDOUBLE); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 894, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 894, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 894, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 0x67;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":895
+ *             elif t == NPY_DOUBLE:      f[0] = 100 #"d"
+ *             elif t == NPY_LONGDOUBLE:  f[0] = 103 #"g"
+ *             elif t == NPY_CFLOAT:      f[0] = 90; f[1] = 102; f += 1 # Zf             # <<<<<<<<<<<<<<
+ *             elif t == NPY_CDOUBLE:     f[0] = 90; f[1] = 100; f += 1 # Zd
+ *             elif t == NPY_CLONGDOUBLE: f[0] = 90; f[1] = 103; f += 1 # Zg
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_CFLOAT); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 895, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 895, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 895, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 90;
+        (__pyx_v_f[1]) = 0x66;
+        __pyx_v_f = (__pyx_v_f + 1);
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":896
+ *             elif t == NPY_LONGDOUBLE:  f[0] = 103 #"g"
+ *             elif t == NPY_CFLOAT:      f[0] = 90; f[1] = 102; f += 1 # Zf
+ *             elif t == NPY_CDOUBLE:     f[0] = 90; f[1] = 100; f += 1 # Zd             # <<<<<<<<<<<<<<
+ *             elif t == NPY_CLONGDOUBLE: f[0] = 90; f[1] = 103; f += 1 # Zg
+ *             elif t == NPY_OBJECT:      f[0] = 79 #"O"
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_CDOUBLE); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 896, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 896, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 896, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 90;
+        (__pyx_v_f[1]) = 0x64;
+        __pyx_v_f = (__pyx_v_f + 1);
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":897
+ *             elif t == NPY_CFLOAT:      f[0] = 90; f[1] = 102; f += 1 # Zf
+ *             elif t == NPY_CDOUBLE:     f[0] = 90; f[1] = 100; f += 1 # Zd
+ *             elif t == NPY_CLONGDOUBLE: f[0] = 90; f[1] = 103; f += 1 # Zg             # <<<<<<<<<<<<<<
+ *             elif t == NPY_OBJECT:      f[0] = 79 #"O"
+ *             else:
+ */
+      __pyx_t_3 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_CLONGDOUBLE); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 897, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_3);
+      __pyx_t_4 = PyObject_RichCompare(__pyx_v_t, __pyx_t_3, Py_EQ); __Pyx_XGOTREF(__pyx_t_4); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 897, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_4); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 897, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      if (__pyx_t_6) {
+        (__pyx_v_f[0]) = 90;
+        (__pyx_v_f[1]) = 0x67;
+        __pyx_v_f = (__pyx_v_f + 1);
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":898
+ *             elif t == NPY_CDOUBLE:     f[0] = 90; f[1] = 100; f += 1 # Zd
+ *             elif t == NPY_CLONGDOUBLE: f[0] = 90; f[1] = 103; f += 1 # Zg
+ *             elif t == NPY_OBJECT:      f[0] = 79 #"O"             # <<<<<<<<<<<<<<
+ *             else:
+ *                 raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)
+ */
+      __pyx_t_4 = __Pyx_PyInt_From_enum__NPY_TYPES(NPY_OBJECT); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 898, __pyx_L1_error)
+      __Pyx_GOTREF(__pyx_t_4);
+      __pyx_t_3 = PyObject_RichCompare(__pyx_v_t, __pyx_t_4, Py_EQ); __Pyx_XGOTREF(__pyx_t_3); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 898, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+      __pyx_t_6 = __Pyx_PyObject_IsTrue(__pyx_t_3); if (unlikely(__pyx_t_6 < 0)) __PYX_ERR(1, 898, __pyx_L1_error)
+      __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+      if (likely(__pyx_t_6)) {
+        (__pyx_v_f[0]) = 79;
+        goto __pyx_L15;
+      }
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":900
+ *             elif t == NPY_OBJECT:      f[0] = 79 #"O"
+ *             else:
+ *                 raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)             # <<<<<<<<<<<<<<
+ *             f += 1
+ *         else:
+ */
+      /*else*/ {
+        __pyx_t_3 = __Pyx_PyUnicode_FormatSafe(__pyx_kp_u_unknown_dtype_code_in_numpy_pxd, __pyx_v_t); if (unlikely(!__pyx_t_3)) __PYX_ERR(1, 900, __pyx_L1_error)
+        __Pyx_GOTREF(__pyx_t_3);
+        __pyx_t_4 = __Pyx_PyObject_CallOneArg(__pyx_builtin_ValueError, __pyx_t_3); if (unlikely(!__pyx_t_4)) __PYX_ERR(1, 900, __pyx_L1_error)
+        __Pyx_GOTREF(__pyx_t_4);
+        __Pyx_DECREF(__pyx_t_3); __pyx_t_3 = 0;
+        __Pyx_Raise(__pyx_t_4, 0, 0, 0);
+        __Pyx_DECREF(__pyx_t_4); __pyx_t_4 = 0;
+        __PYX_ERR(1, 900, __pyx_L1_error)
+      }
+      __pyx_L15:;
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":901
+ *             else:
+ *                 raise ValueError(u"unknown dtype code in numpy.pxd (%d)" % t)
+ *             f += 1             # <<<<<<<<<<<<<<
+ *         else:
+ *             # Cython ignores struct boundary information ("T{...}"),
+ */
+      __pyx_v_f = (__pyx_v_f + 1);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":876
+ *         offset[0] += child.itemsize
+ * 
+ *         if not PyDataType_HASFIELDS(child):             # <<<<<<<<<<<<<<
+ *             t = child.type_num
+ *             if end - f < 5:
+ */
+      goto __pyx_L13;
+    }
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":905
+ *             # Cython ignores struct boundary information ("T{...}"),
+ *             # so don't output it
+ *             f = _util_dtypestring(child, f, end, offset)             # <<<<<<<<<<<<<<
+ *     return f
+ * 
+ */
+    /*else*/ {
+      __pyx_t_9 = __pyx_f_5numpy__util_dtypestring(__pyx_v_child, __pyx_v_f, __pyx_v_end, __pyx_v_offset); if (unlikely(__pyx_t_9 == ((char *)NULL))) __PYX_ERR(1, 905, __pyx_L1_error)
+      __pyx_v_f = __pyx_t_9;
+    }
+    __pyx_L13:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":850
+ *     cdef tuple fields
+ * 
+ *     for childname in descr.names:             # <<<<<<<<<<<<<<
+ *         fields = descr.fields[childname]
+ *         child, new_offset = fields
+ */
+  }
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":906
+ *             # so don't output it
+ *             f = _util_dtypestring(child, f, end, offset)
+ *     return f             # <<<<<<<<<<<<<<
+ * 
+ * 
+ */
+  __pyx_r = __pyx_v_f;
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":841
+ *         return ()
+ * 
+ * cdef inline char* _util_dtypestring(dtype descr, char* f, char* end, int* offset) except NULL:             # <<<<<<<<<<<<<<
+ *     # Recursive utility function used in __getbuffer__ to get format
+ *     # string. The new location in the format string is returned.
+ */
+
+  /* function exit code */
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_XDECREF(__pyx_t_3);
+  __Pyx_XDECREF(__pyx_t_4);
+  __Pyx_AddTraceback("numpy._util_dtypestring", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = NULL;
+  __pyx_L0:;
+  __Pyx_XDECREF((PyObject *)__pyx_v_child);
+  __Pyx_XDECREF(__pyx_v_fields);
+  __Pyx_XDECREF(__pyx_v_childname);
+  __Pyx_XDECREF(__pyx_v_new_offset);
+  __Pyx_XDECREF(__pyx_v_t);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1021
+ *     int _import_umath() except -1
+ * 
+ * cdef inline void set_array_base(ndarray arr, object base):             # <<<<<<<<<<<<<<
+ *     Py_INCREF(base) # important to do this before stealing the reference below!
+ *     PyArray_SetBaseObject(arr, base)
+ */
+
+static CYTHON_INLINE void __pyx_f_5numpy_set_array_base(PyArrayObject *__pyx_v_arr, PyObject *__pyx_v_base) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("set_array_base", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1022
+ * 
+ * cdef inline void set_array_base(ndarray arr, object base):
+ *     Py_INCREF(base) # important to do this before stealing the reference below!             # <<<<<<<<<<<<<<
+ *     PyArray_SetBaseObject(arr, base)
+ * 
+ */
+  Py_INCREF(__pyx_v_base);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1023
+ * cdef inline void set_array_base(ndarray arr, object base):
+ *     Py_INCREF(base) # important to do this before stealing the reference below!
+ *     PyArray_SetBaseObject(arr, base)             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline object get_array_base(ndarray arr):
+ */
+  (void)(PyArray_SetBaseObject(__pyx_v_arr, __pyx_v_base));
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1021
+ *     int _import_umath() except -1
+ * 
+ * cdef inline void set_array_base(ndarray arr, object base):             # <<<<<<<<<<<<<<
+ *     Py_INCREF(base) # important to do this before stealing the reference below!
+ *     PyArray_SetBaseObject(arr, base)
+ */
+
+  /* function exit code */
+  __Pyx_RefNannyFinishContext();
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1025
+ *     PyArray_SetBaseObject(arr, base)
+ * 
+ * cdef inline object get_array_base(ndarray arr):             # <<<<<<<<<<<<<<
+ *     base = PyArray_BASE(arr)
+ *     if base is NULL:
+ */
+
+static CYTHON_INLINE PyObject *__pyx_f_5numpy_get_array_base(PyArrayObject *__pyx_v_arr) {
+  PyObject *__pyx_v_base;
+  PyObject *__pyx_r = NULL;
+  __Pyx_RefNannyDeclarations
+  int __pyx_t_1;
+  __Pyx_RefNannySetupContext("get_array_base", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1026
+ * 
+ * cdef inline object get_array_base(ndarray arr):
+ *     base = PyArray_BASE(arr)             # <<<<<<<<<<<<<<
+ *     if base is NULL:
+ *         return None
+ */
+  __pyx_v_base = PyArray_BASE(__pyx_v_arr);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1027
+ * cdef inline object get_array_base(ndarray arr):
+ *     base = PyArray_BASE(arr)
+ *     if base is NULL:             # <<<<<<<<<<<<<<
+ *         return None
+ *     return <object>base
+ */
+  __pyx_t_1 = ((__pyx_v_base == NULL) != 0);
+  if (__pyx_t_1) {
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1028
+ *     base = PyArray_BASE(arr)
+ *     if base is NULL:
+ *         return None             # <<<<<<<<<<<<<<
+ *     return <object>base
+ * 
+ */
+    __Pyx_XDECREF(__pyx_r);
+    __pyx_r = Py_None; __Pyx_INCREF(Py_None);
+    goto __pyx_L0;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1027
+ * cdef inline object get_array_base(ndarray arr):
+ *     base = PyArray_BASE(arr)
+ *     if base is NULL:             # <<<<<<<<<<<<<<
+ *         return None
+ *     return <object>base
+ */
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1029
+ *     if base is NULL:
+ *         return None
+ *     return <object>base             # <<<<<<<<<<<<<<
+ * 
+ * # Versions of the import_* functions which are more suitable for
+ */
+  __Pyx_XDECREF(__pyx_r);
+  __Pyx_INCREF(((PyObject *)__pyx_v_base));
+  __pyx_r = ((PyObject *)__pyx_v_base);
+  goto __pyx_L0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1025
+ *     PyArray_SetBaseObject(arr, base)
+ * 
+ * cdef inline object get_array_base(ndarray arr):             # <<<<<<<<<<<<<<
+ *     base = PyArray_BASE(arr)
+ *     if base is NULL:
+ */
+
+  /* function exit code */
+  __pyx_L0:;
+  __Pyx_XGIVEREF(__pyx_r);
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1033
+ * # Versions of the import_* functions which are more suitable for
+ * # Cython code.
+ * cdef inline int import_array() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_array()
+ */
+
+static CYTHON_INLINE int __pyx_f_5numpy_import_array(void) {
+  int __pyx_r;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  PyObject *__pyx_t_3 = NULL;
+  int __pyx_t_4;
+  PyObject *__pyx_t_5 = NULL;
+  PyObject *__pyx_t_6 = NULL;
+  PyObject *__pyx_t_7 = NULL;
+  PyObject *__pyx_t_8 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("import_array", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1034
+ * # Cython code.
+ * cdef inline int import_array() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_array()
+ *     except Exception:
+ */
+  {
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ExceptionSave(&__pyx_t_1, &__pyx_t_2, &__pyx_t_3);
+    __Pyx_XGOTREF(__pyx_t_1);
+    __Pyx_XGOTREF(__pyx_t_2);
+    __Pyx_XGOTREF(__pyx_t_3);
+    /*try:*/ {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1035
+ * cdef inline int import_array() except -1:
+ *     try:
+ *         _import_array()             # <<<<<<<<<<<<<<
+ *     except Exception:
+ *         raise ImportError("numpy.core.multiarray failed to import")
+ */
+      __pyx_t_4 = _import_array(); if (unlikely(__pyx_t_4 == ((int)-1))) __PYX_ERR(1, 1035, __pyx_L3_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1034
+ * # Cython code.
+ * cdef inline int import_array() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_array()
+ *     except Exception:
+ */
+    }
+    __Pyx_XDECREF(__pyx_t_1); __pyx_t_1 = 0;
+    __Pyx_XDECREF(__pyx_t_2); __pyx_t_2 = 0;
+    __Pyx_XDECREF(__pyx_t_3); __pyx_t_3 = 0;
+    goto __pyx_L8_try_end;
+    __pyx_L3_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1036
+ *     try:
+ *         _import_array()
+ *     except Exception:             # <<<<<<<<<<<<<<
+ *         raise ImportError("numpy.core.multiarray failed to import")
+ * 
+ */
+    __pyx_t_4 = __Pyx_PyErr_ExceptionMatches(((PyObject *)(&((PyTypeObject*)PyExc_Exception)[0])));
+    if (__pyx_t_4) {
+      __Pyx_AddTraceback("numpy.import_array", __pyx_clineno, __pyx_lineno, __pyx_filename);
+      if (__Pyx_GetException(&__pyx_t_5, &__pyx_t_6, &__pyx_t_7) < 0) __PYX_ERR(1, 1036, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_5);
+      __Pyx_GOTREF(__pyx_t_6);
+      __Pyx_GOTREF(__pyx_t_7);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1037
+ *         _import_array()
+ *     except Exception:
+ *         raise ImportError("numpy.core.multiarray failed to import")             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline int import_umath() except -1:
+ */
+      __pyx_t_8 = __Pyx_PyObject_Call(__pyx_builtin_ImportError, __pyx_tuple__7, NULL); if (unlikely(!__pyx_t_8)) __PYX_ERR(1, 1037, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_8);
+      __Pyx_Raise(__pyx_t_8, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_8); __pyx_t_8 = 0;
+      __PYX_ERR(1, 1037, __pyx_L5_except_error)
+    }
+    goto __pyx_L5_except_error;
+    __pyx_L5_except_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1034
+ * # Cython code.
+ * cdef inline int import_array() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_array()
+ *     except Exception:
+ */
+    __Pyx_XGIVEREF(__pyx_t_1);
+    __Pyx_XGIVEREF(__pyx_t_2);
+    __Pyx_XGIVEREF(__pyx_t_3);
+    __Pyx_ExceptionReset(__pyx_t_1, __pyx_t_2, __pyx_t_3);
+    goto __pyx_L1_error;
+    __pyx_L8_try_end:;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1033
+ * # Versions of the import_* functions which are more suitable for
+ * # Cython code.
+ * cdef inline int import_array() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_array()
+ */
+
+  /* function exit code */
+  __pyx_r = 0;
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_5);
+  __Pyx_XDECREF(__pyx_t_6);
+  __Pyx_XDECREF(__pyx_t_7);
+  __Pyx_XDECREF(__pyx_t_8);
+  __Pyx_AddTraceback("numpy.import_array", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = -1;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1039
+ *         raise ImportError("numpy.core.multiarray failed to import")
+ * 
+ * cdef inline int import_umath() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_umath()
+ */
+
+static CYTHON_INLINE int __pyx_f_5numpy_import_umath(void) {
+  int __pyx_r;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  PyObject *__pyx_t_3 = NULL;
+  int __pyx_t_4;
+  PyObject *__pyx_t_5 = NULL;
+  PyObject *__pyx_t_6 = NULL;
+  PyObject *__pyx_t_7 = NULL;
+  PyObject *__pyx_t_8 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("import_umath", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1040
+ * 
+ * cdef inline int import_umath() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+  {
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ExceptionSave(&__pyx_t_1, &__pyx_t_2, &__pyx_t_3);
+    __Pyx_XGOTREF(__pyx_t_1);
+    __Pyx_XGOTREF(__pyx_t_2);
+    __Pyx_XGOTREF(__pyx_t_3);
+    /*try:*/ {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1041
+ * cdef inline int import_umath() except -1:
+ *     try:
+ *         _import_umath()             # <<<<<<<<<<<<<<
+ *     except Exception:
+ *         raise ImportError("numpy.core.umath failed to import")
+ */
+      __pyx_t_4 = _import_umath(); if (unlikely(__pyx_t_4 == ((int)-1))) __PYX_ERR(1, 1041, __pyx_L3_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1040
+ * 
+ * cdef inline int import_umath() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+    }
+    __Pyx_XDECREF(__pyx_t_1); __pyx_t_1 = 0;
+    __Pyx_XDECREF(__pyx_t_2); __pyx_t_2 = 0;
+    __Pyx_XDECREF(__pyx_t_3); __pyx_t_3 = 0;
+    goto __pyx_L8_try_end;
+    __pyx_L3_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1042
+ *     try:
+ *         _import_umath()
+ *     except Exception:             # <<<<<<<<<<<<<<
+ *         raise ImportError("numpy.core.umath failed to import")
+ * 
+ */
+    __pyx_t_4 = __Pyx_PyErr_ExceptionMatches(((PyObject *)(&((PyTypeObject*)PyExc_Exception)[0])));
+    if (__pyx_t_4) {
+      __Pyx_AddTraceback("numpy.import_umath", __pyx_clineno, __pyx_lineno, __pyx_filename);
+      if (__Pyx_GetException(&__pyx_t_5, &__pyx_t_6, &__pyx_t_7) < 0) __PYX_ERR(1, 1042, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_5);
+      __Pyx_GOTREF(__pyx_t_6);
+      __Pyx_GOTREF(__pyx_t_7);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1043
+ *         _import_umath()
+ *     except Exception:
+ *         raise ImportError("numpy.core.umath failed to import")             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline int import_ufunc() except -1:
+ */
+      __pyx_t_8 = __Pyx_PyObject_Call(__pyx_builtin_ImportError, __pyx_tuple__8, NULL); if (unlikely(!__pyx_t_8)) __PYX_ERR(1, 1043, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_8);
+      __Pyx_Raise(__pyx_t_8, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_8); __pyx_t_8 = 0;
+      __PYX_ERR(1, 1043, __pyx_L5_except_error)
+    }
+    goto __pyx_L5_except_error;
+    __pyx_L5_except_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1040
+ * 
+ * cdef inline int import_umath() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+    __Pyx_XGIVEREF(__pyx_t_1);
+    __Pyx_XGIVEREF(__pyx_t_2);
+    __Pyx_XGIVEREF(__pyx_t_3);
+    __Pyx_ExceptionReset(__pyx_t_1, __pyx_t_2, __pyx_t_3);
+    goto __pyx_L1_error;
+    __pyx_L8_try_end:;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1039
+ *         raise ImportError("numpy.core.multiarray failed to import")
+ * 
+ * cdef inline int import_umath() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_umath()
+ */
+
+  /* function exit code */
+  __pyx_r = 0;
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_5);
+  __Pyx_XDECREF(__pyx_t_6);
+  __Pyx_XDECREF(__pyx_t_7);
+  __Pyx_XDECREF(__pyx_t_8);
+  __Pyx_AddTraceback("numpy.import_umath", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = -1;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+/* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1045
+ *         raise ImportError("numpy.core.umath failed to import")
+ * 
+ * cdef inline int import_ufunc() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_umath()
+ */
+
+static CYTHON_INLINE int __pyx_f_5numpy_import_ufunc(void) {
+  int __pyx_r;
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  PyObject *__pyx_t_3 = NULL;
+  int __pyx_t_4;
+  PyObject *__pyx_t_5 = NULL;
+  PyObject *__pyx_t_6 = NULL;
+  PyObject *__pyx_t_7 = NULL;
+  PyObject *__pyx_t_8 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("import_ufunc", 0);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1046
+ * 
+ * cdef inline int import_ufunc() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+  {
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ExceptionSave(&__pyx_t_1, &__pyx_t_2, &__pyx_t_3);
+    __Pyx_XGOTREF(__pyx_t_1);
+    __Pyx_XGOTREF(__pyx_t_2);
+    __Pyx_XGOTREF(__pyx_t_3);
+    /*try:*/ {
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1047
+ * cdef inline int import_ufunc() except -1:
+ *     try:
+ *         _import_umath()             # <<<<<<<<<<<<<<
+ *     except Exception:
+ *         raise ImportError("numpy.core.umath failed to import")
+ */
+      __pyx_t_4 = _import_umath(); if (unlikely(__pyx_t_4 == ((int)-1))) __PYX_ERR(1, 1047, __pyx_L3_error)
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1046
+ * 
+ * cdef inline int import_ufunc() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+    }
+    __Pyx_XDECREF(__pyx_t_1); __pyx_t_1 = 0;
+    __Pyx_XDECREF(__pyx_t_2); __pyx_t_2 = 0;
+    __Pyx_XDECREF(__pyx_t_3); __pyx_t_3 = 0;
+    goto __pyx_L8_try_end;
+    __pyx_L3_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1048
+ *     try:
+ *         _import_umath()
+ *     except Exception:             # <<<<<<<<<<<<<<
+ *         raise ImportError("numpy.core.umath failed to import")
+ */
+    __pyx_t_4 = __Pyx_PyErr_ExceptionMatches(((PyObject *)(&((PyTypeObject*)PyExc_Exception)[0])));
+    if (__pyx_t_4) {
+      __Pyx_AddTraceback("numpy.import_ufunc", __pyx_clineno, __pyx_lineno, __pyx_filename);
+      if (__Pyx_GetException(&__pyx_t_5, &__pyx_t_6, &__pyx_t_7) < 0) __PYX_ERR(1, 1048, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_5);
+      __Pyx_GOTREF(__pyx_t_6);
+      __Pyx_GOTREF(__pyx_t_7);
+
+      /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1049
+ *         _import_umath()
+ *     except Exception:
+ *         raise ImportError("numpy.core.umath failed to import")             # <<<<<<<<<<<<<<
+ */
+      __pyx_t_8 = __Pyx_PyObject_Call(__pyx_builtin_ImportError, __pyx_tuple__8, NULL); if (unlikely(!__pyx_t_8)) __PYX_ERR(1, 1049, __pyx_L5_except_error)
+      __Pyx_GOTREF(__pyx_t_8);
+      __Pyx_Raise(__pyx_t_8, 0, 0, 0);
+      __Pyx_DECREF(__pyx_t_8); __pyx_t_8 = 0;
+      __PYX_ERR(1, 1049, __pyx_L5_except_error)
+    }
+    goto __pyx_L5_except_error;
+    __pyx_L5_except_error:;
+
+    /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1046
+ * 
+ * cdef inline int import_ufunc() except -1:
+ *     try:             # <<<<<<<<<<<<<<
+ *         _import_umath()
+ *     except Exception:
+ */
+    __Pyx_XGIVEREF(__pyx_t_1);
+    __Pyx_XGIVEREF(__pyx_t_2);
+    __Pyx_XGIVEREF(__pyx_t_3);
+    __Pyx_ExceptionReset(__pyx_t_1, __pyx_t_2, __pyx_t_3);
+    goto __pyx_L1_error;
+    __pyx_L8_try_end:;
+  }
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1045
+ *         raise ImportError("numpy.core.umath failed to import")
+ * 
+ * cdef inline int import_ufunc() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_umath()
+ */
+
+  /* function exit code */
+  __pyx_r = 0;
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_5);
+  __Pyx_XDECREF(__pyx_t_6);
+  __Pyx_XDECREF(__pyx_t_7);
+  __Pyx_XDECREF(__pyx_t_8);
+  __Pyx_AddTraceback("numpy.import_ufunc", __pyx_clineno, __pyx_lineno, __pyx_filename);
+  __pyx_r = -1;
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  return __pyx_r;
+}
+
+static PyMethodDef __pyx_methods[] = {
+  {0, 0, 0, 0}
+};
+
+#if PY_MAJOR_VERSION >= 3
+#if CYTHON_PEP489_MULTI_PHASE_INIT
+static PyObject* __pyx_pymod_create(PyObject *spec, PyModuleDef *def); /*proto*/
+static int __pyx_pymod_exec__hic_interactions(PyObject* module); /*proto*/
+static PyModuleDef_Slot __pyx_moduledef_slots[] = {
+  {Py_mod_create, (void*)__pyx_pymod_create},
+  {Py_mod_exec, (void*)__pyx_pymod_exec__hic_interactions},
+  {0, NULL}
+};
+#endif
+
+static struct PyModuleDef __pyx_moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "_hic_interactions",
+    __pyx_k_These_functions_provide_increase, /* m_doc */
+  #if CYTHON_PEP489_MULTI_PHASE_INIT
+    0, /* m_size */
+  #else
+    -1, /* m_size */
+  #endif
+    __pyx_methods /* m_methods */,
+  #if CYTHON_PEP489_MULTI_PHASE_INIT
+    __pyx_moduledef_slots, /* m_slots */
+  #else
+    NULL, /* m_reload */
+  #endif
+    NULL, /* m_traverse */
+    NULL, /* m_clear */
+    NULL /* m_free */
+};
+#endif
+#ifndef CYTHON_SMALL_CODE
+#if defined(__clang__)
+    #define CYTHON_SMALL_CODE
+#elif defined(__GNUC__) && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 3))
+    #define CYTHON_SMALL_CODE __attribute__((cold))
+#else
+    #define CYTHON_SMALL_CODE
+#endif
+#endif
+
+static __Pyx_StringTabEntry __pyx_string_tab[] = {
+  {&__pyx_kp_u_Format_string_allocated_too_shor, __pyx_k_Format_string_allocated_too_shor, sizeof(__pyx_k_Format_string_allocated_too_shor), 0, 1, 0, 0},
+  {&__pyx_kp_u_Format_string_allocated_too_shor_2, __pyx_k_Format_string_allocated_too_shor_2, sizeof(__pyx_k_Format_string_allocated_too_shor_2), 0, 1, 0, 0},
+  {&__pyx_n_s_ImportError, __pyx_k_ImportError, sizeof(__pyx_k_ImportError), 0, 0, 1, 1},
+  {&__pyx_kp_u_Non_native_byte_order_not_suppor, __pyx_k_Non_native_byte_order_not_suppor, sizeof(__pyx_k_Non_native_byte_order_not_suppor), 0, 1, 0, 0},
+  {&__pyx_n_s_RuntimeError, __pyx_k_RuntimeError, sizeof(__pyx_k_RuntimeError), 0, 0, 1, 1},
+  {&__pyx_n_s_ValueError, __pyx_k_ValueError, sizeof(__pyx_k_ValueError), 0, 0, 1, 1},
+  {&__pyx_n_s_all_total, __pyx_k_all_total, sizeof(__pyx_k_all_total), 0, 0, 1, 1},
+  {&__pyx_n_s_ascontiguousarray, __pyx_k_ascontiguousarray, sizeof(__pyx_k_ascontiguousarray), 0, 0, 1, 1},
+  {&__pyx_n_s_binbounds, __pyx_k_binbounds, sizeof(__pyx_k_binbounds), 0, 0, 1, 1},
+  {&__pyx_n_s_binned, __pyx_k_binned, sizeof(__pyx_k_binned), 0, 0, 1, 1},
+  {&__pyx_n_s_chr_indices, __pyx_k_chr_indices, sizeof(__pyx_k_chr_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_chr_max, __pyx_k_chr_max, sizeof(__pyx_k_chr_max), 0, 0, 1, 1},
+  {&__pyx_n_s_chr_total, __pyx_k_chr_total, sizeof(__pyx_k_chr_total), 0, 0, 1, 1},
+  {&__pyx_n_s_chrints, __pyx_k_chrints, sizeof(__pyx_k_chrints), 0, 0, 1, 1},
+  {&__pyx_n_s_chromosomes, __pyx_k_chromosomes, sizeof(__pyx_k_chromosomes), 0, 0, 1, 1},
+  {&__pyx_n_s_cline_in_traceback, __pyx_k_cline_in_traceback, sizeof(__pyx_k_cline_in_traceback), 0, 0, 1, 1},
+  {&__pyx_n_s_count, __pyx_k_count, sizeof(__pyx_k_count), 0, 0, 1, 1},
+  {&__pyx_n_s_counts, __pyx_k_counts, sizeof(__pyx_k_counts), 0, 0, 1, 1},
+  {&__pyx_n_s_coverage, __pyx_k_coverage, sizeof(__pyx_k_coverage), 0, 0, 1, 1},
+  {&__pyx_n_s_cumsum, __pyx_k_cumsum, sizeof(__pyx_k_cumsum), 0, 0, 1, 1},
+  {&__pyx_n_s_data, __pyx_k_data, sizeof(__pyx_k_data), 0, 0, 1, 1},
+  {&__pyx_n_s_data_indices, __pyx_k_data_indices, sizeof(__pyx_k_data_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_dtype, __pyx_k_dtype, sizeof(__pyx_k_dtype), 0, 0, 1, 1},
+  {&__pyx_n_s_fend1, __pyx_k_fend1, sizeof(__pyx_k_fend1), 0, 0, 1, 1},
+  {&__pyx_n_s_fend2, __pyx_k_fend2, sizeof(__pyx_k_fend2), 0, 0, 1, 1},
+  {&__pyx_n_s_fill, __pyx_k_fill, sizeof(__pyx_k_fill), 0, 0, 1, 1},
+  {&__pyx_n_s_filter, __pyx_k_filter, sizeof(__pyx_k_filter), 0, 0, 1, 1},
+  {&__pyx_n_s_filter_fend_neighbors, __pyx_k_filter_fend_neighbors, sizeof(__pyx_k_filter_fend_neighbors), 0, 0, 1, 1},
+  {&__pyx_n_s_find_cis_fend_neighbors, __pyx_k_find_cis_fend_neighbors, sizeof(__pyx_k_find_cis_fend_neighbors), 0, 0, 1, 1},
+  {&__pyx_n_s_find_distancebound_possible_inte, __pyx_k_find_distancebound_possible_inte, sizeof(__pyx_k_find_distancebound_possible_inte), 0, 0, 1, 1},
+  {&__pyx_n_s_find_fend_coverage, __pyx_k_find_fend_coverage, sizeof(__pyx_k_find_fend_coverage), 0, 0, 1, 1},
+  {&__pyx_n_s_find_fend_ranges, __pyx_k_find_fend_ranges, sizeof(__pyx_k_find_fend_ranges), 0, 0, 1, 1},
+  {&__pyx_n_s_find_max_bin, __pyx_k_find_max_bin, sizeof(__pyx_k_find_max_bin), 0, 0, 1, 1},
+  {&__pyx_n_s_find_max_fend, __pyx_k_find_max_fend, sizeof(__pyx_k_find_max_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_find_min_fend, __pyx_k_find_min_fend, sizeof(__pyx_k_find_min_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_find_nonzero_node_indices, __pyx_k_find_nonzero_node_indices, sizeof(__pyx_k_find_nonzero_node_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_find_nonzeros_in_range, __pyx_k_find_nonzeros_in_range, sizeof(__pyx_k_find_nonzeros_in_range), 0, 0, 1, 1},
+  {&__pyx_n_s_find_trans_fend_neighbors, __pyx_k_find_trans_fend_neighbors, sizeof(__pyx_k_find_trans_fend_neighbors), 0, 0, 1, 1},
+  {&__pyx_n_s_find_zero_node_indices, __pyx_k_find_zero_node_indices, sizeof(__pyx_k_find_zero_node_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_h, __pyx_k_h, sizeof(__pyx_k_h), 0, 0, 1, 1},
+  {&__pyx_kp_s_hifive_libraries__hic_interactio, __pyx_k_hifive_libraries__hic_interactio, sizeof(__pyx_k_hifive_libraries__hic_interactio), 0, 0, 1, 0},
+  {&__pyx_n_s_hifive_libraries__hic_interactio_2, __pyx_k_hifive_libraries__hic_interactio_2, sizeof(__pyx_k_hifive_libraries__hic_interactio_2), 0, 0, 1, 1},
+  {&__pyx_n_s_i, __pyx_k_i, sizeof(__pyx_k_i), 0, 0, 1, 1},
+  {&__pyx_n_s_import, __pyx_k_import, sizeof(__pyx_k_import), 0, 0, 1, 1},
+  {&__pyx_n_s_indices0, __pyx_k_indices0, sizeof(__pyx_k_indices0), 0, 0, 1, 1},
+  {&__pyx_n_s_indices1, __pyx_k_indices1, sizeof(__pyx_k_indices1), 0, 0, 1, 1},
+  {&__pyx_n_s_inf, __pyx_k_inf, sizeof(__pyx_k_inf), 0, 0, 1, 1},
+  {&__pyx_n_s_int32, __pyx_k_int32, sizeof(__pyx_k_int32), 0, 0, 1, 1},
+  {&__pyx_n_s_int64, __pyx_k_int64, sizeof(__pyx_k_int64), 0, 0, 1, 1},
+  {&__pyx_n_s_int_weights, __pyx_k_int_weights, sizeof(__pyx_k_int_weights), 0, 0, 1, 1},
+  {&__pyx_n_s_interactions, __pyx_k_interactions, sizeof(__pyx_k_interactions), 0, 0, 1, 1},
+  {&__pyx_n_s_j, __pyx_k_j, sizeof(__pyx_k_j), 0, 0, 1, 1},
+  {&__pyx_n_s_k, __pyx_k_k, sizeof(__pyx_k_k), 0, 0, 1, 1},
+  {&__pyx_n_s_m1, __pyx_k_m1, sizeof(__pyx_k_m1), 0, 0, 1, 1},
+  {&__pyx_n_s_m2, __pyx_k_m2, sizeof(__pyx_k_m2), 0, 0, 1, 1},
+  {&__pyx_n_s_main, __pyx_k_main, sizeof(__pyx_k_main), 0, 0, 1, 1},
+  {&__pyx_n_s_mapping, __pyx_k_mapping, sizeof(__pyx_k_mapping), 0, 0, 1, 1},
+  {&__pyx_n_s_max_fend, __pyx_k_max_fend, sizeof(__pyx_k_max_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_max_num_fends, __pyx_k_max_num_fends, sizeof(__pyx_k_max_num_fends), 0, 0, 1, 1},
+  {&__pyx_n_s_maxbin, __pyx_k_maxbin, sizeof(__pyx_k_maxbin), 0, 0, 1, 1},
+  {&__pyx_n_s_maxdistance, __pyx_k_maxdistance, sizeof(__pyx_k_maxdistance), 0, 0, 1, 1},
+  {&__pyx_n_s_mids, __pyx_k_mids, sizeof(__pyx_k_mids), 0, 0, 1, 1},
+  {&__pyx_n_s_mids_ptr, __pyx_k_mids_ptr, sizeof(__pyx_k_mids_ptr), 0, 0, 1, 1},
+  {&__pyx_n_s_min_fend, __pyx_k_min_fend, sizeof(__pyx_k_min_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_mincoverage, __pyx_k_mincoverage, sizeof(__pyx_k_mincoverage), 0, 0, 1, 1},
+  {&__pyx_n_s_mindistance, __pyx_k_mindistance, sizeof(__pyx_k_mindistance), 0, 0, 1, 1},
+  {&__pyx_n_s_name, __pyx_k_name, sizeof(__pyx_k_name), 0, 0, 1, 1},
+  {&__pyx_kp_u_ndarray_is_not_C_contiguous, __pyx_k_ndarray_is_not_C_contiguous, sizeof(__pyx_k_ndarray_is_not_C_contiguous), 0, 1, 0, 0},
+  {&__pyx_kp_u_ndarray_is_not_Fortran_contiguou, __pyx_k_ndarray_is_not_Fortran_contiguou, sizeof(__pyx_k_ndarray_is_not_Fortran_contiguou), 0, 1, 0, 0},
+  {&__pyx_n_s_neighbor_indices, __pyx_k_neighbor_indices, sizeof(__pyx_k_neighbor_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_neighbors, __pyx_k_neighbors, sizeof(__pyx_k_neighbors), 0, 0, 1, 1},
+  {&__pyx_n_s_num_bins, __pyx_k_num_bins, sizeof(__pyx_k_num_bins), 0, 0, 1, 1},
+  {&__pyx_n_s_num_chroms, __pyx_k_num_chroms, sizeof(__pyx_k_num_chroms), 0, 0, 1, 1},
+  {&__pyx_n_s_num_data, __pyx_k_num_data, sizeof(__pyx_k_num_data), 0, 0, 1, 1},
+  {&__pyx_n_s_num_fends, __pyx_k_num_fends, sizeof(__pyx_k_num_fends), 0, 0, 1, 1},
+  {&__pyx_n_s_num_indices, __pyx_k_num_indices, sizeof(__pyx_k_num_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_num_nz, __pyx_k_num_nz, sizeof(__pyx_k_num_nz), 0, 0, 1, 1},
+  {&__pyx_n_s_num_removed, __pyx_k_num_removed, sizeof(__pyx_k_num_removed), 0, 0, 1, 1},
+  {&__pyx_n_s_numpy, __pyx_k_numpy, sizeof(__pyx_k_numpy), 0, 0, 1, 1},
+  {&__pyx_kp_s_numpy_core_multiarray_failed_to, __pyx_k_numpy_core_multiarray_failed_to, sizeof(__pyx_k_numpy_core_multiarray_failed_to), 0, 0, 1, 0},
+  {&__pyx_kp_s_numpy_core_umath_failed_to_impor, __pyx_k_numpy_core_umath_failed_to_impor, sizeof(__pyx_k_numpy_core_umath_failed_to_impor), 0, 0, 1, 0},
+  {&__pyx_n_s_nzindices0, __pyx_k_nzindices0, sizeof(__pyx_k_nzindices0), 0, 0, 1, 1},
+  {&__pyx_n_s_nzindices1, __pyx_k_nzindices1, sizeof(__pyx_k_nzindices1), 0, 0, 1, 1},
+  {&__pyx_n_s_nzpos, __pyx_k_nzpos, sizeof(__pyx_k_nzpos), 0, 0, 1, 1},
+  {&__pyx_n_s_pos, __pyx_k_pos, sizeof(__pyx_k_pos), 0, 0, 1, 1},
+  {&__pyx_n_s_positions, __pyx_k_positions, sizeof(__pyx_k_positions), 0, 0, 1, 1},
+  {&__pyx_n_s_range, __pyx_k_range, sizeof(__pyx_k_range), 0, 0, 1, 1},
+  {&__pyx_n_s_ranges, __pyx_k_ranges, sizeof(__pyx_k_ranges), 0, 0, 1, 1},
+  {&__pyx_n_s_removed, __pyx_k_removed, sizeof(__pyx_k_removed), 0, 0, 1, 1},
+  {&__pyx_n_s_start, __pyx_k_start, sizeof(__pyx_k_start), 0, 0, 1, 1},
+  {&__pyx_n_s_start_fend, __pyx_k_start_fend, sizeof(__pyx_k_start_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_startfend, __pyx_k_startfend, sizeof(__pyx_k_startfend), 0, 0, 1, 1},
+  {&__pyx_n_s_stop, __pyx_k_stop, sizeof(__pyx_k_stop), 0, 0, 1, 1},
+  {&__pyx_n_s_stop_fend, __pyx_k_stop_fend, sizeof(__pyx_k_stop_fend), 0, 0, 1, 1},
+  {&__pyx_n_s_sum_weighted_indices, __pyx_k_sum_weighted_indices, sizeof(__pyx_k_sum_weighted_indices), 0, 0, 1, 1},
+  {&__pyx_n_s_sums, __pyx_k_sums, sizeof(__pyx_k_sums), 0, 0, 1, 1},
+  {&__pyx_n_s_test, __pyx_k_test, sizeof(__pyx_k_test), 0, 0, 1, 1},
+  {&__pyx_n_s_total, __pyx_k_total, sizeof(__pyx_k_total), 0, 0, 1, 1},
+  {&__pyx_n_s_total_fends, __pyx_k_total_fends, sizeof(__pyx_k_total_fends), 0, 0, 1, 1},
+  {&__pyx_kp_u_unknown_dtype_code_in_numpy_pxd, __pyx_k_unknown_dtype_code_in_numpy_pxd, sizeof(__pyx_k_unknown_dtype_code_in_numpy_pxd), 0, 1, 0, 0},
+  {&__pyx_n_s_useread_int, __pyx_k_useread_int, sizeof(__pyx_k_useread_int), 0, 0, 1, 1},
+  {&__pyx_n_s_valid, __pyx_k_valid, sizeof(__pyx_k_valid), 0, 0, 1, 1},
+  {&__pyx_n_s_valid_sums, __pyx_k_valid_sums, sizeof(__pyx_k_valid_sums), 0, 0, 1, 1},
+  {&__pyx_n_s_weights, __pyx_k_weights, sizeof(__pyx_k_weights), 0, 0, 1, 1},
+  {&__pyx_n_s_zeros, __pyx_k_zeros, sizeof(__pyx_k_zeros), 0, 0, 1, 1},
+  {&__pyx_n_s_zindices0, __pyx_k_zindices0, sizeof(__pyx_k_zindices0), 0, 0, 1, 1},
+  {&__pyx_n_s_zindices1, __pyx_k_zindices1, sizeof(__pyx_k_zindices1), 0, 0, 1, 1},
+  {&__pyx_n_s_zpos, __pyx_k_zpos, sizeof(__pyx_k_zpos), 0, 0, 1, 1},
+  {0, 0, 0, 0, 0, 0, 0}
+};
+static CYTHON_SMALL_CODE int __Pyx_InitCachedBuiltins(void) {
+  __pyx_builtin_range = __Pyx_GetBuiltinName(__pyx_n_s_range); if (!__pyx_builtin_range) __PYX_ERR(0, 41, __pyx_L1_error)
+  __pyx_builtin_ValueError = __Pyx_GetBuiltinName(__pyx_n_s_ValueError); if (!__pyx_builtin_ValueError) __PYX_ERR(1, 272, __pyx_L1_error)
+  __pyx_builtin_RuntimeError = __Pyx_GetBuiltinName(__pyx_n_s_RuntimeError); if (!__pyx_builtin_RuntimeError) __PYX_ERR(1, 855, __pyx_L1_error)
+  __pyx_builtin_ImportError = __Pyx_GetBuiltinName(__pyx_n_s_ImportError); if (!__pyx_builtin_ImportError) __PYX_ERR(1, 1037, __pyx_L1_error)
+  return 0;
+  __pyx_L1_error:;
+  return -1;
+}
+
+static CYTHON_SMALL_CODE int __Pyx_InitCachedConstants(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_InitCachedConstants", 0);
+
+  /* "hifive/libraries/_hic_interactions.pyx":404
+ *     # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+ *     cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+ *     valid_sums[1:] = numpy.cumsum(filter)             # <<<<<<<<<<<<<<
+ *     mids = numpy.ascontiguousarray(mids)
+ *     cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
+ */
+  __pyx_slice_ = PySlice_New(__pyx_int_1, Py_None, Py_None); if (unlikely(!__pyx_slice_)) __PYX_ERR(0, 404, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_slice_);
+  __Pyx_GIVEREF(__pyx_slice_);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":272
+ *             if ((flags & pybuf.PyBUF_C_CONTIGUOUS == pybuf.PyBUF_C_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_C_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not C contiguous")             # <<<<<<<<<<<<<<
+ * 
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)
+ */
+  __pyx_tuple__2 = PyTuple_Pack(1, __pyx_kp_u_ndarray_is_not_C_contiguous); if (unlikely(!__pyx_tuple__2)) __PYX_ERR(1, 272, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__2);
+  __Pyx_GIVEREF(__pyx_tuple__2);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":276
+ *             if ((flags & pybuf.PyBUF_F_CONTIGUOUS == pybuf.PyBUF_F_CONTIGUOUS)
+ *                 and not PyArray_CHKFLAGS(self, NPY_ARRAY_F_CONTIGUOUS)):
+ *                 raise ValueError(u"ndarray is not Fortran contiguous")             # <<<<<<<<<<<<<<
+ * 
+ *             info.buf = PyArray_DATA(self)
+ */
+  __pyx_tuple__3 = PyTuple_Pack(1, __pyx_kp_u_ndarray_is_not_Fortran_contiguou); if (unlikely(!__pyx_tuple__3)) __PYX_ERR(1, 276, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__3);
+  __Pyx_GIVEREF(__pyx_tuple__3);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":306
+ *                 if ((descr.byteorder == c'>' and little_endian) or
+ *                     (descr.byteorder == c'<' and not little_endian)):
+ *                     raise ValueError(u"Non-native byte order not supported")             # <<<<<<<<<<<<<<
+ *                 if   t == NPY_BYTE:        f = "b"
+ *                 elif t == NPY_UBYTE:       f = "B"
+ */
+  __pyx_tuple__4 = PyTuple_Pack(1, __pyx_kp_u_Non_native_byte_order_not_suppor); if (unlikely(!__pyx_tuple__4)) __PYX_ERR(1, 306, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__4);
+  __Pyx_GIVEREF(__pyx_tuple__4);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":855
+ * 
+ *         if (end - f) - <int>(new_offset - offset[0]) < 15:
+ *             raise RuntimeError(u"Format string allocated too short, see comment in numpy.pxd")             # <<<<<<<<<<<<<<
+ * 
+ *         if ((child.byteorder == c'>' and little_endian) or
+ */
+  __pyx_tuple__5 = PyTuple_Pack(1, __pyx_kp_u_Format_string_allocated_too_shor); if (unlikely(!__pyx_tuple__5)) __PYX_ERR(1, 855, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__5);
+  __Pyx_GIVEREF(__pyx_tuple__5);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":879
+ *             t = child.type_num
+ *             if end - f < 5:
+ *                 raise RuntimeError(u"Format string allocated too short.")             # <<<<<<<<<<<<<<
+ * 
+ *             # Until ticket #99 is fixed, use integers to avoid warnings
+ */
+  __pyx_tuple__6 = PyTuple_Pack(1, __pyx_kp_u_Format_string_allocated_too_shor_2); if (unlikely(!__pyx_tuple__6)) __PYX_ERR(1, 879, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__6);
+  __Pyx_GIVEREF(__pyx_tuple__6);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1037
+ *         _import_array()
+ *     except Exception:
+ *         raise ImportError("numpy.core.multiarray failed to import")             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline int import_umath() except -1:
+ */
+  __pyx_tuple__7 = PyTuple_Pack(1, __pyx_kp_s_numpy_core_multiarray_failed_to); if (unlikely(!__pyx_tuple__7)) __PYX_ERR(1, 1037, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__7);
+  __Pyx_GIVEREF(__pyx_tuple__7);
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1043
+ *         _import_umath()
+ *     except Exception:
+ *         raise ImportError("numpy.core.umath failed to import")             # <<<<<<<<<<<<<<
+ * 
+ * cdef inline int import_ufunc() except -1:
+ */
+  __pyx_tuple__8 = PyTuple_Pack(1, __pyx_kp_s_numpy_core_umath_failed_to_impor); if (unlikely(!__pyx_tuple__8)) __PYX_ERR(1, 1043, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__8);
+  __Pyx_GIVEREF(__pyx_tuple__8);
+
+  /* "hifive/libraries/_hic_interactions.pyx":34
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_bin(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] binbounds not None,
+ *         int maxdistance):
+ */
+  __pyx_tuple__9 = PyTuple_Pack(7, __pyx_n_s_binbounds, __pyx_n_s_maxdistance, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_maxbin, __pyx_n_s_start, __pyx_n_s_num_bins); if (unlikely(!__pyx_tuple__9)) __PYX_ERR(0, 34, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__9);
+  __Pyx_GIVEREF(__pyx_tuple__9);
+  __pyx_codeobj__10 = (PyObject*)__Pyx_PyCode_New(2, 0, 7, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__9, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_max_bin, 34, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__10)) __PYX_ERR(0, 34, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":52
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] max_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_tuple__11 = PyTuple_Pack(12, __pyx_n_s_max_fend, __pyx_n_s_mids, __pyx_n_s_chromosomes, __pyx_n_s_chr_indices, __pyx_n_s_start, __pyx_n_s_maxdistance, __pyx_n_s_h, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_chr_max, __pyx_n_s_num_fends, __pyx_n_s_max_num_fends); if (unlikely(!__pyx_tuple__11)) __PYX_ERR(0, 52, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__11);
+  __Pyx_GIVEREF(__pyx_tuple__11);
+  __pyx_codeobj__12 = (PyObject*)__Pyx_PyCode_New(6, 0, 12, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__11, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_max_fend, 52, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__12)) __PYX_ERR(0, 52, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":77
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_min_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] min_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_tuple__13 = PyTuple_Pack(12, __pyx_n_s_min_fend, __pyx_n_s_mids, __pyx_n_s_chromosomes, __pyx_n_s_chr_indices, __pyx_n_s_mindistance, __pyx_n_s_binned, __pyx_n_s_h, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_chr_max, __pyx_n_s_num_fends, __pyx_n_s_max_num_fends); if (unlikely(!__pyx_tuple__13)) __PYX_ERR(0, 77, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__13);
+  __Pyx_GIVEREF(__pyx_tuple__13);
+  __pyx_codeobj__14 = (PyObject*)__Pyx_PyCode_New(6, 0, 12, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__13, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_min_fend, 77, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__14)) __PYX_ERR(0, 77, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":108
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_coverage(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+  __pyx_tuple__15 = PyTuple_Pack(11, __pyx_n_s_data, __pyx_n_s_data_indices, __pyx_n_s_filter, __pyx_n_s_min_fend, __pyx_n_s_max_fend, __pyx_n_s_coverage, __pyx_n_s_mincoverage, __pyx_n_s_i, __pyx_n_s_fend1, __pyx_n_s_valid, __pyx_n_s_num_fends); if (unlikely(!__pyx_tuple__15)) __PYX_ERR(0, 108, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__15);
+  __Pyx_GIVEREF(__pyx_tuple__15);
+  __pyx_codeobj__16 = (PyObject*)__Pyx_PyCode_New(7, 0, 11, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__15, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_fend_coverage, 108, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__16)) __PYX_ERR(0, 108, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":138
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_cis_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+  __pyx_tuple__17 = PyTuple_Pack(13, __pyx_n_s_data, __pyx_n_s_data_indices, __pyx_n_s_filter, __pyx_n_s_min_fend, __pyx_n_s_max_fend, __pyx_n_s_positions, __pyx_n_s_neighbors, __pyx_n_s_coverage, __pyx_n_s_i, __pyx_n_s_fend1, __pyx_n_s_fend2, __pyx_n_s_num_fends, __pyx_n_s_fill); if (unlikely(!__pyx_tuple__17)) __PYX_ERR(0, 138, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__17);
+  __Pyx_GIVEREF(__pyx_tuple__17);
+  __pyx_codeobj__18 = (PyObject*)__Pyx_PyCode_New(8, 0, 13, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__17, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_cis_fend_neighbors, 138, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__18)) __PYX_ERR(0, 138, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":180
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_trans_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+ */
+  __pyx_tuple__19 = PyTuple_Pack(10, __pyx_n_s_data, __pyx_n_s_filter, __pyx_n_s_positions, __pyx_n_s_neighbors, __pyx_n_s_coverage, __pyx_n_s_i, __pyx_n_s_fend1, __pyx_n_s_fend2, __pyx_n_s_num_data, __pyx_n_s_fill); if (unlikely(!__pyx_tuple__19)) __PYX_ERR(0, 180, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__19);
+  __Pyx_GIVEREF(__pyx_tuple__19);
+  __pyx_codeobj__20 = (PyObject*)__Pyx_PyCode_New(5, 0, 10, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__19, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_trans_fend_neighbors, 180, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__20)) __PYX_ERR(0, 180, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":211
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def filter_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] neighbor_indices not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+ */
+  __pyx_tuple__21 = PyTuple_Pack(12, __pyx_n_s_neighbor_indices, __pyx_n_s_neighbors, __pyx_n_s_filter, __pyx_n_s_coverage, __pyx_n_s_mincoverage, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_fend1, __pyx_n_s_fend2, __pyx_n_s_num_removed, __pyx_n_s_num_fends, __pyx_n_s_removed); if (unlikely(!__pyx_tuple__21)) __PYX_ERR(0, 211, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__21);
+  __Pyx_GIVEREF(__pyx_tuple__21);
+  __pyx_codeobj__22 = (PyObject*)__Pyx_PyCode_New(5, 0, 12, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__21, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_filter_fend_neighbors, 211, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__22)) __PYX_ERR(0, 211, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":246
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_ranges(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_tuple__23 = PyTuple_Pack(14, __pyx_n_s_mapping, __pyx_n_s_mids, __pyx_n_s_ranges, __pyx_n_s_mindistance, __pyx_n_s_maxdistance, __pyx_n_s_start, __pyx_n_s_stop, __pyx_n_s_startfend, __pyx_n_s_binned, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_pos, __pyx_n_s_total, __pyx_n_s_total_fends); if (unlikely(!__pyx_tuple__23)) __PYX_ERR(0, 246, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__23);
+  __Pyx_GIVEREF(__pyx_tuple__23);
+  __pyx_codeobj__24 = (PyObject*)__Pyx_PyCode_New(9, 0, 14, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__23, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_fend_ranges, 246, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__24)) __PYX_ERR(0, 246, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":287
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzeros_in_range(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None):
+ */
+  __pyx_tuple__25 = PyTuple_Pack(5, __pyx_n_s_ranges, __pyx_n_s_data, __pyx_n_s_i, __pyx_n_s_count, __pyx_n_s_num_data); if (unlikely(!__pyx_tuple__25)) __PYX_ERR(0, 287, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__25);
+  __Pyx_GIVEREF(__pyx_tuple__25);
+  __pyx_codeobj__26 = (PyObject*)__Pyx_PyCode_New(2, 0, 5, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__25, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_nonzeros_in_range, 287, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__26)) __PYX_ERR(0, 287, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":305
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ */
+  __pyx_tuple__27 = PyTuple_Pack(9, __pyx_n_s_ranges, __pyx_n_s_indices0, __pyx_n_s_indices1, __pyx_n_s_counts, __pyx_n_s_data, __pyx_n_s_interactions, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_num_data); if (unlikely(!__pyx_tuple__27)) __PYX_ERR(0, 305, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__27);
+  __Pyx_GIVEREF(__pyx_tuple__27);
+  __pyx_codeobj__28 = (PyObject*)__Pyx_PyCode_New(6, 0, 9, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__27, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_nonzero_node_indices, 305, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__28)) __PYX_ERR(0, 305, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":334
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_zero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping,
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ */
+  __pyx_tuple__29 = PyTuple_Pack(18, __pyx_n_s_mapping, __pyx_n_s_ranges, __pyx_n_s_nzindices0, __pyx_n_s_nzindices1, __pyx_n_s_zindices0, __pyx_n_s_zindices1, __pyx_n_s_interactions, __pyx_n_s_start, __pyx_n_s_stop, __pyx_n_s_startfend, __pyx_n_s_binned, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_m1, __pyx_n_s_m2, __pyx_n_s_nzpos, __pyx_n_s_zpos, __pyx_n_s_num_nz); if (unlikely(!__pyx_tuple__29)) __PYX_ERR(0, 334, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__29);
+  __Pyx_GIVEREF(__pyx_tuple__29);
+  __pyx_codeobj__30 = (PyObject*)__Pyx_PyCode_New(11, 0, 18, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__29, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_zero_node_indices, 334, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__30)) __PYX_ERR(0, 334, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":389
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_distancebound_possible_interactions(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] interactions not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] chr_indices not None,
+ */
+  __pyx_tuple__31 = PyTuple_Pack(23, __pyx_n_s_interactions, __pyx_n_s_chr_indices, __pyx_n_s_mids, __pyx_n_s_filter, __pyx_n_s_chrints, __pyx_n_s_useread_int, __pyx_n_s_mindistance, __pyx_n_s_maxdistance, __pyx_n_s_binned, __pyx_n_s_h, __pyx_n_s_i, __pyx_n_s_j, __pyx_n_s_k, __pyx_n_s_chr_total, __pyx_n_s_all_total, __pyx_n_s_total, __pyx_n_s_stop, __pyx_n_s_start_fend, __pyx_n_s_stop_fend, __pyx_n_s_num_chroms, __pyx_n_s_num_fends, __pyx_n_s_valid_sums, __pyx_n_s_mids_ptr); if (unlikely(!__pyx_tuple__31)) __PYX_ERR(0, 389, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__31);
+  __Pyx_GIVEREF(__pyx_tuple__31);
+  __pyx_codeobj__32 = (PyObject*)__Pyx_PyCode_New(9, 0, 23, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__31, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_find_distancebound_possible_inte, 389, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__32)) __PYX_ERR(0, 389, __pyx_L1_error)
+
+  /* "hifive/libraries/_hic_interactions.pyx":494
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def sum_weighted_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices1,
+ */
+  __pyx_tuple__33 = PyTuple_Pack(7, __pyx_n_s_indices0, __pyx_n_s_indices1, __pyx_n_s_weights, __pyx_n_s_int_weights, __pyx_n_s_sums, __pyx_n_s_i, __pyx_n_s_num_indices); if (unlikely(!__pyx_tuple__33)) __PYX_ERR(0, 494, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_tuple__33);
+  __Pyx_GIVEREF(__pyx_tuple__33);
+  __pyx_codeobj__34 = (PyObject*)__Pyx_PyCode_New(5, 0, 7, 0, CO_OPTIMIZED|CO_NEWLOCALS, __pyx_empty_bytes, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_tuple__33, __pyx_empty_tuple, __pyx_empty_tuple, __pyx_kp_s_hifive_libraries__hic_interactio, __pyx_n_s_sum_weighted_indices, 494, __pyx_empty_bytes); if (unlikely(!__pyx_codeobj__34)) __PYX_ERR(0, 494, __pyx_L1_error)
+  __Pyx_RefNannyFinishContext();
+  return 0;
+  __pyx_L1_error:;
+  __Pyx_RefNannyFinishContext();
+  return -1;
+}
+
+static CYTHON_SMALL_CODE int __Pyx_InitGlobals(void) {
+  if (__Pyx_InitStrings(__pyx_string_tab) < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  __pyx_int_1 = PyInt_FromLong(1); if (unlikely(!__pyx_int_1)) __PYX_ERR(0, 1, __pyx_L1_error)
+  return 0;
+  __pyx_L1_error:;
+  return -1;
+}
+
+static CYTHON_SMALL_CODE int __Pyx_modinit_global_init_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_variable_export_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_function_export_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_type_init_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_type_import_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_variable_import_code(void); /*proto*/
+static CYTHON_SMALL_CODE int __Pyx_modinit_function_import_code(void); /*proto*/
+
+static int __Pyx_modinit_global_init_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_global_init_code", 0);
+  /*--- Global init code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+static int __Pyx_modinit_variable_export_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_variable_export_code", 0);
+  /*--- Variable export code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+static int __Pyx_modinit_function_export_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_function_export_code", 0);
+  /*--- Function export code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+static int __Pyx_modinit_type_init_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_type_init_code", 0);
+  /*--- Type init code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+static int __Pyx_modinit_type_import_code(void) {
+  __Pyx_RefNannyDeclarations
+  PyObject *__pyx_t_1 = NULL;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannySetupContext("__Pyx_modinit_type_import_code", 0);
+  /*--- Type import code ---*/
+  __pyx_t_1 = PyImport_ImportModule(__Pyx_BUILTIN_MODULE_NAME); if (unlikely(!__pyx_t_1)) __PYX_ERR(2, 9, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_ptype_7cpython_4type_type = __Pyx_ImportType_0_29_37(__pyx_t_1, __Pyx_BUILTIN_MODULE_NAME, "type", 
+  #if defined(PYPY_VERSION_NUM) && PYPY_VERSION_NUM < 0x050B0000
+  sizeof(PyTypeObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyTypeObject),
+  #else
+  sizeof(PyHeapTypeObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyHeapTypeObject),
+  #endif
+  __Pyx_ImportType_CheckSize_Warn_0_29_37); if (!__pyx_ptype_7cpython_4type_type) __PYX_ERR(2, 9, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __pyx_t_1 = PyImport_ImportModule("numpy"); if (unlikely(!__pyx_t_1)) __PYX_ERR(1, 206, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_ptype_5numpy_dtype = __Pyx_ImportType_0_29_37(__pyx_t_1, "numpy", "dtype", sizeof(PyArray_Descr), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyArray_Descr),__Pyx_ImportType_CheckSize_Ignore_0_29_37); if (!__pyx_ptype_5numpy_dtype) __PYX_ERR(1, 206, __pyx_L1_error)
+  __pyx_ptype_5numpy_flatiter = __Pyx_ImportType_0_29_37(__pyx_t_1, "numpy", "flatiter", sizeof(PyArrayIterObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyArrayIterObject),__Pyx_ImportType_CheckSize_Ignore_0_29_37); if (!__pyx_ptype_5numpy_flatiter) __PYX_ERR(1, 229, __pyx_L1_error)
+  __pyx_ptype_5numpy_broadcast = __Pyx_ImportType_0_29_37(__pyx_t_1, "numpy", "broadcast", sizeof(PyArrayMultiIterObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyArrayMultiIterObject),__Pyx_ImportType_CheckSize_Ignore_0_29_37); if (!__pyx_ptype_5numpy_broadcast) __PYX_ERR(1, 233, __pyx_L1_error)
+  __pyx_ptype_5numpy_ndarray = __Pyx_ImportType_0_29_37(__pyx_t_1, "numpy", "ndarray", sizeof(PyArrayObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyArrayObject),__Pyx_ImportType_CheckSize_Ignore_0_29_37); if (!__pyx_ptype_5numpy_ndarray) __PYX_ERR(1, 242, __pyx_L1_error)
+  __pyx_ptype_5numpy_ufunc = __Pyx_ImportType_0_29_37(__pyx_t_1, "numpy", "ufunc", sizeof(PyUFuncObject), __PYX_GET_STRUCT_ALIGNMENT_0_29_37(PyUFuncObject),__Pyx_ImportType_CheckSize_Ignore_0_29_37); if (!__pyx_ptype_5numpy_ufunc) __PYX_ERR(1, 917, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __Pyx_RefNannyFinishContext();
+  return 0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_RefNannyFinishContext();
+  return -1;
+}
+
+static int __Pyx_modinit_variable_import_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_variable_import_code", 0);
+  /*--- Variable import code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+static int __Pyx_modinit_function_import_code(void) {
+  __Pyx_RefNannyDeclarations
+  __Pyx_RefNannySetupContext("__Pyx_modinit_function_import_code", 0);
+  /*--- Function import code ---*/
+  __Pyx_RefNannyFinishContext();
+  return 0;
+}
+
+
+#ifndef CYTHON_NO_PYINIT_EXPORT
+#define __Pyx_PyMODINIT_FUNC PyMODINIT_FUNC
+#elif PY_MAJOR_VERSION < 3
+#ifdef __cplusplus
+#define __Pyx_PyMODINIT_FUNC extern "C" void
+#else
+#define __Pyx_PyMODINIT_FUNC void
+#endif
+#else
+#ifdef __cplusplus
+#define __Pyx_PyMODINIT_FUNC extern "C" PyObject *
+#else
+#define __Pyx_PyMODINIT_FUNC PyObject *
+#endif
+#endif
+
+
+#if PY_MAJOR_VERSION < 3
+__Pyx_PyMODINIT_FUNC init_hic_interactions(void) CYTHON_SMALL_CODE; /*proto*/
+__Pyx_PyMODINIT_FUNC init_hic_interactions(void)
+#else
+__Pyx_PyMODINIT_FUNC PyInit__hic_interactions(void) CYTHON_SMALL_CODE; /*proto*/
+__Pyx_PyMODINIT_FUNC PyInit__hic_interactions(void)
+#if CYTHON_PEP489_MULTI_PHASE_INIT
+{
+  return PyModuleDef_Init(&__pyx_moduledef);
+}
+static CYTHON_SMALL_CODE int __Pyx_check_single_interpreter(void) {
+    #if PY_VERSION_HEX >= 0x030700A1
+    static PY_INT64_T main_interpreter_id = -1;
+    PY_INT64_T current_id = PyInterpreterState_GetID(PyThreadState_Get()->interp);
+    if (main_interpreter_id == -1) {
+        main_interpreter_id = current_id;
+        return (unlikely(current_id == -1)) ? -1 : 0;
+    } else if (unlikely(main_interpreter_id != current_id))
+    #else
+    static PyInterpreterState *main_interpreter = NULL;
+    PyInterpreterState *current_interpreter = PyThreadState_Get()->interp;
+    if (!main_interpreter) {
+        main_interpreter = current_interpreter;
+    } else if (unlikely(main_interpreter != current_interpreter))
+    #endif
+    {
+        PyErr_SetString(
+            PyExc_ImportError,
+            "Interpreter change detected - this module can only be loaded into one interpreter per process.");
+        return -1;
+    }
+    return 0;
+}
+static CYTHON_SMALL_CODE int __Pyx_copy_spec_to_module(PyObject *spec, PyObject *moddict, const char* from_name, const char* to_name, int allow_none) {
+    PyObject *value = PyObject_GetAttrString(spec, from_name);
+    int result = 0;
+    if (likely(value)) {
+        if (allow_none || value != Py_None) {
+            result = PyDict_SetItemString(moddict, to_name, value);
+        }
+        Py_DECREF(value);
+    } else if (PyErr_ExceptionMatches(PyExc_AttributeError)) {
+        PyErr_Clear();
+    } else {
+        result = -1;
+    }
+    return result;
+}
+static CYTHON_SMALL_CODE PyObject* __pyx_pymod_create(PyObject *spec, CYTHON_UNUSED PyModuleDef *def) {
+    PyObject *module = NULL, *moddict, *modname;
+    if (__Pyx_check_single_interpreter())
+        return NULL;
+    if (__pyx_m)
+        return __Pyx_NewRef(__pyx_m);
+    modname = PyObject_GetAttrString(spec, "name");
+    if (unlikely(!modname)) goto bad;
+    module = PyModule_NewObject(modname);
+    Py_DECREF(modname);
+    if (unlikely(!module)) goto bad;
+    moddict = PyModule_GetDict(module);
+    if (unlikely(!moddict)) goto bad;
+    if (unlikely(__Pyx_copy_spec_to_module(spec, moddict, "loader", "__loader__", 1) < 0)) goto bad;
+    if (unlikely(__Pyx_copy_spec_to_module(spec, moddict, "origin", "__file__", 1) < 0)) goto bad;
+    if (unlikely(__Pyx_copy_spec_to_module(spec, moddict, "parent", "__package__", 1) < 0)) goto bad;
+    if (unlikely(__Pyx_copy_spec_to_module(spec, moddict, "submodule_search_locations", "__path__", 0) < 0)) goto bad;
+    return module;
+bad:
+    Py_XDECREF(module);
+    return NULL;
+}
+
+
+static CYTHON_SMALL_CODE int __pyx_pymod_exec__hic_interactions(PyObject *__pyx_pyinit_module)
+#endif
+#endif
+{
+  PyObject *__pyx_t_1 = NULL;
+  PyObject *__pyx_t_2 = NULL;
+  double __pyx_t_3;
+  int __pyx_lineno = 0;
+  const char *__pyx_filename = NULL;
+  int __pyx_clineno = 0;
+  __Pyx_RefNannyDeclarations
+  #if CYTHON_PEP489_MULTI_PHASE_INIT
+  if (__pyx_m) {
+    if (__pyx_m == __pyx_pyinit_module) return 0;
+    PyErr_SetString(PyExc_RuntimeError, "Module '_hic_interactions' has already been imported. Re-initialisation is not supported.");
+    return -1;
+  }
+  #elif PY_MAJOR_VERSION >= 3
+  if (__pyx_m) return __Pyx_NewRef(__pyx_m);
+  #endif
+  #if CYTHON_REFNANNY
+__Pyx_RefNanny = __Pyx_RefNannyImportAPI("refnanny");
+if (!__Pyx_RefNanny) {
+  PyErr_Clear();
+  __Pyx_RefNanny = __Pyx_RefNannyImportAPI("Cython.Runtime.refnanny");
+  if (!__Pyx_RefNanny)
+      Py_FatalError("failed to import 'refnanny' module");
+}
+#endif
+  __Pyx_RefNannySetupContext("__Pyx_PyMODINIT_FUNC PyInit__hic_interactions(void)", 0);
+  if (__Pyx_check_binary_version() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #ifdef __Pxy_PyFrame_Initialize_Offsets
+  __Pxy_PyFrame_Initialize_Offsets();
+  #endif
+  __pyx_empty_tuple = PyTuple_New(0); if (unlikely(!__pyx_empty_tuple)) __PYX_ERR(0, 1, __pyx_L1_error)
+  __pyx_empty_bytes = PyBytes_FromStringAndSize("", 0); if (unlikely(!__pyx_empty_bytes)) __PYX_ERR(0, 1, __pyx_L1_error)
+  __pyx_empty_unicode = PyUnicode_FromStringAndSize("", 0); if (unlikely(!__pyx_empty_unicode)) __PYX_ERR(0, 1, __pyx_L1_error)
+  #ifdef __Pyx_CyFunction_USED
+  if (__pyx_CyFunction_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  #ifdef __Pyx_FusedFunction_USED
+  if (__pyx_FusedFunction_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  #ifdef __Pyx_Coroutine_USED
+  if (__pyx_Coroutine_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  #ifdef __Pyx_Generator_USED
+  if (__pyx_Generator_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  #ifdef __Pyx_AsyncGen_USED
+  if (__pyx_AsyncGen_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  #ifdef __Pyx_StopAsyncIteration_USED
+  if (__pyx_StopAsyncIteration_init() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  /*--- Library function declarations ---*/
+  /*--- Threads initialization code ---*/
+  #if defined(WITH_THREAD) && PY_VERSION_HEX < 0x030700F0 && defined(__PYX_FORCE_INIT_THREADS) && __PYX_FORCE_INIT_THREADS
+  PyEval_InitThreads();
+  #endif
+  /*--- Module creation code ---*/
+  #if CYTHON_PEP489_MULTI_PHASE_INIT
+  __pyx_m = __pyx_pyinit_module;
+  Py_INCREF(__pyx_m);
+  #else
+  #if PY_MAJOR_VERSION < 3
+  __pyx_m = Py_InitModule4("_hic_interactions", __pyx_methods, __pyx_k_These_functions_provide_increase, 0, PYTHON_API_VERSION); Py_XINCREF(__pyx_m);
+  #else
+  __pyx_m = PyModule_Create(&__pyx_moduledef);
+  #endif
+  if (unlikely(!__pyx_m)) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  __pyx_d = PyModule_GetDict(__pyx_m); if (unlikely(!__pyx_d)) __PYX_ERR(0, 1, __pyx_L1_error)
+  Py_INCREF(__pyx_d);
+  __pyx_b = PyImport_AddModule(__Pyx_BUILTIN_MODULE_NAME); if (unlikely(!__pyx_b)) __PYX_ERR(0, 1, __pyx_L1_error)
+  Py_INCREF(__pyx_b);
+  __pyx_cython_runtime = PyImport_AddModule((char *) "cython_runtime"); if (unlikely(!__pyx_cython_runtime)) __PYX_ERR(0, 1, __pyx_L1_error)
+  Py_INCREF(__pyx_cython_runtime);
+  if (PyObject_SetAttrString(__pyx_m, "__builtins__", __pyx_b) < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  /*--- Initialize various global constants etc. ---*/
+  if (__Pyx_InitGlobals() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #if PY_MAJOR_VERSION < 3 && (__PYX_DEFAULT_STRING_ENCODING_IS_ASCII || __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT)
+  if (__Pyx_init_sys_getdefaultencoding_params() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+  if (__pyx_module_is_main_hifive__libraries___hic_interactions) {
+    if (PyObject_SetAttr(__pyx_m, __pyx_n_s_name, __pyx_n_s_main) < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  }
+  #if PY_MAJOR_VERSION >= 3
+  {
+    PyObject *modules = PyImport_GetModuleDict(); if (unlikely(!modules)) __PYX_ERR(0, 1, __pyx_L1_error)
+    if (!PyDict_GetItemString(modules, "hifive.libraries._hic_interactions")) {
+      if (unlikely(PyDict_SetItemString(modules, "hifive.libraries._hic_interactions", __pyx_m) < 0)) __PYX_ERR(0, 1, __pyx_L1_error)
+    }
+  }
+  #endif
+  /*--- Builtin init code ---*/
+  if (__Pyx_InitCachedBuiltins() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  /*--- Constants init code ---*/
+  if (__Pyx_InitCachedConstants() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  /*--- Global type/function init code ---*/
+  (void)__Pyx_modinit_global_init_code();
+  (void)__Pyx_modinit_variable_export_code();
+  (void)__Pyx_modinit_function_export_code();
+  (void)__Pyx_modinit_type_init_code();
+  if (unlikely(__Pyx_modinit_type_import_code() < 0)) __PYX_ERR(0, 1, __pyx_L1_error)
+  (void)__Pyx_modinit_variable_import_code();
+  (void)__Pyx_modinit_function_import_code();
+  /*--- Execution code ---*/
+  #if defined(__Pyx_Generator_USED) || defined(__Pyx_Coroutine_USED)
+  if (__Pyx_patch_abc() < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  #endif
+
+  /* "hifive/libraries/_hic_interactions.pyx":9
+ * import cython
+ * cimport numpy as np
+ * import numpy             # <<<<<<<<<<<<<<
+ * 
+ * ctypedef np.float32_t DTYPE_t
+ */
+  __pyx_t_1 = __Pyx_Import(__pyx_n_s_numpy, 0, -1); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 9, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_numpy, __pyx_t_1) < 0) __PYX_ERR(0, 9, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":17
+ * ctypedef np.uint32_t DTYPE_uint_t
+ * ctypedef np.int8_t DTYPE_int8_t
+ * cdef double Inf = numpy.inf             # <<<<<<<<<<<<<<
+ * 
+ * cdef extern from "math.h":
+ */
+  __Pyx_GetModuleGlobalName(__pyx_t_1, __pyx_n_s_numpy); if (unlikely(!__pyx_t_1)) __PYX_ERR(0, 17, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_1);
+  __pyx_t_2 = __Pyx_PyObject_GetAttrStr(__pyx_t_1, __pyx_n_s_inf); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 17, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  __Pyx_DECREF(__pyx_t_1); __pyx_t_1 = 0;
+  __pyx_t_3 = __pyx_PyFloat_AsDouble(__pyx_t_2); if (unlikely((__pyx_t_3 == (double)-1) && PyErr_Occurred())) __PYX_ERR(0, 17, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+  __pyx_v_6hifive_9libraries_17_hic_interactions_Inf = __pyx_t_3;
+
+  /* "hifive/libraries/_hic_interactions.pyx":34
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_bin(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] binbounds not None,
+ *         int maxdistance):
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_1find_max_bin, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 34, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_max_bin, __pyx_t_2) < 0) __PYX_ERR(0, 34, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":52
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_max_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] max_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_3find_max_fend, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 52, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_max_fend, __pyx_t_2) < 0) __PYX_ERR(0, 52, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":77
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_min_fend(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] min_fend not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_5find_min_fend, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 77, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_min_fend, __pyx_t_2) < 0) __PYX_ERR(0, 77, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":108
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_coverage(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_7find_fend_coverage, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 108, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_fend_coverage, __pyx_t_2) < 0) __PYX_ERR(0, 108, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":138
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_cis_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_9find_cis_fend_neighbors, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 138, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_cis_fend_neighbors, __pyx_t_2) < 0) __PYX_ERR(0, 138, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":180
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_trans_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_11find_trans_fend_neighbors, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 180, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_trans_fend_neighbors, __pyx_t_2) < 0) __PYX_ERR(0, 180, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":211
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def filter_fend_neighbors(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] neighbor_indices not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_13filter_fend_neighbors, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 211, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_filter_fend_neighbors, __pyx_t_2) < 0) __PYX_ERR(0, 211, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":246
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_fend_ranges(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_15find_fend_ranges, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 246, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_fend_ranges, __pyx_t_2) < 0) __PYX_ERR(0, 246, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":287
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzeros_in_range(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+ *         np.ndarray[DTYPE_int_t, ndim=2] data not None):
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_17find_nonzeros_in_range, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 287, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_nonzeros_in_range, __pyx_t_2) < 0) __PYX_ERR(0, 287, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":305
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_nonzero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_19find_nonzero_node_indices, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 305, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_nonzero_node_indices, __pyx_t_2) < 0) __PYX_ERR(0, 305, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":334
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_zero_node_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] mapping,
+ *         np.ndarray[DTYPE_int64_t, ndim=2] ranges,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_21find_zero_node_indices, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 334, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_zero_node_indices, __pyx_t_2) < 0) __PYX_ERR(0, 334, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":389
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def find_distancebound_possible_interactions(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int64_t, ndim=1] interactions not None,
+ *         np.ndarray[DTYPE_int_t, ndim=1] chr_indices not None,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_23find_distancebound_possible_interactions, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 389, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_find_distancebound_possible_inte, __pyx_t_2) < 0) __PYX_ERR(0, 389, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":494
+ * @cython.wraparound(False)
+ * @cython.cdivision(True)
+ * def sum_weighted_indices(             # <<<<<<<<<<<<<<
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices0,
+ *         np.ndarray[DTYPE_int_t, ndim=1] indices1,
+ */
+  __pyx_t_2 = PyCFunction_NewEx(&__pyx_mdef_6hifive_9libraries_17_hic_interactions_25sum_weighted_indices, NULL, __pyx_n_s_hifive_libraries__hic_interactio_2); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 494, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_sum_weighted_indices, __pyx_t_2) < 0) __PYX_ERR(0, 494, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "hifive/libraries/_hic_interactions.pyx":1
+ * # distutils: language = c++             # <<<<<<<<<<<<<<
+ * 
+ * """These functions provide increased speed in handling functions dealing with finding valid
+ */
+  __pyx_t_2 = __Pyx_PyDict_NewPresized(0); if (unlikely(!__pyx_t_2)) __PYX_ERR(0, 1, __pyx_L1_error)
+  __Pyx_GOTREF(__pyx_t_2);
+  if (PyDict_SetItem(__pyx_d, __pyx_n_s_test, __pyx_t_2) < 0) __PYX_ERR(0, 1, __pyx_L1_error)
+  __Pyx_DECREF(__pyx_t_2); __pyx_t_2 = 0;
+
+  /* "../.pyenv/versions/2.7.18/lib/python2.7/site-packages/Cython/Includes/numpy/__init__.pxd":1045
+ *         raise ImportError("numpy.core.umath failed to import")
+ * 
+ * cdef inline int import_ufunc() except -1:             # <<<<<<<<<<<<<<
+ *     try:
+ *         _import_umath()
+ */
+
+  /*--- Wrapped vars code ---*/
+
+  goto __pyx_L0;
+  __pyx_L1_error:;
+  __Pyx_XDECREF(__pyx_t_1);
+  __Pyx_XDECREF(__pyx_t_2);
+  if (__pyx_m) {
+    if (__pyx_d) {
+      __Pyx_AddTraceback("init hifive.libraries._hic_interactions", __pyx_clineno, __pyx_lineno, __pyx_filename);
+    }
+    Py_CLEAR(__pyx_m);
+  } else if (!PyErr_Occurred()) {
+    PyErr_SetString(PyExc_ImportError, "init hifive.libraries._hic_interactions");
+  }
+  __pyx_L0:;
+  __Pyx_RefNannyFinishContext();
+  #if CYTHON_PEP489_MULTI_PHASE_INIT
+  return (__pyx_m != NULL) ? 0 : -1;
+  #elif PY_MAJOR_VERSION >= 3
+  return __pyx_m;
+  #else
+  return;
+  #endif
+}
+
+/* --- Runtime support code --- */
+/* Refnanny */
+#if CYTHON_REFNANNY
+static __Pyx_RefNannyAPIStruct *__Pyx_RefNannyImportAPI(const char *modname) {
+    PyObject *m = NULL, *p = NULL;
+    void *r = NULL;
+    m = PyImport_ImportModule(modname);
+    if (!m) goto end;
+    p = PyObject_GetAttrString(m, "RefNannyAPI");
+    if (!p) goto end;
+    r = PyLong_AsVoidPtr(p);
+end:
+    Py_XDECREF(p);
+    Py_XDECREF(m);
+    return (__Pyx_RefNannyAPIStruct *)r;
+}
+#endif
+
+/* PyObjectGetAttrStr */
+#if CYTHON_USE_TYPE_SLOTS
+static CYTHON_INLINE PyObject* __Pyx_PyObject_GetAttrStr(PyObject* obj, PyObject* attr_name) {
+    PyTypeObject* tp = Py_TYPE(obj);
+    if (likely(tp->tp_getattro))
+        return tp->tp_getattro(obj, attr_name);
+#if PY_MAJOR_VERSION < 3
+    if (likely(tp->tp_getattr))
+        return tp->tp_getattr(obj, PyString_AS_STRING(attr_name));
+#endif
+    return PyObject_GetAttr(obj, attr_name);
+}
+#endif
+
+/* GetBuiltinName */
+static PyObject *__Pyx_GetBuiltinName(PyObject *name) {
+    PyObject* result = __Pyx_PyObject_GetAttrStr(__pyx_b, name);
+    if (unlikely(!result)) {
+        PyErr_Format(PyExc_NameError,
+#if PY_MAJOR_VERSION >= 3
+            "name '%U' is not defined", name);
+#else
+            "name '%.200s' is not defined", PyString_AS_STRING(name));
+#endif
+    }
+    return result;
+}
+
+/* RaiseArgTupleInvalid */
+static void __Pyx_RaiseArgtupleInvalid(
+    const char* func_name,
+    int exact,
+    Py_ssize_t num_min,
+    Py_ssize_t num_max,
+    Py_ssize_t num_found)
+{
+    Py_ssize_t num_expected;
+    const char *more_or_less;
+    if (num_found < num_min) {
+        num_expected = num_min;
+        more_or_less = "at least";
+    } else {
+        num_expected = num_max;
+        more_or_less = "at most";
+    }
+    if (exact) {
+        more_or_less = "exactly";
+    }
+    PyErr_Format(PyExc_TypeError,
+                 "%.200s() takes %.8s %" CYTHON_FORMAT_SSIZE_T "d positional argument%.1s (%" CYTHON_FORMAT_SSIZE_T "d given)",
+                 func_name, more_or_less, num_expected,
+                 (num_expected == 1) ? "" : "s", num_found);
+}
+
+/* RaiseDoubleKeywords */
+static void __Pyx_RaiseDoubleKeywordsError(
+    const char* func_name,
+    PyObject* kw_name)
+{
+    PyErr_Format(PyExc_TypeError,
+        #if PY_MAJOR_VERSION >= 3
+        "%s() got multiple values for keyword argument '%U'", func_name, kw_name);
+        #else
+        "%s() got multiple values for keyword argument '%s'", func_name,
+        PyString_AsString(kw_name));
+        #endif
+}
+
+/* ParseKeywords */
+static int __Pyx_ParseOptionalKeywords(
+    PyObject *kwds,
+    PyObject **argnames[],
+    PyObject *kwds2,
+    PyObject *values[],
+    Py_ssize_t num_pos_args,
+    const char* function_name)
+{
+    PyObject *key = 0, *value = 0;
+    Py_ssize_t pos = 0;
+    PyObject*** name;
+    PyObject*** first_kw_arg = argnames + num_pos_args;
+    while (PyDict_Next(kwds, &pos, &key, &value)) {
+        name = first_kw_arg;
+        while (*name && (**name != key)) name++;
+        if (*name) {
+            values[name-argnames] = value;
+            continue;
+        }
+        name = first_kw_arg;
+        #if PY_MAJOR_VERSION < 3
+        if (likely(PyString_Check(key))) {
+            while (*name) {
+                if ((CYTHON_COMPILING_IN_PYPY || PyString_GET_SIZE(**name) == PyString_GET_SIZE(key))
+                        && _PyString_Eq(**name, key)) {
+                    values[name-argnames] = value;
+                    break;
+                }
+                name++;
+            }
+            if (*name) continue;
+            else {
+                PyObject*** argname = argnames;
+                while (argname != first_kw_arg) {
+                    if ((**argname == key) || (
+                            (CYTHON_COMPILING_IN_PYPY || PyString_GET_SIZE(**argname) == PyString_GET_SIZE(key))
+                             && _PyString_Eq(**argname, key))) {
+                        goto arg_passed_twice;
+                    }
+                    argname++;
+                }
+            }
+        } else
+        #endif
+        if (likely(PyUnicode_Check(key))) {
+            while (*name) {
+                int cmp = (**name == key) ? 0 :
+                #if !CYTHON_COMPILING_IN_PYPY && PY_MAJOR_VERSION >= 3
+                    (__Pyx_PyUnicode_GET_LENGTH(**name) != __Pyx_PyUnicode_GET_LENGTH(key)) ? 1 :
+                #endif
+                    PyUnicode_Compare(**name, key);
+                if (cmp < 0 && unlikely(PyErr_Occurred())) goto bad;
+                if (cmp == 0) {
+                    values[name-argnames] = value;
+                    break;
+                }
+                name++;
+            }
+            if (*name) continue;
+            else {
+                PyObject*** argname = argnames;
+                while (argname != first_kw_arg) {
+                    int cmp = (**argname == key) ? 0 :
+                    #if !CYTHON_COMPILING_IN_PYPY && PY_MAJOR_VERSION >= 3
+                        (__Pyx_PyUnicode_GET_LENGTH(**argname) != __Pyx_PyUnicode_GET_LENGTH(key)) ? 1 :
+                    #endif
+                        PyUnicode_Compare(**argname, key);
+                    if (cmp < 0 && unlikely(PyErr_Occurred())) goto bad;
+                    if (cmp == 0) goto arg_passed_twice;
+                    argname++;
+                }
+            }
+        } else
+            goto invalid_keyword_type;
+        if (kwds2) {
+            if (unlikely(PyDict_SetItem(kwds2, key, value))) goto bad;
+        } else {
+            goto invalid_keyword;
+        }
+    }
+    return 0;
+arg_passed_twice:
+    __Pyx_RaiseDoubleKeywordsError(function_name, key);
+    goto bad;
+invalid_keyword_type:
+    PyErr_Format(PyExc_TypeError,
+        "%.200s() keywords must be strings", function_name);
+    goto bad;
+invalid_keyword:
+    PyErr_Format(PyExc_TypeError,
+    #if PY_MAJOR_VERSION < 3
+        "%.200s() got an unexpected keyword argument '%.200s'",
+        function_name, PyString_AsString(key));
+    #else
+        "%s() got an unexpected keyword argument '%U'",
+        function_name, key);
+    #endif
+bad:
+    return -1;
+}
+
+/* ArgTypeTest */
+static int __Pyx__ArgTypeTest(PyObject *obj, PyTypeObject *type, const char *name, int exact)
+{
+    if (unlikely(!type)) {
+        PyErr_SetString(PyExc_SystemError, "Missing type object");
+        return 0;
+    }
+    else if (exact) {
+        #if PY_MAJOR_VERSION == 2
+        if ((type == &PyBaseString_Type) && likely(__Pyx_PyBaseString_CheckExact(obj))) return 1;
+        #endif
+    }
+    else {
+        if (likely(__Pyx_TypeCheck(obj, type))) return 1;
+    }
+    PyErr_Format(PyExc_TypeError,
+        "Argument '%.200s' has incorrect type (expected %.200s, got %.200s)",
+        name, type->tp_name, Py_TYPE(obj)->tp_name);
+    return 0;
+}
+
+/* IsLittleEndian */
+static CYTHON_INLINE int __Pyx_Is_Little_Endian(void)
+{
+  union {
+    uint32_t u32;
+    uint8_t u8[4];
+  } S;
+  S.u32 = 0x01020304;
+  return S.u8[0] == 4;
+}
+
+/* BufferFormatCheck */
+static void __Pyx_BufFmt_Init(__Pyx_BufFmt_Context* ctx,
+                              __Pyx_BufFmt_StackElem* stack,
+                              __Pyx_TypeInfo* type) {
+  stack[0].field = &ctx->root;
+  stack[0].parent_offset = 0;
+  ctx->root.type = type;
+  ctx->root.name = "buffer dtype";
+  ctx->root.offset = 0;
+  ctx->head = stack;
+  ctx->head->field = &ctx->root;
+  ctx->fmt_offset = 0;
+  ctx->head->parent_offset = 0;
+  ctx->new_packmode = '@';
+  ctx->enc_packmode = '@';
+  ctx->new_count = 1;
+  ctx->enc_count = 0;
+  ctx->enc_type = 0;
+  ctx->is_complex = 0;
+  ctx->is_valid_array = 0;
+  ctx->struct_alignment = 0;
+  while (type->typegroup == 'S') {
+    ++ctx->head;
+    ctx->head->field = type->fields;
+    ctx->head->parent_offset = 0;
+    type = type->fields->type;
+  }
+}
+static int __Pyx_BufFmt_ParseNumber(const char** ts) {
+    int count;
+    const char* t = *ts;
+    if (*t < '0' || *t > '9') {
+      return -1;
+    } else {
+        count = *t++ - '0';
+        while (*t >= '0' && *t <= '9') {
+            count *= 10;
+            count += *t++ - '0';
+        }
+    }
+    *ts = t;
+    return count;
+}
+static int __Pyx_BufFmt_ExpectNumber(const char **ts) {
+    int number = __Pyx_BufFmt_ParseNumber(ts);
+    if (number == -1)
+        PyErr_Format(PyExc_ValueError,\
+                     "Does not understand character buffer dtype format string ('%c')", **ts);
+    return number;
+}
+static void __Pyx_BufFmt_RaiseUnexpectedChar(char ch) {
+  PyErr_Format(PyExc_ValueError,
+               "Unexpected format string character: '%c'", ch);
+}
+static const char* __Pyx_BufFmt_DescribeTypeChar(char ch, int is_complex) {
+  switch (ch) {
+    case '?': return "'bool'";
+    case 'c': return "'char'";
+    case 'b': return "'signed char'";
+    case 'B': return "'unsigned char'";
+    case 'h': return "'short'";
+    case 'H': return "'unsigned short'";
+    case 'i': return "'int'";
+    case 'I': return "'unsigned int'";
+    case 'l': return "'long'";
+    case 'L': return "'unsigned long'";
+    case 'q': return "'long long'";
+    case 'Q': return "'unsigned long long'";
+    case 'f': return (is_complex ? "'complex float'" : "'float'");
+    case 'd': return (is_complex ? "'complex double'" : "'double'");
+    case 'g': return (is_complex ? "'complex long double'" : "'long double'");
+    case 'T': return "a struct";
+    case 'O': return "Python object";
+    case 'P': return "a pointer";
+    case 's': case 'p': return "a string";
+    case 0: return "end";
+    default: return "unparseable format string";
+  }
+}
+static size_t __Pyx_BufFmt_TypeCharToStandardSize(char ch, int is_complex) {
+  switch (ch) {
+    case '?': case 'c': case 'b': case 'B': case 's': case 'p': return 1;
+    case 'h': case 'H': return 2;
+    case 'i': case 'I': case 'l': case 'L': return 4;
+    case 'q': case 'Q': return 8;
+    case 'f': return (is_complex ? 8 : 4);
+    case 'd': return (is_complex ? 16 : 8);
+    case 'g': {
+      PyErr_SetString(PyExc_ValueError, "Python does not define a standard format string size for long double ('g')..");
+      return 0;
+    }
+    case 'O': case 'P': return sizeof(void*);
+    default:
+      __Pyx_BufFmt_RaiseUnexpectedChar(ch);
+      return 0;
+    }
+}
+static size_t __Pyx_BufFmt_TypeCharToNativeSize(char ch, int is_complex) {
+  switch (ch) {
+    case '?': case 'c': case 'b': case 'B': case 's': case 'p': return 1;
+    case 'h': case 'H': return sizeof(short);
+    case 'i': case 'I': return sizeof(int);
+    case 'l': case 'L': return sizeof(long);
+    #ifdef HAVE_LONG_LONG
+    case 'q': case 'Q': return sizeof(PY_LONG_LONG);
+    #endif
+    case 'f': return sizeof(float) * (is_complex ? 2 : 1);
+    case 'd': return sizeof(double) * (is_complex ? 2 : 1);
+    case 'g': return sizeof(long double) * (is_complex ? 2 : 1);
+    case 'O': case 'P': return sizeof(void*);
+    default: {
+      __Pyx_BufFmt_RaiseUnexpectedChar(ch);
+      return 0;
+    }
+  }
+}
+typedef struct { char c; short x; } __Pyx_st_short;
+typedef struct { char c; int x; } __Pyx_st_int;
+typedef struct { char c; long x; } __Pyx_st_long;
+typedef struct { char c; float x; } __Pyx_st_float;
+typedef struct { char c; double x; } __Pyx_st_double;
+typedef struct { char c; long double x; } __Pyx_st_longdouble;
+typedef struct { char c; void *x; } __Pyx_st_void_p;
+#ifdef HAVE_LONG_LONG
+typedef struct { char c; PY_LONG_LONG x; } __Pyx_st_longlong;
+#endif
+static size_t __Pyx_BufFmt_TypeCharToAlignment(char ch, CYTHON_UNUSED int is_complex) {
+  switch (ch) {
+    case '?': case 'c': case 'b': case 'B': case 's': case 'p': return 1;
+    case 'h': case 'H': return sizeof(__Pyx_st_short) - sizeof(short);
+    case 'i': case 'I': return sizeof(__Pyx_st_int) - sizeof(int);
+    case 'l': case 'L': return sizeof(__Pyx_st_long) - sizeof(long);
+#ifdef HAVE_LONG_LONG
+    case 'q': case 'Q': return sizeof(__Pyx_st_longlong) - sizeof(PY_LONG_LONG);
+#endif
+    case 'f': return sizeof(__Pyx_st_float) - sizeof(float);
+    case 'd': return sizeof(__Pyx_st_double) - sizeof(double);
+    case 'g': return sizeof(__Pyx_st_longdouble) - sizeof(long double);
+    case 'P': case 'O': return sizeof(__Pyx_st_void_p) - sizeof(void*);
+    default:
+      __Pyx_BufFmt_RaiseUnexpectedChar(ch);
+      return 0;
+    }
+}
+/* These are for computing the padding at the end of the struct to align
+   on the first member of the struct. This will probably the same as above,
+   but we don't have any guarantees.
+ */
+typedef struct { short x; char c; } __Pyx_pad_short;
+typedef struct { int x; char c; } __Pyx_pad_int;
+typedef struct { long x; char c; } __Pyx_pad_long;
+typedef struct { float x; char c; } __Pyx_pad_float;
+typedef struct { double x; char c; } __Pyx_pad_double;
+typedef struct { long double x; char c; } __Pyx_pad_longdouble;
+typedef struct { void *x; char c; } __Pyx_pad_void_p;
+#ifdef HAVE_LONG_LONG
+typedef struct { PY_LONG_LONG x; char c; } __Pyx_pad_longlong;
+#endif
+static size_t __Pyx_BufFmt_TypeCharToPadding(char ch, CYTHON_UNUSED int is_complex) {
+  switch (ch) {
+    case '?': case 'c': case 'b': case 'B': case 's': case 'p': return 1;
+    case 'h': case 'H': return sizeof(__Pyx_pad_short) - sizeof(short);
+    case 'i': case 'I': return sizeof(__Pyx_pad_int) - sizeof(int);
+    case 'l': case 'L': return sizeof(__Pyx_pad_long) - sizeof(long);
+#ifdef HAVE_LONG_LONG
+    case 'q': case 'Q': return sizeof(__Pyx_pad_longlong) - sizeof(PY_LONG_LONG);
+#endif
+    case 'f': return sizeof(__Pyx_pad_float) - sizeof(float);
+    case 'd': return sizeof(__Pyx_pad_double) - sizeof(double);
+    case 'g': return sizeof(__Pyx_pad_longdouble) - sizeof(long double);
+    case 'P': case 'O': return sizeof(__Pyx_pad_void_p) - sizeof(void*);
+    default:
+      __Pyx_BufFmt_RaiseUnexpectedChar(ch);
+      return 0;
+    }
+}
+static char __Pyx_BufFmt_TypeCharToGroup(char ch, int is_complex) {
+  switch (ch) {
+    case 'c':
+        return 'H';
+    case 'b': case 'h': case 'i':
+    case 'l': case 'q': case 's': case 'p':
+        return 'I';
+    case '?': case 'B': case 'H': case 'I': case 'L': case 'Q':
+        return 'U';
+    case 'f': case 'd': case 'g':
+        return (is_complex ? 'C' : 'R');
+    case 'O':
+        return 'O';
+    case 'P':
+        return 'P';
+    default: {
+      __Pyx_BufFmt_RaiseUnexpectedChar(ch);
+      return 0;
+    }
+  }
+}
+static void __Pyx_BufFmt_RaiseExpected(__Pyx_BufFmt_Context* ctx) {
+  if (ctx->head == NULL || ctx->head->field == &ctx->root) {
+    const char* expected;
+    const char* quote;
+    if (ctx->head == NULL) {
+      expected = "end";
+      quote = "";
+    } else {
+      expected = ctx->head->field->type->name;
+      quote = "'";
+    }
+    PyErr_Format(PyExc_ValueError,
+                 "Buffer dtype mismatch, expected %s%s%s but got %s",
+                 quote, expected, quote,
+                 __Pyx_BufFmt_DescribeTypeChar(ctx->enc_type, ctx->is_complex));
+  } else {
+    __Pyx_StructField* field = ctx->head->field;
+    __Pyx_StructField* parent = (ctx->head - 1)->field;
+    PyErr_Format(PyExc_ValueError,
+                 "Buffer dtype mismatch, expected '%s' but got %s in '%s.%s'",
+                 field->type->name, __Pyx_BufFmt_DescribeTypeChar(ctx->enc_type, ctx->is_complex),
+                 parent->type->name, field->name);
+  }
+}
+static int __Pyx_BufFmt_ProcessTypeChunk(__Pyx_BufFmt_Context* ctx) {
+  char group;
+  size_t size, offset, arraysize = 1;
+  if (ctx->enc_type == 0) return 0;
+  if (ctx->head->field->type->arraysize[0]) {
+    int i, ndim = 0;
+    if (ctx->enc_type == 's' || ctx->enc_type == 'p') {
+        ctx->is_valid_array = ctx->head->field->type->ndim == 1;
+        ndim = 1;
+        if (ctx->enc_count != ctx->head->field->type->arraysize[0]) {
+            PyErr_Format(PyExc_ValueError,
+                         "Expected a dimension of size %zu, got %zu",
+                         ctx->head->field->type->arraysize[0], ctx->enc_count);
+            return -1;
+        }
+    }
+    if (!ctx->is_valid_array) {
+      PyErr_Format(PyExc_ValueError, "Expected %d dimensions, got %d",
+                   ctx->head->field->type->ndim, ndim);
+      return -1;
+    }
+    for (i = 0; i < ctx->head->field->type->ndim; i++) {
+      arraysize *= ctx->head->field->type->arraysize[i];
+    }
+    ctx->is_valid_array = 0;
+    ctx->enc_count = 1;
+  }
+  group = __Pyx_BufFmt_TypeCharToGroup(ctx->enc_type, ctx->is_complex);
+  do {
+    __Pyx_StructField* field = ctx->head->field;
+    __Pyx_TypeInfo* type = field->type;
+    if (ctx->enc_packmode == '@' || ctx->enc_packmode == '^') {
+      size = __Pyx_BufFmt_TypeCharToNativeSize(ctx->enc_type, ctx->is_complex);
+    } else {
+      size = __Pyx_BufFmt_TypeCharToStandardSize(ctx->enc_type, ctx->is_complex);
+    }
+    if (ctx->enc_packmode == '@') {
+      size_t align_at = __Pyx_BufFmt_TypeCharToAlignment(ctx->enc_type, ctx->is_complex);
+      size_t align_mod_offset;
+      if (align_at == 0) return -1;
+      align_mod_offset = ctx->fmt_offset % align_at;
+      if (align_mod_offset > 0) ctx->fmt_offset += align_at - align_mod_offset;
+      if (ctx->struct_alignment == 0)
+          ctx->struct_alignment = __Pyx_BufFmt_TypeCharToPadding(ctx->enc_type,
+                                                                 ctx->is_complex);
+    }
+    if (type->size != size || type->typegroup != group) {
+      if (type->typegroup == 'C' && type->fields != NULL) {
+        size_t parent_offset = ctx->head->parent_offset + field->offset;
+        ++ctx->head;
+        ctx->head->field = type->fields;
+        ctx->head->parent_offset = parent_offset;
+        continue;
+      }
+      if ((type->typegroup == 'H' || group == 'H') && type->size == size) {
+      } else {
+          __Pyx_BufFmt_RaiseExpected(ctx);
+          return -1;
+      }
+    }
+    offset = ctx->head->parent_offset + field->offset;
+    if (ctx->fmt_offset != offset) {
+      PyErr_Format(PyExc_ValueError,
+                   "Buffer dtype mismatch; next field is at offset %" CYTHON_FORMAT_SSIZE_T "d but %" CYTHON_FORMAT_SSIZE_T "d expected",
+                   (Py_ssize_t)ctx->fmt_offset, (Py_ssize_t)offset);
+      return -1;
+    }
+    ctx->fmt_offset += size;
+    if (arraysize)
+      ctx->fmt_offset += (arraysize - 1) * size;
+    --ctx->enc_count;
+    while (1) {
+      if (field == &ctx->root) {
+        ctx->head = NULL;
+        if (ctx->enc_count != 0) {
+          __Pyx_BufFmt_RaiseExpected(ctx);
+          return -1;
+        }
+        break;
+      }
+      ctx->head->field = ++field;
+      if (field->type == NULL) {
+        --ctx->head;
+        field = ctx->head->field;
+        continue;
+      } else if (field->type->typegroup == 'S') {
+        size_t parent_offset = ctx->head->parent_offset + field->offset;
+        if (field->type->fields->type == NULL) continue;
+        field = field->type->fields;
+        ++ctx->head;
+        ctx->head->field = field;
+        ctx->head->parent_offset = parent_offset;
+        break;
+      } else {
+        break;
+      }
+    }
+  } while (ctx->enc_count);
+  ctx->enc_type = 0;
+  ctx->is_complex = 0;
+  return 0;
+}
+static PyObject *
+__pyx_buffmt_parse_array(__Pyx_BufFmt_Context* ctx, const char** tsp)
+{
+    const char *ts = *tsp;
+    int i = 0, number, ndim;
+    ++ts;
+    if (ctx->new_count != 1) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Cannot handle repeated arrays in format string");
+        return NULL;
+    }
+    if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+    ndim = ctx->head->field->type->ndim;
+    while (*ts && *ts != ')') {
+        switch (*ts) {
+            case ' ': case '\f': case '\r': case '\n': case '\t': case '\v':  continue;
+            default:  break;
+        }
+        number = __Pyx_BufFmt_ExpectNumber(&ts);
+        if (number == -1) return NULL;
+        if (i < ndim && (size_t) number != ctx->head->field->type->arraysize[i])
+            return PyErr_Format(PyExc_ValueError,
+                        "Expected a dimension of size %zu, got %d",
+                        ctx->head->field->type->arraysize[i], number);
+        if (*ts != ',' && *ts != ')')
+            return PyErr_Format(PyExc_ValueError,
+                                "Expected a comma in format string, got '%c'", *ts);
+        if (*ts == ',') ts++;
+        i++;
+    }
+    if (i != ndim)
+        return PyErr_Format(PyExc_ValueError, "Expected %d dimension(s), got %d",
+                            ctx->head->field->type->ndim, i);
+    if (!*ts) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Unexpected end of format string, expected ')'");
+        return NULL;
+    }
+    ctx->is_valid_array = 1;
+    ctx->new_count = 1;
+    *tsp = ++ts;
+    return Py_None;
+}
+static const char* __Pyx_BufFmt_CheckString(__Pyx_BufFmt_Context* ctx, const char* ts) {
+  int got_Z = 0;
+  while (1) {
+    switch(*ts) {
+      case 0:
+        if (ctx->enc_type != 0 && ctx->head == NULL) {
+          __Pyx_BufFmt_RaiseExpected(ctx);
+          return NULL;
+        }
+        if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+        if (ctx->head != NULL) {
+          __Pyx_BufFmt_RaiseExpected(ctx);
+          return NULL;
+        }
+        return ts;
+      case ' ':
+      case '\r':
+      case '\n':
+        ++ts;
+        break;
+      case '<':
+        if (!__Pyx_Is_Little_Endian()) {
+          PyErr_SetString(PyExc_ValueError, "Little-endian buffer not supported on big-endian compiler");
+          return NULL;
+        }
+        ctx->new_packmode = '=';
+        ++ts;
+        break;
+      case '>':
+      case '!':
+        if (__Pyx_Is_Little_Endian()) {
+          PyErr_SetString(PyExc_ValueError, "Big-endian buffer not supported on little-endian compiler");
+          return NULL;
+        }
+        ctx->new_packmode = '=';
+        ++ts;
+        break;
+      case '=':
+      case '@':
+      case '^':
+        ctx->new_packmode = *ts++;
+        break;
+      case 'T':
+        {
+          const char* ts_after_sub;
+          size_t i, struct_count = ctx->new_count;
+          size_t struct_alignment = ctx->struct_alignment;
+          ctx->new_count = 1;
+          ++ts;
+          if (*ts != '{') {
+            PyErr_SetString(PyExc_ValueError, "Buffer acquisition: Expected '{' after 'T'");
+            return NULL;
+          }
+          if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+          ctx->enc_type = 0;
+          ctx->enc_count = 0;
+          ctx->struct_alignment = 0;
+          ++ts;
+          ts_after_sub = ts;
+          for (i = 0; i != struct_count; ++i) {
+            ts_after_sub = __Pyx_BufFmt_CheckString(ctx, ts);
+            if (!ts_after_sub) return NULL;
+          }
+          ts = ts_after_sub;
+          if (struct_alignment) ctx->struct_alignment = struct_alignment;
+        }
+        break;
+      case '}':
+        {
+          size_t alignment = ctx->struct_alignment;
+          ++ts;
+          if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+          ctx->enc_type = 0;
+          if (alignment && ctx->fmt_offset % alignment) {
+            ctx->fmt_offset += alignment - (ctx->fmt_offset % alignment);
+          }
+        }
+        return ts;
+      case 'x':
+        if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+        ctx->fmt_offset += ctx->new_count;
+        ctx->new_count = 1;
+        ctx->enc_count = 0;
+        ctx->enc_type = 0;
+        ctx->enc_packmode = ctx->new_packmode;
+        ++ts;
+        break;
+      case 'Z':
+        got_Z = 1;
+        ++ts;
+        if (*ts != 'f' && *ts != 'd' && *ts != 'g') {
+          __Pyx_BufFmt_RaiseUnexpectedChar('Z');
+          return NULL;
+        }
+        CYTHON_FALLTHROUGH;
+      case '?': case 'c': case 'b': case 'B': case 'h': case 'H': case 'i': case 'I':
+      case 'l': case 'L': case 'q': case 'Q':
+      case 'f': case 'd': case 'g':
+      case 'O': case 'p':
+        if ((ctx->enc_type == *ts) && (got_Z == ctx->is_complex) &&
+            (ctx->enc_packmode == ctx->new_packmode) && (!ctx->is_valid_array)) {
+          ctx->enc_count += ctx->new_count;
+          ctx->new_count = 1;
+          got_Z = 0;
+          ++ts;
+          break;
+        }
+        CYTHON_FALLTHROUGH;
+      case 's':
+        if (__Pyx_BufFmt_ProcessTypeChunk(ctx) == -1) return NULL;
+        ctx->enc_count = ctx->new_count;
+        ctx->enc_packmode = ctx->new_packmode;
+        ctx->enc_type = *ts;
+        ctx->is_complex = got_Z;
+        ++ts;
+        ctx->new_count = 1;
+        got_Z = 0;
+        break;
+      case ':':
+        ++ts;
+        while(*ts != ':') ++ts;
+        ++ts;
+        break;
+      case '(':
+        if (!__pyx_buffmt_parse_array(ctx, &ts)) return NULL;
+        break;
+      default:
+        {
+          int number = __Pyx_BufFmt_ExpectNumber(&ts);
+          if (number == -1) return NULL;
+          ctx->new_count = (size_t)number;
+        }
+    }
+  }
+}
+
+/* BufferGetAndValidate */
+  static CYTHON_INLINE void __Pyx_SafeReleaseBuffer(Py_buffer* info) {
+  if (unlikely(info->buf == NULL)) return;
+  if (info->suboffsets == __Pyx_minusones) info->suboffsets = NULL;
+  __Pyx_ReleaseBuffer(info);
+}
+static void __Pyx_ZeroBuffer(Py_buffer* buf) {
+  buf->buf = NULL;
+  buf->obj = NULL;
+  buf->strides = __Pyx_zeros;
+  buf->shape = __Pyx_zeros;
+  buf->suboffsets = __Pyx_minusones;
+}
+static int __Pyx__GetBufferAndValidate(
+        Py_buffer* buf, PyObject* obj,  __Pyx_TypeInfo* dtype, int flags,
+        int nd, int cast, __Pyx_BufFmt_StackElem* stack)
+{
+  buf->buf = NULL;
+  if (unlikely(__Pyx_GetBuffer(obj, buf, flags) == -1)) {
+    __Pyx_ZeroBuffer(buf);
+    return -1;
+  }
+  if (unlikely(buf->ndim != nd)) {
+    PyErr_Format(PyExc_ValueError,
+                 "Buffer has wrong number of dimensions (expected %d, got %d)",
+                 nd, buf->ndim);
+    goto fail;
+  }
+  if (!cast) {
+    __Pyx_BufFmt_Context ctx;
+    __Pyx_BufFmt_Init(&ctx, stack, dtype);
+    if (!__Pyx_BufFmt_CheckString(&ctx, buf->format)) goto fail;
+  }
+  if (unlikely((size_t)buf->itemsize != dtype->size)) {
+    PyErr_Format(PyExc_ValueError,
+      "Item size of buffer (%" CYTHON_FORMAT_SSIZE_T "d byte%s) does not match size of '%s' (%" CYTHON_FORMAT_SSIZE_T "d byte%s)",
+      buf->itemsize, (buf->itemsize > 1) ? "s" : "",
+      dtype->name, (Py_ssize_t)dtype->size, (dtype->size > 1) ? "s" : "");
+    goto fail;
+  }
+  if (buf->suboffsets == NULL) buf->suboffsets = __Pyx_minusones;
+  return 0;
+fail:;
+  __Pyx_SafeReleaseBuffer(buf);
+  return -1;
+}
+
+/* PyErrFetchRestore */
+  #if CYTHON_FAST_THREAD_STATE
+static CYTHON_INLINE void __Pyx_ErrRestoreInState(PyThreadState *tstate, PyObject *type, PyObject *value, PyObject *tb) {
+    PyObject *tmp_type, *tmp_value, *tmp_tb;
+    tmp_type = tstate->curexc_type;
+    tmp_value = tstate->curexc_value;
+    tmp_tb = tstate->curexc_traceback;
+    tstate->curexc_type = type;
+    tstate->curexc_value = value;
+    tstate->curexc_traceback = tb;
+    Py_XDECREF(tmp_type);
+    Py_XDECREF(tmp_value);
+    Py_XDECREF(tmp_tb);
+}
+static CYTHON_INLINE void __Pyx_ErrFetchInState(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb) {
+    *type = tstate->curexc_type;
+    *value = tstate->curexc_value;
+    *tb = tstate->curexc_traceback;
+    tstate->curexc_type = 0;
+    tstate->curexc_value = 0;
+    tstate->curexc_traceback = 0;
+}
+#endif
+
+/* PyDictVersioning */
+  #if CYTHON_USE_DICT_VERSIONS && CYTHON_USE_TYPE_SLOTS
+static CYTHON_INLINE PY_UINT64_T __Pyx_get_tp_dict_version(PyObject *obj) {
+    PyObject *dict = Py_TYPE(obj)->tp_dict;
+    return likely(dict) ? __PYX_GET_DICT_VERSION(dict) : 0;
+}
+static CYTHON_INLINE PY_UINT64_T __Pyx_get_object_dict_version(PyObject *obj) {
+    PyObject **dictptr = NULL;
+    Py_ssize_t offset = Py_TYPE(obj)->tp_dictoffset;
+    if (offset) {
+#if CYTHON_COMPILING_IN_CPYTHON
+        dictptr = (likely(offset > 0)) ? (PyObject **) ((char *)obj + offset) : _PyObject_GetDictPtr(obj);
+#else
+        dictptr = _PyObject_GetDictPtr(obj);
+#endif
+    }
+    return (dictptr && *dictptr) ? __PYX_GET_DICT_VERSION(*dictptr) : 0;
+}
+static CYTHON_INLINE int __Pyx_object_dict_version_matches(PyObject* obj, PY_UINT64_T tp_dict_version, PY_UINT64_T obj_dict_version) {
+    PyObject *dict = Py_TYPE(obj)->tp_dict;
+    if (unlikely(!dict) || unlikely(tp_dict_version != __PYX_GET_DICT_VERSION(dict)))
+        return 0;
+    return obj_dict_version == __Pyx_get_object_dict_version(obj);
+}
+#endif
+
+/* GetModuleGlobalName */
+  #if CYTHON_USE_DICT_VERSIONS
+static PyObject *__Pyx__GetModuleGlobalName(PyObject *name, PY_UINT64_T *dict_version, PyObject **dict_cached_value)
+#else
+static CYTHON_INLINE PyObject *__Pyx__GetModuleGlobalName(PyObject *name)
+#endif
+{
+    PyObject *result;
+#if !CYTHON_AVOID_BORROWED_REFS
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX >= 0x030500A1
+    result = _PyDict_GetItem_KnownHash(__pyx_d, name, ((PyASCIIObject *) name)->hash);
+    __PYX_UPDATE_DICT_CACHE(__pyx_d, result, *dict_cached_value, *dict_version)
+    if (likely(result)) {
+        return __Pyx_NewRef(result);
+    } else if (unlikely(PyErr_Occurred())) {
+        return NULL;
+    }
+#else
+    result = PyDict_GetItem(__pyx_d, name);
+    __PYX_UPDATE_DICT_CACHE(__pyx_d, result, *dict_cached_value, *dict_version)
+    if (likely(result)) {
+        return __Pyx_NewRef(result);
+    }
+#endif
+#else
+    result = PyObject_GetItem(__pyx_d, name);
+    __PYX_UPDATE_DICT_CACHE(__pyx_d, result, *dict_cached_value, *dict_version)
+    if (likely(result)) {
+        return __Pyx_NewRef(result);
+    }
+    PyErr_Clear();
+#endif
+    return __Pyx_GetBuiltinName(name);
+}
+
+/* PyObjectCall */
+  #if CYTHON_COMPILING_IN_CPYTHON
+static CYTHON_INLINE PyObject* __Pyx_PyObject_Call(PyObject *func, PyObject *arg, PyObject *kw) {
+    PyObject *result;
+    ternaryfunc call = Py_TYPE(func)->tp_call;
+    if (unlikely(!call))
+        return PyObject_Call(func, arg, kw);
+    if (unlikely(Py_EnterRecursiveCall((char*)" while calling a Python object")))
+        return NULL;
+    result = (*call)(func, arg, kw);
+    Py_LeaveRecursiveCall();
+    if (unlikely(!result) && unlikely(!PyErr_Occurred())) {
+        PyErr_SetString(
+            PyExc_SystemError,
+            "NULL result without error in PyObject_Call");
+    }
+    return result;
+}
+#endif
+
+/* ExtTypeTest */
+  static CYTHON_INLINE int __Pyx_TypeTest(PyObject *obj, PyTypeObject *type) {
+    if (unlikely(!type)) {
+        PyErr_SetString(PyExc_SystemError, "Missing type object");
+        return 0;
+    }
+    if (likely(__Pyx_TypeCheck(obj, type)))
+        return 1;
+    PyErr_Format(PyExc_TypeError, "Cannot convert %.200s to %.200s",
+                 Py_TYPE(obj)->tp_name, type->tp_name);
+    return 0;
+}
+
+/* DivInt[PY_LONG_LONG] */
+  static CYTHON_INLINE PY_LONG_LONG __Pyx_div_PY_LONG_LONG(PY_LONG_LONG a, PY_LONG_LONG b) {
+    PY_LONG_LONG q = a / b;
+    PY_LONG_LONG r = a - q*b;
+    q -= ((r != 0) & ((r ^ b) < 0));
+    return q;
+}
+
+/* PyCFunctionFastCall */
+  #if CYTHON_FAST_PYCCALL
+static CYTHON_INLINE PyObject * __Pyx_PyCFunction_FastCall(PyObject *func_obj, PyObject **args, Py_ssize_t nargs) {
+    PyCFunctionObject *func = (PyCFunctionObject*)func_obj;
+    PyCFunction meth = PyCFunction_GET_FUNCTION(func);
+    PyObject *self = PyCFunction_GET_SELF(func);
+    int flags = PyCFunction_GET_FLAGS(func);
+    assert(PyCFunction_Check(func));
+    assert(METH_FASTCALL == (flags & ~(METH_CLASS | METH_STATIC | METH_COEXIST | METH_KEYWORDS | METH_STACKLESS)));
+    assert(nargs >= 0);
+    assert(nargs == 0 || args != NULL);
+    /* _PyCFunction_FastCallDict() must not be called with an exception set,
+       because it may clear it (directly or indirectly) and so the
+       caller loses its exception */
+    assert(!PyErr_Occurred());
+    if ((PY_VERSION_HEX < 0x030700A0) || unlikely(flags & METH_KEYWORDS)) {
+        return (*((__Pyx_PyCFunctionFastWithKeywords)(void*)meth)) (self, args, nargs, NULL);
+    } else {
+        return (*((__Pyx_PyCFunctionFast)(void*)meth)) (self, args, nargs);
+    }
+}
+#endif
+
+/* PyFunctionFastCall */
+  #if CYTHON_FAST_PYCALL
+static PyObject* __Pyx_PyFunction_FastCallNoKw(PyCodeObject *co, PyObject **args, Py_ssize_t na,
+                                               PyObject *globals) {
+    PyFrameObject *f;
+    PyThreadState *tstate = __Pyx_PyThreadState_Current;
+    PyObject **fastlocals;
+    Py_ssize_t i;
+    PyObject *result;
+    assert(globals != NULL);
+    /* XXX Perhaps we should create a specialized
+       PyFrame_New() that doesn't take locals, but does
+       take builtins without sanity checking them.
+       */
+    assert(tstate != NULL);
+    f = PyFrame_New(tstate, co, globals, NULL);
+    if (f == NULL) {
+        return NULL;
+    }
+    fastlocals = __Pyx_PyFrame_GetLocalsplus(f);
+    for (i = 0; i < na; i++) {
+        Py_INCREF(*args);
+        fastlocals[i] = *args++;
+    }
+    result = PyEval_EvalFrameEx(f,0);
+    ++tstate->recursion_depth;
+    Py_DECREF(f);
+    --tstate->recursion_depth;
+    return result;
+}
+#if 1 || PY_VERSION_HEX < 0x030600B1
+static PyObject *__Pyx_PyFunction_FastCallDict(PyObject *func, PyObject **args, Py_ssize_t nargs, PyObject *kwargs) {
+    PyCodeObject *co = (PyCodeObject *)PyFunction_GET_CODE(func);
+    PyObject *globals = PyFunction_GET_GLOBALS(func);
+    PyObject *argdefs = PyFunction_GET_DEFAULTS(func);
+    PyObject *closure;
+#if PY_MAJOR_VERSION >= 3
+    PyObject *kwdefs;
+#endif
+    PyObject *kwtuple, **k;
+    PyObject **d;
+    Py_ssize_t nd;
+    Py_ssize_t nk;
+    PyObject *result;
+    assert(kwargs == NULL || PyDict_Check(kwargs));
+    nk = kwargs ? PyDict_Size(kwargs) : 0;
+    if (Py_EnterRecursiveCall((char*)" while calling a Python object")) {
+        return NULL;
+    }
+    if (
+#if PY_MAJOR_VERSION >= 3
+            co->co_kwonlyargcount == 0 &&
+#endif
+            likely(kwargs == NULL || nk == 0) &&
+            co->co_flags == (CO_OPTIMIZED | CO_NEWLOCALS | CO_NOFREE)) {
+        if (argdefs == NULL && co->co_argcount == nargs) {
+            result = __Pyx_PyFunction_FastCallNoKw(co, args, nargs, globals);
+            goto done;
+        }
+        else if (nargs == 0 && argdefs != NULL
+                 && co->co_argcount == Py_SIZE(argdefs)) {
+            /* function called with no arguments, but all parameters have
+               a default value: use default values as arguments .*/
+            args = &PyTuple_GET_ITEM(argdefs, 0);
+            result =__Pyx_PyFunction_FastCallNoKw(co, args, Py_SIZE(argdefs), globals);
+            goto done;
+        }
+    }
+    if (kwargs != NULL) {
+        Py_ssize_t pos, i;
+        kwtuple = PyTuple_New(2 * nk);
+        if (kwtuple == NULL) {
+            result = NULL;
+            goto done;
+        }
+        k = &PyTuple_GET_ITEM(kwtuple, 0);
+        pos = i = 0;
+        while (PyDict_Next(kwargs, &pos, &k[i], &k[i+1])) {
+            Py_INCREF(k[i]);
+            Py_INCREF(k[i+1]);
+            i += 2;
+        }
+        nk = i / 2;
+    }
+    else {
+        kwtuple = NULL;
+        k = NULL;
+    }
+    closure = PyFunction_GET_CLOSURE(func);
+#if PY_MAJOR_VERSION >= 3
+    kwdefs = PyFunction_GET_KW_DEFAULTS(func);
+#endif
+    if (argdefs != NULL) {
+        d = &PyTuple_GET_ITEM(argdefs, 0);
+        nd = Py_SIZE(argdefs);
+    }
+    else {
+        d = NULL;
+        nd = 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    result = PyEval_EvalCodeEx((PyObject*)co, globals, (PyObject *)NULL,
+                               args, (int)nargs,
+                               k, (int)nk,
+                               d, (int)nd, kwdefs, closure);
+#else
+    result = PyEval_EvalCodeEx(co, globals, (PyObject *)NULL,
+                               args, (int)nargs,
+                               k, (int)nk,
+                               d, (int)nd, closure);
+#endif
+    Py_XDECREF(kwtuple);
+done:
+    Py_LeaveRecursiveCall();
+    return result;
+}
+#endif
+#endif
+
+/* PyObjectCall2Args */
+  static CYTHON_UNUSED PyObject* __Pyx_PyObject_Call2Args(PyObject* function, PyObject* arg1, PyObject* arg2) {
+    PyObject *args, *result = NULL;
+    #if CYTHON_FAST_PYCALL
+    if (PyFunction_Check(function)) {
+        PyObject *args[2] = {arg1, arg2};
+        return __Pyx_PyFunction_FastCall(function, args, 2);
+    }
+    #endif
+    #if CYTHON_FAST_PYCCALL
+    if (__Pyx_PyFastCFunction_Check(function)) {
+        PyObject *args[2] = {arg1, arg2};
+        return __Pyx_PyCFunction_FastCall(function, args, 2);
+    }
+    #endif
+    args = PyTuple_New(2);
+    if (unlikely(!args)) goto done;
+    Py_INCREF(arg1);
+    PyTuple_SET_ITEM(args, 0, arg1);
+    Py_INCREF(arg2);
+    PyTuple_SET_ITEM(args, 1, arg2);
+    Py_INCREF(function);
+    result = __Pyx_PyObject_Call(function, args, NULL);
+    Py_DECREF(args);
+    Py_DECREF(function);
+done:
+    return result;
+}
+
+/* PyObjectCallMethO */
+  #if CYTHON_COMPILING_IN_CPYTHON
+static CYTHON_INLINE PyObject* __Pyx_PyObject_CallMethO(PyObject *func, PyObject *arg) {
+    PyObject *self, *result;
+    PyCFunction cfunc;
+    cfunc = PyCFunction_GET_FUNCTION(func);
+    self = PyCFunction_GET_SELF(func);
+    if (unlikely(Py_EnterRecursiveCall((char*)" while calling a Python object")))
+        return NULL;
+    result = cfunc(self, arg);
+    Py_LeaveRecursiveCall();
+    if (unlikely(!result) && unlikely(!PyErr_Occurred())) {
+        PyErr_SetString(
+            PyExc_SystemError,
+            "NULL result without error in PyObject_Call");
+    }
+    return result;
+}
+#endif
+
+/* PyObjectCallOneArg */
+  #if CYTHON_COMPILING_IN_CPYTHON
+static PyObject* __Pyx__PyObject_CallOneArg(PyObject *func, PyObject *arg) {
+    PyObject *result;
+    PyObject *args = PyTuple_New(1);
+    if (unlikely(!args)) return NULL;
+    Py_INCREF(arg);
+    PyTuple_SET_ITEM(args, 0, arg);
+    result = __Pyx_PyObject_Call(func, args, NULL);
+    Py_DECREF(args);
+    return result;
+}
+static CYTHON_INLINE PyObject* __Pyx_PyObject_CallOneArg(PyObject *func, PyObject *arg) {
+#if CYTHON_FAST_PYCALL
+    if (PyFunction_Check(func)) {
+        return __Pyx_PyFunction_FastCall(func, &arg, 1);
+    }
+#endif
+    if (likely(PyCFunction_Check(func))) {
+        if (likely(PyCFunction_GET_FLAGS(func) & METH_O)) {
+            return __Pyx_PyObject_CallMethO(func, arg);
+#if CYTHON_FAST_PYCCALL
+        } else if (__Pyx_PyFastCFunction_Check(func)) {
+            return __Pyx_PyCFunction_FastCall(func, &arg, 1);
+#endif
+        }
+    }
+    return __Pyx__PyObject_CallOneArg(func, arg);
+}
+#else
+static CYTHON_INLINE PyObject* __Pyx_PyObject_CallOneArg(PyObject *func, PyObject *arg) {
+    PyObject *result;
+    PyObject *args = PyTuple_Pack(1, arg);
+    if (unlikely(!args)) return NULL;
+    result = __Pyx_PyObject_Call(func, args, NULL);
+    Py_DECREF(args);
+    return result;
+}
+#endif
+
+/* BufferFallbackError */
+  static void __Pyx_RaiseBufferFallbackError(void) {
+  PyErr_SetString(PyExc_ValueError,
+     "Buffer acquisition failed on assignment; and then reacquiring the old buffer failed too!");
+}
+
+/* RaiseException */
+  #if PY_MAJOR_VERSION < 3
+static void __Pyx_Raise(PyObject *type, PyObject *value, PyObject *tb,
+                        CYTHON_UNUSED PyObject *cause) {
+    __Pyx_PyThreadState_declare
+    Py_XINCREF(type);
+    if (!value || value == Py_None)
+        value = NULL;
+    else
+        Py_INCREF(value);
+    if (!tb || tb == Py_None)
+        tb = NULL;
+    else {
+        Py_INCREF(tb);
+        if (!PyTraceBack_Check(tb)) {
+            PyErr_SetString(PyExc_TypeError,
+                "raise: arg 3 must be a traceback or None");
+            goto raise_error;
+        }
+    }
+    if (PyType_Check(type)) {
+#if CYTHON_COMPILING_IN_PYPY
+        if (!value) {
+            Py_INCREF(Py_None);
+            value = Py_None;
+        }
+#endif
+        PyErr_NormalizeException(&type, &value, &tb);
+    } else {
+        if (value) {
+            PyErr_SetString(PyExc_TypeError,
+                "instance exception may not have a separate value");
+            goto raise_error;
+        }
+        value = type;
+        type = (PyObject*) Py_TYPE(type);
+        Py_INCREF(type);
+        if (!PyType_IsSubtype((PyTypeObject *)type, (PyTypeObject *)PyExc_BaseException)) {
+            PyErr_SetString(PyExc_TypeError,
+                "raise: exception class must be a subclass of BaseException");
+            goto raise_error;
+        }
+    }
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrRestore(type, value, tb);
+    return;
+raise_error:
+    Py_XDECREF(value);
+    Py_XDECREF(type);
+    Py_XDECREF(tb);
+    return;
+}
+#else
+static void __Pyx_Raise(PyObject *type, PyObject *value, PyObject *tb, PyObject *cause) {
+    PyObject* owned_instance = NULL;
+    if (tb == Py_None) {
+        tb = 0;
+    } else if (tb && !PyTraceBack_Check(tb)) {
+        PyErr_SetString(PyExc_TypeError,
+            "raise: arg 3 must be a traceback or None");
+        goto bad;
+    }
+    if (value == Py_None)
+        value = 0;
+    if (PyExceptionInstance_Check(type)) {
+        if (value) {
+            PyErr_SetString(PyExc_TypeError,
+                "instance exception may not have a separate value");
+            goto bad;
+        }
+        value = type;
+        type = (PyObject*) Py_TYPE(value);
+    } else if (PyExceptionClass_Check(type)) {
+        PyObject *instance_class = NULL;
+        if (value && PyExceptionInstance_Check(value)) {
+            instance_class = (PyObject*) Py_TYPE(value);
+            if (instance_class != type) {
+                int is_subclass = PyObject_IsSubclass(instance_class, type);
+                if (!is_subclass) {
+                    instance_class = NULL;
+                } else if (unlikely(is_subclass == -1)) {
+                    goto bad;
+                } else {
+                    type = instance_class;
+                }
+            }
+        }
+        if (!instance_class) {
+            PyObject *args;
+            if (!value)
+                args = PyTuple_New(0);
+            else if (PyTuple_Check(value)) {
+                Py_INCREF(value);
+                args = value;
+            } else
+                args = PyTuple_Pack(1, value);
+            if (!args)
+                goto bad;
+            owned_instance = PyObject_Call(type, args, NULL);
+            Py_DECREF(args);
+            if (!owned_instance)
+                goto bad;
+            value = owned_instance;
+            if (!PyExceptionInstance_Check(value)) {
+                PyErr_Format(PyExc_TypeError,
+                             "calling %R should have returned an instance of "
+                             "BaseException, not %R",
+                             type, Py_TYPE(value));
+                goto bad;
+            }
+        }
+    } else {
+        PyErr_SetString(PyExc_TypeError,
+            "raise: exception class must be a subclass of BaseException");
+        goto bad;
+    }
+    if (cause) {
+        PyObject *fixed_cause;
+        if (cause == Py_None) {
+            fixed_cause = NULL;
+        } else if (PyExceptionClass_Check(cause)) {
+            fixed_cause = PyObject_CallObject(cause, NULL);
+            if (fixed_cause == NULL)
+                goto bad;
+        } else if (PyExceptionInstance_Check(cause)) {
+            fixed_cause = cause;
+            Py_INCREF(fixed_cause);
+        } else {
+            PyErr_SetString(PyExc_TypeError,
+                            "exception causes must derive from "
+                            "BaseException");
+            goto bad;
+        }
+        PyException_SetCause(value, fixed_cause);
+    }
+    PyErr_SetObject(type, value);
+    if (tb) {
+#if CYTHON_FAST_THREAD_STATE
+        PyThreadState *tstate = __Pyx_PyThreadState_Current;
+        PyObject* tmp_tb = tstate->curexc_traceback;
+        if (tb != tmp_tb) {
+            Py_INCREF(tb);
+            tstate->curexc_traceback = tb;
+            Py_XDECREF(tmp_tb);
+        }
+#else
+        PyObject *tmp_type, *tmp_value, *tmp_tb;
+        PyErr_Fetch(&tmp_type, &tmp_value, &tmp_tb);
+        Py_INCREF(tb);
+        PyErr_Restore(tmp_type, tmp_value, tb);
+        Py_XDECREF(tmp_tb);
+#endif
+    }
+bad:
+    Py_XDECREF(owned_instance);
+    return;
+}
+#endif
+
+/* DictGetItem */
+  #if PY_MAJOR_VERSION >= 3 && !CYTHON_COMPILING_IN_PYPY
+static PyObject *__Pyx_PyDict_GetItem(PyObject *d, PyObject* key) {
+    PyObject *value;
+    value = PyDict_GetItemWithError(d, key);
+    if (unlikely(!value)) {
+        if (!PyErr_Occurred()) {
+            if (unlikely(PyTuple_Check(key))) {
+                PyObject* args = PyTuple_Pack(1, key);
+                if (likely(args)) {
+                    PyErr_SetObject(PyExc_KeyError, args);
+                    Py_DECREF(args);
+                }
+            } else {
+                PyErr_SetObject(PyExc_KeyError, key);
+            }
+        }
+        return NULL;
+    }
+    Py_INCREF(value);
+    return value;
+}
+#endif
+
+/* RaiseTooManyValuesToUnpack */
+  static CYTHON_INLINE void __Pyx_RaiseTooManyValuesError(Py_ssize_t expected) {
+    PyErr_Format(PyExc_ValueError,
+                 "too many values to unpack (expected %" CYTHON_FORMAT_SSIZE_T "d)", expected);
+}
+
+/* RaiseNeedMoreValuesToUnpack */
+  static CYTHON_INLINE void __Pyx_RaiseNeedMoreValuesError(Py_ssize_t index) {
+    PyErr_Format(PyExc_ValueError,
+                 "need more than %" CYTHON_FORMAT_SSIZE_T "d value%.1s to unpack",
+                 index, (index == 1) ? "" : "s");
+}
+
+/* RaiseNoneIterError */
+  static CYTHON_INLINE void __Pyx_RaiseNoneNotIterableError(void) {
+    PyErr_SetString(PyExc_TypeError, "'NoneType' object is not iterable");
+}
+
+/* GetTopmostException */
+  #if CYTHON_USE_EXC_INFO_STACK
+static _PyErr_StackItem *
+__Pyx_PyErr_GetTopmostException(PyThreadState *tstate)
+{
+    _PyErr_StackItem *exc_info = tstate->exc_info;
+    while ((exc_info->exc_type == NULL || exc_info->exc_type == Py_None) &&
+           exc_info->previous_item != NULL)
+    {
+        exc_info = exc_info->previous_item;
+    }
+    return exc_info;
+}
+#endif
+
+/* SaveResetException */
+  #if CYTHON_FAST_THREAD_STATE
+static CYTHON_INLINE void __Pyx__ExceptionSave(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb) {
+    #if CYTHON_USE_EXC_INFO_STACK
+    _PyErr_StackItem *exc_info = __Pyx_PyErr_GetTopmostException(tstate);
+    *type = exc_info->exc_type;
+    *value = exc_info->exc_value;
+    *tb = exc_info->exc_traceback;
+    #else
+    *type = tstate->exc_type;
+    *value = tstate->exc_value;
+    *tb = tstate->exc_traceback;
+    #endif
+    Py_XINCREF(*type);
+    Py_XINCREF(*value);
+    Py_XINCREF(*tb);
+}
+static CYTHON_INLINE void __Pyx__ExceptionReset(PyThreadState *tstate, PyObject *type, PyObject *value, PyObject *tb) {
+    PyObject *tmp_type, *tmp_value, *tmp_tb;
+    #if CYTHON_USE_EXC_INFO_STACK
+    _PyErr_StackItem *exc_info = tstate->exc_info;
+    tmp_type = exc_info->exc_type;
+    tmp_value = exc_info->exc_value;
+    tmp_tb = exc_info->exc_traceback;
+    exc_info->exc_type = type;
+    exc_info->exc_value = value;
+    exc_info->exc_traceback = tb;
+    #else
+    tmp_type = tstate->exc_type;
+    tmp_value = tstate->exc_value;
+    tmp_tb = tstate->exc_traceback;
+    tstate->exc_type = type;
+    tstate->exc_value = value;
+    tstate->exc_traceback = tb;
+    #endif
+    Py_XDECREF(tmp_type);
+    Py_XDECREF(tmp_value);
+    Py_XDECREF(tmp_tb);
+}
+#endif
+
+/* PyErrExceptionMatches */
+  #if CYTHON_FAST_THREAD_STATE
+static int __Pyx_PyErr_ExceptionMatchesTuple(PyObject *exc_type, PyObject *tuple) {
+    Py_ssize_t i, n;
+    n = PyTuple_GET_SIZE(tuple);
+#if PY_MAJOR_VERSION >= 3
+    for (i=0; i<n; i++) {
+        if (exc_type == PyTuple_GET_ITEM(tuple, i)) return 1;
+    }
+#endif
+    for (i=0; i<n; i++) {
+        if (__Pyx_PyErr_GivenExceptionMatches(exc_type, PyTuple_GET_ITEM(tuple, i))) return 1;
+    }
+    return 0;
+}
+static CYTHON_INLINE int __Pyx_PyErr_ExceptionMatchesInState(PyThreadState* tstate, PyObject* err) {
+    PyObject *exc_type = tstate->curexc_type;
+    if (exc_type == err) return 1;
+    if (unlikely(!exc_type)) return 0;
+    if (unlikely(PyTuple_Check(err)))
+        return __Pyx_PyErr_ExceptionMatchesTuple(exc_type, err);
+    return __Pyx_PyErr_GivenExceptionMatches(exc_type, err);
+}
+#endif
+
+/* GetException */
+  #if CYTHON_FAST_THREAD_STATE
+static int __Pyx__GetException(PyThreadState *tstate, PyObject **type, PyObject **value, PyObject **tb)
+#else
+static int __Pyx_GetException(PyObject **type, PyObject **value, PyObject **tb)
+#endif
+{
+    PyObject *local_type, *local_value, *local_tb;
+#if CYTHON_FAST_THREAD_STATE
+    PyObject *tmp_type, *tmp_value, *tmp_tb;
+    local_type = tstate->curexc_type;
+    local_value = tstate->curexc_value;
+    local_tb = tstate->curexc_traceback;
+    tstate->curexc_type = 0;
+    tstate->curexc_value = 0;
+    tstate->curexc_traceback = 0;
+#else
+    PyErr_Fetch(&local_type, &local_value, &local_tb);
+#endif
+    PyErr_NormalizeException(&local_type, &local_value, &local_tb);
+#if CYTHON_FAST_THREAD_STATE
+    if (unlikely(tstate->curexc_type))
+#else
+    if (unlikely(PyErr_Occurred()))
+#endif
+        goto bad;
+    #if PY_MAJOR_VERSION >= 3
+    if (local_tb) {
+        if (unlikely(PyException_SetTraceback(local_value, local_tb) < 0))
+            goto bad;
+    }
+    #endif
+    Py_XINCREF(local_tb);
+    Py_XINCREF(local_type);
+    Py_XINCREF(local_value);
+    *type = local_type;
+    *value = local_value;
+    *tb = local_tb;
+#if CYTHON_FAST_THREAD_STATE
+    #if CYTHON_USE_EXC_INFO_STACK
+    {
+        _PyErr_StackItem *exc_info = tstate->exc_info;
+        tmp_type = exc_info->exc_type;
+        tmp_value = exc_info->exc_value;
+        tmp_tb = exc_info->exc_traceback;
+        exc_info->exc_type = local_type;
+        exc_info->exc_value = local_value;
+        exc_info->exc_traceback = local_tb;
+    }
+    #else
+    tmp_type = tstate->exc_type;
+    tmp_value = tstate->exc_value;
+    tmp_tb = tstate->exc_traceback;
+    tstate->exc_type = local_type;
+    tstate->exc_value = local_value;
+    tstate->exc_traceback = local_tb;
+    #endif
+    Py_XDECREF(tmp_type);
+    Py_XDECREF(tmp_value);
+    Py_XDECREF(tmp_tb);
+#else
+    PyErr_SetExcInfo(local_type, local_value, local_tb);
+#endif
+    return 0;
+bad:
+    *type = 0;
+    *value = 0;
+    *tb = 0;
+    Py_XDECREF(local_type);
+    Py_XDECREF(local_value);
+    Py_XDECREF(local_tb);
+    return -1;
+}
+
+/* TypeImport */
+  #ifndef __PYX_HAVE_RT_ImportType_0_29_37
+#define __PYX_HAVE_RT_ImportType_0_29_37
+static PyTypeObject *__Pyx_ImportType_0_29_37(PyObject *module, const char *module_name, const char *class_name,
+    size_t size, size_t alignment, enum __Pyx_ImportType_CheckSize_0_29_37 check_size)
+{
+    PyObject *result = 0;
+    char warning[200];
+    Py_ssize_t basicsize;
+    Py_ssize_t itemsize;
+#ifdef Py_LIMITED_API
+    PyObject *py_basicsize;
+    PyObject *py_itemsize;
+#endif
+    result = PyObject_GetAttrString(module, class_name);
+    if (!result)
+        goto bad;
+    if (!PyType_Check(result)) {
+        PyErr_Format(PyExc_TypeError,
+            "%.200s.%.200s is not a type object",
+            module_name, class_name);
+        goto bad;
+    }
+#ifndef Py_LIMITED_API
+    basicsize = ((PyTypeObject *)result)->tp_basicsize;
+    itemsize = ((PyTypeObject *)result)->tp_itemsize;
+#else
+    py_basicsize = PyObject_GetAttrString(result, "__basicsize__");
+    if (!py_basicsize)
+        goto bad;
+    basicsize = PyLong_AsSsize_t(py_basicsize);
+    Py_DECREF(py_basicsize);
+    py_basicsize = 0;
+    if (basicsize == (Py_ssize_t)-1 && PyErr_Occurred())
+        goto bad;
+    py_itemsize = PyObject_GetAttrString(result, "__itemsize__");
+    if (!py_itemsize)
+        goto bad;
+    itemsize = PyLong_AsSsize_t(py_itemsize);
+    Py_DECREF(py_itemsize);
+    py_itemsize = 0;
+    if (itemsize == (Py_ssize_t)-1 && PyErr_Occurred())
+        goto bad;
+#endif
+    if (itemsize) {
+        if (size % alignment) {
+            alignment = size % alignment;
+        }
+        if (itemsize < (Py_ssize_t)alignment)
+            itemsize = (Py_ssize_t)alignment;
+    }
+    if ((size_t)(basicsize + itemsize) < size) {
+        PyErr_Format(PyExc_ValueError,
+            "%.200s.%.200s size changed, may indicate binary incompatibility. "
+            "Expected %zd from C header, got %zd from PyObject",
+            module_name, class_name, size, basicsize);
+        goto bad;
+    }
+    if (check_size == __Pyx_ImportType_CheckSize_Error_0_29_37 && (size_t)basicsize != size) {
+        PyErr_Format(PyExc_ValueError,
+            "%.200s.%.200s size changed, may indicate binary incompatibility. "
+            "Expected %zd from C header, got %zd from PyObject",
+            module_name, class_name, size, basicsize);
+        goto bad;
+    }
+    else if (check_size == __Pyx_ImportType_CheckSize_Warn_0_29_37 && (size_t)basicsize > size) {
+        PyOS_snprintf(warning, sizeof(warning),
+            "%s.%s size changed, may indicate binary incompatibility. "
+            "Expected %zd from C header, got %zd from PyObject",
+            module_name, class_name, size, basicsize);
+        if (PyErr_WarnEx(NULL, warning, 0) < 0) goto bad;
+    }
+    return (PyTypeObject *)result;
+bad:
+    Py_XDECREF(result);
+    return NULL;
+}
+#endif
+
+/* Import */
+  static PyObject *__Pyx_Import(PyObject *name, PyObject *from_list, int level) {
+    PyObject *empty_list = 0;
+    PyObject *module = 0;
+    PyObject *global_dict = 0;
+    PyObject *empty_dict = 0;
+    PyObject *list;
+    #if PY_MAJOR_VERSION < 3
+    PyObject *py_import;
+    py_import = __Pyx_PyObject_GetAttrStr(__pyx_b, __pyx_n_s_import);
+    if (!py_import)
+        goto bad;
+    #endif
+    if (from_list)
+        list = from_list;
+    else {
+        empty_list = PyList_New(0);
+        if (!empty_list)
+            goto bad;
+        list = empty_list;
+    }
+    global_dict = PyModule_GetDict(__pyx_m);
+    if (!global_dict)
+        goto bad;
+    empty_dict = PyDict_New();
+    if (!empty_dict)
+        goto bad;
+    {
+        #if PY_MAJOR_VERSION >= 3
+        if (level == -1) {
+            if ((1) && (strchr(__Pyx_MODULE_NAME, '.'))) {
+                module = PyImport_ImportModuleLevelObject(
+                    name, global_dict, empty_dict, list, 1);
+                if (!module) {
+                    if (!PyErr_ExceptionMatches(PyExc_ImportError))
+                        goto bad;
+                    PyErr_Clear();
+                }
+            }
+            level = 0;
+        }
+        #endif
+        if (!module) {
+            #if PY_MAJOR_VERSION < 3
+            PyObject *py_level = PyInt_FromLong(level);
+            if (!py_level)
+                goto bad;
+            module = PyObject_CallFunctionObjArgs(py_import,
+                name, global_dict, empty_dict, list, py_level, (PyObject *)NULL);
+            Py_DECREF(py_level);
+            #else
+            module = PyImport_ImportModuleLevelObject(
+                name, global_dict, empty_dict, list, level);
+            #endif
+        }
+    }
+bad:
+    #if PY_MAJOR_VERSION < 3
+    Py_XDECREF(py_import);
+    #endif
+    Py_XDECREF(empty_list);
+    Py_XDECREF(empty_dict);
+    return module;
+}
+
+/* CLineInTraceback */
+  #ifndef CYTHON_CLINE_IN_TRACEBACK
+static int __Pyx_CLineForTraceback(CYTHON_UNUSED PyThreadState *tstate, int c_line) {
+    PyObject *use_cline;
+    PyObject *ptype, *pvalue, *ptraceback;
+#if CYTHON_COMPILING_IN_CPYTHON
+    PyObject **cython_runtime_dict;
+#endif
+    if (unlikely(!__pyx_cython_runtime)) {
+        return c_line;
+    }
+    __Pyx_ErrFetchInState(tstate, &ptype, &pvalue, &ptraceback);
+#if CYTHON_COMPILING_IN_CPYTHON
+    cython_runtime_dict = _PyObject_GetDictPtr(__pyx_cython_runtime);
+    if (likely(cython_runtime_dict)) {
+        __PYX_PY_DICT_LOOKUP_IF_MODIFIED(
+            use_cline, *cython_runtime_dict,
+            __Pyx_PyDict_GetItemStr(*cython_runtime_dict, __pyx_n_s_cline_in_traceback))
+    } else
+#endif
+    {
+      PyObject *use_cline_obj = __Pyx_PyObject_GetAttrStr(__pyx_cython_runtime, __pyx_n_s_cline_in_traceback);
+      if (use_cline_obj) {
+        use_cline = PyObject_Not(use_cline_obj) ? Py_False : Py_True;
+        Py_DECREF(use_cline_obj);
+      } else {
+        PyErr_Clear();
+        use_cline = NULL;
+      }
+    }
+    if (!use_cline) {
+        c_line = 0;
+        (void) PyObject_SetAttr(__pyx_cython_runtime, __pyx_n_s_cline_in_traceback, Py_False);
+    }
+    else if (use_cline == Py_False || (use_cline != Py_True && PyObject_Not(use_cline) != 0)) {
+        c_line = 0;
+    }
+    __Pyx_ErrRestoreInState(tstate, ptype, pvalue, ptraceback);
+    return c_line;
+}
+#endif
+
+/* CodeObjectCache */
+  static int __pyx_bisect_code_objects(__Pyx_CodeObjectCacheEntry* entries, int count, int code_line) {
+    int start = 0, mid = 0, end = count - 1;
+    if (end >= 0 && code_line > entries[end].code_line) {
+        return count;
+    }
+    while (start < end) {
+        mid = start + (end - start) / 2;
+        if (code_line < entries[mid].code_line) {
+            end = mid;
+        } else if (code_line > entries[mid].code_line) {
+             start = mid + 1;
+        } else {
+            return mid;
+        }
+    }
+    if (code_line <= entries[mid].code_line) {
+        return mid;
+    } else {
+        return mid + 1;
+    }
+}
+static PyCodeObject *__pyx_find_code_object(int code_line) {
+    PyCodeObject* code_object;
+    int pos;
+    if (unlikely(!code_line) || unlikely(!__pyx_code_cache.entries)) {
+        return NULL;
+    }
+    pos = __pyx_bisect_code_objects(__pyx_code_cache.entries, __pyx_code_cache.count, code_line);
+    if (unlikely(pos >= __pyx_code_cache.count) || unlikely(__pyx_code_cache.entries[pos].code_line != code_line)) {
+        return NULL;
+    }
+    code_object = __pyx_code_cache.entries[pos].code_object;
+    Py_INCREF(code_object);
+    return code_object;
+}
+static void __pyx_insert_code_object(int code_line, PyCodeObject* code_object) {
+    int pos, i;
+    __Pyx_CodeObjectCacheEntry* entries = __pyx_code_cache.entries;
+    if (unlikely(!code_line)) {
+        return;
+    }
+    if (unlikely(!entries)) {
+        entries = (__Pyx_CodeObjectCacheEntry*)PyMem_Malloc(64*sizeof(__Pyx_CodeObjectCacheEntry));
+        if (likely(entries)) {
+            __pyx_code_cache.entries = entries;
+            __pyx_code_cache.max_count = 64;
+            __pyx_code_cache.count = 1;
+            entries[0].code_line = code_line;
+            entries[0].code_object = code_object;
+            Py_INCREF(code_object);
+        }
+        return;
+    }
+    pos = __pyx_bisect_code_objects(__pyx_code_cache.entries, __pyx_code_cache.count, code_line);
+    if ((pos < __pyx_code_cache.count) && unlikely(__pyx_code_cache.entries[pos].code_line == code_line)) {
+        PyCodeObject* tmp = entries[pos].code_object;
+        entries[pos].code_object = code_object;
+        Py_DECREF(tmp);
+        return;
+    }
+    if (__pyx_code_cache.count == __pyx_code_cache.max_count) {
+        int new_max = __pyx_code_cache.max_count + 64;
+        entries = (__Pyx_CodeObjectCacheEntry*)PyMem_Realloc(
+            __pyx_code_cache.entries, ((size_t)new_max) * sizeof(__Pyx_CodeObjectCacheEntry));
+        if (unlikely(!entries)) {
+            return;
+        }
+        __pyx_code_cache.entries = entries;
+        __pyx_code_cache.max_count = new_max;
+    }
+    for (i=__pyx_code_cache.count; i>pos; i--) {
+        entries[i] = entries[i-1];
+    }
+    entries[pos].code_line = code_line;
+    entries[pos].code_object = code_object;
+    __pyx_code_cache.count++;
+    Py_INCREF(code_object);
+}
+
+/* AddTraceback */
+  #include "compile.h"
+#include "frameobject.h"
+#include "traceback.h"
+#if PY_VERSION_HEX >= 0x030b00a6
+  #ifndef Py_BUILD_CORE
+    #define Py_BUILD_CORE 1
+  #endif
+  #include "internal/pycore_frame.h"
+#endif
+static PyCodeObject* __Pyx_CreateCodeObjectForTraceback(
+            const char *funcname, int c_line,
+            int py_line, const char *filename) {
+    PyCodeObject *py_code = NULL;
+    PyObject *py_funcname = NULL;
+    #if PY_MAJOR_VERSION < 3
+    PyObject *py_srcfile = NULL;
+    py_srcfile = PyString_FromString(filename);
+    if (!py_srcfile) goto bad;
+    #endif
+    if (c_line) {
+        #if PY_MAJOR_VERSION < 3
+        py_funcname = PyString_FromFormat( "%s (%s:%d)", funcname, __pyx_cfilenm, c_line);
+        if (!py_funcname) goto bad;
+        #else
+        py_funcname = PyUnicode_FromFormat( "%s (%s:%d)", funcname, __pyx_cfilenm, c_line);
+        if (!py_funcname) goto bad;
+        funcname = PyUnicode_AsUTF8(py_funcname);
+        if (!funcname) goto bad;
+        #endif
+    }
+    else {
+        #if PY_MAJOR_VERSION < 3
+        py_funcname = PyString_FromString(funcname);
+        if (!py_funcname) goto bad;
+        #endif
+    }
+    #if PY_MAJOR_VERSION < 3
+    py_code = __Pyx_PyCode_New(
+        0,
+        0,
+        0,
+        0,
+        0,
+        __pyx_empty_bytes, /*PyObject *code,*/
+        __pyx_empty_tuple, /*PyObject *consts,*/
+        __pyx_empty_tuple, /*PyObject *names,*/
+        __pyx_empty_tuple, /*PyObject *varnames,*/
+        __pyx_empty_tuple, /*PyObject *freevars,*/
+        __pyx_empty_tuple, /*PyObject *cellvars,*/
+        py_srcfile,   /*PyObject *filename,*/
+        py_funcname,  /*PyObject *name,*/
+        py_line,
+        __pyx_empty_bytes  /*PyObject *lnotab*/
+    );
+    Py_DECREF(py_srcfile);
+    #else
+    py_code = PyCode_NewEmpty(filename, funcname, py_line);
+    #endif
+    Py_XDECREF(py_funcname);  // XDECREF since it's only set on Py3 if cline
+    return py_code;
+bad:
+    Py_XDECREF(py_funcname);
+    #if PY_MAJOR_VERSION < 3
+    Py_XDECREF(py_srcfile);
+    #endif
+    return NULL;
+}
+static void __Pyx_AddTraceback(const char *funcname, int c_line,
+                               int py_line, const char *filename) {
+    PyCodeObject *py_code = 0;
+    PyFrameObject *py_frame = 0;
+    PyThreadState *tstate = __Pyx_PyThreadState_Current;
+    PyObject *ptype, *pvalue, *ptraceback;
+    if (c_line) {
+        c_line = __Pyx_CLineForTraceback(tstate, c_line);
+    }
+    py_code = __pyx_find_code_object(c_line ? -c_line : py_line);
+    if (!py_code) {
+        __Pyx_ErrFetchInState(tstate, &ptype, &pvalue, &ptraceback);
+        py_code = __Pyx_CreateCodeObjectForTraceback(
+            funcname, c_line, py_line, filename);
+        if (!py_code) {
+            /* If the code object creation fails, then we should clear the
+               fetched exception references and propagate the new exception */
+            Py_XDECREF(ptype);
+            Py_XDECREF(pvalue);
+            Py_XDECREF(ptraceback);
+            goto bad;
+        }
+        __Pyx_ErrRestoreInState(tstate, ptype, pvalue, ptraceback);
+        __pyx_insert_code_object(c_line ? -c_line : py_line, py_code);
+    }
+    py_frame = PyFrame_New(
+        tstate,            /*PyThreadState *tstate,*/
+        py_code,           /*PyCodeObject *code,*/
+        __pyx_d,    /*PyObject *globals,*/
+        0                  /*PyObject *locals*/
+    );
+    if (!py_frame) goto bad;
+    __Pyx_PyFrame_SetLineNumber(py_frame, py_line);
+    PyTraceBack_Here(py_frame);
+bad:
+    Py_XDECREF(py_code);
+    Py_XDECREF(py_frame);
+}
+
+#if PY_MAJOR_VERSION < 3
+static int __Pyx_GetBuffer(PyObject *obj, Py_buffer *view, int flags) {
+    if (PyObject_CheckBuffer(obj)) return PyObject_GetBuffer(obj, view, flags);
+        if (__Pyx_TypeCheck(obj, __pyx_ptype_5numpy_ndarray)) return __pyx_pw_5numpy_7ndarray_1__getbuffer__(obj, view, flags);
+    PyErr_Format(PyExc_TypeError, "'%.200s' does not have the buffer interface", Py_TYPE(obj)->tp_name);
+    return -1;
+}
+static void __Pyx_ReleaseBuffer(Py_buffer *view) {
+    PyObject *obj = view->obj;
+    if (!obj) return;
+    if (PyObject_CheckBuffer(obj)) {
+        PyBuffer_Release(view);
+        return;
+    }
+    if ((0)) {}
+        else if (__Pyx_TypeCheck(obj, __pyx_ptype_5numpy_ndarray)) __pyx_pw_5numpy_7ndarray_3__releasebuffer__(obj, view);
+    view->obj = NULL;
+    Py_DECREF(obj);
+}
+#endif
+
+
+  /* CIntFromPyVerify */
+  #define __PYX_VERIFY_RETURN_INT(target_type, func_type, func_value)\
+    __PYX__VERIFY_RETURN_INT(target_type, func_type, func_value, 0)
+#define __PYX_VERIFY_RETURN_INT_EXC(target_type, func_type, func_value)\
+    __PYX__VERIFY_RETURN_INT(target_type, func_type, func_value, 1)
+#define __PYX__VERIFY_RETURN_INT(target_type, func_type, func_value, exc)\
+    {\
+        func_type value = func_value;\
+        if (sizeof(target_type) < sizeof(func_type)) {\
+            if (unlikely(value != (func_type) (target_type) value)) {\
+                func_type zero = 0;\
+                if (exc && unlikely(value == (func_type)-1 && PyErr_Occurred()))\
+                    return (target_type) -1;\
+                if (is_unsigned && unlikely(value < zero))\
+                    goto raise_neg_overflow;\
+                else\
+                    goto raise_overflow;\
+            }\
+        }\
+        return (target_type) value;\
+    }
+
+/* Declarations */
+  #if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    static CYTHON_INLINE __pyx_t_float_complex __pyx_t_float_complex_from_parts(float x, float y) {
+      return ::std::complex< float >(x, y);
+    }
+  #else
+    static CYTHON_INLINE __pyx_t_float_complex __pyx_t_float_complex_from_parts(float x, float y) {
+      return x + y*(__pyx_t_float_complex)_Complex_I;
+    }
+  #endif
+#else
+    static CYTHON_INLINE __pyx_t_float_complex __pyx_t_float_complex_from_parts(float x, float y) {
+      __pyx_t_float_complex z;
+      z.real = x;
+      z.imag = y;
+      return z;
+    }
+#endif
+
+/* Arithmetic */
+  #if CYTHON_CCOMPLEX
+#else
+    static CYTHON_INLINE int __Pyx_c_eq_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+       return (a.real == b.real) && (a.imag == b.imag);
+    }
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_sum_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+        __pyx_t_float_complex z;
+        z.real = a.real + b.real;
+        z.imag = a.imag + b.imag;
+        return z;
+    }
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_diff_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+        __pyx_t_float_complex z;
+        z.real = a.real - b.real;
+        z.imag = a.imag - b.imag;
+        return z;
+    }
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_prod_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+        __pyx_t_float_complex z;
+        z.real = a.real * b.real - a.imag * b.imag;
+        z.imag = a.real * b.imag + a.imag * b.real;
+        return z;
+    }
+    #if 1
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_quot_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+        if (b.imag == 0) {
+            return __pyx_t_float_complex_from_parts(a.real / b.real, a.imag / b.real);
+        } else if (fabsf(b.real) >= fabsf(b.imag)) {
+            if (b.real == 0 && b.imag == 0) {
+                return __pyx_t_float_complex_from_parts(a.real / b.real, a.imag / b.imag);
+            } else {
+                float r = b.imag / b.real;
+                float s = (float)(1.0) / (b.real + b.imag * r);
+                return __pyx_t_float_complex_from_parts(
+                    (a.real + a.imag * r) * s, (a.imag - a.real * r) * s);
+            }
+        } else {
+            float r = b.real / b.imag;
+            float s = (float)(1.0) / (b.imag + b.real * r);
+            return __pyx_t_float_complex_from_parts(
+                (a.real * r + a.imag) * s, (a.imag * r - a.real) * s);
+        }
+    }
+    #else
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_quot_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+        if (b.imag == 0) {
+            return __pyx_t_float_complex_from_parts(a.real / b.real, a.imag / b.real);
+        } else {
+            float denom = b.real * b.real + b.imag * b.imag;
+            return __pyx_t_float_complex_from_parts(
+                (a.real * b.real + a.imag * b.imag) / denom,
+                (a.imag * b.real - a.real * b.imag) / denom);
+        }
+    }
+    #endif
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_neg_float(__pyx_t_float_complex a) {
+        __pyx_t_float_complex z;
+        z.real = -a.real;
+        z.imag = -a.imag;
+        return z;
+    }
+    static CYTHON_INLINE int __Pyx_c_is_zero_float(__pyx_t_float_complex a) {
+       return (a.real == 0) && (a.imag == 0);
+    }
+    static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_conj_float(__pyx_t_float_complex a) {
+        __pyx_t_float_complex z;
+        z.real =  a.real;
+        z.imag = -a.imag;
+        return z;
+    }
+    #if 1
+        static CYTHON_INLINE float __Pyx_c_abs_float(__pyx_t_float_complex z) {
+          #if !defined(HAVE_HYPOT) || defined(_MSC_VER)
+            return sqrtf(z.real*z.real + z.imag*z.imag);
+          #else
+            return hypotf(z.real, z.imag);
+          #endif
+        }
+        static CYTHON_INLINE __pyx_t_float_complex __Pyx_c_pow_float(__pyx_t_float_complex a, __pyx_t_float_complex b) {
+            __pyx_t_float_complex z;
+            float r, lnr, theta, z_r, z_theta;
+            if (b.imag == 0 && b.real == (int)b.real) {
+                if (b.real < 0) {
+                    float denom = a.real * a.real + a.imag * a.imag;
+                    a.real = a.real / denom;
+                    a.imag = -a.imag / denom;
+                    b.real = -b.real;
+                }
+                switch ((int)b.real) {
+                    case 0:
+                        z.real = 1;
+                        z.imag = 0;
+                        return z;
+                    case 1:
+                        return a;
+                    case 2:
+                        return __Pyx_c_prod_float(a, a);
+                    case 3:
+                        z = __Pyx_c_prod_float(a, a);
+                        return __Pyx_c_prod_float(z, a);
+                    case 4:
+                        z = __Pyx_c_prod_float(a, a);
+                        return __Pyx_c_prod_float(z, z);
+                }
+            }
+            if (a.imag == 0) {
+                if (a.real == 0) {
+                    return a;
+                } else if ((b.imag == 0) && (a.real >= 0)) {
+                    z.real = powf(a.real, b.real);
+                    z.imag = 0;
+                    return z;
+                } else if (a.real > 0) {
+                    r = a.real;
+                    theta = 0;
+                } else {
+                    r = -a.real;
+                    theta = atan2f(0.0, -1.0);
+                }
+            } else {
+                r = __Pyx_c_abs_float(a);
+                theta = atan2f(a.imag, a.real);
+            }
+            lnr = logf(r);
+            z_r = expf(lnr * b.real - theta * b.imag);
+            z_theta = theta * b.real + lnr * b.imag;
+            z.real = z_r * cosf(z_theta);
+            z.imag = z_r * sinf(z_theta);
+            return z;
+        }
+    #endif
+#endif
+
+/* Declarations */
+  #if CYTHON_CCOMPLEX
+  #ifdef __cplusplus
+    static CYTHON_INLINE __pyx_t_double_complex __pyx_t_double_complex_from_parts(double x, double y) {
+      return ::std::complex< double >(x, y);
+    }
+  #else
+    static CYTHON_INLINE __pyx_t_double_complex __pyx_t_double_complex_from_parts(double x, double y) {
+      return x + y*(__pyx_t_double_complex)_Complex_I;
+    }
+  #endif
+#else
+    static CYTHON_INLINE __pyx_t_double_complex __pyx_t_double_complex_from_parts(double x, double y) {
+      __pyx_t_double_complex z;
+      z.real = x;
+      z.imag = y;
+      return z;
+    }
+#endif
+
+/* Arithmetic */
+  #if CYTHON_CCOMPLEX
+#else
+    static CYTHON_INLINE int __Pyx_c_eq_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+       return (a.real == b.real) && (a.imag == b.imag);
+    }
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_sum_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+        __pyx_t_double_complex z;
+        z.real = a.real + b.real;
+        z.imag = a.imag + b.imag;
+        return z;
+    }
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_diff_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+        __pyx_t_double_complex z;
+        z.real = a.real - b.real;
+        z.imag = a.imag - b.imag;
+        return z;
+    }
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_prod_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+        __pyx_t_double_complex z;
+        z.real = a.real * b.real - a.imag * b.imag;
+        z.imag = a.real * b.imag + a.imag * b.real;
+        return z;
+    }
+    #if 1
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_quot_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+        if (b.imag == 0) {
+            return __pyx_t_double_complex_from_parts(a.real / b.real, a.imag / b.real);
+        } else if (fabs(b.real) >= fabs(b.imag)) {
+            if (b.real == 0 && b.imag == 0) {
+                return __pyx_t_double_complex_from_parts(a.real / b.real, a.imag / b.imag);
+            } else {
+                double r = b.imag / b.real;
+                double s = (double)(1.0) / (b.real + b.imag * r);
+                return __pyx_t_double_complex_from_parts(
+                    (a.real + a.imag * r) * s, (a.imag - a.real * r) * s);
+            }
+        } else {
+            double r = b.real / b.imag;
+            double s = (double)(1.0) / (b.imag + b.real * r);
+            return __pyx_t_double_complex_from_parts(
+                (a.real * r + a.imag) * s, (a.imag * r - a.real) * s);
+        }
+    }
+    #else
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_quot_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+        if (b.imag == 0) {
+            return __pyx_t_double_complex_from_parts(a.real / b.real, a.imag / b.real);
+        } else {
+            double denom = b.real * b.real + b.imag * b.imag;
+            return __pyx_t_double_complex_from_parts(
+                (a.real * b.real + a.imag * b.imag) / denom,
+                (a.imag * b.real - a.real * b.imag) / denom);
+        }
+    }
+    #endif
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_neg_double(__pyx_t_double_complex a) {
+        __pyx_t_double_complex z;
+        z.real = -a.real;
+        z.imag = -a.imag;
+        return z;
+    }
+    static CYTHON_INLINE int __Pyx_c_is_zero_double(__pyx_t_double_complex a) {
+       return (a.real == 0) && (a.imag == 0);
+    }
+    static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_conj_double(__pyx_t_double_complex a) {
+        __pyx_t_double_complex z;
+        z.real =  a.real;
+        z.imag = -a.imag;
+        return z;
+    }
+    #if 1
+        static CYTHON_INLINE double __Pyx_c_abs_double(__pyx_t_double_complex z) {
+          #if !defined(HAVE_HYPOT) || defined(_MSC_VER)
+            return sqrt(z.real*z.real + z.imag*z.imag);
+          #else
+            return hypot(z.real, z.imag);
+          #endif
+        }
+        static CYTHON_INLINE __pyx_t_double_complex __Pyx_c_pow_double(__pyx_t_double_complex a, __pyx_t_double_complex b) {
+            __pyx_t_double_complex z;
+            double r, lnr, theta, z_r, z_theta;
+            if (b.imag == 0 && b.real == (int)b.real) {
+                if (b.real < 0) {
+                    double denom = a.real * a.real + a.imag * a.imag;
+                    a.real = a.real / denom;
+                    a.imag = -a.imag / denom;
+                    b.real = -b.real;
+                }
+                switch ((int)b.real) {
+                    case 0:
+                        z.real = 1;
+                        z.imag = 0;
+                        return z;
+                    case 1:
+                        return a;
+                    case 2:
+                        return __Pyx_c_prod_double(a, a);
+                    case 3:
+                        z = __Pyx_c_prod_double(a, a);
+                        return __Pyx_c_prod_double(z, a);
+                    case 4:
+                        z = __Pyx_c_prod_double(a, a);
+                        return __Pyx_c_prod_double(z, z);
+                }
+            }
+            if (a.imag == 0) {
+                if (a.real == 0) {
+                    return a;
+                } else if ((b.imag == 0) && (a.real >= 0)) {
+                    z.real = pow(a.real, b.real);
+                    z.imag = 0;
+                    return z;
+                } else if (a.real > 0) {
+                    r = a.real;
+                    theta = 0;
+                } else {
+                    r = -a.real;
+                    theta = atan2(0.0, -1.0);
+                }
+            } else {
+                r = __Pyx_c_abs_double(a);
+                theta = atan2(a.imag, a.real);
+            }
+            lnr = log(r);
+            z_r = exp(lnr * b.real - theta * b.imag);
+            z_theta = theta * b.real + lnr * b.imag;
+            z.real = z_r * cos(z_theta);
+            z.imag = z_r * sin(z_theta);
+            return z;
+        }
+    #endif
+#endif
+
+/* CIntFromPy */
+  static CYTHON_INLINE int __Pyx_PyInt_As_int(PyObject *x) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const int neg_one = (int) -1, const_zero = (int) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+#if PY_MAJOR_VERSION < 3
+    if (likely(PyInt_Check(x))) {
+        if (sizeof(int) < sizeof(long)) {
+            __PYX_VERIFY_RETURN_INT(int, long, PyInt_AS_LONG(x))
+        } else {
+            long val = PyInt_AS_LONG(x);
+            if (is_unsigned && unlikely(val < 0)) {
+                goto raise_neg_overflow;
+            }
+            return (int) val;
+        }
+    } else
+#endif
+    if (likely(PyLong_Check(x))) {
+        if (is_unsigned) {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (int) 0;
+                case  1: __PYX_VERIFY_RETURN_INT(int, digit, digits[0])
+                case 2:
+                    if (8 * sizeof(int) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) >= 2 * PyLong_SHIFT) {
+                            return (int) (((((int)digits[1]) << PyLong_SHIFT) | (int)digits[0]));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(int) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) >= 3 * PyLong_SHIFT) {
+                            return (int) (((((((int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0]));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(int) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) >= 4 * PyLong_SHIFT) {
+                            return (int) (((((((((int)digits[3]) << PyLong_SHIFT) | (int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0]));
+                        }
+                    }
+                    break;
+            }
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX < 0x030C00A7
+            if (unlikely(Py_SIZE(x) < 0)) {
+                goto raise_neg_overflow;
+            }
+#else
+            {
+                int result = PyObject_RichCompareBool(x, Py_False, Py_LT);
+                if (unlikely(result < 0))
+                    return (int) -1;
+                if (unlikely(result == 1))
+                    goto raise_neg_overflow;
+            }
+#endif
+            if (sizeof(int) <= sizeof(unsigned long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(int, unsigned long, PyLong_AsUnsignedLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(int) <= sizeof(unsigned PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(int, unsigned PY_LONG_LONG, PyLong_AsUnsignedLongLong(x))
+#endif
+            }
+        } else {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (int) 0;
+                case -1: __PYX_VERIFY_RETURN_INT(int, sdigit, (sdigit) (-(sdigit)digits[0]))
+                case  1: __PYX_VERIFY_RETURN_INT(int,  digit, +digits[0])
+                case -2:
+                    if (8 * sizeof(int) - 1 > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, long, -(long) (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 2 * PyLong_SHIFT) {
+                            return (int) (((int)-1)*(((((int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+                case 2:
+                    if (8 * sizeof(int) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 2 * PyLong_SHIFT) {
+                            return (int) ((((((int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+                case -3:
+                    if (8 * sizeof(int) - 1 > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, long, -(long) (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 3 * PyLong_SHIFT) {
+                            return (int) (((int)-1)*(((((((int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(int) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 3 * PyLong_SHIFT) {
+                            return (int) ((((((((int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+                case -4:
+                    if (8 * sizeof(int) - 1 > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, long, -(long) (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 4 * PyLong_SHIFT) {
+                            return (int) (((int)-1)*(((((((((int)digits[3]) << PyLong_SHIFT) | (int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(int) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(int, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(int) - 1 > 4 * PyLong_SHIFT) {
+                            return (int) ((((((((((int)digits[3]) << PyLong_SHIFT) | (int)digits[2]) << PyLong_SHIFT) | (int)digits[1]) << PyLong_SHIFT) | (int)digits[0])));
+                        }
+                    }
+                    break;
+            }
+#endif
+            if (sizeof(int) <= sizeof(long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(int, long, PyLong_AsLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(int) <= sizeof(PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(int, PY_LONG_LONG, PyLong_AsLongLong(x))
+#endif
+            }
+        }
+        {
+#if CYTHON_COMPILING_IN_PYPY && !defined(_PyLong_AsByteArray)
+            PyErr_SetString(PyExc_RuntimeError,
+                            "_PyLong_AsByteArray() not available in PyPy, cannot convert large numbers");
+#else
+            int val;
+            PyObject *v = __Pyx_PyNumber_IntOrLong(x);
+ #if PY_MAJOR_VERSION < 3
+            if (likely(v) && !PyLong_Check(v)) {
+                PyObject *tmp = v;
+                v = PyNumber_Long(tmp);
+                Py_DECREF(tmp);
+            }
+ #endif
+            if (likely(v)) {
+                int one = 1; int is_little = (int)*(unsigned char *)&one;
+                unsigned char *bytes = (unsigned char *)&val;
+                int ret = _PyLong_AsByteArray((PyLongObject *)v,
+                                              bytes, sizeof(val),
+                                              is_little, !is_unsigned);
+                Py_DECREF(v);
+                if (likely(!ret))
+                    return val;
+            }
+#endif
+            return (int) -1;
+        }
+    } else {
+        int val;
+        PyObject *tmp = __Pyx_PyNumber_IntOrLong(x);
+        if (!tmp) return (int) -1;
+        val = __Pyx_PyInt_As_int(tmp);
+        Py_DECREF(tmp);
+        return val;
+    }
+raise_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "value too large to convert to int");
+    return (int) -1;
+raise_neg_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "can't convert negative value to int");
+    return (int) -1;
+}
+
+/* CIntFromPy */
+  static CYTHON_INLINE PY_LONG_LONG __Pyx_PyInt_As_PY_LONG_LONG(PyObject *x) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const PY_LONG_LONG neg_one = (PY_LONG_LONG) -1, const_zero = (PY_LONG_LONG) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+#if PY_MAJOR_VERSION < 3
+    if (likely(PyInt_Check(x))) {
+        if (sizeof(PY_LONG_LONG) < sizeof(long)) {
+            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, long, PyInt_AS_LONG(x))
+        } else {
+            long val = PyInt_AS_LONG(x);
+            if (is_unsigned && unlikely(val < 0)) {
+                goto raise_neg_overflow;
+            }
+            return (PY_LONG_LONG) val;
+        }
+    } else
+#endif
+    if (likely(PyLong_Check(x))) {
+        if (is_unsigned) {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (PY_LONG_LONG) 0;
+                case  1: __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, digit, digits[0])
+                case 2:
+                    if (8 * sizeof(PY_LONG_LONG) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) >= 2 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((((PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0]));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(PY_LONG_LONG) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) >= 3 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((((((PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0]));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(PY_LONG_LONG) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) >= 4 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((((((((PY_LONG_LONG)digits[3]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0]));
+                        }
+                    }
+                    break;
+            }
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX < 0x030C00A7
+            if (unlikely(Py_SIZE(x) < 0)) {
+                goto raise_neg_overflow;
+            }
+#else
+            {
+                int result = PyObject_RichCompareBool(x, Py_False, Py_LT);
+                if (unlikely(result < 0))
+                    return (PY_LONG_LONG) -1;
+                if (unlikely(result == 1))
+                    goto raise_neg_overflow;
+            }
+#endif
+            if (sizeof(PY_LONG_LONG) <= sizeof(unsigned long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(PY_LONG_LONG, unsigned long, PyLong_AsUnsignedLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(PY_LONG_LONG) <= sizeof(unsigned PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(PY_LONG_LONG, unsigned PY_LONG_LONG, PyLong_AsUnsignedLongLong(x))
+#endif
+            }
+        } else {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (PY_LONG_LONG) 0;
+                case -1: __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, sdigit, (sdigit) (-(sdigit)digits[0]))
+                case  1: __PYX_VERIFY_RETURN_INT(PY_LONG_LONG,  digit, +digits[0])
+                case -2:
+                    if (8 * sizeof(PY_LONG_LONG) - 1 > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, long, -(long) (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 2 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((PY_LONG_LONG)-1)*(((((PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+                case 2:
+                    if (8 * sizeof(PY_LONG_LONG) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 2 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) ((((((PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+                case -3:
+                    if (8 * sizeof(PY_LONG_LONG) - 1 > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, long, -(long) (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 3 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((PY_LONG_LONG)-1)*(((((((PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(PY_LONG_LONG) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 3 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) ((((((((PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+                case -4:
+                    if (8 * sizeof(PY_LONG_LONG) - 1 > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, long, -(long) (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 4 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) (((PY_LONG_LONG)-1)*(((((((((PY_LONG_LONG)digits[3]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(PY_LONG_LONG) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(PY_LONG_LONG, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(PY_LONG_LONG) - 1 > 4 * PyLong_SHIFT) {
+                            return (PY_LONG_LONG) ((((((((((PY_LONG_LONG)digits[3]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[2]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[1]) << PyLong_SHIFT) | (PY_LONG_LONG)digits[0])));
+                        }
+                    }
+                    break;
+            }
+#endif
+            if (sizeof(PY_LONG_LONG) <= sizeof(long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(PY_LONG_LONG, long, PyLong_AsLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(PY_LONG_LONG) <= sizeof(PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(PY_LONG_LONG, PY_LONG_LONG, PyLong_AsLongLong(x))
+#endif
+            }
+        }
+        {
+#if CYTHON_COMPILING_IN_PYPY && !defined(_PyLong_AsByteArray)
+            PyErr_SetString(PyExc_RuntimeError,
+                            "_PyLong_AsByteArray() not available in PyPy, cannot convert large numbers");
+#else
+            PY_LONG_LONG val;
+            PyObject *v = __Pyx_PyNumber_IntOrLong(x);
+ #if PY_MAJOR_VERSION < 3
+            if (likely(v) && !PyLong_Check(v)) {
+                PyObject *tmp = v;
+                v = PyNumber_Long(tmp);
+                Py_DECREF(tmp);
+            }
+ #endif
+            if (likely(v)) {
+                int one = 1; int is_little = (int)*(unsigned char *)&one;
+                unsigned char *bytes = (unsigned char *)&val;
+                int ret = _PyLong_AsByteArray((PyLongObject *)v,
+                                              bytes, sizeof(val),
+                                              is_little, !is_unsigned);
+                Py_DECREF(v);
+                if (likely(!ret))
+                    return val;
+            }
+#endif
+            return (PY_LONG_LONG) -1;
+        }
+    } else {
+        PY_LONG_LONG val;
+        PyObject *tmp = __Pyx_PyNumber_IntOrLong(x);
+        if (!tmp) return (PY_LONG_LONG) -1;
+        val = __Pyx_PyInt_As_PY_LONG_LONG(tmp);
+        Py_DECREF(tmp);
+        return val;
+    }
+raise_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "value too large to convert to PY_LONG_LONG");
+    return (PY_LONG_LONG) -1;
+raise_neg_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "can't convert negative value to PY_LONG_LONG");
+    return (PY_LONG_LONG) -1;
+}
+
+/* CIntToPy */
+  static CYTHON_INLINE PyObject* __Pyx_PyInt_From_int(int value) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const int neg_one = (int) -1, const_zero = (int) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+    if (is_unsigned) {
+        if (sizeof(int) < sizeof(long)) {
+            return PyInt_FromLong((long) value);
+        } else if (sizeof(int) <= sizeof(unsigned long)) {
+            return PyLong_FromUnsignedLong((unsigned long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(int) <= sizeof(unsigned PY_LONG_LONG)) {
+            return PyLong_FromUnsignedLongLong((unsigned PY_LONG_LONG) value);
+#endif
+        }
+    } else {
+        if (sizeof(int) <= sizeof(long)) {
+            return PyInt_FromLong((long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(int) <= sizeof(PY_LONG_LONG)) {
+            return PyLong_FromLongLong((PY_LONG_LONG) value);
+#endif
+        }
+    }
+    {
+        int one = 1; int little = (int)*(unsigned char *)&one;
+        unsigned char *bytes = (unsigned char *)&value;
+        return _PyLong_FromByteArray(bytes, sizeof(int),
+                                     little, !is_unsigned);
+    }
+}
+
+/* CIntToPy */
+  static CYTHON_INLINE PyObject* __Pyx_PyInt_From_PY_LONG_LONG(PY_LONG_LONG value) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const PY_LONG_LONG neg_one = (PY_LONG_LONG) -1, const_zero = (PY_LONG_LONG) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+    if (is_unsigned) {
+        if (sizeof(PY_LONG_LONG) < sizeof(long)) {
+            return PyInt_FromLong((long) value);
+        } else if (sizeof(PY_LONG_LONG) <= sizeof(unsigned long)) {
+            return PyLong_FromUnsignedLong((unsigned long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(PY_LONG_LONG) <= sizeof(unsigned PY_LONG_LONG)) {
+            return PyLong_FromUnsignedLongLong((unsigned PY_LONG_LONG) value);
+#endif
+        }
+    } else {
+        if (sizeof(PY_LONG_LONG) <= sizeof(long)) {
+            return PyInt_FromLong((long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(PY_LONG_LONG) <= sizeof(PY_LONG_LONG)) {
+            return PyLong_FromLongLong((PY_LONG_LONG) value);
+#endif
+        }
+    }
+    {
+        int one = 1; int little = (int)*(unsigned char *)&one;
+        unsigned char *bytes = (unsigned char *)&value;
+        return _PyLong_FromByteArray(bytes, sizeof(PY_LONG_LONG),
+                                     little, !is_unsigned);
+    }
+}
+
+/* CIntToPy */
+  static CYTHON_INLINE PyObject* __Pyx_PyInt_From_npy_int64(npy_int64 value) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const npy_int64 neg_one = (npy_int64) -1, const_zero = (npy_int64) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+    if (is_unsigned) {
+        if (sizeof(npy_int64) < sizeof(long)) {
+            return PyInt_FromLong((long) value);
+        } else if (sizeof(npy_int64) <= sizeof(unsigned long)) {
+            return PyLong_FromUnsignedLong((unsigned long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(npy_int64) <= sizeof(unsigned PY_LONG_LONG)) {
+            return PyLong_FromUnsignedLongLong((unsigned PY_LONG_LONG) value);
+#endif
+        }
+    } else {
+        if (sizeof(npy_int64) <= sizeof(long)) {
+            return PyInt_FromLong((long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(npy_int64) <= sizeof(PY_LONG_LONG)) {
+            return PyLong_FromLongLong((PY_LONG_LONG) value);
+#endif
+        }
+    }
+    {
+        int one = 1; int little = (int)*(unsigned char *)&one;
+        unsigned char *bytes = (unsigned char *)&value;
+        return _PyLong_FromByteArray(bytes, sizeof(npy_int64),
+                                     little, !is_unsigned);
+    }
+}
+
+/* CIntToPy */
+  static CYTHON_INLINE PyObject* __Pyx_PyInt_From_enum__NPY_TYPES(enum NPY_TYPES value) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const enum NPY_TYPES neg_one = (enum NPY_TYPES) -1, const_zero = (enum NPY_TYPES) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+    if (is_unsigned) {
+        if (sizeof(enum NPY_TYPES) < sizeof(long)) {
+            return PyInt_FromLong((long) value);
+        } else if (sizeof(enum NPY_TYPES) <= sizeof(unsigned long)) {
+            return PyLong_FromUnsignedLong((unsigned long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(enum NPY_TYPES) <= sizeof(unsigned PY_LONG_LONG)) {
+            return PyLong_FromUnsignedLongLong((unsigned PY_LONG_LONG) value);
+#endif
+        }
+    } else {
+        if (sizeof(enum NPY_TYPES) <= sizeof(long)) {
+            return PyInt_FromLong((long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(enum NPY_TYPES) <= sizeof(PY_LONG_LONG)) {
+            return PyLong_FromLongLong((PY_LONG_LONG) value);
+#endif
+        }
+    }
+    {
+        int one = 1; int little = (int)*(unsigned char *)&one;
+        unsigned char *bytes = (unsigned char *)&value;
+        return _PyLong_FromByteArray(bytes, sizeof(enum NPY_TYPES),
+                                     little, !is_unsigned);
+    }
+}
+
+/* CIntToPy */
+  static CYTHON_INLINE PyObject* __Pyx_PyInt_From_long(long value) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const long neg_one = (long) -1, const_zero = (long) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+    if (is_unsigned) {
+        if (sizeof(long) < sizeof(long)) {
+            return PyInt_FromLong((long) value);
+        } else if (sizeof(long) <= sizeof(unsigned long)) {
+            return PyLong_FromUnsignedLong((unsigned long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(long) <= sizeof(unsigned PY_LONG_LONG)) {
+            return PyLong_FromUnsignedLongLong((unsigned PY_LONG_LONG) value);
+#endif
+        }
+    } else {
+        if (sizeof(long) <= sizeof(long)) {
+            return PyInt_FromLong((long) value);
+#ifdef HAVE_LONG_LONG
+        } else if (sizeof(long) <= sizeof(PY_LONG_LONG)) {
+            return PyLong_FromLongLong((PY_LONG_LONG) value);
+#endif
+        }
+    }
+    {
+        int one = 1; int little = (int)*(unsigned char *)&one;
+        unsigned char *bytes = (unsigned char *)&value;
+        return _PyLong_FromByteArray(bytes, sizeof(long),
+                                     little, !is_unsigned);
+    }
+}
+
+/* CIntFromPy */
+  static CYTHON_INLINE long __Pyx_PyInt_As_long(PyObject *x) {
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wconversion"
+#endif
+    const long neg_one = (long) -1, const_zero = (long) 0;
+#ifdef __Pyx_HAS_GCC_DIAGNOSTIC
+#pragma GCC diagnostic pop
+#endif
+    const int is_unsigned = neg_one > const_zero;
+#if PY_MAJOR_VERSION < 3
+    if (likely(PyInt_Check(x))) {
+        if (sizeof(long) < sizeof(long)) {
+            __PYX_VERIFY_RETURN_INT(long, long, PyInt_AS_LONG(x))
+        } else {
+            long val = PyInt_AS_LONG(x);
+            if (is_unsigned && unlikely(val < 0)) {
+                goto raise_neg_overflow;
+            }
+            return (long) val;
+        }
+    } else
+#endif
+    if (likely(PyLong_Check(x))) {
+        if (is_unsigned) {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (long) 0;
+                case  1: __PYX_VERIFY_RETURN_INT(long, digit, digits[0])
+                case 2:
+                    if (8 * sizeof(long) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) >= 2 * PyLong_SHIFT) {
+                            return (long) (((((long)digits[1]) << PyLong_SHIFT) | (long)digits[0]));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(long) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) >= 3 * PyLong_SHIFT) {
+                            return (long) (((((((long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0]));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(long) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) >= 4 * PyLong_SHIFT) {
+                            return (long) (((((((((long)digits[3]) << PyLong_SHIFT) | (long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0]));
+                        }
+                    }
+                    break;
+            }
+#endif
+#if CYTHON_COMPILING_IN_CPYTHON && PY_VERSION_HEX < 0x030C00A7
+            if (unlikely(Py_SIZE(x) < 0)) {
+                goto raise_neg_overflow;
+            }
+#else
+            {
+                int result = PyObject_RichCompareBool(x, Py_False, Py_LT);
+                if (unlikely(result < 0))
+                    return (long) -1;
+                if (unlikely(result == 1))
+                    goto raise_neg_overflow;
+            }
+#endif
+            if (sizeof(long) <= sizeof(unsigned long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(long, unsigned long, PyLong_AsUnsignedLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(long) <= sizeof(unsigned PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(long, unsigned PY_LONG_LONG, PyLong_AsUnsignedLongLong(x))
+#endif
+            }
+        } else {
+#if CYTHON_USE_PYLONG_INTERNALS
+            const digit* digits = ((PyLongObject*)x)->ob_digit;
+            switch (Py_SIZE(x)) {
+                case  0: return (long) 0;
+                case -1: __PYX_VERIFY_RETURN_INT(long, sdigit, (sdigit) (-(sdigit)digits[0]))
+                case  1: __PYX_VERIFY_RETURN_INT(long,  digit, +digits[0])
+                case -2:
+                    if (8 * sizeof(long) - 1 > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, long, -(long) (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 2 * PyLong_SHIFT) {
+                            return (long) (((long)-1)*(((((long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+                case 2:
+                    if (8 * sizeof(long) > 1 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 2 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 2 * PyLong_SHIFT) {
+                            return (long) ((((((long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+                case -3:
+                    if (8 * sizeof(long) - 1 > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, long, -(long) (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 3 * PyLong_SHIFT) {
+                            return (long) (((long)-1)*(((((((long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+                case 3:
+                    if (8 * sizeof(long) > 2 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 3 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((((unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 3 * PyLong_SHIFT) {
+                            return (long) ((((((((long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+                case -4:
+                    if (8 * sizeof(long) - 1 > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, long, -(long) (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 4 * PyLong_SHIFT) {
+                            return (long) (((long)-1)*(((((((((long)digits[3]) << PyLong_SHIFT) | (long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+                case 4:
+                    if (8 * sizeof(long) > 3 * PyLong_SHIFT) {
+                        if (8 * sizeof(unsigned long) > 4 * PyLong_SHIFT) {
+                            __PYX_VERIFY_RETURN_INT(long, unsigned long, (((((((((unsigned long)digits[3]) << PyLong_SHIFT) | (unsigned long)digits[2]) << PyLong_SHIFT) | (unsigned long)digits[1]) << PyLong_SHIFT) | (unsigned long)digits[0])))
+                        } else if (8 * sizeof(long) - 1 > 4 * PyLong_SHIFT) {
+                            return (long) ((((((((((long)digits[3]) << PyLong_SHIFT) | (long)digits[2]) << PyLong_SHIFT) | (long)digits[1]) << PyLong_SHIFT) | (long)digits[0])));
+                        }
+                    }
+                    break;
+            }
+#endif
+            if (sizeof(long) <= sizeof(long)) {
+                __PYX_VERIFY_RETURN_INT_EXC(long, long, PyLong_AsLong(x))
+#ifdef HAVE_LONG_LONG
+            } else if (sizeof(long) <= sizeof(PY_LONG_LONG)) {
+                __PYX_VERIFY_RETURN_INT_EXC(long, PY_LONG_LONG, PyLong_AsLongLong(x))
+#endif
+            }
+        }
+        {
+#if CYTHON_COMPILING_IN_PYPY && !defined(_PyLong_AsByteArray)
+            PyErr_SetString(PyExc_RuntimeError,
+                            "_PyLong_AsByteArray() not available in PyPy, cannot convert large numbers");
+#else
+            long val;
+            PyObject *v = __Pyx_PyNumber_IntOrLong(x);
+ #if PY_MAJOR_VERSION < 3
+            if (likely(v) && !PyLong_Check(v)) {
+                PyObject *tmp = v;
+                v = PyNumber_Long(tmp);
+                Py_DECREF(tmp);
+            }
+ #endif
+            if (likely(v)) {
+                int one = 1; int is_little = (int)*(unsigned char *)&one;
+                unsigned char *bytes = (unsigned char *)&val;
+                int ret = _PyLong_AsByteArray((PyLongObject *)v,
+                                              bytes, sizeof(val),
+                                              is_little, !is_unsigned);
+                Py_DECREF(v);
+                if (likely(!ret))
+                    return val;
+            }
+#endif
+            return (long) -1;
+        }
+    } else {
+        long val;
+        PyObject *tmp = __Pyx_PyNumber_IntOrLong(x);
+        if (!tmp) return (long) -1;
+        val = __Pyx_PyInt_As_long(tmp);
+        Py_DECREF(tmp);
+        return val;
+    }
+raise_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "value too large to convert to long");
+    return (long) -1;
+raise_neg_overflow:
+    PyErr_SetString(PyExc_OverflowError,
+        "can't convert negative value to long");
+    return (long) -1;
+}
+
+/* FastTypeChecks */
+  #if CYTHON_COMPILING_IN_CPYTHON
+static int __Pyx_InBases(PyTypeObject *a, PyTypeObject *b) {
+    while (a) {
+        a = a->tp_base;
+        if (a == b)
+            return 1;
+    }
+    return b == &PyBaseObject_Type;
+}
+static CYTHON_INLINE int __Pyx_IsSubtype(PyTypeObject *a, PyTypeObject *b) {
+    PyObject *mro;
+    if (a == b) return 1;
+    mro = a->tp_mro;
+    if (likely(mro)) {
+        Py_ssize_t i, n;
+        n = PyTuple_GET_SIZE(mro);
+        for (i = 0; i < n; i++) {
+            if (PyTuple_GET_ITEM(mro, i) == (PyObject *)b)
+                return 1;
+        }
+        return 0;
+    }
+    return __Pyx_InBases(a, b);
+}
+#if PY_MAJOR_VERSION == 2
+static int __Pyx_inner_PyErr_GivenExceptionMatches2(PyObject *err, PyObject* exc_type1, PyObject* exc_type2) {
+    PyObject *exception, *value, *tb;
+    int res;
+    __Pyx_PyThreadState_declare
+    __Pyx_PyThreadState_assign
+    __Pyx_ErrFetch(&exception, &value, &tb);
+    res = exc_type1 ? PyObject_IsSubclass(err, exc_type1) : 0;
+    if (unlikely(res == -1)) {
+        PyErr_WriteUnraisable(err);
+        res = 0;
+    }
+    if (!res) {
+        res = PyObject_IsSubclass(err, exc_type2);
+        if (unlikely(res == -1)) {
+            PyErr_WriteUnraisable(err);
+            res = 0;
+        }
+    }
+    __Pyx_ErrRestore(exception, value, tb);
+    return res;
+}
+#else
+static CYTHON_INLINE int __Pyx_inner_PyErr_GivenExceptionMatches2(PyObject *err, PyObject* exc_type1, PyObject *exc_type2) {
+    int res = exc_type1 ? __Pyx_IsSubtype((PyTypeObject*)err, (PyTypeObject*)exc_type1) : 0;
+    if (!res) {
+        res = __Pyx_IsSubtype((PyTypeObject*)err, (PyTypeObject*)exc_type2);
+    }
+    return res;
+}
+#endif
+static int __Pyx_PyErr_GivenExceptionMatchesTuple(PyObject *exc_type, PyObject *tuple) {
+    Py_ssize_t i, n;
+    assert(PyExceptionClass_Check(exc_type));
+    n = PyTuple_GET_SIZE(tuple);
+#if PY_MAJOR_VERSION >= 3
+    for (i=0; i<n; i++) {
+        if (exc_type == PyTuple_GET_ITEM(tuple, i)) return 1;
+    }
+#endif
+    for (i=0; i<n; i++) {
+        PyObject *t = PyTuple_GET_ITEM(tuple, i);
+        #if PY_MAJOR_VERSION < 3
+        if (likely(exc_type == t)) return 1;
+        #endif
+        if (likely(PyExceptionClass_Check(t))) {
+            if (__Pyx_inner_PyErr_GivenExceptionMatches2(exc_type, NULL, t)) return 1;
+        } else {
+        }
+    }
+    return 0;
+}
+static CYTHON_INLINE int __Pyx_PyErr_GivenExceptionMatches(PyObject *err, PyObject* exc_type) {
+    if (likely(err == exc_type)) return 1;
+    if (likely(PyExceptionClass_Check(err))) {
+        if (likely(PyExceptionClass_Check(exc_type))) {
+            return __Pyx_inner_PyErr_GivenExceptionMatches2(err, NULL, exc_type);
+        } else if (likely(PyTuple_Check(exc_type))) {
+            return __Pyx_PyErr_GivenExceptionMatchesTuple(err, exc_type);
+        } else {
+        }
+    }
+    return PyErr_GivenExceptionMatches(err, exc_type);
+}
+static CYTHON_INLINE int __Pyx_PyErr_GivenExceptionMatches2(PyObject *err, PyObject *exc_type1, PyObject *exc_type2) {
+    assert(PyExceptionClass_Check(exc_type1));
+    assert(PyExceptionClass_Check(exc_type2));
+    if (likely(err == exc_type1 || err == exc_type2)) return 1;
+    if (likely(PyExceptionClass_Check(err))) {
+        return __Pyx_inner_PyErr_GivenExceptionMatches2(err, exc_type1, exc_type2);
+    }
+    return (PyErr_GivenExceptionMatches(err, exc_type1) || PyErr_GivenExceptionMatches(err, exc_type2));
+}
+#endif
+
+/* CheckBinaryVersion */
+  static int __Pyx_check_binary_version(void) {
+    char ctversion[5];
+    int same=1, i, found_dot;
+    const char* rt_from_call = Py_GetVersion();
+    PyOS_snprintf(ctversion, 5, "%d.%d", PY_MAJOR_VERSION, PY_MINOR_VERSION);
+    found_dot = 0;
+    for (i = 0; i < 4; i++) {
+        if (!ctversion[i]) {
+            same = (rt_from_call[i] < '0' || rt_from_call[i] > '9');
+            break;
+        }
+        if (rt_from_call[i] != ctversion[i]) {
+            same = 0;
+            break;
+        }
+    }
+    if (!same) {
+        char rtversion[5] = {'\0'};
+        char message[200];
+        for (i=0; i<4; ++i) {
+            if (rt_from_call[i] == '.') {
+                if (found_dot) break;
+                found_dot = 1;
+            } else if (rt_from_call[i] < '0' || rt_from_call[i] > '9') {
+                break;
+            }
+            rtversion[i] = rt_from_call[i];
+        }
+        PyOS_snprintf(message, sizeof(message),
+                      "compiletime version %s of module '%.100s' "
+                      "does not match runtime version %s",
+                      ctversion, __Pyx_MODULE_NAME, rtversion);
+        return PyErr_WarnEx(NULL, message, 1);
+    }
+    return 0;
+}
+
+/* InitStrings */
+  static int __Pyx_InitStrings(__Pyx_StringTabEntry *t) {
+    while (t->p) {
+        #if PY_MAJOR_VERSION < 3
+        if (t->is_unicode) {
+            *t->p = PyUnicode_DecodeUTF8(t->s, t->n - 1, NULL);
+        } else if (t->intern) {
+            *t->p = PyString_InternFromString(t->s);
+        } else {
+            *t->p = PyString_FromStringAndSize(t->s, t->n - 1);
+        }
+        #else
+        if (t->is_unicode | t->is_str) {
+            if (t->intern) {
+                *t->p = PyUnicode_InternFromString(t->s);
+            } else if (t->encoding) {
+                *t->p = PyUnicode_Decode(t->s, t->n - 1, t->encoding, NULL);
+            } else {
+                *t->p = PyUnicode_FromStringAndSize(t->s, t->n - 1);
+            }
+        } else {
+            *t->p = PyBytes_FromStringAndSize(t->s, t->n - 1);
+        }
+        #endif
+        if (!*t->p)
+            return -1;
+        if (PyObject_Hash(*t->p) == -1)
+            return -1;
+        ++t;
+    }
+    return 0;
+}
+
+static CYTHON_INLINE PyObject* __Pyx_PyUnicode_FromString(const char* c_str) {
+    return __Pyx_PyUnicode_FromStringAndSize(c_str, (Py_ssize_t)strlen(c_str));
+}
+static CYTHON_INLINE const char* __Pyx_PyObject_AsString(PyObject* o) {
+    Py_ssize_t ignore;
+    return __Pyx_PyObject_AsStringAndSize(o, &ignore);
+}
+#if __PYX_DEFAULT_STRING_ENCODING_IS_ASCII || __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT
+#if !CYTHON_PEP393_ENABLED
+static const char* __Pyx_PyUnicode_AsStringAndSize(PyObject* o, Py_ssize_t *length) {
+    char* defenc_c;
+    PyObject* defenc = _PyUnicode_AsDefaultEncodedString(o, NULL);
+    if (!defenc) return NULL;
+    defenc_c = PyBytes_AS_STRING(defenc);
+#if __PYX_DEFAULT_STRING_ENCODING_IS_ASCII
+    {
+        char* end = defenc_c + PyBytes_GET_SIZE(defenc);
+        char* c;
+        for (c = defenc_c; c < end; c++) {
+            if ((unsigned char) (*c) >= 128) {
+                PyUnicode_AsASCIIString(o);
+                return NULL;
+            }
+        }
+    }
+#endif
+    *length = PyBytes_GET_SIZE(defenc);
+    return defenc_c;
+}
+#else
+static CYTHON_INLINE const char* __Pyx_PyUnicode_AsStringAndSize(PyObject* o, Py_ssize_t *length) {
+    if (unlikely(__Pyx_PyUnicode_READY(o) == -1)) return NULL;
+#if __PYX_DEFAULT_STRING_ENCODING_IS_ASCII
+    if (likely(PyUnicode_IS_ASCII(o))) {
+        *length = PyUnicode_GET_LENGTH(o);
+        return PyUnicode_AsUTF8(o);
+    } else {
+        PyUnicode_AsASCIIString(o);
+        return NULL;
+    }
+#else
+    return PyUnicode_AsUTF8AndSize(o, length);
+#endif
+}
+#endif
+#endif
+static CYTHON_INLINE const char* __Pyx_PyObject_AsStringAndSize(PyObject* o, Py_ssize_t *length) {
+#if __PYX_DEFAULT_STRING_ENCODING_IS_ASCII || __PYX_DEFAULT_STRING_ENCODING_IS_DEFAULT
+    if (
+#if PY_MAJOR_VERSION < 3 && __PYX_DEFAULT_STRING_ENCODING_IS_ASCII
+            __Pyx_sys_getdefaultencoding_not_ascii &&
+#endif
+            PyUnicode_Check(o)) {
+        return __Pyx_PyUnicode_AsStringAndSize(o, length);
+    } else
+#endif
+#if (!CYTHON_COMPILING_IN_PYPY) || (defined(PyByteArray_AS_STRING) && defined(PyByteArray_GET_SIZE))
+    if (PyByteArray_Check(o)) {
+        *length = PyByteArray_GET_SIZE(o);
+        return PyByteArray_AS_STRING(o);
+    } else
+#endif
+    {
+        char* result;
+        int r = PyBytes_AsStringAndSize(o, &result, length);
+        if (unlikely(r < 0)) {
+            return NULL;
+        } else {
+            return result;
+        }
+    }
+}
+static CYTHON_INLINE int __Pyx_PyObject_IsTrue(PyObject* x) {
+   int is_true = x == Py_True;
+   if (is_true | (x == Py_False) | (x == Py_None)) return is_true;
+   else return PyObject_IsTrue(x);
+}
+static CYTHON_INLINE int __Pyx_PyObject_IsTrueAndDecref(PyObject* x) {
+    int retval;
+    if (unlikely(!x)) return -1;
+    retval = __Pyx_PyObject_IsTrue(x);
+    Py_DECREF(x);
+    return retval;
+}
+static PyObject* __Pyx_PyNumber_IntOrLongWrongResultType(PyObject* result, const char* type_name) {
+#if PY_MAJOR_VERSION >= 3
+    if (PyLong_Check(result)) {
+        if (PyErr_WarnFormat(PyExc_DeprecationWarning, 1,
+                "__int__ returned non-int (type %.200s).  "
+                "The ability to return an instance of a strict subclass of int "
+                "is deprecated, and may be removed in a future version of Python.",
+                Py_TYPE(result)->tp_name)) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        return result;
+    }
+#endif
+    PyErr_Format(PyExc_TypeError,
+                 "__%.4s__ returned non-%.4s (type %.200s)",
+                 type_name, type_name, Py_TYPE(result)->tp_name);
+    Py_DECREF(result);
+    return NULL;
+}
+static CYTHON_INLINE PyObject* __Pyx_PyNumber_IntOrLong(PyObject* x) {
+#if CYTHON_USE_TYPE_SLOTS
+  PyNumberMethods *m;
+#endif
+  const char *name = NULL;
+  PyObject *res = NULL;
+#if PY_MAJOR_VERSION < 3
+  if (likely(PyInt_Check(x) || PyLong_Check(x)))
+#else
+  if (likely(PyLong_Check(x)))
+#endif
+    return __Pyx_NewRef(x);
+#if CYTHON_USE_TYPE_SLOTS
+  m = Py_TYPE(x)->tp_as_number;
+  #if PY_MAJOR_VERSION < 3
+  if (m && m->nb_int) {
+    name = "int";
+    res = m->nb_int(x);
+  }
+  else if (m && m->nb_long) {
+    name = "long";
+    res = m->nb_long(x);
+  }
+  #else
+  if (likely(m && m->nb_int)) {
+    name = "int";
+    res = m->nb_int(x);
+  }
+  #endif
+#else
+  if (!PyBytes_CheckExact(x) && !PyUnicode_CheckExact(x)) {
+    res = PyNumber_Int(x);
+  }
+#endif
+  if (likely(res)) {
+#if PY_MAJOR_VERSION < 3
+    if (unlikely(!PyInt_Check(res) && !PyLong_Check(res))) {
+#else
+    if (unlikely(!PyLong_CheckExact(res))) {
+#endif
+        return __Pyx_PyNumber_IntOrLongWrongResultType(res, name);
+    }
+  }
+  else if (!PyErr_Occurred()) {
+    PyErr_SetString(PyExc_TypeError,
+                    "an integer is required");
+  }
+  return res;
+}
+static CYTHON_INLINE Py_ssize_t __Pyx_PyIndex_AsSsize_t(PyObject* b) {
+  Py_ssize_t ival;
+  PyObject *x;
+#if PY_MAJOR_VERSION < 3
+  if (likely(PyInt_CheckExact(b))) {
+    if (sizeof(Py_ssize_t) >= sizeof(long))
+        return PyInt_AS_LONG(b);
+    else
+        return PyInt_AsSsize_t(b);
+  }
+#endif
+  if (likely(PyLong_CheckExact(b))) {
+    #if CYTHON_USE_PYLONG_INTERNALS
+    const digit* digits = ((PyLongObject*)b)->ob_digit;
+    const Py_ssize_t size = Py_SIZE(b);
+    if (likely(__Pyx_sst_abs(size) <= 1)) {
+        ival = likely(size) ? digits[0] : 0;
+        if (size == -1) ival = -ival;
+        return ival;
+    } else {
+      switch (size) {
+         case 2:
+           if (8 * sizeof(Py_ssize_t) > 2 * PyLong_SHIFT) {
+             return (Py_ssize_t) (((((size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+         case -2:
+           if (8 * sizeof(Py_ssize_t) > 2 * PyLong_SHIFT) {
+             return -(Py_ssize_t) (((((size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+         case 3:
+           if (8 * sizeof(Py_ssize_t) > 3 * PyLong_SHIFT) {
+             return (Py_ssize_t) (((((((size_t)digits[2]) << PyLong_SHIFT) | (size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+         case -3:
+           if (8 * sizeof(Py_ssize_t) > 3 * PyLong_SHIFT) {
+             return -(Py_ssize_t) (((((((size_t)digits[2]) << PyLong_SHIFT) | (size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+         case 4:
+           if (8 * sizeof(Py_ssize_t) > 4 * PyLong_SHIFT) {
+             return (Py_ssize_t) (((((((((size_t)digits[3]) << PyLong_SHIFT) | (size_t)digits[2]) << PyLong_SHIFT) | (size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+         case -4:
+           if (8 * sizeof(Py_ssize_t) > 4 * PyLong_SHIFT) {
+             return -(Py_ssize_t) (((((((((size_t)digits[3]) << PyLong_SHIFT) | (size_t)digits[2]) << PyLong_SHIFT) | (size_t)digits[1]) << PyLong_SHIFT) | (size_t)digits[0]));
+           }
+           break;
+      }
+    }
+    #endif
+    return PyLong_AsSsize_t(b);
+  }
+  x = PyNumber_Index(b);
+  if (!x) return -1;
+  ival = PyInt_AsSsize_t(x);
+  Py_DECREF(x);
+  return ival;
+}
+static CYTHON_INLINE Py_hash_t __Pyx_PyIndex_AsHash_t(PyObject* o) {
+  if (sizeof(Py_hash_t) == sizeof(Py_ssize_t)) {
+    return (Py_hash_t) __Pyx_PyIndex_AsSsize_t(o);
+#if PY_MAJOR_VERSION < 3
+  } else if (likely(PyInt_CheckExact(o))) {
+    return PyInt_AS_LONG(o);
+#endif
+  } else {
+    Py_ssize_t ival;
+    PyObject *x;
+    x = PyNumber_Index(o);
+    if (!x) return -1;
+    ival = PyInt_AsLong(x);
+    Py_DECREF(x);
+    return ival;
+  }
+}
+static CYTHON_INLINE PyObject * __Pyx_PyBool_FromLong(long b) {
+  return b ? __Pyx_NewRef(Py_True) : __Pyx_NewRef(Py_False);
+}
+static CYTHON_INLINE PyObject * __Pyx_PyInt_FromSize_t(size_t ival) {
+    return PyInt_FromSize_t(ival);
+}
+
+
+#endif /* Py_PYTHON_H */
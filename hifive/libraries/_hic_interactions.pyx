@@ -132,6 +132,114 @@ def find_fend_coverage(
     return None
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def find_cis_fend_neighbors(
+        np.ndarray[DTYPE_int_t, ndim=2] data not None,
+        np.ndarray[DTYPE_int64_t, ndim=1] data_indices not None,
+        np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+        np.ndarray[DTYPE_int_t, ndim=1] min_fend not None,
+        np.ndarray[DTYPE_int_t, ndim=1] max_fend not None,
+        np.ndarray[DTYPE_int64_t, ndim=1] positions not None,
+        np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+        np.ndarray[DTYPE_int_t, ndim=1] coverage not None):
+    cdef long long int i, fend1, fend2
+    cdef long long int num_fends = filter.shape[0]
+    cdef int fill = neighbors.shape[0] > 0
+    with nogil:
+        for fend1 in range(num_fends):
+            if filter[fend1] == 0:
+                continue
+            i = data_indices[fend1]
+            while i < data_indices[fend1 + 1] and data[i, 1] < min_fend[fend1]:
+                i += 1
+            while i < data_indices[fend1 + 1] and data[i, 1] < max_fend[fend1]:
+                fend2 = data[i, 1]
+                if filter[fend2] == 1:
+                    if fend1 == fend2:
+                        if fill == 0:
+                            coverage[fend1] += 1
+                    elif fill == 0:
+                        coverage[fend1] += 1
+                        coverage[fend2] += 1
+                        positions[fend1] += 1
+                        positions[fend2] += 1
+                    else:
+                        neighbors[positions[fend1]] = fend2
+                        positions[fend1] += 1
+                        neighbors[positions[fend2]] = fend1
+                        positions[fend2] += 1
+                i += 1
+    return None
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def find_trans_fend_neighbors(
+        np.ndarray[DTYPE_int_t, ndim=2] data not None,
+        np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+        np.ndarray[DTYPE_int64_t, ndim=1] positions not None,
+        np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+        np.ndarray[DTYPE_int_t, ndim=1] coverage not None):
+    cdef long long int i, fend1, fend2
+    cdef long long int num_data = data.shape[0]
+    cdef int fill = neighbors.shape[0] > 0
+    with nogil:
+        for i in range(num_data):
+            fend1 = data[i, 0]
+            fend2 = data[i, 1]
+            if filter[fend1] == 0 or filter[fend2] == 0:
+                continue
+            if fill == 0:
+                coverage[fend1] += 1
+                coverage[fend2] += 1
+                positions[fend1] += 1
+                positions[fend2] += 1
+            else:
+                neighbors[positions[fend1]] = fend2
+                positions[fend1] += 1
+                neighbors[positions[fend2]] = fend1
+                positions[fend2] += 1
+    return None
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def filter_fend_neighbors(
+        np.ndarray[DTYPE_int64_t, ndim=1] neighbor_indices not None,
+        np.ndarray[DTYPE_int_t, ndim=1] neighbors not None,
+        np.ndarray[DTYPE_int_t, ndim=1] filter not None,
+        np.ndarray[DTYPE_int_t, ndim=1] coverage not None,
+        int mincoverage):
+    cdef long long int i, j, fend1, fend2, num_removed
+    cdef long long int num_fends = filter.shape[0]
+    cdef np.ndarray[DTYPE_int_t, ndim=1] removed = numpy.zeros(num_fends, dtype=numpy.int32)
+    with nogil:
+        num_removed = 0
+        for i in range(num_fends):
+            if filter[i] == 1 and coverage[i] < mincoverage:
+                filter[i] = 0
+                removed[num_removed] = i
+                num_removed += 1
+        # each removed fend lowers the coverage of its remaining partners, which may remove them in turn
+        while num_removed > 0:
+            num_removed -= 1
+            fend1 = removed[num_removed]
+            for j in range(neighbor_indices[fend1], neighbor_indices[fend1 + 1]):
+                fend2 = neighbors[j]
+                if filter[fend2] == 0:
+                    continue
+                coverage[fend2] -= 1
+                if coverage[fend2] < mincoverage:
+                    filter[fend2] = 0
+                    removed[num_removed] = fend2
+                    num_removed += 1
+    return None
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -251,8 +359,10 @@ def find_zero_node_indices(
                 if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
                     continue
                 elif nzpos == num_nz or nzindices1[nzpos] != j or nzindices0[nzpos] != i:
-                    zindices0[zpos] = i
-                    zindices1[zpos] = j
+                    # without zero index arrays, only count interactions
+                    if not zindices0 is None:
+                        zindices0[zpos] = i
+                        zindices1[zpos] = j
                     interactions[i] += 1
                     if i != j:
                         interactions[j] += 1
@@ -260,6 +370,19 @@ def find_zero_node_indices(
     return None
 
 
+cdef inline long long int find_first_above(DTYPE_int_t* mids, long long int lower, long long int upper,
+                                           long long int value) nogil:
+    # find the first fend in [lower, upper) whose midpoint exceeds value
+    cdef long long int middle
+    while lower < upper:
+        middle = (lower + upper) / 2
+        if mids[middle] > value:
+            upper = middle
+        else:
+            lower = middle + 1
+    return lower
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -273,71 +396,62 @@ def find_distancebound_possible_interactions(
         int mindistance,
         int maxdistance,
         int binned):
-    cdef long long int h, i, j, k, chr_total, all_total, total, stop
+    cdef long long int h, i, j, k, chr_total, all_total, total, stop, start_fend, stop_fend
     cdef long long int num_chroms = chrints.shape[0]
     cdef long long int num_fends = filter.shape[0]
+    # valid fends before each fend, so that fends outside of the distance limits can be counted by range
+    cdef np.ndarray[DTYPE_int64_t, ndim=1] valid_sums = numpy.zeros(num_fends + 1, dtype=numpy.int64)
+    valid_sums[1:] = numpy.cumsum(filter)
+    mids = numpy.ascontiguousarray(mids)
+    cdef DTYPE_int_t* mids_ptr = <DTYPE_int_t*> mids.data
     with nogil:
-        all_total = 0
-        chr_total = 0
-        # if trans interactions are included, find total valid fends
-        if useread_int != 0:
-            for i in range(num_fends):
-                all_total += filter[i]
+        all_total = valid_sums[num_fends]
         for h in range(num_chroms):
             i = chrints[h]
+            start_fend = chr_indices[i]
+            stop_fend = chr_indices[i + 1]
             # for each chrom, find valid number of fends
-            chr_total = 0
-            for j in range(chr_indices[i], chr_indices[i + 1]):
-                chr_total += filter[j]
+            chr_total = valid_sums[stop_fend] - valid_sums[start_fend]
             # if using trans, for each valid fend add on all possible trans interactions tot total
             if useread_int > 0:
-                for j in range(chr_indices[i], chr_indices[i + 1]):
+                for j in range(start_fend, stop_fend):
                     if filter[j] > 0:
                         interactions[j] += all_total - chr_total
             # if using cis, find number of interactions within distance range and
             # not adjacent fends or opposite strand adjacent fragment fends
             if useread_int < 2:
-                for j in range(chr_indices[i], chr_indices[i + 1]):
+                for j in range(start_fend, stop_fend):
                     if filter[j] == 0:
                         continue
                     if binned == 0:
                         total = chr_total - 1
-                        if j > chr_indices[i] + 4:
+                        if j > start_fend + 4:
                             # remove upstream interactions outside of maxdistance
-                            k = chr_indices[i]
                             stop = (j / 2) * 2 - 2
-                            while k < stop and mids[j] - mids[k] >= maxdistance:
-                                total -= filter[k]
-                                k += 1
-                            stop = k - 1
+                            k = find_first_above(mids_ptr, start_fend, stop, <long long int>mids[j] - maxdistance)
+                            total -= valid_sums[k] - valid_sums[start_fend]
                             # remove upstream interactions inside of mindistance
-                            k = (j / 2) * 2 - 3
-                            while k > stop and mids[j] - mids[k] < mindistance:
-                                total -= filter[k]
-                                k -= 1
-                        if j < chr_indices[i + 1] - 4:
+                            stop = find_first_above(mids_ptr, k, stop, <long long int>mids[j] - mindistance)
+                            total -= valid_sums[(j / 2) * 2 - 2] - valid_sums[stop]
+                        if j < stop_fend - 4:
                             # remove downstream interactions outside of maxdistance
-                            k = chr_indices[i + 1] - 1
-                            stop = (j / 2) * 2 + 3
-                            while k > stop and mids[k] - mids[j] >= maxdistance:
-                                total -= filter[k]
-                                k -= 1
-                            stop = k + 1
+                            stop = (j / 2) * 2 + 4
+                            k = find_first_above(mids_ptr, stop, stop_fend,
+                                                 <long long int>mids[j] + maxdistance - 1)
+                            total -= valid_sums[stop_fend] - valid_sums[k]
                             # remove downstream interactions inside of mindistance
-                            k = (j / 2) * 2 + 4
-                            while k < stop and mids[k] - mids[j] < mindistance:
-                                total -= filter[k]
-                                k += 1
+                            k = find_first_above(mids_ptr, stop, k, <long long int>mids[j] + mindistance - 1)
+                            total -= valid_sums[k] - valid_sums[stop]
                         if j % 2 == 0:
                             # remove same fragment fend
                             total -= filter[j + 1]
                             # remove previous fragment fends if necessary
-                            if j > chr_indices[i]:
+                            if j > start_fend:
                                 total -= filter[j - 1]
                                 if mids[j] - mids[j - 2] < mindistance:
                                     total -= filter[j - 2]
                             # remove next fragment fends if necessary
-                            if j < chr_indices[i + 1] - 2:
+                            if j < stop_fend - 2:
                                 total -= filter[j + 3]
                                 if mids[j + 2] - mids[j] < mindistance:
                                     total -= filter[j + 2]
@@ -345,12 +459,12 @@ def find_distancebound_possible_interactions(
                             # remove same fragment fend
                             total -= filter[j - 1]
                             # remove previous fragment fends if necessary
-                            if j > chr_indices[i] + 2:
+                            if j > start_fend + 2:
                                 total -= filter[j - 3]
                                 if mids[j] - mids[j - 2] < mindistance:
                                     total -= filter[j - 2]
                             # remove next fragment fends if necessary
-                            if j < chr_indices[i + 1] - 2:
+                            if j < stop_fend - 2:
                                 total -= filter[j + 1]
                                 if mids[j + 2] - mids[j] < mindistance:
                                     total -= filter[j + 2]
@@ -359,27 +473,17 @@ def find_distancebound_possible_interactions(
                         if mindistance > 0:
                             total -= 1
                         # remove upstream interactions outside of maxdistance
-                        k = chr_indices[i]
-                        while k < j and mids[j] - mids[k] >= maxdistance:
-                            total -= filter[k]
-                            k += 1
-                        stop = k - 1
+                        k = find_first_above(mids_ptr, start_fend, j, <long long int>mids[j] - maxdistance)
+                        total -= valid_sums[k] - valid_sums[start_fend]
                         # remove upstream interactions inside of mindistance
-                        k = j - 1
-                        while k > stop and mids[j] - mids[k] < mindistance:
-                            total -= filter[k]
-                            k -= 1
+                        stop = find_first_above(mids_ptr, k, j, <long long int>mids[j] - mindistance)
+                        total -= valid_sums[j] - valid_sums[stop]
                         # remove downstream interactions outside of maxdistance
-                        k = chr_indices[i + 1] - 1
-                        while k > j and mids[k] - mids[j] >= maxdistance:
-                            total -= filter[k]
-                            k -= 1
-                        stop = k + 1
+                        k = find_first_above(mids_ptr, j + 1, stop_fend, <long long int>mids[j] + maxdistance - 1)
+                        total -= valid_sums[stop_fend] - valid_sums[k]
                         # remove downstream interactions inside of mindistance
-                        k = j + 1
-                        while k < stop and mids[k] - mids[j] < mindistance:
-                            total -= filter[k]
-                            k += 1
+                        stop = find_first_above(mids_ptr, j + 1, k, <long long int>mids[j] + mindistance - 1)
+                        total -= valid_sums[stop] - valid_sums[j + 1]
                     interactions[j] += total
     return None
 
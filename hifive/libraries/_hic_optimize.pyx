@@ -5,8 +5,10 @@ parameter optimization necessary for supporting hic analysis using HiFive.
 """
 
 import cython
+from cython.parallel import prange, threadid
 cimport numpy as np
 import numpy
+from _distance_table cimport DistanceTable, get_distance_table, find_distance_mean
 
 ctypedef np.float32_t DTYPE_t
 ctypedef np.float64_t DTYPE_64_t
@@ -28,6 +30,7 @@ cdef extern from "math.h":
     double ceil(double x) nogil
 
 
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -66,28 +69,36 @@ def calculate_binom_gradients(
         np.ndarray[DTYPE_t, ndim=1] zero_means not None,
         np.ndarray[DTYPE_t, ndim=1] corrections not None,
         np.ndarray[DTYPE_t, ndim=1] inv_corrections not None,
-        np.ndarray[DTYPE_64_t, ndim=1] gradients not None):
-    cdef long long int i, index0, index1
-    cdef double value, distance_mean, correction0, correction1
+        np.ndarray[DTYPE_64_t, ndim=1] gradients not None,
+        int num_threads=1):
+    cdef long long int i, j, index0, index1
+    cdef int thread
+    cdef double value, distance_mean
     cdef long long int num_zero_pairs = zero_indices0.shape[0]
     cdef long long int num_nonzero_pairs = nonzero_indices0.shape[0]
+    cdef long long int num_fends = gradients.shape[0]
+    num_threads = max(1, num_threads)
+    cdef np.ndarray[DTYPE_64_t, ndim=2] thread_gradients = numpy.zeros((num_threads, num_fends), dtype=numpy.float64)
     with nogil:
-        for i in range(num_nonzero_pairs):
+        for i in prange(num_nonzero_pairs, num_threads=num_threads, schedule='static'):
+            thread = threadid()
             index0 = nonzero_indices0[i]
             index1 = nonzero_indices1[i]
-            gradients[index0] -= inv_corrections[index0]
+            thread_gradients[thread, index0] -= inv_corrections[index0]
             if index1 != index0:
-                gradients[index1] -= inv_corrections[index1]
-        for i in range(num_zero_pairs):
+                thread_gradients[thread, index1] -= inv_corrections[index1]
+        for i in prange(num_zero_pairs, num_threads=num_threads, schedule='static'):
+            thread = threadid()
             index0 = zero_indices0[i]
             index1 = zero_indices1[i]
             distance_mean = zero_means[i]
-            correction0 = corrections[index0]
-            correction1 = corrections[index1]
             value = 1.0 / (1.0 - distance_mean * corrections[index0] * corrections[index1])
-            gradients[index0] += (distance_mean * corrections[index1]) * value
+            thread_gradients[thread, index0] += (distance_mean * corrections[index1]) * value
             if index1 != index0:
-                gradients[index1] += (distance_mean * corrections[index0]) * value
+                thread_gradients[thread, index1] += (distance_mean * corrections[index0]) * value
+        for j in prange(num_fends, num_threads=num_threads, schedule='static'):
+            for thread in range(num_threads):
+                gradients[j] += thread_gradients[thread, j]
     return None
 
 
@@ -103,16 +114,18 @@ def calculate_binom_cost(
         np.ndarray[DTYPE_t, ndim=1] nonzero_means not None,
         np.ndarray[DTYPE_t, ndim=1] zero_means not None,
         np.ndarray[DTYPE_t, ndim=1] corrections not None,
-        np.ndarray[DTYPE_t, ndim=1] log_corrections not None):
+        np.ndarray[DTYPE_t, ndim=1] log_corrections not None,
+        int num_threads=1):
     cdef long long int i
     cdef double cost
     cdef long long int num_zero_pairs = zero_indices0.shape[0]
     cdef long long int num_nonzero_pairs = nonzero_indices0.shape[0]
+    num_threads = max(1, num_threads)
     with nogil:
         cost = 0.0
-        for i in range(num_nonzero_pairs):
+        for i in prange(num_nonzero_pairs, num_threads=num_threads, schedule='static'):
             cost -= nonzero_means[i] + log_corrections[nonzero_indices0[i]] + log_corrections[nonzero_indices1[i]]
-        for i in range(num_zero_pairs):
+        for i in prange(num_zero_pairs, num_threads=num_threads, schedule='static'):
             cost -= log(max(0.0000001, 1.0 - zero_means[i] * corrections[zero_indices0[i]] * corrections[zero_indices1[i]]))
     return cost
 
@@ -130,23 +143,33 @@ def calculate_poisson_gradients(
         np.ndarray[DTYPE_t, ndim=1] zero_means not None,
         np.ndarray[DTYPE_t, ndim=1] corrections not None,
         np.ndarray[DTYPE_t, ndim=1] inv_corrections not None,
-        np.ndarray[DTYPE_64_t, ndim=1] gradients not None):
-    cdef long long int i, index0, index1
+        np.ndarray[DTYPE_64_t, ndim=1] gradients not None,
+        int num_threads=1):
+    cdef long long int i, j, index0, index1
+    cdef int thread
     cdef long long int num_zero_pairs = zero_indices0.shape[0]
     cdef long long int num_nonzero_pairs = nonzero_indices0.shape[0]
+    cdef long long int num_fends = gradients.shape[0]
+    num_threads = max(1, num_threads)
+    cdef np.ndarray[DTYPE_64_t, ndim=2] thread_gradients = numpy.zeros((num_threads, num_fends), dtype=numpy.float64)
     with nogil:
-        for i in range(num_nonzero_pairs):
+        for i in prange(num_nonzero_pairs, num_threads=num_threads, schedule='static'):
+            thread = threadid()
             index0 = nonzero_indices0[i]
             index1 = nonzero_indices1[i]
-            gradients[index0] += nonzero_means[i] * corrections[index0] - counts[i] * inv_corrections[index0]
+            thread_gradients[thread, index0] += nonzero_means[i] * corrections[index1] - counts[i] * inv_corrections[index0]
             if index1 != index0:
-                gradients[index1] += nonzero_means[i] * corrections[index1] - counts[i] * inv_corrections[index1]
-        for i in range(num_zero_pairs):
+                thread_gradients[thread, index1] += nonzero_means[i] * corrections[index0] - counts[i] * inv_corrections[index1]
+        for i in prange(num_zero_pairs, num_threads=num_threads, schedule='static'):
+            thread = threadid()
             index0 = zero_indices0[i]
             index1 = zero_indices1[i]
-            gradients[index0] += zero_means[i] * corrections[index0]
+            thread_gradients[thread, index0] += zero_means[i] * corrections[index1]
             if index1 != index0:
-                gradients[index1] += zero_means[i] * corrections[index1]
+                thread_gradients[thread, index1] += zero_means[i] * corrections[index0]
+        for j in prange(num_fends, num_threads=num_threads, schedule='static'):
+            for thread in range(num_threads):
+                gradients[j] += thread_gradients[thread, j]
     return None
 
 
@@ -162,20 +185,155 @@ def calculate_poisson_cost(
         np.ndarray[DTYPE_t, ndim=1] nonzero_means not None,
         np.ndarray[DTYPE_t, ndim=1] zero_means not None,
         np.ndarray[DTYPE_t, ndim=1] corrections not None,
-        np.ndarray[DTYPE_t, ndim=1] log_corrections not None):
+        np.ndarray[DTYPE_t, ndim=1] log_corrections not None,
+        int num_threads=1):
     cdef long long int i
     cdef double cost
     cdef long long int num_zero_pairs = zero_indices0.shape[0]
     cdef long long int num_nonzero_pairs = nonzero_indices0.shape[0]
+    num_threads = max(1, num_threads)
     with nogil:
         cost = 0.0
-        for i in range(num_nonzero_pairs):
+        for i in prange(num_nonzero_pairs, num_threads=num_threads, schedule='static'):
             cost += corrections[nonzero_indices0[i]] * corrections[nonzero_indices1[i]] * nonzero_means[i] - counts[i] * ( log(nonzero_means[i]) + log_corrections[nonzero_indices0[i]] + log_corrections[nonzero_indices1[i]] )
-        for i in range(num_zero_pairs):
+        for i in prange(num_zero_pairs, num_threads=num_threads, schedule='static'):
             cost += corrections[zero_indices0[i]] * corrections[zero_indices1[i]] * zero_means[i]
     return cost
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def calculate_implicit_zero_cost(
+        np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+        np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+        np.ndarray[DTYPE_int_t, ndim=1] nonzero_indices1 not None,
+        np.ndarray[DTYPE_int64_t, ndim=1] nonzero_starts not None,
+        np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters not None,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
+        np.ndarray[DTYPE_t, ndim=1] binning_corrections,
+        np.ndarray[DTYPE_int_t, ndim=3] fend_indices,
+        np.ndarray[DTYPE_t, ndim=1] corrections not None,
+        long long int start,
+        long long int stop,
+        int startfend,
+        int binned,
+        int binomial,
+        int num_threads=1):
+    cdef long long int i, j, m1, m2, nzpos, nzstop
+    cdef float distance_mean
+    cdef double cost
+    cdef long long int num_parameters = 0
+    if not fend_indices is None:
+        num_parameters = fend_indices.shape[1]
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    num_threads = max(1, num_threads)
+    with nogil:
+        cost = 0.0
+        for i in prange(start, stop, num_threads=num_threads, schedule='static'):
+            nzpos = nonzero_starts[i - start]
+            nzstop = nonzero_starts[i - start + 1]
+            for j in range(ranges[i, 1], ranges[i, 2]):
+                while nzpos < nzstop and nonzero_indices1[nzpos] < j:
+                    nzpos = nzpos + 1
+                m1 = mapping[i]
+                m2 = mapping[j]
+                if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+                    continue
+                elif nzpos < nzstop and nonzero_indices1[nzpos] == j:
+                    continue
+                distance_mean = find_distance_mean(&lookup, mids[j] - mids[i])
+                for m1 in range(num_parameters):
+                    if fend_indices[i, m1, 0] < fend_indices[j, m1, 0]:
+                        distance_mean = distance_mean * binning_corrections[fend_indices[i, m1, 1] + fend_indices[j, m1, 0]]
+                    else:
+                        distance_mean = distance_mean * binning_corrections[fend_indices[j, m1, 1] + fend_indices[i, m1, 0]]
+                if binomial == 1:
+                    cost += -log(max(0.0000001, 1.0 - distance_mean * corrections[i] * corrections[j]))
+                else:
+                    cost += corrections[i] * corrections[j] * distance_mean
+    return cost
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def calculate_implicit_zero_gradients(
+        np.ndarray[DTYPE_int_t, ndim=1] mapping not None,
+        np.ndarray[DTYPE_int64_t, ndim=2] ranges not None,
+        np.ndarray[DTYPE_int_t, ndim=1] nonzero_indices1 not None,
+        np.ndarray[DTYPE_int64_t, ndim=1] nonzero_starts not None,
+        np.ndarray[DTYPE_int_t, ndim=1] mids not None,
+        np.ndarray[DTYPE_t, ndim=2, mode='c'] parameters not None,
+        np.ndarray[DTYPE_64_t, ndim=3, mode='c'] distance_table,
+        int table_binsize,
+        np.ndarray[DTYPE_t, ndim=1] binning_corrections,
+        np.ndarray[DTYPE_int_t, ndim=3] fend_indices,
+        np.ndarray[DTYPE_t, ndim=1] corrections,
+        np.ndarray[DTYPE_64_t, ndim=1] gradients not None,
+        long long int start,
+        long long int stop,
+        int startfend,
+        int binned,
+        int binomial,
+        int num_threads=1):
+    # if corrections is None, the distance means of unobserved pairs are summed for both fends instead
+    cdef long long int i, j, m1, m2, nzpos, nzstop
+    cdef int thread
+    cdef float distance_mean
+    cdef double mean, value
+    cdef long long int num_fends = gradients.shape[0]
+    cdef long long int num_parameters = 0
+    cdef int use_corrections = 0
+    if not fend_indices is None:
+        num_parameters = fend_indices.shape[1]
+    if not corrections is None:
+        use_corrections = 1
+    cdef DistanceTable lookup = get_distance_table(parameters, distance_table, table_binsize)
+    num_threads = max(1, num_threads)
+    cdef np.ndarray[DTYPE_64_t, ndim=2] thread_gradients = numpy.zeros((num_threads, num_fends), dtype=numpy.float64)
+    with nogil:
+        for i in prange(start, stop, num_threads=num_threads, schedule='static'):
+            thread = threadid()
+            nzpos = nonzero_starts[i - start]
+            nzstop = nonzero_starts[i - start + 1]
+            for j in range(ranges[i, 1], ranges[i, 2]):
+                while nzpos < nzstop and nonzero_indices1[nzpos] < j:
+                    nzpos = nzpos + 1
+                m1 = mapping[i]
+                m2 = mapping[j]
+                if binned == 0 and m2 - m1 < 4 and (m2 - m1 == 1 or ((m1 + startfend) % 2 == 0 and m2 - m1 == 3)):
+                    continue
+                elif nzpos < nzstop and nonzero_indices1[nzpos] == j:
+                    continue
+                distance_mean = find_distance_mean(&lookup, mids[j] - mids[i])
+                for m1 in range(num_parameters):
+                    if fend_indices[i, m1, 0] < fend_indices[j, m1, 0]:
+                        distance_mean = distance_mean * binning_corrections[fend_indices[i, m1, 1] + fend_indices[j, m1, 0]]
+                    else:
+                        distance_mean = distance_mean * binning_corrections[fend_indices[j, m1, 1] + fend_indices[i, m1, 0]]
+                if use_corrections == 0:
+                    thread_gradients[thread, i] += distance_mean
+                    thread_gradients[thread, j] += distance_mean
+                    continue
+                if binomial == 1:
+                    mean = distance_mean
+                    value = 1.0 / (1.0 - mean * corrections[i] * corrections[j])
+                    thread_gradients[thread, i] += (mean * corrections[j]) * value
+                    if i != j:
+                        thread_gradients[thread, j] += (mean * corrections[i]) * value
+                else:
+                    thread_gradients[thread, i] += distance_mean * corrections[j]
+                    if i != j:
+                        thread_gradients[thread, j] += distance_mean * corrections[i]
+        for j in prange(num_fends, num_threads=num_threads, schedule='static'):
+            for thread in range(num_threads):
+                gradients[j] += thread_gradients[thread, j]
+    return None
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
@@ -188,10 +346,14 @@ def find_fend_means(
         np.ndarray[DTYPE_t, ndim=1] corrections not None,
         double mu,
         double trans_mu,
-        int binary):
+        int binary,
+        int num_threads=1):
     cdef long long int i, fend1, fend2, num_trans_data, num_data
+    cdef int thread
     cdef double temp
     cdef long long int num_fends = fend_means.shape[0]
+    num_threads = max(1, num_threads)
+    cdef np.ndarray[DTYPE_64_t, ndim=2] thread_means = numpy.zeros((num_threads, num_fends), dtype=numpy.float64)
     if not trans_data is None:
         num_trans_data = trans_data.shape[0]
     else:
@@ -201,54 +363,62 @@ def find_fend_means(
     else:
         num_data = 0
     with nogil:
-        for i in range(num_fends):
-            fend_means[i] = 0.0
         if binary == 0:
             if distance_means is None:
-                for i in range(num_data):
+                for i in prange(num_data, num_threads=num_threads, schedule='static'):
+                    thread = threadid()
                     fend1 = data[i, 0]
                     fend2 = data[i, 1]
                     temp = data[i, 2] / (mu * corrections[fend1] * corrections[fend2])
-                    fend_means[fend1] += temp
-                    fend_means[fend2] += temp
+                    thread_means[thread, fend1] += temp
+                    thread_means[thread, fend2] += temp
             else:
-                for i in range(num_data):
+                for i in prange(num_data, num_threads=num_threads, schedule='static'):
+                    thread = threadid()
                     fend1 = data[i, 0]
                     fend2 = data[i, 1]
                     temp = data[i, 2] / (distance_means[i] * corrections[fend1] * corrections[fend2])
-                    fend_means[fend1] += temp
-                    fend_means[fend2] += temp
-            for i in range(num_trans_data):
+                    thread_means[thread, fend1] += temp
+                    thread_means[thread, fend2] += temp
+            for i in prange(num_trans_data, num_threads=num_threads, schedule='static'):
+                thread = threadid()
                 fend1 = trans_data[i, 0]
                 fend2 = trans_data[i, 1]
                 temp = trans_data[i, 2] / (trans_mu * corrections[fend1] * corrections[fend2])
                 if not trans_means is None:
                     temp /= trans_means[i]
-                fend_means[fend1] += temp
-                fend_means[fend2] += temp
+                thread_means[thread, fend1] += temp
+                thread_means[thread, fend2] += temp
         else:
             if distance_means is None:
-                for i in range(num_data):
+                for i in prange(num_data, num_threads=num_threads, schedule='static'):
+                    thread = threadid()
                     fend1 = data[i, 0]
                     fend2 = data[i, 1]
                     temp = 1.0 / (mu * corrections[fend1] * corrections[fend2])
-                    fend_means[fend1] += temp
-                    fend_means[fend2] += temp
+                    thread_means[thread, fend1] += temp
+                    thread_means[thread, fend2] += temp
             else:
-                for i in range(num_data):
+                for i in prange(num_data, num_threads=num_threads, schedule='static'):
+                    thread = threadid()
                     fend1 = data[i, 0]
                     fend2 = data[i, 1]
                     temp = 1.0 / (distance_means[i] * corrections[fend1] * corrections[fend2])
-                    fend_means[fend1] += temp
-                    fend_means[fend2] += temp
-            for i in range(num_trans_data):
+                    thread_means[thread, fend1] += temp
+                    thread_means[thread, fend2] += temp
+            for i in prange(num_trans_data, num_threads=num_threads, schedule='static'):
+                thread = threadid()
                 fend1 = trans_data[i, 0]
                 fend2 = trans_data[i, 1]
                 temp = 1.0 / (trans_mu * corrections[fend1] * corrections[fend2])
                 if not trans_means is None:
                     temp /= trans_means[i]
-                fend_means[fend1] += temp
-                fend_means[fend2] += temp
+                thread_means[thread, fend1] += temp
+                thread_means[thread, fend2] += temp
+        for i in prange(num_fends, num_threads=num_threads, schedule='static'):
+            fend_means[i] = 0.0
+            for thread in range(num_threads):
+                fend_means[i] += thread_means[thread, i]
     return None
 
 
@@ -285,71 +455,22 @@ def update_express_corrections(
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-def calculate_v(
-        np.ndarray[DTYPE_int_t, ndim=2] data,
-        np.ndarray[DTYPE_int_t, ndim=2] trans_data,
-        np.ndarray[DTYPE_64_t, ndim=1] counts,
-        np.ndarray[DTYPE_64_t, ndim=1] trans_counts,
-        np.ndarray[DTYPE_64_t, ndim=2] corrections,
-        np.ndarray[DTYPE_64_t, ndim=2] v):
-    cdef long long int i, fend1, fend2, num_data, num_trans_data
-    cdef double correction
-    if not data is None:
-        num_data = data.shape[0]
-    else:
-        num_data = 0
-    if not trans_data is None:
-        num_trans = trans_data.shape[0]
-    else:
-        num_trans = 0
-    with nogil:
-        for i in range(num_data):
-            fend1 = data[i, 0]
-            fend2 = data[i, 1]
-            correction = corrections[fend1, 0] * corrections[fend2, 0] * counts[i]
-            v[fend1, 0] += correction
-            v[fend2, 0] += correction
-        for i in range(num_trans):
-            fend1 = trans_data[i, 0]
-            fend2 = trans_data[i, 1]
-            correction = corrections[fend1, 0] * corrections[fend2, 0] * trans_counts[i]
-            v[fend1, 0] += correction
-            v[fend2, 0] += correction
-    return None
-
-
-@cython.boundscheck(False)
-@cython.wraparound(False)
-@cython.cdivision(True)
-def calculate_w(
-        np.ndarray[DTYPE_int_t, ndim=2] data,
-        np.ndarray[DTYPE_int_t, ndim=2] trans_data,
-        np.ndarray[DTYPE_64_t, ndim=1] counts,
-        np.ndarray[DTYPE_64_t, ndim=1] trans_counts,
-        np.ndarray[DTYPE_64_t, ndim=2] corrections,
-        np.ndarray[DTYPE_64_t, ndim=2] p,
-        np.ndarray[DTYPE_64_t, ndim=2] w):
-    cdef long long int i, fend1, fend2, num_data, num_trans_data
-    cdef double correction
-    if not data is None:
-        num_data = data.shape[0]
-    else:
-        num_data = 0
-    if not trans_data is None:
-        num_trans = trans_data.shape[0]
-    else:
-        num_trans = 0
+def calculate_sparse_product(
+        np.ndarray[DTYPE_int64_t, ndim=1] indptr,
+        np.ndarray[DTYPE_int_t, ndim=1] indices,
+        np.ndarray[DTYPE_64_t, ndim=1] values,
+        np.ndarray[DTYPE_64_t, ndim=1] vector,
+        np.ndarray[DTYPE_64_t, ndim=1] product,
+        int num_threads=1):
+    cdef long long int i, j
+    cdef double temp
+    cdef long long int num_rows = product.shape[0]
+    num_threads = max(1, num_threads)
     with nogil:
-        for i in range(num_data):
-            fend1 = data[i, 0]
-            fend2 = data[i, 1]
-            correction = corrections[fend1, 0] * corrections[fend2, 0] * counts[i]
-            w[fend1, 0] += correction * p[fend2, 0]
-            w[fend2, 0] += correction * p[fend1, 0]
-        for i in range(num_trans):
-            fend1 = trans_data[i, 0]
-            fend2 = trans_data[i, 1]
-            correction = corrections[fend1, 0] * corrections[fend2, 0] * trans_counts[i]
-            w[fend1, 0] += correction * p[fend2, 0]
-            w[fend2, 0] += correction * p[fend1, 0]
+        # each row is summed by a single thread, so results don't depend on the number of threads
+        for i in prange(num_rows, num_threads=num_threads, schedule='static'):
+            temp = 0.0
+            for j in range(indptr[i], indptr[i + 1]):
+                temp = temp + values[j] * vector[indices[j]]
+            product[i] = temp
     return None
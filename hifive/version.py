@@ -0,0 +1,10 @@
+
+# THIS FILE IS GENERATED FROM HIFIVE SETUP.PY
+short_version = '1.4.1'
+version = '1.4.1'
+full_version = '1.4.1.dev0+e8e9aed'
+git_revision = 'e8e9aedabd644e23ab2c0c7f52b8189c89309c9d'
+release = False
+
+if not release:
+    version = full_version
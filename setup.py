@@ -148,8 +148,30 @@ def setup_package():
 
 # ---- Extension Modules ----------------------------------------------------
 
+def get_openmp_flags():
+    # Test whether the compiler supports OpenMP. Without it, parallel loops in the optimization functions run serially.
+    import tempfile
+    import shutil
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import CompileError, LinkError
+    tempdir = tempfile.mkdtemp()
+    source = os.path.join(tempdir, 'test_openmp.c')
+    open(source, 'w').write("#include <omp.h>\nint main() { return omp_get_num_threads() - 1; }\n")
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    try:
+        objects = compiler.compile([source], output_dir=tempdir, extra_postargs=['-fopenmp'])
+        compiler.link_executable(objects, os.path.join(tempdir, 'test_openmp'), extra_postargs=['-fopenmp'])
+        flags = ['-fopenmp']
+    except (CompileError, LinkError):
+        flags = []
+    shutil.rmtree(tempdir)
+    return flags
+
 def get_extension_modules(include_dirs):
     extensions = []
+    openmp_flags = get_openmp_flags()
     # Distance functions
     extensions.append(Extension("hifive.libraries._hic_distance", ["hifive/libraries/_hic_distance.pyx"],
                                 include_dirs=include_dirs, language="c++",
@@ -168,7 +190,7 @@ def get_extension_modules(include_dirs):
     # Optimization functions
     extensions.append(Extension("hifive.libraries._hic_optimize", ["hifive/libraries/_hic_optimize.pyx"],
                                 include_dirs=include_dirs, language="c++",
-                                extra_compile_args=[]))
+                                extra_compile_args=openmp_flags, extra_link_args=openmp_flags))
     extensions.append(Extension("hifive.libraries._fivec_optimize", ["hifive/libraries/_fivec_optimize.pyx",
                                 "hifive/libraries/_normal.cpp"],
                                 include_dirs=include_dirs, language="c++",
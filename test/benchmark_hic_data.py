@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""Measure HiCData raw read loading throughput in reads per second.
+
+Usage: python test/benchmark_hic_data.py [-n NUM_READS] [-f FEND_FILE] [--skip-duplicate-filtering]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse as ap
+
+import numpy
+
+from hifive import hic_data
+import h5py
+
+
+def main():
+    parser = ap.ArgumentParser(description="Benchmark HiCData.load_data_from_raw throughput.")
+    parser.add_argument("-n", "--reads", dest="reads", type=int, default=2000000,
+        help="Number of simulated read pairs to load. [default: %(default)s]")
+    parser.add_argument("-f", "--fends", dest="fends", type=str, default='test/data/test.fends',
+        help="Fend file to simulate reads against. [default: %(default)s]")
+    parser.add_argument("--skip-duplicate-filtering", dest="skipdups", default=False, action='store_true',
+        help="Skip filtering of PCR duplicates. [default: %(default)s]")
+    args = parser.parse_args()
+    tempdir = tempfile.mkdtemp()
+    raw_fname = os.path.join(tempdir, 'benchmark.raw')
+    data_fname = os.path.join(tempdir, 'benchmark.hcd')
+    simulate_reads(args.fends, raw_fname, args.reads)
+    data = hic_data.HiCData(data_fname, 'w', silent=True)
+    start = time.time()
+    data.load_data_from_raw(args.fends, raw_fname, 500, args.skipdups)
+    elapsed = time.time() - start
+    print >> sys.stdout, ("%i reads loaded in %0.2f seconds (%i reads/s)") % (args.reads, elapsed,
+                                                                            args.reads / elapsed)
+    os.remove(raw_fname)
+    os.rmdir(tempdir)
+
+
+def simulate_reads(fend_fname, raw_fname, num_reads):
+    fends = h5py.File(fend_fname, 'r')
+    chroms = fends['chromosomes'][...]
+    chr_indices = fends['chr_indices'][...]
+    starts = fends['fends']['start'][chr_indices[:-1]]
+    stops = fends['fends']['stop'][chr_indices[1:] - 1]
+    fends.close()
+    rng = numpy.random.RandomState(0)
+    output = open(raw_fname, 'w')
+    for i in range(0, num_reads, 1000000):
+        n = min(1000000, num_reads - i)
+        chrints = rng.randint(0, chroms.shape[0], size=(n, 2))
+        coords = (starts[chrints] + rng.random_sample((n, 2)) * (stops[chrints] - starts[chrints])).astype(numpy.int64)
+        strands = numpy.array(['+', '-'])[rng.randint(0, 2, size=(n, 2))]
+        lines = []
+        for j in range(n):
+            lines.append("%s\t%i\t%s\t%s\t%i\t%s\n" % (chroms[chrints[j, 0]], coords[j, 0], strands[j, 0],
+                                                      chroms[chrints[j, 1]], coords[j, 1], strands[j, 1]))
+        output.write(''.join(lines))
+    output.close()
+
+
+if __name__ == "__main__":
+    main()
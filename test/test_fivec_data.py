@@ -39,6 +39,15 @@ class FiveCData(unittest.TestCase):
         data = h5py.File('test/data/test_temp.fcd', 'r')
         self.compare_hdf5_dicts(self.data, data, 'data')
 
+    def test_fivec_bam_data_creation_parallel(self):
+        if 'pysam' not in sys.modules.keys():
+            print >> sys.stderr, "pysam required for bam import"
+            return None
+        subprocess.call("./bin/hifive 5c-data -q -B %s %s --processes 2 %s test/data/test_temp.fcd" %
+                        (self.bam_fname1, self.bam_fname2, self.frag_fname), shell=True)
+        data = h5py.File('test/data/test_temp.fcd', 'r')
+        self.compare_hdf5_dicts(self.data, data, 'data')
+
     def tearDown(self):
         subprocess.call('rm -f test/data/test_temp.fcd', shell=True)
 
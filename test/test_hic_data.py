@@ -20,6 +20,7 @@ class HiCData(unittest.TestCase):
     def setUp(self):
         self.mat_data = h5py.File('test/data/test_import_mat.hcd', 'r')
         self.raw_data = h5py.File('test/data/test_import_raw.hcd', 'r')
+        self.pairs_data = h5py.File('test/data/test_import_pairs.hcd', 'r')
         self.bam_data = h5py.File('test/data/test_import_bam.hcd', 'r')
         self.bin_mat_data = h5py.File('test/data/test_import_bin_mat.hcd', 'r')
         self.bin_raw_data = h5py.File('test/data/test_import_bin_raw.hcd', 'r')
@@ -29,6 +30,7 @@ class HiCData(unittest.TestCase):
         self.binned_fend_fname = 'test/data/test_binned.fends'
         self.mat_fname = 'test/data/test.mat'
         self.raw_fname = 'test/data/test.raw'
+        self.pairs_fname = 'test/data/test.pairs'
         self.bam_fname1 = 'test/data/test_hic_1.bam'
         self.bam_fname2 = 'test/data/test_hic_2.bam'
         self.matrix_fname = 'test/data/*.test.matrix'
@@ -39,6 +41,59 @@ class HiCData(unittest.TestCase):
         data = h5py.File('test/data/test_temp.hcd', 'r')
         self.compare_hdf5_dicts(self.raw_data, data, 'data')
 
+    def test_hic_raw_data_creation_max_memory(self):
+        subprocess.call("./bin/hifive hic-data -q -R %s -i 500 --max-memory 0 %s test/data/test_temp.hcd" %
+                        (self.raw_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.compare_hdf5_dicts(self.raw_data, data, 'data')
+
+    def test_hic_raw_data_creation_parallel(self):
+        subprocess.call("./bin/hifive hic-data -q -R %s -i 500 --processes 2 %s test/data/test_temp.hcd" %
+                        (self.raw_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.compare_hdf5_dicts(self.raw_data, data, 'data')
+
+    def test_hic_raw_data_creation_compressed(self):
+        subprocess.call("./bin/hifive hic-data -q -R %s -i 500 --compression gzip %s test/data/test_temp.hcd" %
+                        (self.raw_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.assertTrue(data['cis_data'].compression == 'gzip', "cis_data not compressed")
+        self.compare_hdf5_dicts(self.raw_data, data, 'data')
+
+    def test_hic_raw_data_creation_compact(self):
+        subprocess.call("./bin/hifive hic-data -q -R %s -i 500 --compact %s test/data/test_temp.hcd" %
+                        (self.raw_fname, self.fend_fname), shell=True)
+        data = hic_data._DataFile('test/data/test_temp.hcd', 'r')
+        self.assertTrue('cis_partner_deltas' in data.file, "cis_data not stored compactly")
+        self.assertTrue('trans_fend_deltas' in data.file, "trans_data not stored compactly")
+        self.compare_hdf5_dicts(self.raw_data, data, 'data')
+
+    def test_hic_pairs_data_creation(self):
+        subprocess.call("./bin/hifive hic-data -q --pairs %s -i 500 %s test/data/test_temp.hcd" %
+                        (self.pairs_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.compare_hdf5_dicts(self.pairs_data, data, 'data')
+
+    def test_hic_pairs_data_creation_parallel(self):
+        subprocess.call("./bin/hifive hic-data -q --pairs %s -i 500 --processes 2 %s test/data/test_temp.hcd" %
+                        (self.pairs_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.compare_hdf5_dicts(self.pairs_data, data, 'data')
+
+    def test_hic_raw_data_append(self):
+        subprocess.call("./bin/hifive hic-data -q -R %s -i 500 %s test/data/test_temp.hcd" %
+                        (self.raw_fname, self.fend_fname), shell=True)
+        subprocess.call("./bin/hifive hic-data -q --pairs %s -i 500 --append %s test/data/test_temp.hcd" %
+                        (self.pairs_fname, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        for name, indices in [['cis', 'cis_indices'], ['trans', 'trans_chrom_indices']]:
+            self.compare_arrays(self.raw_data[indices][...], data[indices][...], indices)
+            self.compare_arrays(self.raw_data['%s_data' % name][:, :2], data['%s_data' % name][:, :2],
+                                '%s_data' % name)
+            self.compare_arrays(self.raw_data['%s_data' % name][:, 2] * 2, data['%s_data' % name][:, 2],
+                                '%s_data counts' % name)
+        self.compare_arrays(self.raw_data['stats']['name'], data['stats']['name'], 'stats names')
+
     def test_hic_mat_data_creation(self):
         subprocess.call("./bin/hifive hic-data -q -M %s -i 500 %s test/data/test_temp.hcd" %
                         (self.mat_fname, self.fend_fname), shell=True)
@@ -54,6 +109,15 @@ class HiCData(unittest.TestCase):
         data = h5py.File('test/data/test_temp.hcd', 'r')
         self.compare_hdf5_dicts(self.bam_data, data, 'data')
 
+    def test_hic_bam_data_creation_parallel(self):
+        if 'pysam' not in sys.modules.keys():
+            print >> sys.stderr, "pysam required for bam import"
+            return None
+        subprocess.call("./bin/hifive hic-data -q -S %s %s -i 500 --processes 2 %s test/data/test_temp.hcd" %
+                        (self.bam_fname1, self.bam_fname2, self.fend_fname), shell=True)
+        data = h5py.File('test/data/test_temp.hcd', 'r')
+        self.compare_hdf5_dicts(self.bam_data, data, 'data')
+
     def test_hic_bin_raw_data_creation(self):
         subprocess.call("./bin/hifive hic-data -q -R %s -i 500 %s test/data/test_temp.hcd" %
                         (self.raw_fname, self.binned_fend_fname), shell=True)
@@ -93,6 +157,61 @@ class HiCData(unittest.TestCase):
         self.assertEqual(data1, data2,
                 "generated mat file doesn't match original")
 
+    def test_hic_trans_chrom_index_upgrade(self):
+        data = hic_data.HiCData('test/data/test.hcd', 'r', silent=True)
+        self.assertTrue(data.trans_indices is None, "trans_indices not replaced")
+        old_data = h5py.File('test/data/test.hcd', 'r')['trans_data'][...]
+        chroms = data.fends['fends']['chr'][...]
+        num_chroms = data.fends['chromosomes'].shape[0]
+        indices = data.trans_chrom_indices
+        self.assertEqual(indices[-1], old_data.shape[0], "trans_chrom_indices doesn't cover trans_data")
+        for i in range(num_chroms):
+            for j in range(num_chroms):
+                where = numpy.where((chroms[old_data[:, 0]] == i) * (chroms[old_data[:, 1]] == j))[0]
+                block = data.trans_data[indices[i * num_chroms + j]:indices[i * num_chroms + j + 1], :]
+                self.compare_arrays(old_data[where, :], block, 'trans_data block')
+
+    def test_hic_trans_chrom_index_saved(self):
+        subprocess.call('cp test/data/test.hcd test/data/test_temp.hcd', shell=True)
+        data = hic_data.HiCData('test/data/test_temp.hcd', 'r', silent=True)
+        data.save()
+        datafile = hic_data._DataFile('test/data/test_temp.hcd', 'r')
+        self.assertTrue('trans_indices' not in datafile.file, "trans_indices not removed")
+        datafile.index_trans_data(data.fends['chr_indices'][...])
+        self.assertTrue(len(datafile.views) == 0, "saved trans_data reordered again")
+        self.compare_arrays(data.trans_chrom_indices, datafile['trans_chrom_indices'][...], 'trans_chrom_indices')
+        self.compare_arrays(data.trans_data, datafile['trans_data'][...], 'trans_data')
+
+    def test_hic_compact_trans_data(self):
+        data = hic_data.HiCData('test/data/test.hcd', 'r', silent=True)
+        data.file = os.path.abspath('test/data/test_temp.hcd')
+        data.fendfilename = './test.fends'
+        data.save(compact=True)
+        compact = hic_data._DataFile('test/data/test_temp.hcd', 'r')
+        self.assertTrue('trans_partner_deltas' in compact.file, "trans_data not stored compactly")
+        self.compare_arrays(data.trans_data, compact['trans_data'][...], 'trans_data')
+        indices = data.trans_chrom_indices
+        for i in numpy.where(indices[1:] > indices[:-1])[0]:
+            middle = (indices[i] + indices[i + 1]) / 2
+            self.compare_arrays(data.trans_data[middle:indices[i + 1], :],
+                                compact['trans_data'][middle:indices[i + 1], :], 'trans_data slice')
+        loaded = hic_data.HiCData('test/data/test_temp.hcd', 'r', silent=True)
+        self.compare_arrays(data.trans_data, loaded.trans_data, 'loaded trans_data')
+
+    def test_hic_compact_data_array_indexing(self):
+        data = hic_data.HiCData('test/data/test.hcd', 'r', silent=True)
+        data.file = os.path.abspath('test/data/test_temp.hcd')
+        data.fendfilename = './test.fends'
+        data.save(compact=True)
+        compact = hic_data._DataFile('test/data/test_temp.hcd', 'r')
+        for name in ['cis_data', 'trans_data']:
+            rows = numpy.array([7, 3, -1, 3, data[name].shape[0] / 2])
+            self.compare_arrays(data[name][rows, :], compact[name][rows, :], '%s rows' % name)
+            self.compare_arrays(data[name][rows, 1], compact[name][rows, 1], '%s row column' % name)
+            where = data[name][:, 2] > 1
+            self.compare_arrays(data[name][where, :], compact[name][where, :], '%s boolean rows' % name)
+            self.compare_arrays(data[name][[], :], compact[name][[], :], '%s empty rows' % name)
+
     def tearDown(self):
         subprocess.call('rm -f test/data/test_temp.hcd', shell=True)
         subprocess.call('rm -f test/data/test_temp.mat', shell=True)
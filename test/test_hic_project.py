@@ -8,7 +8,7 @@ from operator import mul
 
 import numpy
 
-from hifive import hic
+from hifive import hic, checkpoint
 import h5py
 
 
@@ -61,6 +61,24 @@ class HiCProject(unittest.TestCase):
         self.assertTrue(numpy.allclose(self.probpois.chromosome_means, project.chromosome_means, atol=1e-4),
             "chromosome means don't match target values")
 
+    def test_hic_project_probability_lbfgs(self):
+        subprocess.call("./bin/hifive hic-normalize probability -q -m 20000 -o test/data/test_temp.hcp -b 15 -g 0.0015 -p --solver lbfgs %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.assertTrue(numpy.allclose(self.probbin.corrections, project.corrections, atol=5e-2),
+            "learned L-BFGS correction values don't match target values")
+        self.assertTrue(numpy.allclose(self.probbin.chromosome_means, project.chromosome_means, atol=1e-2),
+            "L-BFGS chromosome means don't match target values")
+
+    def test_hic_project_probability_implicit_zeros(self):
+        subprocess.call("./bin/hifive hic-normalize probability -q -m 20000 -o test/data/test_temp.hcp -b 15 -l 0.4 -g 0.0015 -p -a poisson --implicit-zeros %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.assertTrue(numpy.allclose(self.probpois.corrections, project.corrections),
+            "learned correction values with implicit zeros don't match target values")
+        self.assertTrue(numpy.allclose(self.probpois.chromosome_means, project.chromosome_means, atol=1e-4),
+            "chromosome means with implicit zeros don't match target values")
+
     def test_hic_project_express(self):
         subprocess.call("./bin/hifive hic-normalize express -q -m 20000 -o test/data/test_temp.hcp -e 100 -w cis -f 10 %s" %
                         (self.project_fname), shell=True)
@@ -70,6 +88,27 @@ class HiCProject(unittest.TestCase):
         self.assertTrue(numpy.allclose(self.express.chromosome_means, project.chromosome_means),
             "chromosome means don't match target values")
 
+    def test_hic_project_express_kr(self):
+        subprocess.call("./bin/hifive hic-normalize express -q -m 20000 -o test/data/test_temp.hcp -w cis -f 10 -g 0.000001 -z %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        # corrected cis interactions of each chromosome should have equal row sums once balanced
+        data = project.data['cis_data'][...]
+        mids = project.fends['fends']['mid'][...]
+        valid = numpy.where(project.filter[data[:, 0]] * project.filter[data[:, 1]] *
+                            (mids[data[:, 1]] - mids[data[:, 0]] >= 20000))[0]
+        data = data[valid, :]
+        values = data[:, 2] / (project.corrections[data[:, 0]] * project.corrections[data[:, 1]])
+        sums = (numpy.bincount(data[:, 0], weights=values, minlength=mids.shape[0]) +
+                numpy.bincount(data[:, 1], weights=values, minlength=mids.shape[0]))
+        chr_indices = project.fends['chr_indices'][...]
+        for i in range(chr_indices.shape[0] - 1):
+            chrom_sums = sums[chr_indices[i]:chr_indices[i + 1]][numpy.where(
+                project.filter[chr_indices[i]:chr_indices[i + 1]])]
+            if chrom_sums.shape[0] > 1:
+                self.assertTrue(numpy.allclose(chrom_sums, numpy.mean(chrom_sums), rtol=1e-2),
+                    "Knight-Ruiz corrections don't balance the interaction matrix")
+
     def test_hic_project_binning(self):
         subprocess.call("./bin/hifive hic-normalize binning -q -m 20000 -o test/data/test_temp.hcp -r 5 -y cis -t 1.0 -v len,distance -s 3,3 -u even,fixed-const %s" %
                         (self.project_fname), shell=True)
@@ -86,8 +125,104 @@ class HiCProject(unittest.TestCase):
         self.assertTrue(numpy.allclose(self.bin_express.chromosome_means, project.chromosome_means),
             "chromosome means don't match target values")
 
+    def test_hic_project_local_workers(self):
+        subprocess.call("./bin/hifive hic-normalize express -q --workers 3 -m 20000 -o test/data/test_temp.hcp -e 100 -w cis -f 10 %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.assertTrue(numpy.allclose(self.express.corrections, project.corrections),
+            "learned express correction values with local workers don't match target values")
+        run_workers = hic.communication.run_workers
+        methods = []
+
+        def recorded_run_workers(project, method, args, kwargs, num_workers):
+            methods.append(method.__name__)
+            return run_workers(project, method, args, kwargs, num_workers)
+
+        hic.communication.run_workers = recorded_run_workers
+        project = hic.HiC(self.project_fname, 'r', silent=True, num_workers=2)
+        try:
+            project.find_probability_fend_corrections(mindistance=20000, learningstep=0.4, max_iterations=15,
+                                                      minchange=0.0015, precalculate=True)
+        finally:
+            hic.communication.run_workers = run_workers
+        self.assertEqual(methods, ['find_probability_fend_corrections'],
+            "probability corrections weren't learned with local workers")
+        self.assertTrue(numpy.allclose(self.probbin.corrections, project.corrections, atol=1e-4),
+            "learned correction values with local workers don't match target values")
+        self.assertEqual(project.rank, 0, "local workers changed project rank")
+
+    def test_hic_project_threads(self):
+        subprocess.call("./bin/hifive hic-normalize probability -q --threads 3 -m 20000 -o test/data/test_temp.hcp -b 15 -l 0.4 -g 0.0015 -p %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.assertTrue(numpy.allclose(self.probbin.corrections, project.corrections, atol=1e-4),
+            "learned correction values with multiple threads don't match target values")
+        subprocess.call("./bin/hifive hic-normalize express -q --threads 3 -m 20000 -o test/data/test_temp.hcp -e 100 -w cis -f 10 %s" %
+                        (self.project_fname), shell=True)
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.assertTrue(numpy.allclose(self.express.corrections, project.corrections),
+            "learned express correction values with multiple threads don't match target values")
+
+    def test_hic_project_checkpoint_resume(self):
+        update = checkpoint.Checkpoint.update
+
+        def interrupted_update(progress, force=False, **values):
+            update(progress, force, **values)
+            if values.get('iteration', 0) == 5:
+                raise KeyboardInterrupt()
+
+        checkpoint.Checkpoint.update = interrupted_update
+        project = hic.HiC(self.project_fname, 'r', silent=True)
+        try:
+            project.find_probability_fend_corrections(mindistance=20000, learningstep=0.4, max_iterations=15,
+                                                      minchange=0.0015, precalculate=True,
+                                                      checkpoint='test/data/test_temp.ckpt', checkpoint_interval=0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            checkpoint.Checkpoint.update = update
+        self.assertTrue(os.path.exists('test/data/test_temp.ckpt'), "checkpoint file not saved")
+        project = hic.HiC(self.project_fname, 'r', silent=True)
+        project.find_probability_fend_corrections(mindistance=20000, learningstep=0.4, max_iterations=10,
+                                                  minchange=0.0015, precalculate=True,
+                                                  checkpoint='test/data/test_temp.ckpt', resume=True)
+        self.assertTrue(project.history.endswith("Error: checkpoint settings don't match\n"),
+            "checkpoint with different settings was resumed")
+        project.find_probability_fend_corrections(mindistance=20000, learningstep=0.4, max_iterations=15,
+                                                  minchange=0.0015, precalculate=True,
+                                                  checkpoint='test/data/test_temp.ckpt', resume=True)
+        self.assertTrue(numpy.allclose(self.probbin.corrections, project.corrections, atol=1e-4),
+            "resumed correction values don't match target values")
+        self.assertTrue(numpy.allclose(self.probbin.chromosome_means, project.chromosome_means, atol=1e-4),
+            "resumed chromosome means don't match target values")
+        self.assertFalse(os.path.exists('test/data/test_temp.ckpt'), "checkpoint file not removed")
+
+    def test_hic_project_lazy_load(self):
+        project = hic.HiC(self.probpois_fname, 'r', silent=True, lazy=True)
+        self.assertTrue('corrections' not in project.__dict__ and 'fends' not in project.__dict__,
+            "lazy project loaded arrays at creation")
+        self.compare_arrays(self.probpois.corrections, project.corrections, 'lazy')
+        self.compare_arrays(self.probpois.filter, project['filter'], 'lazy')
+        self.assertEqual(self.probpois.chr2int, project.chr2int, "lazy chromosome indices don't match")
+        self.assertEqual(self.probpois.data['cis_data'].shape, project.data['cis_data'].shape,
+            "lazy data file doesn't match")
+        project.save('test/data/test_temp.hcp')
+        project = hic.HiC("test/data/test_temp.hcp", 'r', silent=True)
+        self.compare_arrays(self.probpois.distance_parameters, project.distance_parameters, 'lazy')
+
+    def test_hic_project_cached_tables(self):
+        fends = h5py.File('test/data/test.fends', 'r')
+        mids = self.probpois.fends['fends']['mid']
+        self.compare_arrays(fends['fends']['mid'][...], mids, 'cached')
+        self.compare_arrays(fends['chr_indices'][...], self.probpois.fends['chr_indices'][...], 'cached')
+        mids.fill(0)
+        self.compare_arrays(fends['fends']['mid'][...], self.probpois.fends['fends']['mid'], 'cached')
+        data = h5py.File(self.data_fname, 'r')
+        self.assertEqual(data['cis_indices'][10], self.probpois.data['cis_indices'][10],
+            "cached data indices don't match")
+
     def tearDown(self):
-        subprocess.call('rm -f test/data/test_temp.hcp', shell=True)
+        subprocess.call('rm -f test/data/test_temp.hcp test/data/test_temp.ckpt', shell=True)
 
     def compare_arrays(self, array1, array2, name):
         self.assertTrue(array1.shape == array2.shape,